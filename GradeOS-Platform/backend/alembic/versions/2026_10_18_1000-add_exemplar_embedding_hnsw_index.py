@@ -0,0 +1,91 @@
+"""add_exemplar_embedding_hnsw_index
+
+Revision ID: add_exemplar_hnsw_index
+Revises: add_confession_and_page_images
+Create Date: 2026-10-18 10:00:00.000000+00:00
+"""
+
+import os
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "add_exemplar_hnsw_index"
+down_revision: Union[str, None] = "add_confession_and_page_images"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EMBEDDING_DIM = int(os.getenv("EXEMPLAR_EMBEDDING_DIM", "768"))
+
+
+def _has_vector_extension() -> bool:
+    conn = op.get_bind()
+    return bool(
+        conn.execute(sa.text("SELECT 1 FROM pg_extension WHERE extname='vector'")).scalar()
+    )
+
+
+def upgrade() -> None:
+    """
+    将 exemplars.embedding 转为定长 vector 列并创建 HNSW 余弦索引
+
+    维度与当前嵌入模型不一致的历史向量原样移入 embedding_legacy 列保留，
+    主列置空后由重新确认或回填任务重建；降级时移回。
+    未安装 pgvector 时跳过（检索退化为按题目哈希匹配）。
+    """
+    if not _has_vector_extension():
+        return
+
+    op.add_column(
+        "exemplars",
+        sa.Column(
+            "embedding_legacy",
+            sa.Text,
+            nullable=True,
+            comment="维度与当前嵌入模型不一致的历史向量（待回填）",
+        ),
+    )
+    op.execute(
+        f"""
+        UPDATE exemplars
+        SET embedding_legacy = embedding, embedding = NULL
+        WHERE embedding IS NOT NULL
+          AND vector_dims(embedding::vector) <> {EMBEDDING_DIM}
+        """
+    )
+    op.execute(
+        f"""
+        ALTER TABLE exemplars
+        ALTER COLUMN embedding TYPE vector({EMBEDDING_DIM})
+        USING embedding::vector({EMBEDDING_DIM})
+        """
+    )
+    op.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_exemplars_embedding_hnsw
+        ON exemplars USING hnsw (embedding vector_cosine_ops)
+        WITH (m = 16, ef_construction = 64)
+        """
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS idx_exemplars_type_hash "
+        "ON exemplars(question_type, question_image_hash)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS idx_exemplars_type_hash")
+    op.execute("DROP INDEX IF EXISTS idx_exemplars_embedding_hnsw")
+    if _has_vector_extension():
+        op.execute("ALTER TABLE exemplars ALTER COLUMN embedding TYPE TEXT USING embedding::text")
+        op.execute(
+            """
+            UPDATE exemplars
+            SET embedding = embedding_legacy
+            WHERE embedding IS NULL AND embedding_legacy IS NOT NULL
+            """
+        )
+        op.drop_column("exemplars", "embedding_legacy")
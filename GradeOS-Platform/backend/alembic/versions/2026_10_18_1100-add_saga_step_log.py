@@ -0,0 +1,92 @@
+"""add_saga_step_log
+
+Revision ID: add_saga_step_log
+Revises: add_exemplar_hnsw_index
+Create Date: 2026-10-18 11:00:00.000000+00:00
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "add_saga_step_log"
+down_revision: Union[str, None] = "add_exemplar_hnsw_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    Saga 持久化日志
+
+    - saga_transactions 增加类型、上下文（恢复时重建步骤）、心跳与恢复次数
+    - final_status 放宽到 32 字符（requires_intervention 超过原 20 字符限制）
+    - saga_step_log 每次步骤状态变化一行
+    """
+    op.alter_column(
+        "saga_transactions",
+        "final_status",
+        type_=sa.String(32),
+        existing_type=sa.String(20),
+        existing_nullable=False,
+    )
+    op.add_column("saga_transactions", sa.Column("saga_type", sa.String(64), nullable=True))
+    op.add_column("saga_transactions", sa.Column("context", postgresql.JSONB, nullable=True))
+    op.add_column(
+        "saga_transactions",
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+    )
+    op.add_column(
+        "saga_transactions",
+        sa.Column("recovery_attempts", sa.Integer, nullable=False, server_default="0"),
+    )
+    # 恢复扫描只关心仍在执行的事务
+    op.create_index(
+        "idx_saga_started_updated",
+        "saga_transactions",
+        ["updated_at"],
+        postgresql_where=sa.text("final_status = 'started'"),
+    )
+
+    op.create_table(
+        "saga_step_log",
+        sa.Column("id", sa.BigInteger, primary_key=True, autoincrement=True),
+        sa.Column("saga_id", sa.String(36), nullable=False),
+        sa.Column("step_name", sa.String(128), nullable=False),
+        sa.Column("status", sa.String(32), nullable=False),
+        sa.Column("result", postgresql.JSONB, nullable=True),
+        sa.Column("error", sa.Text, nullable=True),
+        sa.Column(
+            "created_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+    )
+    op.create_index("idx_saga_step_log_saga", "saga_step_log", ["saga_id", "step_name", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("idx_saga_step_log_saga", table_name="saga_step_log")
+    op.drop_table("saga_step_log")
+    op.drop_index("idx_saga_started_updated", table_name="saga_transactions")
+    op.drop_column("saga_transactions", "recovery_attempts")
+    op.drop_column("saga_transactions", "updated_at")
+    op.drop_column("saga_transactions", "context")
+    op.drop_column("saga_transactions", "saga_type")
+    op.alter_column(
+        "saga_transactions",
+        "final_status",
+        type_=sa.String(20),
+        existing_type=sa.String(32),
+        existing_nullable=False,
+    )
@@ -0,0 +1,65 @@
+"""add_retention_runs
+
+Revision ID: add_retention_runs
+Revises: add_saga_step_log
+Create Date: 2026-10-18 12:00:00.000000+00:00
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "add_retention_runs"
+down_revision: Union[str, None] = "add_saga_step_log"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    批改数据保留清理的运行进度
+
+    - 每次清理一行，记录当前分块的批次、已完成的表与各表累计行数
+    - 预算耗尽或中断的运行下次从这里继续
+    """
+    op.create_table(
+        "retention_runs",
+        sa.Column("id", postgresql.UUID(as_uuid=False), primary_key=True),
+        sa.Column("status", sa.String(32), nullable=False),
+        sa.Column("dry_run", sa.Boolean, nullable=False, server_default=sa.false()),
+        sa.Column("cutoff", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("chunk_history_ids", postgresql.JSONB, nullable=False, server_default="[]"),
+        sa.Column("chunk_batch_ids", postgresql.JSONB, nullable=False, server_default="[]"),
+        sa.Column("tables_done", postgresql.JSONB, nullable=False, server_default="[]"),
+        sa.Column("totals", postgresql.JSONB, nullable=False, server_default="{}"),
+        sa.Column("bytes_reclaimable", postgresql.JSONB, nullable=False, server_default="{}"),
+        sa.Column("batches_done", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("error", sa.Text, nullable=True),
+        sa.Column(
+            "started_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+        sa.Column(
+            "updated_at",
+            sa.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=sa.text("NOW()"),
+        ),
+        sa.Column("finished_at", sa.TIMESTAMP(timezone=True), nullable=True),
+    )
+    op.create_index(
+        "idx_retention_runs_status",
+        "retention_runs",
+        ["status", sa.text("started_at DESC")],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("idx_retention_runs_status", table_name="retention_runs")
+    op.drop_table("retention_runs")
@@ -0,0 +1,31 @@
+"""add_grading_log_patch_version
+
+Revision ID: add_grading_log_patch_version
+Revises: add_retention_runs
+Create Date: 2026-10-18 13:00:00.000000+00:00
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "add_grading_log_patch_version"
+down_revision: Union[str, None] = "add_retention_runs"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """
+    批改日志记录生效的规则补丁版本
+
+    - 改判时按原日志的补丁版本拆分灰度组 / 对照组指标
+    """
+    op.add_column("grading_logs", sa.Column("patch_version", sa.String(32), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("grading_logs", "patch_version")
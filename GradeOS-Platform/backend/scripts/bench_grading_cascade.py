@@ -0,0 +1,221 @@
+"""
+批改模型级联模拟：不同升级阈值下的成本与一致率
+
+用桩模型替代真实 LLM（不发网络请求）：
+- 快速档：每题有 --fast-error 概率判错（偏差 1 分），判错时自报置信度偏低，
+  部分判错表现为得分点累加与题目得分不符（规则检查可发现）；
+- 强模型档：每题有 --strong-error 概率判错，结果在同一题上确定（整卷批改与按题重批一致）。
+
+成本按页计：快速档每页 --fast-cost，强模型档每页 --strong-cost；按题重批只发送该题所在页。
+输出每组 (threshold, max_ratio) 相对“只用强模型”的成本、升级比例、
+与强模型结果的一致率以及相对真实分数的准确率。
+
+运行方式：
+    python scripts/bench_grading_cascade.py --students 200 --questions 12
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+from typing import Any, Dict, List
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.grading_cascade import (  # noqa: E402
+    CascadeMetrics,
+    CascadeRunBudget,
+    GradingCascade,
+)
+
+MAX_SCORE = 4
+
+
+def _detail(qid: str, score: int, confidence: float, point_sum: int) -> Dict[str, Any]:
+    return {
+        "question_id": qid,
+        "score": score,
+        "max_score": MAX_SCORE,
+        "confidence": confidence,
+        "scoring_point_results": [
+            {
+                "point_id": f"{qid}.1",
+                "awarded": point_sum,
+                "max_points": MAX_SCORE,
+                "evidence": "作答第二行",
+                "rubric_reference": f"[{qid}.1]",
+            }
+        ],
+    }
+
+
+def _misgrade(rng: random.Random, truth: int) -> int:
+    return max(0, min(MAX_SCORE, truth + rng.choice((-1, 1)))) if truth not in (0, MAX_SCORE) else (
+        1 if truth == 0 else MAX_SCORE - 1
+    )
+
+
+class World:
+    """预先生成每个 (学生, 题目) 的真实分数与两档模型的判分"""
+
+    def __init__(
+        self, students: int, questions: int, fast_error: float, strong_error: float, seed: int
+    ):
+        rng = random.Random(seed)
+        self.qids = [str(q + 1) for q in range(questions)]
+        self.truth: Dict[str, Dict[str, int]] = {}
+        self.fast: Dict[str, List[Dict[str, Any]]] = {}
+        self.strong: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for s in range(students):
+            key = f"S{s:04d}"
+            truth = {qid: rng.randint(0, MAX_SCORE) for qid in self.qids}
+            fast, strong = [], {}
+            for qid in self.qids:
+                wrong = rng.random() < fast_error
+                score = _misgrade(rng, truth[qid]) if wrong else truth[qid]
+                confidence = rng.uniform(0.35, 0.75) if wrong else rng.uniform(0.6, 0.98)
+                # 约三分之一的判错在得分点层面自相矛盾
+                point_sum = truth[qid] if wrong and rng.random() < 0.33 else score
+                fast.append(_detail(qid, score, round(confidence, 3), point_sum))
+                strong_wrong = rng.random() < strong_error
+                strong_score = _misgrade(rng, truth[qid]) if strong_wrong else truth[qid]
+                strong[qid] = _detail(qid, strong_score, 0.9, strong_score)
+            self.truth[key], self.fast[key], self.strong[key] = truth, fast, strong
+
+
+class StubClient:
+    """同构于 LLMReasoningClient 的 grade_student / regrade_questions，按页累计成本"""
+
+    def __init__(self, world: World, tier: str, cost_per_page: float):
+        self.world = world
+        self.tier = tier
+        self.model_name = f"stub/{tier}"
+        self.cost_per_page = cost_per_page
+        self.cost = 0.0
+
+    async def grade_student(self, images, student_key, parsed_rubric, **_kwargs):
+        self.cost += len(images) * self.cost_per_page
+        if self.tier == "fast":
+            details = [dict(d) for d in self.world.fast[student_key]]
+        else:
+            details = [dict(d) for d in self.world.strong[student_key].values()]
+        return {
+            "status": "completed",
+            "student_key": student_key,
+            "question_details": details,
+            "total_score": sum(d["score"] for d in details),
+            "max_score": MAX_SCORE * len(details),
+        }
+
+    async def regrade_questions(self, images, student_key, parsed_rubric, question_ids, **kwargs):
+        contexts = kwargs.get("page_contexts") or {}
+        pages = {
+            page
+            for page in kwargs.get("page_indices") or []
+            if set(contexts.get(page, {}).get("question_numbers", [])) & set(question_ids)
+        }
+        self.cost += len(pages) * self.cost_per_page
+        return [dict(self.world.strong[student_key][qid]) for qid in question_ids]
+
+
+def _page_layout(qids: List[str], per_page: int) -> Dict[int, Dict[str, Any]]:
+    return {
+        page: {"question_numbers": qids[page * per_page : (page + 1) * per_page]}
+        for page in range((len(qids) + per_page - 1) // per_page)
+    }
+
+
+async def _simulate(world: World, args, threshold: float, max_ratio: float) -> Dict[str, float]:
+    fast = StubClient(world, "fast", args.fast_cost)
+    strong = StubClient(world, "strong", args.strong_cost)
+    metrics = CascadeMetrics()
+    cascade = GradingCascade(
+        fast,
+        strong,
+        run_id="bench",
+        threshold=threshold,
+        max_ratio=max_ratio,
+        page_budget_usd=args.page_budget,
+        cost_per_question_usd=args.cost_per_question,
+        budget=CascadeRunBudget(),
+        metrics=metrics,
+    )
+    contexts = _page_layout(world.qids, args.questions_per_page)
+    pages = list(contexts)
+    images = [b""] * len(pages)
+
+    agree_strong = correct = total = 0
+    for key in world.truth:
+        result = await cascade.grade_student(
+            images, key, {}, page_indices=pages, page_contexts=contexts
+        )
+        for detail in result["question_details"]:
+            qid = detail["question_id"]
+            total += 1
+            agree_strong += detail["score"] == world.strong[key][qid]["score"]
+            correct += detail["score"] == world.truth[key][qid]
+    strong_only = len(world.truth) * len(pages) * args.strong_cost
+    escalation = metrics.snapshot()["escalation"]
+    return {
+        "cost": (fast.cost + strong.cost) / strong_only,
+        "escalated": escalation["escalated"] / total,
+        "denied": escalation["budget_denied"] / total,
+        "agree": agree_strong / total,
+        "accuracy": correct / total,
+    }
+
+
+def _strong_only_accuracy(world: World) -> float:
+    hits = [
+        world.strong[key][qid]["score"] == score
+        for key, truth in world.truth.items()
+        for qid, score in truth.items()
+    ]
+    return sum(hits) / len(hits)
+
+
+async def main_async(args) -> None:
+    world = World(args.students, args.questions, args.fast_error, args.strong_error, args.seed)
+    print(
+        f"students={args.students} questions={args.questions} "
+        f"fast_error={args.fast_error} strong_error={args.strong_error} "
+        f"cost fast/strong per page={args.fast_cost}/{args.strong_cost}"
+    )
+    print(f"  strong-only: cost=1.000 agree=1.000 accuracy={_strong_only_accuracy(world):.3f}")
+    for threshold in args.thresholds:
+        for max_ratio in args.ratios:
+            r = await _simulate(world, args, threshold, max_ratio)
+            print(
+                f"  threshold={threshold:.2f} max_ratio={max_ratio:.2f}  cost={r['cost']:.3f}  "
+                f"escalated={r['escalated']:.3f} denied={r['denied']:.3f}  "
+                f"agree={r['agree']:.3f} accuracy={r['accuracy']:.3f}"
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=12)
+    parser.add_argument("--questions-per-page", type=int, default=3)
+    parser.add_argument("--fast-error", type=float, default=0.2)
+    parser.add_argument("--strong-error", type=float, default=0.04)
+    parser.add_argument("--fast-cost", type=float, default=0.0015)
+    parser.add_argument("--strong-cost", type=float, default=0.01)
+    parser.add_argument("--page-budget", type=float, default=0.005, help="每页累积的升级预算 (USD)")
+    parser.add_argument(
+        "--cost-per-question", type=float, default=0.01, help="每道升级题的预估成本 (USD)"
+    )
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8])
+    parser.add_argument("--ratios", type=float, nargs="+", default=[0.2, 0.5])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+批改检查点基准测试：逐字段写入与合并流水线写入
+
+对比 500 个学生（每人 grading_attempt + grading_result 两次写入）：
+- legacy：每次写入一个 HSET + 一个 EXPIRE，json.dumps 文本
+- pipelined：CheckpointWriter 按窗口合并，一次流水线 HSET/EXPIRE，orjson + zstd
+
+统计 Redis 往返次数、写入字节数与耗时（fakeredis，不含网络延迟；
+--rtt-ms 为每次往返叠加模拟网络延迟，--grade-ms 模拟每个学生的批改耗时）。
+
+运行方式：
+    python scripts/bench_grading_checkpoint.py --students 500 --rtt-ms 0.5 --grade-ms 200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis  # noqa: E402
+
+from src.services.grading_checkpoint import (  # noqa: E402
+    REDIS_CHECKPOINT_TTL_SECONDS,
+    CheckpointWriter,
+)
+
+
+def page_result(i: int, questions: int) -> dict:
+    return {
+        "status": "completed",
+        "attempts": 1,
+        "page_result": {
+            "page_index": i,
+            "page_indices": [i * 4 + n for n in range(4)],
+            "status": "completed",
+            "score": 42.5,
+            "max_score": 60,
+            "confidence": 0.91,
+            "student_key": f"Student {i + 1}",
+            "question_details": [
+                {
+                    "question_id": str(q),
+                    "score": 3,
+                    "max_score": 5,
+                    "confidence": 0.9,
+                    "feedback": f"第{q}题：步骤基本完整，单位书写不规范扣 1 分。",
+                    "student_answer": "v = s / t = 120 / 12 = 10 m/s " * 3,
+                    "scoring_point_results": [
+                        {
+                            "point_id": f"{q}.{p}",
+                            "awarded": 1,
+                            "max_points": 1,
+                            "evidence": "列式正确",
+                        }
+                        for p in range(1, 5)
+                    ],
+                }
+                for q in range(1, questions + 1)
+            ],
+        },
+    }
+
+
+class MeteredRedis(fakeredis.FakeAsyncRedis):
+    """统计往返与写入字节；可选为每次往返叠加延迟"""
+
+    def __init__(self, *args, rtt: float = 0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rtt = rtt
+        self.round_trips = 0
+        self.bytes_sent = 0
+
+    async def _round_trip(self):
+        self.round_trips += 1
+        if self.rtt:
+            await asyncio.sleep(self.rtt)
+
+    async def hset(self, name, key=None, value=None, mapping=None, items=None):
+        await self._round_trip()
+        self.bytes_sent += len(value or b"") + sum(len(v) for v in (mapping or {}).values())
+        return await super().hset(name, key=key, value=value, mapping=mapping, items=items)
+
+    async def expire(self, name, time, *args, **kwargs):
+        await self._round_trip()
+        return await super().expire(name, time, *args, **kwargs)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction=transaction, shard_hint=shard_hint)
+        original_hset, original_execute = pipe.hset, pipe.execute
+        outer = self
+
+        def hset(name, key=None, value=None, mapping=None, items=None):
+            outer.bytes_sent += sum(len(v) for v in (mapping or {}).values())
+            return original_hset(name, key=key, value=value, mapping=mapping, items=items)
+
+        async def execute(*args, **kwargs):
+            await outer._round_trip()
+            return await original_execute(*args, **kwargs)
+
+        pipe.hset, pipe.execute = hset, execute
+        return pipe
+
+
+async def legacy_save(redis_client, batch_id, student_key, field, payload):
+    raw = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    key = f"batch_checkpoint:{batch_id}"
+    await redis_client.hset(key, f"student:{student_key}:{field}", raw)
+    await redis_client.expire(key, REDIS_CHECKPOINT_TTL_SECONDS)
+
+
+async def grade_students(
+    save, students: int, questions: int, concurrency: int, grade_seconds: float
+) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def student(i: int):
+        async with semaphore:
+            key = f"Student {i + 1}"
+            await save("bench", key, "grading_attempt", {"attempt": 1, "page_indices": [i]}, False)
+            await asyncio.sleep(grade_seconds)  # 模型批改耗时
+            await save("bench", key, "grading_result", page_result(i, questions), False)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[student(i) for i in range(students)])
+    return time.perf_counter() - start
+
+
+async def run(
+    students: int, questions: int, concurrency: int, rtt_ms: float, grade_ms: float
+) -> None:
+    rtt = rtt_ms / 1000.0
+    grade_seconds = grade_ms / 1000.0
+
+    legacy_redis = MeteredRedis(rtt=rtt)
+
+    async def legacy(batch_id, student_key, field, payload, wait):
+        await legacy_save(legacy_redis, batch_id, student_key, field, payload)
+
+    legacy_s = await grade_students(
+        legacy, students, questions, concurrency, grade_seconds
+    )
+
+    pipelined_redis = MeteredRedis(rtt=rtt)
+
+    async def factory():
+        return pipelined_redis
+
+    writer = CheckpointWriter(client_factory=factory)
+
+    async def pipelined(batch_id, student_key, field, payload, wait):
+        await writer.save(
+            batch_id=batch_id, student_key=student_key, field=field, payload=payload, wait=wait
+        )
+
+    pipelined_s = await grade_students(
+        pipelined, students, questions, concurrency, grade_seconds
+    )
+    await writer.close()
+
+    start = time.perf_counter()
+    loaded = await writer.load("bench")
+    load_ms = (time.perf_counter() - start) * 1000
+
+    print(
+        f"students={students} questions={questions} concurrency={concurrency} "
+        f"rtt={rtt_ms}ms grade={grade_ms}ms"
+    )
+    for name, redis_client, seconds in (
+        ("legacy", legacy_redis, legacy_s),
+        ("pipelined", pipelined_redis, pipelined_s),
+    ):
+        print(
+            f"  {name:10s} round_trips={redis_client.round_trips:6d}  "
+            f"bytes={redis_client.bytes_sent / 1024:9.1f} KiB  time={seconds * 1000:8.1f} ms"
+        )
+    print(f"  bulk load: {len(loaded)} students in {load_ms:.1f} ms (1 HGETALL)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    parser.add_argument("--grade-ms", type=float, default=0.0, help="每个学生的模拟批改耗时")
+    args = parser.parse_args()
+    asyncio.run(
+        run(args.students, args.questions, args.concurrency, args.rtt_ms, args.grade_ms)
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+批改记忆服务基准测试：检索与增量持久化
+
+运行方式：
+    python scripts/bench_grading_memory.py --memories 100000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.grading_memory import (  # noqa: E402
+    GradingMemoryService,
+    MemoryImportance,
+    MemoryType,
+)
+from src.services.memory_storage import InMemoryStorageBackend  # noqa: E402
+
+SUBJECTS = ["physics", "mathematics", "chemistry", "economics", "general"]
+QUESTION_TYPES = [f"qt{i}" for i in range(20)]
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def populate(service: GradingMemoryService, count: int) -> list:
+    memory_types = list(MemoryType)
+    importances = list(MemoryImportance)
+    ids = []
+    for i in range(count):
+        ids.append(
+            service.store_memory(
+                memory_type=memory_types[i % len(memory_types)],
+                pattern=f"pattern-{i}",
+                lesson=f"lesson-{i}",
+                importance=importances[i % len(importances)],
+                question_types=[QUESTION_TYPES[i % len(QUESTION_TYPES)]],
+                subject=SUBJECTS[i % len(SUBJECTS)],
+            )
+        )
+    return ids
+
+
+def bench_retrieval(service: GradingMemoryService, queries: int) -> None:
+    start = time.perf_counter()
+    for i in range(queries):
+        service.retrieve_relevant_memories(
+            question_types=[QUESTION_TYPES[i % len(QUESTION_TYPES)]],
+            memory_types=[MemoryType.ERROR_PATTERN, MemoryType.CORRECTION_HISTORY],
+            subject=SUBJECTS[i % (len(SUBJECTS) - 1)],
+            max_results=10,
+        )
+    heap_ms = (time.perf_counter() - start) * 1000 / queries
+
+    # 对照：对全部候选做完整排序
+    entries = list(service._long_term_memory.values())
+    start = time.perf_counter()
+    for _ in range(queries):
+        sorted(entries, key=lambda x: x.relevance_score, reverse=True)[:10]
+    sort_ms = (time.perf_counter() - start) * 1000 / queries
+
+    print(f"retrieve (top-10 heap):        {heap_ms:8.2f} ms/query")
+    print(f"baseline full sort:            {sort_ms:8.2f} ms/query")
+
+
+async def bench_db_save(service: GradingMemoryService, ids: list) -> None:
+    saved, full_ms = await _atimed(service.save_to_db())
+    print(f"save_to_db initial ({saved} rows): {full_ms:8.1f} ms")
+
+    touched = ids[:: max(1, len(ids) // 1000)]
+    for memory_id in touched:
+        service.confirm_memory(memory_id)
+    saved, dirty_ms = await _atimed(service.save_to_db())
+    print(f"save_to_db dirty ({saved} rows):   {dirty_ms:8.1f} ms")
+
+
+async def _atimed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, (time.perf_counter() - start) * 1000
+
+
+def bench_file_save(count: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "grading_memory.json")
+        service = GradingMemoryService(storage_path=path, max_memory_entries=count * 2)
+        ids = populate(service, count)
+        _, initial_ms = _timed(service.save_to_storage)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"file save initial:             {initial_ms:8.1f} ms ({size_mb:.1f} MB)")
+
+        touched = ids[:: max(1, len(ids) // 1000)]
+        for memory_id in touched:
+            service.confirm_memory(memory_id)
+        _, append_ms = _timed(service.save_to_storage)
+        print(f"file save append ({len(touched)} rows): {append_ms:8.1f} ms")
+
+        _, compact_ms = _timed(service.compact_storage)
+        print(f"file compaction:               {compact_ms:8.1f} ms")
+
+        _, load_ms = _timed(GradingMemoryService, storage_path=path)
+        print(f"file load:                     {load_ms:8.1f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--memories", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    service = GradingMemoryService(
+        max_memory_entries=args.memories * 2,
+        storage_backend=InMemoryStorageBackend(),
+    )
+    ids, populate_ms = _timed(populate, service, args.memories)
+    print(f"populate {args.memories} memories:    {populate_ms:8.1f} ms")
+
+    bench_retrieval(service, args.queries)
+    asyncio.run(bench_db_save(service, ids))
+    bench_file_save(args.memories)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+LocalFileStorage 基准测试：旧版 index.json 全量重写 vs SQLite 索引
+
+旧版每次 save 都重写整个 index.json，N 个文件写入 O(N²) 字节，
+因此旧版只跑 --legacy-files 个文件作对照。
+
+运行方式：
+    python scripts/bench_local_file_storage.py --files 50000 --batches 500 --legacy-files 3000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.file_storage import LocalFileStorage, StoredFile  # noqa: E402
+
+
+def bench_legacy(base: str, files: int, batches: int) -> None:
+    """复现改造前的写法：每个文件写盘后 json.dump(indent=2) 整个索引"""
+    index = {}
+    index_file = os.path.join(base, "index.json")
+    start = time.perf_counter()
+    for i in range(files):
+        batch_id = f"batch-{i % batches}"
+        os.makedirs(os.path.join(base, batch_id), exist_ok=True)
+        path = os.path.join(base, batch_id, f"{i}.png")
+        with open(path, "wb") as f:
+            f.write(f"page-{i}".encode())
+        index[str(i)] = StoredFile(
+            file_id=str(i),
+            filename=f"{i}.png",
+            content_type="image/png",
+            size=8,
+            storage_path=path,
+            batch_id=batch_id,
+        )
+        with open(index_file, "w", encoding="utf-8") as f:
+            json.dump({k: v.to_dict() for k, v in index.items()}, f, ensure_ascii=False, indent=2)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for b in range(batches):
+        [f for f in index.values() if f.batch_id == f"batch-{b}"]
+    list_ms = (time.perf_counter() - start) / batches * 1000
+    print(
+        f"legacy json  {files:6d} files: save {elapsed:7.2f} s ({files / elapsed:8.0f} files/s), "
+        f"index {os.path.getsize(index_file) / 1024 / 1024:6.1f} MB, "
+        f"list_by_batch {list_ms:6.2f} ms"
+    )
+
+
+async def bench_sqlite(base: str, files: int, batches: int, concurrency: int, dup: int) -> None:
+    storage = LocalFileStorage(base)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def save(i: int):
+        async with semaphore:
+            # 每 dup 个文件内容相同，用于观察去重
+            content = f"page-{i // dup}".encode()
+            await storage.save(content, f"{i}.png", f"batch-{i % batches}", "image/png")
+
+    start = time.perf_counter()
+    await asyncio.gather(*[save(i) for i in range(files)])
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    total = 0
+    for b in range(batches):
+        total += len(await storage.list_by_batch(f"batch-{b}"))
+    list_ms = (time.perf_counter() - start) / batches * 1000
+    objects = sum(len(names) for _, _, names in os.walk(storage.objects_path))
+    db_mb = os.path.getsize(storage.index.db_path) / 1024 / 1024
+    print(
+        f"sqlite index {files:6d} files: save {elapsed:7.2f} s ({files / elapsed:8.0f} files/s), "
+        f"index {db_mb:6.1f} MB, list_by_batch {list_ms:6.2f} ms, "
+        f"{objects} objects for {total} files"
+    )
+    storage.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--files", type=int, default=50000)
+    parser.add_argument("--batches", type=int, default=500)
+    parser.add_argument("--legacy-files", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--dup", type=int, default=2, help="每多少个文件共享同一内容")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as legacy_dir:
+        bench_legacy(legacy_dir, args.legacy_files, args.batches)
+    with tempfile.TemporaryDirectory() as sqlite_dir:
+        asyncio.run(
+            bench_sqlite(sqlite_dir, args.files, args.batches, args.concurrency, args.dup)
+        )
+
+
+if __name__ == "__main__":
+    main()
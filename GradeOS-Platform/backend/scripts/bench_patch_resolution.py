@@ -0,0 +1,100 @@
+"""
+灰度补丁解析基准测试：每个学生的分组开销
+
+对比进程内快照解析（PatchResolver.resolve）与每个学生读一次 Redis 部署配置的开销，
+并统计对灰度组学生应用补丁到评分标准副本的耗时。
+
+运行方式：
+    python scripts/bench_patch_resolution.py --students 20000 --deployments 3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fakeredis  # noqa: E402
+
+from src.services.canary_metrics import CanaryMetricsAggregator  # noqa: E402
+from src.services.patch_resolution import (  # noqa: E402
+    DEPLOYMENTS_KEY,
+    PatchResolver,
+    apply_patch_to_rubric,
+)
+
+
+def _rubric(questions: int) -> dict:
+    return {
+        "rubric_context": "评分标准\n" * 200,
+        "questions": [
+            {
+                "question_id": str(i),
+                "grading_notes": "注意单位",
+                "scoring_points": [{"point": i}] * 5,
+            }
+            for i in range(1, questions + 1)
+        ],
+    }
+
+
+async def run(students: int, deployments: int, questions: int) -> None:
+    redis_client = fakeredis.FakeAsyncRedis()
+    resolver = PatchResolver(redis_client=redis_client, metrics=CanaryMetricsAggregator())
+    for i in range(deployments):
+        await resolver.publish_deployment(
+            {
+                "deployment_id": f"d{i}",
+                "patch_id": f"p{i}",
+                "version": f"v{i}.0.0",
+                "patch_type": "rule",
+                "content": {
+                    "affected_questions": ["1", "2"],
+                    "enhancement": {"prompt_additions": [f"补丁说明 {i}"]},
+                },
+                "traffic_percentage": 0.1,
+                "deployed_at": f"2026-10-18T00:00:0{i}",
+            }
+        )
+    keys = [f"student-{i}" for i in range(students)]
+
+    start = time.perf_counter()
+    assignments = [resolver.resolve("batch-1", key) for key in keys]
+    snapshot_us = (time.perf_counter() - start) * 1e6 / students
+
+    # 对照：每个学生批改前都从 Redis 读取部署配置
+    sample = min(students, 2000)
+    start = time.perf_counter()
+    for _ in range(sample):
+        raw = await redis_client.hgetall(DEPLOYMENTS_KEY)
+        [json.loads(value) for value in raw.values()]
+    redis_us = (time.perf_counter() - start) * 1e6 / sample
+
+    rubric = _rubric(questions)
+    patched = [a for a in assignments if a.is_patched]
+    start = time.perf_counter()
+    for assignment in patched:
+        apply_patch_to_rubric(rubric, assignment)
+    apply_us = (time.perf_counter() - start) * 1e6 / max(1, len(patched))
+
+    print(f"students={students} deployments={deployments} patched={len(patched)}")
+    print(f"  snapshot resolve:        {snapshot_us:8.2f} us/student")
+    print(f"  redis read per student:  {redis_us:8.2f} us/student (fakeredis, no network)")
+    print(f"  apply patch to rubric:   {apply_us:8.2f} us/patched student ({questions} questions)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--students", type=int, default=20000)
+    parser.add_argument("--deployments", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.students, args.deployments, args.questions))
+
+
+if __name__ == "__main__":
+    main()
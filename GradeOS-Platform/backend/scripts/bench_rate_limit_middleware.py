@@ -0,0 +1,164 @@
+"""
+限流中间件开销基准测试
+
+对比：无限流 / 旧固定窗口（acquire + get_remaining）/ Lua 滑动窗口 / GCRA / GCRA + 本地预租。
+默认使用 fakeredis（进程内，不含网络延迟），可用 --redis-url 指向真实 Redis，
+--rtt-ms 为每次 Redis 往返（单条命令或整条管道）模拟网络延迟。
+
+运行方式：
+    python scripts/bench_rate_limit_middleware.py --requests 2000 --rtt-ms 0.5
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI, Request  # noqa: E402
+from httpx import ASGITransport, AsyncClient  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from src.api.middleware.rate_limit import RateLimitMiddleware  # noqa: E402
+from src.services.rate_limiter import RateLimiter  # noqa: E402
+
+
+def make_redis(url, rtt_ms: float):
+    if url:
+        import redis.asyncio as redis
+
+        base = redis.Redis.from_url(url)
+    else:
+        import fakeredis
+
+        base = fakeredis.FakeAsyncRedis()
+
+    class CountingRedis(type(base)):
+        commands = 0
+
+        async def execute_command(self, *args, **options):
+            type(self).commands += 1
+            if rtt_ms:
+                await asyncio.sleep(rtt_ms / 1000)
+            return await super().execute_command(*args, **options)
+
+        def pipeline(self, *args, **kwargs):
+            pipe = super().pipeline(*args, **kwargs)
+            execute = pipe.execute
+            owner = type(self)
+
+            async def counted_execute(*a, **kw):
+                # 管道整体算一次往返
+                owner.commands += 1
+                if rtt_ms:
+                    await asyncio.sleep(rtt_ms / 1000)
+                return await execute(*a, **kw)
+
+            pipe.execute = counted_execute
+            return pipe
+
+    base.__class__ = CountingRedis
+    return base
+
+
+class LegacyFixedWindowMiddleware(BaseHTTPMiddleware):
+    """改造前的调用方式：acquire（INCR+EXPIRE 管道）后再 get_remaining"""
+
+    def __init__(self, app, redis_client, max_requests: int, window_seconds: int):
+        super().__init__(app)
+        self.limiter = RateLimiter(redis_client, "legacy")
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+
+    async def dispatch(self, request: Request, call_next):
+        key = request.client.host if request.client else "unknown"
+        await self.limiter.acquire(key, self.max_requests, self.window_seconds)
+        remaining = await self.limiter.get_remaining(key, self.max_requests, self.window_seconds)
+        response = await call_next(request)
+        response.headers["X-RateLimit-Remaining"] = str(remaining)
+        return response
+
+
+def build_app(middleware, redis_client, **kwargs) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    if middleware is not None:
+        app.add_middleware(middleware, redis_client=redis_client, **kwargs)
+    return app
+
+
+async def run_case(label: str, app: FastAPI, redis_client, requests: int) -> float:
+    type(redis_client).commands = 0
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://bench") as client:
+        await client.get("/api/ping")  # 预热（加载脚本等）
+        type(redis_client).commands = 0
+        start = time.perf_counter()
+        for _ in range(requests):
+            await client.get("/api/ping")
+        elapsed = time.perf_counter() - start
+    per_request_us = elapsed / requests * 1e6
+    commands = type(redis_client).commands / requests
+    print(
+        f"{label:32s} {per_request_us:9.1f} us/request  "
+        f"{commands:5.2f} redis round trips/request"
+    )
+    return per_request_us
+
+
+async def main_async(args) -> None:
+    limit = args.requests * 10
+    cases = [
+        ("no rate limit", None, {}),
+        (
+            "legacy fixed window",
+            LegacyFixedWindowMiddleware,
+            {"max_requests": limit, "window_seconds": 60},
+        ),
+        ("lua sliding window", RateLimitMiddleware, {"max_requests": limit, "window_seconds": 60}),
+        (
+            "lua gcra",
+            RateLimitMiddleware,
+            {"max_requests": limit, "window_seconds": 60, "algorithm": "gcra"},
+        ),
+        (
+            f"lua gcra + local lease {args.lease}",
+            RateLimitMiddleware,
+            {
+                "max_requests": limit,
+                "window_seconds": 60,
+                "algorithm": "gcra",
+                "local_lease": args.lease,
+            },
+        ),
+    ]
+    baseline = None
+    for label, middleware, kwargs in cases:
+        redis_client = make_redis(args.redis_url, args.rtt_ms)
+        per_request = await run_case(
+            label, build_app(middleware, redis_client, **kwargs), redis_client, args.requests
+        )
+        if baseline is None:
+            baseline = per_request
+        else:
+            print(f"{'':32s} overhead {per_request - baseline:9.1f} us/request")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--redis-url", default=None)
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    parser.add_argument("--lease", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
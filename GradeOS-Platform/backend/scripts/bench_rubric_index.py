@@ -0,0 +1,117 @@
+"""
+评分标准查询基准测试：RubricRegistry 与 CompiledRubricIndex
+
+模拟批改流程：每个学生一个批改节点，对每道题查询若干次评分标准。
+- registry：每个学生重建 RubricRegistry 并逐题查询（原流程）
+- index：每个学生通过 compile_rubric_index 取共享快照并逐题查询
+- index(copy)：图状态经过序列化时，每个节点拿到内容相同的新字典（按内容指纹复用）
+
+运行方式：
+    python scripts/bench_rubric_index.py --questions 60 --students 500
+"""
+
+import argparse
+import copy
+import logging
+import os
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.rubric_registry import (  # noqa: E402
+    RubricRegistry,
+    compile_rubric_index,
+    question_rubric_from_dict,
+)
+
+
+FULL_WIDTH_DIGITS = str.maketrans("0123456789", "０１２３４５６７８９")
+
+
+def build_rubric(questions: int) -> dict:
+    items = []
+    for i in range(1, questions + 1):
+        qid = f"{(i + 1) // 2}{'a' if i % 2 else 'b'}" if i > questions // 2 else str(i)
+        items.append(
+            {
+                "question_id": qid,
+                "max_score": 5,
+                "question_text": f"第 {i} 题题干 " * 10,
+                "standard_answer": "标准答案 " * 20,
+                "grading_notes": "注意单位",
+                "scoring_points": [
+                    {"description": f"得分点 {j}", "score": 1, "point_id": f"{qid}.{j}"}
+                    for j in range(1, 6)
+                ],
+            }
+        )
+    return {"total_score": questions * 5, "questions": items}
+
+
+def lookup_ids(parsed_rubric: dict) -> list:
+    """批改结果中常见的题号写法：原样、带前缀后缀、全角、子题"""
+    ids = []
+    for q in parsed_rubric["questions"]:
+        qid = q["question_id"]
+        ids += [qid, f"第{qid}题", f"Q{qid}", qid.translate(FULL_WIDTH_DIGITS)]
+    ids += ["7c", "99", "第七题"]
+    return ids
+
+
+def _run(setup, ids: list, students: int) -> tuple:
+    """返回 (构建耗时, 查询耗时)，单位秒"""
+    setup_s = lookup_s = 0.0
+    for student in range(students):
+        start = time.perf_counter()
+        index = setup(student)
+        mid = time.perf_counter()
+        for qid in ids:
+            index.get_rubric_for_question(qid)
+        index.calculate_total_max_score()
+        setup_s += mid - start
+        lookup_s += time.perf_counter() - mid
+    return setup_s, lookup_s
+
+
+def registry_setup(parsed_rubric: dict):
+    def setup(_student):
+        registry = RubricRegistry(total_score=parsed_rubric.get("total_score", 100.0))
+        registry.register_rubrics(
+            [question_rubric_from_dict(q) for q in parsed_rubric["questions"]], log=False
+        )
+        return registry
+
+    return setup
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", type=int, default=60)
+    parser.add_argument("--students", type=int, default=500)
+    args = parser.parse_args()
+
+    # 未命中时的默认规则告警不计入耗时
+    logging.disable(logging.WARNING)
+    parsed_rubric = build_rubric(args.questions)
+    ids = lookup_ids(parsed_rubric)
+    lookups = len(ids) * args.students
+
+    copies = [copy.deepcopy(parsed_rubric) for _ in range(args.students)]
+    results = {
+        "registry": _run(registry_setup(parsed_rubric), ids, args.students),
+        "index": _run(lambda _s: compile_rubric_index(parsed_rubric), ids, args.students),
+        "index(copy)": _run(lambda s: compile_rubric_index(copies[s]), ids, args.students),
+    }
+
+    print(f"questions={args.questions} students={args.students} lookups={lookups}")
+    for name, (setup_s, lookup_s) in results.items():
+        print(
+            f"  {name:11s} setup={setup_s * 1000:8.1f} ms  lookups={lookup_s * 1000:8.1f} ms  "
+            f"per lookup={lookup_s * 1e6 / lookups:6.3f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
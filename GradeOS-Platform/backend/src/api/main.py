@@ -11,7 +11,7 @@ if sys.platform == "win32":
 
 import logging
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 # 加载环境变量（必须在其他导入之前）
 from dotenv import load_dotenv
@@ -28,13 +28,17 @@ import redis.asyncio as redis
 # background bootstrap (see _register_api_routes).
 
 from src.api.middleware.rate_limit import RateLimitMiddleware
+from src.services.rate_limiter import load_policy_set_from_env
 from src.api.dependencies import init_orchestrator, close_orchestrator, get_orchestrator
 from src.utils.database import init_db_pool, close_db_pool, db
 from src.utils.pool_manager import UnifiedPoolManager, PoolConfig
 from src.services.enhanced_api import EnhancedAPIService
-from src.services.tracing import TracingService
+from src.services.tracing import TracingConfig, TracingService
 from src.config.deployment_mode import get_deployment_mode, DeploymentMode
 
+if TYPE_CHECKING:
+    from src.services.maintenance_scheduler import MaintenanceScheduler
+
 
 # 配置日志
 # ????
@@ -101,7 +105,7 @@ redis_client: Optional[redis.Redis] = None
 pool_manager: Optional[UnifiedPoolManager] = None
 enhanced_api_service: Optional[EnhancedAPIService] = None
 tracing_service: Optional[TracingService] = None
-grading_retention_task: Optional[asyncio.Task] = None
+maintenance_scheduler: Optional["MaintenanceScheduler"] = None
 
 
 def _env_truthy(name: str) -> bool:
@@ -131,6 +135,11 @@ def _is_grading_retention_enabled() -> bool:
     return not _env_truthy("DISABLE_GRADING_DATA_RETENTION")
 
 
+def _is_maintenance_scheduler_enabled() -> bool:
+    """Default on; disabled only when `DISABLE_MAINTENANCE_SCHEDULER=true`."""
+    return not _env_truthy("DISABLE_MAINTENANCE_SCHEDULER")
+
+
 async def _bootstrap_init(app: FastAPI) -> None:
     """Initialize expensive dependencies in the background.
 
@@ -138,7 +147,7 @@ async def _bootstrap_init(app: FastAPI) -> None:
     bringing the DB/Redis/LangGraph stack online for real traffic.
     """
 
-    global redis_client, pool_manager, enhanced_api_service, tracing_service, grading_retention_task
+    global redis_client, pool_manager, enhanced_api_service, tracing_service, maintenance_scheduler
 
     st = getattr(app.state, "bootstrap", None)
     if st is None:
@@ -217,6 +226,17 @@ async def _bootstrap_init(app: FastAPI) -> None:
                 try:
                     redis_client = pool_manager.get_redis_client()
                     _set_component("redis_client", "ok")
+                    if redis_client is not None:
+                        # 多进程共享灰度指标计数与补丁部署快照
+                        from src.services.canary_metrics import configure_canary_metrics
+                        from src.services.patch_resolution import configure_patch_resolver
+
+                        configure_canary_metrics(redis_client)
+                        try:
+                            await configure_patch_resolver(redis_client)
+                            _set_component("patch_resolver", "ok")
+                        except Exception as exc:
+                            _set_component("patch_resolver", "error", str(exc))
                 except Exception as exc:
                     redis_client = None
                     _set_component("redis_client", "error", str(exc))
@@ -228,33 +248,40 @@ async def _bootstrap_init(app: FastAPI) -> None:
 
             await _step("db_pool", init_db_pool(use_unified_pool=True), timeout_s=25)
 
-            if _is_grading_retention_enabled():
-                try:
-                    from src.services.grading_retention import (
-                        grading_retention_worker_loop,
-                        run_grading_retention_cleanup_once,
-                    )
+            retention_enabled = _is_grading_retention_enabled()
+            if not retention_enabled:
+                _set_component(
+                    "grading_retention_cleanup",
+                    "disabled",
+                    "DISABLE_GRADING_DATA_RETENTION=true",
+                )
+                logger.info("grading retention cleanup disabled by configuration.")
 
-                    retention_summary = await asyncio.wait_for(
-                        run_grading_retention_cleanup_once(), timeout=90
-                    )
-                    _set_component("grading_retention_cleanup", "ok", str(retention_summary))
+            if _is_maintenance_scheduler_enabled():
+                try:
+                    if maintenance_scheduler is None or not maintenance_scheduler.is_running:
+                        from src.services.maintenance_scheduler import build_default_scheduler
 
-                    if grading_retention_task is None or grading_retention_task.done():
-                        grading_retention_task = asyncio.create_task(
-                            grading_retention_worker_loop(run_immediately=False)
+                        maintenance_scheduler = build_default_scheduler(
+                            redis_client=redis_client,
+                            include_retention=retention_enabled,
                         )
-                    _set_component("grading_retention_worker", "ok")
+                        maintenance_scheduler.start()
+                    _set_component(
+                        "maintenance_scheduler",
+                        "ok",
+                        ", ".join(maintenance_scheduler.job_names()),
+                    )
                 except Exception as exc:
-                    _set_component("grading_retention_cleanup", "error", str(exc))
-                    logger.warning("grading retention setup failed: %s", exc)
+                    _set_component("maintenance_scheduler", "error", str(exc))
+                    logger.warning("maintenance scheduler setup failed: %s", exc)
             else:
                 _set_component(
-                    "grading_retention_cleanup",
+                    "maintenance_scheduler",
                     "disabled",
-                    "DISABLE_GRADING_DATA_RETENTION=true",
+                    "DISABLE_MAINTENANCE_SCHEDULER=true",
                 )
-                logger.info("grading retention cleanup disabled by configuration.")
+                logger.info("maintenance scheduler disabled by configuration.")
         else:
             logger.info("Bootstrap: OFFLINE/NO-DB mode detected.")
             redis_client = None
@@ -264,12 +291,24 @@ async def _bootstrap_init(app: FastAPI) -> None:
 
         if pool_manager and not db.is_degraded:
             try:
-                tracing_service = TracingService(pool_manager=pool_manager)
+                tracing_service = TracingService(
+                    pool_manager=pool_manager, config=TracingConfig.from_env()
+                )
+                await tracing_service.start()
                 _set_component("tracing_service", "ok")
             except Exception as exc:
                 tracing_service = None
                 _set_component("tracing_service", "error", str(exc))
 
+            try:
+                from src.services.grading_logger import get_grading_logger
+
+                # 启动批量写入并重放上次遗留的溢写日志
+                await get_grading_logger().start()
+                _set_component("grading_logger", "ok")
+            except Exception as exc:
+                _set_component("grading_logger", "error", str(exc))
+
             try:
                 enhanced_api_service = EnhancedAPIService(
                     pool_manager=pool_manager, tracing_service=tracing_service
@@ -317,6 +356,24 @@ async def _bootstrap_init(app: FastAPI) -> None:
         except Exception as exc:
             _set_component("orchestrator_resume", "error", str(exc))
 
+        try:
+            from src.api.routes import assistant_grading
+
+            # 重新入队上次进程遗留的批量辅助分析
+            await assistant_grading.resume_assistant_jobs()
+            _set_component("assistant_jobs", "ok")
+        except Exception as exc:
+            _set_component("assistant_jobs", "error", str(exc))
+
+        try:
+            from src.services.grading_import import resume_grading_import_jobs
+
+            # 接手中断或租约过期的成绩导入任务
+            await resume_grading_import_jobs()
+            _set_component("grading_import_jobs", "ok")
+        except Exception as exc:
+            _set_component("grading_import_jobs", "error", str(exc))
+
         if _is_redis_task_queue_enabled():
             try:
                 from src.services.redis_task_queue import init_task_queue
@@ -435,7 +492,7 @@ def _register_api_routes(app: FastAPI) -> None:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager. Non-blocking startup for Railway healthchecks."""
-    global redis_client, pool_manager, enhanced_api_service, tracing_service, grading_retention_task
+    global redis_client, pool_manager, enhanced_api_service, tracing_service, maintenance_scheduler
 
     app.state.bootstrap = {
         "status": "starting",
@@ -463,16 +520,37 @@ async def lifespan(app: FastAPI):
             except Exception:
                 logger.warning("Bootstrap task did not shut down cleanly.", exc_info=True)
 
-        if grading_retention_task is not None:
-            grading_retention_task.cancel()
+        if maintenance_scheduler is not None:
             try:
-                await grading_retention_task
-            except asyncio.CancelledError:
-                pass
+                await maintenance_scheduler.stop()
             except Exception:
-                logger.warning("Grading retention task did not shut down cleanly.", exc_info=True)
+                logger.warning("Maintenance scheduler did not shut down cleanly.", exc_info=True)
             finally:
-                grading_retention_task = None
+                maintenance_scheduler = None
+
+        # Shutdown annotation render pool.
+        try:
+            from src.services.annotation_export_pipeline import shutdown_render_executor
+
+            shutdown_render_executor()
+        except Exception as e:
+            logger.warning(f"Annotation render pool shutdown failed: {e}")
+
+        # Stop assistant analysis job pool (running jobs are resumed on next start).
+        try:
+            from src.services.assistant_job_pool import shutdown_assistant_job_pool
+
+            await shutdown_assistant_job_pool()
+        except Exception as e:
+            logger.warning(f"Assistant job pool shutdown failed: {e}")
+
+        # Stop grading import jobs (leases are released and resumed on next start).
+        try:
+            from src.services.grading_import import shutdown_grading_import_service
+
+            await shutdown_grading_import_service()
+        except Exception as e:
+            logger.warning(f"Grading import service shutdown failed: {e}")
 
         # Shutdown Redis task queue.
         try:
@@ -498,6 +576,35 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             logger.warning(f"Enhanced API service stop failed: {e}")
 
+        try:
+            from src.services.patch_resolution import shutdown_patch_resolver
+
+            await shutdown_patch_resolver()
+        except Exception as e:
+            logger.warning(f"Patch resolver stop failed: {e}")
+
+        try:
+            from src.services.grading_checkpoint import shutdown_checkpoint_writer
+
+            await shutdown_checkpoint_writer()
+        except Exception as e:
+            logger.warning(f"Checkpoint writer flush failed: {e}")
+
+        # Flush buffered grading logs before pools close.
+        try:
+            from src.services.grading_logger import shutdown_grading_logger
+
+            await shutdown_grading_logger()
+        except Exception as e:
+            logger.warning(f"Grading logger stop failed: {e}")
+
+        # Flush remaining trace spans before pools close.
+        try:
+            if tracing_service:
+                await tracing_service.stop()
+        except Exception as e:
+            logger.warning(f"Tracing service stop failed: {e}")
+
         # Close pools.
         try:
             if pool_manager:
@@ -536,13 +643,14 @@ app.add_middleware(
 async def add_rate_limit_middleware():
     """在启动后添加限流中间件"""
     if redis_client:
+        # 默认每分钟 100 个请求；路由策略见 RATE_LIMIT_ROUTES
+        policies = load_policy_set_from_env()
         app.add_middleware(
             RateLimitMiddleware,
             redis_client=redis_client,
-            max_requests=100,  # 每分钟 100 个请求
-            window_seconds=60,
+            policies=policies,
         )
-        logger.info("限流中间件已启用")
+        logger.info(f"限流中间件已启用（路由策略 {len(policies.routes)} 条）")
 
 
 # 全局异常处理器
@@ -641,6 +749,22 @@ async def get_api_stats():
     return enhanced_api_service.stats
 
 
+@app.get("/api/v1/admin/maintenance", tags=["admin"])
+async def get_maintenance_metrics():
+    """
+    获取后台维护任务统计
+
+    返回各维护任务的运行次数、处理行数和最近错误。
+    """
+    if maintenance_scheduler is None:
+        return {"running": False, "jobs": {}}
+
+    return {
+        "running": maintenance_scheduler.is_running,
+        "jobs": maintenance_scheduler.get_metrics(),
+    }
+
+
 @app.get("/api/teacher/classes", tags=["class bootstrap"])
 async def bootstrap_get_teacher_classes(teacher_id: str):
     """
@@ -1,14 +1,21 @@
 """限流中间件"""
 
 import logging
-from typing import Callable
-from datetime import datetime, timezone
+from typing import Callable, Optional
 
-from fastapi import Request, Response, HTTPException, status
+from fastapi import Request, Response, status
+from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 import redis.asyncio as redis
 
-from src.services.rate_limiter import RateLimiter
+from src.services.rate_limiter import (
+    ALGORITHM_SLIDING_WINDOW,
+    LocalLeaseLimiter,
+    RateLimitDecision,
+    RateLimitPolicy,
+    RateLimitPolicySet,
+    ScriptedRateLimiter,
+)
 
 
 logger = logging.getLogger(__name__)
@@ -21,6 +28,9 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
     对所有 API 端点应用限流策略，防止滥用和保护系统稳定性。
     当请求超出限制时返回 429 状态码和 retry-after 头。
 
+    每个请求只做一次 Lua 判定（允许 / 剩余 / 重置时间一并返回）；
+    策略启用 local_lease 时大部分请求在进程内完成判定。
+
     验证：需求 8.3
     """
 
@@ -31,6 +41,9 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         max_requests: int = 100,
         window_seconds: int = 60,
         key_prefix: str = "api_rate_limit",
+        algorithm: str = ALGORITHM_SLIDING_WINDOW,
+        local_lease: int = 0,
+        policies: Optional[RateLimitPolicySet] = None,
     ):
         """
         初始化限流中间件
@@ -41,9 +54,23 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             max_requests: 时间窗口内允许的最大请求数（默认 100）
             window_seconds: 时间窗口大小（秒，默认 60）
             key_prefix: Redis 键前缀
+            algorithm: 默认策略算法（sliding_window / gcra）
+            local_lease: 默认策略的进程内预租令牌数（仅 gcra）
+            policies: 路由策略集（提供时忽略 max_requests / window_seconds /
+                algorithm / local_lease）
         """
         super().__init__(app)
-        self.rate_limiter = RateLimiter(redis_client, key_prefix)
+        self.rate_limiter = ScriptedRateLimiter(redis_client, key_prefix)
+        self.local_limiter = LocalLeaseLimiter(self.rate_limiter)
+        self.policies = policies or RateLimitPolicySet(
+            default=RateLimitPolicy(
+                name="default",
+                limit=max_requests,
+                window_seconds=window_seconds,
+                algorithm=algorithm,
+                local_lease=local_lease,
+            )
+        )
         self.max_requests = max_requests
         self.window_seconds = window_seconds
 
@@ -108,70 +135,11 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         if self._should_skip_rate_limit(request):
             return await call_next(request)
 
-        # 获取客户端标识符
+        policy = self.policies.resolve(request.url.path)
         client_id = self._get_client_identifier(request)
 
         try:
-            # 尝试获取限流令牌
-            allowed = await self.rate_limiter.acquire(
-                key=client_id, max_requests=self.max_requests, window_seconds=self.window_seconds
-            )
-
-            if not allowed:
-                # 超出限流，返回 429
-                # 获取限流详细信息
-                rate_info = await self.rate_limiter.get_rate_limit_info(
-                    key=client_id,
-                    max_requests=self.max_requests,
-                    window_seconds=self.window_seconds,
-                )
-
-                # 计算 retry-after（距离窗口重置的秒数）
-                retry_after = rate_info.get("ttl_seconds", self.window_seconds)
-
-                logger.warning(
-                    f"限流拒绝请求: client={client_id}, "
-                    f"path={request.url.path}, "
-                    f"used={rate_info.get('used')}/{self.max_requests}"
-                )
-
-                # 返回 429 Too Many Requests
-                raise HTTPException(
-                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                    detail={
-                        "error": "rate_limit_exceeded",
-                        "message": f"请求过于频繁，请在 {retry_after} 秒后重试",
-                        "limit": self.max_requests,
-                        "window_seconds": self.window_seconds,
-                        "retry_after": retry_after,
-                    },
-                    headers={
-                        "Retry-After": str(retry_after),
-                        "X-RateLimit-Limit": str(self.max_requests),
-                        "X-RateLimit-Remaining": "0",
-                        "X-RateLimit-Reset": rate_info.get("reset_at", ""),
-                    },
-                )
-
-            # 获取剩余配额
-            remaining = await self.rate_limiter.get_remaining(
-                key=client_id, max_requests=self.max_requests, window_seconds=self.window_seconds
-            )
-
-            # 处理请求
-            response = await call_next(request)
-
-            # 添加限流信息到响应头
-            response.headers["X-RateLimit-Limit"] = str(self.max_requests)
-            response.headers["X-RateLimit-Remaining"] = str(remaining)
-            response.headers["X-RateLimit-Window"] = str(self.window_seconds)
-
-            return response
-
-        except HTTPException:
-            # 重新抛出 HTTPException（包括 429）
-            raise
-
+            decision = await self.local_limiter.check(client_id, policy)
         except Exception as e:
             # 限流器错误：记录日志，允许请求通过（fail-open）
             logger.error(
@@ -181,6 +149,52 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             )
             return await call_next(request)
 
+        if not decision.allowed:
+            return self._reject(request, client_id, policy, decision)
+
+        response = await call_next(request)
+
+        # 添加限流信息到响应头
+        response.headers["X-RateLimit-Limit"] = str(decision.limit)
+        response.headers["X-RateLimit-Remaining"] = str(decision.remaining)
+        response.headers["X-RateLimit-Reset"] = str(decision.reset_after_seconds)
+        response.headers["X-RateLimit-Window"] = str(policy.window_seconds)
+        return response
+
+    def _reject(
+        self,
+        request: Request,
+        client_id: str,
+        policy: RateLimitPolicy,
+        decision: RateLimitDecision,
+    ) -> Response:
+        """返回 429 Too Many Requests"""
+        retry_after = decision.retry_after_seconds
+
+        logger.warning(
+            f"限流拒绝请求: client={client_id}, "
+            f"path={request.url.path}, policy={policy.name}, limit={decision.limit}"
+        )
+
+        return JSONResponse(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            content={
+                "detail": {
+                    "error": "rate_limit_exceeded",
+                    "message": f"请求过于频繁，请在 {retry_after} 秒后重试",
+                    "limit": decision.limit,
+                    "window_seconds": policy.window_seconds,
+                    "retry_after": retry_after,
+                }
+            },
+            headers={
+                "Retry-After": str(retry_after),
+                "X-RateLimit-Limit": str(decision.limit),
+                "X-RateLimit-Remaining": "0",
+                "X-RateLimit-Reset": str(decision.reset_after_seconds),
+            },
+        )
+
 
 def create_rate_limit_middleware(
     redis_client: redis.Redis, max_requests: int = 100, window_seconds: int = 60
@@ -7,13 +7,16 @@ API 端点：
 - POST /assistant/analyze/batch - 批量分析
 - GET /assistant/report/{analysis_id} - 获取分析报告
 - GET /assistant/status/{analysis_id} - 获取分析状态
+- GET /assistant/batch/{batch_id} - 获取批量分析进度
+- POST /assistant/cancel/{target_id} - 取消单个分析或整个批次
+- POST /assistant/resume/{batch_id} - 重新执行批次中未完成的分析
 - WebSocket /assistant/ws/{analysis_id} - 实时进度推送
 """
 
 import uuid
 import logging
 import asyncio
-from typing import List, Optional, Dict, Any
+from typing import Awaitable, Callable, List, Optional, Dict, Any
 from datetime import datetime
 
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Depends
@@ -23,6 +26,12 @@ from pydantic import BaseModel, Field, field_validator
 from src.orchestration.base import Orchestrator, RunStatus
 from src.api.dependencies import get_orchestrator
 from src.graphs.state import create_initial_assistant_state
+from src.services.assistant_job_pool import (
+    JOB_CANCELLED,
+    AssistantJob,
+    AssistantJobPool,
+    get_assistant_job_pool,
+)
 from src.models.assistant_models import (
     AnalyzeRequest,
     AnalyzeResponse,
@@ -188,47 +197,31 @@ async def batch_analyze_assignments(
             f"[AssistantAPI] 收到批量分析请求: batch_id={batch_id}, count={len(request.analyses)}"
         )
 
-        # 为每个任务创建独立的分析
+        # 为每个任务创建独立的分析，交给有界并发的任务池排队执行
+        jobs = []
         for idx, analyze_request in enumerate(request.analyses):
             analysis_id = f"ana_{batch_id}_{idx:03d}"
             analysis_ids.append(analysis_id)
-
-            # 创建初始状态
-            initial_state = create_initial_assistant_state(
-                analysis_id=analysis_id,
-                images=analyze_request.images,
-                submission_id=analyze_request.submission_id,
-                student_id=analyze_request.student_id,
-                subject=analyze_request.subject,
-                context_info=analyze_request.context_info,
-            )
-
-            # 异步启动工作流
-            config = {
-                "configurable": {
-                    "thread_id": analysis_id,
-                },
-                "recursion_limit": 10,
-            }
-
-            asyncio.create_task(
-                _run_analysis_workflow(
-                    orchestrator=orchestrator,
-                    analysis_id=analysis_id,
-                    initial_state=initial_state,
-                    config=config,
+            jobs.append(
+                AssistantJob(
+                    job_id=analysis_id,
+                    batch_id=batch_id,
+                    payload=analyze_request.model_dump(),
                 )
             )
 
+        pool = await _get_job_pool()
+        await pool.submit(jobs)
+
         logger.info(
-            f"[AssistantAPI] 批量分析任务已启动: batch_id={batch_id}, count={len(analysis_ids)}"
+            f"[AssistantAPI] 批量分析任务已入队: batch_id={batch_id}, count={len(analysis_ids)}"
         )
 
         return BatchAnalyzeResponse(
             batch_id=batch_id,
             total_count=len(analysis_ids),
             analysis_ids=analysis_ids,
-            message=f"已启动 {len(analysis_ids)} 个分析任务",
+            message=f"已提交 {len(analysis_ids)} 个分析任务，可通过 WebSocket /ws/{batch_id} 获取批次进度",
         )
 
     except Exception as e:
@@ -314,6 +307,59 @@ async def get_analysis_status(
         raise HTTPException(status_code=500, detail=f"获取状态失败: {str(e)}")
 
 
+@router.get("/batch/{batch_id}")
+async def get_batch_progress(batch_id: str):
+    """
+    获取批量分析进度
+
+    Args:
+        batch_id: 批量分析 ID
+
+    Returns:
+        批次汇总进度与各分析任务状态
+    """
+    pool = await _get_job_pool()
+    await pool.refresh_batch(batch_id)
+    progress = pool.batch_progress(batch_id)
+    if not progress["total"]:
+        raise HTTPException(status_code=404, detail=f"批量分析不存在: {batch_id}")
+    return progress
+
+
+@router.post("/cancel/{target_id}")
+async def cancel_analysis(target_id: str):
+    """
+    取消分析任务
+
+    Args:
+        target_id: 分析任务 ID 或批量分析 ID（取消批次中所有未完成的分析）
+
+    Returns:
+        被取消的任务数
+    """
+    pool = await _get_job_pool()
+    cancelled = await pool.cancel(target_id)
+    logger.info(f"[AssistantAPI] 取消分析: target_id={target_id}, cancelled={cancelled}")
+    return {"target_id": target_id, "cancelled": cancelled}
+
+
+@router.post("/resume/{batch_id}")
+async def resume_batch_analysis(batch_id: str):
+    """
+    重新执行批次中已取消、失败或被中断的分析
+
+    Args:
+        batch_id: 批量分析 ID
+
+    Returns:
+        重新入队的任务数
+    """
+    pool = await _get_job_pool()
+    resumed = await pool.resume(batch_id)
+    logger.info(f"[AssistantAPI] 恢复批量分析: batch_id={batch_id}, resumed={resumed}")
+    return {"batch_id": batch_id, "resumed": resumed}
+
+
 @router.websocket("/ws/{analysis_id}")
 async def analysis_progress_ws(
     websocket: WebSocket,
@@ -324,6 +370,8 @@ async def analysis_progress_ws(
 
     连接后会持续接收分析进度更新，直到分析完成或连接断开。
 
+    analysis_id 也可以是批量分析 ID，此时推送 type=batch_progress 的批次汇总进度。
+
     消息格式：
     ```json
     {
@@ -397,6 +445,9 @@ async def _run_analysis_workflow(
     analysis_id: str,
     initial_state: Dict[str, Any],
     config: Dict[str, Any],
+    report: Optional[Callable[[str, float], Awaitable[None]]] = None,
+    resume: bool = False,
+    raise_on_error: bool = False,
 ):
     """
     运行分析工作流（内部函数）
@@ -406,7 +457,11 @@ async def _run_analysis_workflow(
         analysis_id: 分析任务 ID
         initial_state: 初始状态
         config: 配置
+        report: 阶段进度回调（任务池用于汇总批次进度）
+        resume: 检查点中有未完成的运行时从检查点继续
+        raise_on_error: 失败时在广播错误后重新抛出
     """
+    current_state: Dict[str, Any] = {}
     try:
         logger.info(f"[AssistantWorkflow] 开始执行工作流: analysis_id={analysis_id}")
 
@@ -419,8 +474,15 @@ async def _run_analysis_workflow(
             )
         )
 
+        stream_input: Optional[Dict[str, Any]] = initial_state
+        if resume and getattr(graph, "checkpointer", None) is not None:
+            snapshot = await graph.aget_state(config)
+            if snapshot is not None and snapshot.next:
+                logger.info(f"[AssistantWorkflow] 从检查点恢复: analysis_id={analysis_id}")
+                stream_input = None
+
         # 流式执行工作流
-        async for state_update in graph.astream(initial_state, config=config):
+        async for state_update in graph.astream(stream_input, config=config):
             logger.debug(f"[AssistantWorkflow] 状态更新: {state_update}")
 
             # 提取当前状态信息
@@ -445,6 +507,11 @@ async def _run_analysis_workflow(
                     },
                 },
             )
+            if report is not None:
+                await report(
+                    current_state.get("current_stage", "unknown"),
+                    current_state.get("percentage", 0.0),
+                )
 
         # 工作流完成
         logger.info(f"[AssistantWorkflow] 工作流完成: analysis_id={analysis_id}")
@@ -475,6 +542,73 @@ async def _run_analysis_workflow(
                 "timestamp": datetime.now().isoformat(),
             },
         )
+        if raise_on_error:
+            raise
+
+
+async def _run_assistant_job(
+    job: AssistantJob,
+    report: Callable[[str, float], Awaitable[None]],
+) -> None:
+    """任务池执行单个批量分析任务；重试或重启后的任务从检查点继续"""
+    payload = job.payload
+    initial_state = create_initial_assistant_state(
+        analysis_id=job.job_id,
+        images=payload.get("images") or [],
+        submission_id=payload.get("submission_id"),
+        student_id=payload.get("student_id"),
+        subject=payload.get("subject"),
+        context_info=payload.get("context_info"),
+    )
+    config = {
+        "configurable": {
+            "thread_id": job.job_id,
+        },
+        "recursion_limit": 10,
+    }
+    await _run_analysis_workflow(
+        orchestrator=await get_orchestrator(),
+        analysis_id=job.job_id,
+        initial_state=initial_state,
+        config=config,
+        report=report,
+        resume=job.attempts > 1,
+        raise_on_error=True,
+    )
+
+
+async def _broadcast_job_update(job: AssistantJob, progress: Dict[str, Any]) -> None:
+    """批次汇总进度推送到 /ws/{batch_id}；取消的任务同时通知其分析通道"""
+    timestamp = datetime.now().isoformat()
+    await _broadcast_message(
+        job.batch_id,
+        {
+            "type": "batch_progress",
+            **progress,
+            "analysis_id": job.job_id,
+            "analysis_status": job.status,
+            "timestamp": timestamp,
+        },
+    )
+    if job.status == JOB_CANCELLED:
+        await _broadcast_message(
+            job.job_id,
+            {
+                "type": "cancelled",
+                "analysis_id": job.job_id,
+                "timestamp": timestamp,
+            },
+        )
+
+
+async def _get_job_pool() -> AssistantJobPool:
+    return await get_assistant_job_pool(_run_assistant_job, on_update=_broadcast_job_update)
+
+
+async def resume_assistant_jobs() -> int:
+    """启动时恢复上次进程遗留的未完成批量分析"""
+    pool = await _get_job_pool()
+    return await pool.resume()
 
 
 # ==================== 健康检查 ====================
@@ -15,11 +15,12 @@ import base64
 import json
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 
 from fastapi import (
     APIRouter,
     HTTPException,
+    Request,
     UploadFile,
     File,
     Form,
@@ -43,6 +44,11 @@ from src.utils.image import to_jpeg_bytes, pil_to_jpeg_bytes
 from src.utils.pool_manager import UnifiedPoolManager, PoolNotInitializedError
 from src.services.grading_run_control import GradingRunSnapshot, get_run_controller
 from src.services.file_storage import get_file_storage_service, StoredFile
+from src.services.grading_logger import (
+    get_grading_logger,
+    grading_log_id,
+    grading_submission_id,
+)
 
 # PostgreSQL 作为主存储
 from src.db import (
@@ -3781,6 +3787,8 @@ async def submit_results_review(
 
                     updated_scores: List[float] = []
                     updated_keys: set[str] = set()
+                    # 教师改分：(日志 ID, 改判后分数)，保存完成后回写批改日志
+                    score_overrides: List[tuple[str, float]] = []
 
                     for incoming in request.results:
                         student_key = (
@@ -3858,6 +3866,17 @@ async def submit_results_review(
                             )
                             if updated_feedback is not None:
                                 target["feedback"] = updated_feedback
+                            if (
+                                updated_score is not None
+                                and _safe_float(updated_score) != original_score
+                            ):
+                                submission_id = grading_submission_id(history.id, student_key)
+                                score_overrides.append(
+                                    (
+                                        grading_log_id(submission_id, question_id),
+                                        _safe_float(updated_score),
+                                    )
+                                )
 
                         existing_data["questionResults"] = question_results
 
@@ -3922,6 +3941,15 @@ async def submit_results_review(
                                 summary["average_score"] = history.average_score
                             history.result_data = history_data
                         await save_grading_history(history)
+
+                    teacher_id = history.teacher_id or history_data.get("teacher_id")
+                    if score_overrides and teacher_id:
+                        grading_logger = get_grading_logger()
+                        override_reason = request.notes or "教师复核改分"
+                        for log_id, override_score in score_overrides:
+                            await grading_logger.log_override(
+                                log_id, override_score, override_reason, str(teacher_id)
+                            )
             except Exception as exc:
                 logger.error("保存复核结果失败: %s", exc, exc_info=True)
 
@@ -4048,6 +4076,7 @@ class ExportAnnotatedImagesRequest(BaseModel):
     """导出带批注图片请求"""
 
     include_original: bool = Field(default=False, description="是否包含原始图片")
+    format: Literal["zip", "pdf"] = Field(default="zip", description="导出格式：zip / pdf")
 
 
 class ExportExcelRequest(BaseModel):
@@ -4070,14 +4099,89 @@ async def export_annotated_images(
     orchestrator: Orchestrator = Depends(get_orchestrator),
 ):
     """
-    导出带批注的学生作答图片 (ZIP)
+    导出带批注的学生作答图片 (ZIP / PDF)
 
-    将所有学生的作答图片渲染批注后打包为 ZIP 下载
+    页面在渲染进程池中并行渲染，边渲染边流式写出，下载立即开始
     """
-    raise HTTPException(
-        status_code=410,
-        detail="后端批注渲染已禁用，请使用前端 Canvas 渲染与导出。",
-    )
+    from fastapi.responses import StreamingResponse
+    from src.services.annotation_export_pipeline import AnnotatedExportPipeline
+    from src.services.export_service import ExportConfig
+
+    try:
+        if not orchestrator:
+            raise HTTPException(status_code=503, detail="编排器未初始化")
+
+        run_id = f"batch_grading_{batch_id}"
+        run_info = await orchestrator.get_run_info(run_id)
+
+        if not run_info:
+            raise HTTPException(status_code=404, detail="批次不存在")
+
+        state = run_info.state or {}
+        student_results = (
+            state.get("reviewed_results")
+            or state.get("confessed_results")
+            or state.get("student_results", [])
+        )
+        if not student_results:
+            raise HTTPException(status_code=404, detail="无批改结果")
+
+        formatted_results = _format_results_for_frontend(
+            student_results,
+            parsed_rubric=state.get("parsed_rubric"),
+        )
+
+        images = _decode_state_images(
+            state.get("processed_images") or state.get("answer_images") or []
+        )
+        if not images:
+            images = await get_batch_images_as_bytes_list(batch_id, "answer")
+        if not images:
+            raise HTTPException(status_code=404, detail="无作答图片")
+
+        pipeline = AnnotatedExportPipeline(
+            ExportConfig(include_original=request.include_original)
+        )
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if request.format == "pdf":
+            body = pipeline.stream_pdf(formatted_results, images)
+            media_type = "application/pdf"
+            filename = f"annotated_{batch_id}_{timestamp}.pdf"
+        else:
+            body = pipeline.stream_zip(formatted_results, images, batch_id)
+            media_type = "application/zip"
+            filename = f"annotated_{batch_id}_{timestamp}.zip"
+
+        return StreamingResponse(
+            body,
+            media_type=media_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"导出批注图片失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"导出失败: {str(e)}")
+
+
+def _decode_state_images(raw_images: List[Any]) -> List[bytes]:
+    """将 state 中的图片（bytes / base64 / data URI）统一为 bytes"""
+    images: List[bytes] = []
+    for img in raw_images:
+        if isinstance(img, (bytes, bytearray)):
+            images.append(bytes(img))
+        elif isinstance(img, str) and img:
+            if img.startswith("http://") or img.startswith("https://"):
+                # URL 形式无法直接渲染，交由数据库回退加载
+                return []
+            payload = img.split(",", 1)[1] if img.startswith("data:") else img
+            try:
+                images.append(base64.b64decode(payload))
+            except Exception as exc:
+                logger.debug(f"Failed to decode answer image: {exc}")
+                return []
+    return images
 
 
 @router.post("/export/excel/{batch_id}")
@@ -4426,28 +4530,118 @@ async def get_file(file_id: str):
         raise HTTPException(status_code=500, detail=f"获取文件信息失败: {str(e)}")
 
 
+def _parse_range_header(range_header: str, size: int) -> Optional[tuple]:
+    """解析单区间 Range 头（bytes=a-b / bytes=a- / bytes=-n），返回闭区间 (start, end)
+
+    格式不支持（如多区间）时返回 None 以回退为完整响应；区间不可满足时抛出 416。
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            suffix = int(last)
+            if suffix <= 0:
+                raise ValueError
+            start = max(0, size - suffix)
+            end = size - 1
+    except ValueError:
+        return None
+    end = min(end, size - 1)
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="请求区间无效",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+@router.post("/{batch_id}/files/upload")
+async def upload_batch_file(
+    batch_id: str,
+    request: Request,
+    filename: str,
+    file_type: str = "answer",
+    page_index: Optional[int] = None,
+):
+    """上传单个原始文件：请求体直接流式写入存储后端，不在内存中缓冲完整文件"""
+    metadata: Dict[str, Any] = {"type": file_type}
+    if page_index is not None:
+        metadata["page_index"] = page_index
+    content_type = request.headers.get("content-type")
+    if content_type and content_type.startswith("multipart/"):
+        raise HTTPException(status_code=415, detail="请直接以请求体上传文件内容")
+    try:
+        file_storage = get_file_storage_service()
+        stored = await file_storage.save_stream(
+            batch_id,
+            request.stream(),
+            filename=filename,
+            content_type=content_type,
+            metadata=metadata,
+        )
+        return stored.to_dict()
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"流式上传文件失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"上传文件失败: {str(e)}")
+
+
 @router.get("/files/{file_id}/download")
-async def download_file(file_id: str):
-    """下载文件"""
-    from fastapi.responses import Response
-    
+async def download_file(file_id: str, request: Request):
+    """下载文件（流式输出，支持单区间 Range 请求）"""
+    from fastapi.responses import StreamingResponse
+
     try:
         file_storage = get_file_storage_service()
         file_info = await file_storage.get_file_info(file_id)
-        
+
         if not file_info:
             raise HTTPException(status_code=404, detail="文件不存在")
-        
-        content = await file_storage.get_file(file_id)
-        if not content:
+
+        headers = {
+            "Content-Disposition": f'attachment; filename="{file_info.filename}"',
+            "Accept-Ranges": "bytes",
+        }
+        status_code = 200
+        start, end = 0, None
+        byte_range = None
+        range_header = request.headers.get("range")
+        if range_header and file_info.size:
+            byte_range = _parse_range_header(range_header, file_info.size)
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{file_info.size}"
+            headers["Content-Length"] = str(end - start + 1)
+        else:
+            headers["Content-Length"] = str(file_info.size)
+
+        # 先取第一块，文件缺失时仍能返回 404 而不是中断的 200
+        chunks = file_storage.open_file_range(file_id, start, end)
+        try:
+            first_chunk = await chunks.__anext__()
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="文件内容不存在")
-        
-        return Response(
-            content=content,
+        except StopAsyncIteration:
+            first_chunk = b""
+
+        async def body():
+            yield first_chunk
+            async for chunk in chunks:
+                yield chunk
+
+        return StreamingResponse(
+            body(),
+            status_code=status_code,
             media_type=file_info.content_type,
-            headers={
-                "Content-Disposition": f'attachment; filename="{file_info.filename}"',
-            },
+            headers=headers,
         )
     except HTTPException:
         raise
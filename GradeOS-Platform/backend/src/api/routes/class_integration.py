@@ -2,6 +2,7 @@
 
 按照 implementation_plan.md 实现：
 - POST /grading/{batch_id}/import-to-class
+- GET /grading/import-jobs/{job_id}
 - POST /grading/{batch_id}/revoke
 - GET /class/{class_id}/grading-history
 - POST /homework/{homework_id}/grade
@@ -10,27 +11,23 @@ Requirements: Phase 6
 """
 
 import os
-import json
 import uuid
 import logging
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header
 from pydantic import BaseModel
 
 # PostgreSQL 作为主存储
 from src.db import (
-    GradingHistory,
-    StudentGradingResult,
-    save_grading_history,
-    save_student_result,
     get_grading_history,
-    get_student_results,
     list_grading_history,
     get_homework_submissions,
     get_connection,
+    get_class_by_id,
 )
+from src.services.grading_import import get_grading_import_service
 
 from src.orchestration.langgraph_orchestrator import Orchestrator
 from src.api.dependencies import get_orchestrator
@@ -51,6 +48,7 @@ class StudentMapping(BaseModel):
 
     student_key: str  # 批改结果中的学生标识
     student_id: str  # 班级系统中的学生 ID
+    class_id: Optional[str] = None  # 指定时该学生只导入此班级
 
 
 class ImportToClassRequest(BaseModel):
@@ -58,6 +56,8 @@ class ImportToClassRequest(BaseModel):
 
     class_ids: List[str]
     student_mapping: List[StudentMapping]
+    homework_id: Optional[str] = None  # 指定时同时写入 homework_submissions 的分数
+    idempotency_key: Optional[str] = None  # 也可通过 Idempotency-Key 请求头传入
 
 
 class ImportToClassResponse(BaseModel):
@@ -67,6 +67,27 @@ class ImportToClassResponse(BaseModel):
     imported_count: int
     history_id: str
     message: str
+    job_id: str = ""
+    status: str = "queued"
+
+
+class ImportJobStatusResponse(BaseModel):
+    """导入任务进度"""
+
+    job_id: str
+    batch_id: str
+    history_id: str
+    status: str
+    class_ids: List[str]
+    classes_done: List[str]
+    imported_count: int
+    total_students: int
+    average_score: Optional[float]
+    percentage: float
+    attempts: int
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    finished_at: Optional[str] = None
 
 
 class RevokeRequest(BaseModel):
@@ -188,44 +209,32 @@ async def get_submissions_for_grading(
     )
 
 
-@router.post("/grading/{batch_id}/import-to-class", response_model=ImportToClassResponse)
+@router.post(
+    "/grading/{batch_id}/import-to-class",
+    response_model=ImportToClassResponse,
+    status_code=202,
+)
 async def import_grading_to_class(
     batch_id: str,
     request: ImportToClassRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     orchestrator: Orchestrator = Depends(get_orchestrator),
 ):
     """
-    导入批改结果到班级系统
+    导入批改结果到班级系统（异步任务）
 
-    将批改结果与班级学生关联，并保存到 PostgreSQL。
+    提交后立即返回 job_id，进度通过 GET /grading/import-jobs/{job_id} 查询。
+    相同 Idempotency-Key 的重试返回同一任务，不会重复导入；需要重新导入时使用新的
+    Idempotency-Key。未提供时按请求内容生成，只对进行中的任务去重，任务完成后
+    再次提交会重新导入。
     """
     logger.info(f"导入批改结果到班级: batch_id={batch_id}, classes={request.class_ids}")
+    if not request.class_ids:
+        raise HTTPException(status_code=400, detail="必须选择班级")
 
-    async def _load_from_db() -> List[Dict[str, Any]]:
-        history = await get_grading_history(batch_id)
-        if not history:
-            return []
-        results: List[Dict[str, Any]] = []
-        for row in await get_student_results(history.id):
-            data = row.result_data
-            if isinstance(data, str):
-                try:
-                    data = json.loads(data)
-                except Exception:
-                    data = {}
-            if not isinstance(data, dict):
-                data = {}
-            if not data:
-                data = {
-                    "studentName": row.student_key,
-                    "score": row.score,
-                    "maxScore": row.max_score,
-                }
-            results.append(data)
-        return results
-
-    student_results: List[Dict[str, Any]] = []
-    # 获取批改结果
+    # 编排器内存中有结果时直接使用，否则由任务从数据库分块读取
+    student_results: Optional[List[Dict[str, Any]]] = None
+    run_info = None
     if orchestrator:
         run_id = f"batch_grading_{batch_id}"
         run_info = await orchestrator.get_run_info(run_id)
@@ -236,86 +245,63 @@ async def import_grading_to_class(
                 final_output = await orchestrator.get_final_output(run_id)
                 if final_output:
                     student_results = final_output.get("student_results", [])
-        else:
-            student_results = await _load_from_db()
             if not student_results:
-                raise HTTPException(status_code=404, detail="批改批次不存在")
-    else:
-        student_results = await _load_from_db()
+                raise HTTPException(status_code=400, detail="未找到批改结果")
 
-    if not student_results:
-        raise HTTPException(status_code=400, detail="未找到批改结果")
-
-    # 建立 student_key -> student_id 映射
-    key_to_id = {m.student_key: m.student_id for m in request.student_mapping}
-
-    # 计算平均分
-    total_score = 0.0
-    total_max = 0.0
-    for result in student_results:
-        total_score += result.get("totalScore", result.get("score", 0) or 0)
-        total_max += result.get("maxTotalScore", result.get("maxScore", 0) or 0)
-
-    avg_score = (total_score / len(student_results)) if student_results else 0.0
+    service = get_grading_import_service()
+    history = await get_grading_history(batch_id)
+    if student_results is None:
+        if not history:
+            raise HTTPException(status_code=404, detail="批改批次不存在")
+        if not await service.has_stored_results(history.id):
+            raise HTTPException(status_code=400, detail="未找到批改结果")
 
-    # 保存批改历史
     teacher_id = None
-    if request.class_ids:
-        class_info = get_class_by_id(request.class_ids[0])
-        if class_info:
-            teacher_id = class_info.teacher_id
-    history_id = str(uuid.uuid4())[:8]
-    history = GradingHistory(
-        id=history_id,
-        batch_id=batch_id,
-        teacher_id=teacher_id,
-        status="imported",
-        class_ids=request.class_ids,
-        created_at=datetime.now().isoformat(),
-        completed_at=datetime.now().isoformat(),
-        total_students=len(student_results),
-        average_score=avg_score,
+    class_info = get_class_by_id(request.class_ids[0])
+    if class_info:
+        teacher_id = class_info.teacher_id
+
+    payload = request.model_dump(exclude={"idempotency_key"})
+    payload["teacher_id"] = teacher_id
+    job, started = await service.submit(
+        batch_id,
+        history.id if history else str(uuid.uuid4()),
+        payload,
+        idempotency_key=idempotency_key or request.idempotency_key,
+        results=student_results,
     )
-    await save_grading_history(history)
-
-    # 保存学生结果
-    imported_count = 0
-    for result in student_results:
-        student_key = result.get("studentName") or result.get("studentKey", "")
-        student_id = key_to_id.get(student_key)
-
-        # 从 result 中提取 summary 和 confession
-        summary_data = result.get("summary") or result.get("studentSummary")
-        confession_payload = result.get("confession")
-
-        for class_id in request.class_ids:
-            student_result = StudentGradingResult(
-                id=str(uuid.uuid4())[:8],
-                grading_history_id=history_id,
-                student_key=student_key,
-                class_id=class_id,
-                student_id=student_id,
-                score=result.get("totalScore", result.get("score")),
-                max_score=result.get("maxTotalScore", result.get("maxScore")),
-                summary=summary_data.get("overall") if isinstance(summary_data, dict) else None,
-                confession=(
-                    confession_payload.get("summary")
-                    if isinstance(confession_payload, dict)
-                    else None
-                ),
-                result_data=result,
-                imported_at=datetime.now().isoformat(),
-            )
-            await save_student_result(student_result)
-            imported_count += 1
-
-    logger.info(f"批改结果已导入: history_id={history_id}, count={imported_count}")
 
     return ImportToClassResponse(
         success=True,
-        imported_count=imported_count,
-        history_id=history_id,
-        message=f"成功导入 {imported_count} 条学生批改记录",
+        imported_count=job.imported_count,
+        history_id=job.history_id,
+        message="导入任务已提交" if started else "导入任务已存在",
+        job_id=job.job_id,
+        status=job.status,
+    )
+
+
+@router.get("/grading/import-jobs/{job_id}", response_model=ImportJobStatusResponse)
+async def get_import_job_status(job_id: str):
+    """查询导入任务进度"""
+    job = await get_grading_import_service().get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="导入任务不存在")
+    return ImportJobStatusResponse(
+        job_id=job.job_id,
+        batch_id=job.batch_id,
+        history_id=job.history_id,
+        status=job.status,
+        class_ids=job.class_ids,
+        classes_done=job.classes_done,
+        imported_count=job.imported_count,
+        total_students=job.total_students,
+        average_score=job.average_score,
+        percentage=job.percentage,
+        attempts=job.attempts,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
     )
 
 
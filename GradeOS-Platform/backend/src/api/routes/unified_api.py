@@ -63,7 +63,6 @@ from src.db import (
     list_assistant_concepts,
     save_assistant_mastery_snapshot,
     list_assistant_mastery_snapshots,
-    expire_assistant_conversations,
     get_page_images_for_student,
     get_assistant_conversation,
     get_latest_assistant_conversation,
@@ -2599,11 +2598,6 @@ async def assistant_chat(request: AssistantChatRequest):
         len(request.attachments or []),
     )
 
-    try:
-        expire_assistant_conversations()
-    except Exception as exc:
-        logger.debug("assistant conversation TTL cleanup failed: %s", exc)
-
     has_wrong_review = bool(request.wrong_question_ref or request.wrong_question_context)
     force_new_conversation = bool(request.new_conversation)
     conversation_id = (request.conversation_id or "").strip() or None
@@ -2773,11 +2767,6 @@ async def assistant_conversations(
     class_id: Optional[str] = None,
     limit: int = 20,
 ):
-    try:
-        expire_assistant_conversations()
-    except Exception as exc:
-        logger.debug("assistant conversation TTL cleanup failed: %s", exc)
-
     rows = list_assistant_conversations(student_id, class_id, limit=max(1, min(limit, 60)))
     conversations = [
         AssistantConversationItem(
@@ -2835,11 +2824,6 @@ async def assistant_progress(
     conversation_id: Optional[str] = None,
 ):
     """Fetch persisted assistant progress for a student."""
-    try:
-        expire_assistant_conversations()
-    except Exception as exc:
-        logger.debug("assistant conversation TTL cleanup failed: %s", exc)
-
     resolved_conversation_id = conversation_id
     if not resolved_conversation_id:
         latest = get_latest_assistant_conversation(student_id, class_id)
@@ -60,6 +60,9 @@ from .postgres_grading import (
     save_student_result,
     get_student_results,
     get_student_result,
+    iter_student_result_chunks,
+    replace_student_results,
+    upsert_homework_submission_grades,
     GradingPageImage,
     get_page_images,
     get_page_images_for_student,
@@ -109,6 +112,9 @@ __all__ = [
     "save_student_result",
     "get_student_results",
     "get_student_result",
+    "iter_student_result_chunks",
+    "replace_student_results",
+    "upsert_homework_submission_grades",
     "GradingPageImage",
     "get_page_images",
     "get_page_images_for_student",
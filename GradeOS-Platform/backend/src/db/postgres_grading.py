@@ -5,7 +5,7 @@ import json
 import logging
 import os
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple
 from dataclasses import dataclass, asdict
 
 from src.utils.database import db
@@ -425,9 +425,10 @@ async def list_grading_history(
         return []
 
 
-async def save_student_result(result: StudentGradingResult) -> None:
-    """????????? PostgreSQL"""
-    await ensure_student_results_schema()
+def _serialize_student_result(
+    result: StudentGradingResult,
+) -> Tuple[Optional[str], Optional[str]]:
+    """返回 (confession, result_data) 的入库文本"""
     # Normalize confession payloads and keep result_data in sync.
     result_data_payload = result.result_data
     confession_value = result.confession
@@ -457,6 +458,14 @@ async def save_student_result(result: StudentGradingResult) -> None:
             logger.error(f"??? result_data ??: {e}")
             result_data_json = "{}"
 
+    return confession_value, result_data_json
+
+
+async def save_student_result(result: StudentGradingResult) -> None:
+    """????????? PostgreSQL"""
+    await ensure_student_results_schema()
+    confession_value, result_data_json = _serialize_student_result(result)
+
     # ?????
     update_params = (
         result.id,
@@ -669,6 +678,187 @@ async def get_student_result(
         return None
 
 
+# ==================== 批量导入（调用方控制事务） ====================
+
+
+def _decode_result_data(row: Dict[str, Any]) -> Dict[str, Any]:
+    data = row.get("result_data")
+    if isinstance(data, (bytes, bytearray)):
+        data = data.decode("utf-8", errors="replace")
+    if isinstance(data, str):
+        try:
+            data = json.loads(data)
+        except Exception:
+            data = {}
+    if not isinstance(data, dict) or not data:
+        data = {
+            "studentName": row.get("student_key"),
+            "score": row.get("score"),
+            "maxScore": row.get("max_score"),
+        }
+    return data
+
+
+async def iter_student_result_chunks(
+    conn: Any,
+    grading_history_id: str,
+    *,
+    student_keys: Optional[Sequence[str]] = None,
+    chunk_rows: int = 500,
+) -> AsyncIterator[List[StudentGradingResult]]:
+    """
+    通过服务端游标分块读取某次批改的学生结果
+
+    需在调用方的事务内使用；游标快照不受同一事务后续写入影响，
+    因此可以边读边回写 student_grading_results。
+    student_keys 不为 None 时只读取这些学生。
+    同一学生已导入多个班级时只返回一行（优先未分配班级的原始结果）。
+    """
+    query = """
+        SELECT DISTINCT ON (student_key) student_key, score, max_score, result_data
+        FROM student_grading_results
+        WHERE grading_history_id::text = %s
+    """
+    params: List[Any] = [str(grading_history_id)]
+    if student_keys is not None:
+        query += " AND student_key = ANY(%s)"
+        params.append(list(student_keys))
+    query += " ORDER BY student_key, class_id NULLS FIRST"
+    log_sql_operation("SELECT", "student_grading_results (cursor)")
+
+    async with conn.cursor(name=f"sgr_import_{uuid.uuid4().hex[:12]}") as cursor:
+        await cursor.execute(query, params)
+        while True:
+            rows = await cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            yield [
+                StudentGradingResult(
+                    id="",
+                    grading_history_id=str(grading_history_id),
+                    student_key=row["student_key"],
+                    score=row["score"],
+                    max_score=row["max_score"],
+                    result_data=_decode_result_data(row),
+                )
+                for row in rows
+            ]
+
+
+async def replace_student_results(
+    conn: Any,
+    grading_history_id: str,
+    results: Sequence[StudentGradingResult],
+) -> int:
+    """
+    批量写入学生结果（不提交）
+
+    先删除同一批改历史、同一班级（或尚未分配班级）下相同 student_key / student_id
+    的旧记录，再用 executemany 插入；其他班级已导入的记录保持不变。
+    """
+    if not results:
+        return 0
+    by_class: Dict[Optional[str], Tuple[List[str], List[str]]] = {}
+    for result in results:
+        keys, student_ids = by_class.setdefault(result.class_id, ([], []))
+        keys.append(result.student_key)
+        if result.student_id:
+            student_ids.append(result.student_id)
+    for class_id, (keys, student_ids) in by_class.items():
+        await conn.execute(
+            """
+            DELETE FROM student_grading_results
+            WHERE grading_history_id::text = %s
+              AND (class_id = %s OR class_id IS NULL)
+              AND (student_key = ANY(%s) OR student_id = ANY(%s))
+            """,
+            (str(grading_history_id), class_id, keys, student_ids),
+        )
+    rows = []
+    for result in results:
+        confession_value, result_data_json = _serialize_student_result(result)
+        rows.append(
+            (
+                result.id,
+                result.grading_history_id,
+                result.student_key,
+                result.class_id,
+                result.student_id,
+                result.score,
+                result.max_score,
+                result.summary,
+                confession_value,
+                result_data_json,
+                result.imported_at,
+                result.revoked_at,
+            )
+        )
+    async with conn.cursor() as cursor:
+        await cursor.executemany(
+            """
+            INSERT INTO student_grading_results
+            (id, grading_history_id, student_key, class_id, student_id,
+             score, max_score, summary, confession, result_data,
+             imported_at, revoked_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s::jsonb, %s, %s)
+            """,
+            rows,
+        )
+    log_sql_operation("INSERT", "student_grading_results", result_count=len(rows))
+    return len(rows)
+
+
+async def upsert_homework_submission_grades(
+    conn: Any,
+    class_id: str,
+    homework_id: str,
+    grades: Iterable[Tuple[str, Optional[str], Optional[float], Optional[str]]],
+    grading_batch_id: Optional[str] = None,
+) -> int:
+    """
+    批量写入作业提交的分数与评语（不提交）
+
+    grades 为 (student_id, student_name, score, feedback)；语义同
+    upsert_homework_submission_grade，未提交过的学生会新建提交记录。
+    """
+    now = datetime.now().isoformat()
+    rows = [
+        (
+            str(uuid.uuid5(uuid.NAMESPACE_URL, f"{class_id}:{homework_id}:{student_id}")),
+            class_id,
+            homework_id,
+            student_id,
+            student_name,
+            now,
+            grading_batch_id,
+            score,
+            feedback,
+        )
+        for student_id, student_name, score, feedback in grades
+        if student_id
+    ]
+    if not rows:
+        return 0
+    async with conn.cursor() as cursor:
+        await cursor.executemany(
+            """
+            INSERT INTO homework_submissions
+            (id, class_id, homework_id, student_id, student_name,
+             submission_type, page_count, submitted_at, status, grading_batch_id, score, feedback)
+            VALUES (%s, %s, %s, %s, %s, 'scan', 0, %s, 'graded', %s, %s, %s)
+            ON CONFLICT (class_id, homework_id, student_id) DO UPDATE SET
+                score = EXCLUDED.score,
+                feedback = EXCLUDED.feedback,
+                status = EXCLUDED.status,
+                grading_batch_id = EXCLUDED.grading_batch_id,
+                student_name = COALESCE(EXCLUDED.student_name, homework_submissions.student_name)
+            """,
+            rows,
+        )
+    log_sql_operation("INSERT/UPDATE", "homework_submissions", result_count=len(rows))
+    return len(rows)
+
+
 async def get_page_images_for_student(
     grading_history_id: str,
     student_key: str,
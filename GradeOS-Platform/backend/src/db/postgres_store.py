@@ -1686,17 +1686,38 @@ def upsert_assistant_conversation(
     return dict(row) if row else {}
 
 
-def expire_assistant_conversations(*, now_iso: Optional[str] = None) -> int:
+def expire_assistant_conversations(
+    *, now_iso: Optional[str] = None, limit: Optional[int] = None
+) -> int:
+    """Mark active conversations past `expires_at` as expired.
+
+    With `limit`, only one bounded slice is updated so callers can loop
+    without holding long row locks.
+    """
     current = now_iso or datetime.now().isoformat()
     with get_connection() as conn:
-        result = conn.execute(
-            """
-            UPDATE assistant_conversations
-            SET status = 'expired', updated_at = ?
-            WHERE status = 'active' AND expires_at < ?
-            """,
-            (current, current),
-        )
+        if limit is None:
+            result = conn.execute(
+                """
+                UPDATE assistant_conversations
+                SET status = 'expired', updated_at = ?
+                WHERE status = 'active' AND expires_at < ?
+                """,
+                (current, current),
+            )
+        else:
+            result = conn.execute(
+                """
+                UPDATE assistant_conversations
+                SET status = 'expired', updated_at = ?
+                WHERE ctid IN (
+                    SELECT ctid FROM assistant_conversations
+                    WHERE status = 'active' AND expires_at < ?
+                    LIMIT ?
+                )
+                """,
+                (current, current, max(1, int(limit))),
+            )
     try:
         return int(result.rowcount or 0)
     except Exception:
@@ -1712,7 +1733,6 @@ def get_assistant_conversation(
         return None
     normalized_class = _normalize_class_id(class_id)
     now_iso = datetime.now().isoformat()
-    expire_assistant_conversations(now_iso=now_iso)
     with get_connection() as conn:
         row = conn.execute(
             """
@@ -1729,7 +1749,6 @@ def get_assistant_conversation(
 def get_latest_assistant_conversation(student_id: str, class_id: Optional[str]) -> Optional[Dict[str, Any]]:
     normalized_class = _normalize_class_id(class_id)
     now_iso = datetime.now().isoformat()
-    expire_assistant_conversations(now_iso=now_iso)
     with get_connection() as conn:
         row = conn.execute(
             """
@@ -1752,7 +1771,6 @@ def list_assistant_conversations(
 ) -> List[Dict[str, Any]]:
     normalized_class = _normalize_class_id(class_id)
     now_iso = datetime.now().isoformat()
-    expire_assistant_conversations(now_iso=now_iso)
     with get_connection() as conn:
         rows = conn.execute(
             """
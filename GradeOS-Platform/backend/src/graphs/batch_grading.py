@@ -1967,6 +1967,16 @@ def _collect_expected_logic_review_qids(question_details: List[Dict[str, Any]])
     return expected_qids
 
 
+def _logic_review_items_from_payload(payload_data: Dict[str, Any]) -> Any:
+    return (
+        payload_data.get("question_reviews")
+        or payload_data.get("questionReviews")
+        or payload_data.get("questions")
+        or payload_data.get("reviews")
+        or []
+    )
+
+
 def _build_logic_review_map_and_coverage(
     question_reviews: Any,
     expected_qids: List[str],
@@ -3579,9 +3589,104 @@ def _finalize_assist_result(
 
 
 async def grade_batch_node(state: Dict[str, Any]) -> Dict[str, Any]:
+    resumed = await _resume_grade_batch_from_checkpoint(state)
+    if resumed is not None:
+        return resumed
     return await _grade_batch_node_impl(state)
 
 
+def _resume_from_checkpoint_enabled() -> bool:
+    return os.getenv("GRADING_RESUME_FROM_CHECKPOINT", "true").strip().lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+
+
+async def _load_partial_question_details(state: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """崩溃恢复：该学生中断前已流式完成的题目（页码不变时有效）"""
+    batch_id = state.get("batch_id")
+    if not batch_id or not _resume_from_checkpoint_enabled():
+        return []
+    # 与写入时的键一致（grade_batch 中的 batch_agent_label）
+    student_key = state.get("student_key") or f"Student Batch {state.get('batch_index', 0) + 1}"
+
+    from src.services.grading_checkpoint import load_partial_question_details
+
+    try:
+        return await load_partial_question_details(
+            str(batch_id), student_key, list(state.get("page_indices") or [])
+        )
+    except Exception as exc:
+        logger.debug(f"[grade_batch] partial checkpoint lookup failed: {exc}")
+        return []
+
+
+async def _resume_grade_batch_from_checkpoint(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    崩溃恢复：该学生已有完成的批改检查点时直接复用，不再调用模型
+
+    同一批次的检查点只批量读取一次（load_student_checkpoints），各批改节点共享。
+    只有部分题目完成时返回 None，由批改节点复用已完成的题目并只补批缺失题目
+    （_load_partial_question_details）。
+    """
+    if not _resume_from_checkpoint_enabled():
+        return None
+    batch_id = state.get("batch_id")
+    batch_index = state.get("batch_index", 0)
+    student_key = state.get("student_key") or f"Student {batch_index + 1}"
+    if not batch_id:
+        return None
+
+    from src.services.grading_checkpoint import load_completed_student_result
+
+    try:
+        page_result = await load_completed_student_result(str(batch_id), student_key)
+    except Exception as exc:
+        logger.debug(f"[grade_batch] checkpoint lookup failed: {exc}")
+        return None
+    if page_result is None:
+        return None
+    # 学生分页变化（重新切分）时检查点不再对应当前输入
+    if list(page_result.get("page_indices") or []) != list(state.get("page_indices") or []):
+        return None
+
+    page_result = {**page_result, "resumed_from_checkpoint": True}
+    logger.info(f"[grade_batch] student={student_key} 已有完成的检查点，跳过重新批改")
+    await _broadcast_progress(
+        batch_id,
+        {
+            "type": "agent_update",
+            "parentNodeId": "grade_batch",
+            "agentId": f"batch_{batch_index}",
+            "agentName": student_key,
+            "agentLabel": student_key,
+            "status": "completed",
+            "message": "Restored from checkpoint",
+            "progress": 100,
+        },
+    )
+    grading_mode = _resolve_grading_mode(state.get("inputs", {}), state.get("parsed_rubric", {}))
+    return {
+        "student_results": _build_student_results_from_page_results(
+            [page_result],
+            default_student_key=student_key,
+            grading_mode=grading_mode,
+        ),
+        "grading_results": [page_result],
+        "batch_progress": {
+            "batch_index": batch_index,
+            "total_batches": state.get("total_batches", 1),
+            "pages_processed": 1,
+            "pages_failed": 0,
+            "total_score": page_result.get("score", 0),
+            "status": "completed",
+            "resumed": True,
+            "timestamp": datetime.now().isoformat(),
+        },
+    }
+
+
 async def _grade_batch_node_impl(state: Dict[str, Any]) -> Dict[str, Any]:
     """
     批量批改节点
@@ -3675,16 +3780,31 @@ async def _grade_batch_node_impl(state: Dict[str, Any]) -> Dict[str, Any]:
         # 每个 Worker 独立创建实例，不共享可变状态
         from src.services.llm_reasoning import LLMReasoningClient
         from src.utils.error_handling import execute_with_isolation, get_error_manager
-        from src.services.rubric_registry import RubricRegistry
-
-        # 注意：已移除 Agent Skill，直接使用 rubric_registry
-        from src.models.grading_models import QuestionRubric, ScoringPoint
+        from src.services.rubric_registry import compile_rubric_index
 
         # 独立获取评分标准副本（不共享可变状态）
         parsed_rubric = state.get("parsed_rubric", {})
         import copy
 
         local_parsed_rubric = copy.deepcopy(parsed_rubric)
+
+        # 灰度补丁：按 (batch_id, student_key) 稳定分组，只读进程内部署快照
+        from src.services.patch_resolution import apply_patch_to_rubric, get_patch_resolver
+
+        patch_assignment = get_patch_resolver().resolve(
+            str(batch_id), str(batch_student_id or batch_student_key)
+        )
+        if patch_assignment.is_patched:
+            local_parsed_rubric = apply_patch_to_rubric(
+                local_parsed_rubric,
+                patch_assignment,
+                base_context=_format_rubric_context_from_dict(local_parsed_rubric),
+            )
+            logger.info(
+                f"[grade_batch] student={batch_student_key} 使用补丁 "
+                f"{patch_assignment.patch_version} ({patch_assignment.deployment_id})"
+            )
+
         rubric_map = _build_rubric_question_map(local_parsed_rubric)
         grading_mode = _resolve_grading_mode(state.get("inputs", {}), local_parsed_rubric)
         if grading_mode == "assist_student":
@@ -3707,46 +3827,40 @@ async def _grade_batch_node_impl(state: Dict[str, Any]) -> Dict[str, Any]:
             f"questions_count={len(local_parsed_rubric.get('questions', []))}"
         )
 
-        # 🔥 关键：从 parsed_rubric 重建 RubricRegistry (Requirement 5.1)
-        rubric_registry = RubricRegistry(total_score=local_parsed_rubric.get("total_score", 100.0))
-
-        # 将解析的题目注册到 Registry
-        questions_data = local_parsed_rubric.get("questions", [])
-        if questions_data:
-            question_rubrics = []
-            for q in questions_data:
-                # 构建 ScoringPoint 列表
-                qid = q.get("question_id") or q.get("id") or ""
-                scoring_points = [
-                    ScoringPoint(
-                        description=sp.get("description", ""),
-                        score=sp.get("score", 0),
-                        is_required=sp.get("is_required", True),
-                        point_id=sp.get("point_id") or sp.get("pointId") or f"{qid}.{idx + 1}",
-                    )
-                    for idx, sp in enumerate(q.get("scoring_points", []))
-                ]
-
-                # 构建 QuestionRubric
-                question_rubric = QuestionRubric(
-                    question_id=str(qid),
-                    question_text=q.get("question_text", ""),
-                    max_score=q.get("max_score", 0),
-                    scoring_points=scoring_points,
-                    standard_answer=q.get("standard_answer", ""),
-                    grading_notes=q.get("grading_notes", ""),
-                    alternative_solutions=[],  # 简化处理
-                )
-                question_rubrics.append(question_rubric)
-
-            rubric_registry.register_rubrics(question_rubrics, log=False)
-            logger.info(f"[grade_batch] 已重建 RubricRegistry，注册 {len(question_rubrics)} 道题目")
+        # 🔥 关键：评分标准的只读编译索引 (Requirement 5.1)
+        # 同一份评分标准（按内容哈希）在各批改节点间共享一个快照，查询无锁
+        rubric_index = compile_rubric_index(local_parsed_rubric)
+        logger.info(
+            f"[grade_batch] 评分标准索引: {rubric_index.get_rubric_count()} 道题目"
+        )
 
         # 创建 LLMReasoningClient（已移除 Agent Skill）
+        # 判例 few-shot：同一份评分标准的检索结果在进程内缓存复用
+        from src.services.exemplar_memory import get_exemplar_memory
+
+        exemplar_memory = get_exemplar_memory()
         reasoning_client = LLMReasoningClient(
             api_key=api_key,
-            rubric_registry=rubric_registry,
+            rubric_registry=rubric_index,
+            exemplar_memory=exemplar_memory,
         )
+        # 模型级联：配置了快速档模型时先用快速档整卷批改，再按题升级到上面的模型
+        # 不允许升级（仅单次批改或预算不足）时快速档结果无法复核，直接用上面的模型
+        grader = reasoning_client
+        if not fast_pass_only and budget_allows_second_pass:
+            from src.services.grading_cascade import build_grading_cascade
+
+            grader = build_grading_cascade(
+                reasoning_client,
+                api_key=api_key,
+                run_id=str(batch_id),
+                threshold=second_pass_threshold,
+                max_ratio=second_pass_max_ratio,
+                page_budget_usd=budget_per_page * second_pass_budget_fraction,
+                cost_per_question_usd=est_second_pass_cost,
+                rubric_registry=rubric_index,
+                exemplar_memory=exemplar_memory,
+            ) or reasoning_client
         # 错误隔离：单页失败不影响其他页面 (Requirement 9.2)
         error_manager = get_error_manager()
 
@@ -3799,8 +3913,59 @@ async def _grade_batch_node_impl(state: Dict[str, Any]) -> Dict[str, Any]:
                 second_pass_used += 1
                 return True
 
+        from src.services.grading_checkpoint import (
+            partial_question_field,
+            save_student_checkpoint,
+        )
+
+        streamed_questions: Dict[str, Dict[str, Any]] = {}
+        expected_questions = len((local_parsed_rubric or {}).get("questions") or [])
+
+        async def record_streamed_question(chunk: str) -> None:
+            """单题结果一闭合就推送进度并写入部分检查点"""
+            try:
+                detail = json.loads(chunk)
+            except (TypeError, ValueError):
+                return
+            if not isinstance(detail, dict):
+                return
+            question_id = str(
+                detail.get("question_id")
+                or detail.get("questionId")
+                or len(streamed_questions) + 1
+            )
+            streamed_questions[question_id] = detail
+            await _broadcast_progress(
+                batch_id,
+                {
+                    "type": "question_graded",
+                    "nodeId": "grade_batch",
+                    "agentId": f"batch_{batch_index}",
+                    "agentLabel": batch_student_key,
+                    "questionId": question_id,
+                    "score": detail.get("score"),
+                    "maxScore": detail.get("max_score", detail.get("maxScore")),
+                    "completedQuestions": len(streamed_questions),
+                    "totalQuestions": expected_questions,
+                },
+            )
+            # 逐题增量写入，不重写已完成题目的列表
+            await save_student_checkpoint(
+                batch_id=batch_id,
+                student_key=batch_student_key or batch_agent_label,
+                field=partial_question_field(question_id),
+                payload={
+                    "detail": detail,
+                    "page_indices": page_indices,
+                    "ts": datetime.now().isoformat(),
+                },
+            )
+
         # 🚀 始终使用 grade_student 一次 LLM call 批改整个学生（避免逐页浪费 token）
         async def stream_callback(stream_type: str, chunk: str) -> None:
+            if stream_type == "question":
+                await record_streamed_question(chunk)
+                return
             await _broadcast_progress(
                 batch_id,
                 {
@@ -3828,8 +3993,6 @@ async def _grade_batch_node_impl(state: Dict[str, Any]) -> Dict[str, Any]:
             },
         )
 
-        from src.services.grading_checkpoint import save_student_checkpoint
-
         student_max_retries = int(
             os.getenv("GRADING_STUDENT_MAX_RETRIES", str(max_retries))
         )
@@ -3843,9 +4006,12 @@ async def _grade_batch_node_impl(state: Dict[str, Any]) -> Dict[str, Any]:
         delay = max(0.0, student_retry_delay)
         last_error: str = ""
         student_result: Dict[str, Any] = {}
+        # 上次中断前已完成的题目：首次尝试只补批缺失题目，失败后整卷重批
+        resumed_details = await _load_partial_question_details(state)
 
         while True:
             attempt += 1
+            streamed_questions.clear()
             await save_student_checkpoint(
                 batch_id=batch_id,
                 student_key=batch_student_key or batch_agent_label,
@@ -3865,17 +4031,33 @@ async def _grade_batch_node_impl(state: Dict[str, Any]) -> Dict[str, Any]:
             )
 
             try:
-                student_result = await reasoning_client.grade_student(
-                    images=images,
-                    student_key=batch_student_key,
-                    parsed_rubric=local_parsed_rubric,
-                    page_indices=page_indices,
-                    page_contexts=page_index_contexts,
-                    stream_callback=stream_callback,
-                )
+                if resumed_details:
+                    for detail in resumed_details:
+                        qid = str(detail.get("question_id") or detail.get("questionId") or "")
+                        if qid:
+                            streamed_questions[qid] = detail
+                    student_result = await reasoning_client.resume_student_from_partial(
+                        images=images,
+                        student_key=batch_student_key,
+                        parsed_rubric=local_parsed_rubric,
+                        partial_details=resumed_details,
+                        stream_callback=stream_callback,
+                        page_indices=page_indices,
+                        page_contexts=page_index_contexts,
+                    )
+                else:
+                    student_result = await grader.grade_student(
+                        images=images,
+                        student_key=batch_student_key,
+                        parsed_rubric=local_parsed_rubric,
+                        page_indices=page_indices,
+                        page_contexts=page_index_contexts,
+                        stream_callback=stream_callback,
+                    )
             except Exception as exc:
                 last_error = f"{type(exc).__name__}: {exc}"
                 student_result = {"status": "failed", "error": last_error}
+            resumed_details = []
 
             if isinstance(student_result, dict) and student_result.get("status") == "completed":
                 break
@@ -3966,6 +4148,7 @@ async def _grade_batch_node_impl(state: Dict[str, Any]) -> Dict[str, Any]:
             "student_name": batch_student_name,
             "student_id": batch_student_id,
             "batch_index": batch_index,
+            **patch_assignment.to_stamp(),
         }
         page_results.append(page_result)
 
@@ -4229,6 +4412,10 @@ def _build_student_results_from_page_results(
             entry["student_id"] = result.get("student_id")
         if result.get("student_name") and not entry.get("student_name"):
             entry["student_name"] = result.get("student_name")
+        if result.get("patch_variant") and not entry.get("patch_variant"):
+            entry["patch_variant"] = result.get("patch_variant")
+            entry["patch_version"] = result.get("patch_version")
+            entry["patch_deployment_id"] = result.get("patch_deployment_id")
 
         if not entry["feedback"] and result.get("feedback"):
             entry["feedback"] = result.get("feedback")
@@ -4594,48 +4781,21 @@ async def _regrade_selected_questions(
         return student_results
 
     parsed_rubric = state.get("parsed_rubric", {})
-    questions_data = parsed_rubric.get("questions", []) if isinstance(parsed_rubric, dict) else []
+    if not isinstance(parsed_rubric, dict):
+        parsed_rubric = {}
 
     try:
         from src.services.llm_reasoning import LLMReasoningClient
-        from src.services.rubric_registry import RubricRegistry
-        from src.models.grading_models import QuestionRubric, ScoringPoint
+        from src.services.rubric_registry import compile_rubric_index
     except Exception as exc:
         logger.warning(f"[review] regrade skipped: {exc}")
         return student_results
 
-    rubric_registry = RubricRegistry(total_score=parsed_rubric.get("total_score", 100.0))
-    question_rubrics = []
-    for q in questions_data:
-        qid = q.get("question_id") or q.get("id") or ""
-        if not qid:
-            continue
-        scoring_points = [
-            ScoringPoint(
-                description=sp.get("description", ""),
-                score=sp.get("score", 0),
-                is_required=sp.get("is_required", True),
-                point_id=sp.get("point_id") or sp.get("pointId") or f"{qid}.{idx + 1}",
-            )
-            for idx, sp in enumerate(q.get("scoring_points", []))
-        ]
-        question_rubrics.append(
-            QuestionRubric(
-                question_id=str(qid),
-                question_text=q.get("question_text", ""),
-                max_score=q.get("max_score", 0),
-                scoring_points=scoring_points,
-                standard_answer=q.get("standard_answer", ""),
-                grading_notes=q.get("grading_notes", ""),
-                alternative_solutions=[],
-            )
-        )
-    if question_rubrics:
-        rubric_registry.register_rubrics(question_rubrics, log=False)
+    rubric_index = compile_rubric_index(parsed_rubric)
 
     reasoning_client = LLMReasoningClient(
         api_key=api_key,
-        rubric_registry=rubric_registry,
+        rubric_registry=rubric_index,
     )
 
     student_page_map = state.get("student_page_map") or {}
@@ -5453,40 +5613,90 @@ def _extract_json_from_response(text: str) -> str:
 # 原 confession 节点的功能已合并到 grade_batch 节点中
 
 
-def _build_logic_review_prompt(
+_LOGIC_REVIEW_INSTRUCTION_LINES: Tuple[str, ...] = (
+    "# 角色：逻辑复核审计员 (Logic Review Auditor)",
+    "",
+    "你是一位严谨的逻辑复核审计员，专门负责审计批改结果中的**明显错误**。",
+    "",
+    "## 核心原则（必须严格遵守）",
+    "",
+    "### ⚠️ 最高优先级：只纠正明显错误",
+    "1. **只修正明显的、无可争议的错误**",
+    "   - 证据明确说正确但给了 0 分",
+    "   - 证据明确说错误但给了分",
+    "   - evidence 为空/占位（如“未找到/无法辨认”）但 awarded > 0",
+    "   - 分数超出满分或为负数",
+    "   - 得分点分数累加错误",
+    "",
+    "2. **绝对禁止酌情给分**",
+    '   - 不得因为"学生可能理解了"而给分',
+    '   - 不得因为"答案接近正确"而给部分分（除非评分标准明确允许）',
+    '   - 不得因为"解题思路正确"而给分（除非评分标准明确允许）',
+    "",
+    "3. **严格基于评分标准**",
+    "   - 所有修正必须有评分标准中的明确依据",
+    "   - 如果评分标准未覆盖某种情况，**保留原判**",
+    "   - 不得自行解释或扩展评分标准",
+    "",
+    "4. **批判性思维**",
+    "   - 对自白中披露的风险点持怀疑态度，独立验证",
+    '   - 不要轻信任何"可能"、"应该"的推测',
+    "   - 宁可漏纠也不可错纠",
+    "",
+    "### 🔴 无法判断时的处理",
+    "当遇到以下情况时，**不修正**，但必须：",
+    "- 降低该题的 `confidence` 值（设为 0.3-0.5）",
+    "- 在 `honesty_note` 中详细说明无法判断的原因",
+    "",
+    "无法判断的情况包括：",
+    "- 评分标准不够清晰",
+    "- 学生答案表述模糊",
+    "- 证据与评分标准的对应关系不明确",
+    "- 存在多种合理解释",
+    "",
+    "## 检查维度",
+    "1. **证据一致性**：evidence 与 awarded 是否一致？",
+    "2. **数学正确性**：分数累加是否正确？是否溢出？",
+    "3. **标准符合性**：评分是否符合评分标准的字面要求？",
+    "",
+    "## 修正决策（严格按此执行）",
+    "```",
+    "if 证据【明确且无歧义地】说正确 and awarded == 0:",
+    "    → 修正为得分",
+    "elif 证据【明确且无歧义地】说错误 and awarded > 0:",
+    "    → 修正为扣分",
+    "elif evidence 为空/占位 and awarded > 0:",
+    "    → 修正为扣分（awarded=0）",
+    "elif 得分超出满分 or 得分为负:",
+    "    → 修正为合理边界值",
+    "elif 分数累加明显错误:",
+    "    → 修正累加结果",
+    "elif 存在任何不确定性:",
+    "    → 保留原判 + 降低置信度 + 写明 honesty_note",
+    "else:",
+    "    → 保留原判",
+    "```",
+    "",
+    "## 可用信息源（仅限这些）",
+    "- 批改结果（评分、证据、反馈）",
+    "- 评分标准（rubric）—— **修正的唯一依据**",
+    "- 自白报告(confession_report.items)：仅用于定位复核重点，必须独立验证",
+    "",
+    "## 输出内容",
+    "- **review_corrections**：只包含明显错误的修正",
+    "- **confidence**：评分置信度（无法判断时设为 0.3-0.5）",
+    "- **honesty_note**：无法判断时的详细说明",
+    "",
+)
+
+
+def _build_logic_review_student_lines(
     student: Dict[str, Any],
     question_details: List[Dict[str, Any]],
     rubric_map: Dict[str, Dict[str, Any]],
     limits: Dict[str, int],
-) -> str:
-    """
-    构建逻辑复核 (Logic Review) LLM 提示词
-    
-    改造说明：
-    - 复核重点由独立的 confession_report.items（自白报告）提供，用于定位风险点
-    - 不再依赖 legacy audit/self_critique/self_audit 字段
-    
-    逻辑复核的核心功能：验证/审计 + 一致性修复
-    - 只能基于批改结果、评分标准解析结果和审计信息
-    - 不允许引入新事实/新推理
-    - 要有批判性思维，查漏补缺
-    - 具备有限的修正能力（明显错误）
-
-    ⚠️ 重要：逻辑复核独立性原则 (P3)
-    =========================================
-    此函数构建的 prompt 不能包含任何记忆系统的数据！
-
-    逻辑复核必须是"无状态"的：
-    1. 不能引用历史批改经验或记忆
-    2. 评分决策完全基于当前评分标准和学生答案
-    3. audit 信息仅用于确定复核重点，不直接影响评分
-
-    允许的输入：
-    - student: 当前学生的批改结果
-    - question_details: 当前批改的题目详情
-    - rubric_map: 评分标准（从 parsed_rubric 构建）
-    =========================================
-    """
+) -> List[str]:
+    """单个学生的复核分节：学生标识、自白报告焦点与题目摘要（不含共享指令与输出模板）"""
     student_key = student.get("student_key") or student.get("student_name") or "Unknown"
     max_questions = limits.get("max_questions", 20)
     if max_questions <= 0:
@@ -5498,79 +5708,6 @@ def _build_logic_review_prompt(
     max_evidence_chars = limits.get("max_evidence_chars", 120)
 
     lines = [
-        "# 角色：逻辑复核审计员 (Logic Review Auditor)",
-        "",
-        "你是一位严谨的逻辑复核审计员，专门负责审计批改结果中的**明显错误**。",
-        "",
-        "## 核心原则（必须严格遵守）",
-        "",
-        "### ⚠️ 最高优先级：只纠正明显错误",
-        "1. **只修正明显的、无可争议的错误**",
-        "   - 证据明确说正确但给了 0 分",
-        "   - 证据明确说错误但给了分",
-        "   - evidence 为空/占位（如“未找到/无法辨认”）但 awarded > 0",
-        "   - 分数超出满分或为负数",
-        "   - 得分点分数累加错误",
-        "",
-        "2. **绝对禁止酌情给分**",
-        '   - 不得因为"学生可能理解了"而给分',
-        '   - 不得因为"答案接近正确"而给部分分（除非评分标准明确允许）',
-        '   - 不得因为"解题思路正确"而给分（除非评分标准明确允许）',
-        "",
-        "3. **严格基于评分标准**",
-        "   - 所有修正必须有评分标准中的明确依据",
-        "   - 如果评分标准未覆盖某种情况，**保留原判**",
-        "   - 不得自行解释或扩展评分标准",
-        "",
-        "4. **批判性思维**",
-        "   - 对自白中披露的风险点持怀疑态度，独立验证",
-        '   - 不要轻信任何"可能"、"应该"的推测',
-        "   - 宁可漏纠也不可错纠",
-        "",
-        "### 🔴 无法判断时的处理",
-        "当遇到以下情况时，**不修正**，但必须：",
-        "- 降低该题的 `confidence` 值（设为 0.3-0.5）",
-        "- 在 `honesty_note` 中详细说明无法判断的原因",
-        "",
-        "无法判断的情况包括：",
-        "- 评分标准不够清晰",
-        "- 学生答案表述模糊",
-        "- 证据与评分标准的对应关系不明确",
-        "- 存在多种合理解释",
-        "",
-        "## 检查维度",
-        "1. **证据一致性**：evidence 与 awarded 是否一致？",
-        "2. **数学正确性**：分数累加是否正确？是否溢出？",
-        "3. **标准符合性**：评分是否符合评分标准的字面要求？",
-        "",
-        "## 修正决策（严格按此执行）",
-        "```",
-        "if 证据【明确且无歧义地】说正确 and awarded == 0:",
-        "    → 修正为得分",
-        "elif 证据【明确且无歧义地】说错误 and awarded > 0:",
-        "    → 修正为扣分",
-        "elif evidence 为空/占位 and awarded > 0:",
-        "    → 修正为扣分（awarded=0）",
-        "elif 得分超出满分 or 得分为负:",
-        "    → 修正为合理边界值",
-        "elif 分数累加明显错误:",
-        "    → 修正累加结果",
-        "elif 存在任何不确定性:",
-        "    → 保留原判 + 降低置信度 + 写明 honesty_note",
-        "else:",
-        "    → 保留原判",
-        "```",
-        "",
-        "## 可用信息源（仅限这些）",
-        "- 批改结果（评分、证据、反馈）",
-        "- 评分标准（rubric）—— **修正的唯一依据**",
-        "- 自白报告(confession_report.items)：仅用于定位复核重点，必须独立验证",
-        "",
-        "## 输出内容",
-        "- **review_corrections**：只包含明显错误的修正",
-        "- **confidence**：评分置信度（无法判断时设为 0.3-0.5）",
-        "- **honesty_note**：无法判断时的详细说明",
-        "",
         f"## 学生标识: {student_key}",
         "",
     ]
@@ -5667,7 +5804,10 @@ def _build_logic_review_prompt(
                     f"evidence: {evidence} rubric_ref: {rubric_ref}"
                 )
         lines.append("")
+    return lines
+
 
+def _logic_review_schema_hint(student_key: str) -> str:
     schema_hint = {
         "student_key": student_key,
         "question_reviews": [
@@ -5688,12 +5828,112 @@ def _build_logic_review_prompt(
             }
         ],
     }
+    return json.dumps(schema_hint, ensure_ascii=False, indent=2)
+
 
+def _build_logic_review_prompt(
+    student: Dict[str, Any],
+    question_details: List[Dict[str, Any]],
+    rubric_map: Dict[str, Dict[str, Any]],
+    limits: Dict[str, int],
+) -> str:
+    """
+    构建逻辑复核 (Logic Review) LLM 提示词
+    
+    改造说明：
+    - 复核重点由独立的 confession_report.items（自白报告）提供，用于定位风险点
+    - 不再依赖 legacy audit/self_critique/self_audit 字段
+    
+    逻辑复核的核心功能：验证/审计 + 一致性修复
+    - 只能基于批改结果、评分标准解析结果和审计信息
+    - 不允许引入新事实/新推理
+    - 要有批判性思维，查漏补缺
+    - 具备有限的修正能力（明显错误）
+
+    ⚠️ 重要：逻辑复核独立性原则 (P3)
+    =========================================
+    此函数构建的 prompt 不能包含任何记忆系统的数据！
+
+    逻辑复核必须是"无状态"的：
+    1. 不能引用历史批改经验或记忆
+    2. 评分决策完全基于当前评分标准和学生答案
+    3. audit 信息仅用于确定复核重点，不直接影响评分
+
+    允许的输入：
+    - student: 当前学生的批改结果
+    - question_details: 当前批改的题目详情
+    - rubric_map: 评分标准（从 parsed_rubric 构建）
+    =========================================
+    """
+    student_key = student.get("student_key") or student.get("student_name") or "Unknown"
+    lines = list(_LOGIC_REVIEW_INSTRUCTION_LINES)
+    lines.extend(_build_logic_review_student_lines(student, question_details, rubric_map, limits))
     lines.append("输出 JSON 模板：")
-    lines.append(json.dumps(schema_hint, ensure_ascii=False, indent=2))
+    lines.append(_logic_review_schema_hint(student_key))
     return "\n".join(lines)
 
 
+async def _run_batched_logic_reviews(
+    reasoning_client: Any,
+    student_results: List[Dict[str, Any]],
+    rubric_map: Dict[str, Dict[str, Any]],
+    limits: Dict[str, int],
+    max_concurrency: int,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    跨学生合批逻辑复核
+
+    共享指令只发送一次，各学生分节与单独调用时相同；返回题号覆盖校验通过的
+    学生输出（student_key -> 与单独调用同构的 JSON），其余学生由 review_student 单独复核。
+    """
+    from src.services.review_batching import ReviewMicroBatcher, ReviewPayload
+
+    payloads: List[ReviewPayload] = []
+    expected_by_key: Dict[str, List[str]] = {}
+    for index, student in enumerate(student_results):
+        review_targets = _extract_logic_review_questions(student)
+        if not review_targets:
+            continue
+        student_key = str(
+            student.get("student_key") or student.get("student_name") or f"Student {index + 1}"
+        )
+        expected_by_key[student_key] = _collect_expected_logic_review_qids(
+            _collect_question_details(student)
+        )
+        section = "\n".join(
+            _build_logic_review_student_lines(student, review_targets, rubric_map, limits)
+        )
+        payloads.append(ReviewPayload(student_key=student_key, section=section))
+    if len(payloads) < 2:
+        return {}
+
+    async def invoke(prompt: str) -> Dict[str, Any]:
+        response_text = ""
+        async for chunk in reasoning_client._call_text_api_stream(prompt):
+            output_text, thinking_text = split_thinking_content(chunk)
+            if output_text:
+                response_text += output_text
+            elif thinking_text:
+                response_text += thinking_text
+        return json.loads(reasoning_client._extract_json_from_text(response_text))
+
+    def validate(student_key: str, entry: Dict[str, Any]) -> bool:
+        _, coverage = _build_logic_review_map_and_coverage(
+            _logic_review_items_from_payload(entry),
+            expected_by_key[student_key],
+        )
+        return bool(coverage.get("valid"))
+
+    batcher = ReviewMicroBatcher(
+        invoke,
+        header="\n".join(_LOGIC_REVIEW_INSTRUCTION_LINES),
+        entry_schema=_logic_review_schema_hint("<与分节标题一致的 student_key>"),
+        validate=validate,
+        max_concurrency=max_concurrency,
+    )
+    return await batcher.run(payloads)
+
+
 async def grading_confession_report_node(state: BatchGradingGraphState) -> Dict[str, Any]:
     """
     Post-grading ConfessionReport (text-only; independent LLM call).
@@ -5785,20 +6025,40 @@ async def grading_confession_report_node(state: BatchGradingGraphState) -> Dict[
     from src.services.confession_auditor import ConfessionAuditorClient
     from src.services.grading_checkpoint import save_student_checkpoint
 
+    from src.services.review_batching import REVIEW_BATCH_ENABLED
+
     client = ConfessionAuditorClient(api_key=api_key, purpose="analysis", temperature=0.1)
     max_workers = int(os.getenv("CONFESSION_MAX_WORKERS", "3"))
 
     updated_results: List[Optional[Dict[str, Any]]] = [None] * len(student_results)
 
-    async def audit_student(payload: Dict[str, Any]) -> Dict[str, Any]:
-        index = payload["index"]
-        student = payload["student"]
-        student_key = (
+    def confession_student_key(index: int, student: Dict[str, Any]) -> str:
+        return (
             student.get("student_key")
             or student.get("student_name")
             or student.get("studentName")
             or f"Student {index + 1}"
         )
+
+    # 跨学生合批：通过校验的学生直接采用合批结果，其余学生仍单独调用
+    batched_reports: Dict[str, Dict[str, Any]] = {}
+    if REVIEW_BATCH_ENABLED and len(student_results) > 1:
+        try:
+            batched_reports = await client.grading_confession_report_batch(
+                students=[
+                    (str(confession_student_key(idx, student)), student)
+                    for idx, student in enumerate(student_results)
+                ],
+                batch_id=batch_id,
+                max_concurrency=max_workers,
+            )
+        except Exception as exc:
+            logger.warning(f"[grading_confession_report] batched reports failed: {exc}")
+
+    async def audit_student(payload: Dict[str, Any]) -> Dict[str, Any]:
+        index = payload["index"]
+        student = payload["student"]
+        student_key = confession_student_key(index, student)
         agent_id = f"confession-worker-{index}"
 
         try:
@@ -5816,11 +6076,13 @@ async def grading_confession_report_node(state: BatchGradingGraphState) -> Dict[
                 },
             )
 
-            report = await client.grading_confession_report(
-                student=student,
-                subject_id=str(student_key),
-                batch_id=batch_id,
-            )
+            report = batched_reports.get(str(student_key))
+            if report is None:
+                report = await client.grading_confession_report(
+                    student=student,
+                    subject_id=str(student_key),
+                    batch_id=batch_id,
+                )
 
             updated = dict(student)
             updated["confession"] = report
@@ -6028,12 +6290,23 @@ async def logic_review_node(state: BatchGradingGraphState) -> Dict[str, Any]:
         }
 
     from src.services.llm_reasoning import LLMReasoningClient
+    from src.services.review_batching import REVIEW_BATCH_ENABLED
 
     reasoning_client = LLMReasoningClient(api_key=api_key, rubric_registry=None)
     max_workers = int(os.getenv("LOGIC_REVIEW_MAX_WORKERS", "3"))
     logic_review_results: List[Dict[str, Any]] = []
     updated_results: List[Optional[Dict[str, Any]]] = [None] * len(student_results)
 
+    # 跨学生合批：覆盖校验通过的学生直接采用合批输出，其余学生走单独复核（含重试）
+    batched_reviews: Dict[str, Dict[str, Any]] = {}
+    if REVIEW_BATCH_ENABLED and len(student_results) > 1:
+        try:
+            batched_reviews = await _run_batched_logic_reviews(
+                reasoning_client, student_results, rubric_map, limits, max_workers
+            )
+        except Exception as exc:
+            logger.warning(f"[logic_review] batched review failed: {exc}")
+
     async def review_student(payload: Dict[str, Any]) -> Dict[str, Any]:
         index = payload["index"]
         student = payload["student"]
@@ -6109,7 +6382,15 @@ async def logic_review_node(state: BatchGradingGraphState) -> Dict[str, Any]:
             }
             validation_error: Optional[str] = None
 
-            while attempt < max_attempts:
+            batched_payload = batched_reviews.get(str(student_key))
+            if batched_payload is not None:
+                payload_data = batched_payload
+                review_map, coverage = _build_logic_review_map_and_coverage(
+                    _logic_review_items_from_payload(payload_data),
+                    expected_qids,
+                )
+
+            while attempt < max_attempts and not coverage.get("valid"):
                 attempt += 1
                 if attempt > 1:
                     retry_used = True
@@ -6172,15 +6453,8 @@ async def logic_review_node(state: BatchGradingGraphState) -> Dict[str, Any]:
                         validation_error = f"parse_error:{exc}"
                         logger.warning(f"[logic_review] parse failed student={student_key}: {exc}")
 
-                question_reviews = (
-                    payload_data.get("question_reviews")
-                    or payload_data.get("questionReviews")
-                    or payload_data.get("questions")
-                    or payload_data.get("reviews")
-                    or []
-                )
                 review_map, coverage = _build_logic_review_map_and_coverage(
-                    question_reviews,
+                    _logic_review_items_from_payload(payload_data),
                     expected_qids,
                 )
 
@@ -6266,14 +6540,9 @@ async def logic_review_node(state: BatchGradingGraphState) -> Dict[str, Any]:
             updated_student["logic_reviewed_at"] = datetime.now().isoformat()
 
             review_summary = _build_logic_review_summary(updated_details)
-            question_reviews_payload = (
-                payload_data.get("question_reviews")
-                or payload_data.get("questionReviews")
-                or payload_data.get("questions")
-                or payload_data.get("reviews")
-                or []
+            normalized_question_reviews = _normalize_logic_review_items(
+                _logic_review_items_from_payload(payload_data)
             )
-            normalized_question_reviews = _normalize_logic_review_items(question_reviews_payload)
             logic_review_payload = {
                 "reviewed_at": updated_student["logic_reviewed_at"],
                 "review_summary": review_summary,
@@ -6717,6 +6986,26 @@ async def export_node(state: BatchGradingGraphState) -> Dict[str, Any]:
                         await save_student_result(student_result)
                         logger.info(f"[export] 成功保存学生结果: student_key={student_key}")
                         saved_students += 1
+
+                        # 逐题批改日志（改判时按日志 ID 回写，并计入灰度指标）
+                        try:
+                            from src.services.grading_logger import (
+                                build_question_logs,
+                                get_grading_logger,
+                            )
+
+                            grading_logger = get_grading_logger()
+                            for grading_log in build_question_logs(
+                                history_id,
+                                student_key,
+                                question_details,
+                                patch_version=student.get("patch_version"),
+                            ):
+                                await grading_logger.log_grading(grading_log)
+                        except Exception as e:
+                            logger.warning(
+                                f"[export] 批改日志入队失败: student_key={student_key}, {e}"
+                            )
                         
                         # 3. 保存该学生的页面图像
                         page_results = student.get("page_results", [])
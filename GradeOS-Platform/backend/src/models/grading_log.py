@@ -87,6 +87,9 @@ class GradingLog(BaseModel):
     override_teacher_id: Optional[str] = Field(None, description="改判教师ID")
     override_at: Optional[datetime] = Field(None, description="改判时间")
 
+    # 灰度发布
+    patch_version: Optional[str] = Field(None, description="生效的规则补丁版本（未使用补丁为空）")
+
     created_at: datetime = Field(default_factory=datetime.utcnow, description="创建时间")
 
 
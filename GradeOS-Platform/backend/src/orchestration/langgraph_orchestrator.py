@@ -75,9 +75,20 @@ class LangGraphOrchestrator(Orchestrator):
             config["recursion_limit"] = self._graph_recursion_limit
         return config
 
-    def _track_status(self, run_id: str, status: str, error: Optional[str] = None) -> None:
+    async def _track_status(self, run_id: str, status: str, error: Optional[str] = None) -> None:
         state = map_legacy_status(status)
-        self._run_state_machine.transition(run_id, state)
+        try:
+            result = await self._run_state_machine.transition(run_id, state, reason=status)
+            if not result.valid:
+                logger.debug(
+                    "Ignored run state transition %s -> %s for %s",
+                    result.current.value,
+                    state.value,
+                    run_id,
+                )
+        except Exception as exc:
+            # The shared store is advisory; never fail a run because it is unreachable.
+            logger.warning("Failed to record run state for %s: %s", run_id, exc)
         failure_class: Optional[FailureClass] = None
         if status == "failed":
             failure_class = classify_failure(error)
@@ -516,7 +527,10 @@ class LangGraphOrchestrator(Orchestrator):
         self._budget_warning_emitted.discard(run_id)
 
     async def _create_run_in_db(self, run_id: str, graph_name: str, input_data: Dict[str, Any]):
-        self._run_state_machine.set_initial(run_id, RunState.CREATED)
+        try:
+            await self._run_state_machine.set_initial(run_id, RunState.CREATED, reason="pending")
+        except Exception as exc:
+            logger.warning("Failed to record run state for %s: %s", run_id, exc)
         self._observability.register_run(run_id, graph_name, "pending")
         self._runs[run_id] = {
             "run_id": run_id,
@@ -605,7 +619,7 @@ class LangGraphOrchestrator(Orchestrator):
             except Exception as exc:
                 logger.warning("Failed to update run in DB: %s", exc)
 
-        self._track_status(run_id, status, error)
+        await self._track_status(run_id, status, error)
 
     async def get_run_metrics(self, run_id: str) -> Optional[Dict[str, Any]]:
         metrics = self._observability.build_metrics(run_id)
@@ -614,7 +628,7 @@ class LangGraphOrchestrator(Orchestrator):
             if not run:
                 return None
             self._observability.register_run(run_id, run.get("graph_name", ""), run.get("status", "pending"))
-            self._track_status(run_id, run.get("status", "pending"), run.get("error"))
+            await self._track_status(run_id, run.get("status", "pending"), run.get("error"))
             metrics = self._observability.build_metrics(run_id)
         return metrics.model_dump() if metrics else None
 
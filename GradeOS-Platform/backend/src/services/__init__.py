@@ -11,6 +11,10 @@ from src.services.distributed_transaction import (
     SagaStepStatus,
     SagaTransactionStatus,
     SagaTransaction,
+    SagaLogStore,
+    InMemorySagaLogStore,
+    PostgresSagaLogStore,
+    SagaRecoveryWorker,
     ReviewOverrideSagaBuilder,
 )
 from src.services.grading_confession import generate_confession
@@ -65,6 +69,10 @@ __all__ = [
     "SagaStepStatus",
     "SagaTransactionStatus",
     "SagaTransaction",
+    "SagaLogStore",
+    "InMemorySagaLogStore",
+    "PostgresSagaLogStore",
+    "SagaRecoveryWorker",
     "ReviewOverrideSagaBuilder",
     # Confession
     "generate_confession",
@@ -0,0 +1,492 @@
+"""批注图片并行渲染与流式导出
+
+将整个班级的批注页面渲染并流式写出为 ZIP 或 PDF：
+- 页面在 ProcessPoolExecutor 中渲染，每个工作进程持有一个 AnnotationRenderer（含字体缓存）
+- 渲染结果按 (图片哈希, 批注哈希) 缓存，重复导出直接复用
+- 同时在途的渲染任务数有上限，输出按顺序边渲染边写出，内存占用有界
+"""
+
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import zipfile
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+from src.models.annotation import PageAnnotations, VisualAnnotation
+from src.services.annotation_renderer import AnnotationRenderer, RenderConfig
+from src.services.export_service import AnnotatedImageExporter, ExportConfig
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RENDER_WORKERS = int(os.getenv("ANNOTATION_RENDER_WORKERS", "0")) or min(
+    4, os.cpu_count() or 1
+)
+DEFAULT_RENDER_CACHE_MB = int(os.getenv("ANNOTATION_RENDER_CACHE_MB", "256"))
+STREAM_CHUNK_SIZE = 256 * 1024
+
+
+# ==================== 工作进程 ====================
+
+# 每个工作进程一个渲染器，字体缓存在进程生命周期内复用
+_worker_renderers: Dict[Tuple[str, int], AnnotationRenderer] = {}
+
+
+def _get_worker_renderer(output_format: str, quality: int) -> AnnotationRenderer:
+    key = (output_format.upper(), quality)
+    renderer = _worker_renderers.get(key)
+    if renderer is None:
+        renderer = AnnotationRenderer(
+            RenderConfig(output_format=output_format, output_quality=quality)
+        )
+        _worker_renderers[key] = renderer
+    return renderer
+
+
+def _warm_worker(output_format: str, quality: int) -> None:
+    """工作进程初始化：预加载常用字号"""
+    renderer = _get_worker_renderer(output_format, quality)
+    for size in (
+        renderer.config.font_size_score,
+        renderer.config.font_size_score - 2,
+        renderer.config.font_size_score + 2,
+        renderer.config.font_size_comment,
+    ):
+        renderer._get_font(size)
+
+
+def _render_page_task(
+    image_data: bytes,
+    annotations: List[VisualAnnotation],
+    page_index: int,
+    output_format: str,
+    quality: int,
+) -> bytes:
+    """在工作进程中渲染单页"""
+    renderer = _get_worker_renderer(output_format, quality)
+    if annotations:
+        return renderer.render_page(
+            image_data, PageAnnotations(page_index=page_index, annotations=annotations)
+        )
+    if output_format.upper() == "JPEG":
+        # PDF 导出统一为 JPEG，无批注页面也需要转码
+        return _to_jpeg(image_data, quality)
+    return image_data
+
+
+def _to_jpeg(image_data: bytes, quality: int) -> bytes:
+    image = Image.open(io.BytesIO(image_data))
+    if image.format == "JPEG" and image.mode in ("RGB", "L"):
+        return image_data
+    output = io.BytesIO()
+    image.convert("RGB").save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_render_executor() -> ProcessPoolExecutor:
+    """获取全局渲染进程池（懒加载）"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=DEFAULT_RENDER_WORKERS,
+                initializer=_warm_worker,
+                initargs=("PNG", 95),
+            )
+            logger.info(f"[AnnotationExport] render pool started: workers={DEFAULT_RENDER_WORKERS}")
+        return _executor
+
+
+def shutdown_render_executor() -> None:
+    """关闭全局渲染进程池"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+# ==================== 渲染缓存 ====================
+
+
+class RenderedPageCache:
+    """渲染结果缓存（LRU，按字节数限制容量）"""
+
+    def __init__(self, max_bytes: int = DEFAULT_RENDER_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def image_hash(image_data: bytes) -> str:
+        return hashlib.sha256(image_data).hexdigest()
+
+    @staticmethod
+    def annotation_hash(annotations: List[VisualAnnotation], output_format: str) -> str:
+        payload = json.dumps(
+            [a.to_dict() for a in annotations], sort_keys=True, ensure_ascii=False
+        )
+        return hashlib.sha256(f"{output_format.upper()}|{payload}".encode("utf-8")).hexdigest()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key: Tuple[str, str], data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+_page_cache: Optional[RenderedPageCache] = None
+
+
+def get_rendered_page_cache() -> RenderedPageCache:
+    global _page_cache
+    if _page_cache is None:
+        _page_cache = RenderedPageCache()
+    return _page_cache
+
+
+# ==================== 流式写出 ====================
+
+
+class _ChunkSink:
+    """只追加的写出缓冲，供 zipfile / PDF 写入后按块取走"""
+
+    def __init__(self) -> None:
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.pending_bytes = 0
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+            self._position += len(data)
+            self.pending_bytes += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.pending_bytes = 0
+        return data
+
+
+class StreamingPdfWriter:
+    """
+    逐页写出的最小 PDF 写入器
+
+    每页嵌入一张 JPEG（DCTDecode），对象按顺序写出，结尾统一写 xref，
+    无需把整份文档保留在内存中。
+    """
+
+    def __init__(self, sink: _ChunkSink, dpi: int = 150):
+        self._sink = sink
+        self._dpi = dpi
+        self._offsets: Dict[int, int] = {}
+        self._page_ids: List[int] = []
+        self._next_id = 3  # 1: Catalog, 2: Pages
+        self._sink.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write_object(self, obj_id: int, body: bytes) -> None:
+        self._offsets[obj_id] = self._sink.tell()
+        self._sink.write(f"{obj_id} 0 obj\n".encode("ascii"))
+        self._sink.write(body)
+        self._sink.write(b"\nendobj\n")
+
+    def _allocate(self) -> int:
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def add_jpeg_page(self, jpeg_data: bytes) -> None:
+        with Image.open(io.BytesIO(jpeg_data)) as image:
+            width, height = image.size
+            components = 1 if image.mode == "L" else 3
+        page_width = width * 72.0 / self._dpi
+        page_height = height * 72.0 / self._dpi
+
+        image_id = self._allocate()
+        content_id = self._allocate()
+        page_id = self._allocate()
+
+        color_space = "/DeviceGray" if components == 1 else "/DeviceRGB"
+        self._write_object(
+            image_id,
+            (
+                f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                f"/ColorSpace {color_space} /BitsPerComponent 8 /Filter /DCTDecode "
+                f"/Length {len(jpeg_data)} >>\nstream\n"
+            ).encode("ascii")
+            + jpeg_data
+            + b"\nendstream",
+        )
+        content = f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Im0 Do Q".encode("ascii")
+        self._write_object(
+            content_id,
+            f"<< /Length {len(content)} >>\nstream\n".encode("ascii") + content + b"\nendstream",
+        )
+        self._write_object(
+            page_id,
+            (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+                f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> /Contents {content_id} 0 R >>"
+            ).encode("ascii"),
+        )
+        self._page_ids.append(page_id)
+
+    def close(self) -> None:
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object(
+            2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode("ascii")
+        )
+        self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_offset = self._sink.tell()
+        size = self._next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for obj_id in range(1, size):
+            lines.append(f"{self._offsets.get(obj_id, 0):010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        self._sink.write("".join(lines).encode("ascii"))
+
+
+# ==================== 渲染管线 ====================
+
+
+@dataclass
+class PageRenderJob:
+    """单页渲染任务"""
+
+    student_name: str
+    page_index: int
+    image_data: bytes
+    annotations: List[VisualAnnotation] = field(default_factory=list)
+
+
+class AnnotatedExportPipeline:
+    """
+    批注导出管线
+
+    按学生、页码顺序产出渲染结果；最多 max_in_flight 个页面同时在渲染，
+    已完成的页面立即写出，不等待整批完成。
+    """
+
+    def __init__(
+        self,
+        config: Optional[ExportConfig] = None,
+        *,
+        executor: Optional[Executor] = None,
+        cache: Optional[RenderedPageCache] = None,
+        max_in_flight: Optional[int] = None,
+    ):
+        self.config = config or ExportConfig()
+        self._executor = executor
+        self.cache = cache if cache is not None else get_rendered_page_cache()
+        self.max_in_flight = max_in_flight or DEFAULT_RENDER_WORKERS * 2
+        # 复用既有的批注构建逻辑
+        self._annotation_builder = AnnotatedImageExporter(self.config)
+
+    def iter_jobs(
+        self,
+        student_results: List[Dict[str, Any]],
+        images: List[bytes],
+    ) -> Iterator[PageRenderJob]:
+        """展开为逐页渲染任务"""
+        for student in student_results:
+            student_name = (
+                student.get("studentName")
+                or student.get("student_name")
+                or student.get("student_key")
+                or "Unknown"
+            )
+            start_page = student.get("startPage") or student.get("start_page") or 0
+            end_page = student.get("endPage") or student.get("end_page")
+            if end_page is None:
+                end_page = len(images) - 1
+            question_results = (
+                student.get("questionResults") or student.get("question_results") or []
+            )
+            for page_idx in range(start_page, min(end_page + 1, len(images))):
+                yield PageRenderJob(
+                    student_name=student_name,
+                    page_index=page_idx,
+                    image_data=images[page_idx],
+                    annotations=self._annotation_builder._build_annotations_from_results(
+                        question_results, page_idx
+                    ),
+                )
+
+    async def render(
+        self,
+        jobs: Iterator[PageRenderJob],
+        output_format: Optional[str] = None,
+    ) -> AsyncIterator[Tuple[PageRenderJob, bytes]]:
+        """并行渲染并按输入顺序产出 (任务, 渲染结果)"""
+        output_format = (output_format or self.config.image_format).upper()
+        quality = self.config.image_quality
+        loop = asyncio.get_running_loop()
+        executor = self._executor or get_render_executor()
+
+        window: Deque[Tuple[PageRenderJob, Tuple[str, str], "asyncio.Future[bytes]"]] = deque()
+
+        def submit(job: PageRenderJob) -> None:
+            key = (
+                self.cache.image_hash(job.image_data),
+                self.cache.annotation_hash(job.annotations, output_format),
+            )
+            cached = self.cache.get(key)
+            if cached is not None:
+                future = loop.create_future()
+                future.set_result(cached)
+            else:
+                future = loop.run_in_executor(
+                    executor,
+                    _render_page_task,
+                    job.image_data,
+                    job.annotations,
+                    job.page_index,
+                    output_format,
+                    quality,
+                )
+            window.append((job, key, future))
+
+        job_iter = iter(jobs)
+        try:
+            for job in job_iter:
+                submit(job)
+                if len(window) >= self.max_in_flight:
+                    break
+
+            while window:
+                job, key, future = window.popleft()
+                try:
+                    rendered = await future
+                    self.cache.put(key, rendered)
+                except Exception as e:
+                    logger.warning(
+                        f"[AnnotationExport] render failed: student={job.student_name} "
+                        f"page={job.page_index}: {e}"
+                    )
+                    rendered = (
+                        _to_jpeg(job.image_data, quality)
+                        if output_format == "JPEG"
+                        else job.image_data
+                    )
+                next_job = next(job_iter, None)
+                if next_job is not None:
+                    submit(next_job)
+                yield job, rendered
+        finally:
+            for _, _, future in window:
+                future.cancel()
+
+    async def stream_zip(
+        self,
+        student_results: List[Dict[str, Any]],
+        images: List[bytes],
+        batch_id: str,
+    ) -> AsyncIterator[bytes]:
+        """流式产出 ZIP 字节块"""
+        sink = _ChunkSink()
+        extension = "jpg" if self.config.image_format.upper() == "JPEG" else "png"
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as zf:
+            async for job, image_bytes in self.render(self.iter_jobs(student_results, images)):
+                # 图片本身已压缩，存储模式避免重复压缩
+                zf.writestr(f"{job.student_name}/page_{job.page_index + 1}.{extension}", image_bytes)
+                if self.config.include_original:
+                    zf.writestr(
+                        f"{job.student_name}/original_page_{job.page_index + 1}.png",
+                        job.image_data,
+                    )
+                if sink.pending_bytes >= STREAM_CHUNK_SIZE:
+                    yield sink.drain()
+
+            metadata = {
+                "batch_id": batch_id,
+                "export_time": datetime.now().isoformat(),
+                "student_count": len(student_results),
+                "total_pages": len(images),
+            }
+            zf.writestr(
+                zipfile.ZipInfo("metadata.json"),
+                json.dumps(metadata, ensure_ascii=False, indent=2),
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+        tail = sink.drain()
+        if tail:
+            yield tail
+
+    async def stream_pdf(
+        self,
+        student_results: List[Dict[str, Any]],
+        images: List[bytes],
+    ) -> AsyncIterator[bytes]:
+        """流式产出 PDF 字节块（每页一张 JPEG）"""
+        sink = _ChunkSink()
+        writer = StreamingPdfWriter(sink)
+        async for _, jpeg_bytes in self.render(
+            self.iter_jobs(student_results, images), output_format="JPEG"
+        ):
+            writer.add_jpeg_page(jpeg_bytes)
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+
+__all__ = [
+    "AnnotatedExportPipeline",
+    "PageRenderJob",
+    "RenderedPageCache",
+    "StreamingPdfWriter",
+    "get_render_executor",
+    "get_rendered_page_cache",
+    "shutdown_render_executor",
+]
@@ -563,6 +563,7 @@ def _bbox_has_non_line_ink(image_data: bytes, bbox: Dict[str, float]) -> bool:
     try:
         from PIL import Image
         import numpy as np
+        from src.services.page_classifier import INK_THRESHOLD, remove_ruled_lines
     except Exception:
         # If imaging stack is unavailable, keep annotations rather than failing generation.
         return True
@@ -583,17 +584,13 @@ def _bbox_has_non_line_ink(image_data: bytes, bbox: Dict[str, float]) -> bool:
             return False
 
         # Treat dark pixels as ink. Threshold tuned for scanned answer sheets.
-        ink = crop < 165
+        ink = crop < INK_THRESHOLD
         if ink.sum() == 0:
             return False
 
         ch, cw = ink.shape[:2]
         # Rows dominated by dark pixels are typically printed/ruled lines.
-        row_dark = ink.sum(axis=1)
-        ruled_rows = row_dark >= max(3, int(0.50 * cw))
-        if ruled_rows.any():
-            ink = ink.copy()
-            ink[ruled_rows, :] = False
+        ink = remove_ruled_lines(ink)
 
         dark_count = int(ink.sum())
         if dark_count <= 2:
@@ -630,6 +627,7 @@ def _bbox_is_anchored_to_nearby_ink(
     try:
         from PIL import Image
         import numpy as np
+        from src.services.page_classifier import INK_THRESHOLD, remove_ruled_lines
     except Exception:
         return True
 
@@ -645,12 +643,7 @@ def _bbox_is_anchored_to_nearby_ink(
         x1 = max(x0 + 1, min(w, int(round(bbox["x_max"] * w))))
         y1 = max(y0 + 1, min(h, int(round(bbox["y_max"] * h))))
 
-        ink = arr < 165
-        row_dark = ink.sum(axis=1)
-        ruled_rows = row_dark >= max(3, int(0.50 * w))
-        if ruled_rows.any():
-            ink = ink.copy()
-            ink[ruled_rows, :] = False
+        ink = remove_ruled_lines(arr < INK_THRESHOLD)
 
         pad_x = max(4, int(round(w * expand_ratio)))
         pad_y = max(4, int(round(h * expand_ratio)))
@@ -0,0 +1,649 @@
+"""
+辅助分析任务池：有界并发、持久化队列、批次进度、取消与恢复
+
+批量辅助分析原先为每个请求项直接 create_task，一次请求就会同时启动全部
+LangGraph 运行，压垮 LLM 供应商与 API 内存，且进程重启后任务全部丢失。
+- 任务记录与待执行队列写入 Redis（不可用时退回进程内存储）；
+- 固定数量的 worker 从进程内队列取任务执行，同时在途的运行数不超过 worker 数；
+- 每个任务的阶段与进度汇总为批次进度，通过 on_update 回调推送；
+- 支持按任务或批次取消；启动时重新入队未完成的任务（运行中被中断的任务标记为恢复）；
+- 执行期间定期续租，并据存储中的状态感知其他实例发起的取消；终态只写一次，
+  已取消的任务不会被其他实例的"完成"覆盖。
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+ASSISTANT_ANALYSIS_WORKERS = int(os.getenv("ASSISTANT_ANALYSIS_WORKERS", "4"))
+ASSISTANT_JOB_TTL_SECONDS = int(os.getenv("ASSISTANT_JOB_TTL_SECONDS", "172800"))
+ASSISTANT_JOB_LEASE_SECONDS = int(os.getenv("ASSISTANT_JOB_LEASE_SECONDS", "60"))
+# 运行期间续租间隔（同时检查跨实例取消）
+ASSISTANT_JOB_HEARTBEAT_SECONDS = float(
+    os.getenv("ASSISTANT_JOB_HEARTBEAT_SECONDS", str(ASSISTANT_JOB_LEASE_SECONDS / 3))
+)
+# 租约被其他实例持有时延迟重试；持有者崩溃时租约过期后由本实例接手
+ASSISTANT_JOB_CLAIM_RETRY_SECONDS = float(os.getenv("ASSISTANT_JOB_CLAIM_RETRY_SECONDS", "30"))
+ASSISTANT_JOB_KEY_PREFIX = os.getenv("ASSISTANT_JOB_REDIS_PREFIX", "assistant_job")
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+TERMINAL_STATUSES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+# 仅当租约仍归本实例所有时续期 / 释放
+_RENEW_LEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("EXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_LEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+# 仅当任务未处于终态时写入字段；ARGV[3] 为 1 时同时移出待执行集合
+_TRANSITION_SCRIPT = """
+local status = redis.call("HGET", KEYS[1], "status")
+if not status or status == "completed" or status == "failed" or status == "cancelled" then
+    return 0
+end
+for i = 4, #ARGV, 2 do
+    redis.call("HSET", KEYS[1], ARGV[i], ARGV[i + 1])
+end
+redis.call("EXPIRE", KEYS[1], ARGV[2])
+if ARGV[3] == "1" then
+    redis.call("ZREM", KEYS[2], ARGV[1])
+end
+return 1
+"""
+
+
+def _encode_fields(fields: Mapping[str, Any]) -> Dict[str, str]:
+    payload = {
+        key: (f"{value:.2f}" if isinstance(value, float) else str(value))
+        for key, value in fields.items()
+        if value is not None
+    }
+    payload["updated_at"] = datetime.now().isoformat()
+    return payload
+
+
+@dataclass
+class AssistantJob:
+    """单个辅助分析任务（payload 为可 JSON 序列化的请求参数）"""
+
+    job_id: str
+    batch_id: str
+    payload: Dict[str, Any]
+    status: str = JOB_QUEUED
+    stage: str = JOB_QUEUED
+    percentage: float = 0.0
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    updated_at: Optional[str] = None
+
+    def to_redis_hash(self) -> Dict[str, str]:
+        return {
+            "job_id": self.job_id,
+            "batch_id": self.batch_id,
+            "payload": json.dumps(self.payload, ensure_ascii=False),
+            "status": self.status,
+            "stage": self.stage,
+            "percentage": f"{self.percentage:.2f}",
+            "attempts": str(self.attempts),
+            "error": self.error or "",
+            "created_at": self.created_at,
+            "updated_at": self.updated_at or self.created_at,
+        }
+
+    @classmethod
+    def from_redis(cls, data: Mapping[Any, Any]) -> "AssistantJob":
+        def _decode(value: Any) -> str:
+            if isinstance(value, (bytes, bytearray)):
+                return value.decode("utf-8", errors="ignore")
+            return str(value)
+
+        normalized = {_decode(k): _decode(v) for k, v in data.items()}
+        return cls(
+            job_id=normalized.get("job_id", ""),
+            batch_id=normalized.get("batch_id", ""),
+            payload=json.loads(normalized.get("payload") or "{}"),
+            status=normalized.get("status", JOB_QUEUED),
+            stage=normalized.get("stage", JOB_QUEUED),
+            percentage=float(normalized.get("percentage") or 0.0),
+            attempts=int(normalized.get("attempts") or 0),
+            error=normalized.get("error") or None,
+            created_at=normalized.get("created_at") or datetime.now().isoformat(),
+            updated_at=normalized.get("updated_at") or None,
+        )
+
+
+class InMemoryAssistantJobStore:
+    """进程内任务存储（无 Redis 时使用，重启后不保留）"""
+
+    def __init__(self) -> None:
+        self._jobs: Dict[str, AssistantJob] = {}
+        self._batches: Dict[str, List[str]] = {}
+        self._pending: Dict[str, float] = {}
+
+    async def add_jobs(self, jobs: Sequence[AssistantJob]) -> None:
+        for job in jobs:
+            self._jobs[job.job_id] = job
+            ids = self._batches.setdefault(job.batch_id, [])
+            if job.job_id not in ids:
+                ids.append(job.job_id)
+            self._pending[job.job_id] = time.time()
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        for key, value in fields.items():
+            setattr(job, key, value)
+        job.updated_at = datetime.now().isoformat()
+        if job.status in TERMINAL_STATUSES:
+            self._pending.pop(job_id, None)
+        else:
+            self._pending.setdefault(job_id, time.time())
+
+    async def transition(self, job_id: str, **fields: Any) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.status in TERMINAL_STATUSES:
+            return False
+        await self.update(job_id, **fields)
+        return True
+
+    async def get(self, job_id: str) -> Optional[AssistantJob]:
+        return self._jobs.get(job_id)
+
+    async def batch_jobs(self, batch_id: str) -> List[AssistantJob]:
+        return [self._jobs[i] for i in self._batches.get(batch_id, []) if i in self._jobs]
+
+    async def pending_ids(self) -> List[str]:
+        return sorted(self._pending, key=self._pending.get)
+
+    async def claim(self, job_id: str, owner: str) -> bool:
+        return True
+
+    async def renew(self, job_id: str, owner: str) -> bool:
+        return True
+
+    async def release(self, job_id: str, owner: str) -> None:
+        return None
+
+
+class RedisAssistantJobStore:
+    """
+    Redis 任务存储
+
+    - {prefix}:record:{job_id}  任务记录 Hash
+    - {prefix}:batch:{batch_id} 批次内任务 ID 列表（提交顺序）
+    - {prefix}:pending          未完成任务 ZSET（分数为入队时间），重启后据此恢复
+    - {prefix}:lease:{job_id}   执行租约，避免多个实例同时执行同一任务
+    """
+
+    def __init__(self, redis_client: Any) -> None:
+        self._redis = redis_client
+
+    @staticmethod
+    def _record_key(job_id: str) -> str:
+        return f"{ASSISTANT_JOB_KEY_PREFIX}:record:{job_id}"
+
+    @staticmethod
+    def _batch_key(batch_id: str) -> str:
+        return f"{ASSISTANT_JOB_KEY_PREFIX}:batch:{batch_id}"
+
+    @staticmethod
+    def _pending_key() -> str:
+        return f"{ASSISTANT_JOB_KEY_PREFIX}:pending"
+
+    @staticmethod
+    def _lease_key(job_id: str) -> str:
+        return f"{ASSISTANT_JOB_KEY_PREFIX}:lease:{job_id}"
+
+    async def add_jobs(self, jobs: Sequence[AssistantJob]) -> None:
+        if not jobs:
+            return
+        now = time.time()
+        pipe = self._redis.pipeline()
+        batch_ids = set()
+        for job in jobs:
+            record_key = self._record_key(job.job_id)
+            pipe.hset(record_key, mapping=job.to_redis_hash())
+            pipe.expire(record_key, ASSISTANT_JOB_TTL_SECONDS)
+            pipe.rpush(self._batch_key(job.batch_id), job.job_id)
+            pipe.zadd(self._pending_key(), {job.job_id: now})
+            batch_ids.add(job.batch_id)
+        for batch_id in batch_ids:
+            pipe.expire(self._batch_key(batch_id), ASSISTANT_JOB_TTL_SECONDS)
+        await pipe.execute()
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        payload = _encode_fields(fields)
+        record_key = self._record_key(job_id)
+        pipe = self._redis.pipeline()
+        pipe.hset(record_key, mapping=payload)
+        pipe.expire(record_key, ASSISTANT_JOB_TTL_SECONDS)
+        status = fields.get("status")
+        if status in TERMINAL_STATUSES:
+            pipe.zrem(self._pending_key(), job_id)
+        elif status is not None:
+            pipe.zadd(self._pending_key(), {job_id: time.time()}, nx=True)
+        await pipe.execute()
+
+    async def transition(self, job_id: str, **fields: Any) -> bool:
+        """原子地写入字段，任务已处于终态（或记录不存在）时放弃并返回 False"""
+        args: List[Any] = [
+            job_id,
+            ASSISTANT_JOB_TTL_SECONDS,
+            "1" if fields.get("status") in TERMINAL_STATUSES else "0",
+        ]
+        for key, value in _encode_fields(fields).items():
+            args.extend((key, value))
+        applied = await self._redis.eval(
+            _TRANSITION_SCRIPT, 2, self._record_key(job_id), self._pending_key(), *args
+        )
+        return bool(applied)
+
+    async def get(self, job_id: str) -> Optional[AssistantJob]:
+        data = await self._redis.hgetall(self._record_key(job_id))
+        if not data:
+            return None
+        job = AssistantJob.from_redis(data)
+        return job if job.job_id else None
+
+    async def batch_jobs(self, batch_id: str) -> List[AssistantJob]:
+        ids = await self._redis.lrange(self._batch_key(batch_id), 0, -1)
+        jobs = []
+        for raw in ids:
+            job_id = raw.decode("utf-8") if isinstance(raw, (bytes, bytearray)) else str(raw)
+            job = await self.get(job_id)
+            if job is not None:
+                jobs.append(job)
+        return jobs
+
+    async def pending_ids(self) -> List[str]:
+        ids = await self._redis.zrange(self._pending_key(), 0, -1)
+        return [i.decode("utf-8") if isinstance(i, (bytes, bytearray)) else str(i) for i in ids]
+
+    async def claim(self, job_id: str, owner: str) -> bool:
+        acquired = await self._redis.set(
+            self._lease_key(job_id), owner, nx=True, ex=ASSISTANT_JOB_LEASE_SECONDS
+        )
+        return bool(acquired)
+
+    async def renew(self, job_id: str, owner: str) -> bool:
+        renewed = await self._redis.eval(
+            _RENEW_LEASE_SCRIPT, 1, self._lease_key(job_id), owner, ASSISTANT_JOB_LEASE_SECONDS
+        )
+        return bool(renewed)
+
+    async def release(self, job_id: str, owner: str) -> None:
+        await self._redis.eval(_RELEASE_LEASE_SCRIPT, 1, self._lease_key(job_id), owner)
+
+
+JobRunner = Callable[[AssistantJob, Callable[[str, float], Awaitable[None]]], Awaitable[Any]]
+UpdateCallback = Callable[[AssistantJob, Dict[str, Any]], Awaitable[None]]
+
+
+class AssistantJobPool:
+    """
+    有界并发的辅助分析任务池
+
+    runner(job, report) 执行单个任务，report(stage, percentage) 上报阶段进度；
+    runner 抛出异常视为失败。on_update(job, batch_progress) 在任务状态或进度
+    变化后调用，batch_progress 为该批次的汇总进度。
+
+    多实例共享存储时：租约由其他实例持有的任务延迟 claim_retry_seconds 后重试；
+    运行期间每 heartbeat_seconds 续租一次，并在存储中的状态变为已取消时停止执行。
+    """
+
+    def __init__(
+        self,
+        runner: JobRunner,
+        *,
+        store: Any = None,
+        max_workers: Optional[int] = None,
+        on_update: Optional[UpdateCallback] = None,
+        heartbeat_seconds: Optional[float] = None,
+        claim_retry_seconds: Optional[float] = None,
+    ) -> None:
+        self._runner = runner
+        self._store = store or InMemoryAssistantJobStore()
+        self._max_workers = max(1, max_workers or ASSISTANT_ANALYSIS_WORKERS)
+        self._on_update = on_update
+        self._heartbeat_seconds = heartbeat_seconds or ASSISTANT_JOB_HEARTBEAT_SECONDS
+        self._claim_retry_seconds = (
+            ASSISTANT_JOB_CLAIM_RETRY_SECONDS
+            if claim_retry_seconds is None
+            else claim_retry_seconds
+        )
+        self._owner = f"{os.getpid()}:{id(self)}"
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._queued: set = set()
+        self._workers: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancel_requested: set = set()
+        self._lease_lost: set = set()
+        self._deferred: Dict[str, asyncio.TimerHandle] = {}
+        self._jobs: Dict[str, AssistantJob] = {}
+        self._batches: Dict[str, List[str]] = {}
+        self._closing = False
+        self.max_in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._running)
+
+    def _ensure_workers(self) -> None:
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self._max_workers:
+            self._workers.append(asyncio.create_task(self._worker_loop(len(self._workers))))
+
+    def _track(self, job: AssistantJob) -> None:
+        self._jobs[job.job_id] = job
+        ids = self._batches.setdefault(job.batch_id, [])
+        if job.job_id not in ids:
+            ids.append(job.job_id)
+
+    def _enqueue(self, job_id: str) -> None:
+        deferred = self._deferred.pop(job_id, None)
+        if deferred is not None:
+            deferred.cancel()
+        if self._closing or job_id in self._queued or job_id in self._running:
+            return
+        self._queued.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    async def submit(self, jobs: Sequence[AssistantJob]) -> None:
+        """持久化并入队一批任务"""
+        await self._store.add_jobs(jobs)
+        for job in jobs:
+            self._track(job)
+            self._enqueue(job.job_id)
+        self._ensure_workers()
+        for batch_id in {job.batch_id for job in jobs}:
+            await self._notify(self._jobs[self._batches[batch_id][0]])
+
+    async def resume(self, batch_id: Optional[str] = None) -> int:
+        """
+        重新入队未完成的任务
+
+        不指定 batch_id 时恢复存储中所有未完成任务（用于启动时）；
+        指定时同时重新入队该批次中已取消或失败的任务。
+        """
+        if batch_id is None:
+            stored = [await self._store.get(i) for i in await self._store.pending_ids()]
+            jobs = [job for job in stored if job]
+        else:
+            jobs = await self._store.batch_jobs(batch_id)
+        resumed = 0
+        for job in jobs:
+            if job.job_id in self._running or job.status == JOB_COMPLETED:
+                continue
+            if batch_id is None and job.status in TERMINAL_STATUSES:
+                continue
+            if job.status != JOB_QUEUED:
+                job.status, job.stage, job.error = JOB_QUEUED, JOB_QUEUED, None
+                await self._store.update(job.job_id, status=JOB_QUEUED, stage=JOB_QUEUED, error="")
+            self._cancel_requested.discard(job.job_id)
+            self._track(job)
+            self._enqueue(job.job_id)
+            resumed += 1
+        if resumed:
+            self._ensure_workers()
+            logger.info(f"[AssistantJobPool] resumed jobs={resumed} batch={batch_id or '*'}")
+        return resumed
+
+    async def cancel(self, target_id: str) -> int:
+        """按任务 ID 或批次 ID 取消；返回被取消的任务数"""
+        job_ids = list(self._batches.get(target_id, []))
+        if not job_ids:
+            stored = await self._store.batch_jobs(target_id)
+            if stored:
+                for job in stored:
+                    self._track(job)
+                job_ids = [job.job_id for job in stored]
+            elif target_id in self._jobs or await self._store.get(target_id):
+                job_ids = [target_id]
+        cancelled = 0
+        for job_id in job_ids:
+            job = self._jobs.get(job_id) or await self._store.get(job_id)
+            if job is None or job.status in TERMINAL_STATUSES:
+                continue
+            self._track(job)
+            self._cancel_requested.add(job_id)
+            task = self._running.get(job_id)
+            if task is not None:
+                task.cancel()
+            else:
+                await self._finish(job, JOB_CANCELLED)
+            cancelled += 1
+        return cancelled
+
+    async def refresh_batch(self, batch_id: str) -> None:
+        """从存储加载批次中不在本进程执行的任务（重启后或其他实例提交的批次）"""
+        for job in await self._store.batch_jobs(batch_id):
+            if job.job_id not in self._running:
+                self._track(job)
+
+    def batch_progress(self, batch_id: str) -> Dict[str, Any]:
+        """按进程内跟踪的任务状态汇总批次进度"""
+        jobs = [self._jobs[i] for i in self._batches.get(batch_id, []) if i in self._jobs]
+        counts = {status: 0 for status in (JOB_QUEUED, JOB_RUNNING) + TERMINAL_STATUSES}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        total = len(jobs)
+        percentage = sum(
+            100.0 if job.status in TERMINAL_STATUSES else job.percentage for job in jobs
+        ) / total if total else 0.0
+        return {
+            "batch_id": batch_id,
+            "total": total,
+            **counts,
+            "finished": total > 0 and counts[JOB_QUEUED] == counts[JOB_RUNNING] == 0,
+            "percentage": round(percentage, 2),
+        }
+
+    async def _notify(self, job: AssistantJob) -> None:
+        if self._on_update is None:
+            return
+        try:
+            await self._on_update(job, self.batch_progress(job.batch_id))
+        except Exception as exc:
+            logger.debug(f"[AssistantJobPool] update callback failed job={job.job_id}: {exc}")
+
+    def _sync_from(self, job: AssistantJob, stored: Optional[AssistantJob]) -> None:
+        if stored is not None and stored is not job:
+            job.status, job.stage, job.error = stored.status, stored.stage, stored.error
+            job.percentage, job.attempts = stored.percentage, stored.attempts
+
+    async def _finish(self, job: AssistantJob, status: str, error: Optional[str] = None) -> None:
+        stage, percentage = job.stage, job.percentage
+        if status == JOB_COMPLETED:
+            stage, percentage = JOB_COMPLETED, 100.0
+        elif status == JOB_CANCELLED:
+            stage = JOB_CANCELLED
+        applied = await self._store.transition(
+            job.job_id, status=status, stage=stage, percentage=percentage, error=error or ""
+        )
+        if applied:
+            job.status, job.stage, job.percentage, job.error = status, stage, percentage, error
+        else:
+            # 其他实例已写入终态（如跨实例取消），以存储为准
+            self._sync_from(job, await self._store.get(job.job_id))
+        self._cancel_requested.discard(job.job_id)
+        await self._notify(job)
+
+    def _defer(self, job_id: str) -> None:
+        if self._closing or job_id in self._deferred:
+            return
+        loop = asyncio.get_running_loop()
+        self._deferred[job_id] = loop.call_later(
+            self._claim_retry_seconds, self._enqueue, job_id
+        )
+
+    async def _heartbeat(self, job: AssistantJob, task: asyncio.Task) -> None:
+        """续租；租约丢失或存储中的任务已被取消时停止本地执行"""
+        while not task.done():
+            await asyncio.sleep(self._heartbeat_seconds)
+            try:
+                if not await self._store.renew(job.job_id, self._owner):
+                    logger.warning(f"[AssistantJobPool] lease lost: {job.job_id}")
+                    self._lease_lost.add(job.job_id)
+                    task.cancel()
+                    return
+                stored = await self._store.get(job.job_id)
+                if stored is not None and stored.status == JOB_CANCELLED:
+                    self._cancel_requested.add(job.job_id)
+                    task.cancel()
+                    return
+            except Exception as exc:
+                logger.debug(f"[AssistantJobPool] heartbeat failed job={job.job_id}: {exc}")
+
+    async def _run_job(self, job: AssistantJob) -> None:
+        if not await self._store.claim(job.job_id, self._owner):
+            # 其他实例持有租约：稍后重试，持有者崩溃时租约过期后由本实例接手
+            logger.info(f"[AssistantJobPool] job leased by another worker: {job.job_id}")
+            self._defer(job.job_id)
+            return
+
+        # 排队期间可能已被其他实例完成或取消，以存储中的记录为准
+        self._sync_from(job, await self._store.get(job.job_id))
+        attempts = job.attempts + 1
+        if job.status in TERMINAL_STATUSES or not await self._store.transition(
+            job.job_id, status=JOB_RUNNING, attempts=attempts
+        ):
+            await self._store.release(job.job_id, self._owner)
+            self._sync_from(job, await self._store.get(job.job_id))
+            await self._notify(job)
+            return
+
+        async def report(stage: str, percentage: float) -> None:
+            job.stage, job.percentage = stage, float(percentage)
+            await self._store.update(job.job_id, stage=stage, percentage=float(percentage))
+            await self._notify(job)
+
+        job.status, job.attempts = JOB_RUNNING, attempts
+        await self._notify(job)
+
+        task = asyncio.create_task(self._runner(job, report))
+        heartbeat = asyncio.create_task(self._heartbeat(job, task))
+        self._running[job.job_id] = task
+        self.max_in_flight = max(self.max_in_flight, len(self._running))
+        try:
+            await task
+        except asyncio.CancelledError:
+            if self._closing:
+                # 关闭进程时保留 running 状态，下次启动时恢复
+                raise
+            if job.job_id in self._lease_lost:
+                # 租约已由其他实例接手，不再写入状态
+                pass
+            elif job.job_id in self._cancel_requested:
+                await self._finish(job, JOB_CANCELLED)
+            else:
+                raise
+        except Exception as exc:
+            logger.warning(f"[AssistantJobPool] job failed {job.job_id}: {exc}")
+            await self._finish(job, JOB_FAILED, str(exc))
+        else:
+            await self._finish(job, JOB_COMPLETED)
+        finally:
+            heartbeat.cancel()
+            self._running.pop(job.job_id, None)
+            self._lease_lost.discard(job.job_id)
+            await self._store.release(job.job_id, self._owner)
+
+    async def _worker_loop(self, worker_id: int) -> None:
+        while not self._closing:
+            job_id = await self._queue.get()
+            try:
+                self._queued.discard(job_id)
+                job = self._jobs.get(job_id) or await self._store.get(job_id)
+                if job is None or job.status in TERMINAL_STATUSES:
+                    continue
+                await self._run_job(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.error(f"[AssistantJobPool] worker {worker_id} error on {job_id}: {exc}")
+            finally:
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """等待当前队列中的任务全部处理完"""
+        await self._queue.join()
+
+    async def shutdown(self) -> None:
+        """停止 worker；运行中的任务保持 running 状态，下次启动时恢复"""
+        self._closing = True
+        for handle in self._deferred.values():
+            handle.cancel()
+        self._deferred.clear()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+
+_job_pool: Optional[AssistantJobPool] = None
+
+
+async def create_assistant_job_store() -> Any:
+    """Redis 可用时使用 Redis 存储，否则退回进程内存储"""
+    try:
+        from src.utils.pool_manager import UnifiedPoolManager
+
+        pool_manager = await UnifiedPoolManager.get_instance()
+        if pool_manager.is_initialized:
+            return RedisAssistantJobStore(pool_manager.get_redis_client())
+    except Exception as exc:
+        logger.debug(f"[AssistantJobPool] Redis unavailable, use in-memory store: {exc}")
+    return InMemoryAssistantJobStore()
+
+
+async def get_assistant_job_pool(
+    runner: JobRunner,
+    on_update: Optional[UpdateCallback] = None,
+) -> AssistantJobPool:
+    """获取进程内的辅助分析任务池（首次调用时创建）"""
+    global _job_pool
+    if _job_pool is None:
+        _job_pool = AssistantJobPool(
+            runner, store=await create_assistant_job_store(), on_update=on_update
+        )
+    return _job_pool
+
+
+async def shutdown_assistant_job_pool() -> None:
+    """关闭任务池"""
+    global _job_pool
+    if _job_pool is not None:
+        await _job_pool.shutdown()
+        _job_pool = None
+
+
+__all__ = [
+    "AssistantJob",
+    "AssistantJobPool",
+    "InMemoryAssistantJobStore",
+    "RedisAssistantJobStore",
+    "get_assistant_job_pool",
+    "shutdown_assistant_job_pool",
+]
@@ -0,0 +1,346 @@
+"""灰度发布指标聚合
+
+按部署、分组（canary / control）和时间桶累计批改结果与教师改判，
+供 PatchDeployer 监控灰度补丁：
+- 计数按时间桶存放（Redis 哈希每桶一个 key 并按窗口过期，或进程内存）
+- 每条结果带上生效的补丁版本；部署期间未使用该补丁的结果计入对照组
+- 灰度组与对照组用单侧双比例 z 检验比较
+
+指标口径（分母均为窗口内批改的题目数）：
+- error_rate  误判率：教师改判后分数降低（多给分）
+- miss_rate   漏判率：教师改判后分数升高（少给分）
+- review_rate 复核率：置信度低于复核阈值
+- override_rate 改判率：所有教师改判
+"""
+
+import logging
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+CANARY = "canary"
+CONTROL = "control"
+# 全部流量（不区分部署），用作灰度发布前的基线
+ALL_TRAFFIC = "_all"
+
+COUNTER_FIELDS = ("graded", "errors", "misses", "reviews", "overrides")
+RATE_FIELDS = {
+    "error_rate": "errors",
+    "miss_rate": "misses",
+    "review_rate": "reviews",
+    "override_rate": "overrides",
+}
+
+DEFAULT_BUCKET_SECONDS = int(os.getenv("CANARY_METRICS_BUCKET_SECONDS", "60"))
+DEFAULT_WINDOW_SECONDS = int(os.getenv("CANARY_METRICS_WINDOW_SECONDS", "1800"))
+DEFAULT_REVIEW_THRESHOLD = float(os.getenv("GRADING_REVIEW_CONFIDENCE_THRESHOLD", "0.7"))
+
+
+def two_proportion_z_test(
+    successes_a: int, total_a: int, successes_b: int, total_b: int
+) -> Tuple[float, float]:
+    """单侧双比例 z 检验（H1：a 组比例大于 b 组）
+
+    Returns:
+        (z, p_value)；任一组无样本或方差为 0 时返回 (0.0, 1.0)
+    """
+    if total_a <= 0 or total_b <= 0:
+        return 0.0, 1.0
+    p_a = successes_a / total_a
+    p_b = successes_b / total_b
+    pooled = (successes_a + successes_b) / (total_a + total_b)
+    se = math.sqrt(pooled * (1 - pooled) * (1 / total_a + 1 / total_b))
+    if se == 0:
+        return 0.0, 1.0
+    z = (p_a - p_b) / se
+    return z, 0.5 * math.erfc(z / math.sqrt(2))
+
+
+@dataclass
+class ArmMetrics:
+    """单个分组在窗口内的累计计数"""
+
+    graded: int = 0
+    errors: int = 0
+    misses: int = 0
+    reviews: int = 0
+    overrides: int = 0
+
+    @classmethod
+    def from_counts(cls, counts: Dict[str, int]) -> "ArmMetrics":
+        return cls(**{name: int(counts.get(name, 0)) for name in COUNTER_FIELDS})
+
+    def rate(self, counter: str) -> float:
+        if self.graded <= 0:
+            return 0.0
+        return min(1.0, getattr(self, counter) / self.graded)
+
+    def to_rates(self) -> Dict[str, float]:
+        rates = {name: self.rate(counter) for name, counter in RATE_FIELDS.items()}
+        rates["samples"] = self.graded
+        return rates
+
+
+@dataclass
+class CanaryComparison:
+    """灰度组与对照组的比较结果"""
+
+    deployment_id: str
+    canary: ArmMetrics
+    control: ArmMetrics
+    z_scores: Dict[str, float] = field(default_factory=dict)
+    p_values: Dict[str, float] = field(default_factory=dict)
+
+    def has_samples(self, min_samples: int) -> bool:
+        return self.canary.graded >= min_samples and self.control.graded >= min_samples
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "deployment_id": self.deployment_id,
+            "canary": self.canary.to_rates(),
+            "control": self.control.to_rates(),
+            "z_scores": dict(self.z_scores),
+            "p_values": dict(self.p_values),
+        }
+
+
+class CanaryMetricsStore(ABC):
+    """时间桶计数存储"""
+
+    @abstractmethod
+    async def increment_many(
+        self, updates: List[Tuple[str, Dict[str, int]]], bucket: int
+    ) -> None:
+        """在同一时间桶内累加多个序列的计数"""
+
+    @abstractmethod
+    async def read(self, series: str, buckets: List[int]) -> Dict[str, int]:
+        """读取序列在给定时间桶内的计数之和"""
+
+
+class InMemoryCanaryMetricsStore(CanaryMetricsStore):
+    """进程内存储（单进程部署与测试使用）"""
+
+    def __init__(self, max_buckets: int = 1440):
+        self.max_buckets = max_buckets
+        self._buckets: Dict[Tuple[str, int], Counter] = {}
+
+    async def increment_many(
+        self, updates: List[Tuple[str, Dict[str, int]]], bucket: int
+    ) -> None:
+        for series, counts in updates:
+            self._buckets.setdefault((series, bucket), Counter()).update(counts)
+        oldest = bucket - self.max_buckets
+        for key in [key for key in self._buckets if key[1] <= oldest]:
+            del self._buckets[key]
+
+    async def read(self, series: str, buckets: List[int]) -> Dict[str, int]:
+        total: Counter = Counter()
+        for bucket in buckets:
+            total.update(self._buckets.get((series, bucket), {}))
+        return dict(total)
+
+
+class RedisCanaryMetricsStore(CanaryMetricsStore):
+    """Redis 存储：每个 (序列, 时间桶) 一个哈希，写入与读取各一次管道往返"""
+
+    def __init__(
+        self,
+        redis_client: Any,
+        key_prefix: str = "canary_metrics",
+        ttl_seconds: int = DEFAULT_WINDOW_SECONDS * 2,
+    ):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self.ttl_seconds = max(1, int(ttl_seconds))
+
+    def _key(self, series: str, bucket: int) -> str:
+        return f"{self.key_prefix}:{series}:{bucket}"
+
+    async def increment_many(
+        self, updates: List[Tuple[str, Dict[str, int]]], bucket: int
+    ) -> None:
+        pipe = self.redis_client.pipeline(transaction=False)
+        for series, counts in updates:
+            key = self._key(series, bucket)
+            for name, value in counts.items():
+                if value:
+                    pipe.hincrby(key, name, int(value))
+            pipe.expire(key, self.ttl_seconds)
+        await pipe.execute()
+
+    async def read(self, series: str, buckets: List[int]) -> Dict[str, int]:
+        pipe = self.redis_client.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.hgetall(self._key(series, bucket))
+        total: Counter = Counter()
+        for raw in await pipe.execute():
+            for name, value in (raw or {}).items():
+                if isinstance(name, bytes):
+                    name = name.decode()
+                total[name] += int(value)
+        return dict(total)
+
+
+class CanaryMetricsAggregator:
+    """灰度指标聚合器
+
+    记录带补丁版本的批改结果与改判，并按部署拆成灰度组 / 对照组。
+    写入失败只记录警告，不影响批改流程。
+    """
+
+    def __init__(
+        self,
+        store: Optional[CanaryMetricsStore] = None,
+        bucket_seconds: int = DEFAULT_BUCKET_SECONDS,
+        window_seconds: int = DEFAULT_WINDOW_SECONDS,
+        review_confidence_threshold: float = DEFAULT_REVIEW_THRESHOLD,
+        clock=time.time,
+    ):
+        self.store = store or InMemoryCanaryMetricsStore()
+        self.bucket_seconds = max(1, bucket_seconds)
+        self.window_seconds = max(self.bucket_seconds, window_seconds)
+        self.review_confidence_threshold = review_confidence_threshold
+        self._clock = clock
+        # deployment_id -> patch_version
+        self._deployments: Dict[str, str] = {}
+
+    def register_deployment(self, deployment_id: str, patch_version: str) -> None:
+        self._deployments[deployment_id] = patch_version
+
+    def unregister_deployment(self, deployment_id: str) -> None:
+        self._deployments.pop(deployment_id, None)
+
+    @property
+    def active_deployments(self) -> Dict[str, str]:
+        return dict(self._deployments)
+
+    def _bucket(self, at: Optional[float] = None) -> int:
+        return int((self._clock() if at is None else at) // self.bucket_seconds)
+
+    def _window_buckets(self, window_seconds: Optional[int] = None) -> List[int]:
+        window = window_seconds or self.window_seconds
+        current = self._bucket()
+        count = max(1, math.ceil(window / self.bucket_seconds))
+        return list(range(current - count + 1, current + 1))
+
+    @staticmethod
+    def _series(deployment_id: str, arm: str) -> str:
+        return f"{deployment_id}:{arm}"
+
+    def needs_review(self, confidence: Optional[float]) -> bool:
+        return confidence is not None and confidence < self.review_confidence_threshold
+
+    async def _record(self, grouped: Dict[Optional[str], Counter], at: Optional[float]) -> None:
+        """grouped: patch_version -> 计数；同时累加全局序列与各部署的分组序列"""
+        merged: Dict[str, Counter] = {}
+        for patch_version, counts in grouped.items():
+            targets = [ALL_TRAFFIC] + [
+                self._series(deployment_id, CANARY if version == patch_version else CONTROL)
+                for deployment_id, version in self._deployments.items()
+            ]
+            for series in targets:
+                merged.setdefault(series, Counter()).update(counts)
+        if not merged:
+            return
+        try:
+            await self.store.increment_many(
+                [(series, dict(counts)) for series, counts in merged.items()],
+                self._bucket(at),
+            )
+        except Exception as e:
+            logger.warning(f"写入灰度指标失败: {e}")
+
+    async def record_results(
+        self,
+        results: Iterable[Tuple[Optional[str], bool]],
+        at: Optional[float] = None,
+    ) -> None:
+        """批量记录批改结果
+
+        Args:
+            results: (patch_version, needs_review) 序列
+        """
+        grouped: Dict[Optional[str], Counter] = {}
+        for patch_version, needs_review in results:
+            counts = grouped.setdefault(patch_version, Counter())
+            counts["graded"] += 1
+            if needs_review:
+                counts["reviews"] += 1
+        await self._record(grouped, at)
+
+    async def record_result(
+        self, patch_version: Optional[str], needs_review: bool = False, at: Optional[float] = None
+    ) -> None:
+        await self.record_results([(patch_version, needs_review)], at=at)
+
+    async def record_override(
+        self,
+        patch_version: Optional[str],
+        original_score: Optional[float],
+        override_score: Optional[float],
+        at: Optional[float] = None,
+    ) -> None:
+        """记录教师改判：分数降低计为误判，升高计为漏判"""
+        counts = Counter(overrides=1)
+        if original_score is not None and override_score is not None:
+            if override_score < original_score:
+                counts["errors"] += 1
+            elif override_score > original_score:
+                counts["misses"] += 1
+        await self._record({patch_version: counts}, at)
+
+    async def get_metrics(
+        self,
+        deployment_id: Optional[str] = None,
+        arm: str = CANARY,
+        window_seconds: Optional[int] = None,
+    ) -> ArmMetrics:
+        """读取窗口内的计数；deployment_id 为空时返回全部流量"""
+        series = ALL_TRAFFIC if deployment_id is None else self._series(deployment_id, arm)
+        counts = await self.store.read(series, self._window_buckets(window_seconds))
+        return ArmMetrics.from_counts(counts)
+
+    async def compare(
+        self, deployment_id: str, window_seconds: Optional[int] = None
+    ) -> CanaryComparison:
+        """比较灰度组与对照组，每个比率做一次单侧 z 检验（灰度组更差）"""
+        canary = await self.get_metrics(deployment_id, CANARY, window_seconds)
+        control = await self.get_metrics(deployment_id, CONTROL, window_seconds)
+        comparison = CanaryComparison(deployment_id=deployment_id, canary=canary, control=control)
+        for name, counter in RATE_FIELDS.items():
+            z, p_value = two_proportion_z_test(
+                getattr(canary, counter), canary.graded, getattr(control, counter), control.graded
+            )
+            comparison.z_scores[name] = z
+            comparison.p_values[name] = p_value
+        return comparison
+
+
+# 全局单例
+_canary_metrics: Optional[CanaryMetricsAggregator] = None
+
+
+def get_canary_metrics() -> CanaryMetricsAggregator:
+    """获取灰度指标聚合器单例（默认进程内存储）"""
+    global _canary_metrics
+    if _canary_metrics is None:
+        _canary_metrics = CanaryMetricsAggregator()
+    return _canary_metrics
+
+
+def configure_canary_metrics(redis_client: Any) -> CanaryMetricsAggregator:
+    """切换为 Redis 存储，使多个进程共享计数"""
+    aggregator = get_canary_metrics()
+    aggregator.store = RedisCanaryMetricsStore(
+        redis_client, ttl_seconds=aggregator.window_seconds * 2
+    )
+    return aggregator
@@ -15,11 +15,16 @@ import logging
 import os
 import re
 from datetime import datetime
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
 from langchain_core.messages import HumanMessage, SystemMessage
 
 from src.services.chat_model_factory import get_chat_model
+from src.services.review_batching import (
+    REVIEW_BATCH_MAX_STUDENTS,
+    ReviewMicroBatcher,
+    ReviewPayload,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -737,7 +742,7 @@ def _build_grading_context(
     return "\n".join(lines)
 
 
-def _build_user_prompt(*, scope: str, subject_id: str, context: str, max_items: int) -> str:
+def _build_prompt_requirements(*, scope: str, max_items: int) -> str:
     issue_types = sorted(_RUBRIC_ISSUE_TYPES if scope == "rubric" else _GRADING_ISSUE_TYPES)
 
     return f"""你将收到一段“结构化事实与摘录”（不含原图）。请生成 confession_report（自白报告），用于复核与排序。
@@ -750,11 +755,11 @@ def _build_user_prompt(*, scope: str, subject_id: str, context: str, max_items:
 
 ## 允许的 issue_type 列表
 {", ".join(issue_types)}
+"""
 
-## ConfessionReport JSON Schema Hint
-{_confession_schema_hint()}
 
-## Context
+def _build_context_section(*, scope: str, subject_id: str, context: str, max_items: int) -> str:
+    return f"""## Context
 scope={scope}
 subject_id={subject_id}
 max_items={max_items}
@@ -763,6 +768,14 @@ max_items={max_items}
 """
 
 
+def _build_user_prompt(*, scope: str, subject_id: str, context: str, max_items: int) -> str:
+    return f"""{_build_prompt_requirements(scope=scope, max_items=max_items)}
+## ConfessionReport JSON Schema Hint
+{_confession_schema_hint()}
+
+{_build_context_section(scope=scope, subject_id=subject_id, context=context, max_items=max_items)}"""
+
+
 def _normalize_page_indices(value: Any) -> List[int]:
     if value is None:
         return []
@@ -1215,20 +1228,31 @@ class ConfessionAuditorClient:
                 max_tokens = int(os.getenv("CONFESSION_MAX_OUTPUT_TOKENS", "1800"))
             except ValueError:
                 max_tokens = 1800
-        self._llm = get_chat_model(
-            api_key=self._api_key,
-            model_name=self._model_name,
-            purpose=purpose,
-            temperature=temperature,
-            max_output_tokens=max_tokens,
-        )
+        self._llm_kwargs = {
+            "api_key": self._api_key,
+            "model_name": self._model_name,
+            "purpose": purpose,
+            "temperature": temperature,
+        }
+        self._max_output_tokens = max_tokens
+        self._llm = get_chat_model(**self._llm_kwargs, max_output_tokens=max_tokens)
+        self._batch_llm: Any = None
+
+    def _get_batch_llm(self) -> Any:
+        """合批调用的输出随学生数增长，按每批人数上限放大输出 token 上限"""
+        if self._batch_llm is None:
+            self._batch_llm = get_chat_model(
+                **self._llm_kwargs,
+                max_output_tokens=self._max_output_tokens * max(1, REVIEW_BATCH_MAX_STUDENTS),
+            )
+        return self._batch_llm
 
-    async def _invoke(self, *, user_prompt: str) -> Dict[str, Any]:
+    async def _invoke(self, *, user_prompt: str, llm: Any = None) -> Dict[str, Any]:
         messages = [
             SystemMessage(content=_CONFESSION_SYSTEM_PROMPT),
             HumanMessage(content=user_prompt),
         ]
-        response = await self._llm.ainvoke(messages)
+        response = await (llm or self._llm).ainvoke(messages)
         content = response.content if hasattr(response, "content") else str(response)
         json_text = _extract_json_block(content)
         data = _load_json_with_repair(json_text)
@@ -1292,3 +1316,52 @@ class ConfessionAuditorClient:
                 student=student,
                 max_items=max_items,
             )
+
+    async def grading_confession_report_batch(
+        self,
+        *,
+        students: Sequence[Tuple[str, Dict[str, Any]]],
+        batch_id: Optional[str] = None,
+        subject: Optional[str] = None,
+        max_concurrency: int = 3,
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        跨学生合批生成自白报告
+
+        students 为 (subject_id, student) 列表。只返回合批输出中通过校验的学生，
+        其余学生（未合批、分节缺失或格式不符）由调用方走 grading_confession_report。
+        """
+        max_items = int(os.getenv("CONFESSION_GRADING_MAX_ITEMS", "25"))
+        by_key = {subject_id: student for subject_id, student in students}
+        payloads = [
+            ReviewPayload(
+                student_key=subject_id,
+                section=_build_context_section(
+                    scope="grading",
+                    subject_id=subject_id,
+                    context=_build_grading_context(student, batch_id=batch_id, subject=subject),
+                    max_items=max_items,
+                ),
+            )
+            for subject_id, student in students
+        ]
+
+        async def invoke(prompt: str) -> Dict[str, Any]:
+            return await self._invoke(user_prompt=prompt, llm=self._get_batch_llm())
+
+        batcher = ReviewMicroBatcher(
+            invoke,
+            header=_build_prompt_requirements(scope="grading", max_items=max_items),
+            entry_schema=_confession_schema_hint(),
+            validate=lambda _key, entry: isinstance(entry.get("items"), list),
+            max_concurrency=max_concurrency,
+        )
+        reports: Dict[str, Dict[str, Any]] = {}
+        for subject_id, raw in (await batcher.run(payloads)).items():
+            report = postprocess_confession_report(
+                raw, scope="grading", subject_id=subject_id, max_items=max_items
+            )
+            reports[subject_id] = _apply_honesty_penalty(
+                report, student=by_key[subject_id], max_items=max_items
+            )
+        return reports
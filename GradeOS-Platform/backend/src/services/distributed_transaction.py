@@ -6,15 +6,22 @@
 - 数据库写入
 - 通知发送
 
+每次步骤状态变化都追加写入持久化的 Saga 日志（saga_step_log），步骤可声明依赖，
+互不依赖的步骤并发执行。进程崩溃后由 SagaRecoveryWorker 扫描仍处于 STARTED 的事务，
+根据日志恢复执行或补偿。
+
 验证：需求 4.1, 4.2, 4.3, 4.4, 4.5
 """
 
 import asyncio
+import json
 import logging
 import uuid
-from typing import List, Callable, Any, Optional, Awaitable, Dict
+from abc import ABC, abstractmethod
+from functools import partial
+from typing import List, Callable, Any, Optional, Awaitable, Dict, Set
 from dataclasses import dataclass, field
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
 from src.utils.pool_manager import UnifiedPoolManager, PoolNotInitializedError
@@ -56,17 +63,25 @@ class SagaStep:
     Saga 步骤定义
 
     每个步骤包含：
-    - 名称：用于日志和追踪
+    - 名称：用于日志和追踪（同一 Saga 内唯一）
     - 动作：要执行的异步操作
     - 补偿：失败时的回滚操作
+    - 依赖：None 表示依赖列表中的前一个步骤（顺序执行）；
+      显式列表表示仅依赖这些步骤（只能引用排在前面的步骤），空列表表示无依赖
+    - idempotent：动作可安全重复执行（默认否，需显式声明）。崩溃时处于执行中的步骤
+      仅在幂等时才会被恢复重跑，否则整个 Saga 走补偿
     - 状态：当前执行状态
 
+    崩溃恢复时补偿也可能作用于“执行中”而实际未生效的步骤，因此补偿操作必须幂等。
+
     验证：需求 4.1
     """
 
     name: str
     action: Callable[[], Awaitable[Any]]
     compensation: Callable[[], Awaitable[None]]
+    depends_on: Optional[List[str]] = None
+    idempotent: bool = False
     status: SagaStepStatus = SagaStepStatus.PENDING
     result: Optional[Any] = None
     error: Optional[str] = None
@@ -107,15 +122,336 @@ class SagaTransaction:
         }
 
 
+@dataclass
+class SagaStepState:
+    """Saga 日志中某个步骤的最新状态"""
+
+    name: str
+    status: SagaStepStatus
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class SagaLogRecord:
+    """仍处于 STARTED 状态、等待恢复的 Saga"""
+
+    saga_id: str
+    saga_type: Optional[str]
+    context: Dict[str, Any]
+    started_at: datetime
+    updated_at: datetime
+
+
+class SagaLogStore(ABC):
+    """
+    Saga 持久化日志
+
+    - saga 级别：开始 / 结束（含类型与上下文，用于恢复时重建步骤）
+    - 步骤级别：每次状态变化追加一行，同时刷新 saga 的 updated_at 作为心跳
+    """
+
+    @abstractmethod
+    async def start_saga(
+        self,
+        saga_id: str,
+        saga_type: Optional[str],
+        context: Optional[Dict[str, Any]],
+        steps: List[SagaStep],
+        started_at: datetime,
+    ) -> None:
+        """记录事务开始"""
+
+    @abstractmethod
+    async def record_step(self, saga_id: str, step: SagaStep) -> None:
+        """追加一条步骤状态变化"""
+
+    @abstractmethod
+    async def finish_saga(
+        self,
+        saga_id: str,
+        steps: List[SagaStep],
+        final_status: SagaTransactionStatus,
+        started_at: datetime,
+        error_message: Optional[str] = None,
+    ) -> None:
+        """记录事务结束"""
+
+    @abstractmethod
+    async def list_stale_sagas(self, stale_before: datetime, limit: int) -> List[SagaLogRecord]:
+        """列出 updated_at 早于 stale_before 且仍为 STARTED 的事务"""
+
+    @abstractmethod
+    async def claim_saga(self, saga_id: str, stale_before: datetime) -> bool:
+        """原子地认领一个待恢复事务（刷新心跳），多个恢复进程只有一个成功"""
+
+    @abstractmethod
+    async def load_step_states(self, saga_id: str) -> Dict[str, SagaStepState]:
+        """读取每个步骤的最新状态"""
+
+
+def _json_safe(value: Any) -> Any:
+    """步骤结果写入日志前转为 JSON 兼容值，无法序列化时记录为 None"""
+    try:
+        return json.loads(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return None
+
+
+class InMemorySagaLogStore(SagaLogStore):
+    """进程内 Saga 日志（测试与无数据库的单进程部署）"""
+
+    def __init__(self):
+        self.sagas: Dict[str, Dict[str, Any]] = {}
+        self.step_log: List[Dict[str, Any]] = []
+
+    async def start_saga(self, saga_id, saga_type, context, steps, started_at) -> None:
+        self.sagas[saga_id] = {
+            "saga_type": saga_type,
+            "context": _json_safe(context or {}),
+            "steps": [step.to_dict() for step in steps],
+            "final_status": SagaTransactionStatus.STARTED,
+            "started_at": started_at,
+            "updated_at": datetime.now(timezone.utc),
+            "error_message": None,
+        }
+
+    async def record_step(self, saga_id: str, step: SagaStep) -> None:
+        self.step_log.append(
+            {
+                "saga_id": saga_id,
+                "step_name": step.name,
+                "status": step.status,
+                "result": (
+                    _json_safe(step.result) if step.status == SagaStepStatus.COMPLETED else None
+                ),
+                "error": step.error,
+            }
+        )
+        if saga_id in self.sagas:
+            self.sagas[saga_id]["updated_at"] = datetime.now(timezone.utc)
+
+    async def finish_saga(self, saga_id, steps, final_status, started_at, error_message=None):
+        saga = self.sagas.setdefault(saga_id, {"saga_type": None, "context": {}})
+        saga.update(
+            {
+                "steps": [step.to_dict() for step in steps],
+                "final_status": final_status,
+                "started_at": started_at,
+                "updated_at": datetime.now(timezone.utc),
+                "error_message": error_message,
+            }
+        )
+
+    async def list_stale_sagas(self, stale_before: datetime, limit: int) -> List[SagaLogRecord]:
+        records = [
+            SagaLogRecord(
+                saga_id=saga_id,
+                saga_type=saga["saga_type"],
+                context=saga["context"],
+                started_at=saga["started_at"],
+                updated_at=saga["updated_at"],
+            )
+            for saga_id, saga in self.sagas.items()
+            if saga["final_status"] == SagaTransactionStatus.STARTED
+            and saga["updated_at"] < stale_before
+        ]
+        records.sort(key=lambda record: record.updated_at)
+        return records[:limit]
+
+    async def claim_saga(self, saga_id: str, stale_before: datetime) -> bool:
+        saga = self.sagas.get(saga_id)
+        if (
+            saga is None
+            or saga["final_status"] != SagaTransactionStatus.STARTED
+            or saga["updated_at"] >= stale_before
+        ):
+            return False
+        saga["updated_at"] = datetime.now(timezone.utc)
+        return True
+
+    async def load_step_states(self, saga_id: str) -> Dict[str, SagaStepState]:
+        states: Dict[str, SagaStepState] = {}
+        for row in self.step_log:
+            if row["saga_id"] == saga_id:
+                states[row["step_name"]] = SagaStepState(
+                    name=row["step_name"],
+                    status=row["status"],
+                    result=row["result"],
+                    error=row["error"],
+                )
+        return states
+
+
+class PostgresSagaLogStore(SagaLogStore):
+    """基于 saga_transactions / saga_step_log 表的 Saga 日志"""
+
+    def __init__(self, pool_manager: UnifiedPoolManager):
+        self.pool_manager = pool_manager
+
+    @staticmethod
+    def _json(value: Any):
+        from psycopg.types.json import Json
+
+        return Json(value, dumps=partial(json.dumps, default=str))
+
+    async def start_saga(self, saga_id, saga_type, context, steps, started_at) -> None:
+        now = datetime.now(timezone.utc)
+        async with self.pool_manager.pg_connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO saga_transactions 
+                (saga_id, steps, final_status, started_at, created_at,
+                 saga_type, context, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (saga_id) DO UPDATE SET
+                    steps = EXCLUDED.steps,
+                    final_status = EXCLUDED.final_status,
+                    started_at = EXCLUDED.started_at,
+                    saga_type = EXCLUDED.saga_type,
+                    context = EXCLUDED.context,
+                    updated_at = EXCLUDED.updated_at
+                """,
+                (
+                    saga_id,
+                    self._json([step.to_dict() for step in steps]),
+                    SagaTransactionStatus.STARTED.value,
+                    started_at,
+                    now,
+                    saga_type,
+                    self._json(context or {}),
+                    now,
+                ),
+            )
+
+    async def record_step(self, saga_id: str, step: SagaStep) -> None:
+        now = datetime.now(timezone.utc)
+        result = step.result if step.status == SagaStepStatus.COMPLETED else None
+        async with self.pool_manager.pg_connection() as conn:
+            # 追加步骤日志并刷新心跳，一次往返
+            await conn.execute(
+                """
+                WITH step_row AS (
+                    INSERT INTO saga_step_log
+                    (saga_id, step_name, status, result, error, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                )
+                UPDATE saga_transactions SET updated_at = %s WHERE saga_id = %s
+                """,
+                (
+                    saga_id,
+                    step.name,
+                    step.status.value,
+                    self._json(result) if result is not None else None,
+                    step.error,
+                    now,
+                    now,
+                    saga_id,
+                ),
+            )
+
+    async def finish_saga(self, saga_id, steps, final_status, started_at, error_message=None):
+        completed_at = datetime.now(timezone.utc)
+        async with self.pool_manager.pg_connection() as conn:
+            await conn.execute(
+                """
+                INSERT INTO saga_transactions 
+                (saga_id, steps, final_status, started_at, completed_at, 
+                 error_message, created_at, updated_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (saga_id) DO UPDATE SET
+                    steps = EXCLUDED.steps,
+                    final_status = EXCLUDED.final_status,
+                    completed_at = EXCLUDED.completed_at,
+                    error_message = EXCLUDED.error_message,
+                    updated_at = EXCLUDED.updated_at
+                """,
+                (
+                    saga_id,
+                    self._json([step.to_dict() for step in steps]),
+                    final_status.value,
+                    started_at,
+                    completed_at,
+                    error_message,
+                    completed_at,
+                    completed_at,
+                ),
+            )
+
+    async def list_stale_sagas(self, stale_before: datetime, limit: int) -> List[SagaLogRecord]:
+        async with self.pool_manager.pg_connection() as conn:
+            result = await conn.execute(
+                """
+                SELECT saga_id, saga_type, context, started_at, updated_at
+                FROM saga_transactions
+                WHERE final_status = %s AND updated_at < %s
+                ORDER BY updated_at
+                LIMIT %s
+                """,
+                (SagaTransactionStatus.STARTED.value, stale_before, limit),
+            )
+            rows = await result.fetchall()
+        return [
+            SagaLogRecord(
+                saga_id=row["saga_id"],
+                saga_type=row["saga_type"],
+                context=row["context"] or {},
+                started_at=row["started_at"],
+                updated_at=row["updated_at"],
+            )
+            for row in rows
+        ]
+
+    async def claim_saga(self, saga_id: str, stale_before: datetime) -> bool:
+        async with self.pool_manager.pg_connection() as conn:
+            result = await conn.execute(
+                """
+                UPDATE saga_transactions
+                SET updated_at = %s, recovery_attempts = recovery_attempts + 1
+                WHERE saga_id = %s AND final_status = %s AND updated_at < %s
+                RETURNING saga_id
+                """,
+                (
+                    datetime.now(timezone.utc),
+                    saga_id,
+                    SagaTransactionStatus.STARTED.value,
+                    stale_before,
+                ),
+            )
+            return await result.fetchone() is not None
+
+    async def load_step_states(self, saga_id: str) -> Dict[str, SagaStepState]:
+        async with self.pool_manager.pg_connection() as conn:
+            result = await conn.execute(
+                """
+                SELECT DISTINCT ON (step_name) step_name, status, result, error
+                FROM saga_step_log
+                WHERE saga_id = %s
+                ORDER BY step_name, id DESC
+                """,
+                (saga_id,),
+            )
+            rows = await result.fetchall()
+        return {
+            row["step_name"]: SagaStepState(
+                name=row["step_name"],
+                status=SagaStepStatus(row["status"]),
+                result=row["result"],
+                error=row["error"],
+            )
+            for row in rows
+        }
+
+
 class DistributedTransactionCoordinator:
     """
     分布式事务协调器
 
     采用 Saga 模式协调跨组件事务：
-    - 按顺序执行步骤
-    - 记录每步状态
-    - 失败时触发补偿（逆序执行）
-    - 记录详细事务日志
+    - 按依赖关系执行步骤（未声明依赖时按顺序执行，互不依赖的步骤并发执行）
+    - 每次步骤状态变化写入持久化日志
+    - 失败时触发补偿（按完成顺序逆序执行）
+    - 崩溃后由 recover_saga 根据日志恢复或补偿
 
     验证：需求 4.1, 4.2, 4.3, 4.4, 4.5
     """
@@ -125,6 +461,9 @@ class DistributedTransactionCoordinator:
         pool_manager: UnifiedPoolManager,
         max_compensation_retries: int = 3,
         enable_logging: bool = True,
+        log_store: Optional[SagaLogStore] = None,
+        max_parallel_steps: Optional[int] = None,
+        fault_injector: Optional[Callable[[str, SagaStep], Awaitable[None]]] = None,
     ):
         """
         初始化分布式事务协调器
@@ -132,32 +471,180 @@ class DistributedTransactionCoordinator:
         Args:
             pool_manager: 统一连接池管理器
             max_compensation_retries: 补偿操作最大重试次数
-            enable_logging: 是否启用事务日志记录到数据库
+            enable_logging: 是否启用事务日志记录（关闭后不写日志，也无法崩溃恢复）
+            log_store: Saga 日志存储，默认写入 PostgreSQL
+            max_parallel_steps: 同时执行的步骤数上限（None 表示不限）
+            fault_injector: 故障注入钩子（测试用），在 before_action / after_action /
+                before_compensation 处以 (阶段, 步骤) 调用，可抛出异常模拟进程崩溃
         """
         self.pool_manager = pool_manager
         self.max_compensation_retries = max_compensation_retries
         self.enable_logging = enable_logging
+        self.log_store = log_store or PostgresSagaLogStore(pool_manager)
+        self.max_parallel_steps = max_parallel_steps
+        self.fault_injector = fault_injector
+        self._saga_types: Dict[str, Callable[[Dict[str, Any]], List[SagaStep]]] = {}
         self._logger = logger
 
     def generate_saga_id(self) -> str:
         """生成唯一的 Saga ID"""
         return str(uuid.uuid4())
 
-    async def execute_saga(self, saga_id: str, steps: List[SagaStep]) -> bool:
+    def register_saga_type(
+        self, saga_type: str, factory: Callable[[Dict[str, Any]], List[SagaStep]]
+    ) -> None:
+        """
+        注册可恢复的 Saga 类型
+
+        factory 根据持久化的上下文重建步骤列表，恢复时用于重新获得动作与补偿。
+        """
+        self._saga_types[saga_type] = factory
+
+    @staticmethod
+    def resolve_dependencies(steps: List[SagaStep]) -> Dict[str, Set[str]]:
+        """
+        解析步骤依赖
+
+        依赖只能引用排在前面的步骤，因此不会出现环，列表逆序即合法的补偿顺序。
+
+        Raises:
+            ValueError: 步骤名重复或依赖引用了不存在 / 排在后面的步骤
+        """
+        dependencies: Dict[str, Set[str]] = {}
+        previous: Optional[str] = None
+        for step in steps:
+            if step.name in dependencies:
+                raise ValueError(f"Saga 步骤名重复: {step.name}")
+            if step.depends_on is None:
+                deps = {previous} if previous is not None else set()
+            else:
+                deps = set(step.depends_on)
+                unknown = deps - set(dependencies)
+                if unknown:
+                    raise ValueError(
+                        f"步骤 '{step.name}' 依赖的步骤不存在或未排在其之前: {sorted(unknown)}"
+                    )
+            dependencies[step.name] = deps
+            previous = step.name
+        return dependencies
+
+    async def _inject_fault(self, point: str, step: SagaStep) -> None:
+        if self.fault_injector is not None:
+            await self.fault_injector(point, step)
+
+    async def _record_step(self, saga_id: str, step: SagaStep) -> None:
+        """写入步骤状态变化（日志失败不影响事务执行）"""
+        if not self.enable_logging:
+            return
+        try:
+            await self.log_store.record_step(saga_id, step)
+        except PoolNotInitializedError:
+            self._logger.warning("数据库连接池未初始化，跳过步骤日志记录")
+        except Exception as e:
+            self._logger.warning(f"Saga {saga_id}: 记录步骤 '{step.name}' 状态失败: {e}")
+
+    async def _run_step(self, saga_id: str, step: SagaStep) -> bool:
+        """执行单个步骤，返回是否成功（进程级异常直接向上抛出）"""
+        step.status = SagaStepStatus.RUNNING
+        step.started_at = datetime.now(timezone.utc)
+        step.error = None
+        # 先落日志再执行：崩溃后可知该步骤可能已部分生效
+        await self._record_step(saga_id, step)
+
+        self._logger.debug(f"Saga {saga_id}: 执行步骤 '{step.name}'")
+
+        try:
+            await self._inject_fault("before_action", step)
+            step.result = await step.action()
+            await self._inject_fault("after_action", step)
+        except Exception as e:
+            step.status = SagaStepStatus.FAILED
+            step.error = str(e)
+            step.completed_at = datetime.now(timezone.utc)
+            self._logger.error(f"Saga {saga_id}: 步骤 '{step.name}' 失败: {e}")
+            await self._record_step(saga_id, step)
+            return False
+
+        step.status = SagaStepStatus.COMPLETED
+        step.completed_at = datetime.now(timezone.utc)
+        await self._record_step(saga_id, step)
+
+        self._logger.debug(f"Saga {saga_id}: 步骤 '{step.name}' 完成")
+        return True
+
+    async def _run_steps(
+        self, saga_id: str, steps: List[SagaStep], completed_steps: List[SagaStep]
+    ) -> Optional[str]:
+        """
+        按依赖关系调度执行尚未完成的步骤
+
+        已完成的步骤（completed_steps 中）直接视为满足依赖。任一步骤失败后不再启动新步骤，
+        等待已启动的步骤结束后返回错误信息；全部成功返回 None。
+        """
+        dependencies = self.resolve_dependencies(steps)
+        done = {step.name for step in completed_steps}
+        pending = [step for step in steps if step.name not in done]
+        running: Dict[asyncio.Task, SagaStep] = {}
+        error_message: Optional[str] = None
+
+        try:
+            while pending or running:
+                if error_message is None:
+                    for step in list(pending):
+                        if (
+                            self.max_parallel_steps is not None
+                            and len(running) >= self.max_parallel_steps
+                        ):
+                            break
+                        if dependencies[step.name] <= done:
+                            pending.remove(step)
+                            task = asyncio.create_task(self._run_step(saga_id, step))
+                            running[task] = step
+                if not running:
+                    break
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    step = running.pop(task)
+                    # 非 Exception 的异常（进程退出、取消、故障注入的崩溃）原样抛出
+                    if task.result():
+                        done.add(step.name)
+                        completed_steps.append(step)
+                    elif error_message is None:
+                        error_message = f"步骤 '{step.name}' 失败: {step.error}"
+        except BaseException:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+            raise
+
+        return error_message
+
+    async def execute_saga(
+        self,
+        saga_id: str,
+        steps: List[SagaStep],
+        saga_type: Optional[str] = None,
+        context: Optional[Dict[str, Any]] = None,
+    ) -> bool:
         """
         执行 Saga 事务
 
-        按顺序执行所有步骤，任一步骤失败时执行补偿操作。
+        按依赖关系执行所有步骤，任一步骤失败时执行补偿操作。
 
         Args:
             saga_id: Saga 事务 ID
             steps: 要执行的步骤列表
+            saga_type: 已通过 register_saga_type 注册的类型，崩溃后据此恢复
+            context: 重建步骤所需的上下文（需可 JSON 序列化）
 
         Returns:
             事务是否成功完成
 
         验证：需求 4.1, 4.2
         """
+        self.resolve_dependencies(steps)
+
         started_at = datetime.now(timezone.utc)
         completed_steps: List[SagaStep] = []
         final_status = SagaTransactionStatus.STARTED
@@ -167,59 +654,10 @@ class DistributedTransactionCoordinator:
 
         # 记录事务开始
         if self.enable_logging:
-            await self._log_transaction_start(saga_id, steps, started_at)
+            await self._log_transaction_start(saga_id, steps, started_at, saga_type, context)
 
         try:
-            # 按顺序执行步骤
-            for step in steps:
-                step.status = SagaStepStatus.RUNNING
-                step.started_at = datetime.now(timezone.utc)
-
-                self._logger.debug(f"Saga {saga_id}: 执行步骤 '{step.name}'")
-
-                try:
-                    step.result = await step.action()
-                    step.status = SagaStepStatus.COMPLETED
-                    step.completed_at = datetime.now(timezone.utc)
-                    completed_steps.append(step)
-
-                    self._logger.debug(f"Saga {saga_id}: 步骤 '{step.name}' 完成")
-
-                except Exception as e:
-                    step.status = SagaStepStatus.FAILED
-                    step.error = str(e)
-                    step.completed_at = datetime.now(timezone.utc)
-                    error_message = f"步骤 '{step.name}' 失败: {e}"
-
-                    self._logger.error(f"Saga {saga_id}: 步骤 '{step.name}' 失败: {e}")
-
-                    # 触发补偿
-                    compensation_success = await self.compensate(saga_id, completed_steps)
-
-                    if compensation_success:
-                        final_status = SagaTransactionStatus.COMPENSATED
-                    else:
-                        final_status = SagaTransactionStatus.COMPENSATION_FAILED
-                        error_message += "; 补偿操作也失败，需要人工干预"
-
-                    # 记录事务结束
-                    if self.enable_logging:
-                        await self.log_transaction(
-                            saga_id, steps, final_status, started_at, error_message
-                        )
-
-                    return False
-
-            # 所有步骤成功
-            final_status = SagaTransactionStatus.COMPLETED
-            self._logger.info(f"Saga 事务 {saga_id} 成功完成")
-
-            # 记录事务结束
-            if self.enable_logging:
-                await self.log_transaction(saga_id, steps, final_status, started_at)
-
-            return True
-
+            error_message = await self._run_steps(saga_id, steps, completed_steps)
         except Exception as e:
             error_message = f"Saga 事务执行异常: {e}"
             self._logger.error(f"Saga {saga_id}: {error_message}")
@@ -240,15 +678,41 @@ class DistributedTransactionCoordinator:
 
             return False
 
+        if error_message is None:
+            # 所有步骤成功
+            final_status = SagaTransactionStatus.COMPLETED
+            self._logger.info(f"Saga 事务 {saga_id} 成功完成")
+
+            # 记录事务结束
+            if self.enable_logging:
+                await self.log_transaction(saga_id, steps, final_status, started_at)
+
+            return True
+
+        # 触发补偿
+        compensation_success = await self.compensate(saga_id, completed_steps)
+
+        if compensation_success:
+            final_status = SagaTransactionStatus.COMPENSATED
+        else:
+            final_status = SagaTransactionStatus.COMPENSATION_FAILED
+            error_message += "; 补偿操作也失败，需要人工干预"
+
+        # 记录事务结束
+        if self.enable_logging:
+            await self.log_transaction(saga_id, steps, final_status, started_at, error_message)
+
+        return False
+
     async def compensate(self, saga_id: str, completed_steps: List[SagaStep]) -> bool:
         """
         执行补偿操作
 
-        逆序执行已完成步骤的补偿操作。
+        逆序执行已完成步骤的补偿操作，已补偿过的步骤跳过（恢复时可重复调用）。
 
         Args:
             saga_id: Saga 事务 ID
-            completed_steps: 已完成的步骤列表
+            completed_steps: 已完成的步骤列表（按完成顺序）
 
         Returns:
             补偿是否全部成功
@@ -264,7 +728,11 @@ class DistributedTransactionCoordinator:
 
         # 逆序执行补偿
         for step in reversed(completed_steps):
+            if step.status == SagaStepStatus.COMPENSATED:
+                continue
+
             step.status = SagaStepStatus.COMPENSATING
+            await self._record_step(saga_id, step)
 
             self._logger.debug(f"Saga {saga_id}: 补偿步骤 '{step.name}'")
 
@@ -274,6 +742,7 @@ class DistributedTransactionCoordinator:
             # 重试补偿操作
             for attempt in range(self.max_compensation_retries):
                 try:
+                    await self._inject_fault("before_compensation", step)
                     await step.compensation()
                     step.status = SagaStepStatus.COMPENSATED
                     success = True
@@ -298,6 +767,8 @@ class DistributedTransactionCoordinator:
 
                 self._logger.error(f"Saga {saga_id}: 步骤 '{step.name}' 补偿最终失败，需要人工干预")
 
+            await self._record_step(saga_id, step)
+
         if all_compensated:
             self._logger.info(f"Saga {saga_id}: 所有补偿操作成功完成")
         else:
@@ -305,30 +776,107 @@ class DistributedTransactionCoordinator:
 
         return all_compensated
 
+    async def recover_saga(
+        self, record: SagaLogRecord, prefer_resume: bool = True
+    ) -> SagaTransactionStatus:
+        """
+        恢复一个中断的 Saga（调用方需先通过 log_store.claim_saga 认领）
+
+        - 没有失败 / 补偿记录，且执行中的步骤均幂等时：跳过已完成步骤，继续执行剩余步骤
+        - 否则：补偿所有已完成或执行中的步骤（逆序）
+        - 类型未注册时无法重建步骤，标记为需要人工干预
+
+        Returns:
+            事务最终状态
+        """
+        saga_id = record.saga_id
+        factory = self._saga_types.get(record.saga_type or "")
+        if factory is None:
+            error_message = f"未注册的 Saga 类型 {record.saga_type!r}，无法自动恢复"
+            self._logger.error(f"Saga {saga_id}: {error_message}")
+            await self.log_transaction(
+                saga_id,
+                [],
+                SagaTransactionStatus.REQUIRES_INTERVENTION,
+                record.started_at,
+                error_message,
+            )
+            return SagaTransactionStatus.REQUIRES_INTERVENTION
+
+        steps = factory(record.context)
+        states = await self.log_store.load_step_states(saga_id)
+        for step in steps:
+            state = states.get(step.name)
+            if state is not None:
+                step.status = state.status
+                step.result = state.result
+                step.error = state.error
+
+        in_doubt = [step for step in steps if step.status == SagaStepStatus.RUNNING]
+        unwinding = any(
+            step.status
+            in (
+                SagaStepStatus.FAILED,
+                SagaStepStatus.COMPENSATING,
+                SagaStepStatus.COMPENSATED,
+                SagaStepStatus.COMPENSATION_FAILED,
+            )
+            for step in steps
+        )
+        resume = prefer_resume and not unwinding and all(step.idempotent for step in in_doubt)
+
+        self._logger.info(
+            f"Saga {saga_id}: 开始恢复（{'继续执行' if resume else '补偿'}），"
+            f"执行中步骤: {[step.name for step in in_doubt]}"
+        )
+
+        error_message: Optional[str] = None
+        if resume:
+            completed_steps = [step for step in steps if step.status == SagaStepStatus.COMPLETED]
+            error_message = await self._run_steps(saga_id, steps, completed_steps)
+            if error_message is None:
+                await self.log_transaction(
+                    saga_id, steps, SagaTransactionStatus.COMPLETED, record.started_at
+                )
+                self._logger.info(f"Saga {saga_id}: 恢复执行完成")
+                return SagaTransactionStatus.COMPLETED
+        else:
+            # 执行中的步骤可能已部分生效，一并补偿（补偿需幂等）
+            completed_steps = [
+                step
+                for step in steps
+                if step.status
+                in (
+                    SagaStepStatus.COMPLETED,
+                    SagaStepStatus.RUNNING,
+                    SagaStepStatus.COMPENSATING,
+                    SagaStepStatus.COMPENSATION_FAILED,
+                )
+            ]
+            failed = next((step for step in steps if step.status == SagaStepStatus.FAILED), None)
+            error_message = (
+                f"步骤 '{failed.name}' 失败: {failed.error}" if failed else "进程中断后补偿"
+            )
+
+        if await self.compensate(saga_id, completed_steps):
+            final_status = SagaTransactionStatus.COMPENSATED
+        else:
+            final_status = SagaTransactionStatus.COMPENSATION_FAILED
+            error_message += "; 补偿操作也失败，需要人工干预"
+        await self.log_transaction(saga_id, steps, final_status, record.started_at, error_message)
+        return final_status
+
     async def _log_transaction_start(
-        self, saga_id: str, steps: List[SagaStep], started_at: datetime
+        self,
+        saga_id: str,
+        steps: List[SagaStep],
+        started_at: datetime,
+        saga_type: Optional[str] = None,
+        context: Optional[Dict[str, Any]] = None,
     ) -> None:
         """记录事务开始"""
         try:
-            async with self.pool_manager.pg_connection() as conn:
-                await conn.execute(
-                    """
-                    INSERT INTO saga_transactions 
-                    (saga_id, steps, final_status, started_at, created_at)
-                    VALUES (%s, %s, %s, %s, %s)
-                    ON CONFLICT (saga_id) DO UPDATE SET
-                        steps = EXCLUDED.steps,
-                        final_status = EXCLUDED.final_status,
-                        started_at = EXCLUDED.started_at
-                    """,
-                    (
-                        saga_id,
-                        [step.to_dict() for step in steps],
-                        SagaTransactionStatus.STARTED.value,
-                        started_at,
-                        datetime.now(timezone.utc),
-                    ),
-                )
+            await self.log_store.start_saga(saga_id, saga_type, context, steps, started_at)
         except PoolNotInitializedError:
             self._logger.warning("数据库连接池未初始化，跳过事务日志记录")
         except Exception as e:
@@ -356,33 +904,10 @@ class DistributedTransactionCoordinator:
 
         验证：需求 4.5
         """
-        completed_at = datetime.now(timezone.utc)
-
         try:
-            async with self.pool_manager.pg_connection() as conn:
-                await conn.execute(
-                    """
-                    INSERT INTO saga_transactions 
-                    (saga_id, steps, final_status, started_at, completed_at, 
-                     error_message, created_at)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (saga_id) DO UPDATE SET
-                        steps = EXCLUDED.steps,
-                        final_status = EXCLUDED.final_status,
-                        completed_at = EXCLUDED.completed_at,
-                        error_message = EXCLUDED.error_message
-                    """,
-                    (
-                        saga_id,
-                        [step.to_dict() for step in steps],
-                        final_status.value,
-                        started_at,
-                        completed_at,
-                        error_message,
-                        datetime.now(timezone.utc),
-                    ),
-                )
-
+            await self.log_store.finish_saga(
+                saga_id, steps, final_status, started_at, error_message
+            )
             self._logger.debug(f"Saga {saga_id}: 事务日志已记录")
 
         except PoolNotInitializedError:
@@ -545,68 +1070,111 @@ class DistributedTransactionCoordinator:
         return all_cleaned
 
 
+class SagaRecoveryWorker:
+    """
+    Saga 恢复工作器
+
+    扫描心跳（updated_at）超过 stale_after_seconds 仍处于 STARTED 的事务，
+    认领后交给协调器恢复或补偿。认领是原子的，多个副本同时运行时每个事务只被处理一次。
+    stale_after_seconds 需大于单个步骤的最长执行时间，避免误判仍在执行的事务。
+    """
+
+    def __init__(
+        self,
+        coordinator: DistributedTransactionCoordinator,
+        stale_after_seconds: float = 300.0,
+        batch_size: int = 50,
+        prefer_resume: bool = True,
+    ):
+        self.coordinator = coordinator
+        self.stale_after_seconds = stale_after_seconds
+        self.batch_size = batch_size
+        self.prefer_resume = prefer_resume
+
+    async def run_once(self) -> int:
+        """执行一轮恢复，返回处理的事务数"""
+        store = self.coordinator.log_store
+        stale_before = datetime.now(timezone.utc) - timedelta(seconds=self.stale_after_seconds)
+        try:
+            records = await store.list_stale_sagas(stale_before, self.batch_size)
+        except PoolNotInitializedError:
+            logger.warning("数据库连接池未初始化，跳过 Saga 恢复")
+            return 0
+
+        recovered = 0
+        for record in records:
+            if not await store.claim_saga(record.saga_id, stale_before):
+                continue
+            try:
+                status = await self.coordinator.recover_saga(record, self.prefer_resume)
+                recovered += 1
+                logger.info(f"Saga {record.saga_id}: 恢复结束，状态 {status.value}")
+            except Exception as e:
+                # 认领已刷新心跳，下一轮超过阈值后会再次尝试
+                logger.error(f"Saga {record.saga_id}: 恢复失败: {e}")
+        return recovered
+
+    def as_maintenance_job(self, interval_seconds: float = 60.0):
+        """包装为 MaintenanceScheduler 的周期任务"""
+        from src.services.maintenance_scheduler import MaintenanceJob
+
+        return MaintenanceJob(
+            name="saga_recovery",
+            run=self.run_once,
+            interval_seconds=interval_seconds,
+            lock_ttl_seconds=max(self.stale_after_seconds, interval_seconds),
+        )
+
+
 class ReviewOverrideSagaBuilder:
     """
     审核覆盖事务构建器
 
     构建人工审核覆盖分数的 Saga 事务，包含：
+    - 读取原始数据（结果写入 Saga 日志，供崩溃后补偿使用）
     - 数据库更新
-    - 缓存失效
-    - 通知发送
+    - 缓存失效、通知发送（均只依赖数据库更新，并发执行）
+
+    构建器会向协调器注册 review_override 类型，恢复时用构造参数中的
+    cache_service / notifier 重建步骤。
 
     验证：需求 4.4
     """
 
+    SAGA_TYPE = "review_override"
+
     def __init__(
-        self, coordinator: DistributedTransactionCoordinator, pool_manager: UnifiedPoolManager
+        self,
+        coordinator: DistributedTransactionCoordinator,
+        pool_manager: UnifiedPoolManager,
+        cache_service: Optional[Any] = None,
+        notifier: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
     ):
         self.coordinator = coordinator
         self.pool_manager = pool_manager
-        self._db_updated = False
-        self._cache_invalidated = False
-        self._notification_sent = False
+        self.cache_service = cache_service
+        self.notifier = notifier
+        coordinator.register_saga_type(self.SAGA_TYPE, self.build_steps)
 
-    async def execute_review_override(
+    def build_steps(
         self,
-        submission_id: str,
-        question_id: str,
-        new_score: float,
-        reviewer_id: str,
-        reason: str,
+        context: Dict[str, Any],
         notify_callback: Optional[Callable[[], Awaitable[None]]] = None,
         cache_service: Optional[Any] = None,
-    ) -> bool:
-        """
-        执行审核覆盖事务
-
-        在单个 Saga 事务中完成：
-        1. 数据库更新（更新分数和审核记录）
-        2. 缓存失效（删除相关缓存）
-        3. 通知发送（通知相关方）
-
-        Args:
-            submission_id: 提交 ID
-            question_id: 题目 ID
-            new_score: 新分数
-            reviewer_id: 审核人 ID
-            reason: 覆盖原因
-            notify_callback: 通知回调函数
-            cache_service: 缓存服务实例
-
-        Returns:
-            事务是否成功
-
-        验证：需求 4.4
-        """
-        saga_id = self.coordinator.generate_saga_id()
-
-        # 保存原始数据用于补偿
-        original_data: Dict[str, Any] = {}
-
-        # 步骤 1：数据库更新
-        async def db_update_action() -> None:
-            async with self.pool_manager.pg_transaction() as conn:
-                # 获取原始数据
+    ) -> List[SagaStep]:
+        """根据上下文构建步骤（执行与恢复共用）"""
+        submission_id = context["submission_id"]
+        question_id = context["question_id"]
+        cache_service = cache_service if cache_service is not None else self.cache_service
+        if notify_callback is None and self.notifier is not None:
+            notifier = self.notifier
+
+            async def notify_callback() -> None:
+                await notifier(context)
+
+        # 步骤 1：读取原始数据（无副作用，结果持久化到日志）
+        async def snapshot_action() -> Optional[Dict[str, Any]]:
+            async with self.pool_manager.pg_connection() as conn:
                 result = await conn.execute(
                     """
                     SELECT score, reviewed, reviewer_id, review_reason
@@ -616,13 +1184,21 @@ class ReviewOverrideSagaBuilder:
                     (submission_id, question_id),
                 )
                 row = await result.fetchone()
-                if row:
-                    original_data["score"] = row["score"]
-                    original_data["reviewed"] = row["reviewed"]
-                    original_data["reviewer_id"] = row["reviewer_id"]
-                    original_data["review_reason"] = row["review_reason"]
+            if not row:
+                return None
+            return {
+                "score": float(row["score"]) if row["score"] is not None else None,
+                "reviewed": row["reviewed"],
+                "reviewer_id": row["reviewer_id"],
+                "review_reason": row["review_reason"],
+            }
+
+        async def snapshot_compensation() -> None:
+            return None
 
-                # 更新分数
+        # 步骤 2：数据库更新（写入绝对值，可安全重放）
+        async def db_update_action() -> None:
+            async with self.pool_manager.pg_transaction() as conn:
                 await conn.execute(
                     """
                     UPDATE grading_results
@@ -634,18 +1210,18 @@ class ReviewOverrideSagaBuilder:
                     WHERE submission_id = %s AND question_id = %s
                     """,
                     (
-                        new_score,
-                        reviewer_id,
-                        reason,
+                        context["new_score"],
+                        context["reviewer_id"],
+                        context["reason"],
                         datetime.now(timezone.utc),
                         submission_id,
                         question_id,
                     ),
                 )
-            self._db_updated = True
 
         async def db_update_compensation() -> None:
-            if not self._db_updated:
+            original_data = snapshot_step.result
+            if not original_data:
                 return
             async with self.pool_manager.pg_transaction() as conn:
                 await conn.execute(
@@ -667,48 +1243,112 @@ class ReviewOverrideSagaBuilder:
                         question_id,
                     ),
                 )
-            self._db_updated = False
 
-        # 步骤 2：缓存失效
+        # 步骤 3：缓存失效
         async def cache_invalidate_action() -> None:
             if cache_service is not None:
                 await cache_service.invalidate_with_notification(
                     f"grading_result:{submission_id}:{question_id}"
                 )
-            self._cache_invalidated = True
 
         async def cache_invalidate_compensation() -> None:
             # 缓存失效的补偿：无需操作，缓存会自动重建
-            self._cache_invalidated = False
+            return None
 
-        # 步骤 3：通知发送
+        # 步骤 4：通知发送
         async def notify_action() -> None:
             if notify_callback is not None:
                 await notify_callback()
-            self._notification_sent = True
 
         async def notify_compensation() -> None:
             # 通知的补偿：记录需要发送撤销通知
             # 实际实现中可能需要发送撤销通知
-            self._notification_sent = False
+            return None
 
-        # 构建步骤列表
-        steps = [
+        # 通知重发会让相关方收到重复消息，不声明幂等：崩溃于通知中途时走补偿
+        snapshot_step = SagaStep(
+            name="读取原始数据",
+            action=snapshot_action,
+            compensation=snapshot_compensation,
+            idempotent=True,
+        )
+        return [
+            snapshot_step,
             SagaStep(
                 name="数据库更新",
                 action=db_update_action,
                 compensation=db_update_compensation,
+                idempotent=True,
             ),
             SagaStep(
                 name="缓存失效",
                 action=cache_invalidate_action,
                 compensation=cache_invalidate_compensation,
+                depends_on=["数据库更新"],
+                idempotent=True,
             ),
             SagaStep(
                 name="通知发送",
                 action=notify_action,
                 compensation=notify_compensation,
+                depends_on=["数据库更新"],
             ),
         ]
 
-        return await self.coordinator.execute_saga(saga_id, steps)
+    async def execute_review_override(
+        self,
+        submission_id: str,
+        question_id: str,
+        new_score: float,
+        reviewer_id: str,
+        reason: str,
+        notify_callback: Optional[Callable[[], Awaitable[None]]] = None,
+        cache_service: Optional[Any] = None,
+    ) -> bool:
+        """
+        执行审核覆盖事务
+
+        在单个 Saga 事务中完成：
+        1. 读取原始数据
+        2. 数据库更新（更新分数和审核记录）
+        3. 缓存失效（删除相关缓存）与通知发送（通知相关方），两者并发
+
+        Args:
+            submission_id: 提交 ID
+            question_id: 题目 ID
+            new_score: 新分数
+            reviewer_id: 审核人 ID
+            reason: 覆盖原因
+            notify_callback: 通知回调函数（仅本次执行有效，恢复时使用构造参数 notifier）
+            cache_service: 缓存服务实例
+
+        Returns:
+            事务是否成功
+
+        验证：需求 4.4
+        """
+        saga_id = self.coordinator.generate_saga_id()
+        context = {
+            "submission_id": submission_id,
+            "question_id": question_id,
+            "new_score": new_score,
+            "reviewer_id": reviewer_id,
+            "reason": reason,
+        }
+        steps = self.build_steps(context, notify_callback, cache_service)
+        return await self.coordinator.execute_saga(
+            saga_id, steps, saga_type=self.SAGA_TYPE, context=context
+        )
+
+
+_coordinator: Optional[DistributedTransactionCoordinator] = None
+
+
+def get_transaction_coordinator() -> DistributedTransactionCoordinator:
+    """获取进程内的事务协调器（首次调用时创建，并注册可恢复的 Saga 类型）"""
+    global _coordinator
+    if _coordinator is None:
+        pool_manager = UnifiedPoolManager.get_instance_sync()
+        _coordinator = DistributedTransactionCoordinator(pool_manager)
+        ReviewOverrideSagaBuilder(_coordinator, pool_manager)
+    return _coordinator
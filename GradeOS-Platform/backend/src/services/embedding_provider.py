@@ -0,0 +1,143 @@
+"""
+文本向量嵌入提供者
+
+为判例检索等场景提供可插拔的嵌入后端：
+- HashingEmbedder：本地、确定性的特征哈希嵌入，无需网络（测试与离线模式）
+- CachedEmbeddingProvider：按内容哈希缓存查询向量，避免重复调用嵌入模型
+
+远程嵌入（OpenRouter）见 src.services.exemplar_memory.OpenRouterEmbeddings，
+任何实现 `aembed_query(text) -> List[float]` 的对象都可作为提供者。
+"""
+
+import hashlib
+import logging
+import math
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Protocol
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_DIM = int(os.getenv("EXEMPLAR_EMBEDDING_DIM", "768"))
+DEFAULT_QUERY_CACHE_SIZE = int(os.getenv("EXEMPLAR_QUERY_CACHE_SIZE", "2048"))
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?")
+_CJK_PATTERN = re.compile(r"[\u3400-\u9fff]+")
+
+
+class EmbeddingProvider(Protocol):
+    """嵌入提供者协议"""
+
+    async def aembed_query(self, text: str) -> List[float]: ...
+
+
+def _tokenize(text: str) -> List[str]:
+    """英文/数字按词切分，中文按单字 + 双字切分"""
+    lowered = text.lower()
+    tokens = _WORD_PATTERN.findall(lowered)
+    for run in _CJK_PATTERN.findall(lowered):
+        tokens.extend(run)
+        tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class HashingEmbedder:
+    """
+    特征哈希嵌入（确定性、本地）
+
+    每个词元经 blake2b 映射到一个维度和符号，按词频累加后 L2 归一化。
+    相同文本在任意进程中得到相同向量，适合测试和无嵌入模型的部署。
+    """
+
+    def __init__(self, dimensions: int = DEFAULT_EMBEDDING_DIM):
+        if dimensions <= 0:
+            raise ValueError("dimensions must be positive")
+        self.dimensions = dimensions
+
+    def embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for token in _tokenize(text or ""):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "big")
+            index = value % self.dimensions
+            sign = -1.0 if (value >> 63) & 1 else 1.0
+            vector[index] += sign
+
+        norm = math.sqrt(sum(v * v for v in vector))
+        if norm == 0:
+            return vector
+        return [v / norm for v in vector]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self.embed(text)
+
+
+class CachedEmbeddingProvider:
+    """按内容哈希缓存嵌入结果的包装器（LRU）"""
+
+    def __init__(self, provider: EmbeddingProvider, max_entries: int = DEFAULT_QUERY_CACHE_SIZE):
+        self.provider = provider
+        self.max_entries = max(1, max_entries)
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self.content_hash(text)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return cached
+
+        self.misses += 1
+        embedding = await self.provider.aembed_query(text)
+        if embedding:
+            self._cache[key] = embedding
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return embedding
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"entries": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+def build_exemplar_text(
+    *,
+    question_type: str,
+    question_text: Optional[str] = None,
+    rubric_point_text: Optional[str] = None,
+    answer_text: Optional[str] = None,
+    teacher_feedback: Optional[str] = None,
+) -> str:
+    """
+    组合判例的嵌入输入文本
+
+    存储与检索使用同一组合方式，保证向量空间一致：
+    题型 / 题目文本 / 评分点 / 学生答案（检索时为答案摘要）/ 教师评语（仅存储）。
+    """
+    parts = [f"{question_type}:"]
+    for value in (question_text, rubric_point_text, answer_text):
+        if value and value.strip():
+            parts.append(value)
+    text = " ".join(parts)
+    if teacher_feedback and teacher_feedback.strip():
+        text = f"{text} | {teacher_feedback}"
+    return text
+
+
+__all__ = [
+    "EmbeddingProvider",
+    "HashingEmbedder",
+    "CachedEmbeddingProvider",
+    "build_exemplar_text",
+    "DEFAULT_EMBEDDING_DIM",
+]
@@ -5,16 +5,24 @@
 验证：需求 4.1, 4.2, 4.3, 4.4, 4.5
 """
 
+import asyncio
+import hashlib
 import json
 import logging
-from typing import List, Optional, Dict, Any
+import os
+import time
+from typing import List, Optional, Dict, Any, Sequence, Tuple
 from datetime import datetime, timedelta
 from uuid import uuid4
 
-import asyncpg
-
 from src.config.llm import get_llm_config
 from src.services.llm_client import UnifiedLLMClient, get_llm_client
+from src.services.embedding_provider import (
+    CachedEmbeddingProvider,
+    EmbeddingProvider,
+    HashingEmbedder,
+    build_exemplar_text,
+)
 
 from src.models.exemplar import Exemplar, ExemplarCreateRequest
 from src.utils.pool_manager import UnifiedPoolManager
@@ -22,6 +30,12 @@ from src.utils.pool_manager import UnifiedPoolManager
 
 logger = logging.getLogger(__name__)
 
+# 先取 top_k * 倍数 个 HNSW 近邻，再按相似度阈值过滤
+CANDIDATE_MULTIPLIER = 4
+# 按评分标准检索的判例缓存时长（同一份评分标准的各学生共享一次检索）
+RUBRIC_EXEMPLAR_CACHE_SECONDS = float(os.getenv("EXEMPLAR_RUBRIC_CACHE_SECONDS", "300"))
+RUBRIC_EXEMPLAR_MAX_QUESTIONS = int(os.getenv("EXEMPLAR_RUBRIC_MAX_QUESTIONS", "20"))
+
 
 class OpenRouterEmbeddings:
     """Thin async embedding wrapper for OpenRouter."""
@@ -50,6 +64,24 @@ class OpenRouterEmbeddings:
         return embeddings[0] if embeddings else []
 
 
+def create_default_embedding_provider() -> Optional[EmbeddingProvider]:
+    """
+    按配置创建嵌入提供者
+
+    EXEMPLAR_EMBEDDING_PROVIDER:
+    - openrouter（默认）：远程嵌入模型
+    - hashing：本地确定性哈希嵌入
+    """
+    provider = os.getenv("EXEMPLAR_EMBEDDING_PROVIDER", "openrouter").strip().lower()
+    if provider == "hashing":
+        return HashingEmbedder()
+    try:
+        return OpenRouterEmbeddings()
+    except Exception as e:
+        logger.warning(f"embedding model unavailable: {e}")
+        return None
+
+
 class ExemplarMemory:
     """
     判例记忆库
@@ -63,23 +95,32 @@ class ExemplarMemory:
     def __init__(
         self,
         pool_manager: Optional[UnifiedPoolManager] = None,
-        embedding_model: Optional[OpenRouterEmbeddings] = None,
+        embedding_model: Optional[EmbeddingProvider] = None,
+        query_cache_size: Optional[int] = None,
     ):
         """
         初始化判例记忆服务
 
         Args:
             pool_manager: 数据库连接池管理器
-            embedding_model: 向量嵌入模型（可选，如果不提供则在需要时创建）
+            embedding_model: 向量嵌入模型（可选，如果不提供则按配置创建）
+            query_cache_size: 查询向量缓存容量（按内容哈希）
         """
-        self.pool_manager = pool_manager or UnifiedPoolManager()
+        self.pool_manager = pool_manager or UnifiedPoolManager.get_instance_sync()
         self.embedding_model = embedding_model
         if self.embedding_model is None:
-            try:
-                self.embedding_model = OpenRouterEmbeddings()
-            except Exception as e:
-                logger.warning(f"embedding model unavailable: {e}")
-                self.embedding_model = None
+            self.embedding_model = create_default_embedding_provider()
+
+        self.query_embedder: Optional[CachedEmbeddingProvider] = None
+        if self.embedding_model is not None:
+            if query_cache_size is None:
+                self.query_embedder = CachedEmbeddingProvider(self.embedding_model)
+            else:
+                self.query_embedder = CachedEmbeddingProvider(
+                    self.embedding_model, max_entries=query_cache_size
+                )
+
+        self._rubric_cache: Dict[str, Tuple[float, Dict[str, List[Exemplar]]]] = {}
 
         logger.info("ExemplarMemory 服务初始化完成")
 
@@ -94,7 +135,8 @@ class ExemplarMemory:
 
         Args:
             grading_result: 批改结果字典，包含 question_type, question_image_hash,
-                          student_answer_text, score, max_score
+                          student_answer_text, score, max_score；
+                          可选 question_text, rubric_point_text 用于语义嵌入
             teacher_id: 确认教师ID
             teacher_feedback: 教师评语
 
@@ -119,8 +161,14 @@ class ExemplarMemory:
                     raise ValueError(f"缺少必需字段: {field}")
 
             # 生成向量嵌入
-            # 组合题目类型、学生答案和评语作为嵌入输入
-            embedding_text = f"{grading_result['question_type']}: {grading_result['student_answer_text']} | {teacher_feedback}"
+            # 组合题型、题目文本、评分点、学生答案和评语作为嵌入输入
+            embedding_text = build_exemplar_text(
+                question_type=grading_result["question_type"],
+                question_text=grading_result.get("question_text"),
+                rubric_point_text=grading_result.get("rubric_point_text"),
+                answer_text=grading_result["student_answer_text"],
+                teacher_feedback=teacher_feedback,
+            )
 
             if self.embedding_model:
                 embedding = await self.embedding_model.aembed_query(embedding_text)
@@ -135,6 +183,18 @@ class ExemplarMemory:
             exemplar_id = str(uuid4())
 
             # 存储到数据库
+            values = (
+                exemplar_id,
+                grading_result["question_type"],
+                grading_result["question_image_hash"],
+                grading_result["student_answer_text"],
+                float(grading_result["score"]),
+                float(grading_result["max_score"]),
+                teacher_feedback,
+                teacher_id,
+                datetime.now(),
+                0,
+            )
             async with self.pool_manager.pg_connection() as conn:
                 if embedding_str:
                     await conn.execute(
@@ -144,19 +204,9 @@ class ExemplarMemory:
                             student_answer_text, score, max_score,
                             teacher_feedback, teacher_id, confirmed_at,
                             usage_count, embedding
-                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11::vector)
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::vector)
                         """,
-                        exemplar_id,
-                        grading_result["question_type"],
-                        grading_result["question_image_hash"],
-                        grading_result["student_answer_text"],
-                        float(grading_result["score"]),
-                        float(grading_result["max_score"]),
-                        teacher_feedback,
-                        teacher_id,
-                        datetime.now(),
-                        0,
-                        embedding_str,
+                        values + (embedding_str,),
                     )
                 else:
                     # 没有 embedding，不插入 embedding 字段
@@ -167,18 +217,9 @@ class ExemplarMemory:
                             student_answer_text, score, max_score,
                             teacher_feedback, teacher_id, confirmed_at,
                             usage_count
-                        ) VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+                        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
                         """,
-                        exemplar_id,
-                        grading_result["question_type"],
-                        grading_result["question_image_hash"],
-                        grading_result["student_answer_text"],
-                        float(grading_result["score"]),
-                        float(grading_result["max_score"]),
-                        teacher_feedback,
-                        teacher_id,
-                        datetime.now(),
-                        0,
+                        values,
                     )
 
             logger.info(f"成功存储判例: {exemplar_id}")
@@ -197,6 +238,10 @@ class ExemplarMemory:
         question_type: str,
         top_k: int = 5,
         min_similarity: float = 0.7,
+        *,
+        question_text: Optional[str] = None,
+        rubric_point_text: Optional[str] = None,
+        student_answer_summary: Optional[str] = None,
     ) -> List[Exemplar]:
         """
         检索最相似的判例
@@ -204,11 +249,18 @@ class ExemplarMemory:
         验证：需求 4.3, 4.4
         属性 9：判例检索数量约束
 
+        查询向量由题目文本、评分点文本和学生答案摘要组成（与存储时的嵌入
+        输入一致），并按内容哈希缓存。未提供任何文本时退化为按题目图片
+        哈希精确匹配。
+
         Args:
             question_image_hash: 题目图片哈希值
             question_type: 题目类型
             top_k: 返回数量（3-5个）
             min_similarity: 最小相似度阈值（>= 0.7）
+            question_text: 题目文本
+            rubric_point_text: 评分点文本
+            student_answer_summary: 学生答案摘要
 
         Returns:
             判例列表，按相似度降序排列
@@ -217,61 +269,75 @@ class ExemplarMemory:
             # 限制返回数量在合理范围内
             top_k = min(max(top_k, 1), 5)
 
-            # 如果没有 embedding 模型，返回空列表
-            if not self.embedding_model:
-                logger.warning("embedding 模型未初始化，无法检索判例")
-                return []
-
-            # 生成查询向量
-            query_text = f"{question_type}: {question_image_hash}"
-            query_embedding = await self.embedding_model.aembed_query(query_text)
-            query_embedding_str = f"[{','.join(map(str, query_embedding))}]"
-
-            # 使用余弦相似度检索
-            # 注意：pgvector 的余弦距离范围是 [0, 2]，0 表示完全相同
-            # 相似度 = 1 - (距离 / 2)
-            async with self.pool_manager.pg_connection() as conn:
-                rows = await conn.fetch(
-                    """
-                    SELECT 
-                        exemplar_id, question_type, question_image_hash,
-                        student_answer_text, score, max_score,
-                        teacher_feedback, teacher_id, confirmed_at,
-                        usage_count,
-                        1 - (embedding <=> $1::vector) / 2 AS similarity
-                    FROM exemplars
-                    WHERE question_type = $2
-                        AND embedding IS NOT NULL
-                        AND 1 - (embedding <=> $1::vector) / 2 >= $3
-                    ORDER BY embedding <=> $1::vector
-                    LIMIT $4
-                    """,
-                    query_embedding_str,
-                    question_type,
-                    min_similarity,
-                    top_k,
+            has_content = any(
+                value and value.strip()
+                for value in (question_text, rubric_point_text, student_answer_summary)
+            )
+            if not has_content:
+                rows = await self._fetch_by_image_hash(question_image_hash, question_type, top_k)
+            else:
+                # 如果没有 embedding 模型，返回空列表
+                if not self.query_embedder:
+                    logger.warning("embedding 模型未初始化，无法检索判例")
+                    return []
+
+                # 生成查询向量（按内容哈希缓存）
+                query_text = build_exemplar_text(
+                    question_type=question_type,
+                    question_text=question_text,
+                    rubric_point_text=rubric_point_text,
+                    answer_text=student_answer_summary,
                 )
+                query_embedding = await self.query_embedder.aembed_query(query_text)
+                if not query_embedding:
+                    return []
+                query_embedding_str = f"[{','.join(map(str, query_embedding))}]"
+
+                # 使用余弦相似度检索
+                # 注意：pgvector 的余弦距离范围是 [0, 2]，0 表示完全相同
+                # 相似度 = 1 - (距离 / 2)
+                # 内层查询只做 ORDER BY 距离 + LIMIT，以便命中 HNSW 索引
+                async with self.pool_manager.pg_connection() as conn:
+                    result = await conn.execute(
+                        """
+                        SELECT
+                            exemplar_id, question_type, question_image_hash,
+                            student_answer_text, score, max_score,
+                            teacher_feedback, teacher_id, confirmed_at,
+                            usage_count,
+                            1 - distance / 2 AS similarity
+                        FROM (
+                            SELECT
+                                exemplar_id, question_type, question_image_hash,
+                                student_answer_text, score, max_score,
+                                teacher_feedback, teacher_id, confirmed_at,
+                                usage_count,
+                                embedding <=> %(query)s::vector AS distance
+                            FROM exemplars
+                            WHERE question_type = %(question_type)s
+                                AND embedding IS NOT NULL
+                            ORDER BY embedding <=> %(query)s::vector
+                            LIMIT %(candidates)s
+                        ) AS candidates
+                        WHERE 1 - distance / 2 >= %(min_similarity)s
+                        ORDER BY distance
+                        LIMIT %(top_k)s
+                        """,
+                        {
+                            "query": query_embedding_str,
+                            "question_type": question_type,
+                            "min_similarity": min_similarity,
+                            "top_k": top_k,
+                            "candidates": top_k * CANDIDATE_MULTIPLIER,
+                        },
+                    )
+                    rows = await result.fetchall()
 
             # 转换为 Exemplar 对象
-            exemplars = []
-            for row in rows:
-                exemplar = Exemplar(
-                    exemplar_id=str(row["exemplar_id"]),
-                    question_type=row["question_type"],
-                    question_image_hash=row["question_image_hash"],
-                    student_answer_text=row["student_answer_text"],
-                    score=float(row["score"]),
-                    max_score=float(row["max_score"]),
-                    teacher_feedback=row["teacher_feedback"],
-                    teacher_id=str(row["teacher_id"]),
-                    confirmed_at=row["confirmed_at"],
-                    usage_count=row["usage_count"],
-                    embedding=None,  # 不返回向量以节省内存
-                )
-                exemplars.append(exemplar)
+            exemplars = [self._row_to_exemplar(row) for row in rows]
 
-                # 更新使用次数
-                await self._increment_usage_count(str(row["exemplar_id"]))
+            # 一次性更新使用次数
+            await self._increment_usage_counts([e.exemplar_id for e in exemplars])
 
             logger.info(f"检索到 {len(exemplars)} 个相似判例")
             return exemplars
@@ -281,17 +347,127 @@ class ExemplarMemory:
             # 降级：返回空列表而不抛出异常
             return []
 
+    async def retrieve_for_rubric(
+        self,
+        parsed_rubric: Dict[str, Any],
+        top_k: int = 3,
+        min_similarity: float = 0.7,
+    ) -> Dict[str, List[Exemplar]]:
+        """
+        按评分标准逐题检索判例（用于批改提示词的 few-shot 区段）
+
+        查询只含题型、题目文本和评分点文本，与学生答案无关，因此同一份
+        评分标准的检索结果在 RUBRIC_EXEMPLAR_CACHE_SECONDS 内复用。
+        没有题型或没有任何文本的题目跳过（判例按题型分区存储）。
+
+        Returns:
+            题号 -> 判例列表（只包含检索到判例的题目）
+        """
+        queries = []
+        for question in (parsed_rubric.get("questions") or [])[:RUBRIC_EXEMPLAR_MAX_QUESTIONS]:
+            qid = str(question.get("question_id") or question.get("id") or "").strip()
+            qtype = str(question.get("question_type") or question.get("questionType") or "")
+            if not qid or not qtype.strip():
+                continue
+            points = "; ".join(
+                str(sp.get("description") or "")
+                for sp in question.get("scoring_points") or []
+                if isinstance(sp, dict)
+            )
+            question_text = str(question.get("question_text") or "")
+            if question_text.strip() or points.strip():
+                queries.append((qid, qtype.strip(), question_text, points))
+        if not queries:
+            return {}
+
+        cache_key = hashlib.sha256(
+            json.dumps([queries, top_k, min_similarity], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        now = time.monotonic()
+        cached = self._rubric_cache.get(cache_key)
+        if cached is not None and now - cached[0] <= RUBRIC_EXEMPLAR_CACHE_SECONDS:
+            return cached[1]
+
+        results = await asyncio.gather(
+            *[
+                self.retrieve_similar(
+                    "",
+                    qtype,
+                    top_k=top_k,
+                    min_similarity=min_similarity,
+                    question_text=question_text,
+                    rubric_point_text=points,
+                )
+                for _qid, qtype, question_text, points in queries
+            ]
+        )
+        by_question = {
+            query[0]: exemplars for query, exemplars in zip(queries, results) if exemplars
+        }
+        for key, (loaded_at, _) in list(self._rubric_cache.items()):
+            if now - loaded_at > RUBRIC_EXEMPLAR_CACHE_SECONDS:
+                self._rubric_cache.pop(key, None)
+        self._rubric_cache[cache_key] = (now, by_question)
+        return by_question
+
+    async def _fetch_by_image_hash(
+        self, question_image_hash: str, question_type: str, top_k: int
+    ) -> List[Any]:
+        """按题目图片哈希精确匹配（无文本时的退化路径）"""
+        async with self.pool_manager.pg_connection() as conn:
+            result = await conn.execute(
+                """
+                SELECT
+                    exemplar_id, question_type, question_image_hash,
+                    student_answer_text, score, max_score,
+                    teacher_feedback, teacher_id, confirmed_at,
+                    usage_count
+                FROM exemplars
+                WHERE question_type = %s AND question_image_hash = %s
+                ORDER BY usage_count DESC, confirmed_at DESC
+                LIMIT %s
+                """,
+                (question_type, question_image_hash, top_k),
+            )
+            return await result.fetchall()
+
+    @staticmethod
+    def _row_to_exemplar(row: Any) -> Exemplar:
+        return Exemplar(
+            exemplar_id=str(row["exemplar_id"]),
+            question_type=row["question_type"],
+            question_image_hash=row["question_image_hash"],
+            student_answer_text=row["student_answer_text"],
+            score=float(row["score"]),
+            max_score=float(row["max_score"]),
+            teacher_feedback=row["teacher_feedback"],
+            teacher_id=str(row["teacher_id"]),
+            confirmed_at=row["confirmed_at"],
+            usage_count=row["usage_count"],
+            embedding=None,  # 不返回向量以节省内存
+        )
+
     async def _increment_usage_count(self, exemplar_id: str) -> None:
         """增加判例使用次数"""
+        await self._increment_usage_counts([exemplar_id])
+
+    async def _increment_usage_counts(self, exemplar_ids: Sequence[str]) -> None:
+        """批量增加判例使用次数（单条 UPDATE ... FROM unnest）"""
+        if not exemplar_ids:
+            return
+        deltas: Dict[str, int] = {}
+        for exemplar_id in exemplar_ids:
+            deltas[exemplar_id] = deltas.get(exemplar_id, 0) + 1
         try:
             async with self.pool_manager.pg_connection() as conn:
                 await conn.execute(
                     """
-                    UPDATE exemplars
-                    SET usage_count = usage_count + 1
-                    WHERE exemplar_id = $1
+                    UPDATE exemplars AS e
+                    SET usage_count = e.usage_count + u.delta
+                    FROM unnest(%s::uuid[], %s::int[]) AS u(exemplar_id, delta)
+                    WHERE e.exemplar_id = u.exemplar_id
                     """,
-                    exemplar_id,
+                    (list(deltas.keys()), list(deltas.values())),
                 )
         except Exception as e:
             logger.warning(f"更新判例使用次数失败: {e}")
@@ -315,7 +491,8 @@ class ExemplarMemory:
         try:
             async with self.pool_manager.pg_connection() as conn:
                 # 统计当前判例数量
-                count_row = await conn.fetchrow("SELECT COUNT(*) as count FROM exemplars")
+                result = await conn.execute("SELECT COUNT(*) as count FROM exemplars")
+                count_row = await result.fetchone()
                 current_count = count_row["count"]
 
                 if current_count <= max_capacity:
@@ -329,7 +506,7 @@ class ExemplarMemory:
                 # 1. 优先淘汰超过保留期的判例
                 # 2. 其次淘汰使用频率最低的判例
                 # 3. 最后按确认时间从旧到新淘汰
-                deleted_rows = await conn.fetch(
+                result = await conn.execute(
                     """
                     DELETE FROM exemplars
                     WHERE exemplar_id IN (
@@ -337,18 +514,18 @@ class ExemplarMemory:
                         FROM exemplars
                         ORDER BY 
                             CASE 
-                                WHEN confirmed_at < NOW() - INTERVAL '1 day' * $2 THEN 0
+                                WHEN confirmed_at < NOW() - INTERVAL '1 day' * %s THEN 0
                                 ELSE 1
                             END,
                             usage_count ASC,
                             confirmed_at ASC
-                        LIMIT $1
+                        LIMIT %s
                     )
                     RETURNING exemplar_id
                     """,
-                    evict_count,
-                    retention_days,
+                    (retention_days, evict_count),
                 )
+                deleted_rows = await result.fetchall()
 
                 evicted_count = len(deleted_rows)
                 logger.info(f"成功淘汰 {evicted_count} 个旧判例")
@@ -362,7 +539,7 @@ class ExemplarMemory:
         """根据ID获取判例"""
         try:
             async with self.pool_manager.pg_connection() as conn:
-                row = await conn.fetchrow(
+                result = await conn.execute(
                     """
                     SELECT 
                         exemplar_id, question_type, question_image_hash,
@@ -370,28 +547,36 @@ class ExemplarMemory:
                         teacher_feedback, teacher_id, confirmed_at,
                         usage_count
                     FROM exemplars
-                    WHERE exemplar_id = $1
+                    WHERE exemplar_id = %s
                     """,
-                    exemplar_id,
+                    (exemplar_id,),
                 )
+                row = await result.fetchone()
 
                 if not row:
                     return None
 
-                return Exemplar(
-                    exemplar_id=str(row["exemplar_id"]),
-                    question_type=row["question_type"],
-                    question_image_hash=row["question_image_hash"],
-                    student_answer_text=row["student_answer_text"],
-                    score=float(row["score"]),
-                    max_score=float(row["max_score"]),
-                    teacher_feedback=row["teacher_feedback"],
-                    teacher_id=str(row["teacher_id"]),
-                    confirmed_at=row["confirmed_at"],
-                    usage_count=row["usage_count"],
-                    embedding=None,
-                )
+                return self._row_to_exemplar(row)
 
         except Exception as e:
             logger.error(f"获取判例失败: {e}")
             return None
+
+
+_exemplar_memory: Optional[ExemplarMemory] = None
+
+
+def get_exemplar_memory() -> Optional[ExemplarMemory]:
+    """进程内共享的判例记忆库（使用共享连接池）；没有嵌入模型或连接池未初始化时返回 None"""
+    global _exemplar_memory
+    if _exemplar_memory is None:
+        try:
+            _exemplar_memory = ExemplarMemory()
+        except Exception as e:
+            logger.warning(f"判例记忆库不可用: {e}")
+            return None
+    if _exemplar_memory.query_embedder is None:
+        return None
+    if not _exemplar_memory.pool_manager.is_initialized:
+        return None
+    return _exemplar_memory
@@ -13,17 +13,26 @@ Requirements:
 
 import os
 import io
+import json
 import uuid
+import asyncio
 import hashlib
 import logging
+import sqlite3
+import threading
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any, Union
+from typing import Optional, List, Dict, Any, AsyncIterator, Iterator, Tuple, Union
 from dataclasses import dataclass, field
 
 logger = logging.getLogger(__name__)
 
+# 流式读写的块大小
+STREAM_CHUNK_SIZE = int(os.getenv("FILE_STORAGE_CHUNK_SIZE", str(1024 * 1024)))
+S3_MIN_PART_SIZE = 5 * 1024 * 1024
+
 
 @dataclass
 class StoredFile:
@@ -36,6 +45,7 @@ class StoredFile:
     batch_id: Optional[str] = None
     created_at: str = field(default_factory=lambda: datetime.now().isoformat())
     metadata: Dict[str, Any] = field(default_factory=dict)
+    content_hash: Optional[str] = None
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -47,6 +57,7 @@ class StoredFile:
             "batch_id": self.batch_id,
             "created_at": self.created_at,
             "metadata": self.metadata,
+            "content_hash": self.content_hash,
         }
 
 
@@ -85,53 +96,310 @@ class FileStorageBackend(ABC):
         """列出批次下的所有文件"""
         pass
 
+    async def save_stream(
+        self,
+        stream: AsyncIterator[bytes],
+        filename: str,
+        batch_id: str,
+        content_type: str = "application/octet-stream",
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> StoredFile:
+        """流式保存文件
+
+        默认实现先收集完整内容再调用 save，支持流式写入的后端应覆盖此方法。
+        """
+        chunks = [chunk async for chunk in stream]
+        return await self.save(b"".join(chunks), filename, batch_id, content_type, metadata)
+
+    async def open_range(
+        self, file_id: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """按块读取文件的 [start, end] 字节区间（end 为闭区间，与 HTTP Range 一致）
+
+        文件不存在时抛出 FileNotFoundError。默认实现读取完整内容后切片。
+        """
+        data = await self.get(file_id)
+        if data is None:
+            raise FileNotFoundError(file_id)
+        stop = len(data) if end is None else min(end + 1, len(data))
+        for offset in range(start, stop, STREAM_CHUNK_SIZE):
+            yield data[offset : min(offset + STREAM_CHUNK_SIZE, stop)]
+
+
+class SqliteFileIndex:
+    """LocalFileStorage 的 SQLite 索引
+
+    - WAL 模式，多个 API worker 共享同一目录时读写互不阻塞，写入由 SQLite 文件锁串行化
+    - batch_id / content_hash 建索引，按批次列举与去重引用计数均走索引
+    - 每个线程一条连接（sqlite3 连接不能跨线程共享），由 asyncio.to_thread 调用
+    """
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS files (
+            file_id TEXT PRIMARY KEY,
+            filename TEXT NOT NULL,
+            content_type TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            storage_path TEXT NOT NULL,
+            batch_id TEXT,
+            content_hash TEXT,
+            created_at TEXT NOT NULL,
+            metadata TEXT NOT NULL DEFAULT '{}'
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_files_batch ON files (batch_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files (content_hash)",
+    )
+    COLUMNS = (
+        "file_id, filename, content_type, size, storage_path, "
+        "batch_id, content_hash, created_at, metadata"
+    )
+
+    def __init__(self, db_path: Path, busy_timeout_ms: int = 10000):
+        self.db_path = Path(db_path)
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        conn = self.connection()
+        for statement in self.SCHEMA:
+            conn.execute(statement)
+
+    def connection(self) -> sqlite3.Connection:
+        """获取当前线程的连接（首次使用时创建）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：自动提交，事务由 transaction() 显式控制
+            conn = sqlite3.connect(
+                str(self.db_path),
+                isolation_level=None,
+                check_same_thread=False,
+                timeout=self.busy_timeout_ms / 1000,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务：BEGIN IMMEDIATE 立即获取写锁，避免读后升级写锁时的死锁"""
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def row_to_file(row: Tuple) -> StoredFile:
+        return StoredFile(
+            file_id=row[0],
+            filename=row[1],
+            content_type=row[2],
+            size=row[3],
+            storage_path=row[4],
+            batch_id=row[5],
+            content_hash=row[6],
+            created_at=row[7],
+            metadata=json.loads(row[8]) if row[8] else {},
+        )
+
+    @staticmethod
+    def file_to_row(stored_file: StoredFile) -> Tuple:
+        return (
+            stored_file.file_id,
+            stored_file.filename,
+            stored_file.content_type,
+            stored_file.size,
+            stored_file.storage_path,
+            stored_file.batch_id,
+            stored_file.content_hash,
+            stored_file.created_at,
+            json.dumps(stored_file.metadata, ensure_ascii=False),
+        )
+
+    def insert(self, conn: sqlite3.Connection, stored_file: StoredFile) -> None:
+        conn.execute(
+            f"INSERT INTO files ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            self.file_to_row(stored_file),
+        )
+
+    def get(self, file_id: str) -> Optional[StoredFile]:
+        row = (
+            self.connection()
+            .execute(f"SELECT {self.COLUMNS} FROM files WHERE file_id = ?", (file_id,))
+            .fetchone()
+        )
+        return self.row_to_file(row) if row else None
+
+    def list_by_batch(self, batch_id: str) -> List[StoredFile]:
+        rows = (
+            self.connection()
+            .execute(
+                f"SELECT {self.COLUMNS} FROM files WHERE batch_id = ? "
+                "ORDER BY created_at, rowid",
+                (batch_id,),
+            )
+            .fetchall()
+        )
+        return [self.row_to_file(row) for row in rows]
+
+    def count(self) -> int:
+        return self.connection().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self) -> None:
+        with self._connections_lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            self._connections.clear()
+        self._local = threading.local()
+
 
 class LocalFileStorage(FileStorageBackend):
-    """本地文件存储（开发环境）"""
-    
+    """本地文件存储（开发环境）
+
+    文件内容按 sha256 内容寻址存放在 objects/ 下，相同内容只存一份；
+    元数据索引在 SQLite（index.sqlite3）中，文件与索引 I/O 均放到线程池执行，
+    不阻塞事件循环。旧版 index.json 在首次启动时迁移。
+    """
+
+    INDEX_DB_NAME = "index.sqlite3"
+    LEGACY_INDEX_NAME = "index.json"
+    OBJECTS_DIR = "objects"
+
     def __init__(self, base_path: str = "./uploads"):
         self.base_path = Path(base_path)
         self.base_path.mkdir(parents=True, exist_ok=True)
-        self.index_file = self.base_path / "index.json"
-        self._file_index: Dict[str, StoredFile] = {}
-        self._load_index()
+        self.objects_path = self.base_path / self.OBJECTS_DIR
+        self.objects_path.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.base_path / self.LEGACY_INDEX_NAME
+        self.index = SqliteFileIndex(self.base_path / self.INDEX_DB_NAME)
+        self._migrate_legacy_index()
         logger.info(f"[FileStorage] 使用本地存储: {self.base_path.absolute()}")
-    
-    def _load_index(self):
-        """加载文件索引"""
-        if self.index_file.exists():
-            try:
-                import json
-                with open(self.index_file, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    for file_id, info in data.items():
-                        self._file_index[file_id] = StoredFile(**info)
-                logger.info(f"[FileStorage] 已加载 {len(self._file_index)} 条文件索引")
-            except Exception as e:
-                logger.error(f"[FileStorage] 加载索引失败: {e}")
-    
-    def _save_index(self):
-        """保存文件索引"""
+
+    def _migrate_legacy_index(self) -> int:
+        """将旧版 index.json 导入 SQLite，成功后重命名为 index.json.migrated
+
+        旧文件仍留在原批次目录中，content_hash 为空，删除时直接删除其自身路径。
+        """
+        if not self.index_file.exists():
+            return 0
         try:
-            import json
-            data = {fid: f.to_dict() for fid, f in self._file_index.items()}
-            with open(self.index_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            rows = [
+                SqliteFileIndex.file_to_row(StoredFile(**info)) for info in data.values()
+            ]
+            with self.index.transaction() as conn:
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO files ({SqliteFileIndex.COLUMNS}) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            os.replace(
+                self.index_file, self.index_file.with_name(self.LEGACY_INDEX_NAME + ".migrated")
+            )
+            logger.info(f"[FileStorage] 已将 {len(rows)} 条旧版 JSON 索引迁移到 SQLite")
+            return len(rows)
+        except FileNotFoundError:
+            # 另一个 worker 已完成迁移
+            return 0
         except Exception as e:
-            logger.error(f"[FileStorage] 保存索引失败: {e}")
+            logger.error(f"[FileStorage] 迁移旧版索引失败: {e}")
+            return 0
 
-    def _generate_file_id(self, file_data: bytes, filename: str) -> str:
+    def _generate_file_id(self, content_hash: str) -> str:
         """生成唯一文件 ID"""
-        content_hash = hashlib.md5(file_data).hexdigest()[:8]
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        return f"{timestamp}_{content_hash}_{uuid.uuid4().hex[:8]}"
-    
-    def _get_batch_path(self, batch_id: str) -> Path:
-        """获取批次目录路径"""
-        batch_path = self.base_path / batch_id
-        batch_path.mkdir(parents=True, exist_ok=True)
-        return batch_path
-    
+        return f"{timestamp}_{content_hash[:8]}_{uuid.uuid4().hex[:8]}"
+
+    def _object_path(self, content_hash: str) -> Path:
+        """内容寻址路径：objects/ab/abcdef..."""
+        return self.objects_path / content_hash[:2] / content_hash
+
+    def _write_temp(self, object_path: Path, file_data: bytes) -> Path:
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = object_path.with_name(f"{object_path.name}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(file_data)
+        return tmp_path
+
+    def _commit_object(
+        self,
+        tmp_path: Optional[Path],
+        content_hash: str,
+        size: int,
+        filename: str,
+        batch_id: str,
+        content_type: str,
+        metadata: Dict[str, Any],
+        file_data: Optional[bytes] = None,
+    ) -> StoredFile:
+        """落位对象文件并登记索引
+
+        tmp_path 为已写好的临时文件；为 None 时表示调用方认为对象已存在，
+        若在写锁内发现对象已被并发删除，则用 file_data 重新写出。
+        """
+        object_path = self._object_path(content_hash)
+        stored_file = StoredFile(
+            file_id=self._generate_file_id(content_hash),
+            filename=filename,
+            content_type=content_type,
+            size=size,
+            storage_path=str(object_path),
+            batch_id=batch_id,
+            content_hash=content_hash,
+            metadata=metadata,
+        )
+        try:
+            # 在写锁内落位对象文件并登记索引，与 delete 的“最后引用删除文件”互斥
+            with self.index.transaction() as conn:
+                if not object_path.exists():
+                    if tmp_path is None:
+                        tmp_path = self._write_temp(object_path, file_data)
+                    object_path.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(tmp_path, object_path)
+                    tmp_path = None
+                self.index.insert(conn, stored_file)
+        finally:
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
+        return stored_file
+
+    def _save_sync(
+        self,
+        file_data: bytes,
+        filename: str,
+        batch_id: str,
+        content_type: str,
+        metadata: Dict[str, Any],
+    ) -> StoredFile:
+        content_hash = hashlib.sha256(file_data).hexdigest()
+        object_path = self._object_path(content_hash)
+
+        # 内容已存在时跳过写盘；否则先写临时文件（不持有写锁）
+        tmp_path = None if object_path.exists() else self._write_temp(object_path, file_data)
+        return self._commit_object(
+            tmp_path,
+            content_hash,
+            len(file_data),
+            filename,
+            batch_id,
+            content_type,
+            metadata,
+            file_data=file_data,
+        )
+
     async def save(
         self,
         file_data: bytes,
@@ -142,37 +410,18 @@ class LocalFileStorage(FileStorageBackend):
     ) -> StoredFile:
         """保存文件到本地"""
         try:
-            file_id = self._generate_file_id(file_data, filename)
-            batch_path = self._get_batch_path(batch_id)
-            
-            # 保留原始文件扩展名
-            ext = Path(filename).suffix or self._guess_extension(content_type)
-            storage_filename = f"{file_id}{ext}"
-            storage_path = batch_path / storage_filename
-            
-            # 写入文件
-            with open(storage_path, "wb") as f:
-                f.write(file_data)
-            
-            stored_file = StoredFile(
-                file_id=file_id,
-                filename=filename,
-                content_type=content_type,
-                size=len(file_data),
-                storage_path=str(storage_path),
-                batch_id=batch_id,
-                metadata=metadata or {},
+            stored_file = await asyncio.to_thread(
+                self._save_sync, file_data, filename, batch_id, content_type, metadata or {}
+            )
+            logger.debug(
+                f"[FileStorage] 保存文件: {filename} -> {stored_file.storage_path} "
+                f"({len(file_data)} bytes)"
             )
-            
-            self._file_index[file_id] = stored_file
-            self._save_index() # 持久化索引
-            
-            logger.info(f"[FileStorage] 保存文件: {filename} -> {storage_path} ({len(file_data)} bytes)")
             return stored_file
         except Exception as e:
             logger.error(f"[FileStorage] 本地保存失败: {e}")
             raise
-    
+
     def _guess_extension(self, content_type: str) -> str:
         """根据 MIME 类型猜测扩展名"""
         mime_to_ext = {
@@ -184,43 +433,128 @@ class LocalFileStorage(FileStorageBackend):
             "text/plain": ".txt",
         }
         return mime_to_ext.get(content_type, "")
-    
-    async def get(self, file_id: str) -> Optional[bytes]:
-        """获取文件内容"""
-        stored_file = self._file_index.get(file_id)
+
+    @staticmethod
+    def _write_chunk(f, hasher, chunk: bytes) -> None:
+        hasher.update(chunk)
+        f.write(chunk)
+
+    async def save_stream(
+        self,
+        stream: AsyncIterator[bytes],
+        filename: str,
+        batch_id: str,
+        content_type: str = "application/octet-stream",
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> StoredFile:
+        """流式保存：边读边写临时文件并增量计算 sha256，内存占用与文件大小无关"""
+        incoming = self.objects_path / ".incoming"
+        incoming.mkdir(parents=True, exist_ok=True)
+        tmp_path = incoming / f"{uuid.uuid4().hex}.tmp"
+        hasher = hashlib.sha256()
+        size = 0
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            async for chunk in stream:
+                if not chunk:
+                    continue
+                await asyncio.to_thread(self._write_chunk, f, hasher, chunk)
+                size += len(chunk)
+            await asyncio.to_thread(f.close)
+            stored_file = await asyncio.to_thread(
+                self._commit_object,
+                tmp_path,
+                hasher.hexdigest(),
+                size,
+                filename,
+                batch_id,
+                content_type,
+                metadata or {},
+            )
+        except BaseException as e:
+            f.close()
+            tmp_path.unlink(missing_ok=True)
+            if isinstance(e, Exception):
+                logger.error(f"[FileStorage] 本地流式保存失败: {e}")
+            raise
+        logger.debug(
+            f"[FileStorage] 流式保存文件: {filename} -> {stored_file.storage_path} ({size} bytes)"
+        )
+        return stored_file
+
+    async def open_range(
+        self, file_id: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """按块读取本地文件区间"""
+        stored_file = await asyncio.to_thread(self.index.get, file_id)
+        if not stored_file:
+            raise FileNotFoundError(file_id)
+        f = await asyncio.to_thread(open, stored_file.storage_path, "rb")
+        try:
+            await asyncio.to_thread(f.seek, start)
+            remaining = None if end is None else max(0, end - start + 1)
+            while remaining is None or remaining > 0:
+                size = STREAM_CHUNK_SIZE if remaining is None else min(STREAM_CHUNK_SIZE, remaining)
+                chunk = await asyncio.to_thread(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            f.close()
+
+    def _get_sync(self, file_id: str) -> Optional[bytes]:
+        stored_file = self.index.get(file_id)
         if not stored_file:
             return None
-        
-        storage_path = Path(stored_file.storage_path)
-        if not storage_path.exists():
+        try:
+            with open(stored_file.storage_path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
             return None
-        
-        with open(storage_path, "rb") as f:
-            return f.read()
-    
+
+    async def get(self, file_id: str) -> Optional[bytes]:
+        """获取文件内容"""
+        return await asyncio.to_thread(self._get_sync, file_id)
+
     async def get_info(self, file_id: str) -> Optional[StoredFile]:
         """获取文件信息"""
-        return self._file_index.get(file_id)
-    
-    async def delete(self, file_id: str) -> bool:
-        """删除文件"""
-        stored_file = self._file_index.get(file_id)
-        if not stored_file:
-            return False
-        
-        storage_path = Path(stored_file.storage_path)
-        if storage_path.exists():
-            storage_path.unlink()
-        
-        del self._file_index[file_id]
-        self._save_index() # 持久化索引
-        
-        logger.info(f"[FileStorage] 删除文件: {file_id}")
+        return await asyncio.to_thread(self.index.get, file_id)
+
+    def _delete_sync(self, file_id: str) -> bool:
+        with self.index.transaction() as conn:
+            row = conn.execute(
+                "SELECT storage_path, content_hash FROM files WHERE file_id = ?", (file_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            storage_path, content_hash = row
+            conn.execute("DELETE FROM files WHERE file_id = ?", (file_id,))
+            if content_hash:
+                remaining = conn.execute(
+                    "SELECT COUNT(*) FROM files WHERE content_hash = ?", (content_hash,)
+                ).fetchone()[0]
+                if remaining:
+                    return True
+            # 最后一个引用：持锁删除对象文件，避免与并发 save 的复用判断交错
+            Path(storage_path).unlink(missing_ok=True)
         return True
-    
+
+    async def delete(self, file_id: str) -> bool:
+        """删除文件（内容去重的对象在最后一个引用删除时才移除）"""
+        deleted = await asyncio.to_thread(self._delete_sync, file_id)
+        if deleted:
+            logger.info(f"[FileStorage] 删除文件: {file_id}")
+        return deleted
+
     async def list_by_batch(self, batch_id: str) -> List[StoredFile]:
         """列出批次下的所有文件"""
-        return [f for f in self._file_index.values() if f.batch_id == batch_id]
+        return await asyncio.to_thread(self.index.list_by_batch, batch_id)
+
+    def close(self) -> None:
+        """关闭索引连接"""
+        self.index.close()
 
 
 class S3FileStorage(FileStorageBackend):
@@ -233,12 +567,22 @@ class S3FileStorage(FileStorageBackend):
         access_key: Optional[str] = None,
         secret_key: Optional[str] = None,
         endpoint_url: Optional[str] = None,
+        part_size: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
     ):
         self.bucket_name = bucket_name
         self.region = region
         self.access_key = access_key or os.getenv("AWS_ACCESS_KEY_ID")
         self.secret_key = secret_key or os.getenv("AWS_SECRET_ACCESS_KEY")
         self.endpoint_url = endpoint_url or os.getenv("S3_ENDPOINT_URL")
+        # S3 要求除最后一个分片外每片不小于 5MB
+        self.part_size = max(
+            S3_MIN_PART_SIZE,
+            part_size or int(os.getenv("S3_MULTIPART_PART_SIZE", str(8 * 1024 * 1024))),
+        )
+        self.max_concurrency = max(
+            1, max_concurrency or int(os.getenv("S3_MULTIPART_CONCURRENCY", "4"))
+        )
         self._client = None
         self._file_index: Dict[str, StoredFile] = {}
         logger.info(f"[FileStorage] 使用 S3 存储: bucket={bucket_name}, region={region}")
@@ -313,6 +657,158 @@ class S3FileStorage(FileStorageBackend):
         
         return stored_file
     
+    async def save_stream(
+        self,
+        stream: AsyncIterator[bytes],
+        filename: str,
+        batch_id: str,
+        content_type: str = "application/octet-stream",
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> StoredFile:
+        """流式保存到 S3
+
+        不足一个分片的小文件直接 put_object；否则走分片上传，最多 max_concurrency 个分片并行，
+        内存中约保留 (max_concurrency + 2) 个分片。失败时中止分片上传，不留下残片。
+        """
+        client = await self._get_client()
+        file_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:16]}"
+        ext = Path(filename).suffix or ""
+        s3_key = self._get_s3_key(batch_id, file_id, ext)
+        object_metadata = {
+            "original_filename": filename,
+            "batch_id": batch_id,
+            **(metadata or {}),
+        }
+
+        hasher = hashlib.sha256()
+        size = 0
+        buffer = bytearray()
+        upload_id: Optional[str] = None
+        parts: Dict[int, str] = {}
+        tasks: List[asyncio.Task] = []
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def upload_part(part_number: int, body: bytes) -> None:
+            try:
+                response = await client.upload_part(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    UploadId=upload_id,
+                    PartNumber=part_number,
+                    Body=body,
+                )
+                parts[part_number] = response["ETag"]
+            finally:
+                semaphore.release()
+
+        async def flush_part() -> None:
+            nonlocal upload_id, buffer
+            if upload_id is None:
+                response = await client.create_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    ContentType=content_type,
+                    Metadata=object_metadata,
+                )
+                upload_id = response["UploadId"]
+            # 先占用并发名额再切出分片，背压直接作用到读取请求体的一侧
+            await semaphore.acquire()
+            body = bytes(buffer)
+            buffer = bytearray()
+            tasks.append(asyncio.create_task(upload_part(len(tasks) + 1, body)))
+            for task in tasks:
+                if task.done() and task.exception() is not None:
+                    raise task.exception()
+
+        try:
+            async for chunk in stream:
+                if not chunk:
+                    continue
+                hasher.update(chunk)
+                size += len(chunk)
+                buffer += chunk
+                if len(buffer) >= self.part_size:
+                    await flush_part()
+
+            if upload_id is None:
+                await client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    Body=bytes(buffer),
+                    ContentType=content_type,
+                    Metadata=object_metadata,
+                )
+            else:
+                if buffer:
+                    await flush_part()
+                await asyncio.gather(*tasks)
+                await client.complete_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    UploadId=upload_id,
+                    MultipartUpload={
+                        "Parts": [
+                            {"PartNumber": number, "ETag": parts[number]}
+                            for number in sorted(parts)
+                        ]
+                    },
+                )
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if upload_id is not None:
+                try:
+                    await client.abort_multipart_upload(
+                        Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id
+                    )
+                except Exception as abort_error:
+                    logger.warning(f"[FileStorage] 中止 S3 分片上传失败: {abort_error}")
+            if isinstance(e, Exception):
+                logger.error(f"[FileStorage] S3 流式保存失败: {e}")
+            raise
+
+        stored_file = StoredFile(
+            file_id=file_id,
+            filename=filename,
+            content_type=content_type,
+            size=size,
+            storage_path=f"s3://{self.bucket_name}/{s3_key}",
+            batch_id=batch_id,
+            content_hash=hasher.hexdigest(),
+            metadata=metadata or {},
+        )
+        self._file_index[file_id] = stored_file
+        logger.info(
+            f"[FileStorage] 流式保存文件到 S3: {filename} -> {s3_key} "
+            f"({size} bytes, {len(tasks) or 1} parts)"
+        )
+        return stored_file
+
+    async def open_range(
+        self, file_id: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """通过 Range GET 按块读取 S3 对象区间"""
+        stored_file = self._file_index.get(file_id)
+        if not stored_file:
+            raise FileNotFoundError(file_id)
+
+        client = await self._get_client()
+        s3_key = stored_file.storage_path.replace(f"s3://{self.bucket_name}/", "")
+        byte_range = f"bytes={start}-" if end is None else f"bytes={start}-{end}"
+        response = await client.get_object(Bucket=self.bucket_name, Key=s3_key, Range=byte_range)
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await body.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            close = getattr(body, "close", None)
+            if close is not None:
+                close()
+
     async def get(self, file_id: str) -> Optional[bytes]:
         """从 S3 获取文件内容"""
         stored_file = self._file_index.get(file_id)
@@ -449,6 +945,29 @@ class FileStorageService:
         """列出批次的所有文件"""
         return await self.backend.list_by_batch(batch_id)
     
+    async def save_stream(
+        self,
+        batch_id: str,
+        stream: AsyncIterator[bytes],
+        filename: str,
+        content_type: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> StoredFile:
+        """流式保存单个文件（如直接转存上传请求体）"""
+        return await self.backend.save_stream(
+            stream,
+            filename=filename,
+            batch_id=batch_id,
+            content_type=content_type or self._guess_content_type(filename),
+            metadata=metadata,
+        )
+
+    def open_file_range(
+        self, file_id: str, start: int = 0, end: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
+        """按块读取文件区间（end 为闭区间）"""
+        return self.backend.open_range(file_id, start, end)
+
     async def delete_file(self, file_id: str) -> bool:
         """删除文件"""
         return await self.backend.delete(file_id)
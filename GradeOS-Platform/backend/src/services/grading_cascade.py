@@ -0,0 +1,482 @@
+"""
+批改模型级联：快速档初批，按题升级到强模型档
+
+每个学生先由较便宜 / 较快的模型档（LLM_GRADING_FAST_MODEL）整卷批改，
+再逐题判断是否需要升级：
+- 置信度：模型自报置信度与 confidence_calculator 按得分点引用质量、
+  另类解法加权得到的题目置信度取较小值，低于阈值即升级；
+- 规则检查：复用自白报告的确定性检查，出现 error 级问题
+  （越界得分、无证据给分、得分点累加不符）即升级。
+只有被升级的题目（连同定位到的页面）交给强模型档重批，结果按题替换。
+
+预算：每个运行（batch_id）按已批改页数累积二次批改预算
+（GRADING_BUDGET_PER_PAGE_USD × GRADING_SECOND_PASS_BUDGET_FRACTION），
+每道升级题按一次严格批改的估算成本扣减；预算不足时保留快速档结果。
+每个学生最多升级 GRADING_SECOND_PASS_MAX_RATIO 比例的题目（至少 1 题）。
+"""
+
+import logging
+import math
+import os
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from src.models.grading_models import ScoringPoint, ScoringPointResult
+from src.services.confession_auditor import _compute_grading_mandatory_items
+from src.services.confidence_calculator import (
+    calculate_point_confidence,
+    calculate_question_confidence,
+)
+
+logger = logging.getLogger(__name__)
+
+TIER_FAST = "fast"
+TIER_STRONG = "strong"
+
+GRADING_CASCADE_ENABLED = os.getenv("GRADING_CASCADE_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+GRADING_FAST_MODEL = os.getenv("LLM_GRADING_FAST_MODEL", "")
+CASCADE_MAX_RUNS = int(os.getenv("GRADING_CASCADE_MAX_RUNS", "256"))
+
+# 规则检查中触发升级的问题类型（error 级）
+_ESCALATING_ISSUES = {
+    "score_out_of_bounds",
+    "missing_evidence_awarded_positive",
+    "point_sum_mismatch",
+}
+
+
+def _safe_float(value: Any, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _question_id(detail: Dict[str, Any]) -> str:
+    return str(detail.get("question_id") or detail.get("questionId") or "").strip()
+
+
+def question_confidence(detail: Dict[str, Any]) -> float:
+    """
+    题目置信度：模型自报值与按得分点重算值取较小者
+
+    得分点置信度由 calculate_point_confidence 按评分标准引用与另类解法计算，
+    再由 calculate_question_confidence 按得分点分值加权。
+    """
+    reported = _safe_float(detail.get("confidence"), 1.0)
+    points = detail.get("scoring_point_results") or detail.get("scoring_results") or []
+    point_results: List[ScoringPointResult] = []
+    for point in points:
+        if not isinstance(point, dict):
+            continue
+        reference = point.get("rubric_reference") or point.get("rubricReference")
+        alternative = bool(
+            point.get("is_alternative_solution") or point.get("isAlternativeSolution")
+        )
+        citation = point.get("citation_quality") or ("exact" if reference else "none")
+        point_results.append(
+            ScoringPointResult(
+                scoring_point=ScoringPoint(
+                    description=str(point.get("description") or ""),
+                    score=_safe_float(point.get("max_points") or point.get("maxPoints")),
+                    point_id=str(point.get("point_id") or point.get("pointId") or ""),
+                ),
+                awarded=_safe_float(point.get("awarded", point.get("score"))),
+                evidence=str(point.get("evidence") or ""),
+                rubric_reference=reference,
+                is_alternative_solution=alternative,
+                point_confidence=calculate_point_confidence(
+                    has_rubric_reference=bool(reference),
+                    citation_quality=citation,
+                    is_alternative_solution=alternative,
+                ),
+                citation_quality=citation,
+            )
+        )
+    if not point_results:
+        return round(max(0.0, min(1.0, reported)), 3)
+    return round(max(0.0, min(1.0, reported, calculate_question_confidence(point_results))), 3)
+
+
+@dataclass
+class EscalationCandidate:
+    """需要升级到强模型档的题目"""
+
+    question_id: str
+    confidence: float
+    reasons: List[str] = field(default_factory=list)
+
+
+def plan_escalation(
+    question_details: Sequence[Dict[str, Any]],
+    *,
+    threshold: float,
+    max_ratio: float,
+) -> List[EscalationCandidate]:
+    """
+    选出需要升级的题目
+
+    规则检查命中的题目优先，其次按置信度从低到高；每个学生最多升级
+    ceil(题数 × max_ratio) 道（max_ratio > 0 时至少 1 道）。
+    """
+    details = [d for d in question_details if isinstance(d, dict) and _question_id(d)]
+    if not details or max_ratio <= 0:
+        return []
+
+    rule_hits: Dict[str, List[str]] = {}
+    for item in _compute_grading_mandatory_items({"question_details": details}):
+        if item.get("severity") == "error" and item.get("issue_type") in _ESCALATING_ISSUES:
+            reasons = rule_hits.setdefault(str(item.get("question_id")), [])
+            if item["issue_type"] not in reasons:
+                reasons.append(item["issue_type"])
+
+    candidates: List[EscalationCandidate] = []
+    for detail in details:
+        qid = _question_id(detail)
+        confidence = question_confidence(detail)
+        reasons = list(rule_hits.get(qid, []))
+        if confidence < threshold:
+            reasons.append("low_confidence")
+        if reasons:
+            candidates.append(EscalationCandidate(qid, confidence, reasons))
+
+    candidates.sort(key=lambda c: (c.reasons == ["low_confidence"], c.confidence))
+    limit = max(1, math.ceil(len(details) * max_ratio))
+    return candidates[:limit]
+
+
+class CascadeRunBudget:
+    """
+    按运行累积的升级预算
+
+    每批改一页累积 page_budget_usd；每道升级题预留 cost_per_question_usd。
+    只保留最近 CASCADE_MAX_RUNS 个运行的账目。
+
+    账目只在当前进程内：同一运行分布到多个 worker 进程时，每个进程各自
+    按自己批改的页数累积预算，全局升级比例上限不会跨进程合并。
+    """
+
+    def __init__(self, max_runs: int = CASCADE_MAX_RUNS):
+        self.max_runs = max(1, max_runs)
+        self._runs: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+
+    def _account(self, run_id: str) -> Dict[str, float]:
+        account = self._runs.get(run_id)
+        if account is None:
+            account = {"accrued": 0.0, "spent": 0.0}
+            self._runs[run_id] = account
+            while len(self._runs) > self.max_runs:
+                self._runs.popitem(last=False)
+        else:
+            self._runs.move_to_end(run_id)
+        return account
+
+    def accrue(self, run_id: str, amount_usd: float) -> None:
+        self._account(run_id)["accrued"] += max(0.0, amount_usd)
+
+    def reserve(self, run_id: str, questions: int, cost_per_question_usd: float) -> int:
+        """在预算内尽量多地预留升级题数，返回实际获批的题数"""
+        account = self._account(run_id)
+        if questions <= 0:
+            return 0
+        if cost_per_question_usd <= 0:
+            return questions
+        available = account["accrued"] - account["spent"]
+        granted = min(questions, int(available // cost_per_question_usd + 1e-9))
+        account["spent"] += granted * cost_per_question_usd
+        return granted
+
+    def snapshot(self, run_id: str) -> Dict[str, float]:
+        account = self._runs.get(run_id) or {"accrued": 0.0, "spent": 0.0}
+        return {
+            "accrued_usd": round(account["accrued"], 6),
+            "spent_usd": round(account["spent"], 6),
+        }
+
+
+class CascadeMetrics:
+    """进程内的分档指标：调用数、批改题数、耗时、升级原因与升级前后一致率"""
+
+    def __init__(self) -> None:
+        self.tiers: Dict[str, Counter] = {TIER_FAST: Counter(), TIER_STRONG: Counter()}
+        self.escalation = Counter()
+        self.reasons = Counter()
+
+    def record_call(
+        self, tier: str, *, questions: int, elapsed_ms: float, failed: bool = False
+    ) -> None:
+        counter = self.tiers.setdefault(tier, Counter())
+        counter["calls"] += 1
+        counter["questions"] += questions
+        counter["elapsed_ms"] += int(elapsed_ms)
+        if failed:
+            counter["failures"] += 1
+
+    def record_escalation(
+        self,
+        candidates: Sequence[EscalationCandidate],
+        *,
+        granted: int,
+        agreed: int,
+        regraded: int,
+    ) -> None:
+        self.escalation["students"] += 1
+        self.escalation["candidates"] += len(candidates)
+        self.escalation["escalated"] += granted
+        self.escalation["budget_denied"] += len(candidates) - granted
+        self.escalation["regraded"] += regraded
+        self.escalation["agreed"] += agreed
+        for candidate in candidates[:granted]:
+            self.reasons.update(candidate.reasons)
+
+    def snapshot(self) -> Dict[str, Any]:
+        regraded = self.escalation["regraded"]
+        return {
+            "tiers": {tier: dict(counter) for tier, counter in self.tiers.items()},
+            "escalation": dict(self.escalation),
+            "reasons": dict(self.reasons),
+            "agreement_rate": (self.escalation["agreed"] / regraded) if regraded else None,
+        }
+
+    def reset(self) -> None:
+        self.__init__()
+
+
+class GradingCascade:
+    """
+    两档模型级联批改
+
+    fast_client / strong_client 均为 LLMReasoningClient（或实现了
+    grade_student 与 regrade_questions 的同构对象）。grade_student 的签名与
+    返回结构与 LLMReasoningClient.grade_student 一致，额外附带 result["cascade"]。
+    """
+
+    def __init__(
+        self,
+        fast_client: Any,
+        strong_client: Any,
+        *,
+        run_id: str,
+        threshold: float,
+        max_ratio: float,
+        page_budget_usd: float,
+        cost_per_question_usd: float,
+        budget: Optional[CascadeRunBudget] = None,
+        metrics: Optional[CascadeMetrics] = None,
+    ) -> None:
+        self.fast_client = fast_client
+        self.strong_client = strong_client
+        self.run_id = run_id
+        self.threshold = threshold
+        self.max_ratio = max_ratio
+        self.page_budget_usd = page_budget_usd
+        self.cost_per_question_usd = cost_per_question_usd
+        self.budget = budget or get_cascade_budget()
+        self.metrics = metrics or get_cascade_metrics()
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.strong_client, "model_name", "")
+
+    async def _timed(self, tier: str, questions: Callable[[Any], int], call: Awaitable[Any]) -> Any:
+        start = time.perf_counter()
+        try:
+            result = await call
+        except Exception:
+            self.metrics.record_call(
+                tier, questions=0, elapsed_ms=(time.perf_counter() - start) * 1000, failed=True
+            )
+            raise
+        self.metrics.record_call(
+            tier,
+            questions=questions(result),
+            elapsed_ms=(time.perf_counter() - start) * 1000,
+            failed=isinstance(result, dict) and result.get("status") == "failed",
+        )
+        return result
+
+    async def grade_student(
+        self,
+        images: List[bytes],
+        student_key: str,
+        parsed_rubric: Dict[str, Any],
+        page_indices: Optional[List[int]] = None,
+        page_contexts: Optional[Dict[int, Dict[str, Any]]] = None,
+        stream_callback: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    ) -> Dict[str, Any]:
+        def count_details(result: Any) -> int:
+            if isinstance(result, dict):
+                return len(result.get("question_details") or [])
+            return len(result or [])
+
+        result = await self._timed(
+            TIER_FAST,
+            count_details,
+            self.fast_client.grade_student(
+                images=images,
+                student_key=student_key,
+                parsed_rubric=parsed_rubric,
+                page_indices=page_indices,
+                page_contexts=page_contexts,
+                stream_callback=stream_callback,
+            ),
+        )
+        if not isinstance(result, dict) or result.get("status") != "completed":
+            # 快速档失败：整卷交给强模型档（沿用调用方的重试流程）
+            logger.warning(
+                f"[grading_cascade] fast tier failed student={student_key}, use strong tier"
+            )
+            result = await self._timed(
+                TIER_STRONG,
+                count_details,
+                self.strong_client.grade_student(
+                    images=images,
+                    student_key=student_key,
+                    parsed_rubric=parsed_rubric,
+                    page_indices=page_indices,
+                    page_contexts=page_contexts,
+                    stream_callback=stream_callback,
+                ),
+            )
+            if isinstance(result, dict):
+                result["cascade"] = {"tier": TIER_STRONG, "escalated": [], "fast_failed": True}
+            return result
+
+        positions = (
+            list(page_indices)
+            if page_indices and len(page_indices) == len(images)
+            else list(range(len(images)))
+        )
+        blank = set(result.get("blank_pages") or [])
+        graded_pages = [(p, img) for p, img in zip(positions, images) if p not in blank]
+        self.budget.accrue(self.run_id, len(graded_pages) * self.page_budget_usd)
+
+        details: List[Dict[str, Any]] = list(result.get("question_details") or [])
+        candidates = plan_escalation(details, threshold=self.threshold, max_ratio=self.max_ratio)
+        granted = self.budget.reserve(self.run_id, len(candidates), self.cost_per_question_usd)
+        escalated = candidates[:granted]
+        cascade_info: Dict[str, Any] = {
+            "tier": TIER_FAST,
+            "fast_model": getattr(self.fast_client, "model_name", ""),
+            "strong_model": self.model_name,
+            "escalated": [c.question_id for c in escalated],
+            "reasons": {c.question_id: c.reasons for c in escalated},
+            "budget_denied": [c.question_id for c in candidates[granted:]],
+        }
+        if len(candidates) > granted:
+            logger.info(
+                f"[grading_cascade] budget exhausted run={self.run_id} student={student_key} "
+                f"denied={cascade_info['budget_denied']}"
+            )
+
+        regraded: List[Dict[str, Any]] = []
+        if escalated and graded_pages:
+            try:
+                regraded = await self._timed(
+                    TIER_STRONG,
+                    count_details,
+                    self.strong_client.regrade_questions(
+                        images=[img for _p, img in graded_pages],
+                        student_key=student_key,
+                        parsed_rubric=parsed_rubric,
+                        question_ids=[c.question_id for c in escalated],
+                        page_indices=[p for p, _img in graded_pages],
+                        page_contexts=page_contexts,
+                    ),
+                )
+            except Exception as exc:
+                logger.warning(
+                    f"[grading_cascade] strong tier regrade failed student={student_key}: {exc}"
+                )
+                regraded = []
+
+        by_id = {_question_id(d): d for d in regraded if isinstance(d, dict) and _question_id(d)}
+        agreed = 0
+        merged: List[Dict[str, Any]] = []
+        for detail in details:
+            replacement = by_id.get(_question_id(detail)) if isinstance(detail, dict) else None
+            if replacement is None:
+                merged.append(detail)
+                continue
+            if abs(_safe_float(replacement.get("score")) - _safe_float(detail.get("score"))) < 1e-6:
+                agreed += 1
+            replacement = dict(replacement)
+            replacement["graded_by_tier"] = TIER_STRONG
+            replacement["fast_tier_score"] = detail.get("score")
+            merged.append(replacement)
+
+        self.metrics.record_escalation(
+            candidates, granted=granted, agreed=agreed, regraded=len(by_id)
+        )
+        cascade_info["regraded"] = sorted(by_id)
+        if by_id:
+            result["question_details"] = merged
+            result["total_score"] = sum(_safe_float(d.get("score")) for d in merged)
+            result["max_score"] = sum(
+                _safe_float(d.get("max_score", d.get("maxScore"))) for d in merged
+            ) or result.get("max_score")
+        result["cascade"] = cascade_info
+        return result
+
+
+_cascade_budget: Optional[CascadeRunBudget] = None
+_cascade_metrics: Optional[CascadeMetrics] = None
+
+
+def get_cascade_budget() -> CascadeRunBudget:
+    """获取进程内的运行级升级预算账本"""
+    global _cascade_budget
+    if _cascade_budget is None:
+        _cascade_budget = CascadeRunBudget()
+    return _cascade_budget
+
+
+def get_cascade_metrics() -> CascadeMetrics:
+    """获取进程内的级联分档指标"""
+    global _cascade_metrics
+    if _cascade_metrics is None:
+        _cascade_metrics = CascadeMetrics()
+    return _cascade_metrics
+
+
+def build_grading_cascade(
+    strong_client: Any,
+    *,
+    api_key: Optional[str],
+    run_id: str,
+    threshold: float,
+    max_ratio: float,
+    page_budget_usd: float,
+    cost_per_question_usd: float,
+    rubric_registry: Any = None,
+    exemplar_memory: Any = None,
+) -> Optional[GradingCascade]:
+    """未启用或未配置快速档模型（或与强模型相同）时返回 None，调用方直接用 strong_client"""
+    fast_model = GRADING_FAST_MODEL.strip()
+    if not GRADING_CASCADE_ENABLED or not fast_model:
+        return None
+    if fast_model == getattr(strong_client, "model_name", None):
+        return None
+    from src.services.llm_reasoning import LLMReasoningClient
+
+    fast_client = LLMReasoningClient(
+        api_key=api_key,
+        model_name=fast_model,
+        rubric_registry=rubric_registry,
+        exemplar_memory=exemplar_memory,
+    )
+    return GradingCascade(
+        fast_client,
+        strong_client,
+        run_id=run_id,
+        threshold=threshold,
+        max_ratio=max_ratio,
+        page_budget_usd=page_budget_usd,
+        cost_per_question_usd=cost_per_question_usd,
+    )
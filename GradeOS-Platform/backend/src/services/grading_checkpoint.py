@@ -1,22 +1,129 @@
+"""Best-effort per-student grading checkpoints in Redis.
+
+Writes are coalesced: concurrent grading nodes enqueue their fields and a
+single flush per window sends one pipelined HSET + EXPIRE per batch hash.
+Payloads are encoded with orjson (falling back to json) and compressed with
+zstd above a size threshold; a one-byte header marks the format so values
+written by older versions (plain JSON strings) still decode.
+"""
+
+import asyncio
 import json
 import logging
 import os
-from typing import Any, Optional
+import time
+from dataclasses import dataclass, field as dataclass_field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
 
 from redis.exceptions import RedisError
 
 from src.utils.pool_manager import UnifiedPoolManager, PoolNotInitializedError
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
 logger = logging.getLogger(__name__)
 
 REDIS_CHECKPOINT_KEY_PREFIX = os.getenv("REDIS_CHECKPOINT_KEY_PREFIX", "batch_checkpoint")
 REDIS_CHECKPOINT_TTL_SECONDS = int(os.getenv("REDIS_CHECKPOINT_TTL_SECONDS", "172800"))
+CHECKPOINT_FLUSH_INTERVAL_MS = float(os.getenv("GRADING_CHECKPOINT_FLUSH_MS", "50"))
+CHECKPOINT_MAX_PENDING_FIELDS = int(os.getenv("GRADING_CHECKPOINT_MAX_PENDING", "500"))
+CHECKPOINT_COMPRESS_MIN_BYTES = int(os.getenv("GRADING_CHECKPOINT_COMPRESS_MIN_BYTES", "1024"))
+CHECKPOINT_COMPRESSION = os.getenv("GRADING_CHECKPOINT_COMPRESSION", "zstd").strip().lower()
+CHECKPOINT_RESUME_CACHE_SECONDS = float(os.getenv("GRADING_CHECKPOINT_RESUME_CACHE_SECONDS", "60"))
+
+# Format header bytes. Legacy values are bare JSON and never start with these.
+_FORMAT_JSON = 0x01
+_FORMAT_ZSTD = 0x02
+
+_STUDENT_FIELD_PREFIX = "student:"
+# One field per streamed question (``partial_question.<id>``), written as a delta.
+PARTIAL_QUESTION_FIELD_PREFIX = "partial_question."
+
+_zstd_compressor = None
+_zstd_decompressor = None
 
 
 def _checkpoint_key(batch_id: str) -> str:
     return f"{REDIS_CHECKPOINT_KEY_PREFIX}:{batch_id}"
 
 
+def _student_field(student_key: str, field: str) -> str:
+    return f"{_STUDENT_FIELD_PREFIX}{student_key}:{field}"
+
+
+def _split_student_field(redis_field: str) -> Optional[Tuple[str, str]]:
+    """``student:<key>:<field>`` -> (key, field); student keys may contain ':'."""
+    if not redis_field.startswith(_STUDENT_FIELD_PREFIX):
+        return None
+    student_key, sep, field = redis_field[len(_STUDENT_FIELD_PREFIX):].rpartition(":")
+    if not sep:
+        return None
+    return student_key, field
+
+
+def _dumps(payload: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload, default=str, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def encode_checkpoint(
+    payload: Any,
+    compress_min_bytes: int = CHECKPOINT_COMPRESS_MIN_BYTES,
+) -> bytes:
+    """Serialize a checkpoint payload to the compact binary format."""
+    global _zstd_compressor
+    raw = _dumps(payload)
+    if (
+        zstandard is not None
+        and CHECKPOINT_COMPRESSION == "zstd"
+        and compress_min_bytes >= 0
+        and len(raw) >= compress_min_bytes
+    ):
+        if _zstd_compressor is None:
+            _zstd_compressor = zstandard.ZstdCompressor(level=3)
+        return bytes([_FORMAT_ZSTD]) + _zstd_compressor.compress(raw)
+    return bytes([_FORMAT_JSON]) + raw
+
+
+def decode_checkpoint(raw: Any) -> Any:
+    """Decode a stored checkpoint value (binary format or legacy JSON text)."""
+    global _zstd_decompressor
+    if raw is None:
+        return None
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    if not raw:
+        return None
+    header = raw[0]
+    if header == _FORMAT_JSON:
+        return _loads(raw[1:])
+    if header == _FORMAT_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd-compressed checkpoint but zstandard is not installed")
+        if _zstd_decompressor is None:
+            _zstd_decompressor = zstandard.ZstdDecompressor()
+        return _loads(_zstd_decompressor.decompress(raw[1:]))
+    return _loads(raw)
+
+
 async def _get_redis_client():
     try:
         pool_manager = await UnifiedPoolManager.get_instance()
@@ -30,6 +137,178 @@ async def _get_redis_client():
         return None
 
 
+@dataclass
+class _PendingBatch:
+    fields: Dict[str, bytes] = dataclass_field(default_factory=dict)
+    ttl: int = 0
+
+
+class CheckpointWriter:
+    """Coalesces checkpoint writes into one pipelined round trip per flush window.
+
+    ``save`` enqueues a field and returns; the flush that carries it runs at
+    most ``flush_interval_ms`` later. ``wait=True`` blocks until that flush
+    has been sent. Failures are logged and swallowed; checkpoints are
+    best-effort.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], Awaitable[Any]] = _get_redis_client,
+        flush_interval_ms: float = CHECKPOINT_FLUSH_INTERVAL_MS,
+        max_pending_fields: int = CHECKPOINT_MAX_PENDING_FIELDS,
+        compress_min_bytes: int = CHECKPOINT_COMPRESS_MIN_BYTES,
+    ):
+        self._client_factory = client_factory
+        self.flush_interval = max(0.0, flush_interval_ms) / 1000.0
+        self.max_pending_fields = max(1, max_pending_fields)
+        self.compress_min_bytes = compress_min_bytes
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._pending_count = 0
+        self._flush_waiter: Optional[asyncio.Future] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+        self.stats = {"fields_written": 0, "round_trips": 0, "bytes_written": 0, "errors": 0}
+
+    async def save(
+        self,
+        *,
+        batch_id: str,
+        student_key: str,
+        field: str,
+        payload: Any,
+        ttl_seconds: Optional[int] = None,
+        wait: bool = False,
+    ) -> None:
+        try:
+            encoded = encode_checkpoint(payload, self.compress_min_bytes)
+        except (TypeError, ValueError) as exc:
+            logger.debug(f"Failed to serialize checkpoint payload: {exc}")
+            return
+
+        key = _checkpoint_key(batch_id)
+        pending = self._pending.setdefault(key, _PendingBatch())
+        redis_field = _student_field(student_key, field)
+        if redis_field not in pending.fields:
+            self._pending_count += 1
+        # A later write to the same field supersedes the queued one.
+        pending.fields[redis_field] = encoded
+        pending.ttl = max(pending.ttl, int(ttl_seconds or REDIS_CHECKPOINT_TTL_SECONDS))
+
+        waiter = self._ensure_flush_scheduled()
+        if self._pending_count >= self.max_pending_fields:
+            await self.flush()
+            return
+        if wait:
+            await asyncio.shield(waiter)
+
+    def _ensure_flush_scheduled(self) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        waiter = self._flush_waiter
+        if waiter is None or waiter.done() or waiter.get_loop() is not loop:
+            self._flush_waiter = loop.create_future()
+            self._flush_task = loop.create_task(self._flush_after_window(self._flush_waiter))
+        return self._flush_waiter
+
+    async def _flush_after_window(self, waiter: asyncio.Future) -> None:
+        try:
+            if self.flush_interval > 0:
+                await asyncio.sleep(self.flush_interval)
+            await self.flush()
+        finally:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def flush(self, batch_id: Optional[str] = None) -> int:
+        """Send queued fields (all batches, or one batch) in a single pipeline."""
+        async with self._lock:
+            if batch_id is None:
+                batches, self._pending = self._pending, {}
+                waiter, self._flush_waiter = self._flush_waiter, None
+            else:
+                key = _checkpoint_key(batch_id)
+                batch = self._pending.pop(key, None)
+                batches = {key: batch} if batch else {}
+                waiter = None
+            count = sum(len(batch.fields) for batch in batches.values())
+            self._pending_count = max(0, self._pending_count - count)
+            try:
+                if batches:
+                    await self._write(batches)
+                return count
+            finally:
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(None)
+
+    async def _write(self, batches: Dict[str, _PendingBatch]) -> None:
+        redis_client = await self._client_factory()
+        if not redis_client:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            for key, batch in batches.items():
+                pipe.hset(key, mapping=batch.fields)
+                if batch.ttl > 0:
+                    pipe.expire(key, batch.ttl)
+            await pipe.execute()
+        except RedisError as exc:
+            self.stats["errors"] += 1
+            logger.debug(f"Failed to write checkpoint to Redis: {exc}")
+            return
+        self.stats["round_trips"] += 1
+        for batch in batches.values():
+            self.stats["fields_written"] += len(batch.fields)
+            self.stats["bytes_written"] += sum(len(value) for value in batch.fields.values())
+
+    async def load(self, batch_id: str) -> Dict[str, Dict[str, Any]]:
+        """All checkpoints of a batch as ``{student_key: {field: payload}}``."""
+        await self.flush(batch_id)
+        redis_client = await self._client_factory()
+        if not redis_client:
+            return {}
+        try:
+            raw = await redis_client.hgetall(_checkpoint_key(batch_id))
+        except RedisError as exc:
+            logger.debug(f"Failed to read checkpoints from Redis: {exc}")
+            return {}
+
+        students: Dict[str, Dict[str, Any]] = {}
+        for redis_field, value in (raw or {}).items():
+            if isinstance(redis_field, bytes):
+                redis_field = redis_field.decode("utf-8", errors="replace")
+            parts = _split_student_field(redis_field)
+            if parts is None:
+                continue
+            student_key, field = parts
+            try:
+                students.setdefault(student_key, {})[field] = decode_checkpoint(value)
+            except (ValueError, TypeError) as exc:
+                logger.debug(f"Skipping undecodable checkpoint {redis_field}: {exc}")
+        return students
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+
+
+_checkpoint_writer: Optional[CheckpointWriter] = None
+# batch_id -> (loaded_at, task) so concurrent grading nodes share one HGETALL
+_resume_cache: Dict[str, Tuple[float, "asyncio.Task[Dict[str, Dict[str, Any]]]"]] = {}
+
+
+def get_checkpoint_writer() -> CheckpointWriter:
+    global _checkpoint_writer
+    if _checkpoint_writer is None:
+        _checkpoint_writer = CheckpointWriter()
+    return _checkpoint_writer
+
+
 async def save_student_checkpoint(
     *,
     batch_id: str,
@@ -37,22 +316,100 @@ async def save_student_checkpoint(
     field: str,
     payload: Any,
     ttl_seconds: Optional[int] = None,
+    wait: bool = False,
 ) -> None:
-    """Best-effort Redis checkpointing (no-op if Redis unavailable)."""
-    redis_client = await _get_redis_client()
-    if not redis_client:
-        return
-
-    cache_key = _checkpoint_key(batch_id)
-    ttl = int(ttl_seconds or REDIS_CHECKPOINT_TTL_SECONDS)
-    redis_field = f"student:{student_key}:{field}"
+    """Best-effort Redis checkpointing (no-op if Redis unavailable).
+
+    The write is queued and sent with the next flush; pass ``wait=True`` to
+    return only after it reached Redis.
+    """
+    await get_checkpoint_writer().save(
+        batch_id=batch_id,
+        student_key=student_key,
+        field=field,
+        payload=payload,
+        ttl_seconds=ttl_seconds,
+        wait=wait,
+    )
+
+
+async def load_student_checkpoints(batch_id: str) -> Dict[str, Dict[str, Any]]:
+    """Bulk-load every student's checkpoints for a batch in one round trip."""
+    return await get_checkpoint_writer().load(batch_id)
+
+
+def partial_question_field(question_id: str) -> str:
+    """Checkpoint field of one streamed question (':' separates student fields)."""
+    return f"{PARTIAL_QUESTION_FIELD_PREFIX}{question_id.replace(':', '_')}"
+
+
+async def _load_batch_for_resume(batch_id: str) -> Optional[Dict[str, Dict[str, Any]]]:
+    """The batch's checkpoints, loaded once and shared by all grading nodes
+    of that batch for ``CHECKPOINT_RESUME_CACHE_SECONDS``."""
+    now = time.monotonic()
+    for cached_batch, (loaded_at, _) in list(_resume_cache.items()):
+        if now - loaded_at > CHECKPOINT_RESUME_CACHE_SECONDS:
+            _resume_cache.pop(cached_batch, None)
+    entry = _resume_cache.get(batch_id)
+    if entry is None or entry[1].get_loop() is not asyncio.get_running_loop():
+        entry = (now, asyncio.ensure_future(load_student_checkpoints(batch_id)))
+        _resume_cache[batch_id] = entry
     try:
-        raw = json.dumps(payload, ensure_ascii=False, default=str)
-        await redis_client.hset(cache_key, redis_field, raw)
-        if ttl > 0:
-            await redis_client.expire(cache_key, ttl)
-    except (TypeError, ValueError) as exc:
-        logger.debug(f"Failed to serialize checkpoint payload: {exc}")
-    except RedisError as exc:
-        logger.debug(f"Failed to write checkpoint to Redis: {exc}")
+        return await asyncio.shield(entry[1])
+    except Exception as exc:
+        _resume_cache.pop(batch_id, None)
+        logger.debug(f"Checkpoint resume lookup failed: {exc}")
+        return None
+
+
+async def load_completed_student_result(
+    batch_id: str,
+    student_key: str,
+) -> Optional[Dict[str, Any]]:
+    """Checkpointed page result of a student that finished grading, if any."""
+    students = await _load_batch_for_resume(batch_id)
+    if students is None:
+        return None
+    result = (students.get(student_key) or {}).get("grading_result")
+    if not isinstance(result, dict) or result.get("status") != "completed":
+        return None
+    page_result = result.get("page_result")
+    return page_result if isinstance(page_result, dict) else None
+
+
+async def load_partial_question_details(
+    batch_id: str,
+    student_key: str,
+    page_indices: Sequence[int],
+) -> List[Dict[str, Any]]:
+    """Questions a student had finished streaming before grading was interrupted.
+
+    Only deltas recorded for the same pages are returned; a re-segmented
+    student starts over.
+    """
+    students = await _load_batch_for_resume(batch_id)
+    if students is None:
+        return []
+    details = []
+    for field, payload in (students.get(student_key) or {}).items():
+        if not field.startswith(PARTIAL_QUESTION_FIELD_PREFIX) or not isinstance(payload, dict):
+            continue
+        if list(payload.get("page_indices") or []) != list(page_indices):
+            continue
+        detail = payload.get("detail")
+        if isinstance(detail, dict):
+            details.append(detail)
+    return details
+
+
+def clear_resume_cache(batch_id: Optional[str] = None) -> None:
+    if batch_id is None:
+        _resume_cache.clear()
+    else:
+        _resume_cache.pop(batch_id, None)
+
 
+async def shutdown_checkpoint_writer() -> None:
+    """Flush queued checkpoints (called on application shutdown)."""
+    if _checkpoint_writer is not None:
+        await _checkpoint_writer.close()
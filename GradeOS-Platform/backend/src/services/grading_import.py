@@ -0,0 +1,764 @@
+"""
+批改结果导入班级的后台任务
+
+原导入接口在一次 HTTP 请求内把全部学生结果载入内存、逐条写库。这里改为异步任务：
+- 任务记录在 grading_import_jobs 表，idempotency_key 唯一；相同键的重试返回已有任务，
+  不会重复导入（失败的任务会被重新执行）；未显式提供幂等键时按请求内容生成，
+  只对进行中的任务去重，已完成的任务再次提交会重新导入（撤销或重新批改后需要）；
+- 结果来自编排器内存状态，或通过服务端游标从 student_grading_results 分块读取；
+  内存结果不落库，进程重启后这类任务标记为失败并提示重新提交；
+- 每个班级在一个事务内按块 executemany 写入 student_grading_results
+  （以及指定作业时的 homework_submissions），任务进度在同一事务内更新；
+- 执行者持有租约，进程中断后由启动恢复或其他实例在租约过期后接手，已完成的班级不重做。
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import (
+    Any,
+    AsyncContextManager,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from src.db.postgres_grading import (
+    GradingHistory,
+    StudentGradingResult,
+    get_grading_history,
+    iter_student_result_chunks,
+    replace_student_results,
+    save_grading_history,
+    upsert_homework_submission_grades,
+)
+from src.utils.database import db
+
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_ROWS = int(os.getenv("GRADING_IMPORT_CHUNK_ROWS", "500"))
+IMPORT_WORKERS = int(os.getenv("GRADING_IMPORT_WORKERS", "2"))
+IMPORT_LEASE_SECONDS = int(os.getenv("GRADING_IMPORT_LEASE_SECONDS", "300"))
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+RESULTS_FROM_MEMORY = "memory"
+RESULTS_FROM_DATABASE = "database"
+_MEMORY_RESULTS_LOST = "批改结果仅保存在已中断进程的内存中，请重新提交导入"
+
+_JOB_COLUMNS = (
+    "id, idempotency_key, batch_id, history_id, request, status, classes_done, "
+    "imported_count, total_students, average_score, attempts, error, "
+    "created_at, updated_at, finished_at"
+)
+
+
+class ImportLeaseLost(RuntimeError):
+    """任务租约已被其他执行者接手"""
+
+
+@dataclass
+class GradingImportJob:
+    """
+    一次导入任务
+
+    request 含 class_ids / student_mapping / homework_id / teacher_id，
+    以及结果来源 results_source（memory / database）。
+    """
+
+    job_id: str
+    idempotency_key: str
+    batch_id: str
+    history_id: str
+    request: Dict[str, Any]
+    status: str = "queued"  # queued, running, completed, failed
+    classes_done: List[str] = field(default_factory=list)
+    imported_count: int = 0
+    total_students: int = 0
+    average_score: Optional[float] = None
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    finished_at: Optional[str] = None
+
+    @property
+    def class_ids(self) -> List[str]:
+        return list(self.request.get("class_ids") or [])
+
+    @property
+    def percentage(self) -> float:
+        if self.status == "completed":
+            return 100.0
+        total = len(self.class_ids)
+        return round(100.0 * len(self.classes_done) / total, 1) if total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["percentage"] = self.percentage
+        return data
+
+
+def derive_idempotency_key(batch_id: str, request: Dict[str, Any]) -> str:
+    """未显式提供幂等键时，按批次与请求内容生成"""
+    canonical = {
+        "batch_id": batch_id,
+        "class_ids": sorted(request.get("class_ids") or []),
+        "student_mapping": sorted(
+            json.dumps(item, sort_keys=True) for item in request.get("student_mapping") or []
+        ),
+        "homework_id": request.get("homework_id"),
+    }
+    digest = hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8"))
+    return f"auto:{digest.hexdigest()}"
+
+
+def class_scopes(request: Dict[str, Any]) -> Dict[str, Optional[List[str]]]:
+    """
+    每个班级要导入的 student_key；None 表示全部结果
+
+    映射中带 class_id 时各班级只导入映射到本班（或未指定班级）的学生；
+    否则所有结果写入每个班级，与原接口行为一致。
+    """
+    mapping = request.get("student_mapping") or []
+    class_ids = request.get("class_ids") or []
+    if not any(item.get("class_id") for item in mapping):
+        return {class_id: None for class_id in class_ids}
+    scopes: Dict[str, Optional[List[str]]] = {}
+    for class_id in class_ids:
+        scopes[class_id] = [
+            item["student_key"]
+            for item in mapping
+            if item.get("class_id") in (None, "", class_id)
+        ]
+    return scopes
+
+
+def _number(result: Dict[str, Any], *keys: str) -> Optional[float]:
+    for key in keys:
+        value = result.get(key)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def _from_memory_result(result: Dict[str, Any]) -> StudentGradingResult:
+    return StudentGradingResult(
+        id="",
+        grading_history_id="",
+        student_key=result.get("studentName") or result.get("studentKey") or "",
+        score=_number(result, "totalScore", "score"),
+        max_score=_number(result, "maxTotalScore", "maxScore"),
+        result_data=result,
+    )
+
+
+def _summary_text(result: Dict[str, Any]) -> Optional[str]:
+    summary = result.get("summary") or result.get("studentSummary")
+    return summary.get("overall") if isinstance(summary, dict) else None
+
+
+def _confession_text(result: Dict[str, Any]) -> Optional[str]:
+    confession = result.get("confession")
+    return confession.get("summary") if isinstance(confession, dict) else None
+
+
+def _json_value(value: Any, default: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        value = value.decode("utf-8")
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except Exception:
+            return default
+    return default if value is None else value
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _job_from_row(row: Dict[str, Any]) -> GradingImportJob:
+    average = row.get("average_score")
+    return GradingImportJob(
+        job_id=str(row["id"]),
+        idempotency_key=row["idempotency_key"],
+        batch_id=row["batch_id"],
+        history_id=str(row["history_id"]),
+        request=_json_value(row.get("request"), {}),
+        status=row["status"],
+        classes_done=list(_json_value(row.get("classes_done"), [])),
+        imported_count=int(row.get("imported_count") or 0),
+        total_students=int(row.get("total_students") or 0),
+        average_score=float(average) if average is not None else None,
+        attempts=int(row.get("attempts") or 0),
+        error=row.get("error"),
+        created_at=_text(row.get("created_at")),
+        updated_at=_text(row.get("updated_at")),
+        finished_at=_text(row.get("finished_at")),
+    )
+
+
+async def ensure_import_jobs_table(conn: Any) -> None:
+    await conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS grading_import_jobs (
+            id VARCHAR(64) PRIMARY KEY,
+            idempotency_key VARCHAR(200) NOT NULL UNIQUE,
+            batch_id VARCHAR(64) NOT NULL,
+            history_id VARCHAR(64) NOT NULL,
+            request JSONB NOT NULL,
+            status VARCHAR(32) NOT NULL DEFAULT 'queued',
+            classes_done JSONB NOT NULL DEFAULT '[]',
+            imported_count INTEGER NOT NULL DEFAULT 0,
+            total_students INTEGER NOT NULL DEFAULT 0,
+            average_score DOUBLE PRECISION,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner VARCHAR(64),
+            lease_until TIMESTAMPTZ,
+            error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            finished_at TIMESTAMPTZ
+        )
+        """
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_grading_import_jobs_status "
+        "ON grading_import_jobs(status, lease_until)"
+    )
+
+
+class GradingImportService:
+    """
+    导入任务的提交、执行与恢复
+
+    connection 返回数据库连接的异步上下文管理器（默认 db.connection）；
+    load_history / save_history 默认为 postgres_grading 中的同名函数。
+    """
+
+    def __init__(
+        self,
+        connection: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+        *,
+        chunk_rows: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        lease_seconds: Optional[int] = None,
+        load_history: Callable[[str], Awaitable[Optional[GradingHistory]]] = get_grading_history,
+        save_history: Callable[[GradingHistory], Awaitable[None]] = save_grading_history,
+    ):
+        self._connection = connection or db.connection
+        self.chunk_rows = max(1, chunk_rows or IMPORT_CHUNK_ROWS)
+        self.lease_seconds = max(1, lease_seconds or IMPORT_LEASE_SECONDS)
+        self._load_history = load_history
+        self._save_history = save_history
+        self._semaphore = asyncio.Semaphore(max(1, max_workers or IMPORT_WORKERS))
+        self._owner = uuid.uuid4().hex
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._memory_results: Dict[str, List[Dict[str, Any]]] = {}
+        self._table_ready = False
+
+    async def _ensure_table(self, conn: Any) -> None:
+        if self._table_ready:
+            return
+        await ensure_import_jobs_table(conn)
+        await conn.commit()
+        self._table_ready = True
+
+    # ---------------------------------------------------------------- 提交与查询
+
+    async def submit(
+        self,
+        batch_id: str,
+        history_id: str,
+        request: Dict[str, Any],
+        *,
+        idempotency_key: Optional[str] = None,
+        results: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[GradingImportJob, bool]:
+        """
+        提交导入任务，返回 (任务, 是否本次开始执行)
+
+        相同幂等键的任务已存在时直接返回该任务；失败的任务会被重新执行。
+        未提供 idempotency_key 时，已完成的任务也会清空进度后重新执行；
+        显式幂等键对已完成的任务永久去重。
+        results 为编排器内存中的学生结果；为 None 时从数据库读取。
+        """
+        key = idempotency_key or derive_idempotency_key(batch_id, request)
+        rerun_completed = idempotency_key is None
+        source = RESULTS_FROM_MEMORY if results is not None else RESULTS_FROM_DATABASE
+        stored_request = dict(request, results_source=source)
+        async with self._connection() as conn:
+            await self._ensure_table(conn)
+            cursor = await conn.execute(
+                f"""
+                INSERT INTO grading_import_jobs (id, idempotency_key, batch_id, history_id, request)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (idempotency_key) DO NOTHING
+                RETURNING {_JOB_COLUMNS}
+                """,
+                (
+                    uuid.uuid4().hex,
+                    key,
+                    batch_id,
+                    history_id,
+                    json.dumps(stored_request, ensure_ascii=False),
+                ),
+            )
+            row = await cursor.fetchone()
+            started = row is not None
+            if row is None:
+                # 重新执行失败（或自动键下已完成）的任务时，结果来源以本次提交为准；
+                # 已完成的任务从头导入，失败的任务保留已完成的班级
+                cursor = await conn.execute(
+                    f"""
+                    UPDATE grading_import_jobs
+                    SET status = 'queued', error = NULL, updated_at = NOW(),
+                        request = jsonb_set(request, '{{results_source}}', to_jsonb(%s::text)),
+                        classes_done = CASE WHEN status = 'completed'
+                            THEN '[]'::jsonb ELSE classes_done END,
+                        imported_count = CASE WHEN status = 'completed'
+                            THEN 0 ELSE imported_count END,
+                        finished_at = NULL
+                    WHERE idempotency_key = %s
+                      AND (status = 'failed' OR (status = 'completed' AND %s))
+                    RETURNING {_JOB_COLUMNS}
+                    """,
+                    (source, key, rerun_completed),
+                )
+                row = await cursor.fetchone()
+                started = row is not None
+            if row is None:
+                cursor = await conn.execute(
+                    f"SELECT {_JOB_COLUMNS} FROM grading_import_jobs WHERE idempotency_key = %s",
+                    (key,),
+                )
+                row = await cursor.fetchone()
+            await conn.commit()
+
+        job = _job_from_row(row)
+        if started:
+            if results is not None:
+                self._memory_results[job.job_id] = results
+            self.start(job.job_id)
+            logger.info(
+                "[GradingImport] job %s queued: batch=%s classes=%s",
+                job.job_id,
+                batch_id,
+                job.class_ids,
+            )
+        else:
+            logger.info("[GradingImport] duplicate submit for key %s -> job %s", key, job.job_id)
+        return job, started
+
+    async def get_job(self, job_id: str) -> Optional[GradingImportJob]:
+        async with self._connection() as conn:
+            await self._ensure_table(conn)
+            cursor = await conn.execute(
+                f"SELECT {_JOB_COLUMNS} FROM grading_import_jobs WHERE id = %s", (job_id,)
+            )
+            row = await cursor.fetchone()
+        return _job_from_row(row) if row else None
+
+    async def has_stored_results(self, history_id: str) -> bool:
+        async with self._connection() as conn:
+            cursor = await conn.execute(
+                "SELECT 1 AS found FROM student_grading_results "
+                "WHERE grading_history_id::text = %s LIMIT 1",
+                (str(history_id),),
+            )
+            return await cursor.fetchone() is not None
+
+    # ---------------------------------------------------------------- 调度
+
+    def start(self, job_id: str) -> None:
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            return
+        task = asyncio.create_task(self._run_bounded(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _t, jid=job_id: self._forget(jid, _t))
+
+    def _forget(self, job_id: str, task: asyncio.Task) -> None:
+        if self._tasks.get(job_id) is task:
+            self._tasks.pop(job_id, None)
+
+    async def _run_bounded(self, job_id: str) -> None:
+        async with self._semaphore:
+            try:
+                await self.run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("[GradingImport] job %s crashed: %s", job_id, exc)
+
+    async def resume(self) -> int:
+        """
+        接手排队中或租约已过期的任务，返回接手数量
+
+        结果只在其他（或已重启）进程内存中的任务无法继续，领取前直接标记为失败。
+        """
+        async with self._connection() as conn:
+            await self._ensure_table(conn)
+            cursor = await conn.execute(
+                """
+                SELECT id, request->>'results_source' AS results_source
+                FROM grading_import_jobs
+                WHERE status = 'queued'
+                   OR (status = 'running' AND (lease_until IS NULL OR lease_until < NOW()))
+                ORDER BY created_at
+                """
+            )
+            rows = await cursor.fetchall()
+        resumed = 0
+        for row in rows:
+            job_id = str(row["id"])
+            if row["results_source"] == RESULTS_FROM_MEMORY and job_id not in self._memory_results:
+                await self._fail_unclaimed(job_id, _MEMORY_RESULTS_LOST)
+                continue
+            self.start(job_id)
+            resumed += 1
+        if resumed:
+            logger.info("[GradingImport] resumed %d import jobs", resumed)
+        return resumed
+
+    async def _fail_unclaimed(self, job_id: str, error: str) -> None:
+        """把无人持有的任务标记为失败（其他执行者已领取时不做修改）"""
+        async with self._connection() as conn:
+            cursor = await conn.execute(
+                """
+                UPDATE grading_import_jobs
+                SET status = 'failed', error = %s, lease_owner = NULL, lease_until = NULL,
+                    updated_at = NOW(), finished_at = NOW()
+                WHERE id = %s
+                  AND (status = 'queued'
+                       OR (status = 'running' AND (lease_until IS NULL OR lease_until < NOW())))
+                """,
+                (error, job_id),
+            )
+            await conn.commit()
+        if int(getattr(cursor, "rowcount", 0) or 0):
+            logger.warning("[GradingImport] job %s cannot resume: %s", job_id, error)
+
+    async def join(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+    async def shutdown(self) -> None:
+        """取消本进程的任务并释放租约，下次启动时由 resume 继续"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._memory_results.clear()
+        try:
+            async with self._connection() as conn:
+                await conn.execute(
+                    """
+                    UPDATE grading_import_jobs
+                    SET status = 'queued', lease_owner = NULL, lease_until = NULL,
+                        updated_at = NOW()
+                    WHERE lease_owner = %s AND status = 'running'
+                    """,
+                    (self._owner,),
+                )
+                await conn.commit()
+        except Exception as exc:
+            logger.warning("[GradingImport] failed to release leases: %s", exc)
+
+    # ---------------------------------------------------------------- 执行
+
+    async def _claim(self, job_id: str) -> Optional[GradingImportJob]:
+        async with self._connection() as conn:
+            cursor = await conn.execute(
+                f"""
+                UPDATE grading_import_jobs
+                SET status = 'running', lease_owner = %s,
+                    lease_until = NOW() + %s * INTERVAL '1 second',
+                    attempts = attempts + 1, updated_at = NOW()
+                WHERE id = %s
+                  AND (status = 'queued'
+                       OR (status = 'running' AND (lease_until IS NULL OR lease_until < NOW())))
+                RETURNING {_JOB_COLUMNS}
+                """,
+                (self._owner, self.lease_seconds, job_id),
+            )
+            row = await cursor.fetchone()
+            await conn.commit()
+        return _job_from_row(row) if row else None
+
+    async def _save_progress(self, conn: Any, job: GradingImportJob) -> None:
+        """更新进度并续租（不提交）；租约丢失时抛出 ImportLeaseLost"""
+        finished = job.status in TERMINAL_STATUSES
+        cursor = await conn.execute(
+            """
+            UPDATE grading_import_jobs
+            SET status = %s,
+                history_id = %s,
+                classes_done = %s,
+                imported_count = %s,
+                total_students = %s,
+                average_score = %s,
+                error = %s,
+                lease_owner = CASE WHEN %s THEN NULL ELSE lease_owner END,
+                lease_until = CASE WHEN %s THEN NULL ELSE NOW() + %s * INTERVAL '1 second' END,
+                updated_at = NOW(),
+                finished_at = CASE WHEN %s THEN NOW() ELSE NULL END
+            WHERE id = %s AND lease_owner = %s
+            """,
+            (
+                job.status,
+                job.history_id,
+                json.dumps(job.classes_done),
+                job.imported_count,
+                job.total_students,
+                job.average_score,
+                job.error,
+                finished,
+                finished,
+                self.lease_seconds,
+                finished,
+                job.job_id,
+                self._owner,
+            ),
+        )
+        if int(getattr(cursor, "rowcount", 0) or 0) == 0:
+            raise ImportLeaseLost(f"import job {job.job_id} lease lost")
+
+    async def run(self, job_id: str) -> Optional[GradingImportJob]:
+        """执行（或继续执行）任务；任务不可领取时返回 None"""
+        job = await self._claim(job_id)
+        if job is None:
+            self._memory_results.pop(job_id, None)
+            return None
+        results = self._memory_results.get(job_id)
+        try:
+            if results is None and job.request.get("results_source") == RESULTS_FROM_MEMORY:
+                raise ValueError(_MEMORY_RESULTS_LOST)
+            await self._prepare(job, results)
+            for class_id in job.class_ids:
+                if class_id in job.classes_done:
+                    continue
+                await self._import_class(job, class_id, results)
+            job.status = "completed"
+            async with self._connection() as conn:
+                await self._save_progress(conn, job)
+                await conn.commit()
+            logger.info(
+                "[GradingImport] job %s completed: %d rows into %d classes",
+                job.job_id,
+                job.imported_count,
+                len(job.class_ids),
+            )
+        except ImportLeaseLost:
+            logger.warning("[GradingImport] job %s taken over by another worker", job.job_id)
+        except Exception as exc:
+            job.status = "failed"
+            job.error = str(exc)
+            logger.error("[GradingImport] job %s failed: %s", job.job_id, exc)
+            try:
+                async with self._connection() as conn:
+                    await self._save_progress(conn, job)
+                    await conn.commit()
+            except Exception as save_exc:
+                logger.warning("[GradingImport] failed to record job failure: %s", save_exc)
+        finally:
+            self._memory_results.pop(job_id, None)
+        return job
+
+    async def _prepare(
+        self, job: GradingImportJob, results: Optional[List[Dict[str, Any]]]
+    ) -> None:
+        """统计人数与平均分，并写入批改历史（外键需先于学生结果存在）"""
+        if results is not None:
+            count = len(results)
+            total = sum(_from_memory_result(result).score or 0.0 for result in results)
+            average = total / count if count else 0.0
+        else:
+            async with self._connection() as conn:
+                cursor = await conn.execute(
+                    """
+                    SELECT COUNT(*) AS total, AVG(COALESCE(score, 0)) AS average
+                    FROM (
+                        SELECT DISTINCT ON (student_key) score
+                        FROM student_grading_results
+                        WHERE grading_history_id::text = %s
+                        ORDER BY student_key, class_id NULLS FIRST
+                    ) AS latest
+                    """,
+                    (job.history_id,),
+                )
+                row = await cursor.fetchone()
+            count = int(row["total"] or 0)
+            average = float(row["average"] or 0.0)
+        if count == 0:
+            raise ValueError("未找到批改结果")
+        job.total_students = count
+        job.average_score = average
+
+        now = datetime.now().isoformat()
+        existing = await self._load_history(job.batch_id)
+        if existing is not None:
+            job.history_id = existing.id
+            class_ids = list(dict.fromkeys((existing.class_ids or []) + job.class_ids))
+            history = GradingHistory(
+                id=existing.id,
+                batch_id=existing.batch_id,
+                teacher_id=existing.teacher_id or job.request.get("teacher_id"),
+                status="imported",
+                class_ids=class_ids,
+                created_at=existing.created_at or now,
+                completed_at=existing.completed_at or now,
+                total_students=count,
+                average_score=average,
+                result_data=existing.result_data,
+                rubric_data=existing.rubric_data,
+                current_stage=existing.current_stage,
+            )
+        else:
+            history = GradingHistory(
+                id=job.history_id,
+                batch_id=job.batch_id,
+                teacher_id=job.request.get("teacher_id"),
+                status="imported",
+                class_ids=job.class_ids,
+                created_at=now,
+                completed_at=now,
+                total_students=count,
+                average_score=average,
+            )
+        await self._save_history(history)
+
+    async def _result_chunks(
+        self,
+        conn: Any,
+        job: GradingImportJob,
+        student_keys: Optional[List[str]],
+        results: Optional[List[Dict[str, Any]]],
+    ) -> AsyncIterator[List[StudentGradingResult]]:
+        if results is None:
+            async for chunk in iter_student_result_chunks(
+                conn, job.history_id, student_keys=student_keys, chunk_rows=self.chunk_rows
+            ):
+                yield chunk
+            return
+        wanted: Optional[Set[str]] = set(student_keys) if student_keys is not None else None
+        chunk: List[StudentGradingResult] = []
+        for result in results:
+            source = _from_memory_result(result)
+            if wanted is not None and source.student_key not in wanted:
+                continue
+            chunk.append(source)
+            if len(chunk) >= self.chunk_rows:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    async def _import_class(
+        self,
+        job: GradingImportJob,
+        class_id: str,
+        results: Optional[List[Dict[str, Any]]],
+    ) -> int:
+        """单个班级在一个事务内完成写入与进度更新"""
+        key_to_id = {
+            item["student_key"]: item.get("student_id")
+            for item in job.request.get("student_mapping") or []
+            if item.get("class_id") in (None, "", class_id)
+        }
+        homework_id = job.request.get("homework_id")
+        student_keys = class_scopes(job.request).get(class_id)
+        now = datetime.now().isoformat()
+        written = 0
+
+        async with self._connection() as conn:
+            try:
+                async for chunk in self._result_chunks(conn, job, student_keys, results):
+                    rows = []
+                    for source in chunk:
+                        data = source.result_data or {}
+                        rows.append(
+                            StudentGradingResult(
+                                id=str(
+                                    uuid.uuid5(
+                                        uuid.NAMESPACE_URL,
+                                        f"{job.history_id}:{class_id}:{source.student_key}",
+                                    )
+                                ),
+                                grading_history_id=job.history_id,
+                                student_key=source.student_key,
+                                class_id=class_id,
+                                student_id=key_to_id.get(source.student_key),
+                                score=source.score,
+                                max_score=source.max_score,
+                                summary=_summary_text(data),
+                                confession=_confession_text(data),
+                                result_data=data,
+                                imported_at=now,
+                            )
+                        )
+                    await replace_student_results(conn, job.history_id, rows)
+                    if homework_id:
+                        await upsert_homework_submission_grades(
+                            conn,
+                            class_id,
+                            homework_id,
+                            [
+                                (row.student_id, row.student_key, row.score, row.summary)
+                                for row in rows
+                            ],
+                            grading_batch_id=job.batch_id,
+                        )
+                    written += len(rows)
+                job.classes_done.append(class_id)
+                job.imported_count += written
+                await self._save_progress(conn, job)
+                await conn.commit()
+            except BaseException:
+                if class_id in job.classes_done:
+                    job.classes_done.remove(class_id)
+                    job.imported_count -= written
+                await conn.rollback()
+                raise
+        logger.debug("[GradingImport] job %s class %s: %d rows", job.job_id, class_id, written)
+        return written
+
+
+_import_service: Optional[GradingImportService] = None
+
+
+def get_grading_import_service() -> GradingImportService:
+    global _import_service
+    if _import_service is None:
+        _import_service = GradingImportService()
+    return _import_service
+
+
+async def resume_grading_import_jobs() -> int:
+    return await get_grading_import_service().resume()
+
+
+async def shutdown_grading_import_service() -> None:
+    global _import_service
+    if _import_service is not None:
+        await _import_service.shutdown()
+        _import_service = None
@@ -6,18 +6,145 @@
 
 import asyncio
 import logging
+import os
+import time
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
-from uuid import UUID
+from pathlib import Path
+from uuid import NAMESPACE_URL, UUID, uuid5
 from collections import deque
 
+from psycopg.types.json import Json
+
 from src.models.grading_log import GradingLog, GradingLogCreate, GradingLogOverride
+from src.services.canary_metrics import CanaryMetricsAggregator, get_canary_metrics
 from src.utils.database import db
 
 
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_BATCH_SIZE = int(os.getenv("GRADING_LOG_BATCH_SIZE", "200"))
+DEFAULT_FLUSH_INTERVAL_MS = int(os.getenv("GRADING_LOG_FLUSH_INTERVAL_MS", "200"))
+DEFAULT_MAX_QUEUE_SIZE = int(os.getenv("GRADING_LOG_MAX_QUEUE_SIZE", "10000"))
+DEFAULT_SPILL_PATH = os.getenv("GRADING_LOG_SPILL_PATH", "data/grading_log_spill.jsonl")
+# 数据库不可用时，重放溢写文件的最小间隔
+DEFAULT_SPILL_RETRY_SECONDS = float(os.getenv("GRADING_LOG_SPILL_RETRY_SECONDS", "5"))
+
+# 幂等写入：log_id 由客户端生成，重放时重复的记录直接忽略
+INSERT_LOG_SQL = """
+    INSERT INTO grading_logs (
+        log_id, submission_id, question_id,
+        extracted_answer, extraction_confidence, evidence_snippets,
+        normalized_answer, normalization_rules_applied,
+        match_result, match_failure_reason,
+        score, max_score, confidence, reasoning_trace,
+        was_overridden, patch_version, created_at
+    ) VALUES (
+        %s, %s, %s,
+        %s, %s, %s,
+        %s, %s,
+        %s, %s,
+        %s, %s, %s, %s,
+        %s, %s, %s
+    )
+    ON CONFLICT (log_id) DO NOTHING
+"""
+
+
+def _log_row(log: GradingLog) -> tuple:
+    return (
+        log.log_id,
+        log.submission_id,
+        log.question_id,
+        log.extracted_answer,
+        log.extraction_confidence,
+        Json(log.evidence_snippets),
+        log.normalized_answer,
+        Json(log.normalization_rules_applied),
+        log.match_result,
+        log.match_failure_reason,
+        log.score,
+        log.max_score,
+        log.confidence,
+        Json(log.reasoning_trace),
+        log.was_overridden,
+        log.patch_version,
+        log.created_at,
+    )
+
+
+
+def _as_uuid(value: Any, namespace: str) -> str:
+    """将业务标识规整为 UUID 文本（grading_logs 的 ID 列为 UUID 类型）
+
+    已是合法 UUID 的原样返回，否则按命名空间确定性派生，保证重复调用结果一致。
+    """
+    text = str(value)
+    try:
+        return str(UUID(text))
+    except ValueError:
+        return str(uuid5(NAMESPACE_URL, f"{namespace}:{text}"))
+
+
+def grading_submission_id(history_id: str, student_key: str) -> str:
+    """批改历史内某个学生的提交 ID（确定性生成，导出与复核两侧一致）"""
+    return _as_uuid(f"{history_id}:{student_key}", "grading-submission")
+
+
+def grading_log_id(submission_id: str, question_id: str) -> str:
+    """单题批改日志 ID（确定性生成，改判时据此定位原日志，重放时幂等）"""
+    return str(uuid5(NAMESPACE_URL, f"grading-log:{submission_id}:{question_id}"))
+
+
+def build_question_logs(
+    history_id: str,
+    student_key: str,
+    question_details: List[Dict[str, Any]],
+    patch_version: Optional[str] = None,
+) -> List[GradingLog]:
+    """由学生的逐题批改结果构造批改日志
+
+    Args:
+        history_id: 批改历史 ID
+        student_key: 学生标识
+        question_details: 逐题结果（question_id / score / max_score / confidence ...）
+        patch_version: 生效的规则补丁版本
+
+    Returns:
+        日志列表（缺少题号或分值非法的题目跳过）
+    """
+    submission_id = grading_submission_id(history_id, student_key)
+    logs: List[GradingLog] = []
+    for detail in question_details:
+        if not isinstance(detail, dict):
+            continue
+        question_id = detail.get("question_id") or detail.get("questionId")
+        if not question_id:
+            continue
+        feedback = detail.get("feedback")
+        confidence = detail.get("confidence")
+        try:
+            logs.append(
+                GradingLog(
+                    log_id=grading_log_id(submission_id, str(question_id)),
+                    submission_id=submission_id,
+                    question_id=str(question_id),
+                    extracted_answer=detail.get("student_answer"),
+                    score=detail.get("score"),
+                    max_score=detail.get("max_score") or detail.get("maxScore"),
+                    confidence=(
+                        min(1.0, max(0.0, float(confidence))) if confidence is not None else None
+                    ),
+                    reasoning_trace=[str(feedback)] if feedback else [],
+                    patch_version=patch_version,
+                )
+            )
+        except (TypeError, ValueError) as e:
+            logger.debug(f"跳过无效的批改日志: question_id={question_id}, {e}")
+    return logs
+
+
 class GradingLogger:
     """批改日志服务
 
@@ -27,17 +154,92 @@ class GradingLogger:
     3. 查询改判样本（get_override_samples）
     4. 日志写入容错（flush_pending）
 
+    写入路径：log_grading 只入队，后台刷新任务每 flush_interval_ms 或攒够
+    batch_size 条时批量写入。数据库不可用时整批追加到溢写文件（JSONL），
+    启动或恢复后重放；未配置溢写文件时退回内存暂存队列。
+
     验证：需求 8.1, 8.2, 8.3, 8.4, 8.5
     """
 
-    def __init__(self, max_pending_size: int = 1000):
+    def __init__(
+        self,
+        max_pending_size: int = 1000,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        spill_path: Optional[str] = None,
+        spill_retry_seconds: float = DEFAULT_SPILL_RETRY_SECONDS,
+        metrics: Optional[CanaryMetricsAggregator] = None,
+    ):
         """初始化批改日志服务
 
         Args:
-            max_pending_size: 暂存队列最大容量
+            max_pending_size: 内存暂存队列最大容量（无溢写文件时使用）
+            batch_size: 单次批量写入的最大条数
+            flush_interval_ms: 后台刷新间隔（毫秒）
+            max_queue_size: 写入队列上限，达到后调用方同步刷新（背压）
+            spill_path: 溢写文件路径，None 表示不落盘
+            spill_retry_seconds: 写入失败后重放溢写数据的最小间隔
+            metrics: 灰度指标聚合器，默认使用全局单例
         """
         self._pending_logs: deque = deque(maxlen=max_pending_size)
+        self._buffer: deque = deque()
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_seconds = max(1, flush_interval_ms) / 1000
+        self.max_queue_size = max(self.batch_size, max_queue_size)
+        self.spill_path = Path(spill_path) if spill_path else None
+        self.spill_retry_seconds = spill_retry_seconds
+        self._metrics = metrics
+
         self._flush_lock = asyncio.Lock()
+        self._flush_event = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._running = False
+        self._spilled_count = 0
+        self._last_failure = 0.0
+        self._stats = {
+            "logs_enqueued": 0,
+            "logs_written": 0,
+            "batches_written": 0,
+            "write_failures": 0,
+            "logs_spilled": 0,
+            "logs_replayed": 0,
+        }
+
+    @property
+    def metrics(self) -> CanaryMetricsAggregator:
+        return self._metrics or get_canary_metrics()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return dict(
+            self._stats, buffered_logs=len(self._buffer), pending_logs=self.get_pending_count()
+        )
+
+    async def start(self) -> None:
+        """启动后台刷新任务（首先重放上次遗留的溢写数据）"""
+        if self._running:
+            return
+        self._running = True
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info("批改日志后台写入已启动")
+
+    async def stop(self) -> None:
+        """停止后台刷新任务并写出剩余日志（失败时落盘）
+
+        不取消刷新任务：取消可能打断正在写入的批次，这里通知循环退出并等待
+        当前批次写完。
+        """
+        self._running = False
+        if self._flush_task is not None:
+            self._flush_event.set()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self._flush_buffer()
+        logger.info("批改日志后台写入已停止")
 
     async def log_grading(self, log: GradingLog) -> str:
         """记录批改日志
@@ -48,82 +250,201 @@ class GradingLogger:
         - 匹配阶段：match_result, match_failure_reason
         - 评分阶段：score, max_score, confidence, reasoning_trace
 
+        日志入队后立即返回，由后台任务批量写入。队列满时由调用方同步刷新。
+
         验证：需求 8.1, 8.2, 8.3
 
         Args:
             log: 批改日志对象
 
         Returns:
-            log_id: 日志唯一标识
-
-        Raises:
-            Exception: 数据库写入失败时，日志会被暂存到本地队列
+            log_id: 日志唯一标识（客户端生成）
         """
-        try:
-            async with db.transaction() as conn:
-                # 插入日志记录
-                result = await conn.execute(
-                    """
-                    INSERT INTO grading_logs (
-                        log_id, submission_id, question_id,
-                        extracted_answer, extraction_confidence, evidence_snippets,
-                        normalized_answer, normalization_rules_applied,
-                        match_result, match_failure_reason,
-                        score, max_score, confidence, reasoning_trace,
-                        was_overridden, created_at
-                    ) VALUES (
-                        %(log_id)s, %(submission_id)s, %(question_id)s,
-                        %(extracted_answer)s, %(extraction_confidence)s, %(evidence_snippets)s,
-                        %(normalized_answer)s, %(normalization_rules_applied)s,
-                        %(match_result)s, %(match_failure_reason)s,
-                        %(score)s, %(max_score)s, %(confidence)s, %(reasoning_trace)s,
-                        %(was_overridden)s, %(created_at)s
+        self._buffer.append(log)
+        self._stats["logs_enqueued"] += 1
+        if not self._running:
+            await self.start()
+        if len(self._buffer) >= self.max_queue_size:
+            await self._flush_buffer()
+        elif len(self._buffer) >= self.batch_size:
+            self._flush_event.set()
+        return log.log_id
+
+    async def _flush_loop(self) -> None:
+        """后台刷新循环：按间隔或攒够 batch_size 时批量写出"""
+        await self._replay_pending()
+        while self._running:
+            try:
+                try:
+                    await asyncio.wait_for(
+                        self._flush_event.wait(), timeout=self.flush_interval_seconds
                     )
-                    RETURNING log_id
-                    """,
-                    {
-                        "log_id": log.log_id,
-                        "submission_id": log.submission_id,
-                        "question_id": log.question_id,
-                        "extracted_answer": log.extracted_answer,
-                        "extraction_confidence": log.extraction_confidence,
-                        "evidence_snippets": log.evidence_snippets,
-                        "normalized_answer": log.normalized_answer,
-                        "normalization_rules_applied": log.normalization_rules_applied,
-                        "match_result": log.match_result,
-                        "match_failure_reason": log.match_failure_reason,
-                        "score": log.score,
-                        "max_score": log.max_score,
-                        "confidence": log.confidence,
-                        "reasoning_trace": log.reasoning_trace,
-                        "was_overridden": log.was_overridden,
-                        "created_at": log.created_at,
-                    },
-                )
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_event.clear()
+                await self._flush_buffer()
+                if self.get_pending_count() and self._retry_due():
+                    await self._replay_pending()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.warning(f"刷新批改日志时出错: {e}")
+
+    def _retry_due(self) -> bool:
+        return time.monotonic() - self._last_failure >= self.spill_retry_seconds
+
+    def _drain(self, limit: int) -> List[GradingLog]:
+        """从队列取出至多 limit 条日志（无 await，事件循环内原子）"""
+        count = min(limit, len(self._buffer))
+        return [self._buffer.popleft() for _ in range(count)]
+
+    async def _write_batch(self, logs: List[GradingLog]) -> None:
+        async with db.transaction() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(INSERT_LOG_SQL, [_log_row(log) for log in logs])
+        self._stats["logs_written"] += len(logs)
+        self._stats["batches_written"] += 1
+
+    async def _record_metrics(self, logs: List[GradingLog]) -> None:
+        """写入成功后按补丁版本累计灰度指标（整批一次写入）
+
+        与写库分开处理：指标失败不能让已提交的日志被溢写后重放（重放会再计一次）。
+        """
+        try:
+            await self.metrics.record_results(
+                (log.patch_version, self.metrics.needs_review(log.confidence)) for log in logs
+            )
+        except Exception as e:
+            logger.warning(f"累计灰度指标失败: {e}")
 
-                log_id = (await result.fetchone())[0]
-                logger.info(f"批改日志已记录: {log_id}")
-                return str(log_id)
+    async def _flush_buffer(self) -> int:
+        """将队列中的日志批量写入数据库；失败时整队溢写"""
+        written = 0
+        async with self._flush_lock:
+            while self._buffer:
+                batch = self._drain(self.batch_size)
+                try:
+                    await self._write_batch(batch)
+                    written += len(batch)
+                except asyncio.CancelledError:
+                    # 被取消时事务已回滚：放回队首，由下次刷新或 stop() 写出
+                    self._buffer.extendleft(reversed(batch))
+                    raise
+                except Exception as e:
+                    # 验证：需求 8.5 - 日志写入失败时暂存本地
+                    pending = len(batch) + len(self._buffer)
+                    logger.error(f"批改日志批量写入失败，暂存 {pending} 条: {e}")
+                    self._stats["write_failures"] += 1
+                    self._last_failure = time.monotonic()
+                    await self._spill(batch + self._drain(len(self._buffer)))
+                    break
+                await self._record_metrics(batch)
+        return written
+
+    async def _spill(self, logs: List[GradingLog]) -> None:
+        if not logs:
+            return
+        if self.spill_path is not None:
+            lines = "".join(log.model_dump_json() + "\n" for log in logs)
+            try:
+                await asyncio.to_thread(self._append_spill, lines)
+                self._spilled_count += len(logs)
+                self._stats["logs_spilled"] += len(logs)
+                return
+            except OSError as e:
+                logger.error(f"写入批改日志溢写文件失败，改为内存暂存: {e}")
+        self._pending_logs.extend(logs)
+
+    def _append_spill(self, lines: str) -> None:
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.spill_path, "a", encoding="utf-8") as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _take_spill(self) -> List[GradingLog]:
+        """原子地取走溢写文件内容；上次重放中断留下的文件优先处理"""
+        replaying = self.spill_path.with_name(self.spill_path.name + ".replay")
+        if not replaying.exists():
+            if not self.spill_path.exists():
+                return []
+            os.replace(self.spill_path, replaying)
+        logs = []
+        with open(replaying, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    logs.append(GradingLog.model_validate_json(line))
+                except ValueError as e:
+                    logger.warning(f"跳过损坏的溢写日志行: {e}")
+        return logs
 
-        except Exception as e:
-            logger.error(f"批改日志写入失败，暂存到本地队列: {e}")
-            # 验证：需求 8.5 - 日志写入失败时暂存本地
-            self._pending_logs.append(log)
-            return log.log_id
+    def _finish_spill(self) -> None:
+        replaying = self.spill_path.with_name(self.spill_path.name + ".replay")
+        replaying.unlink(missing_ok=True)
+
+    async def _replay_pending(self) -> int:
+        """重放溢写文件与内存暂存队列中的日志"""
+        async with self._flush_lock:
+            logs = list(self._pending_logs)
+            self._pending_logs.clear()
+            if self.spill_path is not None:
+                try:
+                    logs.extend(await asyncio.to_thread(self._take_spill))
+                except OSError as e:
+                    logger.error(f"读取批改日志溢写文件失败: {e}")
+            if not logs:
+                self._spilled_count = 0
+                return 0
+
+            written = 0
+            failed: List[GradingLog] = []
+            cancelled = False
+            for offset in range(0, len(logs), self.batch_size):
+                batch = logs[offset : offset + self.batch_size]
+                try:
+                    await self._write_batch(batch)
+                    written += len(batch)
+                except asyncio.CancelledError:
+                    # 被取消时先把未写入的部分重新暂存，再向上抛出
+                    failed = logs[offset:]
+                    cancelled = True
+                    break
+                except Exception as e:
+                    logger.error(f"重放批改日志失败，剩余 {len(logs) - offset} 条继续暂存: {e}")
+                    self._stats["write_failures"] += 1
+                    self._last_failure = time.monotonic()
+                    failed = logs[offset:]
+                    break
+                await self._record_metrics(batch)
+
+            self._spilled_count = 0
+            await self._spill(failed)
+            if self.spill_path is not None:
+                await asyncio.to_thread(self._finish_spill)
+            self._stats["logs_replayed"] += written
+            if cancelled:
+                raise asyncio.CancelledError()
+            if written:
+                logger.info(f"重放批改日志: 成功 {written}, 仍暂存 {len(failed)}")
+            return written
 
     async def log_override(
         self, log_id: str, override_score: float, override_reason: str, teacher_id: str
     ) -> bool:
         """记录改判信息
 
-        更新日志记录，标记为已改判，并记录改判详情。
+        更新日志记录，标记为已改判，并记录改判详情；改判按原日志的补丁版本
+        计入灰度指标。
         验证：需求 8.4
 
         Args:
             log_id: 日志ID
             override_score: 改判后的分数
             override_reason: 改判原因
-            teacher_id: 改判教师ID
+            teacher_id: 改判教师ID（非 UUID 的账号 ID 按 _as_uuid 确定性映射）
 
         Returns:
             是否成功更新
@@ -139,21 +460,25 @@ class GradingLogger:
                         override_teacher_id = %(override_teacher_id)s,
                         override_at = NOW()
                     WHERE log_id = %(log_id)s
+                    RETURNING score, patch_version
                     """,
                     {
                         "log_id": log_id,
                         "override_score": override_score,
                         "override_reason": override_reason,
-                        "override_teacher_id": teacher_id,
+                        "override_teacher_id": _as_uuid(teacher_id, "teacher"),
                     },
                 )
+                row = await result.fetchone()
 
-                if result.rowcount > 0:
-                    logger.info(f"改判日志已记录: {log_id}")
-                    return True
-                else:
-                    logger.warning(f"未找到日志记录: {log_id}")
-                    return False
+            if row is None:
+                logger.warning(f"未找到日志记录: {log_id}")
+                return False
+
+            logger.info(f"改判日志已记录: {log_id}")
+            original_score = float(row[0]) if row[0] is not None else None
+            await self.metrics.record_override(row[1], original_score, override_score)
+            return True
 
         except Exception as e:
             logger.error(f"改判日志记录失败: {e}")
@@ -235,38 +560,19 @@ class GradingLogger:
     async def flush_pending(self) -> int:
         """刷新暂存的日志
 
-        将本地暂存队列中的日志重新尝试写入数据库。
+        写出队列中的日志，并重放溢写文件与内存暂存队列。
         验证：需求 8.5
 
         Returns:
             成功写入的日志数量
         """
-        async with self._flush_lock:
-            if not self._pending_logs:
-                return 0
-
-            success_count = 0
-            failed_logs = []
-
-            while self._pending_logs:
-                log = self._pending_logs.popleft()
-                try:
-                    await self.log_grading(log)
-                    success_count += 1
-                except Exception as e:
-                    logger.error(f"重试写入日志失败: {e}")
-                    failed_logs.append(log)
-
-            # 将失败的日志重新放回队列
-            for log in failed_logs:
-                self._pending_logs.append(log)
-
-            logger.info(f"刷新暂存日志: 成功 {success_count}, 失败 {len(failed_logs)}")
-            return success_count
+        written = await self._flush_buffer()
+        written += await self._replay_pending()
+        return written
 
     def get_pending_count(self) -> int:
-        """获取暂存队列中的日志数量"""
-        return len(self._pending_logs)
+        """获取尚未写入数据库的暂存日志数量（内存暂存 + 溢写文件）"""
+        return len(self._pending_logs) + self._spilled_count
 
 
 # 全局单例
@@ -277,5 +583,11 @@ def get_grading_logger() -> GradingLogger:
     """获取批改日志服务单例"""
     global _grading_logger
     if _grading_logger is None:
-        _grading_logger = GradingLogger()
+        _grading_logger = GradingLogger(spill_path=DEFAULT_SPILL_PATH or None)
     return _grading_logger
+
+
+async def shutdown_grading_logger() -> None:
+    """停止批改日志后台写入（未创建时为空操作）"""
+    if _grading_logger is not None:
+        await _grading_logger.stop()
@@ -20,12 +20,13 @@
 """
 
 import json
+import heapq
 import logging
 import hashlib
 import os
 import asyncio
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional, Tuple, TYPE_CHECKING
+from typing import Dict, Any, List, Optional, Set, Tuple, TYPE_CHECKING
 from dataclasses import dataclass, field, asdict
 from enum import Enum
 from collections import defaultdict
@@ -37,6 +38,12 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+# 文件存储采用追加日志（每行一条紧凑 JSON），日志行数超过
+# 存活记忆数 * COMPACTION_RATIO + COMPACTION_MIN_RECORDS 时整体压缩重写。
+COMPACTION_RATIO = 2
+COMPACTION_MIN_RECORDS = 1000
+_COMPACT_SEPARATORS = (",", ":")
+
 
 class MemoryType(str, Enum):
     """记忆类型"""
@@ -270,10 +277,19 @@ class GradingMemoryService:
         # 置信度校准统计
         self._calibration_stats: Dict[str, CalibrationStats] = {}
 
-        # 索引（用于快速检索）
-        self._type_index: Dict[MemoryType, List[str]] = defaultdict(list)
-        self._question_type_index: Dict[str, List[str]] = defaultdict(list)
-        self._subject_index: Dict[str, List[str]] = defaultdict(list)  # 科目索引
+        # 索引（用于快速检索，集合保证 O(1) 增删）
+        self._type_index: Dict[MemoryType, Set[str]] = defaultdict(set)
+        self._question_type_index: Dict[str, Set[str]] = defaultdict(set)
+        self._subject_index: Dict[str, Set[str]] = defaultdict(set)  # 科目索引
+
+        # 脏标记：仅持久化自上次保存以来变更/删除的记忆
+        self._dirty_ids: Set[str] = set()
+        self._removed_ids: Set[str] = set()
+        self._calibration_dirty = False
+
+        # 追加日志状态（文件存储模式）
+        self._log_record_count = 0
+        self._needs_compaction = False
 
         # 线程锁
         self._lock = threading.RLock()
@@ -303,6 +319,30 @@ class GradingMemoryService:
 
         return self._async_lock
 
+    def _index_entry(self, entry: MemoryEntry) -> None:
+        """将记忆加入类型/科目/题型索引"""
+        self._type_index[entry.memory_type].add(entry.memory_id)
+        self._subject_index[entry.subject].add(entry.memory_id)
+        for qt in entry.related_question_types:
+            self._question_type_index[qt].add(entry.memory_id)
+
+    def _unindex_entry(self, entry: MemoryEntry) -> None:
+        """将记忆从索引中移除"""
+        self._type_index.get(entry.memory_type, set()).discard(entry.memory_id)
+        self._subject_index.get(entry.subject, set()).discard(entry.memory_id)
+        for qt in entry.related_question_types:
+            self._question_type_index.get(qt, set()).discard(entry.memory_id)
+
+    def _mark_dirty(self, memory_id: str) -> None:
+        """标记记忆已变更，等待下次持久化"""
+        self._dirty_ids.add(memory_id)
+        self._removed_ids.discard(memory_id)
+
+    def get_dirty_count(self) -> int:
+        """待持久化的记忆数量"""
+        with self._lock:
+            return len(self._dirty_ids) + len(self._removed_ids)
+
     def set_storage_backend(self, backend: "MemoryStorageBackend") -> None:
         """设置存储后端（用于延迟初始化）"""
         self._storage_backend = backend
@@ -327,10 +367,7 @@ class GradingMemoryService:
                     try:
                         entry = MemoryEntry.from_dict(mem_data)
                         self._long_term_memory[entry.memory_id] = entry
-                        self._type_index[entry.memory_type].append(entry.memory_id)
-                        self._subject_index[entry.subject].append(entry.memory_id)  # 科目索引
-                        for qt in entry.related_question_types:
-                            self._question_type_index[qt].append(entry.memory_id)
+                        self._index_entry(entry)
                     except Exception as e:
                         logger.warning(f"[Memory] 加载记忆条目失败: {e}")
 
@@ -354,7 +391,10 @@ class GradingMemoryService:
 
     async def save_to_db(self) -> int:
         """
-        将内存中的记忆保存到数据库
+        将变更过的记忆批量保存到数据库
+
+        只写入脏记忆（新增/更新），一次批量提交；失败的记忆保留脏标记，
+        下次保存时重试。
 
         Returns:
             int: 保存的记忆数量
@@ -364,31 +404,48 @@ class GradingMemoryService:
 
         try:
             async with self._get_async_lock():
-                saved_count = 0
+                with self._lock:
+                    dirty_ids = list(self._dirty_ids)
+                    self._dirty_ids.clear()
+                    items = [
+                        (memory_id, self._long_term_memory[memory_id].to_dict())
+                        for memory_id in dirty_ids
+                        if memory_id in self._long_term_memory
+                    ]
+                    calibration_payload = None
+                    if self._calibration_dirty:
+                        self._calibration_dirty = False
+                        calibration_payload = {
+                            qt: {
+                                "predicted_confidences": stats.predicted_confidences[-1000:],
+                                "actual_accuracies": stats.actual_accuracies[-1000:],
+                            }
+                            for qt, stats in self._calibration_stats.items()
+                        }
 
-                # 保存长期记忆
-                for memory_id, entry in self._long_term_memory.items():
+                saved_count = 0
+                if items:
                     try:
-                        success = await self._storage_backend.save_memory(
-                            memory_id, entry.to_dict(), self.memory_ttl_seconds
+                        saved_count = await self._storage_backend.save_memories(
+                            items, self.memory_ttl_seconds
                         )
-                        if success:
-                            saved_count += 1
                     except Exception as e:
-                        logger.warning(f"[Memory] 保存记忆 {memory_id} 失败: {e}")
+                        logger.warning(f"[Memory] 批量保存记忆失败: {e}")
+                    if saved_count < len(items):
+                        # 无法区分部分失败的条目，全部保留脏标记
+                        with self._lock:
+                            for memory_id, _ in items:
+                                if memory_id in self._long_term_memory:
+                                    self._dirty_ids.add(memory_id)
 
                 # 保存校准统计
-                for qt, stats in self._calibration_stats.items():
-                    try:
-                        await self._storage_backend.save_calibration_stats(
-                            qt,
-                            {
-                                "predicted_confidences": stats.predicted_confidences[-1000:],
-                                "actual_accuracies": stats.actual_accuracies[-1000:],
-                            },
-                        )
-                    except Exception as e:
-                        logger.warning(f"[Memory] 保存校准统计 {qt} 失败: {e}")
+                if calibration_payload:
+                    for qt, payload in calibration_payload.items():
+                        try:
+                            await self._storage_backend.save_calibration_stats(qt, payload)
+                        except Exception as e:
+                            self._calibration_dirty = True
+                            logger.warning(f"[Memory] 保存校准统计 {qt} 失败: {e}")
 
                 logger.info(f"[Memory] 保存 {saved_count} 条记忆到数据库")
                 return saved_count
@@ -430,9 +487,12 @@ class GradingMemoryService:
             try:
                 entry = self._long_term_memory.get(memory_id)
                 if entry:
-                    await self._storage_backend.save_memory(
+                    saved = await self._storage_backend.save_memory(
                         memory_id, entry.to_dict(), self.memory_ttl_seconds
                     )
+                    if saved:
+                        with self._lock:
+                            self._dirty_ids.discard(memory_id)
             except Exception as e:
                 logger.warning(f"[Memory] 异步保存记忆到数据库失败: {e}")
 
@@ -515,6 +575,7 @@ class GradingMemoryService:
                 existing = self._long_term_memory[memory_id]
                 existing.occurrence_count += 1
                 existing.last_updated_at = datetime.now().isoformat()
+                self._mark_dirty(memory_id)
                 if batch_id and batch_id not in existing.source_batch_ids:
                     existing.source_batch_ids.append(batch_id)
                     # 限制 source_batch_ids 长度，保留最近 100 个
@@ -542,10 +603,8 @@ class GradingMemoryService:
             self._long_term_memory[memory_id] = entry
 
             # 更新索引
-            self._type_index[memory_type].append(memory_id)
-            self._subject_index[subject].append(memory_id)  # 科目索引
-            for qt in entry.related_question_types:
-                self._question_type_index[qt].append(memory_id)
+            self._index_entry(entry)
+            self._mark_dirty(memory_id)
 
             # 检查容量限制
             self._enforce_capacity_limit()
@@ -559,6 +618,7 @@ class GradingMemoryService:
             if memory_id in self._long_term_memory:
                 self._long_term_memory[memory_id].confirmation_count += 1
                 self._long_term_memory[memory_id].last_accessed_at = datetime.now().isoformat()
+                self._mark_dirty(memory_id)
                 return True
             return False
 
@@ -568,6 +628,7 @@ class GradingMemoryService:
             if memory_id in self._long_term_memory:
                 self._long_term_memory[memory_id].contradiction_count += 1
                 self._long_term_memory[memory_id].last_accessed_at = datetime.now().isoformat()
+                self._mark_dirty(memory_id)
                 return True
             return False
 
@@ -607,23 +668,23 @@ class GradingMemoryService:
             if memory_types:
                 memory_ids = set()
                 for mt in memory_types:
-                    memory_ids.update(self._type_index.get(mt, []))
+                    memory_ids.update(self._type_index.get(mt, ()))
             else:
                 memory_ids = set(self._long_term_memory.keys())
 
             # 按科目过滤（重要！确保不同科目的经验隔离）
             if subject:
-                subject_memory_ids = set(self._subject_index.get(subject, []))
+                subject_memory_ids = set(self._subject_index.get(subject, ()))
                 if include_general:
                     # 也包含通用记忆
-                    subject_memory_ids.update(self._subject_index.get("general", []))
+                    subject_memory_ids.update(self._subject_index.get("general", ()))
                 memory_ids = memory_ids & subject_memory_ids if subject_memory_ids else memory_ids
 
             # 如果指定了题型，进一步过滤
             if question_types:
                 type_memory_ids = set()
                 for qt in question_types:
-                    type_memory_ids.update(self._question_type_index.get(qt, []))
+                    type_memory_ids.update(self._question_type_index.get(qt, ()))
                 # 交集或取相关的
                 if type_memory_ids:
                     # 优先取交集，但也保留部分通用记忆
@@ -638,7 +699,7 @@ class GradingMemoryService:
                             relevant_ids.add(mid)
                     memory_ids = relevant_ids if relevant_ids else memory_ids
 
-            # 过滤和排序
+            # 过滤
             for memory_id in memory_ids:
                 entry = self._long_term_memory.get(memory_id)
                 if not entry:
@@ -648,13 +709,16 @@ class GradingMemoryService:
                     continue
                 if entry.confidence >= min_confidence:
                     candidates.append(entry)
-                    # 更新访问时间
-                    entry.last_accessed_at = datetime.now().isoformat()
 
-            # 按相关性排序
-            candidates.sort(key=lambda x: x.relevance_score, reverse=True)
+            # 只取 top-k（有界堆），避免对全部候选排序
+            top = heapq.nlargest(max_results, candidates, key=lambda x: x.relevance_score)
+
+            # 更新访问时间（仅内存，不触发持久化）
+            accessed_at = datetime.now().isoformat()
+            for entry in top:
+                entry.last_accessed_at = accessed_at
 
-            return candidates[:max_results]
+            return top
 
     def get_error_patterns_for_question_type(
         self,
@@ -863,6 +927,7 @@ class GradingMemoryService:
             MAX_CALIBRATION_SAMPLES = 1000
 
             for question_type, confidences in batch_mem.confidence_distribution.items():
+                self._calibration_dirty = True
                 if question_type not in self._calibration_stats:
                     self._calibration_stats[question_type] = CalibrationStats(
                         question_type=question_type
@@ -1028,9 +1093,9 @@ class GradingMemoryService:
             "subject": subject,  # 当前检索使用的科目
             "memory_stats": {
                 "total_memories": len(self._long_term_memory),
-                "error_pattern_count": len(self._type_index.get(MemoryType.ERROR_PATTERN, [])),
-                "correction_count": len(self._type_index.get(MemoryType.CORRECTION_HISTORY, [])),
-                "subject_memory_count": len(self._subject_index.get(subject, [])) if subject else 0,
+                "error_pattern_count": len(self._type_index.get(MemoryType.ERROR_PATTERN, ())),
+                "correction_count": len(self._type_index.get(MemoryType.CORRECTION_HISTORY, ())),
+                "subject_memory_count": len(self._subject_index.get(subject, ())) if subject else 0,
                 "available_subjects": list(self._subject_index.keys()),
             },
         }
@@ -1109,49 +1174,83 @@ class GradingMemoryService:
         if len(self._long_term_memory) <= self.max_memory_entries:
             return
 
-        # 按相关性得分排序，删除得分最低的
-        entries = list(self._long_term_memory.values())
-        entries.sort(key=lambda x: x.relevance_score)
-
-        # 删除底部20%
-        to_remove = entries[: len(entries) // 5]
+        # 删除相关性得分最低的 20%
+        to_remove = heapq.nsmallest(
+            len(self._long_term_memory) // 5,
+            self._long_term_memory.values(),
+            key=lambda x: x.relevance_score,
+        )
         for entry in to_remove:
             del self._long_term_memory[entry.memory_id]
-            # 更新索引
-            if entry.memory_id in self._type_index.get(entry.memory_type, []):
-                self._type_index[entry.memory_type].remove(entry.memory_id)
-            # 更新科目索引
-            if entry.memory_id in self._subject_index.get(entry.subject, []):
-                self._subject_index[entry.subject].remove(entry.memory_id)
-            for qt in entry.related_question_types:
-                if entry.memory_id in self._question_type_index.get(qt, []):
-                    self._question_type_index[qt].remove(entry.memory_id)
+            self._unindex_entry(entry)
+            self._dirty_ids.discard(entry.memory_id)
+            self._removed_ids.add(entry.memory_id)
 
         logger.info(f"[Memory] 容量限制：删除 {len(to_remove)} 条低价值记忆")
 
     def _load_from_storage(self) -> None:
-        """从存储加载记忆"""
+        """
+        从存储加载记忆
+
+        支持两种格式：
+        - 追加日志：每行一条 {"op": "put"|"del"|"calibration", ...}，后写覆盖先写
+        - 旧版整体 JSON：{"long_term_memory": [...], "calibration_stats": {...}}，
+          加载后在下次保存时压缩为日志格式
+        """
         if not self.storage_path or not os.path.exists(self.storage_path):
             return
 
         try:
             with open(self.storage_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
+                raw = f.read()
+
+            legacy = None
+            try:
+                parsed = json.loads(raw) if raw.strip() else None
+                if isinstance(parsed, dict) and "long_term_memory" in parsed:
+                    legacy = parsed
+            except json.JSONDecodeError:
+                pass
+
+            if legacy is not None:
+                entries = legacy.get("long_term_memory", [])
+                calibration = legacy.get("calibration_stats", {})
+                self._needs_compaction = True
+            else:
+                latest: Dict[str, Optional[Dict[str, Any]]] = {}
+                calibration = {}
+                for line in raw.splitlines():
+                    if not line.strip():
+                        continue
+                    self._log_record_count += 1
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 进程崩溃可能留下半行，跳过即可
+                        logger.warning("[Memory] 跳过损坏的日志行")
+                        continue
+                    op = record.get("op")
+                    if op == "put":
+                        entry_data = record.get("entry") or {}
+                        if entry_data.get("memory_id"):
+                            latest[entry_data["memory_id"]] = entry_data
+                    elif op == "del":
+                        latest[record.get("id", "")] = None
+                    elif op == "calibration":
+                        calibration = record.get("data") or {}
+                entries = [data for data in latest.values() if data is not None]
 
             # 加载长期记忆
-            for entry_data in data.get("long_term_memory", []):
+            for entry_data in entries:
                 try:
                     entry = MemoryEntry.from_dict(entry_data)
                     self._long_term_memory[entry.memory_id] = entry
-                    self._type_index[entry.memory_type].append(entry.memory_id)
-                    self._subject_index[entry.subject].append(entry.memory_id)  # 科目索引
-                    for qt in entry.related_question_types:
-                        self._question_type_index[qt].append(entry.memory_id)
+                    self._index_entry(entry)
                 except Exception as e:
                     logger.warning(f"加载记忆条目失败: {e}")
 
             # 加载校准统计
-            for qt, stats_data in data.get("calibration_stats", {}).items():
+            for qt, stats_data in calibration.items():
                 self._calibration_stats[qt] = CalibrationStats(
                     question_type=qt,
                     predicted_confidences=stats_data.get("predicted_confidences", []),
@@ -1162,12 +1261,69 @@ class GradingMemoryService:
         except Exception as e:
             logger.error(f"加载记忆存储失败: {e}")
 
+    def _calibration_snapshot(self) -> Dict[str, Dict[str, List[float]]]:
+        return {
+            qt: {
+                "predicted_confidences": stats.predicted_confidences[-1000:],  # 保留最近1000条
+                "actual_accuracies": stats.actual_accuracies[-1000:],
+            }
+            for qt, stats in self._calibration_stats.items()
+        }
+
+    def _should_compact(self) -> bool:
+        if self._needs_compaction:
+            return True
+        threshold = len(self._long_term_memory) * COMPACTION_RATIO + COMPACTION_MIN_RECORDS
+        return self._log_record_count > threshold
+
+    def compact_storage(self) -> None:
+        """将追加日志压缩为仅包含存活记忆的快照（原子替换）"""
+        if not self.storage_path:
+            return
+
+        with self._lock:
+            directory = os.path.dirname(self.storage_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.storage_path}.tmp"
+            count = 0
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for entry in self._long_term_memory.values():
+                    f.write(
+                        json.dumps(
+                            {"op": "put", "entry": entry.to_dict()},
+                            ensure_ascii=False,
+                            separators=_COMPACT_SEPARATORS,
+                        )
+                    )
+                    f.write("\n")
+                    count += 1
+                if self._calibration_stats:
+                    f.write(
+                        json.dumps(
+                            {"op": "calibration", "data": self._calibration_snapshot()},
+                            ensure_ascii=False,
+                            separators=_COMPACT_SEPARATORS,
+                        )
+                    )
+                    f.write("\n")
+                    count += 1
+            os.replace(tmp_path, self.storage_path)
+
+            self._log_record_count = count
+            self._needs_compaction = False
+            self._dirty_ids.clear()
+            self._removed_ids.clear()
+            self._calibration_dirty = False
+
+        logger.info(f"[Memory] 压缩记忆存储，写入 {count} 条记录")
+
     def save_to_storage(self) -> None:
         """
         保存记忆到存储
 
         如果使用数据库后端，会尝试异步保存到数据库。
-        否则保存到本地文件。
+        否则把变更追加到本地日志文件，日志过长时整体压缩。
         """
         # 如果使用数据库后端，尝试异步保存
         if self._use_db_backend and self._storage_backend:
@@ -1192,29 +1348,53 @@ class GradingMemoryService:
 
         try:
             with self._lock:
-                data = {
-                    "long_term_memory": [
-                        entry.to_dict() for entry in self._long_term_memory.values()
-                    ],
-                    "calibration_stats": {
-                        qt: {
-                            "predicted_confidences": stats.predicted_confidences[
-                                -1000:
-                            ],  # 保留最近1000条
-                            "actual_accuracies": stats.actual_accuracies[-1000:],
-                        }
-                        for qt, stats in self._calibration_stats.items()
-                    },
-                    "saved_at": datetime.now().isoformat(),
-                }
+                if self._needs_compaction:
+                    self.compact_storage()
+                    return
+
+                lines = [
+                    json.dumps(
+                        {"op": "put", "entry": self._long_term_memory[memory_id].to_dict()},
+                        ensure_ascii=False,
+                        separators=_COMPACT_SEPARATORS,
+                    )
+                    for memory_id in self._dirty_ids
+                    if memory_id in self._long_term_memory
+                ]
+                lines.extend(
+                    json.dumps({"op": "del", "id": memory_id}, separators=_COMPACT_SEPARATORS)
+                    for memory_id in self._removed_ids
+                )
+                if self._calibration_dirty:
+                    lines.append(
+                        json.dumps(
+                            {"op": "calibration", "data": self._calibration_snapshot()},
+                            ensure_ascii=False,
+                            separators=_COMPACT_SEPARATORS,
+                        )
+                    )
+                if not lines:
+                    return
+
+                # 确保目录存在
+                directory = os.path.dirname(self.storage_path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+
+                with open(self.storage_path, "a", encoding="utf-8") as f:
+                    f.write("\n".join(lines))
+                    f.write("\n")
 
-            # 确保目录存在
-            os.makedirs(os.path.dirname(self.storage_path), exist_ok=True)
+                self._log_record_count += len(lines)
+                self._dirty_ids.clear()
+                self._removed_ids.clear()
+                self._calibration_dirty = False
 
-            with open(self.storage_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+                if self._should_compact():
+                    self.compact_storage()
+                    return
 
-            logger.info(f"[Memory] 保存 {len(self._long_term_memory)} 条记忆到文件存储")
+            logger.info(f"[Memory] 追加 {len(lines)} 条记录到文件存储")
         except Exception as e:
             logger.error(f"保存记忆存储失败: {e}")
 
@@ -1288,6 +1468,7 @@ class GradingMemoryService:
             old_status = entry.verification_status
             entry.verification_status = MemoryVerificationStatus.VERIFIED
             entry.last_updated_at = datetime.now().isoformat()
+            self._mark_dirty(memory_id)
             entry.confirmation_count += 1
 
             # 记录验证历史
@@ -1348,6 +1529,7 @@ class GradingMemoryService:
             old_status = entry.verification_status
             entry.verification_status = MemoryVerificationStatus.CORE
             entry.last_updated_at = datetime.now().isoformat()
+            self._mark_dirty(memory_id)
             entry.importance = MemoryImportance.CRITICAL  # 核心记忆自动提升重要性
 
             # 记录验证历史
@@ -1413,6 +1595,7 @@ class GradingMemoryService:
             old_status = entry.verification_status
             entry.verification_status = MemoryVerificationStatus.SUSPICIOUS
             entry.last_updated_at = datetime.now().isoformat()
+            self._mark_dirty(memory_id)
             entry.contradiction_count += 1
 
             # 记录验证历史
@@ -1471,6 +1654,7 @@ class GradingMemoryService:
             entry.deleted_reason = reason
             entry.verification_status = MemoryVerificationStatus.DEPRECATED
             entry.last_updated_at = datetime.now().isoformat()
+            self._mark_dirty(memory_id)
 
             # 记录验证历史
             entry.verification_history.append(
@@ -1531,6 +1715,7 @@ class GradingMemoryService:
             entry.deleted_reason = None
             entry.verification_status = previous_status
             entry.last_updated_at = datetime.now().isoformat()
+            self._mark_dirty(memory_id)
 
             # 记录验证历史
             entry.verification_history.append(
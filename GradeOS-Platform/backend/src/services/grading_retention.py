@@ -3,15 +3,31 @@
 Policy:
 - Keep grading batch data for 7 days by default.
 - After expiration, delete the whole batch and all linked records.
+- Deletes run in small per-table slices with pacing and a per-run budget;
+  progress is kept in retention_runs so interrupted runs resume.
 """
 
 from __future__ import annotations
 
 import asyncio
+import json
 import logging
 import os
+import time
+import uuid
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import Any, Dict, Iterable, List, Sequence, Tuple
+from typing import (
+    Any,
+    AsyncContextManager,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 from src.utils.database import db
 
@@ -22,6 +38,12 @@ DEFAULT_CLEANUP_INTERVAL_SECONDS = int(
     os.getenv("GRADING_DATA_CLEANUP_INTERVAL_SECONDS", "3600")
 )
 DEFAULT_BATCH_SIZE = int(os.getenv("GRADING_DATA_RETENTION_BATCH_SIZE", "200"))
+DEFAULT_SLICE_ROWS = int(os.getenv("GRADING_RETENTION_SLICE_ROWS", "500"))
+DEFAULT_BLOB_SLICE_ROWS = int(os.getenv("GRADING_RETENTION_BLOB_SLICE_ROWS", "20"))
+DEFAULT_SLICE_SLEEP_MS = int(os.getenv("GRADING_RETENTION_SLICE_SLEEP_MS", "50"))
+DEFAULT_TIME_BUDGET_SECONDS = int(os.getenv("GRADING_RETENTION_TIME_BUDGET_SECONDS", "600"))
+# 0 disables the row budget.
+DEFAULT_ROW_BUDGET = int(os.getenv("GRADING_RETENTION_ROW_BUDGET", "0"))
 
 
 def _normalize_positive_int(value: int, fallback: int) -> int:
@@ -96,174 +118,492 @@ async def _fetch_expired_batches(conn: Any, cutoff: datetime, limit: int) -> Lis
     return expired
 
 
-async def _delete_with_text_array(
-    conn: Any,
-    table: str,
-    column: str,
-    values: Iterable[str],
-) -> int:
-    payload = [str(v) for v in values if v]
-    if not payload:
-        return 0
-    query = f"DELETE FROM {table} WHERE {column}::text = ANY(%s)"
-    result = await conn.execute(query, (payload,))
-    return int(getattr(result, "rowcount", 0) or 0)
-
-
-async def _delete_batch_chunk(
-    conn: Any,
-    table_names: set[str],
-    history_ids: List[str],
-    batch_ids: List[str],
-) -> Dict[str, int]:
-    run_ids = [f"batch_grading_{batch_id}" for batch_id in batch_ids]
-    deleted: Dict[str, int] = {}
-
-    if "grading_annotations" in table_names:
-        deleted["grading_annotations"] = await _delete_with_text_array(
-            conn, "grading_annotations", "grading_history_id", history_ids
-        )
+@dataclass(frozen=True)
+class RetentionTable:
+    """A table cleaned for expired batches.
 
-    if "grading_page_images" in table_names:
-        deleted["grading_page_images"] = await _delete_with_text_array(
-            conn, "grading_page_images", "grading_history_id", history_ids
-        )
+    Rows are matched by `column` against the chunk's history ids, batch ids or
+    derived run ids (`key`). Tables with `clear_sql` are updated instead of
+    deleted. `blob` tables hold large BYTEA payloads and use smaller slices.
+    `uuid_column` marks a UUID-typed `column`, compared against a uuid[] so the
+    index on it stays usable (text columns are compared as-is).
+    """
 
-    if "student_grading_results" in table_names:
-        deleted["student_grading_results"] = await _delete_with_text_array(
-            conn, "student_grading_results", "grading_history_id", history_ids
-        )
+    name: str
+    column: str
+    key: str
+    blob: bool = False
+    clear_sql: Optional[str] = None
+    result_key: Optional[str] = None
+    alt_column: Optional[str] = None
+    alt_key: Optional[str] = None
+    uuid_column: bool = False
+
+    @property
+    def summary_key(self) -> str:
+        return self.result_key or self.name
+
+
+# Children first, grading_history last: an interrupted chunk is still found as
+# expired on the next run.
+RETENTION_TABLES: Tuple[RetentionTable, ...] = (
+    RetentionTable("grading_annotations", "grading_history_id", "history"),
+    RetentionTable(
+        "grading_page_images", "grading_history_id", "history", blob=True, uuid_column=True
+    ),
+    RetentionTable("student_grading_results", "grading_history_id", "history", uuid_column=True),
+    RetentionTable("grading_import_items", "batch_id", "batch"),
+    RetentionTable("grading_imports", "batch_id", "batch"),
+    # Keep submission entity, but clear grading outputs for expired batches.
+    RetentionTable(
+        "homework_submissions",
+        "grading_batch_id",
+        "batch",
+        clear_sql="grading_batch_id = NULL, score = NULL, feedback = NULL",
+        result_key="homework_submissions_cleared",
+    ),
+    RetentionTable("batch_images", "batch_id", "batch", blob=True),
+    RetentionTable("workflow_state", "batch_id", "batch"),
+    RetentionTable("stream_events", "stream_id", "run"),
+    RetentionTable("enhanced_checkpoint_writes", "thread_id", "run"),
+    RetentionTable("enhanced_checkpoints", "thread_id", "run", blob=True),
+    RetentionTable("runs", "run_id", "run"),
+    RetentionTable("attempts", "run_id", "run"),
+    RetentionTable(
+        "grading_history",
+        "id",
+        "history",
+        alt_column="batch_id",
+        alt_key="batch",
+        uuid_column=True,
+    ),
+)
 
-    if "grading_import_items" in table_names:
-        deleted["grading_import_items"] = await _delete_with_text_array(
-            conn, "grading_import_items", "batch_id", batch_ids
-        )
+RESUMABLE_RUN_STATUSES = ("running", "budget_exhausted", "failed")
 
-    if "grading_imports" in table_names:
-        deleted["grading_imports"] = await _delete_with_text_array(
-            conn, "grading_imports", "batch_id", batch_ids
-        )
 
-    if "homework_submissions" in table_names:
-        # Keep submission entity, but clear grading outputs for expired batches.
-        query = """
-            UPDATE homework_submissions
-            SET grading_batch_id = NULL, score = NULL, feedback = NULL
-            WHERE grading_batch_id::text = ANY(%s)
-        """
-        result = await conn.execute(query, (batch_ids,))
-        deleted["homework_submissions_cleared"] = int(getattr(result, "rowcount", 0) or 0)
+@dataclass
+class RetentionSettings:
+    """Slice size, pacing and per-run budget for the retention engine."""
 
-    if "batch_images" in table_names:
-        deleted["batch_images"] = await _delete_with_text_array(
-            conn, "batch_images", "batch_id", batch_ids
-        )
+    slice_rows: int = DEFAULT_SLICE_ROWS
+    blob_slice_rows: int = DEFAULT_BLOB_SLICE_ROWS
+    slice_sleep_seconds: float = DEFAULT_SLICE_SLEEP_MS / 1000
+    time_budget_seconds: float = DEFAULT_TIME_BUDGET_SECONDS
+    row_budget: int = DEFAULT_ROW_BUDGET
 
-    if "workflow_state" in table_names:
-        deleted["workflow_state"] = await _delete_with_text_array(
-            conn, "workflow_state", "batch_id", batch_ids
-        )
+    def slice_for(self, table: RetentionTable) -> int:
+        rows = self.blob_slice_rows if table.blob else self.slice_rows
+        return _normalize_positive_int(rows, 50)
 
-    if "stream_events" in table_names and run_ids:
-        deleted["stream_events"] = await _delete_with_text_array(
-            conn, "stream_events", "stream_id", run_ids
-        )
 
-    if "enhanced_checkpoint_writes" in table_names and run_ids:
-        deleted["enhanced_checkpoint_writes"] = await _delete_with_text_array(
-            conn, "enhanced_checkpoint_writes", "thread_id", run_ids
-        )
+@dataclass
+class RetentionRun:
+    """Progress of one retention run, persisted in retention_runs."""
 
-    if "enhanced_checkpoints" in table_names and run_ids:
-        deleted["enhanced_checkpoints"] = await _delete_with_text_array(
-            conn, "enhanced_checkpoints", "thread_id", run_ids
-        )
+    run_id: str
+    cutoff: datetime
+    dry_run: bool = False
+    status: str = "running"
+    history_ids: List[str] = field(default_factory=list)
+    batch_ids: List[str] = field(default_factory=list)
+    tables_done: List[str] = field(default_factory=list)
+    totals: Dict[str, int] = field(default_factory=dict)
+    bytes_reclaimable: Dict[str, int] = field(default_factory=dict)
+    batches_done: int = 0
+    resumed: bool = False
+
+    def key_values(self, key: Optional[str]) -> List[str]:
+        if key == "history":
+            return self.history_ids
+        if key == "batch":
+            return self.batch_ids
+        if key == "run":
+            return [f"batch_grading_{batch_id}" for batch_id in self.batch_ids]
+        return []
 
-    if "runs" in table_names and run_ids:
-        deleted["runs"] = await _delete_with_text_array(conn, "runs", "run_id", run_ids)
-    if "attempts" in table_names and run_ids:
-        deleted["attempts"] = await _delete_with_text_array(conn, "attempts", "run_id", run_ids)
 
-    if "grading_history" in table_names:
-        query = """
-            DELETE FROM grading_history
-            WHERE id::text = ANY(%s) OR batch_id::text = ANY(%s)
+async def ensure_retention_runs_table(conn: Any) -> None:
+    await conn.execute(
         """
-        result = await conn.execute(query, (history_ids, batch_ids))
-        deleted["grading_history"] = int(getattr(result, "rowcount", 0) or 0)
+        CREATE TABLE IF NOT EXISTS retention_runs (
+            id UUID PRIMARY KEY,
+            status VARCHAR(32) NOT NULL,
+            dry_run BOOLEAN NOT NULL DEFAULT FALSE,
+            cutoff TIMESTAMPTZ NOT NULL,
+            chunk_history_ids JSONB NOT NULL DEFAULT '[]',
+            chunk_batch_ids JSONB NOT NULL DEFAULT '[]',
+            tables_done JSONB NOT NULL DEFAULT '[]',
+            totals JSONB NOT NULL DEFAULT '{}',
+            bytes_reclaimable JSONB NOT NULL DEFAULT '{}',
+            batches_done INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            started_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            finished_at TIMESTAMPTZ
+        )
+        """
+    )
+    await conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_retention_runs_status "
+        "ON retention_runs(status, started_at DESC)"
+    )
 
-    return deleted
 
+def _row_value(row: Any, key: str, index: int) -> Any:
+    try:
+        return row[key]
+    except (KeyError, TypeError, IndexError):
+        return row[index]
 
-async def run_grading_retention_cleanup_once(
-    *,
-    keep_days: int | None = None,
-    batch_limit: int | None = None,
-) -> Dict[str, Any]:
-    """Delete expired grading batches and linked records once."""
-    if not db.is_available:
-        return {"status": "skipped", "reason": "database_unavailable"}
 
-    keep_days = _normalize_positive_int(keep_days or retention_days(), 7)
-    batch_limit = _normalize_positive_int(batch_limit or cleanup_batch_size(), 200)
-    cutoff = datetime.now(timezone.utc) - timedelta(days=keep_days)
+def _json_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [str(item) for item in value or []]
 
-    totals: Dict[str, int] = {"expired_batches": 0}
-    max_rounds = 100
 
-    for _ in range(max_rounds):
-        async with db.connection() as conn:
-            table_names = await _existing_tables(
-                conn,
-                [
-                    "grading_history",
-                    "student_grading_results",
-                    "grading_page_images",
-                    "grading_annotations",
-                    "grading_imports",
-                    "grading_import_items",
-                    "batch_images",
-                    "workflow_state",
-                    "runs",
-                    "attempts",
-                    "stream_events",
-                    "enhanced_checkpoints",
-                    "enhanced_checkpoint_writes",
-                    "homework_submissions",
-                ],
+def _json_dict(value: Any) -> Dict[str, int]:
+    if isinstance(value, str):
+        value = json.loads(value)
+    return {str(k): int(v) for k, v in (value or {}).items()}
+
+
+def _where_clause(table: RetentionTable) -> str:
+    where = f"{table.column} = ANY(%s{'::uuid[]' if table.uuid_column else ''})"
+    if table.alt_column:
+        where = f"({where} OR {table.alt_column} = ANY(%s))"
+    return where
+
+
+def _where_params(table: RetentionTable, run: RetentionRun) -> Tuple[Any, ...]:
+    params: Tuple[Any, ...] = (run.key_values(table.key),)
+    if table.alt_column:
+        params += (run.key_values(table.alt_key),)
+    return params
+
+
+class GradingRetentionEngine:
+    """Deletes expired grading batches in bounded, resumable slices.
+
+    - Each table is drained with `ctid = ANY(ARRAY(SELECT ctid ... LIMIT n))`
+      statements, committed one slice at a time, so locks and WAL per statement
+      stay small even for BYTEA tables.
+    - Progress (current chunk, finished tables, row totals) is written to
+      retention_runs in the same transaction as each slice. An interrupted or
+      budget-limited run resumes from there.
+    - Dry-run reports rows and approximate bytes that would be reclaimed.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[RetentionSettings] = None,
+        connection: Optional[Callable[[], AsyncContextManager[Any]]] = None,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.settings = settings or RetentionSettings()
+        self._connection = connection or db.connection
+        self._sleep = sleep
+        self._clock = clock
+        self._deadline = 0.0
+        self._rows_this_run = 0
+
+    def _budget_exhausted(self) -> bool:
+        if self.settings.time_budget_seconds > 0 and self._clock() >= self._deadline:
+            return True
+        return 0 < self.settings.row_budget <= self._rows_this_run
+
+    async def _load_resumable_run(self, conn: Any) -> Optional[RetentionRun]:
+        result = await conn.execute(
+            """
+            SELECT id::text AS id, cutoff, chunk_history_ids, chunk_batch_ids,
+                   tables_done, totals, batches_done
+            FROM retention_runs
+            WHERE dry_run = FALSE AND status = ANY(%s)
+            ORDER BY started_at DESC
+            LIMIT 1
+            """,
+            (list(RESUMABLE_RUN_STATUSES),),
+        )
+        row = await result.fetchone()
+        if not row:
+            return None
+        return RetentionRun(
+            run_id=str(_row_value(row, "id", 0)),
+            cutoff=_row_value(row, "cutoff", 1),
+            history_ids=_json_list(_row_value(row, "chunk_history_ids", 2)),
+            batch_ids=_json_list(_row_value(row, "chunk_batch_ids", 3)),
+            tables_done=_json_list(_row_value(row, "tables_done", 4)),
+            totals=_json_dict(_row_value(row, "totals", 5)),
+            batches_done=int(_row_value(row, "batches_done", 6) or 0),
+            resumed=True,
+        )
+
+    async def _create_run(self, conn: Any, cutoff: datetime, dry_run: bool) -> RetentionRun:
+        run = RetentionRun(run_id=str(uuid.uuid4()), cutoff=cutoff, dry_run=dry_run)
+        await conn.execute(
+            """
+            INSERT INTO retention_runs (id, status, dry_run, cutoff)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (run.run_id, run.status, dry_run, cutoff),
+        )
+        await conn.commit()
+        return run
+
+    async def _save_progress(
+        self, conn: Any, run: RetentionRun, *, error: Optional[str] = None, commit: bool = True
+    ) -> None:
+        finished = run.status not in ("running",)
+        await conn.execute(
+            """
+            UPDATE retention_runs
+            SET status = %s,
+                chunk_history_ids = %s,
+                chunk_batch_ids = %s,
+                tables_done = %s,
+                totals = %s,
+                bytes_reclaimable = %s,
+                batches_done = %s,
+                error = %s,
+                updated_at = NOW(),
+                finished_at = CASE WHEN %s THEN NOW() ELSE NULL END
+            WHERE id = %s
+            """,
+            (
+                run.status,
+                json.dumps(run.history_ids),
+                json.dumps(run.batch_ids),
+                json.dumps(run.tables_done),
+                json.dumps(run.totals),
+                json.dumps(run.bytes_reclaimable),
+                run.batches_done,
+                error,
+                finished and run.status != "budget_exhausted",
+                run.run_id,
+            ),
+        )
+        if commit:
+            await conn.commit()
+
+    async def _drain_table(self, conn: Any, run: RetentionRun, table: RetentionTable) -> bool:
+        """Delete (or clear) the chunk's rows slice by slice; False if the budget ran out."""
+        slice_rows = self.settings.slice_for(table)
+        where = _where_clause(table)
+        target = (
+            f"UPDATE {table.name} SET {table.clear_sql}"
+            if table.clear_sql
+            else f"DELETE FROM {table.name}"
+        )
+        query = (
+            f"{target} WHERE ctid = ANY(ARRAY("
+            f"SELECT ctid FROM {table.name} WHERE {where} LIMIT %s))"
+        )
+        params = _where_params(table, run) + (slice_rows,)
+        key = table.summary_key
+
+        while True:
+            if self._budget_exhausted():
+                return False
+            result = await conn.execute(query, params)
+            affected = int(getattr(result, "rowcount", 0) or 0)
+            run.totals[key] = run.totals.get(key, 0) + affected
+            self._rows_this_run += affected
+            # Progress rides on the slice's own transaction.
+            await self._save_progress(conn, run, commit=False)
+            await conn.commit()
+            if affected < slice_rows:
+                return True
+            if self.settings.slice_sleep_seconds > 0:
+                await self._sleep(self.settings.slice_sleep_seconds)
+
+    async def _estimate_chunk(
+        self, conn: Any, run: RetentionRun, table_names: set[str]
+    ) -> None:
+        for table in RETENTION_TABLES:
+            if table.name not in table_names:
+                continue
+            result = await conn.execute(
+                f"""
+                SELECT COUNT(*) AS row_count,
+                       COALESCE(SUM(pg_column_size(t.*)), 0) AS row_bytes
+                FROM {table.name} AS t
+                WHERE {_where_clause(table)}
+                """,
+                _where_params(table, run),
+            )
+            row = await result.fetchone()
+            key = table.summary_key
+            run.totals[key] = run.totals.get(key, 0) + int(_row_value(row, "row_count", 0) or 0)
+            run.bytes_reclaimable[key] = run.bytes_reclaimable.get(key, 0) + int(
+                _row_value(row, "row_bytes", 1) or 0
             )
 
+    async def _dry_run(
+        self, conn: Any, table_names: set[str], cutoff: datetime, batch_limit: int, max_rounds: int
+    ) -> RetentionRun:
+        run = await self._create_run(conn, cutoff, dry_run=True)
+        expired = await _fetch_expired_batches(conn, cutoff, batch_limit * max_rounds)
+        for offset in range(0, len(expired), batch_limit):
+            chunk = expired[offset : offset + batch_limit]
+            run.history_ids = [item[0] for item in chunk]
+            run.batch_ids = [item[1] for item in chunk]
+            await self._estimate_chunk(conn, run, table_names)
+            run.batches_done += len(chunk)
+        run.history_ids, run.batch_ids = [], []
+        run.status = "dry_run"
+        await self._save_progress(conn, run)
+        return run
+
+    async def run(
+        self,
+        *,
+        keep_days: int,
+        batch_limit: int,
+        dry_run: bool = False,
+        max_rounds: int = 100,
+    ) -> Dict[str, Any]:
+        cutoff = datetime.now(timezone.utc) - timedelta(days=keep_days)
+        self._deadline = self._clock() + self.settings.time_budget_seconds
+        self._rows_this_run = 0
+
+        async with self._connection() as conn:
+            table_names = await _existing_tables(
+                conn, [table.name for table in RETENTION_TABLES]
+            )
             if "grading_history" not in table_names:
                 return {"status": "skipped", "reason": "grading_history_not_found"}
-
-            expired = await _fetch_expired_batches(conn, cutoff, batch_limit)
-            if not expired:
-                break
-
-            history_ids = [item[0] for item in expired]
-            batch_ids = [item[1] for item in expired]
-            chunk_deleted = await _delete_batch_chunk(conn, table_names, history_ids, batch_ids)
+            await ensure_retention_runs_table(conn)
             await conn.commit()
 
-            totals["expired_batches"] += len(batch_ids)
-            for key, value in chunk_deleted.items():
-                totals[key] = totals.get(key, 0) + int(value or 0)
+            if dry_run:
+                run = await self._dry_run(conn, table_names, cutoff, batch_limit, max_rounds)
+                return self._summary(run, keep_days)
+
+            run = await self._load_resumable_run(conn)
+            if run is None:
+                run = await self._create_run(conn, cutoff, dry_run=False)
+            else:
+                logger.info(
+                    "[Retention] resuming run %s (%d batches done, chunk of %d)",
+                    run.run_id,
+                    run.batches_done,
+                    len(run.batch_ids),
+                )
+                run.status = "running"
+            # New chunks always use the current cutoff.
+            run.cutoff = cutoff
+
+            try:
+                await self._run_chunks(conn, run, table_names, batch_limit, max_rounds)
+            except Exception as exc:
+                await conn.rollback()
+                run.status = "failed"
+                try:
+                    await self._save_progress(conn, run, error=str(exc))
+                except Exception as save_exc:
+                    logger.warning("[Retention] failed to record run failure: %s", save_exc)
+                raise
+            return self._summary(run, keep_days)
+
+    async def _run_chunks(
+        self,
+        conn: Any,
+        run: RetentionRun,
+        table_names: set[str],
+        batch_limit: int,
+        max_rounds: int,
+    ) -> None:
+        for _ in range(max_rounds):
+            if not run.batch_ids:
+                expired = await _fetch_expired_batches(conn, run.cutoff, batch_limit)
+                if not expired:
+                    break
+                run.history_ids = [item[0] for item in expired]
+                run.batch_ids = [item[1] for item in expired]
+                run.tables_done = []
+                await self._save_progress(conn, run)
+
+            history_before = run.totals.get("grading_history", 0)
+            for table in RETENTION_TABLES:
+                if table.name not in table_names or table.name in run.tables_done:
+                    continue
+                if not await self._drain_table(conn, run, table):
+                    run.status = "budget_exhausted"
+                    await self._save_progress(conn, run)
+                    logger.info(
+                        "[Retention] budget exhausted in %s; run %s will resume",
+                        table.name,
+                        run.run_id,
+                    )
+                    return
+                run.tables_done.append(table.name)
+                await self._save_progress(conn, run)
+
+            deleted_history = run.totals.get("grading_history", 0) - history_before
+            run.batches_done += len(run.batch_ids)
+            run.history_ids, run.batch_ids, run.tables_done = [], [], []
+            await self._save_progress(conn, run)
 
             # Safety: stop if parent rows were not removed to avoid endless loops.
-            if chunk_deleted.get("grading_history", 0) == 0:
+            if deleted_history == 0:
                 logger.warning(
                     "[Retention] No grading_history rows deleted for expired chunk; stopping early."
                 )
                 break
 
-    totals.update(
-        {
-            "status": "ok",
-            "retention_days": keep_days,
-            "cutoff": cutoff.isoformat(),
-        }
-    )
-    return totals
+        run.status = "completed"
+        await self._save_progress(conn, run)
+
+    @staticmethod
+    def _summary(run: RetentionRun, keep_days: int) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {"expired_batches": run.batches_done}
+        if run.dry_run:
+            summary.update(
+                {
+                    "dry_run": True,
+                    "would_delete": dict(run.totals),
+                    "would_reclaim_bytes": dict(run.bytes_reclaimable),
+                    "would_reclaim_total_bytes": sum(run.bytes_reclaimable.values()),
+                }
+            )
+        else:
+            summary.update(run.totals)
+            summary["rows_affected"] = sum(run.totals.values())
+        summary.update(
+            {
+                "status": "ok",
+                "run_id": run.run_id,
+                "run_status": run.status,
+                "resumed": run.resumed,
+                "retention_days": keep_days,
+                "cutoff": run.cutoff.isoformat(),
+            }
+        )
+        return summary
+
+
+async def run_grading_retention_cleanup_once(
+    *,
+    keep_days: int | None = None,
+    batch_limit: int | None = None,
+    dry_run: bool = False,
+    settings: Optional[RetentionSettings] = None,
+) -> Dict[str, Any]:
+    """Delete expired grading batches and linked records once.
+
+    Stops early when the run budget is exhausted; the next call resumes the
+    same run. With `dry_run=True` nothing is deleted and the summary reports
+    rows and approximate bytes per table that would be reclaimed.
+    """
+    if not db.is_available:
+        return {"status": "skipped", "reason": "database_unavailable"}
+
+    keep_days = _normalize_positive_int(keep_days or retention_days(), 7)
+    batch_limit = _normalize_positive_int(batch_limit or cleanup_batch_size(), 200)
+    engine = GradingRetentionEngine(settings=settings)
+    return await engine.run(keep_days=keep_days, batch_limit=batch_limit, dry_run=dry_run)
 
 
 async def grading_retention_worker_loop(
@@ -0,0 +1,488 @@
+"""
+视觉调用前的页面图像预处理
+
+每页图像在发送给视觉模型前只处理一次，并按内容哈希 + 策略缓存：
+- 裁掉空白页边（仅限不依赖页面坐标的调用）
+- 纠正扫描倾斜（同上）
+- 按模型提供方缩放到目标长边
+- 颜色不携带信息时转为灰度
+- 以调优后的 JPEG 质量重新编码
+- 估算每页的视觉 token 数
+
+批改与批注调用要求模型返回 [0, 1] 归一化坐标并直接用于原图绘制批注，
+因此这两类调用只做等比缩放与重新编码，不裁剪、不旋转。
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from src.utils.image import pil_to_jpeg_bytes
+
+logger = logging.getLogger(__name__)
+
+IMAGE_PREP_ENABLED = os.getenv("VISION_IMAGE_PREP_ENABLED", "true").lower() in ("1", "true", "yes")
+IMAGE_PREP_CACHE_MB = float(os.getenv("VISION_IMAGE_PREP_CACHE_MB", "64"))
+GRAYSCALE_MAX_COLOR_RATIO = float(os.getenv("VISION_GRAYSCALE_MAX_COLOR_RATIO", "0.01"))
+
+CALL_IDENTIFICATION = "identification"
+CALL_GRADING = "grading"
+CALL_ANNOTATION = "annotation"
+
+# 各提供方建议的长边上限（超过后服务端也会缩放或切成更多 tile）
+PROVIDER_LONG_EDGE = {
+    "gemini": 1536,
+    "openai": 1536,
+    "anthropic": 1568,
+    "default": 1568,
+}
+
+ImageInput = Union[bytes, bytearray, str]
+
+
+def provider_for_model(model_name: Optional[str]) -> str:
+    """根据 OpenRouter 模型名推断提供方"""
+    name = (model_name or "").lower()
+    if "gemini" in name or name.startswith("google/"):
+        return "gemini"
+    if "claude" in name or name.startswith("anthropic/"):
+        return "anthropic"
+    if name.startswith("openai/") or name.startswith(("gpt", "o1", "o3", "o4")):
+        return "openai"
+    return "default"
+
+
+def estimate_vision_tokens(width: int, height: int, provider: str = "default") -> int:
+    """
+    估算一张图片的视觉 token 数
+
+    - gemini：≤384px 计 258；更大时按 768px tile 计，每块 258
+    - openai（high detail）：缩入 2048 方框、短边缩到 768 后按 512px tile 计，85 + 170/块
+    - anthropic 及其他：缩到长边 1568 后按 宽×高/750 计
+    """
+    if width <= 0 or height <= 0:
+        return 0
+    if provider == "gemini":
+        if width <= 384 and height <= 384:
+            return 258
+        return 258 * math.ceil(width / 768) * math.ceil(height / 768)
+    if provider == "openai":
+        scale = min(1.0, 2048 / max(width, height))
+        w, h = width * scale, height * scale
+        scale = min(1.0, 768 / min(w, h))
+        w, h = w * scale, h * scale
+        return 85 + 170 * math.ceil(w / 512) * math.ceil(h / 512)
+    scale = min(1.0, 1568 / max(width, height))
+    return math.ceil((width * scale) * (height * scale) / 750)
+
+
+@dataclass(frozen=True)
+class VisionImagePolicy:
+    """一类视觉调用的图像处理参数"""
+
+    call_type: str
+    max_long_edge: int
+    jpeg_quality: int
+    crop_margins: bool = False
+    deskew: bool = False
+    allow_grayscale: bool = True
+
+
+def _env_int(key: str, default: int) -> int:
+    try:
+        return int(os.getenv(key, default))
+    except ValueError:
+        return default
+
+
+class VisionImagePolicies:
+    """
+    按调用类型与模型提供方选择图像处理策略
+
+    长边 = 提供方上限 × 调用类型比例，可用 VISION_<TYPE>_LONG_EDGE 覆盖。
+    """
+
+    # 调用类型 -> (长边比例, JPEG 质量, 裁边, 纠偏)
+    DEFAULTS: Dict[str, Tuple[float, int, bool, bool]] = {
+        CALL_IDENTIFICATION: (0.5, 70, True, True),
+        CALL_GRADING: (1.0, 80, False, False),
+        CALL_ANNOTATION: (1.0, 80, False, False),
+    }
+
+    def __init__(self, overrides: Optional[Dict[str, VisionImagePolicy]] = None):
+        self._overrides = dict(overrides or {})
+        self._cache: Dict[Tuple[str, str], VisionImagePolicy] = {}
+
+    def for_call(self, call_type: str, model_name: Optional[str] = None) -> VisionImagePolicy:
+        if call_type in self._overrides:
+            return self._overrides[call_type]
+        provider = provider_for_model(model_name)
+        key = (call_type, provider)
+        policy = self._cache.get(key)
+        if policy is None:
+            ratio, quality, crop, deskew = self.DEFAULTS.get(call_type, self.DEFAULTS[CALL_GRADING])
+            long_edge = int(PROVIDER_LONG_EDGE.get(provider, PROVIDER_LONG_EDGE["default"]) * ratio)
+            policy = VisionImagePolicy(
+                call_type=call_type,
+                max_long_edge=_env_int(f"VISION_{call_type.upper()}_LONG_EDGE", long_edge),
+                jpeg_quality=_env_int(f"VISION_{call_type.upper()}_JPEG_QUALITY", quality),
+                crop_margins=crop,
+                deskew=deskew,
+            )
+            self._cache[key] = policy
+        return policy
+
+
+@dataclass
+class PreparedImage:
+    """预处理后的页面图像"""
+
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    original_size: Tuple[int, int]
+    estimated_tokens: int
+    original_tokens: int
+    grayscale: bool = False
+    crop_box: Optional[Tuple[int, int, int, int]] = None
+    skew_angle: float = 0.0
+    _b64: Optional[str] = field(default=None, repr=False)
+
+    @property
+    def b64(self) -> str:
+        if self._b64 is None:
+            self._b64 = base64.b64encode(self.data).decode("ascii")
+        return self._b64
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.b64}"
+
+    def content_part(self) -> Dict[str, Any]:
+        return {"type": "image_url", "image_url": self.data_url}
+
+
+def _to_bytes(image: ImageInput) -> bytes:
+    if isinstance(image, (bytes, bytearray)):
+        return bytes(image)
+    text = image.strip()
+    if text.startswith("data:"):
+        text = text.split(",", 1)[-1]
+    return base64.b64decode(text)
+
+
+def _background_level(gray: np.ndarray) -> float:
+    return float(np.percentile(gray, 90))
+
+
+def _ink_mask(gray: np.ndarray, contrast: int = 60) -> np.ndarray:
+    """比纸面背景暗 contrast 以上的像素视为墨迹"""
+    return gray < (_background_level(gray) - contrast)
+
+
+def detect_content_box(
+    gray: np.ndarray,
+    min_ink_ratio: float = 0.004,
+    padding_ratio: float = 0.015,
+) -> Optional[Tuple[int, int, int, int]]:
+    """
+    找出有墨迹的内容区域 (left, top, right, bottom)
+
+    接近全黑的边缘行/列（扫描仪黑边）不计入内容；无内容时返回 None。
+    """
+    height, width = gray.shape
+    ink = _ink_mask(gray)
+    row_ratio = ink.mean(axis=1)
+    col_ratio = ink.mean(axis=0)
+    rows = np.flatnonzero((row_ratio > min_ink_ratio) & (row_ratio < 0.9))
+    cols = np.flatnonzero((col_ratio > min_ink_ratio) & (col_ratio < 0.9))
+    if rows.size == 0 or cols.size == 0:
+        return None
+    pad_y = int(height * padding_ratio)
+    pad_x = int(width * padding_ratio)
+    return (
+        max(0, int(cols[0]) - pad_x),
+        max(0, int(rows[0]) - pad_y),
+        min(width, int(cols[-1]) + 1 + pad_x),
+        min(height, int(rows[-1]) + 1 + pad_y),
+    )
+
+
+def estimate_skew_angle(
+    gray_image: Image.Image,
+    max_angle: float = 5.0,
+    step: float = 0.25,
+    work_long_edge: int = 600,
+) -> float:
+    """
+    投影法估计倾斜角（度）
+
+    在缩小的二值图上尝试各角度，取行投影最“尖锐”（方差最大）的角度。
+    """
+    small = gray_image.copy()
+    small.thumbnail((work_long_edge, work_long_edge))
+    arr = np.asarray(small, dtype=np.uint8)
+    binary = Image.fromarray(np.where(_ink_mask(arr), 255, 0).astype(np.uint8))
+    best_angle, best_score = 0.0, -1.0
+    for angle in np.arange(-max_angle, max_angle + step / 2, step):
+        rotated = binary.rotate(float(angle), resample=Image.NEAREST, fillcolor=0)
+        profile = np.asarray(rotated, dtype=np.float32).sum(axis=1)
+        score = float(np.square(np.diff(profile)).sum())
+        if score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def _color_ratio(image: Image.Image) -> float:
+    """彩色像素（通道差 > 40）占比，在缩略图上计算"""
+    thumb = image.convert("RGB")
+    thumb.thumbnail((256, 256))
+    arr = np.asarray(thumb, dtype=np.int16)
+    chroma = arr.max(axis=2) - arr.min(axis=2)
+    return float((chroma > 40).mean())
+
+
+def _source_mime(image: Image.Image) -> str:
+    return Image.MIME.get(image.format or "", "image/jpeg")
+
+
+class ImagePreparer:
+    """
+    页面图像预处理器
+
+    结果按 (内容哈希, 策略) 做 LRU 缓存，总字节数受 VISION_IMAGE_PREP_CACHE_MB 限制；
+    线程安全，可在 asyncio.to_thread 中并发调用。无法解码的输入原样返回（fail-open）。
+    """
+
+    def __init__(
+        self,
+        policies: Optional[VisionImagePolicies] = None,
+        cache_max_bytes: int = int(IMAGE_PREP_CACHE_MB * 1024 * 1024),
+        enabled: bool = IMAGE_PREP_ENABLED,
+    ):
+        self.policies = policies or VisionImagePolicies()
+        self.cache_max_bytes = cache_max_bytes
+        self.enabled = enabled
+        self._cache: "OrderedDict[Tuple[Any, ...], PreparedImage]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {
+            "pages": 0,
+            "cache_hits": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "tokens_in": 0,
+            "tokens_out": 0,
+        }
+
+    def prepare(
+        self,
+        image: ImageInput,
+        call_type: str = CALL_GRADING,
+        model_name: Optional[str] = None,
+    ) -> PreparedImage:
+        raw = _to_bytes(image)
+        policy = self.policies.for_call(call_type, model_name)
+        provider = provider_for_model(model_name)
+        key = (hashlib.blake2b(raw, digest_size=16).digest(), policy, provider)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return cached
+
+        prepared = self._prepare(raw, policy, provider)
+
+        with self._lock:
+            self.stats["pages"] += 1
+            self.stats["bytes_in"] += prepared.original_bytes
+            self.stats["bytes_out"] += len(prepared.data)
+            self.stats["tokens_in"] += prepared.original_tokens
+            self.stats["tokens_out"] += prepared.estimated_tokens
+            if key not in self._cache:
+                self._cache[key] = prepared
+                self._cache_bytes += len(prepared.data)
+            while self._cache_bytes > self.cache_max_bytes and self._cache:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted.data)
+        return prepared
+
+    def prepare_many(
+        self,
+        images: Sequence[ImageInput],
+        call_type: str = CALL_GRADING,
+        model_name: Optional[str] = None,
+    ) -> List[PreparedImage]:
+        return [self.prepare(image, call_type, model_name) for image in images]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def _prepare(self, raw: bytes, policy: VisionImagePolicy, provider: str) -> PreparedImage:
+        try:
+            source = Image.open(BytesIO(raw))
+            original_size = source.size
+            if self.enabled and source.format == "JPEG":
+                # JPEG 可在解码时按 1/2、1/4、1/8 缩小，大幅减少解码与后续处理的像素量；
+                # 要裁边时多留一些分辨率，保证裁剪后仍接近目标长边
+                target = policy.max_long_edge * (1.5 if policy.crop_margins else 1.0)
+                scale = target / max(original_size)
+                if scale < 0.5:
+                    source.draft(
+                        source.mode,
+                        (
+                            math.ceil(original_size[0] * scale),
+                            math.ceil(original_size[1] * scale),
+                        ),
+                    )
+            source.load()
+        except Exception as exc:
+            logger.debug(f"[image_preparation] 无法解码图像，原样发送: {exc}")
+            return PreparedImage(
+                data=raw,
+                mime_type="image/jpeg",
+                width=0,
+                height=0,
+                original_bytes=len(raw),
+                original_size=(0, 0),
+                estimated_tokens=0,
+                original_tokens=0,
+            )
+
+        original_tokens = estimate_vision_tokens(*original_size, provider=provider)
+        if not self.enabled:
+            return PreparedImage(
+                data=raw,
+                mime_type=_source_mime(source),
+                width=original_size[0],
+                height=original_size[1],
+                original_bytes=len(raw),
+                original_size=original_size,
+                estimated_tokens=original_tokens,
+                original_tokens=original_tokens,
+            )
+
+        image = source
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        grayscale = image.mode == "L"
+        if not grayscale and policy.allow_grayscale:
+            if _color_ratio(image) <= GRAYSCALE_MAX_COLOR_RATIO:
+                image = image.convert("L")
+                grayscale = True
+
+        skew_angle = 0.0
+        if policy.deskew:
+            skew_angle = estimate_skew_angle(image.convert("L"))
+            if abs(skew_angle) >= 0.3:
+                fill = 255 if grayscale else (255, 255, 255)
+                image = image.rotate(
+                    skew_angle, resample=Image.BICUBIC, expand=True, fillcolor=fill
+                )
+            else:
+                skew_angle = 0.0
+
+        crop_box = None
+        if policy.crop_margins:
+            box = detect_content_box(np.asarray(image.convert("L"), dtype=np.uint8))
+            if box is not None:
+                left, top, right, bottom = box
+                if (right - left) * (bottom - top) < 0.97 * image.width * image.height:
+                    image = image.crop(box)
+                    crop_box = box
+
+        if max(image.size) > policy.max_long_edge:
+            image = image.copy()
+            image.thumbnail((policy.max_long_edge, policy.max_long_edge), Image.LANCZOS)
+
+        data = pil_to_jpeg_bytes(image, quality=policy.jpeg_quality)
+        mime_type = "image/jpeg"
+        if (
+            len(data) >= len(raw)
+            and image.size == original_size
+            and crop_box is None
+            and not skew_angle
+        ):
+            # 没有几何变化且重新编码不更小时，直接发送原图
+            data, mime_type = raw, _source_mime(source)
+
+        return PreparedImage(
+            data=data,
+            mime_type=mime_type,
+            width=image.width,
+            height=image.height,
+            original_bytes=len(raw),
+            original_size=original_size,
+            estimated_tokens=estimate_vision_tokens(*image.size, provider=provider),
+            original_tokens=original_tokens,
+            grayscale=grayscale,
+            crop_box=crop_box,
+            skew_angle=skew_angle,
+        )
+
+
+_image_preparer: Optional[ImagePreparer] = None
+
+
+def get_image_preparer() -> ImagePreparer:
+    """获取进程内共享的图像预处理器"""
+    global _image_preparer
+    if _image_preparer is None:
+        _image_preparer = ImagePreparer()
+    return _image_preparer
+
+
+def prepare_vision_image(
+    image: ImageInput,
+    call_type: str = CALL_GRADING,
+    model_name: Optional[str] = None,
+) -> PreparedImage:
+    """同步预处理单页图像（命中缓存时几乎无开销）"""
+    return get_image_preparer().prepare(image, call_type, model_name)
+
+
+async def prepare_vision_images(
+    images: Sequence[ImageInput],
+    call_type: str = CALL_GRADING,
+    model_name: Optional[str] = None,
+) -> List[PreparedImage]:
+    """在线程中预处理多页图像，避免解码/缩放阻塞事件循环"""
+    if not images:
+        return []
+    return await asyncio.to_thread(
+        get_image_preparer().prepare_many, list(images), call_type, model_name
+    )
+
+
+__all__ = [
+    "CALL_ANNOTATION",
+    "CALL_GRADING",
+    "CALL_IDENTIFICATION",
+    "ImagePreparer",
+    "PreparedImage",
+    "VisionImagePolicies",
+    "VisionImagePolicy",
+    "detect_content_box",
+    "estimate_skew_angle",
+    "estimate_vision_tokens",
+    "get_image_preparer",
+    "prepare_vision_image",
+    "prepare_vision_images",
+    "provider_for_model",
+]
@@ -12,6 +12,7 @@ Requirements: 1.1, 1.2, 1.3, 9.1
 
 import asyncio
 import base64
+import functools
 import json
 import logging
 import os
@@ -26,6 +27,7 @@ from typing import (
     Callable,
     Awaitable,
     Literal,
+    Union,
 )
 
 import httpx
@@ -44,9 +46,23 @@ from ..models.grading_models import (
 from ..config.models import get_default_model
 from ..utils.error_handling import with_retry, get_error_manager
 from ..utils.llm_thinking import split_thinking_content
+from ..utils.streaming_json import QuestionDetailsStreamParser
+from ..services.image_preparation import (
+    CALL_ANNOTATION,
+    CALL_GRADING,
+    prepare_vision_images,
+)
+from ..services.missing_question_regrade import (
+    MissingQuestionRequest,
+    collect_question_pages,
+    get_missing_question_coalescer,
+    localize_question_pages,
+)
+from ..services.page_classifier import find_blank_pages
 
 if TYPE_CHECKING:
-    from ..services.rubric_registry import RubricRegistry
+    from ..services.exemplar_memory import ExemplarMemory
+    from ..services.rubric_registry import CompiledRubricIndex, RubricRegistry
 
 
 logger = logging.getLogger(__name__)
@@ -115,7 +131,8 @@ class LLMReasoningClient:
         self,
         api_key: Optional[str] = None,
         model_name: Optional[str] = None,
-        rubric_registry: Optional["RubricRegistry"] = None,
+        rubric_registry: Optional[Union["RubricRegistry", "CompiledRubricIndex"]] = None,
+        exemplar_memory: Optional["ExemplarMemory"] = None,
     ):
         """
         初始化 LLM 推理客户端
@@ -123,7 +140,8 @@ class LLMReasoningClient:
         Args:
             api_key: Google AI API 密钥
             model_name: 使用的模型名称，默认使用全局配置
-            rubric_registry: 评分标准注册中心（可选）
+            rubric_registry: 评分标准注册中心或其编译快照（可选）
+            exemplar_memory: 判例记忆库（可选），提供时整卷批改提示词附带参考判例
         """
         if model_name is None:
             model_name = get_default_model()
@@ -152,6 +170,8 @@ class LLMReasoningClient:
 
         # 集成 RubricRegistry (Requirement 1.1)
         self._rubric_registry = rubric_registry
+        self._exemplar_memory = exemplar_memory
+        self._exemplar_top_k = self._read_int_env("GRADING_EXEMPLAR_TOP_K", 3)
 
     @staticmethod
     def _read_int_env(key: str, default: int) -> int:
@@ -163,6 +183,39 @@ class LLMReasoningClient:
         except ValueError:
             return default
 
+    async def _build_exemplar_context(self, parsed_rubric: Dict[str, Any]) -> str:
+        """按题检索老师确认过的判例，拼成批改提示词的参考判例区段"""
+        if self._exemplar_memory is None or self._exemplar_top_k <= 0:
+            return ""
+        try:
+            by_question = await self._exemplar_memory.retrieve_for_rubric(
+                parsed_rubric, top_k=self._exemplar_top_k
+            )
+        except Exception as exc:
+            logger.warning(f"[grade_student] 判例检索失败，跳过参考判例: {exc}")
+            return ""
+        if not by_question:
+            return ""
+        lines = ["## 参考判例（老师确认过的批改，仅用于把握给分尺度，不得照搬分数）"]
+        for qid, exemplars in by_question.items():
+            lines.append(f"第{qid}题：")
+            for exemplar in exemplars:
+                lines.append(
+                    f"  - 学生答案：{exemplar.student_answer_text[:200]}；"
+                    f"得分 {exemplar.score}/{exemplar.max_score}；"
+                    f"教师评语：{exemplar.teacher_feedback[:200]}"
+                )
+        return "\n".join(lines)
+
+    async def _vision_image_parts(
+        self,
+        images: List[Any],
+        call_type: str = CALL_GRADING,
+    ) -> List[Dict[str, Any]]:
+        """预处理页面图像（按内容哈希缓存）并构造消息中的图像片段"""
+        prepared = await prepare_vision_images(images, call_type, self.model_name)
+        return [item.content_part() for item in prepared]
+
     def _limit_questions_for_prompt(self, questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         max_questions = self._max_prompt_questions
         if max_questions <= 0:
@@ -176,12 +229,14 @@ class LLMReasoningClient:
         return criteria[:max_criteria]
 
     @property
-    def rubric_registry(self) -> Optional["RubricRegistry"]:
+    def rubric_registry(self) -> Optional[Union["RubricRegistry", "CompiledRubricIndex"]]:
         """获取评分标准注册中心"""
         return self._rubric_registry
 
     @rubric_registry.setter
-    def rubric_registry(self, registry: "RubricRegistry") -> None:
+    def rubric_registry(
+        self, registry: Union["RubricRegistry", "CompiledRubricIndex"]
+    ) -> None:
         """设置评分标准注册中心"""
         self._rubric_registry = registry
 
@@ -589,10 +644,8 @@ class LLMReasoningClient:
         """
         try:
             message = HumanMessage(
-                content=[
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": f"data:image/png;base64,{image_b64}"},
-                ]
+                content=[{"type": "text", "text": prompt}]
+                + await self._vision_image_parts([image_b64])
             )
 
             if stream_callback:
@@ -660,10 +713,8 @@ class LLMReasoningClient:
     async def _call_vision_api_stream(self, image_b64: str, prompt: str) -> AsyncIterator[str]:
         """流式调用视觉 API"""
         message = HumanMessage(
-            content=[
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": f"data:image/png;base64,{image_b64}"},
-            ]
+            content=[{"type": "text", "text": prompt}]
+            + await self._vision_image_parts([image_b64])
         )
         async for chunk in self.llm.astream([message]):
             yield self._extract_text_from_response(chunk.content)
@@ -729,10 +780,8 @@ class LLMReasoningClient:
 
         # 构建消息
         message = HumanMessage(
-            content=[
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": f"data:image/jpeg;base64,{question_image_b64}"},
-            ]
+            content=[{"type": "text", "text": prompt}]
+            + await self._vision_image_parts([question_image_b64])
         )
 
         # 调用 LLM
@@ -901,14 +950,8 @@ class LLMReasoningClient:
         # 构建消息内容
         content = [{"type": "text", "text": prompt}]
 
-        # 添加图像
-        for img_bytes in images:
-            if isinstance(img_bytes, bytes):
-                img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-            else:
-                img_b64 = img_bytes  # 已经是 base64 字符串
-
-            content.append({"type": "image_url", "image_url": f"data:image/png;base64,{img_b64}"})
+        # 添加图像（bytes 或 base64 字符串）
+        content.extend(await self._vision_image_parts(images))
 
         # 调用 LLM
         # 调用 LLM (使用流式)
@@ -1988,49 +2031,52 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
             )
         return placeholders
 
-    async def _grade_missing_questions(
+    def _select_pages_for_missing_questions(
         self,
         images: List[bytes],
-        student_key: str,
         parsed_rubric: Dict[str, Any],
         missing_ids: List[str],
-        context_info: str,
-        stream_callback: Optional[Callable[[str, str], Awaitable[None]]] = None,
-    ) -> List[Dict[str, Any]]:
-        if not missing_ids:
-            return []
-        missing_ids_text = ", ".join(missing_ids)
-        rubric_info = self._build_student_grading_rubric_info(
-            parsed_rubric,
-            question_ids=missing_ids,
-        )
-        prompt = (
-            "You are a grading assistant. Grade ONLY the following questions for "
-            f"{student_key}: {missing_ids_text}.\n\n"
-            f"Rubric:\n{rubric_info}\n\n"
-            f"Context:\n{context_info}\n\n"
-            "Return JSON only with this structure:\n"
-            '{"question_details": [{"question_id": "1", "score": 0, "max_score": 0, '
-            '"student_answer": "", "is_correct": false, "feedback": "", '
-            '"confidence": 0.0, "scoring_point_results": []}]}\n'
-            "Rules:\n"
-            "- Only include the specified questions.\n"
-            "- If an answer is missing or unclear, score 0 and explain briefly in feedback.\n"
-            "- Return valid JSON only.\n"
+        page_indices: Optional[List[int]] = None,
+        page_contexts: Optional[Dict[int, Dict[str, Any]]] = None,
+        question_pages: Optional[Dict[str, Any]] = None,
+    ) -> List[tuple]:
+        """按题定位缺题所在页面，返回 (全局页码, 图像) 列表"""
+        if page_indices and len(page_indices) == len(images):
+            pages = list(page_indices)
+        else:
+            pages = list(range(len(images)))
+        localized = localize_question_pages(
+            question_order=self._get_expected_question_ids(parsed_rubric),
+            target_ids=missing_ids,
+            page_indices=pages,
+            question_pages=question_pages,
+            page_contexts=page_contexts,
+            normalize=self._normalize_question_id,
         )
-        content = [{"type": "text", "text": prompt}]
-        for img_bytes in images:
-            if isinstance(img_bytes, bytes):
-                img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-            else:
-                img_b64 = img_bytes
-            content.append(
-                {
-                    "type": "image_url",
-                    "image_url": f"data:image/jpeg;base64,{img_b64}",
-                }
-            )
-        message = HumanMessage(content=content)
+        wanted = set()
+        for qpages in localized.values():
+            wanted.update(qpages)
+        return [(page, image) for page, image in zip(pages, images) if page in wanted]
+
+    @staticmethod
+    async def _feed_question_stream(
+        parser: Optional[QuestionDetailsStreamParser],
+        text: str,
+        stream_callback: Optional[Callable[[str, str], Awaitable[None]]] = None,
+    ) -> None:
+        """把输出分片交给增量解析器；每道新完成的题目以 "question" 事件回调（JSON 文本）"""
+        if parser is None:
+            return
+        for detail in parser.feed(text):
+            if stream_callback:
+                await stream_callback("question", json.dumps(detail, ensure_ascii=False))
+
+    async def _stream_completion_text(
+        self,
+        message: HumanMessage,
+        stream_callback: Optional[Callable[[str, str], Awaitable[None]]] = None,
+        question_stream: Optional[QuestionDetailsStreamParser] = None,
+    ) -> str:
         full_response = ""
         async for chunk in self.llm.astream([message]):
             content_chunk = chunk.content
@@ -2040,6 +2086,7 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
                 full_response += content_chunk
                 if stream_callback:
                     await stream_callback("output", content_chunk)
+                await self._feed_question_stream(question_stream, content_chunk, stream_callback)
             elif isinstance(content_chunk, list):
                 for part in content_chunk:
                     text_part = ""
@@ -2051,19 +2098,14 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
                         full_response += text_part
                         if stream_callback:
                             await stream_callback("output", text_part)
-        if not full_response:
-            return []
-        try:
-            json_text = self._extract_json_from_text(full_response)
-            payload = self._load_json_with_repair(json_text)
-        except Exception:
-            return []
-        raw_details = (
-            payload.get("question_details")
-            or payload.get("questionDetails")
-            or payload.get("questions")
-            or []
-        )
+                        await self._feed_question_stream(question_stream, text_part, stream_callback)
+        return full_response
+
+    def _filter_missing_question_details(
+        self,
+        raw_details: Any,
+        missing_ids: List[str],
+    ) -> List[Dict[str, Any]]:
         if not isinstance(raw_details, list):
             return []
         normalized_missing = {self._normalize_question_id(qid) for qid in missing_ids if qid}
@@ -2077,6 +2119,181 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
                 normalized.append(normalized_detail)
         return normalized
 
+    async def _grade_missing_question_group(
+        self,
+        parsed_rubric: Dict[str, Any],
+        requests: List[MissingQuestionRequest],
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        一次调用补批一组学生的缺题
+
+        每张图片前附带 [学生标签] 与全局页码；多个学生时要求按标签分组返回。
+        """
+        question_ids: List[str] = []
+        for request in requests:
+            for qid in request.missing_ids:
+                if qid not in question_ids:
+                    question_ids.append(qid)
+        rubric_info = self._build_student_grading_rubric_info(
+            parsed_rubric,
+            question_ids=question_ids,
+        )
+        labels = [f"S{i + 1}" for i in range(len(requests))]
+        detail_schema = (
+            '{"question_id": "1", "score": 0, "max_score": 0, '
+            '"student_answer": "", "is_correct": false, "feedback": "", '
+            '"confidence": 0.0, "source_pages": [], "scoring_point_results": []}'
+        )
+        if len(requests) == 1:
+            request = requests[0]
+            prompt = (
+                "You are a grading assistant. Grade ONLY the following questions for "
+                f"{request.student_key}: {', '.join(request.missing_ids)}.\n"
+                "Only the pages most likely to contain these answers are attached; "
+                "each image is preceded by its page number.\n\n"
+                f"Rubric:\n{rubric_info}\n\n"
+                f"Context:\n{request.context_info}\n\n"
+                "Return JSON only with this structure:\n"
+                f'{{"question_details": [{detail_schema}]}}\n'
+            )
+        else:
+            assignments = "\n".join(
+                f"- {label} ({request.student_key}): {', '.join(request.missing_ids)}"
+                for label, request in zip(labels, requests)
+            )
+            prompt = (
+                "You are a grading assistant. The attached pages belong to several "
+                "different students; each image is preceded by the student label and "
+                "page number. Grade ONLY the listed questions for each student, using "
+                "only that student's pages:\n"
+                f"{assignments}\n\n"
+                f"Rubric:\n{rubric_info}\n\n"
+                "Return JSON only with this structure:\n"
+                f'{{"students": [{{"student": "S1", "question_details": [{detail_schema}]}}]}}\n'
+            )
+        prompt += (
+            "Rules:\n"
+            "- Only include the specified questions.\n"
+            "- If an answer is missing or unclear, score 0 and explain briefly in feedback.\n"
+            "- Return valid JSON only.\n"
+        )
+        content = [{"type": "text", "text": prompt}]
+        image_parts = iter(
+            await self._vision_image_parts(
+                [image for request in requests for _page, image in request.pages]
+            )
+        )
+        for label, request in zip(labels, requests):
+            for page, _image in request.pages:
+                page_label = f"page {page}" if len(requests) == 1 else f"[{label}] page {page}"
+                content.append({"type": "text", "text": page_label})
+                content.append(next(image_parts))
+        message = HumanMessage(content=content)
+        stream_callback = requests[0].stream_callback if len(requests) == 1 else None
+        # 单个学生时逐题增量解析：输出截断或中断时保留已完成的题目
+        question_stream = (
+            QuestionDetailsStreamParser(loads=self._load_json_with_repair)
+            if len(requests) == 1
+            else None
+        )
+        results: List[List[Dict[str, Any]]] = [[] for _ in requests]
+        try:
+            full_response = await self._stream_completion_text(
+                message, stream_callback, question_stream
+            )
+        except Exception:
+            if question_stream is None or not question_stream.items:
+                raise
+            full_response = ""
+        payload: Any = None
+        if full_response:
+            try:
+                json_text = self._extract_json_from_text(full_response)
+                payload = self._load_json_with_repair(json_text)
+            except Exception:
+                payload = None
+        if not isinstance(payload, dict) and question_stream is not None and question_stream.items:
+            payload = {"question_details": list(question_stream.items)}
+        if not isinstance(payload, dict):
+            return results
+
+        raw_by_request: Dict[int, Any] = {}
+        entries = payload.get("students")
+        if isinstance(entries, list):
+            by_label = {label: i for i, label in enumerate(labels)}
+            by_key = {request.student_key: i for i, request in enumerate(requests)}
+            for entry in entries:
+                if not isinstance(entry, dict):
+                    continue
+                tag = str(entry.get("student") or entry.get("label") or "").strip()
+                i = by_label.get(tag, by_key.get(entry.get("student_key") or tag))
+                if i is None:
+                    continue
+                raw_by_request[i] = (
+                    entry.get("question_details") or entry.get("questionDetails") or []
+                )
+        elif len(requests) == 1:
+            raw_by_request[0] = (
+                payload.get("question_details")
+                or payload.get("questionDetails")
+                or payload.get("questions")
+                or []
+            )
+        for i, request in enumerate(requests):
+            results[i] = self._filter_missing_question_details(
+                raw_by_request.get(i), request.missing_ids
+            )
+        return results
+
+    async def _grade_missing_questions(
+        self,
+        images: List[bytes],
+        student_key: str,
+        parsed_rubric: Dict[str, Any],
+        missing_ids: List[str],
+        context_info: str,
+        stream_callback: Optional[Callable[[str, str], Awaitable[None]]] = None,
+        page_indices: Optional[List[int]] = None,
+        page_contexts: Optional[Dict[int, Dict[str, Any]]] = None,
+        question_pages: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        补批缺失的题目
+
+        只发送定位到的页面；同一评分标准下并发的缺题学生由合并器打包为有限次调用。
+        """
+        if not missing_ids:
+            return []
+        pages = self._select_pages_for_missing_questions(
+            images,
+            parsed_rubric,
+            missing_ids,
+            page_indices=page_indices,
+            page_contexts=page_contexts,
+            question_pages=question_pages,
+        )
+        if not pages:
+            return []
+        request = MissingQuestionRequest(
+            student_key=student_key,
+            missing_ids=list(missing_ids),
+            pages=pages,
+            context_info=context_info,
+            stream_callback=stream_callback,
+        )
+        from ..services.rubric_registry import compile_rubric_index
+
+        group_key = (
+            self.model_name,
+            compile_rubric_index(parsed_rubric),
+            parsed_rubric.get("rubric_context") or "",
+        )
+        return await get_missing_question_coalescer().submit(
+            group_key,
+            functools.partial(self._grade_missing_question_group, parsed_rubric),
+            request,
+        )
+
     async def _ensure_student_result_complete(
         self,
         result: Dict[str, Any],
@@ -2085,9 +2302,15 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
         images: List[bytes],
         context_info: str,
         stream_callback: Optional[Callable[[str, str], Awaitable[None]]] = None,
+        page_indices: Optional[List[int]] = None,
+        page_contexts: Optional[Dict[int, Dict[str, Any]]] = None,
+        question_pages: Optional[Dict[str, Any]] = None,
+        force: bool = False,
     ) -> Dict[str, Any]:
-        max_passes = self._read_int_env("GRADING_COMPLETION_PASSES", 1)
-        if max_passes <= 0:
+        # 补批会额外调用模型，默认关闭（GRADING_COMPLETION_PASSES>0 开启）；
+        # 输出截断时已批完的题目之外全部缺失，无论开关都要补批（force）
+        max_passes = self._read_int_env("GRADING_COMPLETION_PASSES", 0)
+        if max_passes <= 0 and not force:
             return result
         expected_ids = self._get_expected_question_ids(parsed_rubric)
         if not expected_ids:
@@ -2099,6 +2322,8 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
         missing_ids = [qid for qid in expected_ids if qid not in existing_ids]
         if not missing_ids:
             return result
+        if question_pages is None:
+            question_pages = collect_question_pages(details, self._normalize_question_id)
         completion_details = await self._grade_missing_questions(
             images=images,
             student_key=student_key,
@@ -2106,6 +2331,9 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
             missing_ids=missing_ids,
             context_info=context_info,
             stream_callback=stream_callback,
+            page_indices=page_indices,
+            page_contexts=page_contexts,
+            question_pages=question_pages,
         )
         if completion_details:
             merged = self._merge_question_details(details, completion_details)
@@ -2121,6 +2349,98 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
         result["max_score"] = max_score
         return result
 
+    async def regrade_questions(
+        self,
+        images: List[bytes],
+        student_key: str,
+        parsed_rubric: Dict[str, Any],
+        question_ids: List[str],
+        context_info: str = "",
+        stream_callback: Optional[Callable[[str, str], Awaitable[None]]] = None,
+        page_indices: Optional[List[int]] = None,
+        page_contexts: Optional[Dict[int, Dict[str, Any]]] = None,
+        question_pages: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        用本客户端的模型重批指定题目
+
+        与缺题补批共用按题定位页面与跨学生合并调用，供模型级联把
+        低置信度题目升级到更强的模型。
+        """
+        return await self._grade_missing_questions(
+            images=images,
+            student_key=student_key,
+            parsed_rubric=parsed_rubric,
+            missing_ids=[self._normalize_question_id(qid) for qid in question_ids],
+            context_info=context_info,
+            stream_callback=stream_callback,
+            page_indices=page_indices,
+            page_contexts=page_contexts,
+            question_pages=question_pages,
+        )
+
+    async def resume_student_from_partial(
+        self,
+        images: List[bytes],
+        student_key: str,
+        parsed_rubric: Dict[str, Any],
+        partial_details: List[Dict[str, Any]],
+        stream_callback: Optional[Callable[[str, str], Awaitable[None]]] = None,
+        page_indices: Optional[List[int]] = None,
+        page_contexts: Optional[Dict[int, Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """
+        从部分检查点续批学生
+
+        上次中断前已流式完成的题目直接复用，只把缺失的题目按题定位页面补批。
+        """
+        details = [
+            self._normalize_question_detail(detail, page_indices[0] if page_indices else 0)
+            for detail in partial_details
+            if isinstance(detail, dict)
+        ]
+        existing_ids = self._collect_question_detail_ids(details)
+        missing_ids = [
+            qid for qid in self._get_expected_question_ids(parsed_rubric) if qid not in existing_ids
+        ]
+        if missing_ids:
+            regraded = await self.regrade_questions(
+                images,
+                student_key,
+                parsed_rubric,
+                missing_ids,
+                stream_callback=stream_callback,
+                page_indices=page_indices,
+                page_contexts=page_contexts,
+                question_pages=collect_question_pages(details, self._normalize_question_id),
+            )
+            details = self._merge_question_details(details, regraded)
+            still_missing = [
+                qid for qid in missing_ids if qid not in self._collect_question_detail_ids(details)
+            ]
+            if still_missing:
+                details = self._merge_question_details(
+                    details,
+                    self._build_missing_question_placeholders(still_missing, parsed_rubric),
+                )
+        total_score, max_score = self._sum_question_detail_scores(details)
+        confidences = [self._safe_float(detail.get("confidence", 0.0)) for detail in details]
+        logger.info(
+            f"[grade_student] 从部分检查点续批: student={student_key}, "
+            f"复用 {len(existing_ids)} 题, 补批 {len(missing_ids)} 题"
+        )
+        return {
+            "status": "completed",
+            "student_key": student_key,
+            "total_score": total_score,
+            "max_score": max_score or parsed_rubric.get("total_score", 0),
+            "confidence": sum(confidences) / len(confidences) if confidences else 0.0,
+            "question_details": details,
+            "overall_feedback": "",
+            "reused_question_ids": sorted(existing_ids),
+            "regraded_question_ids": missing_ids,
+        }
+
     def _build_student_grading_rubric_info(
         self,
         parsed_rubric: Dict[str, Any],
@@ -2308,19 +2628,20 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
 
         # 构建包含所有图片的消息内容
         content = [{"type": "text", "text": prompt}]
-        for i, image in enumerate(images):
-            img_b64 = base64.b64encode(image).decode("utf-8")
-            content.append({"type": "image_url", "image_url": f"data:image/png;base64,{img_b64}"})
+        content.extend(await self._vision_image_parts(images))
 
         message = HumanMessage(content=content)
 
-        # 流式调用
+        # 流式调用；每道题的对象闭合后额外产出一条 question 事件（内容为该题 JSON）
+        question_stream = QuestionDetailsStreamParser(loads=self._load_json_with_repair)
         async for chunk in self.llm.astream([message]):
             output_text, thinking_text = split_thinking_content(chunk.content)
             if thinking_text:
                 yield {"type": "thinking", "content": thinking_text}
             if output_text:
                 yield {"type": "output", "content": output_text}
+                for detail in question_stream.feed(output_text):
+                    yield {"type": "question", "content": json.dumps(detail, ensure_ascii=False)}
 
     def _build_batch_rubric_info(self, parsed_rubric: Dict[str, Any]) -> str:
         """构建批量批改的评分标准信息"""
@@ -2751,39 +3072,9 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
         Returns:
             str: 格式化的评分标准文本
         """
-        lines = [
-            f"第{rubric.question_id}题 (满分{rubric.max_score}分):",
-            (
-                f"  题目: {rubric.question_text[:200]}..."
-                if len(rubric.question_text) > 200
-                else f"  题目: {rubric.question_text}"
-            ),
-        ]
+        from ..services.rubric_registry import format_rubric_for_prompt
 
-        # 添加得分点
-        if rubric.scoring_points:
-            lines.append("  得分点:")
-            for sp in rubric.scoring_points:
-                required = "【必须】" if sp.is_required else "【可选】"
-                lines.append(f"    - {required} {sp.description} ({sp.score}分)")
-
-        # 添加标准答案
-        if rubric.standard_answer:
-            answer_preview = (
-                rubric.standard_answer[:150] + "..."
-                if len(rubric.standard_answer) > 150
-                else rubric.standard_answer
-            )
-            lines.append(f"  标准答案: {answer_preview}")
-
-        # 添加另类解法 (Requirement 1.3)
-        if rubric.alternative_solutions:
-            lines.append("  另类解法:")
-            for alt in rubric.alternative_solutions:
-                lines.append(f"    - {alt.description} (最高{alt.max_score}分)")
-                lines.append(f"      条件: {alt.scoring_conditions}")
-
-        return "\n".join(lines)
+        return format_rubric_for_prompt(rubric)
 
     async def build_dynamic_rubric_context(
         self,
@@ -2801,8 +3092,15 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
         if not self._rubric_registry:
             return ""
 
+        # 编译快照已预先格式化各题片段
+        get_fragment = getattr(self._rubric_registry, "get_prompt_fragment", None)
         rubric_texts = []
         for qid in question_ids:
+            if get_fragment is not None:
+                fragment = get_fragment(qid)
+                if fragment:
+                    rubric_texts.append(fragment)
+                continue
             rubric = await self.get_rubric_for_question(qid)
             if rubric:
                 rubric_texts.append(self._format_rubric_for_prompt(rubric))
@@ -3370,6 +3668,45 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
                 "question_details": [],
             }
 
+        # 本地检测空白页（双面扫描的背面、未作答的答题纸），不送入批改提示词
+        positions = (
+            list(page_indices)
+            if page_indices and len(page_indices) == len(images)
+            else list(range(len(images)))
+        )
+        blank_positions = set(await asyncio.to_thread(find_blank_pages, images))
+        blank_pages = [positions[i] for i in sorted(blank_positions)]
+        if len(blank_positions) == len(images):
+            logger.info(f"[grade_student] 学生 {student_key} 的 {len(images)} 页均为空白，跳过模型调用")
+            details = self._build_missing_question_placeholders(
+                self._get_expected_question_ids(parsed_rubric), parsed_rubric
+            )
+            # 整份空白可能是扫描或空白检测出错（如铅笔作答过浅）：低置信度并交人工复核
+            for detail in details:
+                detail["needs_review"] = True
+                detail["review_reasons"] = ["all_pages_blank"]
+            _, max_score = self._sum_question_detail_scores(details)
+            return {
+                "status": "completed",
+                "student_key": student_key,
+                "total_score": 0.0,
+                "max_score": max_score or parsed_rubric.get("total_score", 0),
+                "confidence": 0.0,
+                "needs_review": True,
+                "review_reasons": ["all_pages_blank"],
+                "question_details": details,
+                "overall_feedback": "No answer detected.",
+                "blank_pages": blank_pages,
+            }
+        if blank_positions:
+            images = [img for i, img in enumerate(images) if i not in blank_positions]
+            page_indices = [p for i, p in enumerate(positions) if i not in blank_positions]
+            if page_contexts:
+                page_contexts = {
+                    idx: ctx for idx, ctx in page_contexts.items() if idx not in blank_pages
+                }
+            logger.info(f"[grade_student] 学生 {student_key} 跳过空白页: {blank_pages}")
+
         logger.info(f"[grade_student] 开始批改学生 {student_key}，共 {len(images)} 页")
 
         # 构建评分标准上下文
@@ -3421,6 +3758,8 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
                     )
             page_context_info = "\n".join(context_lines)
 
+        exemplar_context = await self._build_exemplar_context(parsed_rubric)
+
         # 构建批改提示词
         prompt = f"""你是一位专业的阅卷教师，请仔细分析以下学生的答题图像并进行精确评分，同时输出**逐步骤**的批注坐标信息。
 
@@ -3437,6 +3776,8 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
 
 {page_context_info}
 
+{exemplar_context}
+
 ## 批改原则（必须遵守）
 1. **严格依据评分标准**：每个得分点必须在评分标准中有明确依据
 2. **不得超出标准范围**：不能给评分标准之外的分数
@@ -3529,45 +3870,56 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
 """
 
         try:
-            # 将图像转为 base64
+            # 预处理图像（缩放、灰度、重新编码）并转为 data URL
             content = [{"type": "text", "text": prompt}]
-            for idx, img_bytes in enumerate(images):
-                if isinstance(img_bytes, bytes):
-                    img_b64 = base64.b64encode(img_bytes).decode("utf-8")
-                else:
-                    img_b64 = img_bytes
-                content.append(
-                    {"type": "image_url", "image_url": f"data:image/jpeg;base64,{img_b64}"}
-                )
+            content.extend(await self._vision_image_parts(images))
 
             message = HumanMessage(content=content)
 
-            # 流式调用 LLM
+            # 流式调用 LLM；每道题的结果在对象闭合时即取出（截断时保留已完成的题目）
             full_response = ""
             thinking_content = ""
+            question_stream = QuestionDetailsStreamParser(loads=self._load_json_with_repair)
 
-            async for chunk in self.llm.astream([message]):
-                chunk_content = chunk.content
-                if chunk_content:
-                    if isinstance(chunk_content, str):
-                        full_response += chunk_content
-                        if stream_callback:
-                            await stream_callback("output", chunk_content)
-                    elif isinstance(chunk_content, list):
-                        for part in chunk_content:
-                            if isinstance(part, str):
-                                full_response += part
-                                if stream_callback:
-                                    await stream_callback("output", part)
-                            elif isinstance(part, dict):
-                                if part.get("type") == "thinking":
-                                    thinking_content += part.get("thinking", "")
-                                    if stream_callback:
-                                        await stream_callback("thinking", part.get("thinking", ""))
-                                elif "text" in part:
-                                    full_response += part["text"]
+            try:
+                async for chunk in self.llm.astream([message]):
+                    chunk_content = chunk.content
+                    if chunk_content:
+                        if isinstance(chunk_content, str):
+                            full_response += chunk_content
+                            if stream_callback:
+                                await stream_callback("output", chunk_content)
+                            await self._feed_question_stream(
+                                question_stream, chunk_content, stream_callback
+                            )
+                        elif isinstance(chunk_content, list):
+                            for part in chunk_content:
+                                if isinstance(part, str):
+                                    full_response += part
                                     if stream_callback:
-                                        await stream_callback("output", part["text"])
+                                        await stream_callback("output", part)
+                                    await self._feed_question_stream(
+                                        question_stream, part, stream_callback
+                                    )
+                                elif isinstance(part, dict):
+                                    if part.get("type") == "thinking":
+                                        thinking_content += part.get("thinking", "")
+                                        if stream_callback:
+                                            await stream_callback("thinking", part.get("thinking", ""))
+                                    elif "text" in part:
+                                        full_response += part["text"]
+                                        if stream_callback:
+                                            await stream_callback("output", part["text"])
+                                        await self._feed_question_stream(
+                                            question_stream, part["text"], stream_callback
+                                        )
+            except Exception as exc:
+                if not question_stream.items:
+                    raise
+                logger.warning(
+                    f"[grade_student] 流式输出中断: student={student_key}, "
+                    f"已完成 {len(question_stream.items)} 题，其余题目补批: {exc}"
+                )
 
             # 分离思考内容和输出内容
             output_text, extracted_thinking = split_thinking_content(full_response)
@@ -3594,6 +3946,21 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
             if result is None:
                 result = self._parse_page_break_output(output_text, student_key)
 
+            # 输出被截断或格式损坏：保留流式解析出的完整题目，缺失的题目由补批处理
+            if result is None and question_stream.items:
+                logger.warning(
+                    f"[grade_student] 输出不完整，使用流式解析的 {len(question_stream.items)} 道题: "
+                    f"student={student_key}"
+                )
+                # 截断时缺少整体评价与模型自评，降低置信度并交人工复核
+                result = {
+                    "question_details": list(question_stream.items),
+                    "stream_truncated": True,
+                    "confidence": 0.5,
+                    "needs_review": True,
+                    "review_reasons": ["stream_truncated"],
+                }
+
             if result is None:
                 logger.error(f"[grade_student] JSON 解析失败: {json_text[:500]}")
                 return {
@@ -3622,7 +3989,10 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
             if "question_details" not in result:
                 result["question_details"] = []
 
-            # 规范化 question_details
+            # 规范化 question_details（先记录模型明确给出的页码，供缺题定位）
+            question_pages = collect_question_pages(
+                result.get("question_details", []), self._normalize_question_id
+            )
             normalized_details = []
             for detail in result.get("question_details", []):
                 normalized = self._normalize_question_detail(
@@ -3631,6 +4001,22 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
                 normalized_details.append(normalized)
             result["question_details"] = normalized_details
 
+            # 补批漏掉的题目：只发送定位到的页面
+            result = await self._ensure_student_result_complete(
+                result,
+                parsed_rubric,
+                student_key,
+                images,
+                page_context_info,
+                stream_callback=stream_callback,
+                page_indices=page_indices,
+                page_contexts=page_contexts,
+                question_pages=question_pages,
+                force=bool(result.get("stream_truncated")),
+            )
+
+            result["blank_pages"] = blank_pages
+
             logger.info(
                 f"[grade_student] 批改完成: student={student_key}, "
                 f"score={result.get('total_score')}/{result.get('max_score')}, "
@@ -3674,10 +4060,8 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
         
         for attempt in range(max_retries):
             try:
-                content = [
-                    {"type": "text", "text": prompt},
-                    {"type": "image_url", "image_url": f"data:image/jpeg;base64,{image_base64}"},
-                ]
+                content = [{"type": "text", "text": prompt}]
+                content.extend(await self._vision_image_parts([image_base64], CALL_ANNOTATION))
 
                 system_message = SystemMessage(content=ANNOTATION_SYSTEM_PROMPT)
                 message = HumanMessage(content=content)
@@ -3752,13 +4136,9 @@ Student assist: explain mistakes and how to improve, step-by-step if needed.
         for attempt in range(max_retries):
             try:
                 content: List[Dict[str, Any]] = [{"type": "text", "text": prompt}]
-                for image_base64 in image_base64_list:
-                    content.append(
-                        {
-                            "type": "image_url",
-                            "image_url": f"data:image/jpeg;base64,{image_base64}",
-                        }
-                    )
+                content.extend(
+                    await self._vision_image_parts(image_base64_list, CALL_ANNOTATION)
+                )
 
                 system_message = SystemMessage(content=ANNOTATION_SYSTEM_PROMPT)
                 message = HumanMessage(content=content)
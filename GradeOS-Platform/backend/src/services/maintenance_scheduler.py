@@ -0,0 +1,306 @@
+"""Background maintenance scheduler.
+
+Runs housekeeping jobs (assistant conversation expiry, grading retention, ...)
+on fixed intervals inside the API lifespan so request handlers never do
+maintenance work inline.
+
+Each job run is guarded by a cross-replica lock:
+- Redis `SET NX PX` when a Redis client is available.
+- Postgres session advisory lock otherwise.
+- No lock (single process) when neither backend is available.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from src.utils.database import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCK_PREFIX = "gradeos:maintenance"
+DEFAULT_EXPIRY_INTERVAL_SECONDS = int(
+    os.getenv("ASSISTANT_CONVERSATION_EXPIRY_INTERVAL_SECONDS", "60")
+)
+DEFAULT_EXPIRY_BATCH_SIZE = int(os.getenv("ASSISTANT_CONVERSATION_EXPIRY_BATCH_SIZE", "500"))
+DEFAULT_EXPIRY_MAX_ROUNDS = 200
+DEFAULT_CANARY_MONITOR_INTERVAL_SECONDS = int(os.getenv("CANARY_MONITOR_INTERVAL_SECONDS", "60"))
+DEFAULT_SAGA_RECOVERY_INTERVAL_SECONDS = int(os.getenv("SAGA_RECOVERY_INTERVAL_SECONDS", "60"))
+
+# Delete the lock only if we still own it.
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+def _positive_int(value: Any, fallback: int) -> int:
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        return fallback
+    return parsed if parsed > 0 else fallback
+
+
+@dataclass
+class MaintenanceJob:
+    """A periodic housekeeping job.
+
+    `run` returns the number of rows processed in that run.
+    """
+
+    name: str
+    run: Callable[[], Awaitable[int]]
+    interval_seconds: float
+    run_immediately: bool = True
+    lock_ttl_seconds: float = 600.0
+
+
+@dataclass
+class MaintenanceJobStats:
+    runs: int = 0
+    skipped_locked: int = 0
+    failures: int = 0
+    rows_processed: int = 0
+    last_rows: int = 0
+    last_duration_ms: float = 0.0
+    last_run_at: Optional[str] = None
+    last_error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "skipped_locked": self.skipped_locked,
+            "failures": self.failures,
+            "rows_processed": self.rows_processed,
+            "last_rows": self.last_rows,
+            "last_duration_ms": round(self.last_duration_ms, 2),
+            "last_run_at": self.last_run_at,
+            "last_error": self.last_error,
+        }
+
+
+class MaintenanceScheduler:
+    """Runs registered jobs on intervals, one replica per job at a time."""
+
+    def __init__(
+        self,
+        *,
+        redis_client: Optional[Any] = None,
+        use_db_lock: bool = True,
+        lock_prefix: str = DEFAULT_LOCK_PREFIX,
+    ) -> None:
+        self._redis = redis_client
+        self._use_db_lock = use_db_lock
+        self._lock_prefix = lock_prefix
+        self._jobs: Dict[str, MaintenanceJob] = {}
+        self._stats: Dict[str, MaintenanceJobStats] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def is_running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def register(self, job: MaintenanceJob) -> None:
+        if job.name in self._jobs:
+            raise ValueError(f"maintenance job already registered: {job.name}")
+        self._jobs[job.name] = job
+        self._stats[job.name] = MaintenanceJobStats()
+
+    def job_names(self) -> List[str]:
+        return list(self._jobs)
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+    def start(self) -> None:
+        if self.is_running:
+            return
+        self._tasks = [
+            asyncio.create_task(self._job_loop(job), name=f"maintenance:{job.name}")
+            for job in self._jobs.values()
+        ]
+
+    async def stop(self) -> None:
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        for task in tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception:
+                logger.warning("[Maintenance] job task did not shut down cleanly.", exc_info=True)
+
+    async def run_job_once(self, name: str) -> Optional[int]:
+        """Run a job once under its lock.
+
+        Returns rows processed, or None when another replica holds the lock
+        or the job failed.
+        """
+        job = self._jobs[name]
+        stats = self._stats[name]
+        async with self._acquire_lock(job) as acquired:
+            if not acquired:
+                stats.skipped_locked += 1
+                return None
+            started = time.perf_counter()
+            stats.last_run_at = datetime.now(timezone.utc).isoformat()
+            try:
+                rows = int(await job.run() or 0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                stats.failures += 1
+                stats.last_error = str(exc) or repr(exc)
+                logger.warning("[Maintenance] job %s failed: %s", name, exc)
+                return None
+            finally:
+                stats.last_duration_ms = (time.perf_counter() - started) * 1000
+
+            stats.runs += 1
+            stats.last_rows = rows
+            stats.rows_processed += rows
+            stats.last_error = None
+            if rows:
+                logger.info(
+                    "[Maintenance] job %s processed %s rows in %.1fms",
+                    name,
+                    rows,
+                    stats.last_duration_ms,
+                )
+            return rows
+
+    async def _job_loop(self, job: MaintenanceJob) -> None:
+        if not job.run_immediately:
+            await asyncio.sleep(job.interval_seconds)
+        while True:
+            await self.run_job_once(job.name)
+            await asyncio.sleep(job.interval_seconds)
+
+    @asynccontextmanager
+    async def _acquire_lock(self, job: MaintenanceJob) -> AsyncIterator[bool]:
+        key = f"{self._lock_prefix}:{job.name}"
+
+        if self._redis is not None:
+            token = uuid.uuid4().hex
+            try:
+                acquired = bool(
+                    await self._redis.set(
+                        key, token, nx=True, px=int(job.lock_ttl_seconds * 1000)
+                    )
+                )
+            except Exception as exc:
+                logger.warning("[Maintenance] redis lock failed for %s: %s", job.name, exc)
+                acquired = False
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    try:
+                        await self._redis.eval(_RELEASE_LOCK_SCRIPT, 1, key, token)
+                    except Exception as exc:
+                        logger.debug("[Maintenance] redis unlock failed for %s: %s", job.name, exc)
+            return
+
+        if self._use_db_lock and db.is_available:
+            async with db.connection() as conn:
+                result = await conn.execute(
+                    "SELECT pg_try_advisory_lock(hashtext(%s)) AS locked", (key,)
+                )
+                row = await result.fetchone()
+                try:
+                    locked = bool(row["locked"])
+                except Exception:
+                    locked = bool(row[0]) if row else False
+                try:
+                    yield locked
+                finally:
+                    if locked:
+                        await conn.execute("SELECT pg_advisory_unlock(hashtext(%s))", (key,))
+            return
+
+        yield True
+
+
+async def expire_assistant_conversations_job(
+    *,
+    batch_size: Optional[int] = None,
+    max_rounds: int = DEFAULT_EXPIRY_MAX_ROUNDS,
+) -> int:
+    """Expire stale assistant conversations in bounded slices."""
+    from src.db.postgres_store import expire_assistant_conversations
+
+    limit = _positive_int(batch_size or DEFAULT_EXPIRY_BATCH_SIZE, 500)
+    total = 0
+    for _ in range(max_rounds):
+        updated = await asyncio.to_thread(expire_assistant_conversations, limit=limit)
+        total += updated
+        if updated < limit:
+            break
+    return total
+
+
+async def grading_retention_job() -> int:
+    """Run one grading-retention pass and report rows removed."""
+    from src.services.grading_retention import run_grading_retention_cleanup_once
+
+    summary = await run_grading_retention_cleanup_once()
+    if summary.get("status") != "ok":
+        return 0
+    return int(summary.get("rows_affected", 0))
+
+
+def build_default_scheduler(
+    *,
+    redis_client: Optional[Any] = None,
+    include_retention: bool = True,
+) -> MaintenanceScheduler:
+    """Build the scheduler with the standard housekeeping jobs."""
+    from src.services.distributed_transaction import (
+        SagaRecoveryWorker,
+        get_transaction_coordinator,
+    )
+    from src.services.grading_retention import cleanup_interval_seconds
+    from src.services.patch_deployer import get_patch_deployer
+
+    scheduler = MaintenanceScheduler(redis_client=redis_client)
+    scheduler.register(
+        MaintenanceJob(
+            name="assistant_conversation_expiry",
+            run=expire_assistant_conversations_job,
+            interval_seconds=_positive_int(DEFAULT_EXPIRY_INTERVAL_SECONDS, 60),
+            lock_ttl_seconds=300,
+        )
+    )
+    scheduler.register(
+        get_patch_deployer().as_maintenance_job(
+            interval_seconds=_positive_int(DEFAULT_CANARY_MONITOR_INTERVAL_SECONDS, 60)
+        )
+    )
+    scheduler.register(
+        SagaRecoveryWorker(get_transaction_coordinator()).as_maintenance_job(
+            interval_seconds=_positive_int(DEFAULT_SAGA_RECOVERY_INTERVAL_SECONDS, 60)
+        )
+    )
+    if include_retention:
+        scheduler.register(
+            MaintenanceJob(
+                name="grading_retention",
+                run=grading_retention_job,
+                interval_seconds=cleanup_interval_seconds(),
+                lock_ttl_seconds=3600,
+            )
+        )
+    return scheduler
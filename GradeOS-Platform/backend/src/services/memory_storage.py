@@ -16,7 +16,7 @@ import logging
 import asyncio
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional, Callable, Awaitable
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Sequence, Tuple
 from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
@@ -35,6 +35,23 @@ class MemoryStorageBackend(ABC):
         """保存单条记忆"""
         pass
 
+    async def save_memories(
+        self, items: Sequence[Tuple[str, Dict[str, Any]]], ttl_seconds: Optional[int] = None
+    ) -> int:
+        """
+        批量保存记忆
+
+        默认逐条调用 save_memory；支持批量写入的后端应覆盖此方法。
+
+        Returns:
+            int: 成功保存的数量
+        """
+        saved = 0
+        for memory_id, data in items:
+            if await self.save_memory(memory_id, data, ttl_seconds):
+                saved += 1
+        return saved
+
     @abstractmethod
     async def get_memory(self, memory_id: str) -> Optional[Dict[str, Any]]:
         """获取单条记忆"""
@@ -241,6 +258,34 @@ class RedisStorageBackend(MemoryStorageBackend):
             logger.error(f"[Redis] 保存记忆失败: {e}")
             return False
 
+    async def save_memories(
+        self, items: Sequence[Tuple[str, Dict[str, Any]]], ttl_seconds: Optional[int] = None
+    ) -> int:
+        if not items:
+            return 0
+        try:
+            ttl = ttl_seconds or self._default_ttl
+            index_keys = set()
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for memory_id, data in items:
+                    pipe.setex(
+                        f"{self.MEMORY_PREFIX}{memory_id}",
+                        ttl,
+                        json.dumps(data, ensure_ascii=False, default=str),
+                    )
+                    memory_type = data.get("memory_type")
+                    if memory_type:
+                        index_key = f"{self.INDEX_PREFIX}type:{memory_type}"
+                        pipe.sadd(index_key, memory_id)
+                        index_keys.add(index_key)
+                for index_key in index_keys:
+                    pipe.expire(index_key, ttl)
+                await pipe.execute()
+            return len(items)
+        except Exception as e:
+            logger.error(f"[Redis] 批量保存记忆失败: {e}")
+            return 0
+
     async def get_memory(self, memory_id: str) -> Optional[Dict[str, Any]]:
         try:
             key = f"{self.MEMORY_PREFIX}{memory_id}"
@@ -566,6 +611,64 @@ class PostgresStorageBackend(MemoryStorageBackend):
             logger.error(f"[PostgreSQL] 初始化表失败: {e}")
             raise
 
+    _UPSERT_MEMORY_SQL = """
+        INSERT INTO grading_memories (
+            memory_id, memory_type, importance, pattern, context, lesson,
+            subject,
+            occurrence_count, confirmation_count, contradiction_count,
+            created_at, last_accessed_at, last_updated_at,
+            related_question_types, related_rubric_ids, source_batch_ids,
+            metadata, expires_at
+        ) VALUES (
+            %s, %s, %s, %s, %s, %s,
+            %s,
+            %s, %s, %s,
+            %s, %s, %s,
+            %s, %s, %s,
+            %s, %s
+        )
+        ON CONFLICT (memory_id) DO UPDATE SET
+            pattern = EXCLUDED.pattern,
+            context = EXCLUDED.context,
+            lesson = EXCLUDED.lesson,
+            subject = EXCLUDED.subject,
+            occurrence_count = EXCLUDED.occurrence_count,
+            confirmation_count = EXCLUDED.confirmation_count,
+            contradiction_count = EXCLUDED.contradiction_count,
+            last_updated_at = EXCLUDED.last_updated_at,
+            related_question_types = EXCLUDED.related_question_types,
+            related_rubric_ids = EXCLUDED.related_rubric_ids,
+            source_batch_ids = EXCLUDED.source_batch_ids,
+            metadata = EXCLUDED.metadata,
+            expires_at = EXCLUDED.expires_at
+    """
+
+    @staticmethod
+    def _memory_params(
+        memory_id: str, data: Dict[str, Any], expires_at: Optional[datetime]
+    ) -> tuple:
+        now_iso = datetime.now().isoformat()
+        return (
+            memory_id,
+            data.get("memory_type"),
+            data.get("importance"),
+            data.get("pattern"),
+            json.dumps(data.get("context", {})),
+            data.get("lesson"),
+            data.get("subject", "general"),  # 科目字段
+            data.get("occurrence_count", 1),
+            data.get("confirmation_count", 0),
+            data.get("contradiction_count", 0),
+            data.get("created_at", now_iso),
+            data.get("last_accessed_at", now_iso),
+            data.get("last_updated_at", now_iso),
+            data.get("related_question_types", []),
+            data.get("related_rubric_ids", []),
+            data.get("source_batch_ids", []),
+            json.dumps(data.get("metadata", {})),
+            expires_at,
+        )
+
     async def save_memory(
         self, memory_id: str, data: Dict[str, Any], ttl_seconds: Optional[int] = None
     ) -> bool:
@@ -578,57 +681,8 @@ class PostgresStorageBackend(MemoryStorageBackend):
 
             async with self._pool_manager.pg_connection() as conn:
                 await conn.execute(
-                    """
-                    INSERT INTO grading_memories (
-                        memory_id, memory_type, importance, pattern, context, lesson,
-                        subject,
-                        occurrence_count, confirmation_count, contradiction_count,
-                        created_at, last_accessed_at, last_updated_at,
-                        related_question_types, related_rubric_ids, source_batch_ids,
-                        metadata, expires_at
-                    ) VALUES (
-                        %s, %s, %s, %s, %s, %s,
-                        %s,
-                        %s, %s, %s,
-                        %s, %s, %s,
-                        %s, %s, %s,
-                        %s, %s
-                    )
-                    ON CONFLICT (memory_id) DO UPDATE SET
-                        pattern = EXCLUDED.pattern,
-                        context = EXCLUDED.context,
-                        lesson = EXCLUDED.lesson,
-                        subject = EXCLUDED.subject,
-                        occurrence_count = EXCLUDED.occurrence_count,
-                        confirmation_count = EXCLUDED.confirmation_count,
-                        contradiction_count = EXCLUDED.contradiction_count,
-                        last_updated_at = EXCLUDED.last_updated_at,
-                        related_question_types = EXCLUDED.related_question_types,
-                        related_rubric_ids = EXCLUDED.related_rubric_ids,
-                        source_batch_ids = EXCLUDED.source_batch_ids,
-                        metadata = EXCLUDED.metadata,
-                        expires_at = EXCLUDED.expires_at
-                """,
-                    (
-                        memory_id,
-                        data.get("memory_type"),
-                        data.get("importance"),
-                        data.get("pattern"),
-                        json.dumps(data.get("context", {})),
-                        data.get("lesson"),
-                        data.get("subject", "general"),  # 科目字段
-                        data.get("occurrence_count", 1),
-                        data.get("confirmation_count", 0),
-                        data.get("contradiction_count", 0),
-                        data.get("created_at", datetime.now().isoformat()),
-                        data.get("last_accessed_at", datetime.now().isoformat()),
-                        data.get("last_updated_at", datetime.now().isoformat()),
-                        data.get("related_question_types", []),
-                        data.get("related_rubric_ids", []),
-                        data.get("source_batch_ids", []),
-                        json.dumps(data.get("metadata", {})),
-                        expires_at,
-                    ),
+                    self._UPSERT_MEMORY_SQL,
+                    self._memory_params(memory_id, data, expires_at),
                 )
 
             logger.debug(f"[PostgreSQL] 保存记忆成功: {memory_id}")
@@ -638,6 +692,36 @@ class PostgresStorageBackend(MemoryStorageBackend):
             logger.error(f"[PostgreSQL] 保存记忆失败: {e}")
             return False
 
+    async def save_memories(
+        self, items: Sequence[Tuple[str, Dict[str, Any]]], ttl_seconds: Optional[int] = None
+    ) -> int:
+        if not items:
+            return 0
+        await self._ensure_tables()
+
+        try:
+            expires_at = None
+            if ttl_seconds:
+                expires_at = datetime.now() + timedelta(seconds=ttl_seconds)
+
+            # 单连接、单事务、一次 executemany（psycopg 3 使用 pipeline 模式批量发送）
+            async with self._pool_manager.pg_connection() as conn:
+                async with conn.cursor() as cur:
+                    await cur.executemany(
+                        self._UPSERT_MEMORY_SQL,
+                        [
+                            self._memory_params(memory_id, data, expires_at)
+                            for memory_id, data in items
+                        ],
+                    )
+
+            logger.debug(f"[PostgreSQL] 批量保存记忆成功: {len(items)} 条")
+            return len(items)
+
+        except Exception as e:
+            logger.error(f"[PostgreSQL] 批量保存记忆失败: {e}")
+            return 0
+
     async def get_memory(self, memory_id: str) -> Optional[Dict[str, Any]]:
         await self._ensure_tables()
 
@@ -1023,6 +1107,34 @@ class MultiLayerStorageBackend(MemoryStorageBackend):
 
         return success
 
+    async def save_memories(
+        self, items: Sequence[Tuple[str, Dict[str, Any]]], ttl_seconds: Optional[int] = None
+    ) -> int:
+        saved = 0
+
+        # 尝试恢复 Redis
+        await self._maybe_recover_redis()
+
+        # 写入 PostgreSQL（持久化）
+        if self._postgres:
+            saved = await self._postgres.save_memories(items, ttl_seconds)
+
+        # 写入 Redis（缓存）
+        if self._redis and self._redis_available:
+            redis_ttl = min(ttl_seconds or self._redis_ttl, self._redis_ttl)
+            cached = await self._redis.save_memories(items, redis_ttl)
+            if cached or not items:
+                self._redis_failure_count = 0
+            else:
+                self._redis_failure_count += 1
+                if self._redis_failure_count >= 3:
+                    logger.warning(
+                        f"[MultiLayer] Redis 连续 {self._redis_failure_count} 次失败，暂时降级"
+                    )
+                    self._redis_available = False
+
+        return saved
+
     async def get_memory(self, memory_id: str) -> Optional[Dict[str, Any]]:
         # 尝试恢复 Redis
         await self._maybe_recover_redis()
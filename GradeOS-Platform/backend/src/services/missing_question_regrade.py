@@ -0,0 +1,286 @@
+"""
+缺题补批：按题定位页面，并跨学生合并补批调用
+
+首轮批改漏掉题目时，不再把学生的全部页面重新编码发送：
+- 先根据页面索引中的题号、首轮结果的 source_pages 和评分标准题序，
+  估计每道缺题所在的页面，只发送这些页面；
+- 同一时间窗口内、同一模型与同一评分标准下的缺题学生被打包进
+  有限次数的补批调用（按单次图片数、学生数上限切分），再按学生拆分结果。
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_WINDOW_MS = float(os.getenv("GRADING_COMPLETION_WINDOW_MS", "100"))
+COMPLETION_MAX_IMAGES_PER_CALL = int(os.getenv("GRADING_COMPLETION_MAX_IMAGES", "8"))
+COMPLETION_MAX_STUDENTS_PER_CALL = int(os.getenv("GRADING_COMPLETION_MAX_STUDENTS", "4"))
+
+_PAGE_KEYS = ("source_pages", "sourcePages", "page_indices", "pageIndices")
+
+
+def _as_page(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def collect_question_pages(
+    details: Iterable[Any],
+    normalize: Callable[[Any], str] = str,
+) -> Dict[str, Set[int]]:
+    """从首轮批改的题目详情中收集模型明确给出的页码（题号 -> 全局页码集合）"""
+    located: Dict[str, Set[int]] = {}
+    for detail in details or []:
+        if not isinstance(detail, dict):
+            continue
+        qid = normalize(detail.get("question_id") or detail.get("questionId") or detail.get("id"))
+        if not qid:
+            continue
+        for key in _PAGE_KEYS:
+            raw_pages = detail.get(key)
+            if not raw_pages:
+                continue
+            if not isinstance(raw_pages, (list, tuple)):
+                raw_pages = [raw_pages]
+            pages = {page for page in map(_as_page, raw_pages) if page is not None}
+            if pages:
+                located.setdefault(qid, set()).update(pages)
+            break
+    return located
+
+
+def localize_question_pages(
+    question_order: Sequence[str],
+    target_ids: Iterable[str],
+    page_indices: Sequence[int],
+    question_pages: Optional[Mapping[str, Iterable[int]]] = None,
+    page_contexts: Optional[Mapping[Any, Mapping[str, Any]]] = None,
+    normalize: Callable[[Any], str] = str,
+) -> Dict[str, List[int]]:
+    """
+    估计每道目标题所在的页面
+
+    优先使用页面索引中标注的题号；否则按评分标准题序，取前后最近的已定位题目
+    所在页面之间（含两端，覆盖跨页作答）的页面；前后都无法定位时返回全部页面。
+
+    Args:
+        question_order: 评分标准中的题号顺序（已规范化）
+        target_ids: 需要定位的题号
+        page_indices: 学生的全局页码，顺序与图像一致
+        question_pages: 首轮结果中已定位题目的页码
+        page_contexts: 页面索引上下文 {页码: {"question_numbers": [...]}}
+        normalize: 题号规范化函数
+
+    Returns:
+        Dict[str, List[int]]: 题号 -> 全局页码列表（按学生页面顺序）
+    """
+    pages = list(page_indices)
+    position = {page: pos for pos, page in enumerate(pages)}
+
+    context_hits: Dict[str, Set[int]] = {}
+    for raw_page, context in (page_contexts or {}).items():
+        page = _as_page(raw_page)
+        if page not in position or not isinstance(context, Mapping):
+            continue
+        for number in context.get("question_numbers") or []:
+            qid = normalize(number)
+            if qid:
+                context_hits.setdefault(qid, set()).add(position[page])
+
+    anchors: Dict[str, Set[int]] = {qid: set(hits) for qid, hits in context_hits.items()}
+    for qid, qpages in (question_pages or {}).items():
+        hits = {position[page] for page in map(_as_page, qpages) if page in position}
+        if hits:
+            anchors.setdefault(qid, set()).update(hits)
+
+    order_index = {qid: i for i, qid in enumerate(question_order)}
+    localized: Dict[str, List[int]] = {}
+    for qid in target_ids:
+        if qid in context_hits:
+            localized[qid] = [pages[pos] for pos in sorted(context_hits[qid])]
+            continue
+        lo, hi = 0, len(pages) - 1
+        i = order_index.get(qid)
+        if i is not None:
+            for previous in reversed(question_order[:i]):
+                if previous in anchors:
+                    lo = max(anchors[previous])
+                    break
+            for following in question_order[i + 1:]:
+                if following in anchors:
+                    hi = min(anchors[following])
+                    break
+        if lo > hi:
+            lo, hi = hi, lo
+        localized[qid] = pages[lo:hi + 1]
+    return localized
+
+
+@dataclass
+class MissingQuestionRequest:
+    """一个学生的缺题补批请求；pages 为 (全局页码, 图像) 列表"""
+
+    student_key: str
+    missing_ids: List[str]
+    pages: List[Tuple[int, Any]]
+    context_info: str = ""
+    stream_callback: Optional[Callable[[str, str], Awaitable[None]]] = None
+    future: Optional[asyncio.Future] = field(default=None, repr=False)
+
+
+GradeGroupFn = Callable[[List[MissingQuestionRequest]], Awaitable[List[List[Dict[str, Any]]]]]
+
+
+def pack_completion_requests(
+    requests: Sequence[MissingQuestionRequest],
+    max_images_per_call: int,
+    max_students_per_call: int,
+) -> List[List[MissingQuestionRequest]]:
+    """
+    按到达顺序把请求装入有限次调用
+
+    单次调用的图片数不超过 max_images_per_call、学生数不超过 max_students_per_call；
+    同一学生的页面不拆分，单个学生超过图片上限时独占一次调用。
+    """
+    calls: List[List[MissingQuestionRequest]] = []
+    current: List[MissingQuestionRequest] = []
+    image_count = 0
+    for request in requests:
+        size = len(request.pages)
+        if current and (
+            len(current) >= max_students_per_call or image_count + size > max_images_per_call
+        ):
+            calls.append(current)
+            current, image_count = [], 0
+        current.append(request)
+        image_count += size
+    if current:
+        calls.append(current)
+    return calls
+
+
+class MissingQuestionCoalescer:
+    """
+    缺题补批合并器
+
+    同一事件循环内、相同分组键（模型 + 评分标准）的请求在窗口期内聚合，
+    窗口结束后打包为有限次调用并发执行。调用失败时各学生得到空结果，
+    由调用方回退为占位结果（fail-open）。
+    """
+
+    def __init__(
+        self,
+        window_ms: float = COMPLETION_WINDOW_MS,
+        max_images_per_call: int = COMPLETION_MAX_IMAGES_PER_CALL,
+        max_students_per_call: int = COMPLETION_MAX_STUDENTS_PER_CALL,
+    ):
+        self.window_seconds = max(0.0, window_ms) / 1000.0
+        self.max_images_per_call = max(1, max_images_per_call)
+        self.max_students_per_call = max(1, max_students_per_call)
+        self._pending: Dict[
+            Tuple[Hashable, int], Tuple[GradeGroupFn, List[MissingQuestionRequest]]
+        ] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.stats = {"requests": 0, "calls": 0, "images": 0, "errors": 0}
+
+    async def submit(
+        self,
+        group_key: Hashable,
+        grade_group: GradeGroupFn,
+        request: MissingQuestionRequest,
+    ) -> List[Dict[str, Any]]:
+        """提交一个学生的补批请求，返回该学生的题目详情（可能为空）"""
+        self.stats["requests"] += 1
+        if self.window_seconds <= 0:
+            results = await self._call(grade_group, [request])
+            return results[0]
+
+        loop = asyncio.get_running_loop()
+        request.future = loop.create_future()
+        key = (group_key, id(loop))
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = (grade_group, [])
+            self._pending[key] = entry
+            task = loop.create_task(self._flush_after_window(key))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        entry[1].append(request)
+        return await request.future
+
+    async def _flush_after_window(self, key: Tuple[Hashable, int]) -> None:
+        await asyncio.sleep(self.window_seconds)
+        grade_group, requests = self._pending.pop(key)
+        calls = pack_completion_requests(
+            requests, self.max_images_per_call, self.max_students_per_call
+        )
+        logger.debug(
+            f"[missing_question_regrade] 合并补批: students={len(requests)}, calls={len(calls)}"
+        )
+        await asyncio.gather(*(self._dispatch(grade_group, chunk) for chunk in calls))
+
+    async def _dispatch(
+        self, grade_group: GradeGroupFn, requests: List[MissingQuestionRequest]
+    ) -> None:
+        results = await self._call(grade_group, requests)
+        for request, details in zip(requests, results):
+            if request.future is not None and not request.future.done():
+                request.future.set_result(details)
+
+    async def _call(
+        self, grade_group: GradeGroupFn, requests: List[MissingQuestionRequest]
+    ) -> List[List[Dict[str, Any]]]:
+        self.stats["calls"] += 1
+        self.stats["images"] += sum(len(request.pages) for request in requests)
+        try:
+            results = await grade_group(requests)
+        except Exception as exc:
+            self.stats["errors"] += 1
+            logger.warning(
+                f"[missing_question_regrade] 补批调用失败，回退占位结果: "
+                f"students={[request.student_key for request in requests]}, error={exc}"
+            )
+            return [[] for _ in requests]
+        results = list(results or [])
+        results.extend([] for _ in range(len(requests) - len(results)))
+        return results
+
+
+_missing_question_coalescer: Optional[MissingQuestionCoalescer] = None
+
+
+def get_missing_question_coalescer() -> MissingQuestionCoalescer:
+    """获取进程内共享的缺题补批合并器"""
+    global _missing_question_coalescer
+    if _missing_question_coalescer is None:
+        _missing_question_coalescer = MissingQuestionCoalescer()
+    return _missing_question_coalescer
+
+
+__all__ = [
+    "MissingQuestionCoalescer",
+    "MissingQuestionRequest",
+    "collect_question_pages",
+    "get_missing_question_coalescer",
+    "localize_question_pages",
+    "pack_completion_requests",
+]
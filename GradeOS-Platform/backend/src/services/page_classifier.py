@@ -0,0 +1,187 @@
+"""
+页面内容本地分类：空白 / 仅印刷 / 有手写
+
+在调用视觉模型前，用墨迹密度与连通域统计快速判断页面内容：
+- 暗像素二值化后，沿用批注校验中的横线剔除规则（整行过半为暗像素视为印刷横线），
+  并对竖直框线做同样处理
+- 去掉扫描噪点与剔除后残留的线段碎片
+- 没有任何有效连通域的页面判为空白（双面扫描的空白背面、未作答的答题纸）
+- 其余页面按连通域高度（绝对字高与相对正文的离散程度）区分印刷体与手写
+
+只有空白页会被跳过；无法解码或依赖缺失时一律按“有手写”处理（fail-open）。
+"""
+
+import io
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PAGE_BLANK = "blank"
+PAGE_PRINTED = "printed"
+PAGE_HANDWRITTEN = "handwritten"
+
+# 与 annotation_generator._bbox_has_non_line_ink 使用相同的暗像素阈值；
+# 纸面较白时放宽到“比纸面暗 50”，以免漏掉浅色铅笔作答
+INK_THRESHOLD = 165
+_PENCIL_CONTRAST = 50
+PAGE_CLASSIFIER_ENABLED = os.getenv("PAGE_BLANK_DETECTION_ENABLED", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+_WORK_LONG_EDGE = 1000
+# 以下阈值均以长边 1000px 的工作尺寸计
+_MIN_COMPONENT_AREA = 12
+_MIN_COMPONENT_EXTENT = 5
+_LINE_FRAGMENT_ASPECT = 6
+_TALL_COMPONENT_RATIO = 2.2
+_HANDWRITTEN_TALL_FRACTION = 0.08
+# 正文印刷字高约 10px；手写字符通常在 20px 以上
+_LARGE_COMPONENT_HEIGHT = 18
+_HANDWRITTEN_LARGE_INK_SHARE = 0.3
+# 印刷页上的手写作答常与印刷字粘连，按大连通域的个数（而非墨迹面积）判断
+_HANDWRITTEN_MIN_LARGE_COMPONENTS = 8
+_HANDWRITTEN_LARGE_FRACTION = 0.02
+
+
+def remove_ruled_lines(ink: np.ndarray, min_ratio: float = 0.5) -> np.ndarray:
+    """剔除暗像素占整行一半以上的行（印刷横线、答题线）"""
+    row_dark = ink.sum(axis=1)
+    ruled_rows = row_dark >= max(3, int(min_ratio * ink.shape[1]))
+    if ruled_rows.any():
+        ink = ink.copy()
+        ink[ruled_rows, :] = False
+    return ink
+
+
+@dataclass(frozen=True)
+class PageClassification:
+    """单页分类结果与所依据的统计量"""
+
+    kind: str
+    ink_ratio: float = 0.0
+    components: int = 0
+    tall_fraction: float = 0.0
+    large_ink_share: float = 0.0
+    large_components: int = 0
+
+    @property
+    def is_blank(self) -> bool:
+        return self.kind == PAGE_BLANK
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "ink_ratio": round(self.ink_ratio, 5),
+            "components": self.components,
+            "tall_fraction": round(self.tall_fraction, 3),
+            "large_ink_share": round(self.large_ink_share, 3),
+            "large_components": self.large_components,
+        }
+
+
+_UNKNOWN = PageClassification(kind=PAGE_HANDWRITTEN)
+
+
+def _load_gray(image_data: bytes) -> np.ndarray:
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_data))
+    scale = _WORK_LONG_EDGE / max(image.size)
+    if scale < 1.0:
+        # JPEG 直接按比例解码，分类不需要原始分辨率
+        image.draft("L", (int(image.size[0] * scale), int(image.size[1] * scale)))
+    image = image.convert("L")
+    if max(image.size) > _WORK_LONG_EDGE:
+        image.thumbnail((_WORK_LONG_EDGE, _WORK_LONG_EDGE))
+    return np.asarray(image, dtype=np.uint8)
+
+
+def classify_page(image_data: bytes) -> PageClassification:
+    """判断页面为空白、仅印刷或有手写内容"""
+    if not PAGE_CLASSIFIER_ENABLED:
+        return _UNKNOWN
+    try:
+        from scipy import ndimage
+
+        gray = _load_gray(image_data)
+    except Exception as exc:
+        logger.debug(f"[page_classifier] 无法分类页面，按有内容处理: {exc}")
+        return _UNKNOWN
+    if gray.shape[0] < 8 or gray.shape[1] < 8:
+        return _UNKNOWN
+
+    paper = float(np.percentile(gray, 90))
+    ink = gray < max(INK_THRESHOLD, paper - _PENCIL_CONTRAST)
+    ink = remove_ruled_lines(ink)
+    ink = remove_ruled_lines(ink.T).T
+
+    labels, count = ndimage.label(ink, structure=np.ones((3, 3), dtype=bool))
+    if count == 0:
+        return PageClassification(kind=PAGE_BLANK)
+
+    areas = np.bincount(labels.ravel())[1:]
+    boxes = ndimage.find_objects(labels)
+    heights = np.fromiter((b[0].stop - b[0].start for b in boxes), dtype=np.int32, count=count)
+    widths = np.fromiter((b[1].stop - b[1].start for b in boxes), dtype=np.int32, count=count)
+    extent = np.maximum(heights, widths)
+    thin = np.minimum(heights, widths)
+    line_fragment = (thin <= 3) & (extent >= _LINE_FRAGMENT_ASPECT * thin)
+    keep = (areas >= _MIN_COMPONENT_AREA) & (extent >= _MIN_COMPONENT_EXTENT) & ~line_fragment
+
+    kept = int(keep.sum())
+    if kept == 0:
+        return PageClassification(kind=PAGE_BLANK)
+
+    kept_heights = heights[keep]
+    kept_areas = areas[keep]
+    median_height = float(np.median(kept_heights))
+    tall_fraction = float((kept_heights > _TALL_COMPONENT_RATIO * median_height).mean())
+    large = kept_heights >= _LARGE_COMPONENT_HEIGHT
+    large_components = int(large.sum())
+    large_ink_share = float(kept_areas[large].sum() / kept_areas.sum())
+
+    # 手写：字高明显大于正文印刷体，或高度参差（印刷页中夹杂的手写作答）
+    handwritten = (
+        large_ink_share > _HANDWRITTEN_LARGE_INK_SHARE
+        or tall_fraction > _HANDWRITTEN_TALL_FRACTION
+        or (
+            large_components >= _HANDWRITTEN_MIN_LARGE_COMPONENTS
+            and large_components >= _HANDWRITTEN_LARGE_FRACTION * kept
+        )
+    )
+    return PageClassification(
+        kind=PAGE_HANDWRITTEN if handwritten else PAGE_PRINTED,
+        ink_ratio=float(kept_areas.sum()) / gray.size,
+        components=kept,
+        tall_fraction=tall_fraction,
+        large_ink_share=large_ink_share,
+        large_components=large_components,
+    )
+
+
+def find_blank_pages(images: Sequence[Any]) -> List[int]:
+    """返回空白页在 images 中的位置；非 bytes 输入（如 base64 字符串）视为有内容"""
+    return [
+        i
+        for i, image in enumerate(images)
+        if isinstance(image, (bytes, bytearray)) and classify_page(bytes(image)).is_blank
+    ]
+
+
+__all__ = [
+    "INK_THRESHOLD",
+    "PAGE_BLANK",
+    "PAGE_HANDWRITTEN",
+    "PAGE_PRINTED",
+    "PageClassification",
+    "classify_page",
+    "find_blank_pages",
+    "remove_ruled_lines",
+]
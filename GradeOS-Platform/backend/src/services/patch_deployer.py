@@ -11,6 +11,13 @@ from datetime import datetime, timedelta
 from uuid import uuid4
 
 from src.models.rule_patch import RulePatch, PatchStatus
+from src.services.canary_metrics import (
+    CANARY,
+    CanaryComparison,
+    CanaryMetricsAggregator,
+    get_canary_metrics,
+)
+from src.services.patch_resolution import PatchResolver, get_patch_resolver
 from src.utils.database import get_db_pool
 
 
@@ -46,6 +53,10 @@ class PatchDeployer:
         canary_duration_minutes: int = 30,
         anomaly_threshold: float = 0.1,
         error_rate_threshold: float = 0.2,
+        metrics: Optional[CanaryMetricsAggregator] = None,
+        significance_level: float = 0.01,
+        min_samples_per_arm: int = 200,
+        patch_resolver: Optional[PatchResolver] = None,
     ):
         """初始化补丁部署器
 
@@ -53,10 +64,18 @@ class PatchDeployer:
             canary_duration_minutes: 灰度发布持续时间（分钟）
             anomaly_threshold: 异常阈值（误判率增加超过此值触发回滚）
             error_rate_threshold: 错误率阈值（超过此值触发回滚）
+            metrics: 灰度指标聚合器，默认使用全局单例
+            significance_level: 灰度组劣于对照组的显著性水平
+            min_samples_per_arm: 两组样本都达到此数量才做判断
+            patch_resolver: 批改时解析补丁的部署快照，默认使用全局单例
         """
         self.canary_duration_minutes = canary_duration_minutes
         self.anomaly_threshold = anomaly_threshold
         self.error_rate_threshold = error_rate_threshold
+        self.metrics = metrics or get_canary_metrics()
+        self.significance_level = significance_level
+        self.min_samples_per_arm = min_samples_per_arm
+        self.patch_resolver = patch_resolver or get_patch_resolver()
         self._active_deployments: Dict[str, Dict[str, Any]] = {}
 
     async def deploy_canary(self, patch: RulePatch, traffic_percentage: float = 0.1) -> str:
@@ -103,6 +122,9 @@ class PatchDeployer:
                 scope="canary",
             )
 
+            # 从此刻起按补丁版本拆分灰度组 / 对照组指标
+            self.metrics.register_deployment(deployment_id, patch.version)
+
             # 记录部署信息
             self._active_deployments[deployment_id] = {
                 "patch_id": patch.patch_id,
@@ -137,10 +159,10 @@ class PatchDeployer:
         Raises:
             DeploymentError: 部署不存在或状态不正确
         """
-        if deployment_id not in self._active_deployments:
+        deployment = self._get_deployment(deployment_id)
+        if deployment is None:
             raise DeploymentError(f"部署 {deployment_id} 不存在")
 
-        deployment = self._active_deployments[deployment_id]
         patch_id = deployment["patch_id"]
         version = deployment["version"]
 
@@ -187,11 +209,11 @@ class PatchDeployer:
         Returns:
             是否成功
         """
-        if deployment_id not in self._active_deployments:
+        deployment = self._get_deployment(deployment_id)
+        if deployment is None:
             logger.warning(f"部署 {deployment_id} 不存在，可能已经回滚")
             return True
 
-        deployment = self._active_deployments[deployment_id]
         patch_id = deployment["patch_id"]
         version = deployment["version"]
 
@@ -210,7 +232,8 @@ class PatchDeployer:
             )
 
             # 移除部署记录
-            del self._active_deployments[deployment_id]
+            self._active_deployments.pop(deployment_id, None)
+            self.metrics.unregister_deployment(deployment_id)
 
             logger.info(f"回滚成功：部署 {deployment_id}")
             return True
@@ -235,35 +258,41 @@ class PatchDeployer:
             - anomalies: 检测到的异常列表
             - action_taken: 采取的行动（none/rollback）
         """
-        if deployment_id not in self._active_deployments:
+        deployment = self._get_deployment(deployment_id)
+        if deployment is None:
             return {"status": "not_found", "message": f"部署 {deployment_id} 不存在"}
 
-        deployment = self._active_deployments[deployment_id]
         patch_id = deployment["patch_id"]
-        baseline_metrics = deployment["baseline_metrics"]
 
         logger.info(f"监控部署：{deployment_id}")
 
         try:
-            # 获取当前指标
-            current_metrics = await self._get_current_metrics()
-
-            # 检测异常
-            anomalies = self._detect_anomalies(baseline_metrics, current_metrics)
-
-            # 判断状态
-            if not anomalies:
-                status = "healthy"
+            # 灰度组为当前指标，同时段对照组为基线
+            comparison = await self.metrics.compare(deployment_id)
+            current_metrics = comparison.canary.to_rates()
+            baseline_metrics = comparison.control.to_rates()
+
+            if not comparison.has_samples(self.min_samples_per_arm):
+                # 样本不足时不下结论，避免小样本噪声触发回滚
+                status = "collecting"
+                anomalies: List[Dict[str, Any]] = []
                 action_taken = "none"
-            elif any(a["severity"] == "critical" for a in anomalies):
-                status = "critical"
-                # 自动回滚
-                logger.error(f"检测到严重异常，自动回滚部署 {deployment_id}")
-                await self.rollback(deployment_id)
-                action_taken = "rollback"
             else:
-                status = "warning"
-                action_taken = "none"
+                anomalies = self._detect_anomalies(baseline_metrics, current_metrics)
+                anomalies.extend(self._detect_significant_regressions(comparison))
+
+                if not anomalies:
+                    status = "healthy"
+                    action_taken = "none"
+                elif any(a["severity"] == "critical" for a in anomalies):
+                    status = "critical"
+                    # 自动回滚
+                    logger.error(f"检测到严重异常，自动回滚部署 {deployment_id}")
+                    await self.rollback(deployment_id)
+                    action_taken = "rollback"
+                else:
+                    status = "warning"
+                    action_taken = "none"
 
             result = {
                 "status": status,
@@ -271,6 +300,7 @@ class PatchDeployer:
                 "patch_id": patch_id,
                 "metrics": current_metrics,
                 "baseline_metrics": baseline_metrics,
+                "p_values": comparison.p_values,
                 "anomalies": anomalies,
                 "action_taken": action_taken,
                 "monitored_at": datetime.utcnow().isoformat(),
@@ -286,6 +316,95 @@ class PatchDeployer:
             logger.error(f"监控失败：{e}")
             return {"status": "error", "message": str(e)}
 
+    async def monitor_active_deployments(self) -> int:
+        """监控所有灰度中的部署，返回自动回滚的数量
+
+        以共享的部署快照（Redis）为准，其他进程发布的部署同样会被监控。
+        """
+        try:
+            await self.patch_resolver.refresh()
+        except Exception as e:
+            logger.warning(f"刷新部署快照失败，使用本地快照：{e}")
+        deployments = self.patch_resolver.deployments
+        # 已被其他进程回滚的部署不再保留本地记录
+        for deployment_id in set(self._active_deployments) - set(deployments):
+            del self._active_deployments[deployment_id]
+        rolled_back = 0
+        for deployment_id, deployment in list(deployments.items()):
+            if deployment.scope != "canary":
+                continue
+            result = await self.monitor_deployment(deployment_id)
+            if result.get("action_taken") == "rollback":
+                rolled_back += 1
+        return rolled_back
+
+    def _get_deployment(self, deployment_id: str) -> Optional[Dict[str, Any]]:
+        """读取部署信息：本进程发布的部署优先，否则从共享部署快照还原
+
+        Args:
+            deployment_id: 部署ID
+
+        Returns:
+            部署信息，部署不存在时返回 None
+        """
+        deployment = self._active_deployments.get(deployment_id)
+        if deployment is not None:
+            return deployment
+        shared = self.patch_resolver.deployments.get(deployment_id)
+        if shared is None:
+            return None
+        try:
+            started_at = datetime.fromisoformat(shared.deployed_at)
+        except ValueError:
+            started_at = None
+        return {
+            "patch_id": shared.patch_id,
+            "version": shared.version,
+            "traffic_percentage": shared.traffic_percentage,
+            "scope": shared.scope,
+            "started_at": started_at,
+        }
+
+    def as_maintenance_job(self, interval_seconds: float = 60.0):
+        """包装为 MaintenanceScheduler 的周期任务"""
+        from src.services.maintenance_scheduler import MaintenanceJob
+
+        return MaintenanceJob(
+            name="canary_monitor",
+            run=self.monitor_active_deployments,
+            interval_seconds=interval_seconds,
+        )
+
+    def _detect_significant_regressions(
+        self, comparison: CanaryComparison
+    ) -> List[Dict[str, Any]]:
+        """灰度组比率显著高于对照组（单侧 z 检验）
+
+        误判率、改判率显著升高为严重异常；漏判率、复核率为警告。
+        """
+        anomalies = []
+        for name, p_value in comparison.p_values.items():
+            if p_value >= self.significance_level:
+                continue
+            critical = name in ("error_rate", "override_rate")
+            canary_rate = comparison.canary.to_rates()[name]
+            control_rate = comparison.control.to_rates()[name]
+            anomalies.append(
+                {
+                    "type": f"{name}_significant_increase",
+                    "severity": "critical" if critical else "warning",
+                    "baseline": control_rate,
+                    "current": canary_rate,
+                    "increase": canary_rate - control_rate,
+                    "p_value": p_value,
+                    "message": (
+                        f"{name} 灰度组 {canary_rate:.2%} 显著高于对照组 "
+                        f"{control_rate:.2%}（p={p_value:.4f}）"
+                    ),
+                }
+            )
+        return anomalies
+
     def _detect_anomalies(
         self, baseline: Dict[str, float], current: Dict[str, float]
     ) -> List[Dict[str, Any]]:
@@ -408,8 +527,6 @@ class PatchDeployer:
             traffic_percentage: 流量比例
             scope: 部署范围
         """
-        # TODO: 实际实现应该写入配置中心（如 Redis、Consul 等）
-        # 这里仅记录日志
         logger.info(
             f"写入部署配置：{deployment_id} | "
             f"补丁 {patch.patch_id} | "
@@ -417,20 +534,20 @@ class PatchDeployer:
             f"范围 {scope}"
         )
 
-        # 模拟写入配置
         config = {
             "deployment_id": deployment_id,
             "patch_id": patch.patch_id,
             "version": patch.version,
             "patch_type": patch.patch_type.value,
             "content": patch.content,
+            "description": patch.description,
             "traffic_percentage": traffic_percentage,
             "scope": scope,
             "deployed_at": datetime.utcnow().isoformat(),
         }
 
-        # 实际实现应该写入 Redis 或其他配置中心
-        # await redis.set(f"deployment:{deployment_id}", json.dumps(config))
+        # 写入 Redis 并通知各进程刷新补丁解析快照
+        await self.patch_resolver.publish_deployment(config)
 
     async def _remove_deployment_config(self, deployment_id: str) -> None:
         """删除部署配置
@@ -438,11 +555,8 @@ class PatchDeployer:
         Args:
             deployment_id: 部署ID
         """
-        # TODO: 实际实现应该从配置中心删除
         logger.info(f"删除部署配置：{deployment_id}")
-
-        # 实际实现应该从 Redis 删除
-        # await redis.delete(f"deployment:{deployment_id}")
+        await self.patch_resolver.remove_deployment(deployment_id)
 
     async def _cleanup_deployment(self, deployment_id: str) -> None:
         """清理部署资源
@@ -454,6 +568,7 @@ class PatchDeployer:
             await self._remove_deployment_config(deployment_id)
             if deployment_id in self._active_deployments:
                 del self._active_deployments[deployment_id]
+            self.metrics.unregister_deployment(deployment_id)
         except Exception as e:
             logger.error(f"清理部署资源失败：{e}")
 
@@ -497,23 +612,31 @@ class PatchDeployer:
                 created_at=row["created_at"],
             )
 
-    async def _get_current_metrics(self) -> Dict[str, float]:
+    async def _get_current_metrics(
+        self, deployment_id: Optional[str] = None, arm: str = CANARY
+    ) -> Dict[str, float]:
         """获取当前系统指标
 
+        Args:
+            deployment_id: 部署ID，为空时返回全部流量
+            arm: 分组（canary / control）
+
         Returns:
             指标字典，包含：
             - error_rate: 误判率
             - miss_rate: 漏判率
             - review_rate: 复核率
+            - override_rate: 改判率
+            - samples: 窗口内批改的题目数
         """
-        # TODO: 实际实现应该从监控系统获取实时指标
-        # 这里返回模拟数据
-        return {
-            "error_rate": 0.10,
-            "miss_rate": 0.05,
-            "review_rate": 0.15,
-            "timestamp": datetime.utcnow().isoformat(),
-        }
+        try:
+            arm_metrics = await self.metrics.get_metrics(deployment_id, arm)
+        except Exception as e:
+            logger.warning(f"读取灰度指标失败：{e}")
+            return {"timestamp": datetime.utcnow().isoformat()}
+        metrics: Dict[str, Any] = arm_metrics.to_rates()
+        metrics["timestamp"] = datetime.utcnow().isoformat()
+        return metrics
 
 
 # 全局单例
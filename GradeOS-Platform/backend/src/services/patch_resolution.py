@@ -0,0 +1,344 @@
+"""灰度补丁解析
+
+批改时为每个学生决定使用哪个规则补丁：
+- 按 (deployment_id, batch_id, student_key) 的稳定哈希分桶，哈希值低于
+  流量比例的学生进入灰度组；同一学生在任意进程、任意重试中分组一致，
+  扩大流量比例时已在灰度组的学生保持不变
+- 活跃部署保存在进程内快照中，解析过程不访问 Redis；快照在 Redis
+  pub/sub 通知到达时刷新，并定期兜底刷新
+- 选中的补丁应用到该学生的评分标准副本上，分组信息写入批改结果
+"""
+
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from src.services.canary_metrics import CANARY, CONTROL, get_canary_metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+DEPLOYMENTS_KEY = "patch_deployments"
+DEPLOYMENTS_CHANNEL = "patch_deployments:changed"
+DEFAULT_REFRESH_INTERVAL_SECONDS = float(os.getenv("PATCH_RESOLVER_REFRESH_SECONDS", "60"))
+
+_HASH_SPACE = float(1 << 64)
+
+
+def assignment_point(deployment_id: str, batch_id: str, student_key: str) -> float:
+    """(deployment_id, batch_id, student_key) 映射到 [0, 1)，跨进程稳定"""
+    digest = hashlib.blake2b(
+        f"{deployment_id}\x1f{batch_id}\x1f{student_key}".encode("utf-8"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "big") / _HASH_SPACE
+
+
+@dataclass(frozen=True)
+class ActiveDeployment:
+    """一个生效中的补丁部署"""
+
+    deployment_id: str
+    patch_id: str
+    version: str
+    patch_type: str
+    content: Dict[str, Any]
+    traffic_percentage: float
+    scope: str = "canary"
+    deployed_at: str = ""
+    description: str = ""
+
+    @classmethod
+    def from_config(cls, config: Mapping[str, Any]) -> "ActiveDeployment":
+        return cls(
+            deployment_id=str(config["deployment_id"]),
+            patch_id=str(config["patch_id"]),
+            version=str(config["version"]),
+            patch_type=str(config.get("patch_type") or ""),
+            content=dict(config.get("content") or {}),
+            traffic_percentage=float(config.get("traffic_percentage", 0.0)),
+            scope=str(config.get("scope") or "canary"),
+            deployed_at=str(config.get("deployed_at") or ""),
+            description=str(config.get("description") or ""),
+        )
+
+    def to_config(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class PatchAssignment:
+    """某个学生的补丁分组结果"""
+
+    variant: str
+    deployment_id: Optional[str] = None
+    patch_version: Optional[str] = None
+    deployment: Optional[ActiveDeployment] = field(default=None, compare=False)
+
+    @property
+    def is_patched(self) -> bool:
+        return self.deployment is not None
+
+    def to_stamp(self) -> Dict[str, Any]:
+        """写入批改结果的分组字段"""
+        return {
+            "patch_variant": self.variant,
+            "patch_version": self.patch_version,
+            "patch_deployment_id": self.deployment_id,
+        }
+
+
+# 没有活跃部署时的分组（不在任何实验中）
+BASELINE_ASSIGNMENT = PatchAssignment(variant="baseline")
+
+
+def _patch_instruction_lines(deployment: ActiveDeployment) -> List[str]:
+    content = deployment.content
+    enhancement = content.get("enhancement") or {}
+    lines = []
+    description = enhancement.get("description") or deployment.description
+    if description:
+        lines.append(f"- {description}")
+    for addition in enhancement.get("prompt_additions") or []:
+        lines.append(f"- {addition}")
+    for group in enhancement.get("synonym_groups") or []:
+        if isinstance(group, (list, tuple)):
+            lines.append(f"- 视为等价表述：{' / '.join(str(item) for item in group)}")
+    for variant in enhancement.get("new_variants") or []:
+        lines.append(f"- 规范化时接受变体：{variant}")
+    for example in enhancement.get("examples") or []:
+        if isinstance(example, dict) and example.get("input") and example.get("output"):
+            lines.append(f"- {example['input']} 等同于 {example['output']}")
+    for adjustment in enhancement.get("adjustments") or []:
+        if isinstance(adjustment, dict) and adjustment.get("condition"):
+            lines.append(
+                f"- {adjustment['condition']}：扣分 {adjustment.get('new_deduction')}"
+                f"（原 {adjustment.get('old_deduction')}）"
+            )
+    return lines
+
+
+def apply_patch_to_rubric(
+    parsed_rubric: Dict[str, Any],
+    assignment: PatchAssignment,
+    base_context: Optional[str] = None,
+) -> Dict[str, Any]:
+    """返回应用了补丁的评分标准副本（不修改入参）
+
+    补丁以“规则补丁”段落追加到 rubric_context；受影响题目（affected_questions）
+    同时追加到其 grading_notes。
+    """
+    deployment = assignment.deployment
+    if deployment is None:
+        return parsed_rubric
+    lines = _patch_instruction_lines(deployment)
+    if not lines:
+        return parsed_rubric
+
+    patched = copy.deepcopy(parsed_rubric)
+    section = f"## 规则补丁 {deployment.version}\n" + "\n".join(lines)
+    context = patched.get("rubric_context") or base_context or ""
+    patched["rubric_context"] = f"{context}\n\n{section}" if context else section
+
+    affected = {str(q) for q in deployment.content.get("affected_questions") or []}
+    if affected:
+        for question in patched.get("questions") or []:
+            qid = str(question.get("question_id") or question.get("id") or "")
+            if qid in affected:
+                notes = question.get("grading_notes") or ""
+                question["grading_notes"] = f"{notes}\n{section}" if notes else section
+    patched["patch_version"] = deployment.version
+    return patched
+
+
+class PatchResolver:
+    """活跃部署快照与学生分组
+
+    resolve() 只读进程内快照（无 await、无网络）；快照整体替换，读写无需加锁。
+    未配置 Redis 时只使用本进程发布的部署。
+    """
+
+    def __init__(
+        self,
+        redis_client: Any = None,
+        refresh_interval_seconds: float = DEFAULT_REFRESH_INTERVAL_SECONDS,
+        key: str = DEPLOYMENTS_KEY,
+        channel: str = DEPLOYMENTS_CHANNEL,
+        metrics: Any = None,
+    ):
+        self.redis_client = redis_client
+        self.metrics = metrics
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.key = key
+        self.channel = channel
+        self._snapshot: Mapping[str, ActiveDeployment] = MappingProxyType({})
+        # 按部署时间排序，多个部署同时生效时先部署的优先
+        self._ordered: Tuple[ActiveDeployment, ...] = ()
+        self._listener_task: Optional[asyncio.Task] = None
+        self._running = False
+        self._refreshes = 0
+
+    @property
+    def deployments(self) -> Mapping[str, ActiveDeployment]:
+        return self._snapshot
+
+    @property
+    def has_active_deployments(self) -> bool:
+        return bool(self._ordered)
+
+    @property
+    def refresh_count(self) -> int:
+        return self._refreshes
+
+    def _install(self, deployments: Dict[str, ActiveDeployment]) -> None:
+        previous = set(self._snapshot)
+        self._snapshot = MappingProxyType(dict(deployments))
+        self._ordered = tuple(
+            sorted(deployments.values(), key=lambda d: (d.deployed_at, d.deployment_id))
+        )
+        # 各进程按同一快照拆分灰度 / 对照指标
+        metrics = self.metrics or get_canary_metrics()
+        for deployment_id in previous - set(deployments):
+            metrics.unregister_deployment(deployment_id)
+        for deployment in deployments.values():
+            metrics.register_deployment(deployment.deployment_id, deployment.version)
+
+    def resolve(self, batch_id: str, student_key: str) -> PatchAssignment:
+        """为 (batch_id, student_key) 选择补丁；至多应用一个部署"""
+        ordered = self._ordered
+        if not ordered:
+            return BASELINE_ASSIGNMENT
+        for deployment in ordered:
+            if deployment.scope == "full" or (
+                assignment_point(deployment.deployment_id, batch_id, student_key)
+                < deployment.traffic_percentage
+            ):
+                return PatchAssignment(
+                    variant=CANARY,
+                    deployment_id=deployment.deployment_id,
+                    patch_version=deployment.version,
+                    deployment=deployment,
+                )
+        return PatchAssignment(variant=CONTROL)
+
+    async def refresh(self) -> None:
+        """从 Redis 重新加载全部活跃部署"""
+        if self.redis_client is None:
+            return
+        raw = await self.redis_client.hgetall(self.key)
+        deployments: Dict[str, ActiveDeployment] = {}
+        for deployment_id, payload in (raw or {}).items():
+            try:
+                if isinstance(payload, bytes):
+                    payload = payload.decode("utf-8")
+                deployment = ActiveDeployment.from_config(json.loads(payload))
+                deployments[deployment.deployment_id] = deployment
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"忽略无法解析的部署配置 {deployment_id!r}: {e}")
+        self._install(deployments)
+        self._refreshes += 1
+
+    async def publish_deployment(self, config: Mapping[str, Any]) -> ActiveDeployment:
+        """写入（或更新）部署配置并通知所有进程刷新"""
+        deployment = ActiveDeployment.from_config(config)
+        if self.redis_client is not None:
+            await self.redis_client.hset(
+                self.key, deployment.deployment_id, json.dumps(deployment.to_config(), default=str)
+            )
+            await self.redis_client.publish(self.channel, deployment.deployment_id)
+        updated = dict(self._snapshot)
+        updated[deployment.deployment_id] = deployment
+        self._install(updated)
+        return deployment
+
+    async def remove_deployment(self, deployment_id: str) -> None:
+        """删除部署配置并通知所有进程刷新"""
+        if self.redis_client is not None:
+            await self.redis_client.hdel(self.key, deployment_id)
+            await self.redis_client.publish(self.channel, deployment_id)
+        updated = dict(self._snapshot)
+        updated.pop(deployment_id, None)
+        self._install(updated)
+
+    async def start(self) -> None:
+        """加载快照并订阅变更通知"""
+        if self._running or self.redis_client is None:
+            return
+        self._running = True
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"加载补丁部署快照失败: {e}")
+        self._listener_task = asyncio.create_task(self._listen())
+        logger.info("补丁解析快照已启动")
+
+    async def stop(self) -> None:
+        self._running = False
+        if self._listener_task is not None:
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+            self._listener_task = None
+
+    async def _listen(self) -> None:
+        """订阅变更频道；收到通知或超过刷新间隔时重新加载快照"""
+        while self._running:
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub()
+                await pubsub.subscribe(self.channel)
+                # 订阅建立前的变更可能错过，订阅后补一次刷新
+                await self.refresh()
+                while self._running:
+                    # 收到通知立即刷新；超时即为定期兜底刷新
+                    await pubsub.get_message(
+                        ignore_subscribe_messages=True,
+                        timeout=self.refresh_interval_seconds,
+                    )
+                    await self.refresh()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.warning(f"补丁部署订阅中断，稍后重试: {e}")
+                await asyncio.sleep(min(5.0, self.refresh_interval_seconds))
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.unsubscribe(self.channel)
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+
+
+# 全局单例
+_patch_resolver: Optional[PatchResolver] = None
+
+
+def get_patch_resolver() -> PatchResolver:
+    """获取补丁解析器单例"""
+    global _patch_resolver
+    if _patch_resolver is None:
+        _patch_resolver = PatchResolver()
+    return _patch_resolver
+
+
+async def configure_patch_resolver(redis_client: Any) -> PatchResolver:
+    """使用 Redis 共享部署配置并启动订阅"""
+    resolver = get_patch_resolver()
+    if resolver.redis_client is None:
+        resolver.redis_client = redis_client
+    await resolver.start()
+    return resolver
+
+
+async def shutdown_patch_resolver() -> None:
+    if _patch_resolver is not None:
+        await _patch_resolver.stop()
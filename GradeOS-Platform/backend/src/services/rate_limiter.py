@@ -1,12 +1,23 @@
 """
 限流器服务
 
-提供基于 Redis 的滑动窗口限流功能，用于保护 API 和外部服务调用。
-使用 Redis INCR 配合 EXPIRE 实现原子计数。
+提供基于 Redis 的限流功能，用于保护 API 和外部服务调用。
+- RateLimiter：固定窗口计数（INCR + EXPIRE）
+- ScriptedRateLimiter：Lua 脚本实现的滑动窗口计数器 / GCRA 令牌桶，
+  一次 EVALSHA 同时返回是否允许、剩余配额和重置时间
+- LocalLeaseLimiter：进程内令牌桶，按块从 Redis 预租配额，大部分请求无需访问网络
+- load_policy_set_from_env：从环境变量构建默认策略与按路由前缀的策略
 """
 
+import asyncio
+import json
 import logging
-from typing import Optional
+import math
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, List, Mapping, Optional, Tuple
 from datetime import datetime, timedelta, timezone
 
 import redis.asyncio as redis
@@ -241,3 +252,432 @@ class RateLimiter:
                 "window_seconds": window_seconds,
                 "error": str(e),
             }
+
+
+# ==================== Lua 脚本限流 ====================
+
+# 滑动窗口计数器：当前窗口计数 + 上一窗口计数按剩余比例加权
+# KEYS[1]: 限流键（hash: w=窗口起点, c=当前计数, p=上一窗口计数）
+# ARGV: limit, window_ms, cost
+# 返回: {allowed, remaining, reset_after_ms, retry_after_ms}
+SLIDING_WINDOW_SCRIPT = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local start = now - (now % window)
+
+local data = redis.call('HMGET', KEYS[1], 'w', 'c', 'p')
+local w = tonumber(data[1])
+local c = tonumber(data[2]) or 0
+local p = tonumber(data[3]) or 0
+if w == nil then
+    c = 0
+    p = 0
+elseif w ~= start then
+    if w == start - window then p = c else p = 0 end
+    c = 0
+end
+
+local elapsed = now - start
+local estimated = p * (window - elapsed) / window + c
+local allowed = 0
+local retry = 0
+if estimated + cost <= limit then
+    allowed = 1
+    c = c + cost
+    estimated = estimated + cost
+    redis.call('HSET', KEYS[1], 'w', start, 'c', c, 'p', p)
+    redis.call('PEXPIRE', KEYS[1], window * 2)
+else
+    local room = limit - c - cost
+    if p > 0 and room >= 0 then
+        retry = math.ceil(window - elapsed - room * window / p)
+    else
+        retry = window - elapsed
+    end
+    if retry < 1 then retry = 1 end
+end
+
+local remaining = math.floor(limit - estimated)
+if remaining < 0 then remaining = 0 end
+return {allowed, remaining, window - elapsed, retry}
+"""
+
+# GCRA 令牌桶：只存理论到达时间（TAT）
+# KEYS[1]: 限流键
+# ARGV: emission_interval_ms, burst, cost, partial(1 允许部分发放，用于租约)
+# 返回: {granted, remaining, reset_after_ms, retry_after_ms}
+GCRA_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local partial = tonumber(ARGV[4])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local tolerance = interval * burst
+local tat = tonumber(redis.call('GET', KEYS[1]))
+if tat == nil or tat < now then tat = now end
+
+local available = math.floor((now + tolerance - tat) / interval)
+if available < 0 then available = 0 end
+local granted = cost
+if available < cost then
+    if partial == 1 and available > 0 then
+        granted = available
+    else
+        local retry = math.ceil(tat + interval * cost - tolerance - now)
+        if retry < 1 then retry = 1 end
+        return {0, available, math.ceil(tat - now), retry}
+    end
+end
+
+local new_tat = tat + interval * granted
+redis.call('SET', KEYS[1], string.format('%.3f', new_tat), 'PX', math.ceil(new_tat - now) + 1)
+return {granted, available - granted, math.ceil(new_tat - now), 0}
+"""
+
+ALGORITHM_SLIDING_WINDOW = "sliding_window"
+ALGORITHM_GCRA = "gcra"
+
+
+@dataclass(frozen=True)
+class RateLimitPolicy:
+    """
+    限流策略
+
+    Attributes:
+        name: 策略名（参与 Redis 键，区分不同路由/租户的配额）
+        limit: 窗口内允许的请求数
+        window_seconds: 窗口大小（秒）
+        algorithm: sliding_window 或 gcra
+        burst: GCRA 突发容量（默认等于 limit）
+        local_lease: 进程内每次预租的令牌数，0 表示不启用（仅 gcra）
+    """
+
+    name: str
+    limit: int
+    window_seconds: float
+    algorithm: str = ALGORITHM_SLIDING_WINDOW
+    burst: Optional[int] = None
+    local_lease: int = 0
+
+    def __post_init__(self) -> None:
+        if self.limit <= 0 or self.window_seconds <= 0:
+            raise ValueError("limit and window_seconds must be positive")
+        if self.algorithm not in (ALGORITHM_SLIDING_WINDOW, ALGORITHM_GCRA):
+            raise ValueError(f"unknown rate limit algorithm: {self.algorithm}")
+        if self.local_lease and self.algorithm != ALGORITHM_GCRA:
+            raise ValueError("local_lease requires the gcra algorithm")
+
+    @property
+    def window_ms(self) -> int:
+        return max(1, int(self.window_seconds * 1000))
+
+    @property
+    def emission_interval_ms(self) -> float:
+        return self.window_seconds * 1000 / self.limit
+
+    @property
+    def burst_size(self) -> int:
+        return self.burst or self.limit
+
+
+@dataclass
+class RateLimitDecision:
+    """单次限流判定结果"""
+
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_after_ms: int
+    retry_after_ms: int = 0
+    granted: int = 0
+
+    @property
+    def retry_after_seconds(self) -> int:
+        return max(1, math.ceil(self.retry_after_ms / 1000)) if not self.allowed else 0
+
+    @property
+    def reset_after_seconds(self) -> int:
+        return max(0, math.ceil(self.reset_after_ms / 1000))
+
+
+@dataclass
+class RateLimitPolicySet:
+    """
+    按路由选择限流策略
+
+    优先级：最长匹配的路由前缀策略 > 默认策略
+    """
+
+    default: RateLimitPolicy
+    routes: List[Tuple[str, RateLimitPolicy]] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self.routes = sorted(self.routes, key=lambda item: len(item[0]), reverse=True)
+
+    def resolve(self, path: str) -> RateLimitPolicy:
+        for prefix, policy in self.routes:
+            if path.startswith(prefix):
+                return policy
+        return self.default
+
+
+def load_policy_set_from_env(environ: Optional[Mapping[str, str]] = None) -> RateLimitPolicySet:
+    """
+    从环境变量构建限流策略集
+
+    - RATE_LIMIT_MAX_REQUESTS / RATE_LIMIT_WINDOW_SECONDS：默认策略（100 次 / 60 秒）
+    - RATE_LIMIT_ALGORITHM：默认策略算法（sliding_window / gcra）
+    - RATE_LIMIT_LOCAL_LEASE：默认策略的进程内预租令牌数（仅 gcra）
+    - RATE_LIMIT_ROUTES：按路由前缀的策略，JSON 对象，例如
+      {"/api/batch": {"limit": 20, "window_seconds": 60, "algorithm": "gcra", "burst": 40}}
+
+    无法解析的路由策略记录警告后忽略，其余策略照常生效。
+    """
+    env = os.environ if environ is None else environ
+    algorithm = env.get("RATE_LIMIT_ALGORITHM") or ALGORITHM_SLIDING_WINDOW
+    default = RateLimitPolicy(
+        name="default",
+        limit=int(env.get("RATE_LIMIT_MAX_REQUESTS") or 100),
+        window_seconds=float(env.get("RATE_LIMIT_WINDOW_SECONDS") or 60),
+        algorithm=algorithm,
+        # 进程内预租只适用于 GCRA
+        local_lease=(
+            int(env.get("RATE_LIMIT_LOCAL_LEASE") or 0) if algorithm == ALGORITHM_GCRA else 0
+        ),
+    )
+
+    routes: List[Tuple[str, RateLimitPolicy]] = []
+    raw_routes = env.get("RATE_LIMIT_ROUTES")
+    if raw_routes:
+        try:
+            config: Any = json.loads(raw_routes)
+            if not isinstance(config, dict):
+                raise ValueError("expected a JSON object keyed by route prefix")
+        except ValueError as e:
+            logger.warning(f"RATE_LIMIT_ROUTES 解析失败，忽略路由策略: {e}")
+            config = {}
+        for prefix, options in config.items():
+            try:
+                routes.append((prefix, _route_policy(prefix, options, default)))
+            except (TypeError, ValueError) as e:
+                logger.warning(f"忽略无效的路由限流策略 {prefix!r}: {e}")
+    return RateLimitPolicySet(default=default, routes=routes)
+
+
+def _route_policy(
+    prefix: str, options: Mapping[str, Any], default: RateLimitPolicy
+) -> RateLimitPolicy:
+    if not prefix.startswith("/") or not isinstance(options, Mapping):
+        raise ValueError("route prefix must start with '/' and map to an object")
+    burst = options.get("burst")
+    return RateLimitPolicy(
+        name=str(options.get("name") or f"route:{prefix}"),
+        limit=int(options.get("limit", default.limit)),
+        window_seconds=float(options.get("window_seconds", default.window_seconds)),
+        algorithm=str(options.get("algorithm", ALGORITHM_SLIDING_WINDOW)),
+        burst=int(burst) if burst is not None else None,
+        local_lease=int(options.get("local_lease", 0)),
+    )
+
+
+class ScriptedRateLimiter:
+    """
+    Lua 脚本限流器
+
+    每次判定只有一次 EVALSHA 往返，时间取自 Redis 服务器，避免多副本时钟偏差。
+    Redis 异常时放行（fail-open），与 RateLimiter 保持一致。
+    """
+
+    def __init__(self, redis_client: redis.Redis, key_prefix: str = "rate_limit"):
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix
+        self._sliding_window = redis_client.register_script(SLIDING_WINDOW_SCRIPT)
+        self._gcra = redis_client.register_script(GCRA_SCRIPT)
+
+    async def load_scripts(self) -> None:
+        """预加载脚本（SCRIPT LOAD），避免首个请求多一次 NOSCRIPT 往返"""
+        for script in (self._sliding_window, self._gcra):
+            script.sha = await self.redis_client.script_load(script.script)
+
+    def _key(self, key: str, policy: RateLimitPolicy) -> str:
+        # 花括号作为 hash tag，集群模式下同一标识落在同一槽
+        return f"{self.key_prefix}:{policy.algorithm}:{policy.name}:{{{key}}}"
+
+    async def check(self, key: str, policy: RateLimitPolicy, cost: int = 1) -> RateLimitDecision:
+        """判定一次请求（消耗 cost 个配额）"""
+        try:
+            if policy.algorithm == ALGORITHM_GCRA:
+                result = await self._gcra(
+                    keys=[self._key(key, policy)],
+                    args=[policy.emission_interval_ms, policy.burst_size, cost, 0],
+                )
+                limit = policy.burst_size
+            else:
+                result = await self._sliding_window(
+                    keys=[self._key(key, policy)],
+                    args=[policy.limit, policy.window_ms, cost],
+                )
+                limit = policy.limit
+        except RedisError as e:
+            logger.error(f"限流脚本 Redis 错误（默认允许）: {str(e)}, key={key}")
+            return self._fail_open(policy, cost)
+        except Exception as e:
+            logger.error(f"限流脚本发生未预期错误（默认允许）: {str(e)}, key={key}", exc_info=True)
+            return self._fail_open(policy, cost)
+
+        granted, remaining, reset_after_ms, retry_after_ms = (int(v) for v in result)
+        return RateLimitDecision(
+            allowed=granted > 0,
+            limit=limit,
+            remaining=remaining,
+            reset_after_ms=reset_after_ms,
+            retry_after_ms=retry_after_ms,
+            granted=cost if granted > 0 else 0,
+        )
+
+    async def lease(self, key: str, policy: RateLimitPolicy, tokens: int) -> RateLimitDecision:
+        """从 GCRA 桶中预租至多 tokens 个令牌（不足时部分发放）"""
+        try:
+            result = await self._gcra(
+                keys=[self._key(key, policy)],
+                args=[policy.emission_interval_ms, policy.burst_size, tokens, 1],
+            )
+        except RedisError as e:
+            logger.error(f"限流租约 Redis 错误（默认允许）: {str(e)}, key={key}")
+            return self._fail_open(policy, 1)
+        except Exception as e:
+            logger.error(f"限流租约发生未预期错误（默认允许）: {str(e)}, key={key}", exc_info=True)
+            return self._fail_open(policy, 1)
+
+        granted, remaining, reset_after_ms, retry_after_ms = (int(v) for v in result)
+        return RateLimitDecision(
+            allowed=granted > 0,
+            limit=policy.burst_size,
+            remaining=remaining,
+            reset_after_ms=reset_after_ms,
+            retry_after_ms=retry_after_ms,
+            granted=granted,
+        )
+
+    @staticmethod
+    def _fail_open(policy: RateLimitPolicy, cost: int) -> RateLimitDecision:
+        return RateLimitDecision(
+            allowed=True,
+            limit=policy.limit,
+            remaining=policy.limit,
+            reset_after_ms=0,
+            granted=cost,
+        )
+
+
+@dataclass
+class _LeasedBucket:
+    tokens: int = 0
+    remote_remaining: int = 0
+    reset_after_ms: int = 0
+    expires_at: float = 0.0
+    blocked_until: float = 0.0
+    retry_after_ms: int = 0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class LocalLeaseLimiter:
+    """
+    进程内令牌桶
+
+    每次从 Redis 预租 policy.local_lease 个令牌，本地扣减用完再租。
+    租约超过 lease_ttl_seconds 未用完即作废（这部分配额在 Redis 中已消耗），
+    因此租约大小应远小于 limit。租约被拒后在 retry_after 内直接本地拒绝。
+    未配置 local_lease 的策略直接走 Redis。
+    """
+
+    def __init__(
+        self,
+        limiter: ScriptedRateLimiter,
+        lease_ttl_seconds: float = 1.0,
+        max_buckets: int = 10000,
+    ):
+        self.limiter = limiter
+        self.lease_ttl_seconds = lease_ttl_seconds
+        self.max_buckets = max_buckets
+        self._buckets: "OrderedDict[Tuple[str, str], _LeasedBucket]" = OrderedDict()
+        self.local_hits = 0
+        self.remote_calls = 0
+
+    def _bucket(self, key: str, policy: RateLimitPolicy) -> _LeasedBucket:
+        bucket_key = (policy.name, key)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = _LeasedBucket()
+            self._buckets[bucket_key] = bucket
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(bucket_key)
+        return bucket
+
+    def _take_local(
+        self, bucket: _LeasedBucket, policy: RateLimitPolicy
+    ) -> Optional[RateLimitDecision]:
+        now = time.monotonic()
+        if bucket.blocked_until > now:
+            self.local_hits += 1
+            return RateLimitDecision(
+                allowed=False,
+                limit=policy.burst_size,
+                remaining=0,
+                reset_after_ms=bucket.reset_after_ms,
+                retry_after_ms=max(1, int((bucket.blocked_until - now) * 1000)),
+            )
+        if bucket.tokens > 0 and bucket.expires_at > now:
+            bucket.tokens -= 1
+            self.local_hits += 1
+            return RateLimitDecision(
+                allowed=True,
+                limit=policy.burst_size,
+                remaining=bucket.tokens + bucket.remote_remaining,
+                reset_after_ms=bucket.reset_after_ms,
+                granted=1,
+            )
+        return None
+
+    async def check(self, key: str, policy: RateLimitPolicy) -> RateLimitDecision:
+        if policy.local_lease <= 0:
+            self.remote_calls += 1
+            return await self.limiter.check(key, policy)
+
+        bucket = self._bucket(key, policy)
+        decision = self._take_local(bucket, policy)
+        if decision is not None:
+            return decision
+
+        async with bucket.lock:
+            # 等锁期间其他协程可能已续租
+            decision = self._take_local(bucket, policy)
+            if decision is not None:
+                return decision
+
+            self.remote_calls += 1
+            leased = await self.limiter.lease(key, policy, policy.local_lease)
+            if not leased.allowed:
+                bucket.tokens = 0
+                bucket.reset_after_ms = leased.reset_after_ms
+                bucket.blocked_until = time.monotonic() + leased.retry_after_ms / 1000
+                return leased
+
+            bucket.tokens = leased.granted - 1
+            bucket.remote_remaining = leased.remaining
+            bucket.reset_after_ms = leased.reset_after_ms
+            bucket.expires_at = time.monotonic() + self.lease_ttl_seconds
+            return RateLimitDecision(
+                allowed=True,
+                limit=leased.limit,
+                remaining=bucket.tokens + leased.remaining,
+                reset_after_ms=leased.reset_after_ms,
+                granted=1,
+            )
@@ -0,0 +1,210 @@
+"""
+跨学生复核请求合批：短文本复核调用的微批处理
+
+自白报告与逻辑复核都是“每个学生一次纯文本调用”，每次调用都重复同一段
+指令与输出模板，而单个学生的事实摘要往往很短：
+- 按 token 预算把多个学生的分节打包进一次结构化输出调用（指令只发送一次）；
+- 输出为 {"students": [...]}，按 student_key 拆分回每个学生；
+- 任一学生的分节缺失、重复或未通过调用方校验时，该学生不返回结果，
+  由调用方按原有流程单独调用（单独调用的提示词与合批前完全一致）。
+"""
+
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+REVIEW_BATCH_ENABLED = os.getenv("REVIEW_BATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+REVIEW_BATCH_TOKEN_BUDGET = int(os.getenv("REVIEW_BATCH_TOKEN_BUDGET", "12000"))
+REVIEW_BATCH_MAX_STUDENTS = int(os.getenv("REVIEW_BATCH_MAX_STUDENTS", "4"))
+
+_CJK_RE = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估计 token 数：中日韩字符每个计 1，其余字符每 4 个计 1"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@dataclass
+class ReviewPayload:
+    """单个学生的复核分节（不含共享指令）"""
+
+    student_key: str
+    section: str
+    tokens: int = field(default=0)
+
+    def __post_init__(self) -> None:
+        if not self.tokens:
+            self.tokens = estimate_tokens(self.section)
+
+
+def pack_review_payloads(
+    payloads: Sequence[ReviewPayload],
+    *,
+    header_tokens: int = 0,
+    token_budget: Optional[int] = None,
+    max_students: Optional[int] = None,
+) -> List[List[ReviewPayload]]:
+    """
+    按输入顺序贪心装箱
+
+    每批的估计输入 token（共享指令 + 各学生分节）不超过 token_budget，
+    人数不超过 max_students；单个分节本身超预算时独占一批。
+    """
+    budget = REVIEW_BATCH_TOKEN_BUDGET if token_budget is None else token_budget
+    limit = max(1, REVIEW_BATCH_MAX_STUDENTS if max_students is None else max_students)
+    batches: List[List[ReviewPayload]] = []
+    current: List[ReviewPayload] = []
+    used = header_tokens
+    for payload in payloads:
+        if current and (used + payload.tokens > budget or len(current) >= limit):
+            batches.append(current)
+            current, used = [], header_tokens
+        current.append(payload)
+        used += payload.tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def build_batched_prompt(header: str, batch: Sequence[ReviewPayload], entry_schema: str) -> str:
+    """共享指令只出现一次，随后是单个学生的输出模板与各学生分节"""
+    lines = [
+        header.rstrip(),
+        "",
+        "## 批量处理说明",
+        f"本次请求包含 {len(batch)} 位学生，彼此完全独立：逐一按上述要求处理，"
+        "不得在学生之间混用任何信息。",
+        '只输出一个 JSON 对象：{"students": [每位学生一项]}。',
+        "每项必须包含 student_key（与分节标题中的值完全一致），其余字段与单个学生的输出模板相同。",
+        "",
+        "### 单个学生输出模板",
+        entry_schema.strip(),
+        "",
+    ]
+    for payload in batch:
+        lines.append(f"=== 学生 student_key={payload.student_key} ===")
+        lines.append(payload.section.strip())
+        lines.append(f"=== 结束 student_key={payload.student_key} ===")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def demux_batched_output(data: Any, student_keys: Sequence[str]) -> Dict[str, Dict[str, Any]]:
+    """按 student_key 拆分合批输出；未知、缺失或重复出现的学生不返回"""
+    entries = data.get("students") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        return {}
+    expected = set(student_keys)
+    found: Dict[str, Dict[str, Any]] = {}
+    duplicated = set()
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        key = entry.get("student_key") or entry.get("studentKey")
+        key = str(key).strip() if key is not None else ""
+        if key not in expected:
+            continue
+        if key in found:
+            duplicated.add(key)
+        found[key] = entry
+    return {key: entry for key, entry in found.items() if key not in duplicated}
+
+
+class ReviewMicroBatcher:
+    """
+    复核微批执行器
+
+    invoke 接收完整提示词并返回解析后的 JSON；validate(student_key, entry)
+    判断某个学生的分节是否可直接采用。run() 只返回通过校验的学生，
+    未合批（独占一批）或校验失败的学生由调用方单独处理。
+    """
+
+    def __init__(
+        self,
+        invoke: Callable[[str], Awaitable[Any]],
+        *,
+        header: str,
+        entry_schema: str,
+        validate: Callable[[str, Dict[str, Any]], bool],
+        token_budget: Optional[int] = None,
+        max_students: Optional[int] = None,
+        max_concurrency: int = 3,
+    ) -> None:
+        self._invoke = invoke
+        self._header = header
+        self._entry_schema = entry_schema
+        self._validate = validate
+        self._token_budget = token_budget
+        self._max_students = max_students
+        self._max_concurrency = max_concurrency
+        self.calls = 0
+
+    async def _run_batch(self, batch: List[ReviewPayload]) -> Dict[str, Dict[str, Any]]:
+        keys = [payload.student_key for payload in batch]
+        prompt = build_batched_prompt(self._header, batch, self._entry_schema)
+        self.calls += 1
+        try:
+            data = await self._invoke(prompt)
+        except Exception as exc:
+            logger.warning(f"[review_batching] batch call failed students={keys}: {exc}")
+            return {}
+
+        accepted: Dict[str, Dict[str, Any]] = {}
+        for key, entry in demux_batched_output(data, keys).items():
+            try:
+                valid = self._validate(key, entry)
+            except Exception as exc:
+                logger.debug(f"[review_batching] validate failed student={key}: {exc}")
+                valid = False
+            if valid:
+                accepted[key] = entry
+        rejected = [key for key in keys if key not in accepted]
+        if rejected:
+            logger.info(f"[review_batching] fallback to individual calls: students={rejected}")
+        return accepted
+
+    async def run(self, payloads: Sequence[ReviewPayload]) -> Dict[str, Dict[str, Any]]:
+        counts: Dict[str, int] = {}
+        for payload in payloads:
+            counts[payload.student_key] = counts.get(payload.student_key, 0) + 1
+        # 同名学生无法按 student_key 拆分，保持单独调用
+        candidates = [payload for payload in payloads if counts[payload.student_key] == 1]
+        batches = [
+            batch
+            for batch in pack_review_payloads(
+                candidates,
+                header_tokens=estimate_tokens(self._header) + estimate_tokens(self._entry_schema),
+                token_budget=self._token_budget,
+                max_students=self._max_students,
+            )
+            if len(batch) > 1
+        ]
+        if not batches:
+            return {}
+
+        semaphore = asyncio.Semaphore(self._max_concurrency) if self._max_concurrency > 0 else None
+
+        async def run_one(batch: List[ReviewPayload]) -> Dict[str, Dict[str, Any]]:
+            if semaphore is None:
+                return await self._run_batch(batch)
+            async with semaphore:
+                return await self._run_batch(batch)
+
+        results: Dict[str, Dict[str, Any]] = {}
+        for accepted in await asyncio.gather(*(run_one(batch) for batch in batches)):
+            results.update(accepted)
+        logger.info(
+            f"[review_batching] students={sum(len(b) for b in batches)} "
+            f"calls={len(batches)} accepted={len(results)}"
+        )
+        return results
+
@@ -7,14 +7,18 @@
 Requirements: 1.1, 1.3, 1.4, 1.5, 11.3
 """
 
+import hashlib
 import logging
 import json
 import re
-from typing import Dict, List, Optional, Any, Tuple
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Mapping, Optional, Any, Tuple
 from dataclasses import dataclass, field
 from datetime import datetime
 from threading import Lock
 from pathlib import Path
+from types import MappingProxyType
 
 from src.models.grading_models import (
     QuestionRubric,
@@ -248,6 +252,12 @@ class RubricRegistry:
         with self._lock:
             return sum(r.max_score for r in self._rubrics.values())
 
+    def compile(self) -> "CompiledRubricIndex":
+        """生成当前评分标准的只读查询快照"""
+        with self._lock:
+            rubrics = list(self._rubrics.values())
+        return CompiledRubricIndex(rubrics, total_score=self._total_score, version=self._version)
+
     # ==================== 序列化方法 ====================
 
     def to_dict(self) -> Dict[str, Any]:
@@ -441,6 +451,366 @@ class RubricRegistry:
             return "1.1"
 
 
+# ==================== 编译后的只读索引 ====================
+
+_CHINESE_DIGITS = {
+    "零": 0, "〇": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+    "五": 5, "六": 6, "七": 7, "八": 8, "九": 9,
+}
+_ID_PREFIX = re.compile(r"^(?:第|题目|题号|question|no\.?|q)\s*")
+_ID_SUFFIX = re.compile(r"\s*(?:小题|题|分)$")
+_CHINESE_NUMBER = re.compile(r"^[零〇一二两三四五六七八九十百]+")
+_ID_PARTS = re.compile(r"^(\d+)[\s.\-_]*(?:[(（]?\s*([a-z]+|\d+)\s*[)）]?)?$")
+
+# 编译后单个索引最多记住的“原始题号 -> 查询结果”条目数（超出后不再缓存，查询照常）
+_INDEX_MEMO_LIMIT = 4096
+# 按内容指纹缓存的编译结果数量
+_INDEX_CACHE_SIZE = 32
+
+
+def _chinese_to_int(text: str) -> Optional[int]:
+    """中文数字（不超过 999）转整数，如 "十二" -> 12、"二十" -> 20"""
+    total, current = 0, 0
+    for char in text:
+        if char == "百":
+            total += (current or 1) * 100
+            current = 0
+        elif char == "十":
+            total += (current or 1) * 10
+            current = 0
+        elif char in _CHINESE_DIGITS:
+            current = _CHINESE_DIGITS[char]
+        else:
+            return None
+    return total + current
+
+
+def canonical_question_id(question_id: Any) -> str:
+    """
+    题号的规范形式
+
+    - 全角字符转半角（"７ａ" -> "7a"）
+    - 去除 第/题目/Q 等前缀与 题/分 等后缀
+    - 中文数字转阿拉伯数字（"第十二题" -> "12"）
+    - 子题统一写法："7(a)"、"7-a"、"7 a" -> "7a"；"7(1)"、"7.1" -> "7.1"
+    """
+    text = unicodedata.normalize("NFKC", str(question_id or "")).strip().lower()
+    text = _ID_PREFIX.sub("", text)
+    text = _ID_SUFFIX.sub("", text).strip().rstrip(".:：")
+    match = _CHINESE_NUMBER.match(text)
+    if match:
+        number = _chinese_to_int(match.group(0))
+        if number is not None:
+            text = f"{number}{text[match.end():]}"
+    parts = _ID_PARTS.match(text)
+    if not parts:
+        return text
+    main, sub = parts.groups()
+    if not sub:
+        return main
+    return f"{main}.{sub}" if sub.isdigit() else f"{main}{sub}"
+
+
+def _parent_question_id(canonical_id: str) -> Optional[str]:
+    """子题的父题号（"7a" -> "7"、"7.1" -> "7"）"""
+    match = re.match(r"^(\d+)(?:\.\d+|[a-z]+)$", canonical_id)
+    return match.group(1) if match else None
+
+
+def format_rubric_for_prompt(rubric: QuestionRubric) -> str:
+    """将单题评分标准格式化为提示词片段"""
+    lines = [
+        f"第{rubric.question_id}题 (满分{rubric.max_score}分):",
+        (
+            f"  题目: {rubric.question_text[:200]}..."
+            if len(rubric.question_text) > 200
+            else f"  题目: {rubric.question_text}"
+        ),
+    ]
+
+    # 添加得分点
+    if rubric.scoring_points:
+        lines.append("  得分点:")
+        for sp in rubric.scoring_points:
+            required = "【必须】" if sp.is_required else "【可选】"
+            lines.append(f"    - {required} {sp.description} ({sp.score}分)")
+
+    # 添加标准答案
+    if rubric.standard_answer:
+        answer_preview = (
+            rubric.standard_answer[:150] + "..."
+            if len(rubric.standard_answer) > 150
+            else rubric.standard_answer
+        )
+        lines.append(f"  标准答案: {answer_preview}")
+
+    # 添加另类解法 (Requirement 1.3)
+    if rubric.alternative_solutions:
+        lines.append("  另类解法:")
+        for alt in rubric.alternative_solutions:
+            lines.append(f"    - {alt.description} (最高{alt.max_score}分)")
+            lines.append(f"      条件: {alt.scoring_conditions}")
+
+    return "\n".join(lines)
+
+
+def question_rubric_from_dict(question: Mapping[str, Any]) -> QuestionRubric:
+    """parsed_rubric 中的单题字典 -> QuestionRubric"""
+    qid = question.get("question_id") or question.get("id") or ""
+    scoring_points = [
+        ScoringPoint(
+            description=sp.get("description", ""),
+            score=sp.get("score", 0),
+            is_required=sp.get("is_required", True),
+            point_id=sp.get("point_id") or sp.get("pointId") or f"{qid}.{idx + 1}",
+        )
+        for idx, sp in enumerate(question.get("scoring_points", []))
+    ]
+    return QuestionRubric(
+        question_id=str(qid),
+        question_text=question.get("question_text", ""),
+        max_score=question.get("max_score", 0),
+        scoring_points=scoring_points,
+        standard_answer=question.get("standard_answer", ""),
+        grading_notes=question.get("grading_notes", ""),
+        alternative_solutions=[],  # 简化处理
+    )
+
+
+class CompiledRubricIndex:
+    """
+    评分标准的只读查询快照
+
+    构建时一次性完成题号规范化、别名与子题映射、提示词片段和满分合计，
+    查询时只做字典读取，不加锁。与 RubricRegistry 的查询接口一致，
+    可直接传给 LLMReasoningClient；多个批改节点共享同一快照。
+
+    返回的 QuestionRubric / RubricQueryResult 在各调用方之间共享，调用方不得修改。
+    """
+
+    def __init__(
+        self,
+        rubrics: Iterable[QuestionRubric],
+        total_score: float = 100.0,
+        version: str = "1.0",
+        default_max_score: float = 5.0,
+        default_confidence: float = 0.3,
+    ):
+        self._total_score = total_score
+        self._version = version
+        self._default_max_score = default_max_score
+        self._default_confidence = default_confidence
+
+        by_id: Dict[str, QuestionRubric] = {}
+        for rubric in rubrics:
+            by_id[canonical_question_id(rubric.question_id)] = rubric
+        self._rubrics: Mapping[str, QuestionRubric] = MappingProxyType(by_id)
+        self._fragments: Mapping[str, str] = MappingProxyType(
+            {qid: format_rubric_for_prompt(rubric) for qid, rubric in by_id.items()}
+        )
+        self._total_max_score = sum(r.max_score for r in by_id.values())
+
+        children: Dict[str, List[str]] = {}
+        for qid in by_id:
+            parent = _parent_question_id(qid)
+            if parent:
+                children.setdefault(parent, []).append(qid)
+        self._children: Mapping[str, Tuple[str, ...]] = MappingProxyType(
+            {parent: tuple(ids) for parent, ids in children.items()}
+        )
+
+        # 规范题号 -> 查询结果；父题结果在命中子题时复用
+        self._exact: Dict[str, RubricQueryResult] = {
+            qid: RubricQueryResult(
+                rubric=rubric,
+                is_default=False,
+                confidence=1.0,
+                message=f"找到题目 {rubric.question_id} 的评分标准",
+            )
+            for qid, rubric in by_id.items()
+        }
+        self._parent_results: Dict[str, RubricQueryResult] = {
+            qid: RubricQueryResult(
+                rubric=rubric,
+                is_default=False,
+                confidence=0.8,
+                message=f"使用父题目 {qid} 的评分标准",
+            )
+            for qid, rubric in by_id.items()
+        }
+        # 原始题号 -> 查询结果；预置已注册题号的常见写法，其余在首次查询时补充
+        self._memo: Dict[str, RubricQueryResult] = {}
+        for qid, rubric in by_id.items():
+            self._memo[qid] = self._exact[qid]
+            self._memo[str(rubric.question_id)] = self._exact[qid]
+
+    @classmethod
+    def from_parsed_rubric(cls, parsed_rubric: Mapping[str, Any]) -> "CompiledRubricIndex":
+        """从 parsed_rubric 字典构建"""
+        rubrics = [
+            question_rubric_from_dict(q)
+            for q in parsed_rubric.get("questions", []) or []
+            if q.get("question_id") or q.get("id")
+        ]
+        return cls(rubrics, total_score=parsed_rubric.get("total_score", 100.0))
+
+    @property
+    def total_score(self) -> float:
+        """获取试卷总分"""
+        return self._total_score
+
+    @property
+    def version(self) -> str:
+        """获取版本号"""
+        return self._version
+
+    def get_rubric_for_question(self, question_id: str) -> RubricQueryResult:
+        """获取指定题目的评分标准（语义同 RubricRegistry.get_rubric_for_question）"""
+        result = self._memo.get(question_id)
+        if result is not None:
+            return result
+        result = self._resolve(question_id)
+        # dict 单次赋值在 GIL 下是原子的，并发写入同一键只会得到等价结果
+        if len(self._memo) < _INDEX_MEMO_LIMIT:
+            self._memo[question_id] = result
+        return result
+
+    def _resolve(self, question_id: str) -> RubricQueryResult:
+        canonical = canonical_question_id(question_id)
+        result = self._exact.get(canonical)
+        if result is not None:
+            return result
+        parent = _parent_question_id(canonical)
+        if parent and parent in self._parent_results:
+            return self._parent_results[parent]
+
+        logger.warning(f"题目 {question_id} 的评分标准不存在，使用默认规则")
+        return RubricQueryResult(
+            rubric=QuestionRubric(
+                question_id=str(question_id),
+                max_score=self._default_max_score,
+                question_text="",
+                standard_answer="",
+                scoring_points=[
+                    ScoringPoint(
+                        description="默认得分点",
+                        score=self._default_max_score,
+                        is_required=True,
+                    )
+                ],
+                alternative_solutions=[],
+                grading_notes="使用默认评分规则，建议人工复核",
+            ),
+            is_default=True,
+            confidence=self._default_confidence,
+            message=f"题目 {question_id} 使用默认评分规则",
+        )
+
+    def get_prompt_fragment(self, question_id: str) -> str:
+        """题目的提示词片段（默认规则同样格式化）"""
+        result = self.get_rubric_for_question(question_id)
+        if result.is_default or result.rubric is None:
+            return format_rubric_for_prompt(result.rubric) if result.rubric else ""
+        return self._fragments[canonical_question_id(result.rubric.question_id)]
+
+    def get_sub_question_ids(self, question_id: str) -> Tuple[str, ...]:
+        """已注册的子题题号（如 "7" -> ("7a", "7b")）"""
+        return self._children.get(canonical_question_id(question_id), ())
+
+    def max_score_for(self, question_ids: Iterable[str]) -> float:
+        """指定题目的满分合计（重复题号只计一次，未注册题号按默认规则计）"""
+        seen = set()
+        total = 0.0
+        for qid in question_ids:
+            rubric = self.get_rubric_for_question(qid).rubric
+            key = id(rubric)
+            if rubric is None or key in seen:
+                continue
+            seen.add(key)
+            total += float(rubric.max_score or 0)
+        return total
+
+    def get_all_rubrics(self) -> List[QuestionRubric]:
+        return list(self._rubrics.values())
+
+    def get_rubric_count(self) -> int:
+        return len(self._rubrics)
+
+    def has_rubric(self, question_id: str) -> bool:
+        return canonical_question_id(question_id) in self._rubrics
+
+    def get_question_ids(self) -> List[str]:
+        return list(self._rubrics.keys())
+
+    def calculate_total_max_score(self) -> float:
+        """所有题目的满分总和（构建时计算）"""
+        return self._total_max_score
+
+
+# 内容指纹 -> 编译索引。不按 id(parsed_rubric) 缓存：批改节点为每个学生
+# 深拷贝评分标准，对象身份每次都不同，只会让缓存塞满一次性的副本
+_index_cache: "OrderedDict[str, CompiledRubricIndex]" = OrderedDict()
+_index_cache_lock = Lock()
+
+
+def _rubric_key(parsed_rubric: Mapping[str, Any]) -> Optional[str]:
+    """索引实际用到的字段的内容哈希；无法序列化时返回 None（不缓存）"""
+    key = (
+        parsed_rubric.get("total_score", 100.0),
+        [
+            (
+                q.get("question_id") or q.get("id"),
+                q.get("max_score", 0),
+                q.get("question_text", ""),
+                q.get("standard_answer", ""),
+                q.get("grading_notes", ""),
+                [
+                    (
+                        sp.get("description", ""),
+                        sp.get("score", 0),
+                        sp.get("is_required", True),
+                        sp.get("point_id") or sp.get("pointId"),
+                    )
+                    for sp in q.get("scoring_points", [])
+                ],
+            )
+            for q in parsed_rubric.get("questions", []) or []
+        ],
+    )
+    try:
+        encoded = json.dumps(key, ensure_ascii=False, sort_keys=True)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _remember(cache: OrderedDict, key: Any, value: Any) -> None:
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > _INDEX_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def compile_rubric_index(parsed_rubric: Mapping[str, Any]) -> CompiledRubricIndex:
+    """
+    获取 parsed_rubric 对应的编译索引
+
+    同一批次的各个批改节点共享一个快照：按题目内容哈希复用（深拷贝的
+    副本命中同一快照），内容变化（如应用了规则补丁）时生成新快照。
+    """
+    key = _rubric_key(parsed_rubric)
+    index = None
+    if key is not None:
+        with _index_cache_lock:
+            index = _index_cache.get(key)
+    if index is None:
+        index = CompiledRubricIndex.from_parsed_rubric(parsed_rubric)
+    if key is not None:
+        with _index_cache_lock:
+            _remember(_index_cache, key, index)
+    return index
+
+
 # ==================== 全局单例支持 ====================
 
 _global_registry: Optional[RubricRegistry] = None
@@ -472,6 +842,11 @@ def reset_global_registry() -> None:
 __all__ = [
     "RubricRegistry",
     "RubricQueryResult",
+    "CompiledRubricIndex",
+    "canonical_question_id",
+    "compile_rubric_index",
+    "format_rubric_for_prompt",
+    "question_rubric_from_dict",
     "get_global_registry",
     "reset_global_registry",
 ]
@@ -1,13 +1,33 @@
-"""Run state machine and failure classification helpers."""
+"""Run state machine and failure classification helpers.
+
+Run states live in a store so that every API instance and worker validates
+transitions against the same view:
+- InMemoryRunStateStore: process-local (tests, single-process deployments).
+- RedisRunStateStore: each transition is a compare-and-set applied by one Lua
+  script, with a capped per-run history, TTL eviction of terminal runs and a
+  pub/sub channel that watchers subscribe to instead of polling.
+"""
 
 from __future__ import annotations
 
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
-from typing import Dict, Optional, Set, Tuple
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Set, Tuple
 
 from src.models.run_lifecycle import FailureClass, RunState
 
 
+logger = logging.getLogger(__name__)
+
+
 _ALLOWED_TRANSITIONS: Dict[RunState, Set[RunState]] = {
     RunState.CREATED: {
         RunState.RUNNING,
@@ -75,42 +95,613 @@ def classify_failure(error_text: Optional[str]) -> FailureClass:
     return FailureClass.UNKNOWN
 
 
+TERMINAL_STATES = frozenset({RunState.COMPLETED, RunState.FAILED, RunState.CANCELLED})
+
+# Terminal runs are evicted after this TTL; active runs use a long TTL so that
+# runs abandoned by a crashed worker do not accumulate forever.
+RUN_STATE_TERMINAL_TTL_SECONDS = int(os.getenv("RUN_STATE_TERMINAL_TTL_SECONDS", "3600"))
+RUN_STATE_ACTIVE_TTL_SECONDS = int(os.getenv("RUN_STATE_ACTIVE_TTL_SECONDS", "604800"))
+RUN_STATE_HISTORY_LIMIT = int(os.getenv("RUN_STATE_HISTORY_LIMIT", "100"))
+RUN_STATE_KEY_PREFIX = os.getenv("RUN_STATE_REDIS_PREFIX", "run_state")
+# While running on the in-memory fallback, how often Redis is tried again.
+RUN_STATE_REDIS_RETRY_SECONDS = float(os.getenv("RUN_STATE_REDIS_RETRY_SECONDS", "30"))
+
+# Outcomes of a single store operation.
+_APPLIED = "applied"
+_NOOP = "noop"
+_INVALID = "invalid"
+_CONFLICT = "conflict"
+
+
 @dataclass
 class TransitionResult:
     previous: RunState
     current: RunState
     valid: bool
+    version: int = 0
+    changed: bool = False
+    conflict: bool = False
 
+    @classmethod
+    def from_outcome(
+        cls, outcome: str, previous: RunState, target: RunState, version: int
+    ) -> "TransitionResult":
+        if outcome == _APPLIED:
+            return cls(previous=previous, current=target, valid=True, version=version, changed=True)
+        return cls(
+            previous=previous,
+            current=previous,
+            valid=outcome == _NOOP,
+            version=version,
+            conflict=outcome == _CONFLICT,
+        )
 
-class RunStateMachine:
-    """Minimal in-memory run state machine with transition validation."""
 
-    def __init__(self) -> None:
-        self._states: Dict[str, RunState] = {}
+@dataclass(frozen=True)
+class TransitionRecord:
+    """One entry of a run's transition history (also the payload sent to watchers)."""
+
+    run_id: str
+    current: RunState
+    version: int
+    at_ms: int
+    previous: Optional[RunState] = None
+    reason: Optional[str] = None
+
+    def to_json(self) -> str:
+        payload: Dict[str, Any] = {
+            "run_id": self.run_id,
+            "current": self.current.value,
+            "version": self.version,
+            "at_ms": self.at_ms,
+        }
+        if self.previous is not None:
+            payload["previous"] = self.previous.value
+        if self.reason:
+            payload["reason"] = self.reason
+        return json.dumps(payload, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw: Any) -> "TransitionRecord":
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        payload = json.loads(raw)
+        previous = payload.get("previous")
+        return cls(
+            run_id=payload["run_id"],
+            current=RunState(payload["current"]),
+            version=int(payload["version"]),
+            at_ms=int(payload["at_ms"]),
+            previous=RunState(previous) if previous else None,
+            reason=payload.get("reason") or None,
+        )
+
+
+def _decide(
+    stored: Optional[RunState],
+    target: RunState,
+    expected: Optional[RunState],
+    force: bool,
+) -> str:
+    """Decide the outcome of a transition; mirrored by the Redis Lua script."""
+    current = stored or RunState.CREATED
+    if expected is not None and expected != current:
+        return _CONFLICT
+    if force:
+        return _APPLIED
+    if target == current:
+        return _NOOP if stored is not None else _APPLIED
+    if target in _ALLOWED_TRANSITIONS.get(current, set()):
+        return _APPLIED
+    return _INVALID
+
+
+class RunStateWatch(ABC):
+    """
+    Async iterator over transition records.
+
+    Use as ``async with store.watch(run_id) as updates``: the subscription is
+    active once the context is entered, so read the current state afterwards to
+    avoid missing a transition in between.
+    """
+
+    async def __aenter__(self) -> "RunStateWatch":
+        await self._open()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    def __aiter__(self) -> "RunStateWatch":
+        return self
+
+    async def __anext__(self) -> TransitionRecord:
+        return await self._receive()
+
+    async def next(self, timeout: Optional[float] = None) -> TransitionRecord:
+        """Wait for the next record; raises asyncio.TimeoutError after timeout."""
+        return await asyncio.wait_for(self._receive(), timeout)
+
+    async def _open(self) -> None:
+        return None
+
+    @abstractmethod
+    async def _receive(self) -> TransitionRecord:
+        """Wait for the next transition record."""
 
-    def get(self, run_id: str) -> Optional[RunState]:
-        return self._states.get(run_id)
+    async def close(self) -> None:
+        return None
 
-    def set_initial(self, run_id: str, state: RunState = RunState.CREATED) -> TransitionResult:
-        prev = self._states.get(run_id, state)
-        self._states[run_id] = state
-        return TransitionResult(previous=prev, current=state, valid=True)
 
-    def transition(self, run_id: str, next_state: RunState) -> TransitionResult:
-        current = self._states.get(run_id, RunState.CREATED)
-        allowed = _ALLOWED_TRANSITIONS.get(current, set())
-        valid = next_state == current or next_state in allowed
-        if valid:
-            self._states[run_id] = next_state
-            return TransitionResult(previous=current, current=next_state, valid=True)
-        # Keep current state unchanged when transition is invalid.
-        return TransitionResult(previous=current, current=current, valid=False)
+class _MemoryWatch(RunStateWatch):
+    def __init__(self, watchers: Set["_MemoryWatch"], run_id: Optional[str]) -> None:
+        self._watchers = watchers
+        self.run_id = run_id
+        self.queue: "asyncio.Queue[TransitionRecord]" = asyncio.Queue()
 
-    def transition_from_legacy(self, run_id: str, legacy_status: str) -> TransitionResult:
-        return self.transition(run_id, map_legacy_status(legacy_status))
+    async def _open(self) -> None:
+        self._watchers.add(self)
 
-    def clear(self, run_id: str) -> None:
+    async def _receive(self) -> TransitionRecord:
+        return await self.queue.get()
+
+    async def close(self) -> None:
+        self._watchers.discard(self)
+
+
+class InMemoryRunStateStore:
+    """Process-local store; used for tests and single-process deployments."""
+
+    def __init__(
+        self,
+        terminal_ttl_seconds: Optional[int] = None,
+        active_ttl_seconds: Optional[int] = None,
+        history_limit: Optional[int] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.terminal_ttl_seconds = (
+            RUN_STATE_TERMINAL_TTL_SECONDS if terminal_ttl_seconds is None else terminal_ttl_seconds
+        )
+        self.active_ttl_seconds = (
+            RUN_STATE_ACTIVE_TTL_SECONDS if active_ttl_seconds is None else active_ttl_seconds
+        )
+        self.history_limit = max(1, history_limit or RUN_STATE_HISTORY_LIMIT)
+        self._clock = clock
+        self._states: Dict[str, Tuple[RunState, int]] = {}
+        self._history: Dict[str, Deque[TransitionRecord]] = {}
+        self._expires: Dict[str, float] = {}
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._watchers: Set[_MemoryWatch] = set()
+
+    def _evict_expired(self) -> None:
+        now = self._clock()
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, run_id = heapq.heappop(self._expiry_heap)
+            # Skip stale heap entries left behind by later transitions.
+            if self._expires.get(run_id) == expires_at:
+                self._drop(run_id)
+
+    def _drop(self, run_id: str) -> None:
         self._states.pop(run_id, None)
+        self._history.pop(run_id, None)
+        self._expires.pop(run_id, None)
+
+    def __len__(self) -> int:
+        self._evict_expired()
+        return len(self._states)
+
+    async def get(self, run_id: str) -> Optional[RunState]:
+        self._evict_expired()
+        entry = self._states.get(run_id)
+        return entry[0] if entry else None
+
+    async def apply(
+        self,
+        run_id: str,
+        target: RunState,
+        *,
+        expected: Optional[RunState] = None,
+        force: bool = False,
+        reason: Optional[str] = None,
+    ) -> TransitionResult:
+        self._evict_expired()
+        stored, version = self._states.get(run_id, (None, 0))
+        current = stored or RunState.CREATED
+        outcome = _decide(stored, target, expected, force)
+        if outcome != _APPLIED:
+            return TransitionResult.from_outcome(outcome, current, target, version)
+
+        version += 1
+        now = self._clock()
+        record = TransitionRecord(
+            run_id=run_id,
+            current=target,
+            version=version,
+            at_ms=int(now * 1000),
+            previous=stored,
+            reason=reason,
+        )
+        self._states[run_id] = (target, version)
+        self._history.setdefault(run_id, deque(maxlen=self.history_limit)).append(record)
+        ttl = self.terminal_ttl_seconds if target in TERMINAL_STATES else self.active_ttl_seconds
+        expires_at = now + ttl
+        self._expires[run_id] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, run_id))
+        for watcher in list(self._watchers):
+            if watcher.run_id is None or watcher.run_id == run_id:
+                watcher.queue.put_nowait(record)
+        return TransitionResult.from_outcome(outcome, current, target, version)
+
+    async def history(self, run_id: str) -> List[TransitionRecord]:
+        self._evict_expired()
+        return list(self._history.get(run_id, ()))
+
+    def watch(self, run_id: Optional[str] = None) -> RunStateWatch:
+        return _MemoryWatch(self._watchers, run_id)
 
-    def clear_all(self) -> None:
+    async def delete(self, run_id: str) -> None:
+        self._drop(run_id)
+
+    def snapshot(self) -> Dict[str, RunState]:
+        """Current state of every live run."""
+        self._evict_expired()
+        return {run_id: state for run_id, (state, _version) in self._states.items()}
+
+    async def delete_all(self) -> None:
         self._states.clear()
+        self._history.clear()
+        self._expires.clear()
+        self._expiry_heap.clear()
+
+
+def _lua_set(states: Any) -> str:
+    ordered = sorted(states, key=lambda s: s.value)
+    return "{" + ", ".join(f"{state.value} = true" for state in ordered) + "}"
+
+
+# KEYS: state hash, history list
+# ARGV: run_id, target, expected ('' = any), force ('1'/'0'), reason,
+#       terminal ttl, active ttl, history limit, events channel
+# The transition table is generated from _ALLOWED_TRANSITIONS so both stores
+# validate against the same rules.
+TRANSITION_SCRIPT = """
+local ALLOWED = {%s}
+local TERMINAL = %s
+local run_id = ARGV[1]
+local target = ARGV[2]
+local expected = ARGV[3]
+local force = ARGV[4] == '1'
+
+local data = redis.call('HMGET', KEYS[1], 'state', 'version')
+local stored = data[1]
+local version = tonumber(data[2]) or 0
+local current = stored or 'created'
+
+if expected ~= '' and expected ~= current then
+    return {'conflict', current, version}
+end
+if not force then
+    if target == current then
+        if stored then return {'noop', current, version} end
+    elseif not (ALLOWED[current] and ALLOWED[current][target]) then
+        return {'invalid', current, version}
+    end
+end
+
+version = version + 1
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('HSET', KEYS[1], 'state', target, 'version', version, 'updated_at_ms', now)
+
+local record = {run_id = run_id, current = target, version = version, at_ms = now}
+if stored then record.previous = stored end
+if ARGV[5] ~= '' then record.reason = ARGV[5] end
+local encoded = cjson.encode(record)
+redis.call('RPUSH', KEYS[2], encoded)
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[8]), -1)
+
+local ttl = tonumber(ARGV[7])
+if TERMINAL[target] then ttl = tonumber(ARGV[6]) end
+redis.call('EXPIRE', KEYS[1], ttl)
+redis.call('EXPIRE', KEYS[2], ttl)
+
+redis.call('PUBLISH', ARGV[9], encoded)
+redis.call('PUBLISH', ARGV[9] .. ':' .. run_id, encoded)
+return {'applied', current, version}
+""" % (
+    ", ".join(
+        f"{source.value} = {_lua_set(targets)}" for source, targets in _ALLOWED_TRANSITIONS.items()
+    ),
+    _lua_set(TERMINAL_STATES),
+)
+
+
+def _text(value: Any) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+class _RedisWatch(RunStateWatch):
+    def __init__(self, redis_client: Any, channel: str, run_id: Optional[str]) -> None:
+        self._redis = redis_client
+        self._channel = channel
+        self.run_id = run_id
+        self._pubsub: Any = None
+
+    async def _open(self) -> None:
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(self._channel)
+
+    async def _receive(self) -> TransitionRecord:
+        if self._pubsub is None:
+            await self._open()
+        while True:
+            message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is None or message.get("type") != "message":
+                continue
+            try:
+                return TransitionRecord.from_json(message["data"])
+            except (ValueError, KeyError, TypeError) as exc:
+                logger.warning("Ignoring malformed run state event: %s", exc)
+
+    async def close(self) -> None:
+        if self._pubsub is None:
+            return
+        pubsub, self._pubsub = self._pubsub, None
+        try:
+            await pubsub.unsubscribe(self._channel)
+        finally:
+            await pubsub.aclose()
+
+
+class RedisRunStateStore:
+    """
+    Shared store backed by Redis.
+
+    Each transition is one Lua script run: read, validate/compare, write with a
+    bumped version, append to the capped history list, set TTLs and publish.
+    Redis runs scripts atomically, so concurrent transitions from any number of
+    processes are linearizable; versions of a run are contiguous.
+    """
+
+    def __init__(
+        self,
+        redis_client: Any,
+        key_prefix: Optional[str] = None,
+        terminal_ttl_seconds: Optional[int] = None,
+        active_ttl_seconds: Optional[int] = None,
+        history_limit: Optional[int] = None,
+    ) -> None:
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix or RUN_STATE_KEY_PREFIX
+        self.terminal_ttl_seconds = (
+            RUN_STATE_TERMINAL_TTL_SECONDS if terminal_ttl_seconds is None else terminal_ttl_seconds
+        )
+        self.active_ttl_seconds = (
+            RUN_STATE_ACTIVE_TTL_SECONDS if active_ttl_seconds is None else active_ttl_seconds
+        )
+        self.history_limit = max(1, history_limit or RUN_STATE_HISTORY_LIMIT)
+        self._transition = redis_client.register_script(TRANSITION_SCRIPT)
+
+    async def load_scripts(self) -> None:
+        """Preload the script (SCRIPT LOAD) to skip the first NOSCRIPT round trip."""
+        self._transition.sha = await self.redis_client.script_load(self._transition.script)
+
+    def _state_key(self, run_id: str) -> str:
+        # Braces form a hash tag so both keys of a run share a cluster slot.
+        return f"{self.key_prefix}:{{{run_id}}}"
+
+    def _history_key(self, run_id: str) -> str:
+        return f"{self.key_prefix}:{{{run_id}}}:history"
+
+    @property
+    def events_channel(self) -> str:
+        return f"{self.key_prefix}:events"
+
+    async def get(self, run_id: str) -> Optional[RunState]:
+        value = await self.redis_client.hget(self._state_key(run_id), "state")
+        return RunState(_text(value)) if value else None
+
+    async def apply(
+        self,
+        run_id: str,
+        target: RunState,
+        *,
+        expected: Optional[RunState] = None,
+        force: bool = False,
+        reason: Optional[str] = None,
+    ) -> TransitionResult:
+        outcome, current, version = await self._transition(
+            keys=[self._state_key(run_id), self._history_key(run_id)],
+            args=[
+                run_id,
+                target.value,
+                expected.value if expected is not None else "",
+                "1" if force else "0",
+                reason or "",
+                self.terminal_ttl_seconds,
+                self.active_ttl_seconds,
+                self.history_limit,
+                self.events_channel,
+            ],
+        )
+        return TransitionResult.from_outcome(
+            _text(outcome), RunState(_text(current)), target, int(version)
+        )
+
+    async def history(self, run_id: str) -> List[TransitionRecord]:
+        raw = await self.redis_client.lrange(self._history_key(run_id), 0, -1)
+        return [TransitionRecord.from_json(item) for item in raw]
+
+    def watch(self, run_id: Optional[str] = None) -> RunStateWatch:
+        channel = self.events_channel if run_id is None else f"{self.events_channel}:{run_id}"
+        return _RedisWatch(self.redis_client, channel, run_id)
+
+    async def delete(self, run_id: str) -> None:
+        await self.redis_client.delete(self._state_key(run_id), self._history_key(run_id))
+
+    async def delete_all(self) -> None:
+        async for key in self.redis_client.scan_iter(match=f"{self.key_prefix}:{{*"):
+            await self.redis_client.delete(key)
+
+
+def _memory_store_forced() -> bool:
+    mode = os.getenv("RUN_STATE_STORE", "auto").strip().lower()
+    return mode == "memory" or os.getenv("OFFLINE_MODE", "false").lower() == "true"
+
+
+async def _connect_redis_run_state_store() -> Optional[RedisRunStateStore]:
+    """Redis-backed store, or None when Redis is not configured or unreachable."""
+    try:
+        from src.utils.pool_manager import UnifiedPoolManager
+
+        pool_manager = await UnifiedPoolManager.get_instance()
+        if pool_manager.is_initialized:
+            return RedisRunStateStore(pool_manager.get_redis_client())
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url:
+            import redis.asyncio as redis
+
+            client = redis.from_url(redis_url)
+            try:
+                await asyncio.wait_for(client.ping(), timeout=2.0)
+            except BaseException:
+                await client.aclose()
+                raise
+            return RedisRunStateStore(client)
+    except Exception as exc:
+        logger.warning("Run state store: Redis unavailable: %s", exc)
+    return None
+
+
+async def create_run_state_store() -> Any:
+    """
+    Pick the run state store.
+
+    RUN_STATE_STORE=memory forces the process-local store. Otherwise the shared
+    Redis pool is used when initialized (API process); workers without the pool
+    connect through REDIS_URL. Falls back to memory when Redis is unreachable.
+    """
+    if _memory_store_forced():
+        return InMemoryRunStateStore()
+    store = await _connect_redis_run_state_store()
+    if store is None:
+        logger.warning("Run state store: using in-memory store")
+        return InMemoryRunStateStore()
+    return store
+
+
+class RunStateMachine:
+    """
+    Run state machine validating transitions against a (possibly shared) store.
+
+    Without an explicit store the machine connects to Redis lazily. When Redis
+    is unreachable it runs on a process-local fallback and tries Redis again
+    every ``redis_retry_seconds``; once connected, the fallback's live runs are
+    copied into Redis (runs Redis already knows are left alone).
+    """
+
+    def __init__(
+        self,
+        store: Any = None,
+        *,
+        redis_retry_seconds: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._store = store
+        self._fallback: Optional[InMemoryRunStateStore] = None
+        self._retry_at = 0.0
+        self._redis_retry_seconds = (
+            RUN_STATE_REDIS_RETRY_SECONDS if redis_retry_seconds is None else redis_retry_seconds
+        )
+        self._clock = clock
+        self._resolve_lock = asyncio.Lock()
+
+    async def _resolve(self) -> Any:
+        if self._store is not None:
+            return self._store
+        if self._fallback is not None and self._clock() < self._retry_at:
+            return self._fallback
+        async with self._resolve_lock:
+            if self._store is not None:
+                return self._store
+            if self._fallback is not None and self._clock() < self._retry_at:
+                return self._fallback
+            if _memory_store_forced():
+                self._store = InMemoryRunStateStore()
+                return self._store
+            store = await _connect_redis_run_state_store()
+            if store is None:
+                if self._fallback is None:
+                    logger.warning(
+                        "Run state store: using in-memory fallback, retrying Redis every %.0fs",
+                        self._redis_retry_seconds,
+                    )
+                    self._fallback = InMemoryRunStateStore()
+                self._retry_at = self._clock() + self._redis_retry_seconds
+                return self._fallback
+            if self._fallback is not None:
+                await self._migrate_fallback(store)
+                self._fallback = None
+            self._store = store
+            return store
+
+    async def _migrate_fallback(self, store: Any) -> None:
+        """Carry runs tracked during the outage over to the shared store."""
+        migrated = 0
+        for run_id, state in self._fallback.snapshot().items():
+            try:
+                if await store.get(run_id) is None:
+                    await store.apply(run_id, state, force=True, reason="redis_recovered")
+                    migrated += 1
+            except Exception as exc:
+                logger.warning("Run state store: failed to migrate %s: %s", run_id, exc)
+        logger.info("Run state store: Redis reachable again, migrated %d runs", migrated)
+
+    async def get(self, run_id: str) -> Optional[RunState]:
+        return await (await self._resolve()).get(run_id)
+
+    async def set_initial(
+        self, run_id: str, state: RunState = RunState.CREATED, reason: Optional[str] = None
+    ) -> TransitionResult:
+        """Reset a run to ``state`` unconditionally (recorded in the history)."""
+        store = await self._resolve()
+        return await store.apply(run_id, state, force=True, reason=reason)
+
+    async def transition(
+        self,
+        run_id: str,
+        next_state: RunState,
+        *,
+        expected: Optional[RunState] = None,
+        reason: Optional[str] = None,
+    ) -> TransitionResult:
+        """
+        Validate and apply a transition; unknown runs start from CREATED.
+
+        With ``expected`` the transition is a compare-and-set: it only applies
+        when the stored state equals ``expected`` (result.conflict otherwise).
+        Invalid transitions keep the current state unchanged.
+        """
+        store = await self._resolve()
+        return await store.apply(run_id, next_state, expected=expected, reason=reason)
+
+    async def transition_from_legacy(
+        self, run_id: str, legacy_status: str, reason: Optional[str] = None
+    ) -> TransitionResult:
+        return await self.transition(run_id, map_legacy_status(legacy_status), reason=reason)
+
+    async def history(self, run_id: str) -> List[TransitionRecord]:
+        return await (await self._resolve()).history(run_id)
+
+    @asynccontextmanager
+    async def watch(self, run_id: Optional[str] = None) -> AsyncIterator[RunStateWatch]:
+        """Subscribe to transitions of one run (or all runs when run_id is None)."""
+        store = await self._resolve()
+        async with store.watch(run_id) as updates:
+            yield updates
+
+    async def clear(self, run_id: str) -> None:
+        await (await self._resolve()).delete(run_id)
+
+    async def clear_all(self) -> None:
+        await (await self._resolve()).delete_all()
@@ -0,0 +1,455 @@
+"""
+学生身份分层识别：本地条码 / 填涂学号 → 班级名单模糊匹配 → 页眉裁剪后再调用模型
+
+- 页眉区域（默认上 30%）先在本地识别：二维码、一维条码（需要可选依赖 opencv），
+  以及填涂式学号（每列 0-9 十个圆圈、各涂一个）
+- 任何识别出的姓名 / 学号都与班级名单（postgres_store.list_class_students）做模糊匹配
+- 本地仍无法确定的页面，只把页眉裁剪图发送给模型
+- 本地识别与模型结果均按页面内容哈希缓存，重复提交的页面无需再次识别
+"""
+
+import asyncio
+import difflib
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from PIL import Image
+
+from src.services.page_classifier import INK_THRESHOLD
+from src.utils.image import pil_to_jpeg_bytes
+
+try:
+    import cv2
+except ImportError:  # 条码识别为可选能力；缺失时只读取填涂学号
+    cv2 = None
+
+logger = logging.getLogger(__name__)
+
+ID_SOURCE_BARCODE = "barcode"
+ID_SOURCE_BUBBLE = "bubble_grid"
+ID_SOURCE_LLM = "llm"
+
+HEADER_RATIO = float(os.getenv("STUDENT_ID_HEADER_RATIO", "0.3"))
+NAME_MATCH_THRESHOLD = float(os.getenv("STUDENT_ID_NAME_MATCH_THRESHOLD", "0.75"))
+ROSTER_TTL_SECONDS = float(os.getenv("STUDENT_ID_ROSTER_TTL_SECONDS", "300"))
+ID_CACHE_SIZE = int(os.getenv("STUDENT_ID_CACHE_SIZE", "4096"))
+
+# 页眉在本地识别前缩放到的最大宽度（约 200dpi 的 A4 宽度）
+_HEADER_WORK_WIDTH = 1700
+# 条码检测器内部会缩到 512px，这里按多个宽度依次尝试以覆盖不同的条宽
+_BARCODE_WIDTHS = (1024, 768, 512)
+_BUBBLE_ROWS = 10
+_BUBBLE_MIN_COLUMNS = 4
+_BUBBLE_MIN_SIZE = 8
+_BUBBLE_MAX_SIZE = 80
+
+
+@dataclass(frozen=True)
+class HeaderId:
+    """页眉中本地识别出的学号"""
+
+    value: str
+    source: str
+
+
+@dataclass(frozen=True)
+class RosterMatch:
+    """与班级名单匹配上的学生"""
+
+    student_id: str
+    name: str
+    score: float
+    matched_on: str
+
+
+def page_hash(image_data: bytes) -> bytes:
+    return hashlib.blake2b(image_data, digest_size=16).digest()
+
+
+# ==================== 页眉裁剪与本地识别 ====================
+
+
+def _open_header(image_data: bytes, ratio: float, max_width: int) -> Image.Image:
+    image = Image.open(BytesIO(image_data))
+    scale = max_width / image.size[0]
+    if scale < 0.5 and image.format == "JPEG":
+        image.draft(image.mode, (int(image.size[0] * scale), int(image.size[1] * scale)))
+    width, height = image.size
+    header = image.crop((0, 0, width, max(1, int(round(height * ratio)))))
+    if width > max_width:
+        header = header.resize(
+            (max_width, max(1, int(header.height * max_width / width))), Image.BILINEAR
+        )
+    return header
+
+
+def crop_header(image_data: bytes, ratio: float = HEADER_RATIO) -> bytes:
+    """裁出页眉区域（供模型识别姓名 / 学号）；无法解码时返回原图"""
+    try:
+        header = _open_header(image_data, ratio, _HEADER_WORK_WIDTH)
+    except Exception as exc:
+        logger.debug(f"[student_id] 无法裁剪页眉，发送整页: {exc}")
+        return image_data
+    return pil_to_jpeg_bytes(header, quality=85)
+
+
+def decode_header_codes(gray: np.ndarray) -> List[str]:
+    """识别页眉中的二维码与一维条码内容（需要 opencv）"""
+    if cv2 is None:
+        return []
+    found: List[str] = []
+    try:
+        text, _points, _straight = cv2.QRCodeDetector().detectAndDecode(gray)
+        if text:
+            found.append(text.strip())
+    except cv2.error as exc:
+        logger.debug(f"[student_id] 二维码识别失败: {exc}")
+    if found:
+        return found
+
+    detector = cv2.barcode.BarcodeDetector()
+    for width in _BARCODE_WIDTHS:
+        scale = width / gray.shape[1]
+        image = (
+            cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            if scale < 1.0
+            else gray
+        )
+        try:
+            ok, decoded, _types, _points = detector.detectAndDecodeWithType(image)
+        except cv2.error as exc:
+            logger.debug(f"[student_id] 条码识别失败: {exc}")
+            break
+        if ok:
+            found = [value.strip() for value in decoded if value and value.strip()]
+            if found:
+                break
+    return found
+
+
+def _cluster_1d(values: np.ndarray, tolerance: float) -> np.ndarray:
+    """按间隔把一维坐标分组，返回每个值所属的组号（组号按坐标升序）"""
+    order = np.argsort(values)
+    groups = np.zeros(len(values), dtype=np.int32)
+    current = 0
+    for prev, idx in zip(order[:-1], order[1:]):
+        if values[idx] - values[prev] > tolerance:
+            current += 1
+        groups[idx] = current
+    return groups
+
+
+def read_bubble_grid(
+    gray: np.ndarray,
+    rows: int = _BUBBLE_ROWS,
+    min_columns: int = _BUBBLE_MIN_COLUMNS,
+) -> Optional[str]:
+    """
+    读取填涂式学号：每列 rows 个圆圈（自上而下 0-9），每列恰好涂满一个
+
+    圆圈与涂点都按近似正方形的连通域识别（空心圈中心无墨迹、涂点填充率高），
+    再按中心坐标聚成行列；任一列未涂或多涂时返回 None。
+    """
+    from scipy import ndimage
+
+    paper = float(np.percentile(gray, 90))
+    ink = gray < max(INK_THRESHOLD, paper - 60)
+    labels, count = ndimage.label(ink)
+    if count < rows * min_columns:
+        return None
+
+    areas = np.bincount(labels.ravel())[1:]
+    bubbles: List[Tuple[float, float, int, bool]] = []
+    for idx, box in enumerate(ndimage.find_objects(labels)):
+        height = box[0].stop - box[0].start
+        width = box[1].stop - box[1].start
+        if not (_BUBBLE_MIN_SIZE <= min(height, width) and max(height, width) <= _BUBBLE_MAX_SIZE):
+            continue
+        if not 0.75 <= width / height <= 1.33:
+            continue
+        fill = areas[idx] / float(height * width)
+        if fill >= 0.6:
+            filled = True
+        elif fill <= 0.45:
+            core = labels[box][height // 3 : 2 * height // 3, width // 3 : 2 * width // 3]
+            if (core == idx + 1).any():
+                continue
+            filled = False
+        else:
+            continue
+        center_y = (box[0].start + box[0].stop) / 2
+        center_x = (box[1].start + box[1].stop) / 2
+        bubbles.append((center_y, center_x, max(height, width), filled))
+
+    if len(bubbles) < rows * min_columns:
+        return None
+    sizes = np.array([b[2] for b in bubbles], dtype=np.float32)
+    size = float(np.median(sizes))
+    keep = np.abs(sizes - size) <= 0.3 * size
+    ys = np.array([b[0] for b in bubbles], dtype=np.float32)[keep]
+    xs = np.array([b[1] for b in bubbles], dtype=np.float32)[keep]
+    filled = np.array([b[3] for b in bubbles], dtype=bool)[keep]
+    if ys.size < rows * min_columns:
+        return None
+
+    row_of = _cluster_1d(ys, size * 0.5)
+    col_of = _cluster_1d(xs, size * 0.5)
+    grid_rows = [r for r in np.unique(row_of) if (row_of == r).sum() >= min_columns]
+    grid_cols = [c for c in np.unique(col_of) if (col_of == c).sum() == rows]
+    if len(grid_rows) != rows or len(grid_cols) < min_columns:
+        return None
+
+    digit_of_row = {row: digit for digit, row in enumerate(grid_rows)}
+    digits = []
+    for col in grid_cols:
+        marked = np.flatnonzero((col_of == col) & filled)
+        if len(marked) != 1 or row_of[marked[0]] not in digit_of_row:
+            return None
+        digits.append(str(digit_of_row[row_of[marked[0]]]))
+    return "".join(digits)
+
+
+def detect_header_id(image_data: bytes, ratio: float = HEADER_RATIO) -> Optional[HeaderId]:
+    """在页眉中本地识别学号：条码 / 二维码优先，其次填涂学号；无法识别返回 None"""
+    try:
+        gray = np.asarray(
+            _open_header(image_data, ratio, _HEADER_WORK_WIDTH).convert("L"), dtype=np.uint8
+        )
+    except Exception as exc:
+        logger.debug(f"[student_id] 无法解码页眉: {exc}")
+        return None
+    if gray.shape[0] < 16 or gray.shape[1] < 16:
+        return None
+
+    codes = decode_header_codes(gray)
+    if codes:
+        return HeaderId(value=codes[0], source=ID_SOURCE_BARCODE)
+    try:
+        bubble_id = read_bubble_grid(gray)
+    except Exception as exc:
+        logger.debug(f"[student_id] 填涂学号读取失败: {exc}")
+        bubble_id = None
+    if bubble_id:
+        return HeaderId(value=bubble_id, source=ID_SOURCE_BUBBLE)
+    return None
+
+
+# ==================== 班级名单匹配 ====================
+
+
+def _normalize_id(value: Any) -> str:
+    return re.sub(r"[^0-9A-Za-z]", "", str(value or "")).upper()
+
+
+def _normalize_name(value: Any) -> str:
+    return re.sub(r"[\s　·.\-_]", "", str(value or "")).casefold()
+
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """两个字符串是否至多相差一次替换 / 插入 / 删除"""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    if len(a) == len(b):
+        return sum(x != y for x, y in zip(a, b)) <= 1
+    if len(a) > len(b):
+        a, b = b, a
+    i = 0
+    while i < len(a) and a[i] == b[i]:
+        i += 1
+    return a[i:] == b[i + 1 :]
+
+
+class ClassRoster:
+    """
+    班级名单，用于校正识别到的姓名 / 学号
+
+    学号与名单中的 id、username 比较：先精确匹配，长度 ≥ 6 时允许唯一的一位之差；
+    姓名按相似度匹配，且最佳候选需明显优于次佳候选。
+    """
+
+    def __init__(self, students: Iterable[Any]):
+        self._by_id: Dict[str, Tuple[str, str]] = {}
+        self._names: List[Tuple[str, str, str]] = []
+        for student in students:
+            student_id = str(getattr(student, "id", "") or "")
+            if not student_id:
+                continue
+            username = getattr(student, "username", "") or ""
+            name = getattr(student, "name", None) or username or student_id
+            for key in (student_id, username):
+                normalized = _normalize_id(key)
+                if normalized:
+                    self._by_id.setdefault(normalized, (student_id, name))
+            normalized_name = _normalize_name(name)
+            if normalized_name:
+                self._names.append((normalized_name, student_id, name))
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def match_id(self, raw_id: Any) -> Optional[RosterMatch]:
+        key = _normalize_id(raw_id)
+        if not key:
+            return None
+        hit = self._by_id.get(key)
+        if hit:
+            return RosterMatch(student_id=hit[0], name=hit[1], score=1.0, matched_on="id")
+        if len(key) < 6:
+            return None
+        close = {hit for known, hit in self._by_id.items() if _within_one_edit(key, known)}
+        if len(close) == 1:
+            student_id, name = close.pop()
+            return RosterMatch(student_id=student_id, name=name, score=0.9, matched_on="id")
+        return None
+
+    def match_name(self, raw_name: Any) -> Optional[RosterMatch]:
+        key = _normalize_name(raw_name)
+        if not key or not self._names:
+            return None
+        scored = sorted(
+            (
+                (difflib.SequenceMatcher(None, key, known).ratio(), student_id, name)
+                for known, student_id, name in self._names
+            ),
+            reverse=True,
+        )
+        best_score, student_id, name = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        if best_score < NAME_MATCH_THRESHOLD or best_score - runner_up < 0.1:
+            return None
+        return RosterMatch(
+            student_id=student_id, name=name, score=round(best_score, 3), matched_on="name"
+        )
+
+    def match(self, name: Any = None, student_id: Any = None) -> Optional[RosterMatch]:
+        return self.match_id(student_id) or self.match_name(name)
+
+
+class _RosterCache:
+    def __init__(self, ttl_seconds: float = ROSTER_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._entries: Dict[str, Tuple[float, ClassRoster]] = {}
+
+    async def get(self, class_id: str) -> ClassRoster:
+        entry = self._entries.get(class_id)
+        if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+            return entry[1]
+        from src.db.postgres_store import list_class_students
+
+        students = await asyncio.to_thread(list_class_students, class_id)
+        roster = ClassRoster(students)
+        self._entries[class_id] = (time.monotonic(), roster)
+        return roster
+
+
+_roster_cache = _RosterCache()
+
+
+async def load_class_roster(class_id: str) -> ClassRoster:
+    """读取班级名单（进程内缓存 STUDENT_ID_ROSTER_TTL_SECONDS 秒）"""
+    return await _roster_cache.get(class_id)
+
+
+# ==================== 按页面哈希缓存识别结果 ====================
+
+
+class PageIdentificationCache:
+    """
+    按 (页面内容哈希, 识别方式) 缓存识别结果的 LRU，线程安全
+
+    本地识别结果（包括“未识别到”）与模型结果分开存放；只缓存成功的模型调用。
+    """
+
+    _MISSING = object()
+
+    def __init__(self, max_entries: int = ID_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[bytes, Hashable], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: bytes, kind: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            value = self._entries.get((digest, kind), self._MISSING)
+            if value is self._MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end((digest, kind))
+            self.hits += 1
+            return value
+
+    def contains(self, digest: bytes, kind: Hashable) -> bool:
+        with self._lock:
+            return (digest, kind) in self._entries
+
+    def put(self, digest: bytes, kind: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[(digest, kind)] = value
+            self._entries.move_to_end((digest, kind))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_page_identification_cache: Optional[PageIdentificationCache] = None
+
+
+def get_page_identification_cache() -> PageIdentificationCache:
+    """获取进程内共享的页面识别缓存"""
+    global _page_identification_cache
+    if _page_identification_cache is None:
+        _page_identification_cache = PageIdentificationCache()
+    return _page_identification_cache
+
+
+def detect_header_ids(images: Sequence[bytes], skip: Iterable[int] = ()) -> Dict[int, HeaderId]:
+    """批量本地识别页眉学号（带缓存），返回 {页面位置: HeaderId}"""
+    cache = get_page_identification_cache()
+    skipped = set(skip)
+    found: Dict[int, HeaderId] = {}
+    for i, image in enumerate(images):
+        if i in skipped or not isinstance(image, (bytes, bytearray)):
+            continue
+        digest = page_hash(bytes(image))
+        if cache.contains(digest, "local"):
+            header_id = cache.get(digest, "local")
+        else:
+            header_id = detect_header_id(bytes(image))
+            cache.put(digest, "local", header_id)
+        if header_id is not None:
+            found[i] = header_id
+    return found
+
+
+__all__ = [
+    "ClassRoster",
+    "HeaderId",
+    "ID_SOURCE_BARCODE",
+    "ID_SOURCE_BUBBLE",
+    "ID_SOURCE_LLM",
+    "PageIdentificationCache",
+    "RosterMatch",
+    "crop_header",
+    "decode_header_codes",
+    "detect_header_id",
+    "detect_header_ids",
+    "get_page_identification_cache",
+    "load_class_roster",
+    "page_hash",
+    "read_bubble_grid",
+]
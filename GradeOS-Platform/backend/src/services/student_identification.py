@@ -1,7 +1,8 @@
 """学生身份识别服务 - 基于题目顺序循环检测
 
 核心逻辑：
-1. 首先尝试识别学生信息（姓名/学号）
+1. 首先尝试识别学生信息（姓名/学号）：页眉条码 / 填涂学号本地识别，
+   与班级名单匹配，仍无法确定时才把页眉裁剪图发送给模型
 2. 如果无法识别学生信息，则识别当前页面的题目编号
 3. 通过检测题目编号的"循环"来推断学生边界
    - 例如：题目顺序 1,2,3,4,1,2,3,4 表示有 2 个学生
@@ -9,16 +10,26 @@
 """
 
 import asyncio
-import base64
 import json
 import logging
 import os
 from typing import List, Optional, Tuple
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 
 from langchain_core.messages import HumanMessage
 
 from src.services.chat_model_factory import get_chat_model
+from src.services.image_preparation import CALL_IDENTIFICATION, prepare_vision_images
+from src.services.page_classifier import find_blank_pages
+from src.services.student_id_detection import (
+    ClassRoster,
+    HeaderId,
+    crop_header,
+    detect_header_ids,
+    get_page_identification_cache,
+    load_class_roster,
+    page_hash,
+)
 from src.models.region import BoundingBox
 from src.utils.coordinates import normalize_coordinates
 from src.config.models import get_lite_model
@@ -48,6 +59,7 @@ class PageAnalysis:
     first_question: Optional[str] = None  # 第一道题的编号
     student_info: Optional[StudentInfo] = None
     is_cover_page: bool = False  # 是否为封面/说明页
+    is_blank_page: bool = False  # 本地检测为空白页（未调用模型）
 
 
 @dataclass
@@ -67,6 +79,7 @@ class BatchSegmentationResult:
     student_count: int
     page_mappings: List[PageStudentMapping]
     unidentified_pages: List[int]
+    blank_pages: List[int] = field(default_factory=list)
 
 
 class StudentIdentificationService:
@@ -99,8 +112,6 @@ class StudentIdentificationService:
         Returns:
             PageAnalysis: 包含学生信息和题目编号的分析结果
         """
-        image_b64 = base64.b64encode(image_data).decode("utf-8")
-
         if boundary_only:
             prompt = """Analyze this exam page ONLY for boundary detection.
 Return JSON only, no extra text.
@@ -146,70 +157,27 @@ Output JSON:
 Normalize question numbers (e.g., "Question 1" -> "1"). Ignore A/B/C/D options.
 """
 
+        cache = get_page_identification_cache()
+        digest = page_hash(image_data) if isinstance(image_data, (bytes, bytearray)) else None
+        cache_kind = ("page", boundary_only, self.model_name)
+        if digest is not None:
+            cached = cache.get(digest, cache_kind)
+            if cached is not None:
+                return replace(cached, page_index=page_index)
+
+        # 识别只需看清姓名、学号与题号：裁边、纠偏并使用较低分辨率
+        prepared = await prepare_vision_images([image_data], CALL_IDENTIFICATION, self.model_name)
         message = HumanMessage(
-            content=[
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": f"data:image/png;base64,{image_b64}"},
-            ]
+            content=[{"type": "text", "text": prompt}, prepared[0].content_part()]
         )
 
         try:
-            # 添加重试机制处理 503 错误
-            max_retries = 3
-            retry_delay = 5
-            last_error = None
-
-            for attempt in range(max_retries):
-                try:
-                    response = await self.llm.ainvoke([message])
-                    break
-                except Exception as e:
-                    last_error = e
-                    error_str = str(e)
-                    if "503" in error_str or "overloaded" in error_str.lower():
-                        if attempt < max_retries - 1:
-                            logger.warning(
-                                f"LLM API 过载，{retry_delay}秒后重试 ({attempt + 1}/{max_retries})"
-                            )
-                            await asyncio.sleep(retry_delay)
-                            retry_delay *= 2
-                            continue
-                    raise
-            else:
-                raise last_error
-
-            # 处理 response.content 可能是列表的情况
-            result_text = response.content
-            if isinstance(result_text, list):
-                text_parts = []
-                for item in result_text:
-                    if isinstance(item, str):
-                        text_parts.append(item)
-                    elif isinstance(item, dict) and "text" in item:
-                        text_parts.append(item["text"])
-                result_text = "".join(text_parts)
-            elif not isinstance(result_text, str):
-                result_text = str(result_text) if result_text else ""
-
-            # 提取 JSON
-            if "```json" in result_text:
-                json_start = result_text.find("```json") + 7
-                json_end = result_text.find("```", json_start)
-                result_text = result_text[json_start:json_end].strip()
-
-            data = json.loads(result_text)
+            data = await self._invoke_json(message)
 
             # 解析学生信息
             student_info = None
             if not boundary_only:
-                si = data.get("student_info", {})
-                if si.get("found") and (si.get("name") or si.get("student_id")):
-                    student_info = StudentInfo(
-                        name=si.get("name"),
-                        student_id=si.get("student_id"),
-                        class_name=si.get("class_name"),
-                        confidence=si.get("confidence", 0.0),
-                    )
+                student_info = self._parse_student_info(data)
 
             # 解析题目编号
             questions = data.get("questions", {})
@@ -220,18 +188,178 @@ Normalize question numbers (e.g., "Question 1" -> "1"). Ignore A/B/C/D options.
                 if not first_question:
                     first_question = question_numbers[0]
 
-            return PageAnalysis(
+            analysis = PageAnalysis(
                 page_index=page_index,
                 question_numbers=question_numbers,
                 first_question=first_question,
                 student_info=student_info,
                 is_cover_page=data.get("is_cover_page", False),
             )
+            if digest is not None:
+                cache.put(digest, cache_kind, analysis)
+                return replace(analysis)
+            return analysis
 
         except Exception as e:
             logger.error(f"页面分析失败 (page {page_index}): {str(e)}")
             return PageAnalysis(page_index=page_index)
 
+    async def analyze_header(self, image_data: bytes, page_index: int = 0) -> PageAnalysis:
+        """
+        只识别页眉中的学生信息（发送裁剪后的页眉区域而非整页）
+
+        页眉区域通常也包含首道题的题号，一并返回，供无学生信息时做边界检测。
+
+        Returns:
+            PageAnalysis: 包含 student_info 与页眉内题号的分析结果
+        """
+        cache = get_page_identification_cache()
+        digest = page_hash(image_data)
+        cache_kind = ("header", "questions", self.model_name)
+        cached = cache.get(digest, cache_kind)
+        if cached is not None:
+            return replace(cached, page_index=page_index)
+
+        prompt = """This image is the top strip of an exam answer page.
+Extract the student's name, student ID and class only if they are written or printed here, otherwise use null.
+Also list up to 3 question numbers visible in this strip, in order (empty list if none).
+Return JSON only, no extra text.
+
+Output JSON:
+{
+  "student_info": {
+    "found": true/false,
+    "name": "name or null",
+    "student_id": "id or null",
+    "class_name": "class or null",
+    "confidence": 0.0
+  },
+  "questions": {
+    "numbers": ["1", "2"],
+    "first_question": "1"
+  },
+  "is_cover_page": false
+}
+
+Normalize question numbers (e.g., "Question 1" -> "1"). Ignore A/B/C/D options.
+"""
+        header = await asyncio.to_thread(crop_header, image_data)
+        prepared = await prepare_vision_images([header], CALL_IDENTIFICATION, self.model_name)
+        message = HumanMessage(
+            content=[{"type": "text", "text": prompt}, prepared[0].content_part()]
+        )
+        try:
+            data = await self._invoke_json(message)
+        except Exception as e:
+            logger.error(f"页眉识别失败 (page {page_index}): {str(e)}")
+            return PageAnalysis(page_index=page_index)
+
+        questions = data.get("questions") or {}
+        question_numbers = [str(q) for q in (questions.get("numbers") or [])][:3]
+        analysis = PageAnalysis(
+            page_index=page_index,
+            question_numbers=question_numbers,
+            first_question=questions.get("first_question")
+            or (question_numbers[0] if question_numbers else None),
+            student_info=self._parse_student_info(data),
+            is_cover_page=bool(data.get("is_cover_page", False)),
+        )
+        cache.put(digest, cache_kind, analysis)
+        return replace(analysis)
+
+    async def _invoke_json(self, message: HumanMessage) -> dict:
+        """调用模型并解析 JSON 响应（503 / 过载时退避重试）"""
+        # 添加重试机制处理 503 错误
+        max_retries = 3
+        retry_delay = 5
+        last_error = None
+
+        for attempt in range(max_retries):
+            try:
+                response = await self.llm.ainvoke([message])
+                break
+            except Exception as e:
+                last_error = e
+                error_str = str(e)
+                if "503" in error_str or "overloaded" in error_str.lower():
+                    if attempt < max_retries - 1:
+                        logger.warning(
+                            f"LLM API 过载，{retry_delay}秒后重试 ({attempt + 1}/{max_retries})"
+                        )
+                        await asyncio.sleep(retry_delay)
+                        retry_delay *= 2
+                        continue
+                raise
+        else:
+            raise last_error
+
+        # 处理 response.content 可能是列表的情况
+        result_text = response.content
+        if isinstance(result_text, list):
+            text_parts = []
+            for item in result_text:
+                if isinstance(item, str):
+                    text_parts.append(item)
+                elif isinstance(item, dict) and "text" in item:
+                    text_parts.append(item["text"])
+            result_text = "".join(text_parts)
+        elif not isinstance(result_text, str):
+            result_text = str(result_text) if result_text else ""
+
+        # 提取 JSON
+        if "```json" in result_text:
+            json_start = result_text.find("```json") + 7
+            json_end = result_text.find("```", json_start)
+            result_text = result_text[json_start:json_end].strip()
+
+        return json.loads(result_text)
+
+    @staticmethod
+    def _parse_student_info(data: dict) -> Optional[StudentInfo]:
+        si = data.get("student_info") or {}
+        if si.get("found") and (si.get("name") or si.get("student_id")):
+            return StudentInfo(
+                name=si.get("name"),
+                student_id=si.get("student_id"),
+                class_name=si.get("class_name"),
+                confidence=si.get("confidence", 0.0),
+            )
+        return None
+
+    @staticmethod
+    def _match_roster(
+        student_info: Optional[StudentInfo], roster: Optional[ClassRoster]
+    ) -> Optional[StudentInfo]:
+        """用班级名单校正模型识别出的姓名 / 学号"""
+        if student_info is None or roster is None:
+            return student_info
+        match = roster.match(name=student_info.name, student_id=student_info.student_id)
+        if match is None:
+            return student_info
+        return StudentInfo(
+            name=match.name,
+            student_id=match.student_id,
+            class_name=student_info.class_name,
+            confidence=max(student_info.confidence or 0.0, match.score),
+            bounding_box=student_info.bounding_box,
+        )
+
+    @staticmethod
+    def _student_from_header_id(
+        header_id: Optional[HeaderId], roster: Optional[ClassRoster]
+    ) -> Optional[StudentInfo]:
+        """本地识别出的学号；有名单时必须能匹配上，否则交给模型确认"""
+        if header_id is None:
+            return None
+        if roster is None:
+            return StudentInfo(student_id=header_id.value, confidence=0.9)
+        match = roster.match_id(header_id.value)
+        if match is None:
+            return None
+        return StudentInfo(
+            name=match.name, student_id=match.student_id, confidence=max(0.9, match.score)
+        )
+
     def detect_student_boundaries(self, page_analyses: List[PageAnalysis]) -> List[Tuple[int, int]]:
         """
         通过题目顺序循环检测学生边界
@@ -317,20 +445,34 @@ Normalize question numbers (e.g., "Question 1" -> "1"). Ignore A/B/C/D options.
         return int(q)
 
     async def segment_batch_document(
-        self, images_data: List[bytes], progress_callback: Optional[callable] = None
+        self,
+        images_data: List[bytes],
+        progress_callback: Optional[callable] = None,
+        roster: Optional[ClassRoster] = None,
+        class_id: Optional[str] = None,
     ) -> BatchSegmentationResult:
         """
         分割多学生合卷文档
 
         策略：
-        1. 分析所有页面，提取学生信息和题目编号
-        2. 优先使用学生信息进行分组
-        3. 如果无学生信息，使用题目顺序循环检测
-        4. 为无法识别的学生分配代号
+        1. 本地识别页眉中的条码 / 二维码 / 填涂学号，并与班级名单匹配
+        2. 本地无法确定的页面，只把页眉裁剪图发送给模型识别姓名 / 学号及页眉内的题号
+        3. 优先使用学生信息进行分组
+        4. 如果无学生信息，复用页眉识别得到的题号做题目顺序循环检测（不再整页调用模型）
+        5. 为无法识别的学生分配代号
+
+        Args:
+            roster: 班级名单（用于校正识别结果）；未提供时按 class_id 读取
         """
         logger.info(f"开始批量文档分割，共 {len(images_data)} 页")
 
-        # ??????????? (????)
+        if roster is None and class_id:
+            try:
+                roster = await load_class_roster(class_id)
+            except Exception as exc:
+                logger.warning(f"读取班级名单失败，跳过名单匹配 (class {class_id}): {exc}")
+
+        # 模型调用并发上限
         max_concurrency = int(os.getenv("STUDENT_ID_MAX_CONCURRENCY", "5"))
         semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency > 0 else None
         debug_enabled = os.getenv("STUDENT_ID_DEBUG", "false").strip().lower() in (
@@ -341,26 +483,57 @@ Normalize question numbers (e.g., "Question 1" -> "1"). Ignore A/B/C/D options.
         if debug_enabled:
             logger.debug("Starting parallel analysis of %s pages", len(images_data))
 
-        async def analyzed_page_with_semaphore(image_data, i):
+        async def limited(analyze, image_data, i):
             if semaphore:
                 async with semaphore:
                     if debug_enabled:
                         logger.debug("Analyzing page %s...", i)
-                    analysis = await self.analyze_page(image_data, i)
+                    analysis = await analyze(image_data, i)
                     if debug_enabled:
                         logger.debug("Page %s analysis complete", i)
             else:
                 if debug_enabled:
                     logger.debug("Analyzing page %s...", i)
-                analysis = await self.analyze_page(image_data, i)
+                analysis = await analyze(image_data, i)
                 if debug_enabled:
                     logger.debug("Page %s analysis complete", i)
+            return analysis
+
+        # 空白页（双面扫描背面等）不调用模型，仍保留位置以便归入前一位学生
+        blank_pages = set(await asyncio.to_thread(find_blank_pages, images_data))
+        if blank_pages:
+            logger.info(f"跳过 {len(blank_pages)} 个空白页: {sorted(blank_pages)}")
+
+        # 第一层：本地识别页眉学号（按页面哈希缓存）
+        header_ids = await asyncio.to_thread(detect_header_ids, images_data, blank_pages)
+
+        async def identify_page(image_data, i):
+            if i in blank_pages:
+                analysis = PageAnalysis(page_index=i, is_blank_page=True)
+            else:
+                student_info = self._student_from_header_id(header_ids.get(i), roster)
+                if student_info is not None:
+                    analysis = PageAnalysis(page_index=i, student_info=student_info)
+                else:
+                    # 第二层：只把页眉发送给模型，结果再与名单匹配
+                    analysis = await limited(self.analyze_header, image_data, i)
+                    analysis.student_info = self._match_roster(analysis.student_info, roster)
             if progress_callback:
                 await progress_callback(i + 1, len(images_data))
             return analysis
 
-        tasks = [analyzed_page_with_semaphore(img, i) for i, img in enumerate(images_data)]
+        tasks = [identify_page(img, i) for i, img in enumerate(images_data)]
         page_analyses = await asyncio.gather(*tasks)
+        logger.info(
+            f"页眉识别完成: 本地 {len(header_ids)} 页, "
+            f"模型 {len(images_data) - len(header_ids) - len(blank_pages)} 页"
+        )
+
+        # 第二阶段：检测学生边界
+        # 首先检查是否有明确的学生信息；没有时用页眉识别同时返回的题号做循环检测
+        has_student_info = any(
+            a.student_info and a.student_info.confidence >= 0.6 for a in page_analyses
+        )
 
         # 按索引排序，确保顺序正确
         page_analyses.sort(key=lambda x: x.page_index)
@@ -372,18 +545,14 @@ Normalize question numbers (e.g., "Question 1" -> "1"). Ignore A/B/C/D options.
                 f"student={analysis.student_info.name if analysis.student_info else 'None'}"
             )
 
-        # 第二阶段：检测学生边界
-        # 首先检查是否有明确的学生信息
-        has_student_info = any(
-            a.student_info and a.student_info.confidence >= 0.6 for a in page_analyses
-        )
-
         if has_student_info:
             # 使用学生信息分组
-            return self._segment_by_student_info(page_analyses)
+            result = self._segment_by_student_info(page_analyses)
         else:
             # 使用题目顺序循环检测
-            return self._segment_by_question_cycle(page_analyses)
+            result = self._segment_by_question_cycle(page_analyses)
+        result.blank_pages = [a.page_index for a in page_analyses if a.is_blank_page]
+        return result
 
     def segment_from_analyses(self, page_analyses: List[PageAnalysis]) -> BatchSegmentationResult:
         """
@@ -407,8 +576,11 @@ Normalize question numbers (e.g., "Question 1" -> "1"). Ignore A/B/C/D options.
         )
 
         if has_student_info:
-            return self._segment_by_student_info(page_analyses)
-        return self._segment_by_question_cycle(page_analyses)
+            result = self._segment_by_student_info(page_analyses)
+        else:
+            result = self._segment_by_question_cycle(page_analyses)
+        result.blank_pages = [a.page_index for a in page_analyses if a.is_blank_page]
+        return result
 
     def _segment_by_student_info(
         self, page_analyses: List[PageAnalysis]
@@ -6,14 +6,21 @@
 - 跨组件传递追踪标识
 - 结构化日志记录
 - 性能告警
+- 采样（头部按 trace_id 采样，错误/慢跨度始终保留）
+- 有界环形缓冲 + 后台批量写入
+- OTLP JSON 文件导出
 
 验证：需求 5.1, 5.2, 5.3, 5.4, 5.5
 """
 
 import asyncio
+import hashlib
+import json
 import logging
+import os
 import uuid
-from typing import Optional, Dict, Any, List, Callable, Awaitable
+from collections import OrderedDict, deque
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Deque
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from enum import Enum
@@ -122,9 +129,159 @@ class TracingConfig:
     enable_persistence: bool = True  # 是否持久化到数据库
     enable_alerts: bool = True  # 是否启用告警
     max_attributes_size: int = 10000  # 属性最大字节数
-    batch_size: int = 100  # 批量持久化大小
+    batch_size: int = 100  # 批量持久化大小（达到后提前唤醒刷新）
     flush_interval_seconds: float = 5.0  # 刷新间隔（秒）
 
+    # 采样：普通跨度按 trace_id 以 sample_rate 采样；错误与慢跨度始终保留
+    sample_rate: float = 1.0
+    slow_span_threshold_ms: Optional[int] = None  # 默认与告警阈值相同
+    max_error_traces: int = 4096  # 记录出错 trace 的数量上限（同 trace 后续跨度全部保留）
+
+    # 缓冲：固定容量环形缓冲，满时丢弃最旧的跨度
+    max_buffer_spans: int = 10000
+    max_flush_spans: int = 1000  # 单次写库的最大跨度数
+
+    # OTLP JSON 导出（每次刷新追加一行 ExportTraceServiceRequest）
+    otlp_export_path: Optional[str] = None
+    service_name: str = "gradeos-backend"
+
+    @classmethod
+    def from_env(cls) -> "TracingConfig":
+        """从环境变量创建配置"""
+        config = cls()
+        config.sample_rate = _env_float("TRACING_SAMPLE_RATE", config.sample_rate)
+        config.max_buffer_spans = int(
+            _env_float("TRACING_BUFFER_SIZE", config.max_buffer_spans)
+        )
+        config.flush_interval_seconds = (
+            _env_float("TRACING_FLUSH_INTERVAL_MS", config.flush_interval_seconds * 1000) / 1000
+        )
+        config.alert_threshold_ms = int(
+            _env_float("TRACING_ALERT_THRESHOLD_MS", config.alert_threshold_ms)
+        )
+        config.otlp_export_path = os.getenv("TRACING_OTLP_EXPORT_PATH") or None
+        return config
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = os.getenv(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        logger.warning(f"无效的环境变量 {name}={raw!r}，使用默认值 {default}")
+        return default
+
+
+# OTLP SpanKind / StatusCode
+_OTLP_KIND = {
+    SpanKind.API: 2,  # SERVER
+    SpanKind.DATABASE: 3,  # CLIENT
+    SpanKind.CACHE: 3,
+    SpanKind.EXTERNAL_SERVICE: 3,
+}
+_OTLP_STATUS_OK = 1
+_OTLP_STATUS_ERROR = 2
+
+
+def _otlp_hex_id(value: str, length: int) -> str:
+    """将内部 ID 规范为 OTLP 要求的定长十六进制串"""
+    compact = value.replace("-", "").lower()
+    if len(compact) >= length and all(c in "0123456789abcdef" for c in compact[:length]):
+        return compact[:length]
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:length]
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, str):
+        return {"stringValue": value}
+    return {"stringValue": json.dumps(value, ensure_ascii=False, default=str)}
+
+
+def _unix_nanos(value: Optional[datetime]) -> str:
+    if value is None:
+        return "0"
+    return str(int(value.timestamp() * 1_000_000) * 1000)
+
+
+def span_to_otlp(span: TraceSpan) -> Dict[str, Any]:
+    """转换为 OTLP/JSON Span"""
+    attributes = [
+        {"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()
+    ]
+    attributes.append({"key": "gradeos.span_kind", "value": {"stringValue": span.kind.value}})
+    status: Dict[str, Any] = {
+        "code": _OTLP_STATUS_OK if span.status == SpanStatus.OK else _OTLP_STATUS_ERROR
+    }
+    if span.error_message:
+        status["message"] = span.error_message
+    otlp = {
+        "traceId": _otlp_hex_id(span.trace_id, 32),
+        "spanId": _otlp_hex_id(span.span_id, 16),
+        "name": span.name,
+        "kind": _OTLP_KIND.get(span.kind, 1),  # INTERNAL
+        "startTimeUnixNano": _unix_nanos(span.start_time),
+        "endTimeUnixNano": _unix_nanos(span.end_time),
+        "attributes": attributes,
+        "status": status,
+    }
+    if span.parent_span_id:
+        otlp["parentSpanId"] = _otlp_hex_id(span.parent_span_id, 16)
+    return otlp
+
+
+class OtlpJsonFileExporter:
+    """
+    OTLP JSON 文件导出器
+
+    每次导出追加一行 ExportTraceServiceRequest（JSON Lines），
+    可由 OpenTelemetry Collector 的 filelog / otlpjsonfile 接收器读取。
+    """
+
+    def __init__(self, path: str, service_name: str = "gradeos-backend"):
+        self.path = path
+        self.service_name = service_name
+
+    def build_request(self, spans: List[TraceSpan]) -> Dict[str, Any]:
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": self.service_name},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "gradeos.tracing"},
+                            "spans": [span_to_otlp(span) for span in spans],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def export(self, spans: List[TraceSpan]) -> int:
+        if not spans:
+            return 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(self.build_request(spans), ensure_ascii=False, default=str)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        return len(spans)
+
 
 class TracingService:
     """
@@ -158,9 +315,19 @@ class TracingService:
         self.config = config or TracingConfig()
         self.alert_callback = alert_callback
 
-        # 待持久化的 span 缓冲区
-        self._span_buffer: List[TraceSpan] = []
-        self._buffer_lock = asyncio.Lock()
+        # 待持久化的 span 环形缓冲区（满时丢弃最旧的）
+        self._span_buffer: Deque[TraceSpan] = deque(maxlen=max(1, self.config.max_buffer_spans))
+        self._flush_event = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+        # 出错的 trace（同一 trace 后续结束的跨度全部保留）
+        self._error_traces: "OrderedDict[str, None]" = OrderedDict()
+
+        self._exporter: Optional[OtlpJsonFileExporter] = None
+        if self.config.otlp_export_path:
+            self._exporter = OtlpJsonFileExporter(
+                self.config.otlp_export_path, service_name=self.config.service_name
+            )
 
         # 后台刷新任务
         self._flush_task: Optional[asyncio.Task] = None
@@ -169,7 +336,11 @@ class TracingService:
         # 统计信息
         self._stats = {
             "spans_created": 0,
+            "spans_recorded": 0,
+            "spans_sampled_out": 0,
+            "spans_dropped": 0,
             "spans_persisted": 0,
+            "spans_exported": 0,
             "alerts_triggered": 0,
             "persistence_errors": 0,
         }
@@ -177,7 +348,13 @@ class TracingService:
     @property
     def stats(self) -> Dict[str, int]:
         """获取统计信息"""
-        return self._stats.copy()
+        stats = self._stats.copy()
+        stats["buffered_spans"] = len(self._span_buffer)
+        return stats
+
+    @property
+    def _persistence_enabled(self) -> bool:
+        return self.config.enable_persistence or self._exporter is not None
 
     async def start(self) -> None:
         """启动追踪服务"""
@@ -186,7 +363,7 @@ class TracingService:
 
         self._running = True
 
-        if self.config.enable_persistence:
+        if self._persistence_enabled:
             self._flush_task = asyncio.create_task(self._flush_loop())
 
         logger.info("追踪服务已启动")
@@ -209,26 +386,43 @@ class TracingService:
         logger.info("追踪服务已停止")
 
     async def _flush_loop(self) -> None:
-        """后台刷新循环"""
+        """后台刷新循环：按间隔或缓冲达到 batch_size 时批量写出"""
         while self._running:
             try:
-                await asyncio.sleep(self.config.flush_interval_seconds)
+                try:
+                    await asyncio.wait_for(
+                        self._flush_event.wait(), timeout=self.config.flush_interval_seconds
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_event.clear()
                 await self._flush_buffer()
             except asyncio.CancelledError:
                 break
             except Exception as e:
                 logger.warning(f"刷新追踪数据时出错: {e}")
 
-    async def _flush_buffer(self) -> None:
-        """刷新缓冲区到数据库"""
-        async with self._buffer_lock:
-            if not self._span_buffer:
-                return
-
-            spans_to_persist = self._span_buffer.copy()
-            self._span_buffer.clear()
+    def _drain(self, limit: int) -> List[TraceSpan]:
+        """从缓冲区取出至多 limit 个跨度（无 await，事件循环内原子）"""
+        count = min(limit, len(self._span_buffer))
+        return [self._span_buffer.popleft() for _ in range(count)]
 
-        await self._persist_spans(spans_to_persist)
+    async def _flush_buffer(self) -> None:
+        """刷新缓冲区到数据库 / OTLP 文件"""
+        async with self._flush_lock:
+            while self._span_buffer:
+                spans = self._drain(max(1, self.config.max_flush_spans))
+                if self.config.enable_persistence:
+                    await self._persist_spans(spans)
+                if self._exporter is not None:
+                    await self._export_spans(spans)
+
+    async def _export_spans(self, spans: List[TraceSpan]) -> None:
+        try:
+            exported = await asyncio.to_thread(self._exporter.export, spans)
+            self._stats["spans_exported"] += exported
+        except Exception as e:
+            logger.warning(f"导出 OTLP 跨度失败: {e}")
 
     def generate_trace_id(self) -> str:
         """
@@ -335,16 +529,65 @@ class TracingService:
         if self.config.enable_alerts:
             await self.check_and_alert(span)
 
-        # 添加到缓冲区
-        if self.config.enable_persistence:
-            async with self._buffer_lock:
-                self._span_buffer.append(span)
+        self.record_span(span)
 
-                # 如果缓冲区满了，立即刷新
-                if len(self._span_buffer) >= self.config.batch_size:
-                    spans_to_persist = self._span_buffer.copy()
-                    self._span_buffer.clear()
-                    asyncio.create_task(self._persist_spans(spans_to_persist))
+    def is_trace_sampled(self, trace_id: str) -> bool:
+        """
+        头部采样：按 trace_id 哈希决定，同一 trace 的所有跨度结论一致
+        """
+        rate = self.config.sample_rate
+        if rate >= 1.0:
+            return True
+        if rate <= 0.0:
+            return False
+        digest = hashlib.blake2b(trace_id.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") / 2**64 < rate
+
+    def should_keep(self, span: TraceSpan) -> bool:
+        """
+        尾部决策：错误、慢跨度以及出错 trace 中的跨度始终保留，
+        其他跨度按头部采样结果
+        """
+        if span.status != SpanStatus.OK:
+            self._mark_error_trace(span.trace_id)
+            return True
+        slow_threshold = self.config.slow_span_threshold_ms
+        if slow_threshold is None:
+            slow_threshold = self.config.alert_threshold_ms
+        if span.duration_ms is not None and span.duration_ms >= slow_threshold:
+            return True
+        if span.trace_id in self._error_traces:
+            return True
+        return self.is_trace_sampled(span.trace_id)
+
+    def _mark_error_trace(self, trace_id: str) -> None:
+        self._error_traces[trace_id] = None
+        self._error_traces.move_to_end(trace_id)
+        while len(self._error_traces) > self.config.max_error_traces:
+            self._error_traces.popitem(last=False)
+
+    def record_span(self, span: TraceSpan) -> bool:
+        """
+        将已结束的跨度放入缓冲区（经过采样）
+
+        Returns:
+            是否被保留
+        """
+        if not self._persistence_enabled:
+            return False
+        if not self.should_keep(span):
+            self._stats["spans_sampled_out"] += 1
+            return False
+
+        if len(self._span_buffer) == self._span_buffer.maxlen:
+            self._stats["spans_dropped"] += 1
+        self._span_buffer.append(span)
+        self._stats["spans_recorded"] += 1
+
+        # 达到批量大小时提前唤醒刷新任务
+        if len(self._span_buffer) >= self.config.batch_size and not self._flush_event.is_set():
+            self._flush_event.set()
+        return True
 
     @asynccontextmanager
     async def trace_span(
@@ -426,10 +669,13 @@ class TracingService:
             return
 
         try:
+            from psycopg.types.json import Json
+
+            created_at = datetime.now(timezone.utc)
             async with self.pool_manager.pg_connection() as conn:
-                # 批量插入
-                for span in spans:
-                    await conn.execute(
+                # 单条语句批量插入（psycopg 3 executemany 走 pipeline 模式）
+                async with conn.cursor() as cur:
+                    await cur.executemany(
                         """
                         INSERT INTO trace_spans 
                         (trace_id, span_id, parent_span_id, kind, name,
@@ -442,19 +688,22 @@ class TracingService:
                             attributes = EXCLUDED.attributes,
                             status = EXCLUDED.status
                         """,
-                        (
-                            span.trace_id,
-                            span.span_id,
-                            span.parent_span_id,
-                            span.kind.value,
-                            span.name,
-                            span.start_time,
-                            span.end_time,
-                            span.duration_ms,
-                            span.attributes,
-                            span.status.value,
-                            datetime.now(timezone.utc),
-                        ),
+                        [
+                            (
+                                span.trace_id,
+                                span.span_id,
+                                span.parent_span_id,
+                                span.kind.value,
+                                span.name,
+                                span.start_time,
+                                span.end_time,
+                                span.duration_ms,
+                                Json(span.attributes),
+                                span.status.value,
+                                created_at,
+                            )
+                            for span in spans
+                        ],
                     )
 
             self._stats["spans_persisted"] += len(spans)
@@ -0,0 +1,137 @@
+"""
+流式 JSON 增量解析：在 LLM 输出过程中逐个取出 question_details 数组元素
+
+批改输出是数千 token 的单个 JSON，原流程要等流结束后才整体解析，
+截断时整份结果都会丢失。这里按字符扫描：
+- 在 <thinking> 块之外查找 "question_details": [（兼容 questionDetails），
+  之后跟踪字符串、转义与括号深度；
+- 数组中的每个对象在右花括号出现时立即解析并返回；
+- 一段输出中可以有多个数组（如 ---PAGE_BREAK--- 分隔的多页输出），依次处理；
+- 无法解析的元素跳过并计数，不影响后续元素；feed() 不会因输入格式抛出异常。
+"""
+
+import json
+import re
+from typing import Any, Callable, Dict, List, Optional
+
+_ARRAY_START_RE = re.compile(r'"(?:question_details|questionDetails)"\s*:\s*\[')
+_THINKING_OPEN_RE = re.compile(r"<thinking>", re.IGNORECASE)
+_THINKING_CLOSE_RE = re.compile(r"</thinking>", re.IGNORECASE)
+# 数组起始标记可能跨分片，未匹配时保留的尾部长度
+_SEARCH_TAIL = 64
+
+
+class QuestionDetailsStreamParser:
+    """
+    question_details 元素的增量解析器
+
+    feed(chunk) 返回本次新完成的题目对象；items 为累计结果（按输出顺序）。
+    loads 用于解析单个元素，默认 json.loads，可传入带修复的加载函数。
+    """
+
+    def __init__(self, loads: Optional[Callable[[str], Any]] = None) -> None:
+        self._loads = loads or json.loads
+        self._buf = ""
+        self._pos = 0
+        self._in_array = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._item_start: Optional[int] = None
+        self.items: List[Dict[str, Any]] = []
+        self.arrays_closed = 0
+        self.malformed = 0
+
+    @property
+    def in_item(self) -> bool:
+        """当前是否有未闭合的题目对象（流在此时结束即为截断）"""
+        return self._item_start is not None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        if not chunk:
+            return []
+        self._buf += chunk
+        completed: List[Dict[str, Any]] = []
+        while self._pos < len(self._buf):
+            if self._in_array:
+                self._scan_array(completed)
+            elif not self._seek_array():
+                break
+        self._compact()
+        return completed
+
+    def _seek_array(self) -> bool:
+        """定位下一个数组起点；返回 False 表示需要更多输入"""
+        match = _ARRAY_START_RE.search(self._buf, self._pos)
+        thinking = _THINKING_OPEN_RE.search(self._buf, self._pos)
+        if thinking is not None and (match is None or thinking.start() < match.start()):
+            close = _THINKING_CLOSE_RE.search(self._buf, thinking.end())
+            if close is None:
+                self._pos = thinking.start()
+                return False
+            self._pos = close.end()
+            return True
+        if match is None:
+            self._pos = max(self._pos, len(self._buf) - _SEARCH_TAIL)
+            return False
+        self._pos = match.end()
+        self._in_array = True
+        self._depth = 0
+        self._in_string = self._escape = False
+        self._item_start = None
+        return True
+
+    def _scan_array(self, completed: List[Dict[str, Any]]) -> None:
+        buf = self._buf
+        i = self._pos
+        end = len(buf)
+        while i < end:
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    if ch == "]":
+                        self._in_array = False
+                        self.arrays_closed += 1
+                        self._pos = i + 1
+                        return
+                    # 多余的右花括号：忽略
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._item_start is not None:
+                        self._emit(buf[self._item_start : i + 1], completed)
+                        self._item_start = None
+            i += 1
+        self._pos = i
+
+    def _emit(self, text: str, completed: List[Dict[str, Any]]) -> None:
+        try:
+            item = self._loads(text)
+        except Exception:
+            item = None
+        if isinstance(item, dict):
+            self.items.append(item)
+            completed.append(item)
+        else:
+            self.malformed += 1
+
+    def _compact(self) -> None:
+        """丢弃已扫描且不再需要的前缀"""
+        keep = self._pos if self._item_start is None else self._item_start
+        if keep > 4096:
+            self._buf = self._buf[keep:]
+            self._pos -= keep
+            if self._item_start is not None:
+                self._item_start -= keep
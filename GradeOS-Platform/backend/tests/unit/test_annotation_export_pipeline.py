@@ -0,0 +1,151 @@
+"""单元测试：批注并行渲染与流式 ZIP / PDF 导出"""
+
+import io
+import json
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import fitz
+import pytest
+from PIL import Image
+
+from src.services.annotation_export_pipeline import (
+    AnnotatedExportPipeline,
+    RenderedPageCache,
+)
+from src.services.export_service import AnnotatedImageExporter, ExportConfig
+
+
+def _page(seed: int, size=(320, 400)) -> bytes:
+    image = Image.new("RGB", size, (255 - seed % 50, 255, 255))
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+
+def _students(count: int, pages_per_student: int) -> list:
+    students = []
+    for i in range(count):
+        start = i * pages_per_student
+        students.append(
+            {
+                "studentName": f"student_{i}",
+                "startPage": start,
+                "endPage": start + pages_per_student - 1,
+                "questionResults": [
+                    {
+                        "questionId": "1",
+                        "score": i % 5,
+                        "maxScore": 5,
+                        "pageIndices": [start],
+                        "answerRegion": {"x_min": 0.1, "y_min": 0.1, "x_max": 0.6, "y_max": 0.3},
+                        "steps": [
+                            {
+                                "is_correct": bool(i % 2),
+                                "step_region": {
+                                    "x_min": 0.2,
+                                    "y_min": 0.4,
+                                    "x_max": 0.3,
+                                    "y_max": 0.5,
+                                },
+                            }
+                        ],
+                    }
+                ],
+            }
+        )
+    return students
+
+
+async def _collect(stream) -> bytes:
+    return b"".join([chunk async for chunk in stream])
+
+
+@pytest.mark.asyncio
+async def test_stream_zip_matches_sequential_exporter():
+    images = [_page(i) for i in range(6)]
+    students = _students(3, 2)
+    config = ExportConfig()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pipeline = AnnotatedExportPipeline(
+            config, executor=executor, cache=RenderedPageCache(), max_in_flight=3
+        )
+        data = await _collect(pipeline.stream_zip(students, images, "batch-1"))
+
+    expected = {}
+    exporter = AnnotatedImageExporter(config)
+    for student in students:
+        for page_idx, rendered in exporter.render_student_pages(
+            student, images, student["startPage"], student["endPage"]
+        ):
+            expected[f"{student['studentName']}/page_{page_idx + 1}.png"] = rendered
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        names = zf.namelist()
+        assert names[:-1] == list(expected)
+        for name, rendered in expected.items():
+            assert zf.read(name) == rendered
+        assert json.loads(zf.read("metadata.json"))["student_count"] == 3
+
+
+@pytest.mark.asyncio
+async def test_stream_pdf_is_valid_and_has_all_pages():
+    images = [_page(i) for i in range(4)]
+    students = _students(2, 2)
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pipeline = AnnotatedExportPipeline(executor=executor, cache=RenderedPageCache())
+        chunks = [chunk async for chunk in pipeline.stream_pdf(students, images)]
+
+    # 每页一个块，外加文件尾
+    assert len(chunks) == 5
+    with fitz.open(stream=b"".join(chunks), filetype="pdf") as doc:
+        assert doc.page_count == 4
+        assert doc[0].get_images()
+
+
+@pytest.mark.asyncio
+async def test_rendered_pages_are_cached_by_image_and_annotations():
+    images = [_page(i) for i in range(4)]
+    students = _students(2, 2)
+    cache = RenderedPageCache()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        pipeline = AnnotatedExportPipeline(executor=executor, cache=cache)
+        first = await _collect(pipeline.stream_zip(students, images, "b"))
+        assert cache.get_stats()["hits"] == 0
+
+        await _collect(pipeline.stream_zip(students, images, "b"))
+        assert cache.get_stats()["hits"] == 4
+
+        students[0]["questionResults"][0]["score"] = 4.5
+        await _collect(pipeline.stream_zip(students, images, "b"))
+        # 批注变化的页面重新渲染
+        assert cache.get_stats()["misses"] == 5
+
+    assert first
+
+
+def test_cache_evicts_by_byte_budget():
+    cache = RenderedPageCache(max_bytes=10)
+    cache.put(("a", "1"), b"12345")
+    cache.put(("b", "1"), b"12345")
+    cache.put(("c", "1"), b"123")
+    assert cache.get(("a", "1")) is None
+    assert cache.get(("c", "1")) == b"123"
+    assert cache.get_stats()["bytes"] <= 10
+
+
+@pytest.mark.asyncio
+async def test_process_pool_rendering():
+    images = [_page(i) for i in range(4)]
+    students = _students(2, 2)
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        pipeline = AnnotatedExportPipeline(executor=executor, cache=RenderedPageCache())
+        data = await _collect(pipeline.stream_zip(students, images, "b"))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert len(zf.namelist()) == 5
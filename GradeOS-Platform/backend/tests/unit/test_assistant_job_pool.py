@@ -0,0 +1,271 @@
+"""单元测试：辅助分析任务池（有界并发、批次进度、取消与重启恢复）"""
+
+import asyncio
+
+import pytest
+from starlette.websockets import WebSocketState
+
+from src.api.routes import assistant_grading as route
+from src.models.assistant_models import AnalyzeRequest, BatchAnalyzeRequest
+from src.services import assistant_job_pool
+from src.services.assistant_job_pool import (
+    AssistantJob,
+    AssistantJobPool,
+    InMemoryAssistantJobStore,
+    RedisAssistantJobStore,
+)
+
+
+class _StubResponse:
+    content = "{}"
+
+
+class _StubLLM:
+    """替代 UnifiedLLMClient：记录同时在途的调用数"""
+
+    in_flight = 0
+    max_in_flight = 0
+    calls = 0
+
+    def __init__(self, *_args, **_kwargs):
+        pass
+
+    async def complete(self, **_kwargs):
+        cls = type(self)
+        cls.calls += 1
+        cls.in_flight += 1
+        cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            return _StubResponse()
+        finally:
+            cls.in_flight -= 1
+
+    async def close(self):
+        return None
+
+
+class _FakeWebSocket:
+    client_state = WebSocketState.CONNECTED
+    application_state = WebSocketState.CONNECTED
+
+    def __init__(self):
+        self.messages = []
+
+    async def send_json(self, message):
+        self.messages.append(message)
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    _StubLLM.in_flight = _StubLLM.max_in_flight = _StubLLM.calls = 0
+    for module in (
+        "src.services.assistant_analyzer",
+        "src.services.error_detector",
+        "src.services.suggestion_generator",
+    ):
+        monkeypatch.setattr(f"{module}.UnifiedLLMClient", _StubLLM)
+    return _StubLLM
+
+
+@pytest.mark.asyncio
+async def test_batch_analysis_runs_with_bounded_concurrency(monkeypatch, stub_llm):
+    pool = AssistantJobPool(
+        route._run_assistant_job,
+        store=InMemoryAssistantJobStore(),
+        max_workers=3,
+        on_update=route._broadcast_job_update,
+    )
+    monkeypatch.setattr(assistant_job_pool, "_job_pool", pool)
+    request = BatchAnalyzeRequest(
+        analyses=[AnalyzeRequest(images=["aGVsbG8="], student_id=f"s{i}") for i in range(10)]
+    )
+
+    response = await route.batch_analyze_assignments(request, orchestrator=None)
+    socket = _FakeWebSocket()
+    monkeypatch.setitem(route.active_connections, response.batch_id, [socket])
+    await pool.join()
+
+    # 每个运行依次调用各 LLM 节点，同时在途的运行不超过 worker 数
+    assert stub_llm.calls >= 20
+    assert stub_llm.max_in_flight <= 3
+    assert pool.max_in_flight == 3
+    progress = pool.batch_progress(response.batch_id)
+    assert progress["completed"] == 10 and progress["finished"]
+    assert progress["percentage"] == 100.0
+    assert socket.messages[-1]["type"] == "batch_progress"
+    assert socket.messages[-1]["completed"] == 10
+
+
+@pytest.mark.asyncio
+async def test_cancel_batch_stops_running_and_queued_jobs():
+    started = []
+    release = asyncio.Event()
+
+    async def runner(job, report):
+        started.append(job.job_id)
+        await report("understand", 10.0)
+        await release.wait()
+
+    pool = AssistantJobPool(runner, max_workers=2)
+    await pool.submit([AssistantJob(job_id=f"j{i}", batch_id="b", payload={}) for i in range(5)])
+    while len(started) < 2:
+        await asyncio.sleep(0)
+
+    assert pool.batch_progress("b")["running"] == 2
+    assert await pool.cancel("b") == 5
+    await pool.join()
+
+    assert started == ["j0", "j1"]
+    assert pool.batch_progress("b")["cancelled"] == 5
+    assert await pool.cancel("b") == 0
+
+    # 取消后可按批次重新执行
+    release.set()
+    assert await pool.resume("b") == 5
+    await pool.join()
+    assert pool.batch_progress("b")["completed"] == 5
+
+
+@pytest.mark.asyncio
+async def test_unfinished_jobs_resume_after_restart():
+    store = InMemoryAssistantJobStore()
+    blocker = asyncio.Event()
+
+    async def blocked(job, report):
+        await blocker.wait()
+
+    first = AssistantJobPool(blocked, store=store, max_workers=1)
+    await first.submit([AssistantJob(job_id=f"j{i}", batch_id="b", payload={}) for i in range(3)])
+    while first.in_flight < 1:
+        await asyncio.sleep(0)
+    await first.shutdown()
+    assert (await store.get("j0")).status == "running"
+
+    attempts = {}
+
+    async def runner(job, report):
+        attempts[job.job_id] = job.attempts
+        if job.job_id == "j2":
+            raise RuntimeError("upstream 500")
+
+    second = AssistantJobPool(runner, store=store, max_workers=2)
+    assert await second.resume() == 3
+    await second.join()
+
+    # j0 在上次进程中已开始执行，本次为第二次尝试（从检查点继续）
+    assert attempts == {"j0": 2, "j1": 1, "j2": 1}
+    assert [(await store.get(f"j{i}")).status for i in range(3)] == [
+        "completed",
+        "completed",
+        "failed",
+    ]
+    assert await store.pending_ids() == []
+    assert await second.resume() == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_store_round_trip():
+    fakeredis = pytest.importorskip("fakeredis")
+    # RedisAssistantJobStore 用 Lua 脚本做原子更新，fakeredis 需要 lupa 才能执行
+    pytest.importorskip("lupa")
+    store = RedisAssistantJobStore(fakeredis.FakeAsyncRedis())
+    await store.add_jobs(
+        [
+            AssistantJob(job_id=f"j{i}", batch_id="b", payload={"images": ["x"], "subject": "数学"})
+            for i in range(2)
+        ]
+    )
+    await store.update("j0", status="running", stage="understand", percentage=25.0)
+    await store.update("j1", status="completed")
+
+    job = await store.get("j0")
+    assert (job.status, job.stage, job.percentage, job.payload["subject"]) == (
+        "running",
+        "understand",
+        25.0,
+        "数学",
+    )
+    assert [j.job_id for j in await store.batch_jobs("b")] == ["j0", "j1"]
+    assert await store.pending_ids() == ["j0"]
+    assert await store.claim("j0", "a") and not await store.claim("j0", "b")
+    await store.release("j0", "b")
+    assert not await store.claim("j0", "b")
+    assert await store.renew("j0", "a") and not await store.renew("j0", "b")
+    await store.release("j0", "a")
+    assert await store.claim("j0", "b")
+
+    # 终态只写一次：已完成的任务不会被改写
+    assert not await store.transition("j1", status="cancelled")
+    assert await store.transition("j0", status="cancelled", stage="cancelled")
+    assert not await store.transition("j0", status="completed")
+    assert (await store.get("j0")).status == "cancelled"
+    assert await store.pending_ids() == []
+
+
+def _shared_redis_store():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    return RedisAssistantJobStore(fakeredis.FakeAsyncRedis())
+
+
+async def _wait_for(predicate, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await predicate():
+        assert asyncio.get_running_loop().time() < deadline
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_cancel_from_another_instance_stops_running_job():
+    store = _shared_redis_store()
+    started = asyncio.Event()
+    finished = []
+
+    async def runner(job, report):
+        started.set()
+        try:
+            await asyncio.sleep(10)
+        finally:
+            finished.append(job.job_id)
+
+    owner = AssistantJobPool(runner, store=store, max_workers=1, heartbeat_seconds=0.01)
+    other = AssistantJobPool(runner, store=store, max_workers=1, heartbeat_seconds=0.01)
+    await owner.submit([AssistantJob(job_id="j0", batch_id="b", payload={})])
+    await asyncio.wait_for(started.wait(), timeout=2)
+
+    assert await other.cancel("b") == 1
+    await asyncio.wait_for(owner.join(), timeout=2)
+
+    assert finished == ["j0"]
+    assert (await store.get("j0")).status == "cancelled"
+    assert owner.batch_progress("b")["cancelled"] == 1
+    await owner.shutdown()
+    await other.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_job_leased_elsewhere_is_retried_after_lease_frees():
+    store = _shared_redis_store()
+    ran = []
+
+    async def runner(job, report):
+        ran.append(job.job_id)
+
+    await store.add_jobs([AssistantJob(job_id="j0", batch_id="b", payload={})])
+    assert await store.claim("j0", "crashed-instance")
+
+    pool = AssistantJobPool(runner, store=store, max_workers=1, claim_retry_seconds=0.01)
+    assert await pool.resume() == 1
+    await pool.join()
+    await asyncio.sleep(0.05)
+    assert ran == []
+
+    await store.release("j0", "crashed-instance")
+
+    async def completed():
+        return (await store.get("j0")).status == "completed"
+
+    await _wait_for(completed)
+    assert ran == ["j0"]
+    await pool.shutdown()
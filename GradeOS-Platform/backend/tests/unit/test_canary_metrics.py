@@ -0,0 +1,258 @@
+"""单元测试：灰度指标聚合、显著性比较与自动回滚"""
+
+import random
+from contextlib import asynccontextmanager
+
+import fakeredis
+import pytest
+
+from src.models.grading_log import GradingLog
+from src.models.rule_patch import PatchStatus, PatchType, RulePatch
+from src.services import grading_logger as grading_logger_module
+from src.services.canary_metrics import (
+    CANARY,
+    CONTROL,
+    CanaryMetricsAggregator,
+    InMemoryCanaryMetricsStore,
+    RedisCanaryMetricsStore,
+    two_proportion_z_test,
+)
+from src.services.grading_logger import GradingLogger
+from src.services.patch_deployer import PatchDeployer
+from src.services.patch_resolution import PatchResolver
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _patch(version="v2.0.0"):
+    return RulePatch(
+        patch_id="patch-1",
+        patch_type=PatchType.RULE,
+        version=version,
+        description="test patch",
+        content={"rule": "x"},
+        source_pattern_id="pattern-1",
+    )
+
+
+@pytest.fixture
+def deployer_factory(monkeypatch):
+    status_updates = []
+
+    async def fake_update(self, patch_id, status, **kwargs):
+        status_updates.append((patch_id, status))
+
+    monkeypatch.setattr(PatchDeployer, "_update_patch_status", fake_update)
+
+    def factory(metrics, **kwargs):
+        deployer = PatchDeployer(
+            metrics=metrics,
+            min_samples_per_arm=200,
+            patch_resolver=PatchResolver(metrics=metrics),
+            **kwargs,
+        )
+        deployer.status_updates = status_updates
+        return deployer
+
+    return factory
+
+
+async def _drive_traffic(metrics, version, n, error_rate, control_error_rate, seed=7):
+    """合成流量：一半走灰度补丁，一半走对照；按给定比例产生“分数被调低”的改判"""
+    rng = random.Random(seed)
+    for i in range(n):
+        canary = i % 2 == 0
+        patch_version = version if canary else None
+        await metrics.record_result(patch_version, needs_review=rng.random() < 0.1)
+        if rng.random() < (error_rate if canary else control_error_rate):
+            await metrics.record_override(patch_version, original_score=5.0, override_score=3.0)
+
+
+def test_two_proportion_z_test():
+    z, p_value = two_proportion_z_test(60, 400, 20, 400)
+    assert z > 4 and p_value < 1e-4
+    z, p_value = two_proportion_z_test(20, 400, 20, 400)
+    assert z == 0 and p_value == pytest.approx(0.5)
+    assert two_proportion_z_test(0, 0, 5, 10) == (0.0, 1.0)
+
+
+@pytest.mark.asyncio
+async def test_results_are_split_into_arms_and_rolled_off_by_window():
+    clock = FakeClock()
+    metrics = CanaryMetricsAggregator(
+        store=InMemoryCanaryMetricsStore(), bucket_seconds=60, window_seconds=300, clock=clock
+    )
+    await metrics.record_result(None)
+    metrics.register_deployment("d1", "v2")
+
+    await metrics.record_results([("v2", True), ("v2", False), (None, False), ("v1", True)])
+    await metrics.record_override("v2", 5.0, 3.0)
+    await metrics.record_override(None, 2.0, 4.0)
+
+    canary = await metrics.get_metrics("d1", CANARY)
+    control = await metrics.get_metrics("d1", CONTROL)
+    overall = await metrics.get_metrics()
+    assert (canary.graded, canary.reviews, canary.errors, canary.overrides) == (2, 1, 1, 1)
+    assert (control.graded, control.reviews, control.misses) == (2, 1, 1)
+    assert overall.graded == 5
+
+    clock.now += 301
+    assert (await metrics.get_metrics("d1", CANARY)).graded == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_store_shares_counts_between_aggregators():
+    redis_client = fakeredis.FakeAsyncRedis()
+    clock = FakeClock()
+    writer = CanaryMetricsAggregator(store=RedisCanaryMetricsStore(redis_client), clock=clock)
+    reader = CanaryMetricsAggregator(store=RedisCanaryMetricsStore(redis_client), clock=clock)
+    writer.register_deployment("d1", "v2")
+
+    await writer.record_results([("v2", False)] * 30 + [(None, True)] * 10)
+    await writer.record_override("v2", 4.0, 1.0)
+
+    comparison = await reader.compare("d1")
+    assert comparison.canary.graded == 30
+    assert comparison.canary.errors == 1
+    assert comparison.control.reviews == 10
+    assert comparison.p_values["review_rate"] == pytest.approx(1.0, abs=1e-6)
+
+
+@pytest.mark.asyncio
+async def test_regressing_canary_is_rolled_back_automatically(deployer_factory):
+    metrics = CanaryMetricsAggregator(clock=FakeClock())
+    deployer = deployer_factory(metrics)
+    deployment_id = await deployer.deploy_canary(_patch(), traffic_percentage=0.5)
+
+    await _drive_traffic(metrics, "v2.0.0", 1200, error_rate=0.12, control_error_rate=0.03)
+    assert await deployer.monitor_active_deployments() == 1
+
+    assert deployment_id not in deployer._active_deployments
+    assert deployment_id not in metrics.active_deployments
+    assert ("patch-1", PatchStatus.ROLLED_BACK) in deployer.status_updates
+
+
+@pytest.mark.asyncio
+async def test_monitor_uses_shared_deployment_snapshot(deployer_factory):
+    redis_client = fakeredis.FakeAsyncRedis()
+    metrics = CanaryMetricsAggregator(clock=FakeClock())
+    publisher = deployer_factory(metrics)
+    publisher.patch_resolver = PatchResolver(redis_client=redis_client, metrics=metrics)
+    deployment_id = await publisher.deploy_canary(_patch(), traffic_percentage=0.5)
+
+    # 监控任务运行在另一个进程：本地没有部署记录，只能读共享快照
+    monitor = deployer_factory(metrics)
+    monitor.patch_resolver = PatchResolver(redis_client=redis_client, metrics=metrics)
+    assert monitor._active_deployments == {}
+
+    await _drive_traffic(metrics, "v2.0.0", 1200, error_rate=0.12, control_error_rate=0.03)
+    assert await monitor.monitor_active_deployments() == 1
+
+    assert await redis_client.hgetall(monitor.patch_resolver.key) == {}
+    assert ("patch-1", PatchStatus.ROLLED_BACK) in monitor.status_updates
+    assert await publisher.monitor_active_deployments() == 0
+    assert deployment_id not in publisher._active_deployments
+
+
+@pytest.mark.asyncio
+async def test_healthy_canary_is_kept(deployer_factory):
+    metrics = CanaryMetricsAggregator(clock=FakeClock())
+    deployer = deployer_factory(metrics)
+    deployment_id = await deployer.deploy_canary(_patch(), traffic_percentage=0.5)
+
+    await _drive_traffic(metrics, "v2.0.0", 1200, error_rate=0.04, control_error_rate=0.04)
+    result = await deployer.monitor_deployment(deployment_id)
+
+    assert result["status"] == "healthy"
+    assert result["action_taken"] == "none"
+    assert result["metrics"]["samples"] == 600
+    assert result["baseline_metrics"]["samples"] == 600
+    assert deployment_id in deployer._active_deployments
+
+
+@pytest.mark.asyncio
+async def test_small_samples_do_not_trigger_rollback(deployer_factory):
+    metrics = CanaryMetricsAggregator(clock=FakeClock())
+    deployer = deployer_factory(metrics)
+    deployment_id = await deployer.deploy_canary(_patch(), traffic_percentage=0.5)
+
+    # 极端但样本很少：不下结论
+    await _drive_traffic(metrics, "v2.0.0", 20, error_rate=1.0, control_error_rate=0.0)
+    result = await deployer.monitor_deployment(deployment_id)
+
+    assert result["status"] == "collecting"
+    assert result["action_taken"] == "none"
+    assert deployment_id in deployer._active_deployments
+
+
+class OverrideDb:
+    """模拟 grading_logs：批量写入与改判 UPDATE ... RETURNING"""
+
+    def __init__(self):
+        self.rows = {}
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield self
+
+    def cursor(self):
+        db = self
+
+        class Cursor:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            async def executemany(self, query, rows):
+                for row in rows:
+                    db.rows[row[0]] = {"score": row[10], "patch_version": row[15]}
+
+        return Cursor()
+
+    async def execute(self, query, params):
+        row = self.rows.get(params["log_id"])
+
+        class Result:
+            async def fetchone(self):
+                return None if row is None else (row["score"], row["patch_version"])
+
+        return Result()
+
+
+@pytest.mark.asyncio
+async def test_grading_logger_feeds_results_and_overrides(monkeypatch):
+    monkeypatch.setattr(grading_logger_module, "db", OverrideDb())
+    metrics = CanaryMetricsAggregator(clock=FakeClock())
+    metrics.register_deployment("d1", "v2")
+    grading_logger = GradingLogger(batch_size=10, flush_interval_ms=10, metrics=metrics)
+
+    logs = [
+        GradingLog(
+            submission_id=f"s{i}",
+            question_id="q1",
+            score=4.0,
+            confidence=0.5 if i % 2 else 0.95,
+            patch_version="v2" if i < 6 else None,
+        )
+        for i in range(10)
+    ]
+    for log in logs:
+        await grading_logger.log_grading(log)
+    await grading_logger.stop()
+
+    assert await grading_logger.log_override(logs[0].log_id, 2.0, "too generous", "t1")
+    assert await grading_logger.log_override(logs[7].log_id, 5.0, "missed step", "t1")
+    assert not await grading_logger.log_override("missing", 1.0, "x", "t1")
+
+    canary = await metrics.get_metrics("d1", CANARY)
+    control = await metrics.get_metrics("d1", CONTROL)
+    assert (canary.graded, canary.reviews, canary.errors, canary.overrides) == (6, 3, 1, 1)
+    assert (control.graded, control.reviews, control.misses, control.overrides) == (4, 2, 1, 1)
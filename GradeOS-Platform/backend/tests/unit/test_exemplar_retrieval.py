@@ -0,0 +1,341 @@
+"""单元测试：基于嵌入的判例检索、查询向量缓存与批量使用计数"""
+
+import io
+import json
+import math
+import random
+from contextlib import asynccontextmanager
+
+import pytest
+from PIL import Image
+
+from src.services import llm_reasoning
+from src.services.embedding_provider import CachedEmbeddingProvider, HashingEmbedder
+from src.services.exemplar_memory import ExemplarMemory
+from src.services.llm_reasoning import LLMReasoningClient
+
+
+def _parse_vector(value: str) -> list:
+    return [float(x) for x in value.strip("[]").split(",")]
+
+
+def _cosine_distance(a: list, b: list) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return 1 - dot / norm if norm else 1.0
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def fetchall(self):
+        return self.rows
+
+    async def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class FakeExemplarConn:
+    """模拟 psycopg AsyncConnection 上的 exemplars 表：插入、余弦近邻查询和 unnest 批量更新"""
+
+    def __init__(self):
+        self.rows = {}
+        self.executed = []
+        self.fetch_calls = 0
+
+    async def execute(self, query, params=None):
+        # 与 psycopg 一致：参数整体传入，占位符为 %s / %(name)s
+        assert "$" not in query
+        if isinstance(params, dict):
+            for name in params:
+                assert f"%({name})s" in query
+        else:
+            params = tuple(params or ())
+            assert query.count("%s") == len(params)
+
+        if query.lstrip().startswith("SELECT"):
+            self.fetch_calls += 1
+            return FakeCursor(self._select(query, params))
+
+        self.executed.append((query, params))
+        if "INSERT INTO exemplars" in query:
+            (exemplar_id, qtype, qhash, answer, score, max_score,
+             feedback, teacher_id, confirmed_at, usage_count) = params[:10]
+            self.rows[exemplar_id] = {
+                "exemplar_id": exemplar_id,
+                "question_type": qtype,
+                "question_image_hash": qhash,
+                "student_answer_text": answer,
+                "score": score,
+                "max_score": max_score,
+                "teacher_feedback": feedback,
+                "teacher_id": teacher_id,
+                "confirmed_at": confirmed_at,
+                "usage_count": usage_count,
+                "embedding": _parse_vector(params[10]) if len(params) > 10 else None,
+            }
+        elif "unnest" in query:
+            for exemplar_id, delta in zip(*params):
+                self.rows[exemplar_id]["usage_count"] += delta
+        return FakeCursor([])
+
+    def _select(self, query, params):
+        if "<=>" in query:
+            query_vec = _parse_vector(params["query"])
+            scored = sorted(
+                (
+                    (_cosine_distance(row["embedding"], query_vec), row)
+                    for row in self.rows.values()
+                    if row["question_type"] == params["question_type"]
+                    and row["embedding"] is not None
+                ),
+                key=lambda item: item[0],
+            )[: params["candidates"]]
+            return [
+                dict(row, similarity=1 - distance / 2)
+                for distance, row in scored
+                if 1 - distance / 2 >= params["min_similarity"]
+            ][: params["top_k"]]
+
+        qtype, qhash, top_k = params
+        matched = [
+            row
+            for row in self.rows.values()
+            if row["question_type"] == qtype and row["question_image_hash"] == qhash
+        ]
+        matched.sort(key=lambda row: row["usage_count"], reverse=True)
+        return matched[:top_k]
+
+
+class FakePoolManager:
+    def __init__(self, conn):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def pg_connection(self):
+        yield self.conn
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self, dimensions=256):
+        super().__init__(dimensions)
+        self.calls = 0
+
+    async def aembed_query(self, text):
+        self.calls += 1
+        return await super().aembed_query(text)
+
+
+TOPICS = {
+    "momentum": ["momentum", "collision", "impulse", "velocity", "mass", "conserved"],
+    "circuit": ["resistor", "current", "voltage", "ohm", "series", "parallel"],
+    "optics": ["lens", "focal", "refraction", "image", "mirror", "ray"],
+    "thermo": ["entropy", "heat", "temperature", "engine", "work", "gas"],
+    "waves": ["frequency", "wavelength", "amplitude", "interference", "phase", "node"],
+}
+
+
+def _answer(rng: random.Random, topic: str) -> str:
+    words = rng.sample(TOPICS[topic], 4) + rng.sample(["the", "so", "then", "because"], 2)
+    rng.shuffle(words)
+    return " ".join(words)
+
+
+async def _build_corpus(memory: ExemplarMemory, per_topic: int, rng: random.Random) -> None:
+    for topic in TOPICS:
+        for i in range(per_topic):
+            await memory.store_exemplar(
+                grading_result={
+                    "question_type": "stepwise",
+                    "question_image_hash": f"{topic}-{i}",
+                    "question_text": f"{topic} problem",
+                    "student_answer_text": _answer(rng, topic),
+                    "score": 5,
+                    "max_score": 10,
+                },
+                teacher_id="teacher-1",
+                teacher_feedback=f"{topic} reasoning",
+            )
+
+
+@pytest.mark.asyncio
+async def test_recall_at_k_on_topic_corpus():
+    rng = random.Random(7)
+    conn = FakeExemplarConn()
+    memory = ExemplarMemory(
+        pool_manager=FakePoolManager(conn), embedding_model=HashingEmbedder(256)
+    )
+    await _build_corpus(memory, per_topic=20, rng=rng)
+
+    hits = 0
+    total = 0
+    for topic in TOPICS:
+        for _ in range(5):
+            results = await memory.retrieve_similar(
+                question_image_hash="unseen",
+                question_type="stepwise",
+                top_k=5,
+                min_similarity=0.0,
+                question_text=f"{topic} problem",
+                student_answer_summary=_answer(rng, topic),
+            )
+            total += 5
+            hits += sum(1 for e in results if e.question_image_hash.startswith(topic))
+
+    assert hits / total >= 0.9
+
+
+@pytest.mark.asyncio
+async def test_query_embeddings_are_cached_by_content():
+    conn = FakeExemplarConn()
+    embedder = CountingEmbedder()
+    memory = ExemplarMemory(pool_manager=FakePoolManager(conn), embedding_model=embedder)
+    assert isinstance(memory.query_embedder, CachedEmbeddingProvider)
+
+    for _ in range(3):
+        await memory.retrieve_similar(
+            "hash", "essay", question_text="describe entropy", min_similarity=0.0
+        )
+    await memory.retrieve_similar(
+        "hash", "essay", question_text="describe momentum", min_similarity=0.0
+    )
+
+    assert embedder.calls == 2
+    assert memory.query_embedder.get_stats()["hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_usage_counts_updated_in_single_statement():
+    rng = random.Random(3)
+    conn = FakeExemplarConn()
+    memory = ExemplarMemory(
+        pool_manager=FakePoolManager(conn), embedding_model=HashingEmbedder(256)
+    )
+    await _build_corpus(memory, per_topic=4, rng=rng)
+    conn.executed.clear()
+
+    results = await memory.retrieve_similar(
+        "unseen",
+        "stepwise",
+        top_k=5,
+        min_similarity=0.0,
+        question_text="optics problem",
+        student_answer_summary="lens focal image",
+    )
+
+    assert len(results) == 5
+    assert len(conn.executed) == 1
+    query, (ids, deltas) = conn.executed[0]
+    assert "unnest" in query
+    assert sorted(ids) == sorted(e.exemplar_id for e in results)
+    assert deltas == [1] * 5
+    assert all(conn.rows[e.exemplar_id]["usage_count"] == 1 for e in results)
+
+
+@pytest.mark.asyncio
+async def test_retrieval_without_text_matches_image_hash():
+    rng = random.Random(5)
+    conn = FakeExemplarConn()
+    embedder = CountingEmbedder()
+    memory = ExemplarMemory(pool_manager=FakePoolManager(conn), embedding_model=embedder)
+    await _build_corpus(memory, per_topic=2, rng=rng)
+    embedder.calls = 0
+
+    results = await memory.retrieve_similar("circuit-1", "stepwise")
+
+    assert [e.question_image_hash for e in results] == ["circuit-1"]
+    assert embedder.calls == 0
+
+
+RUBRIC = {
+    "total_score": 20,
+    "questions": [
+        {
+            "question_id": "1",
+            "question_type": "stepwise",
+            "max_score": 10,
+            "question_text": "optics problem",
+            "scoring_points": [{"point_id": "1.1", "description": "lens focal image"}],
+        },
+        {
+            "question_id": "2",
+            "max_score": 10,
+            "question_text": "circuit problem",
+            "scoring_points": [{"point_id": "2.1", "description": "ohm law"}],
+        },
+    ],
+}
+
+
+@pytest.mark.asyncio
+async def test_rubric_retrieval_is_per_question_and_cached():
+    rng = random.Random(11)
+    conn = FakeExemplarConn()
+    memory = ExemplarMemory(
+        pool_manager=FakePoolManager(conn), embedding_model=HashingEmbedder(256)
+    )
+    await _build_corpus(memory, per_topic=3, rng=rng)
+
+    by_question = await memory.retrieve_for_rubric(RUBRIC, top_k=2, min_similarity=0.0)
+    # 第 2 题没有题型，不检索
+    assert list(by_question) == ["1"]
+    assert [e.question_image_hash.split("-")[0] for e in by_question["1"]] == ["optics"] * 2
+
+    fetches = conn.fetch_calls
+    assert await memory.retrieve_for_rubric(RUBRIC, top_k=2, min_similarity=0.0) == by_question
+    assert conn.fetch_calls == fetches
+
+
+class _PromptRecorder:
+    def __init__(self):
+        self.prompts = []
+
+    async def astream(self, messages):
+        self.prompts.append(messages[0].content[0]["text"])
+
+        class Chunk:
+            content = json.dumps({"question_details": []})
+
+        yield Chunk()
+
+
+@pytest.mark.asyncio
+async def test_grade_student_prompt_includes_retrieved_exemplars(monkeypatch):
+    llm = _PromptRecorder()
+    monkeypatch.setattr(llm_reasoning, "get_chat_model", lambda **kwargs: llm)
+    monkeypatch.setattr(llm_reasoning, "find_blank_pages", lambda images: [])
+
+    class StubMemory:
+        async def retrieve_for_rubric(self, parsed_rubric, top_k=3, min_similarity=0.7):
+            conn = FakeExemplarConn()
+            memory = ExemplarMemory(
+                pool_manager=FakePoolManager(conn), embedding_model=HashingEmbedder(64)
+            )
+            await memory.store_exemplar(
+                {
+                    "question_type": "stepwise",
+                    "question_image_hash": "h",
+                    "student_answer_text": "f = 20cm, image is real",
+                    "score": 8,
+                    "max_score": 10,
+                },
+                teacher_id="teacher-1",
+                teacher_feedback="missing sign convention",
+            )
+            return {"1": await memory.retrieve_similar("h", "stepwise")}
+
+    buffer = io.BytesIO()
+    Image.new("L", (64, 64), 255).save(buffer, format="PNG")
+    client = LLMReasoningClient(api_key="k", model_name="stub/model", exemplar_memory=StubMemory())
+    await client.grade_student([buffer.getvalue()], "s1", RUBRIC)
+
+    prompt = llm.prompts[0]
+    assert "## 参考判例" in prompt
+    assert "f = 20cm, image is real" in prompt and "missing sign convention" in prompt
+
+    llm.prompts.clear()
+    await LLMReasoningClient(api_key="k", model_name="stub/model").grade_student(
+        [buffer.getvalue()], "s1", RUBRIC
+    )
+    assert "## 参考判例" not in llm.prompts[0]
@@ -0,0 +1,232 @@
+"""单元测试：批改模型级联（按题升级、定位页面重批、运行级预算与分档指标）"""
+
+import asyncio
+import io
+import json
+import re
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from src.services import grading_cascade, llm_reasoning
+from src.services.grading_cascade import (
+    TIER_FAST,
+    TIER_STRONG,
+    CascadeMetrics,
+    CascadeRunBudget,
+    build_grading_cascade,
+    plan_escalation,
+    question_confidence,
+)
+from src.services.llm_reasoning import LLMReasoningClient
+
+FAST, STRONG = "stub/fast-tier", "stub/strong-tier"
+
+RUBRIC = {
+    "total_score": 11,
+    "questions": [
+        {"question_id": "1", "max_score": 3,
+         "scoring_points": [{"point_id": "1.1", "description": "结论", "score": 3}]},
+        {"question_id": "2", "max_score": 4,
+         "scoring_points": [{"point_id": "2.1", "description": "方法", "score": 4}]},
+        {"question_id": "3", "max_score": 4,
+         "scoring_points": [{"point_id": "3.1", "description": "计算", "score": 2},
+                            {"point_id": "3.2", "description": "答案", "score": 2}]},
+    ],
+}
+
+
+def _point(pid, awarded, max_points, reference=True):
+    return {
+        "point_id": pid,
+        "awarded": awarded,
+        "max_points": max_points,
+        "evidence": f"学生写出了 {pid} 对应步骤",
+        "rubric_reference": f"[{pid}]" if reference else "",
+    }
+
+
+def _fast_details():
+    return [
+        # 置信度高、得分点有引用：保留快速档结果
+        {"question_id": "1", "score": 3, "max_score": 3, "confidence": 0.95,
+         "source_pages": [10], "scoring_point_results": [_point("1.1", 3, 3)]},
+        # 模型自报置信度低
+        {"question_id": "2", "score": 1, "max_score": 4, "confidence": 0.4,
+         "source_pages": [11], "scoring_point_results": [_point("2.1", 1, 4)]},
+        # 得分点累加与题目得分不符（规则检查 error）
+        {"question_id": "3", "score": 4, "max_score": 4, "confidence": 0.9,
+         "source_pages": [12],
+         "scoring_point_results": [_point("3.1", 2, 2), _point("3.2", 0, 2)]},
+    ]
+
+
+def test_plan_escalation_prefers_rule_hits_then_low_confidence():
+    details = _fast_details()
+    plan = plan_escalation(details, threshold=0.65, max_ratio=1.0)
+    assert [(c.question_id, c.reasons) for c in plan] == [
+        ("3", ["point_sum_mismatch"]),
+        ("2", ["low_confidence"]),
+    ]
+    assert [c.question_id for c in plan_escalation(details, threshold=0.65, max_ratio=0.2)] == ["3"]
+    assert plan_escalation(details, threshold=0.65, max_ratio=0.0) == []
+
+
+def test_question_confidence_uses_point_citations():
+    detail = {"confidence": 0.95, "scoring_point_results": [_point("1.1", 3, 3)]}
+    assert question_confidence(detail) == pytest.approx(0.9)
+    # 无评分标准引用的得分点置信度不超过 0.7
+    detail["scoring_point_results"] = [_point("1.1", 3, 3, reference=False)]
+    assert question_confidence(detail) == pytest.approx(0.7)
+    assert plan_escalation([{"question_id": "1", **detail}], threshold=0.75, max_ratio=1.0)
+
+
+def test_run_budget_accrues_per_page_and_is_shared_by_run():
+    budget = CascadeRunBudget(max_runs=2)
+    budget.accrue("run-a", 0.005)
+    assert budget.reserve("run-a", 3, 0.002) == 2
+    assert budget.reserve("run-a", 1, 0.002) == 0
+    assert budget.reserve("run-b", 1, 0.002) == 0
+    assert budget.reserve("run-b", 4, 0.0) == 4
+    budget.accrue("run-c", 1.0)
+    # 只保留最近的运行账目
+    assert budget.snapshot("run-a") == {"accrued_usd": 0.0, "spent_usd": 0.0}
+
+
+class _Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class _TierLLM:
+    """按模型档返回确定结果；记录每次调用的题目与图片数"""
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.calls = []
+
+    async def astream(self, messages):
+        parts = messages[0].content
+        prompt = parts[0]["text"]
+        images = sum(1 for p in parts if p.get("type") == "image_url")
+        await asyncio.sleep(0)
+        if "Grade ONLY the following questions" in prompt:
+            asked = re.search(r"questions for [^:]+: ([^\n]+)\.", prompt).group(1).split(", ")
+            self.calls.append(("regrade", asked, images))
+            regraded = {
+                "2": {"question_id": "2", "score": 2, "max_score": 4, "confidence": 0.9,
+                      "scoring_point_results": [_point("2.1", 2, 4)]},
+                "3": {"question_id": "3", "score": 2, "max_score": 4, "confidence": 0.9,
+                      "scoring_point_results": [_point("3.1", 2, 2), _point("3.2", 0, 2)]},
+            }
+            payload = {"question_details": [regraded[q] for q in asked if q in regraded]}
+        else:
+            self.calls.append(("grade", None, images))
+            payload = {"question_details": _fast_details()}
+        yield _Chunk(json.dumps(payload, ensure_ascii=False))
+
+
+def _answered_page(seed):
+    rng = np.random.default_rng(seed)
+    page = Image.new("L", (2480, 3508), 244)
+    draw = ImageDraw.Draw(page)
+    for y in range(300, 3300, 120):
+        draw.line([(160, y), (2320, y)], fill=120, width=4)
+    for _ in range(30):
+        points = [(int(rng.integers(300, 2100)), int(rng.integers(600, 1800)))]
+        for _ in range(6):
+            x, y = points[-1]
+            points.append((x + int(rng.integers(-60, 60)), y + int(rng.integers(-60, 60))))
+        draw.line(points, fill=40, width=8)
+    buffer = io.BytesIO()
+    page.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def tiers(monkeypatch):
+    llms = {FAST: _TierLLM(FAST), STRONG: _TierLLM(STRONG)}
+    # 其他用例并发 patch 可能遗留 Mock，这里固定为真实客户端
+    monkeypatch.setattr(llm_reasoning, "LLMReasoningClient", LLMReasoningClient)
+    monkeypatch.setattr(
+        llm_reasoning, "get_chat_model", lambda **kwargs: llms[kwargs["model_name"]]
+    )
+    monkeypatch.setattr(grading_cascade, "GRADING_FAST_MODEL", FAST)
+    return llms
+
+
+PAGES = [10, 11, 12]
+CONTEXTS = {page: {"question_numbers": [str(i + 1)]} for i, page in enumerate(PAGES)}
+
+
+def _cascade(page_budget_usd, cost_per_question_usd, metrics, budget):
+    strong = LLMReasoningClient(api_key="k", model_name=STRONG)
+    cascade = build_grading_cascade(
+        strong,
+        api_key="k",
+        run_id="run-1",
+        threshold=0.65,
+        max_ratio=1.0,
+        page_budget_usd=page_budget_usd,
+        cost_per_question_usd=cost_per_question_usd,
+    )
+    cascade.metrics, cascade.budget = metrics, budget
+    return cascade
+
+
+@pytest.mark.asyncio
+async def test_cascade_escalates_only_flagged_questions_with_their_pages(tiers):
+    metrics = CascadeMetrics()
+    cascade = _cascade(0.01, 0.001, metrics, CascadeRunBudget())
+    images = [_answered_page(seed) for seed in range(3)]
+
+    result = await cascade.grade_student(
+        images, "s1", RUBRIC, page_indices=PAGES, page_contexts=CONTEXTS
+    )
+
+    assert tiers[FAST].calls == [("grade", None, 3)]
+    # 只重批 Q3（规则）与 Q2（低置信度），只发送这两题所在的两页
+    assert tiers[STRONG].calls == [("regrade", ["3", "2"], 2)]
+    scores = {d["question_id"]: d["score"] for d in result["question_details"]}
+    assert scores == {"1": 3, "2": 2, "3": 2}
+    assert result["total_score"] == 7
+    assert result["cascade"]["escalated"] == ["3", "2"]
+    assert result["cascade"]["regraded"] == ["2", "3"]
+    tiers_by_q = {d["question_id"]: d.get("graded_by_tier") for d in result["question_details"]}
+    assert tiers_by_q == {"1": None, "2": TIER_STRONG, "3": TIER_STRONG}
+
+    snapshot = metrics.snapshot()
+    assert snapshot["tiers"][TIER_FAST]["calls"] == 1
+    assert snapshot["tiers"][TIER_STRONG]["questions"] == 2
+    assert snapshot["escalation"]["escalated"] == 2
+    assert snapshot["reasons"] == {"point_sum_mismatch": 1, "low_confidence": 1}
+    assert snapshot["agreement_rate"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_cascade_keeps_fast_results_when_run_budget_is_spent(tiers):
+    metrics = CascadeMetrics()
+    # 3 页累积 0.003，每道升级题 0.002：只够升级一题
+    cascade = _cascade(0.001, 0.002, metrics, CascadeRunBudget())
+    images = [_answered_page(seed) for seed in range(3)]
+
+    result = await cascade.grade_student(
+        images, "s1", RUBRIC, page_indices=PAGES, page_contexts=CONTEXTS
+    )
+
+    assert tiers[STRONG].calls == [("regrade", ["3"], 1)]
+    assert result["cascade"]["budget_denied"] == ["2"]
+    scores = {d["question_id"]: d["score"] for d in result["question_details"]}
+    assert scores == {"1": 3, "2": 1, "3": 2}
+    assert metrics.snapshot()["escalation"]["budget_denied"] == 1
+
+
+def test_cascade_disabled_without_distinct_fast_model(tiers, monkeypatch):
+    strong = LLMReasoningClient(api_key="k", model_name=STRONG)
+    kwargs = dict(api_key="k", run_id="r", threshold=0.6, max_ratio=0.2,
+                  page_budget_usd=0.01, cost_per_question_usd=0.001)
+    monkeypatch.setattr(grading_cascade, "GRADING_FAST_MODEL", "")
+    assert build_grading_cascade(strong, **kwargs) is None
+    monkeypatch.setattr(grading_cascade, "GRADING_FAST_MODEL", STRONG)
+    assert build_grading_cascade(strong, **kwargs) is None
@@ -0,0 +1,241 @@
+"""单元测试：批改检查点的合并写入、二进制编码与批量恢复"""
+
+import asyncio
+import json
+
+import fakeredis
+import pytest
+
+from src.graphs import batch_grading
+from src.services import grading_checkpoint
+from src.services.grading_checkpoint import (
+    CheckpointWriter,
+    decode_checkpoint,
+    encode_checkpoint,
+)
+
+
+class CountingRedis(fakeredis.FakeAsyncRedis):
+    """记录 pipeline 执行次数（每次 execute 为一次往返）"""
+
+    round_trips = 0
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = super().pipeline(transaction=transaction, shard_hint=shard_hint)
+        original = pipe.execute
+        outer = self
+
+        async def execute(*args, **kwargs):
+            outer.round_trips += 1
+            return await original(*args, **kwargs)
+
+        pipe.execute = execute
+        return pipe
+
+
+def _writer(redis_client, **kwargs):
+    async def factory():
+        return redis_client
+
+    return CheckpointWriter(client_factory=factory, **kwargs)
+
+
+def _page_result(i):
+    return {
+        "status": "completed",
+        "attempts": 1,
+        "page_result": {
+            "page_index": i,
+            "page_indices": [i],
+            "status": "completed",
+            "score": i % 10,
+            "max_score": 10,
+            "student_key": f"student:{i}",
+            "question_details": [
+                {"question_id": str(q), "score": 1, "feedback": "步骤完整，结论正确" * 5}
+                for q in range(12)
+            ],
+        },
+    }
+
+
+def test_encoding_round_trip_compresses_large_payloads():
+    small = {"attempt": 1}
+    large = _page_result(3)
+
+    assert encode_checkpoint(small)[0] == 0x01
+    encoded = encode_checkpoint(large, compress_min_bytes=256)
+    assert encoded[0] == 0x02
+    assert len(encoded) < len(json.dumps(large, ensure_ascii=False).encode("utf-8"))
+    assert decode_checkpoint(encoded) == large
+    assert decode_checkpoint(encode_checkpoint(small)) == small
+    # 旧版本写入的纯 JSON 仍可读取
+    assert decode_checkpoint(json.dumps(large, ensure_ascii=False)) == large
+
+
+@pytest.mark.asyncio
+async def test_concurrent_saves_share_one_pipelined_round_trip():
+    redis_client = CountingRedis()
+    writer = _writer(redis_client, flush_interval_ms=20)
+
+    await asyncio.gather(
+        *[
+            writer.save(
+                batch_id="b1",
+                student_key=f"student:{i}",
+                field="grading_result",
+                payload=_page_result(i),
+                wait=True,
+            )
+            for i in range(200)
+        ],
+        writer.save(
+            batch_id="b2", student_key="s", field="grading_attempt", payload={"a": 1}, wait=True
+        ),
+    )
+
+    assert redis_client.round_trips == 1
+    assert await redis_client.hlen("batch_checkpoint:b1") == 200
+    ttl = await redis_client.ttl("batch_checkpoint:b1")
+    assert 0 < ttl <= grading_checkpoint.REDIS_CHECKPOINT_TTL_SECONDS
+    assert writer.stats["fields_written"] == 201
+
+    loaded = await writer.load("b1")
+    assert set(loaded) == {f"student:{i}" for i in range(200)}
+    assert loaded["student:7"]["grading_result"] == _page_result(7)
+
+
+@pytest.mark.asyncio
+async def test_unwaited_writes_are_flushed_before_load_and_on_close():
+    redis_client = CountingRedis()
+    writer = _writer(redis_client, flush_interval_ms=10_000)
+
+    for attempt in (1, 2):
+        await writer.save(
+            batch_id="b1", student_key="s1", field="grading_attempt", payload={"attempt": attempt}
+        )
+    assert redis_client.round_trips == 0
+
+    loaded = await writer.load("b1")
+    assert loaded == {"s1": {"grading_attempt": {"attempt": 2}}}
+
+    await writer.save(
+        batch_id="b2", student_key="s2", field="confession_report", payload={"ok": True}
+    )
+    await writer.close()
+    assert await redis_client.hexists("batch_checkpoint:b2", "student:s2:confession_report")
+
+
+@pytest.mark.asyncio
+async def test_max_pending_forces_flush_and_redis_outage_is_swallowed():
+    class BrokenRedis(fakeredis.FakeAsyncRedis):
+        def pipeline(self, transaction=True, shard_hint=None):
+            from redis.exceptions import ConnectionError as RedisConnectionError
+
+            raise RedisConnectionError("down")
+
+    redis_client = CountingRedis()
+    writer = _writer(redis_client, flush_interval_ms=10_000, max_pending_fields=10)
+    for i in range(25):
+        await writer.save(batch_id="b", student_key=f"s{i}", field="f", payload=i)
+    assert redis_client.round_trips == 2
+    await writer.close()
+
+    broken = _writer(BrokenRedis(), flush_interval_ms=1)
+    await broken.save(batch_id="b", student_key="s", field="f", payload={"x": 1}, wait=True)
+    assert broken.stats["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_grade_batch_node_resumes_completed_students(monkeypatch):
+    redis_client = fakeredis.FakeAsyncRedis()
+    writer = _writer(redis_client, flush_interval_ms=1)
+    monkeypatch.setattr(grading_checkpoint, "_checkpoint_writer", writer)
+    grading_checkpoint.clear_resume_cache()
+
+    async def no_broadcast(*args, **kwargs):
+        return None
+
+    async def must_not_grade(state):
+        raise AssertionError("completed student should not be graded again")
+
+    monkeypatch.setattr(batch_grading, "_broadcast_progress", no_broadcast)
+    monkeypatch.setattr(batch_grading, "_grade_batch_node_impl", must_not_grade)
+
+    checkpoint = _page_result(4)
+    checkpoint["page_result"]["student_key"] = "Alice"
+    await grading_checkpoint.save_student_checkpoint(
+        batch_id="batch-9", student_key="Alice", field="grading_result", payload=checkpoint
+    )
+
+    result = await batch_grading.grade_batch_node(
+        {
+            "batch_id": "batch-9",
+            "batch_index": 0,
+            "total_batches": 2,
+            "page_indices": [4],
+            "student_key": "Alice",
+        }
+    )
+
+    assert result["grading_results"][0]["resumed_from_checkpoint"] is True
+    assert result["student_results"][0]["student_key"] == "Alice"
+    assert result["batch_progress"]["resumed"] is True
+
+    # 页码变化或没有检查点的学生照常批改
+    graded = []
+
+    async def grade(state):
+        graded.append(state["student_key"])
+        return {"student_results": [], "grading_results": []}
+
+    monkeypatch.setattr(batch_grading, "_grade_batch_node_impl", grade)
+    for key, pages in (("Alice", [4, 5]), ("Bob", [6])):
+        await batch_grading.grade_batch_node(
+            {
+                "batch_id": "batch-9",
+                "batch_index": 1,
+                "total_batches": 2,
+                "page_indices": pages,
+                "student_key": key,
+            }
+        )
+    assert graded == ["Alice", "Bob"]
+    grading_checkpoint.clear_resume_cache()
+
+
+@pytest.mark.asyncio
+async def test_partial_question_deltas_are_loaded_for_matching_pages(monkeypatch):
+    redis_client = fakeredis.FakeAsyncRedis()
+    writer = _writer(redis_client, flush_interval_ms=1)
+    monkeypatch.setattr(grading_checkpoint, "_checkpoint_writer", writer)
+    grading_checkpoint.clear_resume_cache()
+
+    for qid in ("1", "2:a"):
+        await grading_checkpoint.save_student_checkpoint(
+            batch_id="batch-3",
+            student_key="Alice",
+            field=grading_checkpoint.partial_question_field(qid),
+            payload={"detail": {"question_id": qid, "score": 2}, "page_indices": [4, 5]},
+        )
+    await grading_checkpoint.save_student_checkpoint(
+        batch_id="batch-3",
+        student_key="Alice",
+        field="grading_attempt",
+        payload={"attempt": 1},
+        wait=True,
+    )
+
+    # 每题单独一个字段，而不是反复重写整个列表
+    fields = await redis_client.hkeys("batch_checkpoint:batch-3")
+    assert {f.decode() for f in fields} == {
+        "student:Alice:partial_question.1",
+        "student:Alice:partial_question.2_a",
+        "student:Alice:grading_attempt",
+    }
+
+    details = await grading_checkpoint.load_partial_question_details("batch-3", "Alice", [4, 5])
+    assert sorted(d["question_id"] for d in details) == ["1", "2:a"]
+    assert await grading_checkpoint.load_partial_question_details("batch-3", "Alice", [4]) == []
+    assert await grading_checkpoint.load_partial_question_details("batch-3", "Bob", [4, 5]) == []
+    grading_checkpoint.clear_resume_cache()
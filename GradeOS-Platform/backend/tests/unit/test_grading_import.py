@@ -0,0 +1,708 @@
+"""单元测试：批改结果导入任务（分块写入、幂等键、失败重试与租约接管）"""
+
+import copy
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+
+from src.db.postgres_grading import GradingHistory
+from src.services.grading_import import (
+    GradingImportService,
+    ImportLeaseLost,
+    class_scopes,
+    derive_idempotency_key,
+)
+
+
+class FakeResult:
+    def __init__(self, rows=None, rowcount=None):
+        self._rows = rows or []
+        self.rowcount = len(self._rows) if rowcount is None else rowcount
+
+    async def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    async def fetchall(self):
+        return self._rows
+
+
+class FakeCursor:
+    def __init__(self, conn, name=None):
+        self.conn = conn
+        self.name = name
+        self._rows = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, query, params):
+        assert self.name, "结果应通过服务端游标读取"
+        assert "DISTINCT ON (student_key)" in query
+        keys = set(params[1]) if len(params) > 1 else None
+        rows = _distinct_by_key(self.conn.state()["student_grading_results"], params[0])
+        self._rows = [dict(row) for row in rows if keys is None or row["student_key"] in keys]
+
+    async def fetchmany(self, size):
+        self.conn.db.fetch_sizes.append(size)
+        chunk, self._rows = self._rows[:size], self._rows[size:]
+        return chunk
+
+    async def executemany(self, query, rows):
+        state = self.conn.state()
+        if "INSERT INTO student_grading_results" in query:
+            columns = [
+                "id",
+                "grading_history_id",
+                "student_key",
+                "class_id",
+                "student_id",
+                "score",
+                "max_score",
+                "summary",
+                "confession",
+                "result_data",
+                "imported_at",
+                "revoked_at",
+            ]
+            for values in rows:
+                state["student_grading_results"].append(dict(zip(columns, values)))
+            self.conn.written.add("student_grading_results")
+        elif "INSERT INTO homework_submissions" in query:
+            for values in rows:
+                class_id = values[1]
+                if class_id == self.conn.db.fail_on_class:
+                    raise RuntimeError(f"boom in {class_id}")
+                key = (class_id, values[2], values[3])
+                state["homework_submissions"][key] = {
+                    "student_name": values[4],
+                    "grading_batch_id": values[6],
+                    "score": values[7],
+                }
+            self.conn.written.add("homework_submissions")
+        else:
+            raise AssertionError(f"unexpected executemany: {query}")
+        self.conn.db.executemany_calls += 1
+
+
+def _distinct_by_key(results, history_id):
+    """每个学生一行，优先未分配班级的记录（对应 DISTINCT ON ... class_id NULLS FIRST）"""
+    chosen = {}
+    for row in results:
+        if row["grading_history_id"] != history_id:
+            continue
+        current = chosen.get(row["student_key"])
+        if current is None or (current["class_id"] is not None and row["class_id"] is None):
+            chosen[row["student_key"]] = row
+    return [chosen[key] for key in sorted(chosen)]
+
+
+class FakeConnection:
+    """每个连接在首条语句时复制状态，commit 时整体替换，rollback 时丢弃"""
+
+    def __init__(self, db):
+        self.db = db
+        self._tx = None
+        self.written = set()
+
+    def state(self):
+        if self._tx is None:
+            self._tx = copy.deepcopy(self.db.state)
+        return self._tx
+
+    async def commit(self):
+        if self._tx is not None:
+            self.db.state = self._tx
+            self.db.commits.append(frozenset(self.written))
+        self._tx, self.written = None, set()
+
+    async def rollback(self):
+        self._tx, self.written = None, set()
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def _job(self, **match):
+        for job in self.state()["jobs"].values():
+            if all(job[key] == value for key, value in match.items()):
+                return job
+        return None
+
+    def _lease_free(self, job):
+        return job["status"] == "queued" or (
+            job["status"] == "running"
+            and (job["lease_until"] is None or job["lease_until"] < self.db.now)
+        )
+
+    async def execute(self, query, params=()):
+        q = " ".join(query.split())
+        jobs = self.state()["jobs"]
+        if q.startswith("CREATE"):
+            return FakeResult()
+        if q.startswith("INSERT INTO grading_import_jobs"):
+            job_id, key, batch_id, history_id, request = params
+            if self._job(idempotency_key=key):
+                return FakeResult()
+            jobs[job_id] = {
+                "id": job_id,
+                "idempotency_key": key,
+                "batch_id": batch_id,
+                "history_id": history_id,
+                "request": request,
+                "status": "queued",
+                "classes_done": "[]",
+                "imported_count": 0,
+                "total_students": 0,
+                "average_score": None,
+                "attempts": 0,
+                "error": None,
+                "lease_owner": None,
+                "lease_until": None,
+                "created_at": len(jobs),
+                "updated_at": None,
+                "finished_at": None,
+            }
+            self.written.add("grading_import_jobs")
+            return FakeResult([dict(jobs[job_id])])
+        if q.startswith("UPDATE grading_import_jobs SET status = 'queued', error = NULL"):
+            source, key, rerun_completed = params
+            job = self._job(idempotency_key=key)
+            if not job or job["status"] not in (
+                ("failed", "completed") if rerun_completed else ("failed",)
+            ):
+                return FakeResult()
+            if job["status"] == "completed":
+                job.update(classes_done="[]", imported_count=0)
+            request = dict(json.loads(job["request"]), results_source=source)
+            job.update(status="queued", error=None, request=json.dumps(request), finished_at=None)
+            return FakeResult([dict(job)])
+        if q.startswith("SELECT") and "FROM grading_import_jobs WHERE idempotency_key" in q:
+            job = self._job(idempotency_key=params[0])
+            return FakeResult([dict(job)] if job else [])
+        if q.startswith("SELECT") and "FROM grading_import_jobs WHERE id = %s" in q:
+            job = jobs.get(params[0])
+            return FakeResult([dict(job)] if job else [])
+        if q.startswith("SELECT id, request->>'results_source' AS results_source"):
+            rows = sorted(
+                (job for job in jobs.values() if self._lease_free(job)),
+                key=lambda job: job["created_at"],
+            )
+            return FakeResult(
+                [
+                    {
+                        "id": job["id"],
+                        "results_source": json.loads(job["request"]).get("results_source"),
+                    }
+                    for job in rows
+                ]
+            )
+        if q.startswith("UPDATE grading_import_jobs SET status = 'failed', error = %s"):
+            error, job_id = params
+            job = jobs.get(job_id)
+            if not job or not self._lease_free(job):
+                return FakeResult(rowcount=0)
+            job.update(status="failed", error=error, lease_owner=None, lease_until=None)
+            self.written.add("grading_import_jobs")
+            return FakeResult(rowcount=1)
+        if "SET status = 'running', lease_owner = %s" in q:
+            owner, seconds, job_id = params
+            job = jobs.get(job_id)
+            if not job or not self._lease_free(job):
+                return FakeResult()
+            job.update(
+                status="running",
+                lease_owner=owner,
+                lease_until=self.db.now + seconds,
+                attempts=job["attempts"] + 1,
+            )
+            return FakeResult([dict(job)])
+        if q.startswith("UPDATE grading_import_jobs SET status = %s, history_id = %s"):
+            (
+                status,
+                history_id,
+                classes_done,
+                imported,
+                total,
+                average,
+                error,
+                release,
+                _,
+                seconds,
+                _,
+                job_id,
+                owner,
+            ) = params
+            job = jobs.get(job_id)
+            if not job or job["lease_owner"] != owner:
+                return FakeResult(rowcount=0)
+            job.update(
+                status=status,
+                history_id=history_id,
+                classes_done=classes_done,
+                imported_count=imported,
+                total_students=total,
+                average_score=average,
+                error=error,
+                lease_until=None if release else self.db.now + seconds,
+            )
+            if release:
+                job["lease_owner"] = None
+            self.written.add("grading_import_jobs")
+            return FakeResult(rowcount=1)
+        if "SET status = 'queued', lease_owner = NULL" in q:
+            count = 0
+            for job in jobs.values():
+                if job["lease_owner"] == params[0] and job["status"] == "running":
+                    job.update(status="queued", lease_owner=None, lease_until=None)
+                    count += 1
+            return FakeResult(rowcount=count)
+        results = self.state()["student_grading_results"]
+        if "SELECT 1 AS found" in q:
+            return FakeResult(
+                [{"found": 1}] if any(r["grading_history_id"] == params[0] for r in results) else []
+            )
+        if "COUNT(*) AS total" in q:
+            scores = [r["score"] or 0 for r in _distinct_by_key(results, params[0])]
+            average = sum(scores) / len(scores) if scores else None
+            return FakeResult([{"total": len(scores), "average": average}])
+        if q.startswith("DELETE FROM student_grading_results"):
+            history_id, class_id, keys, student_ids = params
+            kept = [
+                r
+                for r in results
+                if not (
+                    r["grading_history_id"] == history_id
+                    and r["class_id"] in (class_id, None)
+                    and (r["student_key"] in keys or r["student_id"] in student_ids)
+                )
+            ]
+            self.state()["student_grading_results"] = kept
+            return FakeResult(rowcount=len(results) - len(kept))
+        raise AssertionError(f"unexpected query: {q}")
+
+
+class FakeImportDb:
+    def __init__(self):
+        self.state = {"jobs": {}, "student_grading_results": [], "homework_submissions": {}}
+        self.now = 1000.0
+        self.commits = []
+        self.fetch_sizes = []
+        self.executemany_calls = 0
+        self.fail_on_class = None
+        self.histories = {}
+
+    @asynccontextmanager
+    async def connection(self):
+        yield FakeConnection(self)
+
+    async def load_history(self, batch_id):
+        return self.histories.get(batch_id)
+
+    async def save_history(self, history):
+        self.histories[history.batch_id] = history
+
+    def service(self, **kwargs):
+        kwargs.setdefault("chunk_rows", 10)
+        return GradingImportService(
+            self.connection,
+            max_workers=1,
+            lease_seconds=60,
+            load_history=self.load_history,
+            save_history=self.save_history,
+            **kwargs,
+        )
+
+    def rows(self, **match):
+        return [
+            r
+            for r in self.state["student_grading_results"]
+            if all(r[key] == value for key, value in match.items())
+        ]
+
+
+def _results(n):
+    return [
+        {
+            "studentName": f"S{i:03d}",
+            "totalScore": i % 10,
+            "maxTotalScore": 10,
+            "studentSummary": {"overall": f"summary {i}"},
+            "confession": {"summary": "ok"},
+        }
+        for i in range(n)
+    ]
+
+
+def _request(class_ids, n, scoped=True, homework_id="hw1"):
+    return {
+        "class_ids": class_ids,
+        "student_mapping": [
+            {
+                "student_key": f"S{i:03d}",
+                "student_id": f"u{i}",
+                "class_id": class_ids[i % len(class_ids)] if scoped else None,
+            }
+            for i in range(n)
+        ],
+        "homework_id": homework_id,
+    }
+
+
+@pytest.mark.asyncio
+async def test_memory_results_import_one_transaction_per_class():
+    fake = FakeImportDb()
+    service = fake.service()
+    classes = ["c1", "c2", "c3"]
+    job, started = await service.submit("b1", "h1", _request(classes, 25), results=_results(25))
+    await service.join()
+
+    assert started
+    done = await service.get_job(job.job_id)
+    assert done.status == "completed" and done.percentage == 100.0
+    assert done.classes_done == classes and done.imported_count == 25
+    assert done.total_students == 25 and done.average_score == pytest.approx(
+        sum(i % 10 for i in range(25)) / 25
+    )
+    # 每个班级的学生结果、作业分数与任务进度在同一次提交中
+    class_commits = [c for c in fake.commits if "student_grading_results" in c]
+    assert len(class_commits) == 3
+    assert all({"homework_submissions", "grading_import_jobs"} <= c for c in class_commits)
+    for index, class_id in enumerate(classes):
+        rows = fake.rows(class_id=class_id)
+        assert {r["student_key"] for r in rows} == {f"S{i:03d}" for i in range(index, 25, 3)}
+        assert all(r["student_id"] == f"u{int(r['student_key'][1:])}" for r in rows)
+    assert len(fake.state["homework_submissions"]) == 25
+    assert fake.state["homework_submissions"][("c2", "hw1", "u1")]["score"] == 1.0
+    history = fake.histories["b1"]
+    assert history.id == "h1" and history.status == "imported" and history.total_students == 25
+
+
+@pytest.mark.asyncio
+async def test_retry_with_same_key_does_not_reimport():
+    fake = FakeImportDb()
+    service = fake.service()
+    request = _request(["c1", "c2"], 12)
+    first, _ = await service.submit(
+        "b1", "h1", request, idempotency_key="import-1", results=_results(12)
+    )
+    await service.join()
+    writes = fake.executemany_calls
+
+    again, started = await service.submit(
+        "b1", "h1", dict(request), idempotency_key="import-1", results=_results(12)
+    )
+    await service.join()
+    assert not started and again.job_id == first.job_id and again.status == "completed"
+    assert fake.executemany_calls == writes
+
+    forced, started = await service.submit(
+        "b1", "h1", request, idempotency_key="reimport-1", results=_results(12)
+    )
+    await service.join()
+    assert started and forced.job_id != first.job_id
+    assert fake.executemany_calls > writes
+    assert len(fake.rows(grading_history_id="h1")) == 12
+
+
+@pytest.mark.asyncio
+async def test_derived_key_dedupes_in_flight_and_reruns_completed_job():
+    fake = FakeImportDb()
+    service = fake.service()
+    request = _request(["c1", "c2"], 12)
+    first, started = await service.submit("b1", "h1", request, results=_results(12))
+    assert started
+    # 进行中的任务：重复提交返回同一任务，不再启动
+    duplicate, started = await service.submit("b1", "h1", dict(request), results=_results(12))
+    assert not started and duplicate.job_id == first.job_id
+    await service.join()
+    writes = fake.executemany_calls
+
+    # 撤销或重新批改后再次导入：已完成的自动键任务从头重新执行
+    fake.state["student_grading_results"] = []
+    again, started = await service.submit("b1", "h1", dict(request), results=_results(10))
+    assert started and again.job_id == first.job_id
+    assert again.classes_done == [] and again.imported_count == 0
+    await service.join()
+
+    done = await service.get_job(first.job_id)
+    assert done.status == "completed" and done.imported_count == 10
+    assert fake.executemany_calls > writes
+    assert len(fake.rows(grading_history_id="h1")) == 10
+
+
+@pytest.mark.asyncio
+async def test_failed_class_rolls_back_and_retry_skips_finished_classes():
+    fake = FakeImportDb()
+    fake.fail_on_class = "c2"
+    service = fake.service()
+    request = _request(["c1", "c2", "c3"], 30)
+    job, _ = await service.submit("b1", "h1", request, results=_results(30))
+    await service.join()
+
+    failed = await service.get_job(job.job_id)
+    assert failed.status == "failed" and "boom in c2" in failed.error
+    assert failed.classes_done == ["c1"] and failed.imported_count == 10
+    assert len(fake.rows(class_id="c1")) == 10 and not fake.rows(class_id="c2")
+
+    fake.fail_on_class = None
+    calls_before = fake.executemany_calls
+    retried, started = await service.submit("b1", "h1", request, results=_results(30))
+    await service.join()
+    done = await service.get_job(retried.job_id)
+    assert started and retried.job_id == job.job_id
+    assert done.status == "completed" and done.attempts == 2
+    assert done.classes_done == ["c1", "c2", "c3"] and done.imported_count == 30
+    # c1 未重写：只写入 c2、c3 两个班级（每班结果与作业各一次 executemany）
+    assert fake.executemany_calls - calls_before == 4
+
+
+@pytest.mark.asyncio
+async def test_stored_results_are_read_through_server_side_cursor():
+    fake = FakeImportDb()
+    fake.histories["b1"] = GradingHistory(
+        id="h1",
+        batch_id="b1",
+        status="completed",
+        class_ids=["c0"],
+        result_data={"keep": True},
+        rubric_data={"questions": []},
+    )
+    for i in range(23):
+        fake.state["student_grading_results"].append(
+            {
+                "id": f"r{i}",
+                "grading_history_id": "h1",
+                "student_key": f"S{i:03d}",
+                "class_id": None,
+                "student_id": None,
+                "score": float(i),
+                "max_score": 30.0,
+                "result_data": json.dumps({"studentName": f"S{i:03d}", "score": i}) if i else None,
+            }
+        )
+    service = fake.service(chunk_rows=5)
+    assert await service.has_stored_results("h1")
+    job, _ = await service.submit(
+        "b1", "h1", _request(["c1", "c2"], 23, scoped=False, homework_id=None)
+    )
+    await service.join()
+
+    done = await service.get_job(job.job_id)
+    assert done.status == "completed" and done.imported_count == 46
+    assert fake.fetch_sizes and set(fake.fetch_sizes) == {5}
+    # 每个班级各有一份完整结果，未分配班级的原始记录被导入记录取代
+    for class_id in ("c1", "c2"):
+        rows = fake.rows(grading_history_id="h1", class_id=class_id)
+        assert sorted(r["student_key"] for r in rows) == [f"S{i:03d}" for i in range(23)]
+        first = next(r for r in rows if r["student_key"] == "S000")
+        assert json.loads(first["result_data"])["score"] == 0.0
+    assert not fake.rows(grading_history_id="h1", class_id=None)
+    assert len({r["id"] for r in fake.rows(grading_history_id="h1")}) == 46
+    history = fake.histories["b1"]
+    assert history.class_ids == ["c0", "c1", "c2"] and history.rubric_data == {"questions": []}
+    assert history.average_score == pytest.approx(11.0)
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_taken_over_and_old_worker_is_fenced():
+    fake = FakeImportDb()
+    fake.state["student_grading_results"] = [
+        {
+            "id": f"r{i}",
+            "grading_history_id": "h1",
+            "student_key": f"S{i:03d}",
+            "class_id": None,
+            "student_id": None,
+            "score": 1.0,
+            "max_score": 10.0,
+            "result_data": None,
+        }
+        for i in range(8)
+    ]
+    crashed = fake.service()
+    request = _request(["c1", "c2"], 8)
+    job, _ = await crashed.submit("b1", "h1", request)
+    # 原执行者领取后未完成（进程中断）
+    for task in list(crashed._tasks.values()):
+        task.cancel()
+    stale = await crashed._claim(job.job_id)
+    assert stale is not None
+
+    survivor = fake.service()
+    assert await survivor.resume() == 0
+    fake.now += 120
+    assert await survivor.resume() == 1
+    await survivor.join()
+    assert (await survivor.get_job(job.job_id)).status == "completed"
+
+    async with fake.connection() as conn:
+        with pytest.raises(ImportLeaseLost):
+            await crashed._save_progress(conn, stale)
+
+
+@pytest.mark.asyncio
+async def test_memory_results_lost_on_restart_fail_until_resubmitted():
+    fake = FakeImportDb()
+    crashed = fake.service()
+    request = _request(["c1", "c2"], 6)
+    job, _ = await crashed.submit("b1", "h1", request, results=_results(6))
+    for task in list(crashed._tasks.values()):
+        task.cancel()
+    await crashed.shutdown()
+
+    # 重启后内存结果已丢失：不领取任务，直接以明确原因标记失败
+    restarted = fake.service()
+    assert await restarted.resume() == 0
+    lost = await restarted.get_job(job.job_id)
+    assert lost.status == "failed" and "重新提交" in lost.error and lost.attempts == 0
+    assert fake.executemany_calls == 0
+
+    retried, started = await restarted.submit("b1", "h1", request, results=_results(6))
+    await restarted.join()
+    done = await restarted.get_job(retried.job_id)
+    assert started and retried.job_id == job.job_id
+    assert done.status == "completed" and done.imported_count == 6
+
+
+def test_scopes_and_derived_keys():
+    request = _request(["c1", "c2"], 4)
+    request["student_mapping"].append({"student_key": "X", "student_id": "ux", "class_id": None})
+    assert class_scopes(request) == {"c1": ["S000", "S002", "X"], "c2": ["S001", "S003", "X"]}
+    assert class_scopes(_request(["c1"], 2, scoped=False)) == {"c1": None}
+
+    reordered = dict(
+        request, class_ids=["c2", "c1"], student_mapping=request["student_mapping"][::-1]
+    )
+    assert derive_idempotency_key("b", request) == derive_idempotency_key("b", reordered)
+    assert derive_idempotency_key("b", request) != derive_idempotency_key("b2", request)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(
+    not os.getenv("GRADING_IMPORT_TEST_DATABASE_URL"),
+    reason="GRADING_IMPORT_TEST_DATABASE_URL not set",
+)
+async def test_import_against_postgres():
+    import psycopg
+    from psycopg.rows import dict_row
+
+    dsn = os.environ["GRADING_IMPORT_TEST_DATABASE_URL"]
+    students, class_ids = 2000, [f"class-{c}" for c in range(10)]
+
+    @asynccontextmanager
+    async def connection():
+        conn = await psycopg.AsyncConnection.connect(dsn, row_factory=dict_row)
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+    async with connection() as conn:
+        await conn.execute(
+            "DROP TABLE IF EXISTS grading_import_jobs, student_grading_results, "
+            "homework_submissions, grading_history CASCADE"
+        )
+        await conn.execute(
+            "CREATE TABLE grading_history (id TEXT PRIMARY KEY, batch_id TEXT UNIQUE)"
+        )
+        await conn.execute("""
+            CREATE TABLE student_grading_results (
+                id TEXT PRIMARY KEY,
+                grading_history_id TEXT NOT NULL REFERENCES grading_history(id),
+                student_key TEXT NOT NULL, class_id TEXT, student_id TEXT,
+                score REAL, max_score REAL, summary TEXT, confession TEXT,
+                result_data JSONB, imported_at TEXT, revoked_at TEXT
+            )
+            """)
+        await conn.execute(
+            "CREATE UNIQUE INDEX ON student_grading_results"
+            "(grading_history_id, class_id, student_key)"
+        )
+        await conn.execute("""
+            CREATE TABLE homework_submissions (
+                id TEXT PRIMARY KEY, class_id TEXT NOT NULL, homework_id TEXT NOT NULL,
+                student_id TEXT NOT NULL, student_name TEXT, images TEXT, content TEXT,
+                submission_type TEXT, page_count INTEGER DEFAULT 0, submitted_at TEXT NOT NULL,
+                status TEXT DEFAULT 'pending', grading_batch_id TEXT, score REAL, feedback TEXT,
+                UNIQUE(class_id, homework_id, student_id)
+            )
+            """)
+        await conn.execute("INSERT INTO grading_history VALUES ('h-pg', 'b-pg')")
+        await conn.execute(
+            """
+            INSERT INTO student_grading_results
+                (id, grading_history_id, student_key, score, max_score, result_data)
+            SELECT 'r' || i, 'h-pg', 'S' || lpad(i::text, 4, '0'), i %% 50, 50,
+                   jsonb_build_object(
+                       'studentName', 'S' || lpad(i::text, 4, '0'),
+                       'totalScore', i %% 50,
+                       'studentSummary', jsonb_build_object('overall', 'ok {}"')
+                   )
+            FROM generate_series(0, %s) AS i
+            """,
+            (students - 1,),
+        )
+        await conn.commit()
+
+    histories = {"b-pg": GradingHistory(id="h-pg", batch_id="b-pg", status="completed")}
+
+    async def load_history(batch_id):
+        return histories.get(batch_id)
+
+    async def save_history(history):
+        histories[history.batch_id] = history
+
+    service = GradingImportService(
+        connection,
+        chunk_rows=250,
+        max_workers=2,
+        load_history=load_history,
+        save_history=save_history,
+    )
+    request = {
+        "class_ids": class_ids,
+        "student_mapping": [
+            {"student_key": f"S{i:04d}", "student_id": f"u{i}", "class_id": class_ids[i % 10]}
+            for i in range(students)
+        ],
+        "homework_id": "hw-pg",
+    }
+    job, _ = await service.submit("b-pg", "h-pg", request, idempotency_key=f"pg-{uuid.uuid4()}")
+    await service.join()
+
+    done = await service.get_job(job.job_id)
+    assert done.status == "completed", done.error
+    assert done.imported_count == students and done.classes_done == class_ids
+    assert done.average_score == pytest.approx(sum(i % 50 for i in range(students)) / students)
+    async with connection() as conn:
+        cursor = await conn.execute(
+            "SELECT class_id, COUNT(*) AS n FROM student_grading_results GROUP BY class_id"
+        )
+        assert {row["class_id"]: row["n"] for row in await cursor.fetchall()} == {
+            c: 200 for c in class_ids
+        }
+        cursor = await conn.execute(
+            "SELECT COUNT(*) AS n, COUNT(DISTINCT class_id) AS classes FROM homework_submissions "
+            "WHERE homework_id = 'hw-pg' AND status = 'graded'"
+        )
+        row = await cursor.fetchone()
+        assert (row["n"], row["classes"]) == (students, 10)
+
+    again, started = await service.submit(
+        "b-pg", "h-pg", request, idempotency_key=job.idempotency_key
+    )
+    assert not started and again.job_id == job.job_id
+
+    # 自动键：完成后再次提交会从头重新导入
+    auto, started = await service.submit("b-pg", "h-pg", request)
+    await service.join()
+    rerun, started = await service.submit("b-pg", "h-pg", request)
+    assert started and rerun.job_id == auto.job_id and rerun.classes_done == []
+    await service.join()
+    done = await service.get_job(auto.job_id)
+    assert done.status == "completed" and done.imported_count == students
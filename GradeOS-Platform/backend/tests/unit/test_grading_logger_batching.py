@@ -0,0 +1,251 @@
+"""单元测试：批改日志的批量写入、溢写落盘与重放"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from uuid import uuid4
+
+import pytest
+
+from src.models.grading_log import GradingLog
+from src.services import grading_logger as grading_logger_module
+from src.services.grading_logger import GradingLogger
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def executemany(self, query, rows):
+        assert "ON CONFLICT (log_id) DO NOTHING" in query
+        assert "RETURNING" not in query
+        if self.db.write_delay:
+            await asyncio.sleep(self.db.write_delay)
+        self.db.batches.append(len(rows))
+        for row in rows:
+            self.db.rows.setdefault(row[0], row)
+
+
+class FakeConn:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return FakeCursor(self.db)
+
+
+class FakeDatabase:
+    """只支持 transaction()；down=True 时模拟数据库不可用"""
+
+    def __init__(self):
+        self.rows = {}
+        self.batches = []
+        self.transactions = 0
+        self.down = False
+        self.write_delay = 0.0
+
+    @asynccontextmanager
+    async def transaction(self):
+        if self.down:
+            raise ConnectionError("database unavailable")
+        self.transactions += 1
+        yield FakeConn(self)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDatabase()
+    monkeypatch.setattr(grading_logger_module, "db", fake)
+    return fake
+
+
+def _log(i: int) -> GradingLog:
+    return GradingLog(
+        submission_id=str(uuid4()),
+        question_id=f"q{i}",
+        extracted_answer=f"answer_{i}",
+        score=float(i % 10),
+        confidence=0.9,
+        reasoning_trace=[f"step_{i}"],
+    )
+
+
+@pytest.mark.asyncio
+async def test_logs_are_written_in_batches_without_round_trip_per_log(fake_db):
+    grading_logger = GradingLogger(batch_size=200, flush_interval_ms=10)
+    logs = [_log(i) for i in range(1000)]
+
+    ids = [await grading_logger.log_grading(log) for log in logs]
+    await grading_logger.stop()
+
+    assert ids == [log.log_id for log in logs]
+    assert set(fake_db.rows) == set(ids)
+    assert fake_db.transactions <= 10
+    assert max(fake_db.batches) <= 200
+    assert grading_logger.stats["logs_written"] == 1000
+
+
+@pytest.mark.asyncio
+async def test_outage_spills_to_disk_and_restart_replays(fake_db, tmp_path):
+    spill = tmp_path / "spill" / "grading_logs.jsonl"
+    grading_logger = GradingLogger(batch_size=50, flush_interval_ms=10, spill_path=str(spill))
+    fake_db.down = True
+
+    logs = [_log(i) for i in range(300)]
+    for log in logs:
+        await grading_logger.log_grading(log)
+    await grading_logger.stop()
+
+    assert fake_db.rows == {}
+    assert len(spill.read_text(encoding="utf-8").splitlines()) == 300
+    assert grading_logger.get_pending_count() == 300
+
+    # 模拟进程重启：新实例启动时重放溢写文件
+    fake_db.down = False
+    restarted = GradingLogger(batch_size=50, flush_interval_ms=10, spill_path=str(spill))
+    await restarted.start()
+    for _ in range(100):
+        if len(fake_db.rows) == 300:
+            break
+        await asyncio.sleep(0.01)
+    await restarted.stop()
+
+    assert set(fake_db.rows) == {log.log_id for log in logs}
+    assert fake_db.rows[logs[7].log_id][3] == "answer_7"
+    assert not spill.exists()
+    assert restarted.get_pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_no_loss_when_database_drops_mid_run(fake_db, tmp_path):
+    spill = tmp_path / "grading_logs.jsonl"
+    grading_logger = GradingLogger(
+        batch_size=25, flush_interval_ms=5, spill_path=str(spill), spill_retry_seconds=0
+    )
+    logs = [_log(i) for i in range(600)]
+
+    for i, log in enumerate(logs):
+        if i == 150:
+            fake_db.down = True
+        if i == 450:
+            fake_db.down = False
+        await grading_logger.log_grading(log)
+        if i % 50 == 0:
+            await asyncio.sleep(0.01)
+
+    assert grading_logger.stats["logs_spilled"] > 0
+    assert await grading_logger.flush_pending() >= 0
+    await grading_logger.stop()
+
+    assert set(fake_db.rows) == {log.log_id for log in logs}
+    assert grading_logger.get_pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_memory_fallback_without_spill_file(fake_db):
+    grading_logger = GradingLogger(batch_size=10, flush_interval_ms=10_000)
+    fake_db.down = True
+    logs = [_log(i) for i in range(30)]
+    for log in logs:
+        await grading_logger.log_grading(log)
+    await grading_logger._flush_buffer()
+    assert grading_logger.get_pending_count() == 30
+
+    fake_db.down = False
+    assert await grading_logger.flush_pending() == 30
+    await grading_logger.stop()
+    assert set(fake_db.rows) == {log.log_id for log in logs}
+
+
+@pytest.mark.asyncio
+async def test_full_queue_flushes_inline(fake_db):
+    grading_logger = GradingLogger(batch_size=20, flush_interval_ms=60_000, max_queue_size=50)
+    await grading_logger.start()
+    try:
+        for i in range(120):
+            await grading_logger.log_grading(_log(i))
+            assert grading_logger.stats["buffered_logs"] < 50
+    finally:
+        await grading_logger.stop()
+    assert len(fake_db.rows) == 120
+
+
+@pytest.mark.asyncio
+async def test_stop_waits_for_in_flight_batch(fake_db, tmp_path):
+    fake_db.write_delay = 0.2
+    grading_logger = GradingLogger(
+        batch_size=10, flush_interval_ms=1, spill_path=str(tmp_path / "grading_logs.jsonl")
+    )
+    await grading_logger.start()
+    logs = [_log(i) for i in range(25)]
+    for log in logs:
+        await grading_logger.log_grading(log)
+    await asyncio.sleep(0.05)
+    await grading_logger.stop()
+
+    assert set(fake_db.rows) == {log.log_id for log in logs}
+    assert grading_logger.get_pending_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_write_returns_batch_to_queue(fake_db):
+    fake_db.write_delay = 0.2
+    grading_logger = GradingLogger(batch_size=10, flush_interval_ms=60_000)
+    for i in range(15):
+        await grading_logger.log_grading(_log(i))
+    await asyncio.sleep(0.05)
+    grading_logger._flush_task.cancel()
+    await asyncio.gather(grading_logger._flush_task, return_exceptions=True)
+
+    assert fake_db.rows == {}
+    assert grading_logger.stats["buffered_logs"] == 15
+    fake_db.write_delay = 0.0
+    await grading_logger.stop()
+    assert len(fake_db.rows) == 15
+
+
+class FailingMetrics:
+    def needs_review(self, confidence):
+        return False
+
+    async def record_results(self, results):
+        raise RuntimeError("redis unavailable")
+
+
+@pytest.mark.asyncio
+async def test_metrics_failure_does_not_spill_written_logs(fake_db, tmp_path):
+    spill = tmp_path / "grading_logs.jsonl"
+    grading_logger = GradingLogger(
+        batch_size=10, flush_interval_ms=60_000, spill_path=str(spill), metrics=FailingMetrics()
+    )
+    for i in range(20):
+        await grading_logger.log_grading(_log(i))
+    assert await grading_logger._flush_buffer() == 20
+
+    assert len(fake_db.rows) == 20
+    assert grading_logger.get_pending_count() == 0
+    assert not spill.exists()
+
+
+def test_question_logs_use_stable_ids_shared_with_overrides():
+    details = [
+        {"question_id": "1", "score": 3, "max_score": 5, "confidence": 0.9, "feedback": "ok"},
+        {"questionId": "2", "score": 0, "maxScore": 2, "confidence": 1.4},
+        {"score": 1},
+    ]
+
+    logs = grading_logger_module.build_question_logs("h-1", "张三", details, patch_version="v2")
+    again = grading_logger_module.build_question_logs("h-1", "张三", details)
+
+    assert [log.question_id for log in logs] == ["1", "2"]
+    assert [log.log_id for log in logs] == [log.log_id for log in again]
+    assert logs[1].confidence == 1.0
+    assert {log.patch_version for log in logs} == {"v2"}
+    submission_id = grading_logger_module.grading_submission_id("h-1", "张三")
+    assert logs[0].submission_id == submission_id
+    assert logs[0].log_id == grading_logger_module.grading_log_id(submission_id, "1")
@@ -0,0 +1,175 @@
+"""单元测试：批改记忆服务的索引、检索与增量持久化"""
+
+import json
+
+import pytest
+
+from src.services.grading_memory import (
+    GradingMemoryService,
+    MemoryImportance,
+    MemoryType,
+)
+from src.services.memory_storage import InMemoryStorageBackend
+
+
+class RecordingBackend(InMemoryStorageBackend):
+    """记录批量写入调用的内存后端"""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_calls = []
+
+    async def save_memories(self, items, ttl_seconds=None):
+        self.batch_calls.append([memory_id for memory_id, _ in items])
+        return await super().save_memories(items, ttl_seconds)
+
+
+def _populate(service: GradingMemoryService, count: int) -> list:
+    importances = list(MemoryImportance)
+    ids = []
+    for i in range(count):
+        memory_id = service.store_memory(
+            memory_type=MemoryType.ERROR_PATTERN if i % 2 else MemoryType.RISK_SIGNAL,
+            pattern=f"pattern-{i}",
+            lesson=f"lesson-{i}",
+            importance=importances[i % len(importances)],
+            question_types=[f"qt{i % 3}"],
+            subject="physics" if i % 4 else "general",
+        )
+        for _ in range(i % 5):
+            service.confirm_memory(memory_id)
+        ids.append(memory_id)
+    return ids
+
+
+def test_indexes_are_sets_and_eviction_updates_them():
+    service = GradingMemoryService(max_memory_entries=50)
+    _populate(service, 60)
+
+    assert len(service._long_term_memory) <= 50
+    live = set(service._long_term_memory)
+    indexed = set().union(*service._type_index.values())
+    assert indexed == live
+    assert set().union(*service._subject_index.values()) == live
+    for ids in service._question_type_index.values():
+        assert isinstance(ids, set)
+        assert ids <= live
+
+
+def test_retrieval_matches_full_sort():
+    service = GradingMemoryService()
+    _populate(service, 200)
+
+    result = service.retrieve_relevant_memories(
+        memory_types=[MemoryType.ERROR_PATTERN], subject="physics", max_results=7
+    )
+
+    expected_pool = [
+        entry
+        for entry in service._long_term_memory.values()
+        if entry.memory_type == MemoryType.ERROR_PATTERN
+        and entry.subject in ("physics", "general")
+        and entry.confidence >= 0.3
+    ]
+    expected = sorted(expected_pool, key=lambda x: x.relevance_score, reverse=True)[:7]
+    assert [e.relevance_score for e in result] == [e.relevance_score for e in expected]
+
+
+@pytest.mark.asyncio
+async def test_save_to_db_writes_only_dirty_memories_in_one_batch():
+    backend = RecordingBackend()
+    service = GradingMemoryService(storage_backend=backend)
+    ids = _populate(service, 20)
+
+    assert await service.save_to_db() == 20
+    assert len(backend.batch_calls) == 1
+    assert service.get_dirty_count() == 0
+
+    # 没有变更时不写库
+    assert await service.save_to_db() == 0
+    assert len(backend.batch_calls) == 1
+
+    service.confirm_memory(ids[3])
+    service.verify_memory(ids[5])
+    assert await service.save_to_db() == 2
+    assert sorted(backend.batch_calls[-1]) == sorted([ids[3], ids[5]])
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_keeps_dirty_flags():
+    class FailingBackend(InMemoryStorageBackend):
+        async def save_memories(self, items, ttl_seconds=None):
+            raise RuntimeError("db down")
+
+    service = GradingMemoryService(storage_backend=FailingBackend())
+    _populate(service, 5)
+
+    assert await service.save_to_db() == 0
+    assert service.get_dirty_count() == 5
+
+
+def test_file_storage_appends_and_reloads(tmp_path):
+    path = tmp_path / "memory.json"
+    service = GradingMemoryService(storage_path=str(path))
+    ids = _populate(service, 10)
+    service.save_to_storage()
+
+    service.contradict_memory(ids[0])
+    service.save_to_storage()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 11
+    assert all(json.loads(line)["op"] == "put" for line in lines)
+
+    reloaded = GradingMemoryService(storage_path=str(path))
+    assert set(reloaded._long_term_memory) == set(ids)
+    assert reloaded.get_memory_by_id(ids[0]).contradiction_count == 1
+
+
+def test_compaction_rewrites_live_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.services.grading_memory.COMPACTION_MIN_RECORDS", 5)
+    path = tmp_path / "memory.json"
+    service = GradingMemoryService(storage_path=str(path))
+    ids = _populate(service, 4)
+    service.save_to_storage()
+
+    for _ in range(3):
+        for memory_id in ids:
+            service.confirm_memory(memory_id)
+        service.save_to_storage()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) <= len(ids) * 2 + 5
+
+    reloaded = GradingMemoryService(storage_path=str(path))
+    assert {
+        memory_id: entry.confirmation_count
+        for memory_id, entry in reloaded._long_term_memory.items()
+    } == {
+        memory_id: entry.confirmation_count
+        for memory_id, entry in service._long_term_memory.items()
+    }
+
+
+def test_legacy_json_file_is_migrated(tmp_path):
+    path = tmp_path / "memory.json"
+    legacy_service = GradingMemoryService()
+    ids = _populate(legacy_service, 3)
+    legacy = {
+        "long_term_memory": [e.to_dict() for e in legacy_service._long_term_memory.values()],
+        "calibration_stats": {
+            "choice": {"predicted_confidences": [0.9], "actual_accuracies": [0.8]}
+        },
+    }
+    path.write_text(json.dumps(legacy, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    service = GradingMemoryService(storage_path=str(path))
+    assert set(service._long_term_memory) == set(ids)
+    assert "choice" in service._calibration_stats
+
+    service.save_to_storage()
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert {r["op"] for r in records} == {"put", "calibration"}
+
+    reloaded = GradingMemoryService(storage_path=str(path))
+    assert set(reloaded._long_term_memory) == set(ids)
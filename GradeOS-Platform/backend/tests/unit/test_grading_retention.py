@@ -0,0 +1,357 @@
+"""单元测试：批改数据保留清理的分片删除、预算续跑与 dry-run"""
+
+import os
+import re
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.services.grading_retention import (
+    RETENTION_TABLES,
+    GradingRetentionEngine,
+    RetentionSettings,
+)
+
+
+class FakeResult:
+    def __init__(self, rows=None, rowcount=0):
+        self._rows = rows or []
+        self.rowcount = rowcount
+
+    async def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    async def fetchall(self):
+        return self._rows
+
+
+class FakeRetentionDb:
+    """按 SQL 形状模拟保留清理用到的语句"""
+
+    SLICE = re.compile(r"^\s*(DELETE FROM|UPDATE) (\w+)")
+    ANY_COLUMN = re.compile(r"(\w+) = ANY\(%s(?:::uuid\[\])?\)")
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.runs = {}
+        self.slices = []
+        self.commits = 0
+        self.fail_on = None
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        pass
+
+    def _matches(self, query, params, row):
+        columns = self.ANY_COLUMN.findall(query)
+        return any(str(row.get(col)) in values for col, values in zip(columns, params))
+
+    async def execute(self, query, params=()):
+        if "information_schema.tables" in query:
+            names = [name for name in params[0] if name in self.tables]
+            return FakeResult([{"table_name": name} for name in names])
+        if query.lstrip().startswith("CREATE"):
+            return FakeResult()
+        if "INSERT INTO retention_runs" in query:
+            run_id, status, dry_run, cutoff = params
+            self.runs[run_id] = {
+                "id": run_id,
+                "status": status,
+                "dry_run": dry_run,
+                "cutoff": cutoff,
+            }
+            self.runs[run_id].update(
+                chunk_history_ids="[]",
+                chunk_batch_ids="[]",
+                tables_done="[]",
+                totals="{}",
+                batches_done=0,
+                order=len(self.runs),
+            )
+            return FakeResult(rowcount=1)
+        if "UPDATE retention_runs" in query:
+            keys = [
+                "status",
+                "chunk_history_ids",
+                "chunk_batch_ids",
+                "tables_done",
+                "totals",
+                "bytes_reclaimable",
+                "batches_done",
+                "error",
+                "finished",
+            ]
+            self.runs[params[-1]].update(dict(zip(keys, params[:-1])))
+            return FakeResult(rowcount=1)
+        if "FROM retention_runs" in query:
+            candidates = [
+                run
+                for run in self.runs.values()
+                if not run["dry_run"] and run["status"] in params[0]
+            ]
+            candidates.sort(key=lambda run: run["order"], reverse=True)
+            return FakeResult(candidates[:1])
+        if "FROM grading_history" in query and "ORDER BY" in query:
+            cutoff, limit = params
+            rows = sorted(self.tables["grading_history"], key=lambda row: row["created_at"])
+            rows = [
+                {"history_id": row["id"], "batch_id": row["batch_id"]}
+                for row in rows
+                if row["created_at"] < cutoff
+            ]
+            return FakeResult(rows[:limit])
+        if "COUNT(*)" in query:
+            table = re.search(r"FROM (\w+) AS t", query).group(1)
+            rows = [row for row in self.tables[table] if self._matches(query, params, row)]
+            return FakeResult(
+                [{"row_count": len(rows), "row_bytes": sum(len(str(row)) for row in rows)}]
+            )
+        match = self.SLICE.match(query)
+        if match:
+            verb, table = match.groups()
+            if self.fail_on == table:
+                raise RuntimeError(f"boom in {table}")
+            where_params, limit = params[:-1], params[-1]
+            targets = [row for row in self.tables[table] if self._matches(query, where_params, row)]
+            targets = targets[:limit]
+            if verb == "UPDATE":
+                for row in targets:
+                    row.update(grading_batch_id=None, score=None, feedback=None)
+            else:
+                self.tables[table] = [row for row in self.tables[table] if row not in targets]
+            self.slices.append((table, limit, len(targets)))
+            return FakeResult(rowcount=len(targets))
+        raise AssertionError(f"unexpected query: {query}")
+
+
+def _seed(expired=6, recent=2, now=None):
+    now = now or datetime.now(timezone.utc)
+    tables = {table.name: [] for table in RETENTION_TABLES}
+    for i in range(expired + recent):
+        created = now - timedelta(days=30 if i < expired else 1, minutes=i)
+        history_id, batch_id = f"h{i}", f"b{i}"
+        tables["grading_history"].append(
+            {"id": history_id, "batch_id": batch_id, "created_at": created}
+        )
+        tables["grading_page_images"] += [
+            {"grading_history_id": history_id, "image": b"x" * 100, "n": n} for n in range(7)
+        ]
+        tables["student_grading_results"] += [
+            {"grading_history_id": history_id, "n": n} for n in range(3)
+        ]
+        tables["batch_images"] += [{"batch_id": batch_id, "n": n} for n in range(5)]
+        tables["homework_submissions"] += [
+            {"id": f"s{i}-{n}", "grading_batch_id": batch_id, "score": 3, "feedback": "ok"}
+            for n in range(2)
+        ]
+        tables["stream_events"] += [
+            {"stream_id": f"batch_grading_{batch_id}", "n": n} for n in range(4)
+        ]
+        tables["runs"].append({"run_id": f"batch_grading_{batch_id}"})
+    return tables
+
+
+def _engine(fake, **settings):
+    defaults = dict(slice_rows=4, blob_slice_rows=2, slice_sleep_seconds=0, time_budget_seconds=60)
+    defaults.update(settings)
+    return GradingRetentionEngine(
+        settings=RetentionSettings(**defaults), connection=fake.connection
+    )
+
+
+@pytest.mark.asyncio
+async def test_cleanup_deletes_expired_batches_in_bounded_slices():
+    fake = FakeRetentionDb(_seed())
+
+    summary = await _engine(fake).run(keep_days=7, batch_limit=4)
+
+    assert summary["status"] == "ok"
+    assert summary["run_status"] == "completed"
+    assert summary["expired_batches"] == 6
+    assert summary["grading_history"] == 6
+    assert summary["grading_page_images"] == 42
+    assert summary["batch_images"] == 30
+    assert summary["homework_submissions_cleared"] == 12
+    assert summary["rows_affected"] == sum(
+        value
+        for key, value in summary.items()
+        if key in {table.summary_key for table in RETENTION_TABLES}
+    )
+    assert {row["batch_id"] for row in fake.tables["grading_history"]} == {"b6", "b7"}
+    assert len(fake.tables["batch_images"]) == 10
+    assert sum(1 for row in fake.tables["homework_submissions"] if row["score"] is None) == 12
+
+    blob_tables = {table.name for table in RETENTION_TABLES if table.blob}
+    for table, limit, affected in fake.slices:
+        assert limit == (2 if table in blob_tables else 4)
+        assert affected <= limit
+    assert fake.runs[summary["run_id"]]["status"] == "completed"
+
+
+@pytest.mark.asyncio
+async def test_row_budget_stops_and_next_run_resumes():
+    now = datetime.now(timezone.utc)
+    single = FakeRetentionDb(_seed(now=now))
+    expected = await _engine(single).run(keep_days=7, batch_limit=4)
+
+    fake = FakeRetentionDb(_seed(now=now))
+    first = await _engine(fake, row_budget=20).run(keep_days=7, batch_limit=4)
+    assert first["run_status"] == "budget_exhausted"
+    assert fake.runs[first["run_id"]]["status"] == "budget_exhausted"
+
+    summary = first
+    for _ in range(20):
+        summary = await _engine(fake, row_budget=20).run(keep_days=7, batch_limit=4)
+        assert summary["run_id"] == first["run_id"]
+        assert summary["resumed"] is True
+        if summary["run_status"] == "completed":
+            break
+
+    assert summary["run_status"] == "completed"
+    for table in RETENTION_TABLES:
+        assert summary.get(table.summary_key, 0) == expected.get(table.summary_key, 0)
+    assert fake.tables == single.tables
+
+
+@pytest.mark.asyncio
+async def test_failed_run_resumes_without_redoing_finished_tables():
+    fake = FakeRetentionDb(_seed(expired=3, recent=0))
+    fake.fail_on = "batch_images"
+
+    with pytest.raises(RuntimeError):
+        await _engine(fake).run(keep_days=7, batch_limit=10)
+    (run,) = fake.runs.values()
+    assert run["status"] == "failed"
+    assert "grading_page_images" in run["tables_done"]
+
+    fake.fail_on = None
+    done_before = len(fake.slices)
+    summary = await _engine(fake).run(keep_days=7, batch_limit=10)
+
+    assert summary["run_id"] == run["id"]
+    assert summary["run_status"] == "completed"
+    assert summary["grading_page_images"] == 21
+    assert summary["grading_history"] == 3
+    resumed_tables = {table for table, _, _ in fake.slices[done_before:]}
+    assert "grading_page_images" not in resumed_tables
+    assert fake.tables["grading_history"] == []
+
+
+@pytest.mark.asyncio
+async def test_dry_run_reports_rows_and_bytes_without_deleting():
+    tables = _seed()
+    fake = FakeRetentionDb(tables)
+    snapshot = {name: len(rows) for name, rows in tables.items()}
+
+    summary = await _engine(fake).run(keep_days=7, batch_limit=4, dry_run=True)
+
+    assert summary["dry_run"] is True
+    assert summary["expired_batches"] == 6
+    assert summary["would_delete"]["grading_page_images"] == 42
+    assert summary["would_delete"]["homework_submissions_cleared"] == 12
+    assert summary["would_reclaim_bytes"]["grading_page_images"] > 0
+    total_bytes = summary["would_reclaim_total_bytes"]
+    assert isinstance(total_bytes, int)
+    assert total_bytes >= summary["would_reclaim_bytes"]["batch_images"]
+    assert fake.slices == []
+    assert {name: len(rows) for name, rows in fake.tables.items()} == snapshot
+    assert fake.runs[summary["run_id"]]["status"] == "dry_run"
+
+    # dry-run 记录不会被当作待续跑的清理
+    real = await _engine(fake).run(keep_days=7, batch_limit=4)
+    assert real["run_id"] != summary["run_id"]
+    assert real["resumed"] is False
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(
+    not os.getenv("RETENTION_TEST_DATABASE_URL"),
+    reason="RETENTION_TEST_DATABASE_URL not set",
+)
+async def test_cleanup_against_postgres():
+    import psycopg
+    from psycopg.rows import dict_row
+
+    dsn = os.environ["RETENTION_TEST_DATABASE_URL"]
+
+    @asynccontextmanager
+    async def connection():
+        conn = await psycopg.AsyncConnection.connect(dsn, row_factory=dict_row)
+        try:
+            yield conn
+        finally:
+            await conn.close()
+
+    async with connection() as conn:
+        await conn.execute(
+            "DROP TABLE IF EXISTS grading_history, batch_images, student_grading_results, "
+            "retention_runs CASCADE"
+        )
+        await conn.execute("""
+            CREATE TABLE grading_history (
+                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+                batch_id VARCHAR(64) NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL,
+                completed_at TIMESTAMPTZ
+            )
+            """)
+        await conn.execute(
+            "CREATE TABLE batch_images (id SERIAL PRIMARY KEY, batch_id VARCHAR(64), data BYTEA)"
+        )
+        # 测试数据高度可压缩：关闭压缩，使估算字节数接近真实图片
+        await conn.execute("ALTER TABLE batch_images ALTER COLUMN data SET STORAGE EXTERNAL")
+        await conn.execute("""
+            CREATE TABLE student_grading_results (
+                id SERIAL PRIMARY KEY,
+                grading_history_id UUID NOT NULL REFERENCES grading_history(id)
+            )
+            """)
+        await conn.execute(
+            "CREATE INDEX idx_sgr_history ON student_grading_results(grading_history_id)"
+        )
+        await conn.execute("""
+            INSERT INTO grading_history (batch_id, created_at)
+            SELECT 'b' || i, NOW() - (CASE WHEN i < 8 THEN 30 ELSE 1 END) * INTERVAL '1 day'
+            FROM generate_series(0, 9) AS i
+            """)
+        await conn.execute("""
+            INSERT INTO batch_images (batch_id, data)
+            SELECT 'b' || (i % 10), decode(repeat('ab', 4096), 'hex')
+            FROM generate_series(0, 499) AS i
+            """)
+        await conn.execute("""
+            INSERT INTO student_grading_results (grading_history_id)
+            SELECT id FROM grading_history, generate_series(1, 3)
+            """)
+        await conn.commit()
+
+    engine = GradingRetentionEngine(
+        settings=RetentionSettings(
+            slice_rows=50, blob_slice_rows=7, slice_sleep_seconds=0, time_budget_seconds=60
+        ),
+        connection=connection,
+    )
+    preview = await engine.run(keep_days=7, batch_limit=3, dry_run=True)
+    assert preview["would_delete"]["batch_images"] == 400
+    assert preview["would_reclaim_bytes"]["batch_images"] >= 400 * 4096
+
+    summary = await engine.run(keep_days=7, batch_limit=3)
+    assert summary["run_status"] == "completed"
+    assert summary["expired_batches"] == 8
+    assert summary["batch_images"] == 400
+    assert summary["student_grading_results"] == 24
+
+    async with connection() as conn:
+        result = await conn.execute("SELECT COUNT(*) AS n FROM batch_images")
+        assert (await result.fetchone())["n"] == 100
+        result = await conn.execute(
+            "SELECT status FROM retention_runs WHERE id = %s", (summary["run_id"],)
+        )
+        assert (await result.fetchone())["status"] == "completed"
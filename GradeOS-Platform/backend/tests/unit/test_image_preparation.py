@@ -0,0 +1,149 @@
+"""单元测试：视觉调用前的页面图像预处理（合成扫描页的黄金结果）"""
+
+import base64
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from src.services.image_preparation import (
+    CALL_ANNOTATION,
+    CALL_GRADING,
+    CALL_IDENTIFICATION,
+    ImagePreparer,
+    VisionImagePolicies,
+    estimate_vision_tokens,
+    provider_for_model,
+)
+
+GEMINI = "google/gemini-3-flash-preview"
+
+
+def _scan(
+    size=(2480, 3508),
+    margin=(300, 500, 2100, 3000),
+    skew=0.0,
+    red_marks=False,
+    seed=0,
+):
+    """合成 300dpi A4 扫描页：浅灰纸面、若干行“文字”、可选倾斜与红笔批改"""
+    rng = np.random.default_rng(seed)
+    page = Image.new("RGB", size, (245, 245, 245))
+    draw = ImageDraw.Draw(page)
+    left, top, right, bottom = margin
+    for y in range(top, bottom, 90):
+        x = left
+        while x < right:
+            width = int(rng.integers(20, 60))
+            draw.rectangle([x, y, min(x + width, right), y + 40], fill=(30, 30, 30))
+            x += width + int(rng.integers(10, 30))
+    if red_marks:
+        for y in range(top, bottom, 180):
+            draw.rectangle([right - 260, y, right, y + 60], fill=(220, 30, 30))
+    if skew:
+        page = page.rotate(skew, fillcolor=(245, 245, 245))
+    noisy = np.asarray(page).astype(np.int16) + rng.integers(-8, 8, size=(size[1], size[0], 1))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)).save(buffer, "JPEG", quality=95)
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="module")
+def skewed_scan():
+    return _scan(skew=2.0)
+
+
+def test_token_estimates_and_provider_detection():
+    assert provider_for_model(GEMINI) == "gemini"
+    assert provider_for_model("anthropic/claude-sonnet-4") == "anthropic"
+    assert provider_for_model("openai/gpt-4o") == "openai"
+    assert provider_for_model("qwen/qwen-vl") == "default"
+
+    assert estimate_vision_tokens(300, 300, "gemini") == 258
+    assert estimate_vision_tokens(2480, 3508, "gemini") == 258 * 4 * 5
+    assert estimate_vision_tokens(1086, 1536, "gemini") == 258 * 2 * 2
+    assert estimate_vision_tokens(2480, 3508, "openai") == 85 + 170 * 2 * 3
+    assert estimate_vision_tokens(1092, 1092, "anthropic") == 1590
+
+
+def test_policies_pick_resolution_per_call_type(monkeypatch):
+    monkeypatch.delenv("VISION_GRADING_LONG_EDGE", raising=False)
+    policies = VisionImagePolicies()
+    identification = policies.for_call(CALL_IDENTIFICATION, GEMINI)
+    grading = policies.for_call(CALL_GRADING, GEMINI)
+    annotation = policies.for_call(CALL_ANNOTATION, "anthropic/claude-sonnet-4")
+
+    assert identification.max_long_edge == 768
+    assert identification.crop_margins and identification.deskew
+    assert grading.max_long_edge == 1536 and not grading.crop_margins and not grading.deskew
+    assert annotation.max_long_edge == 1568 and not annotation.crop_margins
+    assert grading.jpeg_quality > identification.jpeg_quality
+
+
+def test_identification_golden_crops_deskews_and_downscales(skewed_scan):
+    prepared = ImagePreparer().prepare(skewed_scan, CALL_IDENTIFICATION, GEMINI)
+
+    assert prepared.original_size == (2480, 3508)
+    assert prepared.skew_angle == pytest.approx(-2.0, abs=0.3)
+    assert prepared.grayscale
+    assert prepared.crop_box is not None
+    assert max(prepared.width, prepared.height) == 768
+    # 内容区域约为页面的 73% × 71%，裁边后宽高比随之改变
+    assert prepared.width / prepared.height == pytest.approx(0.75, abs=0.05)
+    assert prepared.estimated_tokens == 258
+    assert prepared.original_tokens == 5160
+    assert len(prepared.data) < len(skewed_scan) / 20
+
+    decoded = Image.open(io.BytesIO(prepared.data))
+    assert decoded.format == "JPEG" and decoded.mode == "L"
+    assert decoded.size == (prepared.width, prepared.height)
+
+
+@pytest.mark.parametrize("call_type", [CALL_GRADING, CALL_ANNOTATION])
+def test_coordinate_calls_keep_page_geometry(skewed_scan, call_type):
+    prepared = ImagePreparer().prepare(skewed_scan, call_type, GEMINI)
+
+    # 只做等比缩放：归一化坐标仍对应原图
+    assert prepared.crop_box is None and prepared.skew_angle == 0.0
+    assert (prepared.width, prepared.height) == (1086, 1536)
+    assert prepared.width / prepared.height == pytest.approx(2480 / 3508, abs=0.002)
+    assert prepared.estimated_tokens == 1032
+
+
+def test_colour_is_kept_when_it_carries_signal():
+    prepared = ImagePreparer().prepare(_scan(red_marks=True), CALL_GRADING, GEMINI)
+
+    assert not prepared.grayscale
+    assert Image.open(io.BytesIO(prepared.data)).mode == "RGB"
+
+
+def test_results_are_cached_by_content_and_policy(skewed_scan):
+    preparer = ImagePreparer()
+    first = preparer.prepare(skewed_scan, CALL_GRADING, GEMINI)
+
+    assert preparer.prepare(bytes(skewed_scan), CALL_GRADING, GEMINI) is first
+    # 已编码为 base64 的同一页也命中缓存
+    encoded = base64.b64encode(skewed_scan).decode("ascii")
+    assert preparer.prepare(encoded, CALL_GRADING, GEMINI) is first
+    assert preparer.prepare(skewed_scan, CALL_IDENTIFICATION, GEMINI) is not first
+    assert preparer.stats["pages"] == 2 and preparer.stats["cache_hits"] == 2
+    assert preparer.stats["tokens_out"] < preparer.stats["tokens_in"] / 3
+
+    small_cache = ImagePreparer(cache_max_bytes=len(first.data) + 1)
+    small_cache.prepare(skewed_scan, CALL_GRADING, GEMINI)
+    small_cache.prepare(_scan(seed=1), CALL_GRADING, GEMINI)
+    assert len(small_cache._cache) == 1
+
+
+def test_undecodable_or_small_inputs_pass_through():
+    preparer = ImagePreparer()
+    raw = b"not an image"
+    prepared = preparer.prepare(raw, CALL_GRADING, GEMINI)
+    assert prepared.data == raw and prepared.estimated_tokens == 0
+
+    buffer = io.BytesIO()
+    Image.new("L", (200, 100), 255).save(buffer, "PNG")
+    tiny = preparer.prepare(buffer.getvalue(), CALL_GRADING, GEMINI)
+    assert (tiny.width, tiny.height) == (200, 100)
+    assert tiny.data_url.startswith(("data:image/png;base64,", "data:image/jpeg;base64,"))
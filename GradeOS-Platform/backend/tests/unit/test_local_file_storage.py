@@ -0,0 +1,96 @@
+"""单元测试：LocalFileStorage 的 SQLite 索引、内容去重与旧索引迁移"""
+
+import asyncio
+import json
+
+import pytest
+
+from src.services.file_storage import LocalFileStorage, StoredFile
+
+
+@pytest.mark.asyncio
+async def test_save_get_and_list_by_batch(tmp_path):
+    storage = LocalFileStorage(str(tmp_path))
+    first = await storage.save(b"page-1", "p1.png", "batch-a", "image/png", {"page_index": 0})
+    second = await storage.save(b"page-2", "p2.png", "batch-a", "image/png")
+    await storage.save(b"other", "x.pdf", "batch-b", "application/pdf")
+
+    assert await storage.get(first.file_id) == b"page-1"
+    info = await storage.get_info(first.file_id)
+    assert info.metadata == {"page_index": 0}
+    assert info.content_hash == first.content_hash
+
+    listed = await storage.list_by_batch("batch-a")
+    assert [f.file_id for f in listed] == [first.file_id, second.file_id]
+    assert await storage.list_by_batch("missing") == []
+    assert not (tmp_path / "index.json").exists()
+    assert not list(tmp_path.rglob("*.tmp"))
+
+
+@pytest.mark.asyncio
+async def test_identical_content_is_stored_once(tmp_path):
+    storage = LocalFileStorage(str(tmp_path))
+    a = await storage.save(b"same bytes", "a.png", "batch-a")
+    b = await storage.save(b"same bytes", "b.png", "batch-b")
+
+    assert a.file_id != b.file_id
+    assert a.storage_path == b.storage_path
+    assert len([p for p in (tmp_path / "objects").rglob("*") if p.is_file()]) == 1
+
+    # 仍有引用时保留对象文件，最后一个引用删除后才移除
+    assert await storage.delete(a.file_id)
+    assert await storage.get(b.file_id) == b"same bytes"
+    assert await storage.delete(b.file_id)
+    assert not list(p for p in (tmp_path / "objects").rglob("*") if p.is_file())
+    assert not await storage.delete(b.file_id)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_saves_and_shared_directory(tmp_path):
+    storage = LocalFileStorage(str(tmp_path))
+    # 同目录的第二个实例模拟另一个 API worker
+    other = LocalFileStorage(str(tmp_path))
+
+    saved = await asyncio.gather(
+        *[
+            (storage if i % 2 else other).save(f"data-{i % 10}".encode(), f"{i}.png", "batch")
+            for i in range(100)
+        ]
+    )
+
+    assert len({f.file_id for f in saved}) == 100
+    assert len(await storage.list_by_batch("batch")) == 100
+    assert len(await other.list_by_batch("batch")) == 100
+    assert len([p for p in (tmp_path / "objects").rglob("*") if p.is_file()]) == 10
+    storage.close()
+    other.close()
+
+
+@pytest.mark.asyncio
+async def test_legacy_json_index_is_migrated(tmp_path):
+    legacy_file = tmp_path / "batch-a" / "legacy.png"
+    legacy_file.parent.mkdir()
+    legacy_file.write_bytes(b"legacy")
+    entry = StoredFile(
+        file_id="f1",
+        filename="legacy.png",
+        content_type="image/png",
+        size=6,
+        storage_path=str(legacy_file),
+        batch_id="batch-a",
+    ).to_dict()
+    entry.pop("content_hash")  # 旧版索引没有该字段
+    (tmp_path / "index.json").write_text(json.dumps({"f1": entry}), encoding="utf-8")
+
+    storage = LocalFileStorage(str(tmp_path))
+
+    assert not (tmp_path / "index.json").exists()
+    assert (tmp_path / "index.json.migrated").exists()
+    assert [f.file_id for f in await storage.list_by_batch("batch-a")] == ["f1"]
+    assert await storage.get("f1") == b"legacy"
+
+    # 重启不会重复导入
+    assert LocalFileStorage(str(tmp_path)).index.count() == 1
+
+    assert await storage.delete("f1")
+    assert not legacy_file.exists()
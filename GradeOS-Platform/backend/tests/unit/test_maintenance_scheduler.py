@@ -0,0 +1,151 @@
+"""Unit tests for the background maintenance scheduler."""
+
+import asyncio
+
+import pytest
+
+from src.services import maintenance_scheduler as ms
+from src.services.maintenance_scheduler import MaintenanceJob, MaintenanceScheduler
+
+
+class FakeRedis:
+    """Minimal async Redis supporting SET NX and the unlock script."""
+
+    def __init__(self) -> None:
+        self.store = {}
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token):
+        if self.store.get(key) == token:
+            del self.store[key]
+            return 1
+        return 0
+
+
+@pytest.mark.asyncio
+async def test_run_job_once_records_rows():
+    scheduler = MaintenanceScheduler(redis_client=FakeRedis())
+
+    async def job():
+        return 7
+
+    scheduler.register(MaintenanceJob(name="expiry", run=job, interval_seconds=60))
+
+    assert await scheduler.run_job_once("expiry") == 7
+    assert await scheduler.run_job_once("expiry") == 7
+
+    stats = scheduler.get_metrics()["expiry"]
+    assert stats["runs"] == 2
+    assert stats["rows_processed"] == 14
+    assert stats["last_rows"] == 7
+    assert stats["failures"] == 0
+
+
+@pytest.mark.asyncio
+async def test_lock_allows_single_replica():
+    redis = FakeRedis()
+    calls = []
+    release = asyncio.Event()
+
+    async def slow_job():
+        calls.append(1)
+        await release.wait()
+        return 1
+
+    replicas = [MaintenanceScheduler(redis_client=redis) for _ in range(3)]
+    for scheduler in replicas:
+        scheduler.register(MaintenanceJob(name="retention", run=slow_job, interval_seconds=60))
+
+    first = asyncio.create_task(replicas[0].run_job_once("retention"))
+    await asyncio.sleep(0)
+    others = await asyncio.gather(*(s.run_job_once("retention") for s in replicas[1:]))
+    release.set()
+
+    assert await first == 1
+    assert others == [None, None]
+    assert len(calls) == 1
+    assert all(s.get_metrics()["retention"]["skipped_locked"] == 1 for s in replicas[1:])
+    # Lock is released after the run.
+    assert redis.store == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_recorded_and_releases_lock():
+    redis = FakeRedis()
+    scheduler = MaintenanceScheduler(redis_client=redis)
+
+    async def broken():
+        raise RuntimeError("db down")
+
+    scheduler.register(MaintenanceJob(name="broken", run=broken, interval_seconds=60))
+
+    assert await scheduler.run_job_once("broken") is None
+    stats = scheduler.get_metrics()["broken"]
+    assert stats["failures"] == 1
+    assert stats["last_error"] == "db down"
+    assert redis.store == {}
+
+
+@pytest.mark.asyncio
+async def test_start_and_stop_runs_loop():
+    scheduler = MaintenanceScheduler(redis_client=FakeRedis())
+    ran = asyncio.Event()
+
+    async def job():
+        ran.set()
+        return 0
+
+    scheduler.register(MaintenanceJob(name="tick", run=job, interval_seconds=3600))
+    scheduler.start()
+    await asyncio.wait_for(ran.wait(), timeout=1)
+    assert scheduler.is_running
+    await scheduler.stop()
+    assert not scheduler.is_running
+
+
+def test_duplicate_job_name_rejected():
+    scheduler = MaintenanceScheduler()
+
+    async def job():
+        return 0
+
+    scheduler.register(MaintenanceJob(name="a", run=job, interval_seconds=1))
+    with pytest.raises(ValueError):
+        scheduler.register(MaintenanceJob(name="a", run=job, interval_seconds=1))
+
+
+@pytest.mark.asyncio
+async def test_expiry_job_loops_in_bounded_slices(monkeypatch):
+    remaining = [1250]
+    limits = []
+
+    def fake_expire(*, now_iso=None, limit=None):
+        limits.append(limit)
+        updated = min(limit, remaining[0])
+        remaining[0] -= updated
+        return updated
+
+    monkeypatch.setattr("src.db.postgres_store.expire_assistant_conversations", fake_expire)
+
+    total = await ms.expire_assistant_conversations_job(batch_size=500)
+
+    assert total == 1250
+    assert limits == [500, 500, 500]
+
+
+def test_default_scheduler_registers_canary_monitor():
+    scheduler = ms.build_default_scheduler(include_retention=False)
+
+    assert "canary_monitor" in scheduler.job_names()
+    assert "grading_retention" not in scheduler.job_names()
+
+
+def test_default_scheduler_registers_saga_recovery():
+    scheduler = ms.build_default_scheduler(include_retention=False)
+
+    assert "saga_recovery" in scheduler.job_names()
@@ -0,0 +1,233 @@
+"""单元测试：缺题补批只发送定位页面，并跨学生合并为有限次调用"""
+
+import asyncio
+import base64
+import json
+import re
+
+import pytest
+
+from src.services import llm_reasoning, missing_question_regrade
+from src.services.llm_reasoning import LLMReasoningClient
+from src.services.missing_question_regrade import (
+    MissingQuestionCoalescer,
+    MissingQuestionRequest,
+    localize_question_pages,
+    pack_completion_requests,
+)
+
+
+RUBRIC = {
+    "total_score": 25,
+    "questions": [
+        {"question_id": str(i), "max_score": 5, "scoring_points": []} for i in range(1, 6)
+    ],
+}
+
+# 首轮：第 3 题漏批；其余题给出页码（全局页码 10-15）
+FIRST_PASS_PAGES = {"1": [10], "2": [11], "4": [12], "5": [14, 15]}
+
+
+def _page_image(student_index, page):
+    return bytes([student_index, page]) * 4096
+
+
+class _Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class StubVisionLLM:
+    """记录每次调用发送的图片数与字节数，并按提示词返回首轮或补批结果"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def astream(self, messages):
+        parts = messages[0].content
+        prompt = parts[0]["text"]
+        images = [p["image_url"] for p in parts if p.get("type") == "image_url"]
+        self.calls.append(
+            {
+                "completion": "Grade ONLY" in prompt,
+                "images": len(images),
+                "bytes": sum(len(url.split(",", 1)[1]) for url in images),
+                "labels": [p["text"] for p in parts[1:] if p.get("type") == "text"],
+            }
+        )
+        await asyncio.sleep(0)
+        if "Grade ONLY" not in prompt:
+            details = [
+                {"question_id": qid, "score": 3, "max_score": 5, "source_pages": pages}
+                for qid, pages in FIRST_PASS_PAGES.items()
+            ]
+            payload = {"question_details": details}
+        else:
+            assignments = re.findall(r"- (S\d+) \((.+?)\): (.+)", prompt)
+            if assignments:
+                payload = {
+                    "students": [
+                        {
+                            "student": label,
+                            "question_details": [
+                                {"question_id": qid, "score": 4, "max_score": 5}
+                                for qid in ids.split(", ")
+                            ],
+                        }
+                        for label, _key, ids in assignments
+                    ]
+                }
+            else:
+                payload = {"question_details": [{"question_id": "3", "score": 4, "max_score": 5}]}
+        yield _Chunk(json.dumps(payload))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("GRADING_COMPLETION_PASSES", "1")
+    llm = StubVisionLLM()
+    monkeypatch.setattr(llm_reasoning, "get_chat_model", lambda **kwargs: llm)
+    return LLMReasoningClient(model_name="stub-vision")
+
+
+def _use_coalescer(monkeypatch, **kwargs):
+    coalescer = MissingQuestionCoalescer(**kwargs)
+    monkeypatch.setattr(missing_question_regrade, "_missing_question_coalescer", coalescer)
+    return coalescer
+
+
+def test_localization_uses_page_contexts_then_rubric_order():
+    order = ["1", "2", "3", "4", "5"]
+    pages = [10, 11, 12, 13, 14, 15]
+
+    localized = localize_question_pages(
+        order, ["3"], pages, question_pages={"2": {11}, "4": {12}}
+    )
+    assert localized == {"3": [11, 12]}
+
+    # 页面索引中标注的题号优先
+    localized = localize_question_pages(
+        order,
+        ["3", "5"],
+        pages,
+        question_pages={"2": {11}, "4": {12}},
+        page_contexts={13: {"question_numbers": ["第3题"]}},
+        normalize=lambda value: str(value).strip("第题"),
+    )
+    assert localized == {"3": [13], "5": [12, 13, 14, 15]}
+
+    # 没有任何锚点时退回全部页面
+    assert localize_question_pages(order, ["3"], pages) == {"3": pages}
+
+
+def test_packing_bounds_images_and_students_per_call():
+    requests = [
+        MissingQuestionRequest(student_key=f"s{i}", missing_ids=["3"], pages=[(0, b"")] * n)
+        for i, n in enumerate([2, 2, 1, 5, 1, 1, 1])
+    ]
+    calls = pack_completion_requests(requests, max_images_per_call=4, max_students_per_call=3)
+    assert [[r.student_key for r in call] for call in calls] == [
+        ["s0", "s1"],
+        ["s2"],
+        ["s3"],
+        ["s4", "s5", "s6"],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_missing_question_is_regraded_from_localized_pages_only(client, monkeypatch):
+    _use_coalescer(monkeypatch, window_ms=0)
+    pages = list(range(10, 16))
+    images = [_page_image(0, page) for page in pages]
+
+    result = await client.grade_student(
+        images=images, student_key="Alice", parsed_rubric=RUBRIC, page_indices=pages
+    )
+
+    first_pass, completion = client.llm.calls
+    assert first_pass["images"] == 6 and not first_pass["completion"]
+    assert completion["completion"]
+    assert completion["images"] == 2
+    assert completion["labels"] == ["page 11", "page 12"]
+    expected_bytes = sum(len(base64.b64encode(images[i])) for i in (1, 2))
+    assert completion["bytes"] == expected_bytes
+    assert completion["bytes"] * 3 == first_pass["bytes"]
+
+    assert result["missing_question_ids"] == ["3"]
+    regraded = [d for d in result["question_details"] if d["question_id"] == "3"]
+    assert regraded[0]["score"] == 4
+    assert result["total_score"] == 4 * 3 + 4
+
+
+@pytest.mark.asyncio
+async def test_completion_pass_is_off_by_default(client, monkeypatch):
+    monkeypatch.delenv("GRADING_COMPLETION_PASSES")
+    _use_coalescer(monkeypatch, window_ms=0)
+    pages = list(range(10, 16))
+
+    result = await client.grade_student(
+        images=[_page_image(0, page) for page in pages],
+        student_key="Alice",
+        parsed_rubric=RUBRIC,
+        page_indices=pages,
+    )
+
+    assert [call["completion"] for call in client.llm.calls] == [False]
+    assert "3" not in {d["question_id"] for d in result["question_details"]}
+
+
+@pytest.mark.asyncio
+async def test_missing_students_share_a_bounded_set_of_calls(client, monkeypatch):
+    coalescer = _use_coalescer(
+        monkeypatch, window_ms=20, max_images_per_call=4, max_students_per_call=3
+    )
+    pages = list(range(10, 16))
+
+    results = await asyncio.gather(
+        *[
+            client.grade_student(
+                images=[_page_image(s, page) for page in pages],
+                student_key=f"student-{s}",
+                parsed_rubric=RUBRIC,
+                page_indices=pages,
+            )
+            for s in range(5)
+        ]
+    )
+
+    completions = [call for call in client.llm.calls if call["completion"]]
+    # 5 名学生各 2 页，每次最多 4 张图：3 次调用，而不是 5 次各 6 页
+    assert len(completions) == 3
+    assert sum(call["images"] for call in completions) == 10
+    assert all(call["images"] <= 4 for call in completions)
+    assert coalescer.stats == {"requests": 5, "calls": 3, "images": 10, "errors": 0}
+    assert completions[0]["labels"] == [
+        "[S1] page 11", "[S1] page 12", "[S2] page 11", "[S2] page 12"
+    ]
+    for result in results:
+        regraded = [d for d in result["question_details"] if d["question_id"] == "3"]
+        assert regraded[0]["score"] == 4
+
+
+@pytest.mark.asyncio
+async def test_failed_completion_call_falls_back_to_placeholders(client, monkeypatch):
+    _use_coalescer(monkeypatch, window_ms=5)
+    first_pass = client.llm.astream
+
+    async def flaky(messages):
+        if "Grade ONLY" in messages[0].content[0]["text"]:
+            raise RuntimeError("upstream 503")
+        async for chunk in first_pass(messages):
+            yield chunk
+
+    monkeypatch.setattr(client.llm, "astream", flaky)
+    result = await client.grade_student(
+        images=[_page_image(0, page) for page in range(6)],
+        student_key="Bob",
+        parsed_rubric=RUBRIC,
+        page_indices=list(range(10, 16)),
+    )
+
+    placeholder = [d for d in result["question_details"] if d["question_id"] == "3"][0]
+    assert placeholder["score"] == 0 and placeholder["feedback"] == "No answer detected."
+    assert result["status"] == "completed"
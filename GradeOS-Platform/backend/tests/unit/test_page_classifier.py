@@ -0,0 +1,187 @@
+"""单元测试：空白页本地检测（合成空白、横线、印刷与手写页面）"""
+
+import asyncio
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from src.services import llm_reasoning, student_identification
+from src.services.llm_reasoning import LLMReasoningClient
+from src.services.page_classifier import (
+    PAGE_BLANK,
+    PAGE_HANDWRITTEN,
+    PAGE_PRINTED,
+    classify_page,
+    find_blank_pages,
+)
+from src.services.student_identification import StudentIdentificationService
+
+SIZE = (2480, 3508)
+
+
+def _encode(page, fmt="PNG"):
+    buffer = io.BytesIO()
+    page.save(buffer, format=fmt, compress_level=1)
+    return buffer.getvalue()
+
+
+def _paper(rng, shade=244):
+    """带扫描噪点与少量灰尘的纸面"""
+    arr = np.clip(rng.normal(shade, 4, (SIZE[1], SIZE[0])), 0, 255).astype(np.uint8)
+    for _ in range(30):
+        y, x = rng.integers(0, SIZE[1] - 3), rng.integers(0, SIZE[0] - 3)
+        arr[y : y + 3, x : x + 3] = 90
+    return Image.fromarray(arr)
+
+
+def _ruled(rng):
+    """答题纸：横线 + 外框，无作答"""
+    page = _paper(rng)
+    draw = ImageDraw.Draw(page)
+    for y in range(300, SIZE[1] - 200, 120):
+        draw.line([(160, y), (SIZE[0] - 160, y)], fill=120, width=4)
+    draw.rectangle([120, 200, SIZE[0] - 120, SIZE[1] - 120], outline=80, width=6)
+    return page
+
+
+def _printed(rng):
+    """试题页：每行印刷字（约 3mm 高）写在横线上"""
+    page = _ruled(rng)
+    draw = ImageDraw.Draw(page)
+    for y in range(300, SIZE[1] - 200, 120):
+        x = 200
+        while x < SIZE[0] - 400:
+            width = int(rng.integers(12, 28))
+            draw.rectangle([x, y - 44, x + width, y - 12], fill=30)
+            x += width + int(rng.integers(8, 24))
+    return page
+
+
+def _handwrite(page, rng, strokes=40, fill=40):
+    draw = ImageDraw.Draw(page)
+    for _ in range(strokes):
+        points = [(int(rng.integers(300, SIZE[0] - 300)), int(rng.integers(600, 1800)))]
+        for _ in range(6):
+            x, y = points[-1]
+            points.append((x + int(rng.integers(-60, 60)), y + int(rng.integers(-60, 60))))
+        draw.line(points, fill=fill, width=8)
+    return page
+
+
+@pytest.mark.parametrize("fmt", ["PNG", "JPEG"])
+def test_blank_and_ruled_pages_are_blank(fmt):
+    rng = np.random.default_rng(0)
+    for page in (_paper(rng), _ruled(rng)):
+        result = classify_page(_encode(page.convert("RGB"), fmt))
+        assert result.kind == PAGE_BLANK
+        assert result.is_blank
+
+
+@pytest.mark.parametrize("fmt", ["PNG", "JPEG"])
+def test_printed_and_handwritten_pages(fmt):
+    rng = np.random.default_rng(1)
+    assert classify_page(_encode(_printed(rng).convert("RGB"), fmt)).kind == PAGE_PRINTED
+    for base in (_paper, _ruled, _printed):
+        page = _handwrite(base(rng), rng)
+        assert classify_page(_encode(page.convert("RGB"), fmt)).kind == PAGE_HANDWRITTEN
+
+
+def test_single_short_answer_and_light_pencil_are_not_blank():
+    rng = np.random.default_rng(2)
+    page = _ruled(rng)
+    # 只写了一个数字
+    ImageDraw.Draw(page).line([(1200, 1000), (1230, 940), (1230, 1060)], fill=40, width=8)
+    assert not classify_page(_encode(page)).is_blank
+
+    # 浅色铅笔作答（灰度 190，高于默认暗像素阈值）
+    page = _handwrite(_ruled(rng), rng, strokes=5, fill=190)
+    assert not classify_page(_encode(page)).is_blank
+
+
+def test_undecodable_input_fails_open():
+    assert classify_page(b"not an image").kind == PAGE_HANDWRITTEN
+    rng = np.random.default_rng(3)
+    blank = _encode(_paper(rng))
+    assert find_blank_pages([blank, "base64-string", b"junk", blank]) == [0, 3]
+
+
+class _Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class _RecordingLLM:
+    def __init__(self):
+        self.image_counts = []
+
+    async def astream(self, messages):
+        parts = messages[0].content
+        self.image_counts.append(sum(1 for p in parts if p.get("type") == "image_url"))
+        await asyncio.sleep(0)
+        yield _Chunk(json.dumps({"question_details": [{"question_id": "1", "score": 2}]}))
+
+    async def ainvoke(self, messages):
+        parts = messages[0].content
+        self.image_counts.append(sum(1 for p in parts if p.get("type") == "image_url"))
+        return _Chunk(json.dumps({"questions": {"numbers": ["1", "2"], "first_question": "1"}}))
+
+
+RUBRIC = {"total_score": 5, "questions": [{"question_id": "1", "max_score": 5}]}
+
+
+@pytest.mark.asyncio
+async def test_grade_student_skips_blank_pages_but_records_them(monkeypatch):
+    llm = _RecordingLLM()
+    monkeypatch.setattr(llm_reasoning, "get_chat_model", lambda **kwargs: llm)
+    client = LLMReasoningClient(model_name="stub-vision")
+    rng = np.random.default_rng(4)
+    answered = _encode(_handwrite(_ruled(rng), rng))
+    blank = _encode(_ruled(rng))
+
+    result = await client.grade_student(
+        [answered, blank], "s1", RUBRIC, page_indices=[6, 7]
+    )
+    assert llm.image_counts == [1]
+    assert result["status"] == "completed"
+    assert result["blank_pages"] == [7]
+
+    # 全部空白：不调用模型，按未作答记零分
+    result = await client.grade_student([blank, blank], "s2", RUBRIC, page_indices=[8, 9])
+    assert llm.image_counts == [1]
+    assert result["blank_pages"] == [8, 9]
+    assert result["total_score"] == 0
+    assert [d["question_id"] for d in result["question_details"]] == ["1"]
+    # 整份空白不可信为满置信度：交人工复核
+    assert result["confidence"] == 0.0
+    assert result["needs_review"] is True
+    assert all(d["needs_review"] for d in result["question_details"])
+
+
+@pytest.mark.asyncio
+async def test_segmentation_skips_identification_for_blank_pages(monkeypatch):
+    llm = _RecordingLLM()
+    monkeypatch.setattr(student_identification, "get_chat_model", lambda **kwargs: llm)
+    service = StudentIdentificationService(model_name="stub-vision")
+    rng = np.random.default_rng(5)
+    first = _encode(_handwrite(_ruled(rng), rng))
+    second = _encode(_handwrite(_ruled(rng), rng))
+    blank = _encode(_ruled(rng))
+    progress = []
+
+    async def on_progress(done, total):
+        progress.append(done)
+
+    result = await service.segment_batch_document(
+        [first, blank, second, blank], progress_callback=on_progress
+    )
+    # 两个非空白页各一次页眉识别（同时返回题号供边界检测），空白页不调用模型
+    assert len(llm.image_counts) == 2
+    assert result.blank_pages == [1, 3]
+    assert result.total_pages == 4
+    assert sorted(progress) == [1, 2, 3, 4]
+    # 空白背面仍归入前一位学生
+    assert result.student_count == 2
+    assert sorted(m.page_index for m in result.page_mappings) == [0, 1, 2, 3]
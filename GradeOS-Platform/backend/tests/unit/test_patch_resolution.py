@@ -0,0 +1,195 @@
+"""单元测试：灰度补丁的确定性分流、快照刷新与评分标准应用"""
+
+import asyncio
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import fakeredis
+import pytest
+
+from src.models.rule_patch import PatchType, RulePatch
+from src.services.canary_metrics import CANARY, CONTROL, CanaryMetricsAggregator
+from src.services.patch_deployer import PatchDeployer
+from src.services.patch_resolution import (
+    BASELINE_ASSIGNMENT,
+    PatchResolver,
+    apply_patch_to_rubric,
+    assignment_point,
+)
+
+
+BACKEND_DIR = Path(__file__).resolve().parents[2]
+
+
+def _config(deployment_id="d1", traffic=0.1, scope="canary", version="v2.0.0", **extra):
+    config = {
+        "deployment_id": deployment_id,
+        "patch_id": f"patch-{deployment_id}",
+        "version": version,
+        "patch_type": "rule",
+        "content": {
+            "affected_questions": ["2"],
+            "enhancement": {"prompt_additions": ["单位写成 m/s 或 米每秒均可"]},
+        },
+        "traffic_percentage": traffic,
+        "scope": scope,
+        "deployed_at": "2026-10-18T00:00:00",
+    }
+    config.update(extra)
+    return config
+
+
+async def _resolver(*configs, **kwargs):
+    resolver = PatchResolver(metrics=CanaryMetricsAggregator(), **kwargs)
+    for config in configs:
+        await resolver.publish_deployment(config)
+    return resolver
+
+
+def test_assignment_point_is_stable_across_processes():
+    keys = [("d1", "batch-1", f"student-{i}") for i in range(50)]
+    script = (
+        "import json, sys\n"
+        "from src.services.patch_resolution import assignment_point\n"
+        "keys = json.loads(sys.argv[1])\n"
+        "print(json.dumps([assignment_point(*key) for key in keys]))\n"
+    )
+    outputs = [
+        subprocess.run(
+            [sys.executable, "-c", script, json.dumps(keys)],
+            cwd=BACKEND_DIR,
+            env={"PYTHONHASHSEED": seed, "PATH": ""},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        for seed in ("1", "2")
+    ]
+    expected = [assignment_point(*key) for key in keys]
+    for output in outputs:
+        assert json.loads(output.strip().splitlines()[-1]) == expected
+
+
+@pytest.mark.asyncio
+async def test_traffic_split_matches_percentage_and_ramps_monotonically():
+    resolver = await _resolver(_config(traffic=0.1))
+    students = [f"student-{i}" for i in range(5000)]
+
+    first = {s for s in students if resolver.resolve("batch-1", s).variant == CANARY}
+    assert 0.08 < len(first) / len(students) < 0.12
+    # 重试同一学生分组不变
+    assert first == {s for s in students if resolver.resolve("batch-1", s).variant == CANARY}
+
+    await resolver.publish_deployment(_config(traffic=0.5))
+    ramped = {s for s in students if resolver.resolve("batch-1", s).variant == CANARY}
+    assert first <= ramped
+    assert 0.45 < len(ramped) / len(students) < 0.55
+
+    assignment = resolver.resolve("batch-1", next(iter(first)))
+    assert assignment.is_patched and assignment.patch_version == "v2.0.0"
+    assert assignment.to_stamp() == {
+        "patch_variant": CANARY,
+        "patch_version": "v2.0.0",
+        "patch_deployment_id": "d1",
+    }
+    control = resolver.resolve("batch-1", next(iter(set(students) - ramped)))
+    assert control.variant == CONTROL and not control.is_patched
+
+
+@pytest.mark.asyncio
+async def test_full_scope_and_removal():
+    resolver = await _resolver(_config(scope="full", traffic=1.0))
+    assert resolver.resolve("b", "s").variant == CANARY
+    await resolver.remove_deployment("d1")
+    assert resolver.resolve("b", "s") is BASELINE_ASSIGNMENT
+    assert not resolver.has_active_deployments
+
+
+@pytest.mark.asyncio
+async def test_pubsub_notification_refreshes_other_processes():
+    server = fakeredis.FakeServer()
+    publisher = await _resolver(redis_client=fakeredis.FakeAsyncRedis(server=server))
+    subscriber = PatchResolver(
+        redis_client=fakeredis.FakeAsyncRedis(server=server),
+        refresh_interval_seconds=30,
+        metrics=CanaryMetricsAggregator(),
+    )
+    await subscriber.start()
+    try:
+        await asyncio.sleep(0.05)
+        await publisher.publish_deployment(_config(traffic=0.3))
+        for _ in range(100):
+            if "d1" in subscriber.deployments:
+                break
+            await asyncio.sleep(0.01)
+        assert subscriber.deployments["d1"].traffic_percentage == 0.3
+        assert subscriber.metrics.active_deployments == {"d1": "v2.0.0"}
+
+        students = [f"s{i}" for i in range(500)]
+        assert [subscriber.resolve("b", s) for s in students] == [
+            publisher.resolve("b", s) for s in students
+        ]
+
+        await publisher.remove_deployment("d1")
+        for _ in range(100):
+            if not subscriber.has_active_deployments:
+                break
+            await asyncio.sleep(0.01)
+        assert subscriber.resolve("b", "s0") is BASELINE_ASSIGNMENT
+        assert subscriber.metrics.active_deployments == {}
+    finally:
+        await subscriber.stop()
+
+
+@pytest.mark.asyncio
+async def test_apply_patch_to_rubric_copies_and_annotates_affected_questions():
+    resolver = await _resolver(_config(scope="full", traffic=1.0))
+    rubric = {
+        "questions": [
+            {"question_id": "1", "grading_notes": ""},
+            {"question_id": "2", "grading_notes": "看单位"},
+        ]
+    }
+
+    patched = apply_patch_to_rubric(rubric, resolver.resolve("b", "s"), base_context="原评分标准")
+
+    assert "rubric_context" not in rubric
+    assert rubric["questions"][1]["grading_notes"] == "看单位"
+    assert patched["rubric_context"].startswith("原评分标准")
+    assert "## 规则补丁 v2.0.0" in patched["rubric_context"]
+    assert "米每秒" in patched["questions"][1]["grading_notes"]
+    assert patched["questions"][0]["grading_notes"] == ""
+    assert patched["patch_version"] == "v2.0.0"
+    assert apply_patch_to_rubric(rubric, BASELINE_ASSIGNMENT) is rubric
+
+
+@pytest.mark.asyncio
+async def test_deployer_publishes_to_resolver(monkeypatch):
+    async def fake_update(self, patch_id, status, **kwargs):
+        return None
+
+    monkeypatch.setattr(PatchDeployer, "_update_patch_status", fake_update)
+    metrics = CanaryMetricsAggregator()
+    resolver = PatchResolver(redis_client=fakeredis.FakeAsyncRedis(), metrics=metrics)
+    deployer = PatchDeployer(metrics=metrics, patch_resolver=resolver)
+    patch = RulePatch(
+        patch_id="patch-1",
+        patch_type=PatchType.RULE,
+        version="v3.0.0",
+        description="接受等价单位",
+        content={"rule": "x"},
+        source_pattern_id="pattern-1",
+    )
+
+    deployment_id = await deployer.deploy_canary(patch, traffic_percentage=0.2)
+    assert resolver.deployments[deployment_id].version == "v3.0.0"
+    assert resolver.deployments[deployment_id].description == "接受等价单位"
+
+    reloaded = PatchResolver(redis_client=resolver.redis_client, metrics=CanaryMetricsAggregator())
+    await reloaded.refresh()
+    assert set(reloaded.deployments) == {deployment_id}
+
+    await deployer.rollback(deployment_id)
+    assert not resolver.has_active_deployments
@@ -0,0 +1,295 @@
+"""单元测试：跨学生复核合批（装箱、拆分、自白报告与逻辑复核的合批与回退）"""
+
+import copy
+import json
+import re
+
+import pytest
+
+from src.graphs import batch_grading as batch_grading_module
+from src.services import confession_auditor, review_batching
+from src.services.review_batching import (
+    ReviewMicroBatcher,
+    ReviewPayload,
+    demux_batched_output,
+    pack_review_payloads,
+)
+
+_SECTION_RE = re.compile(r"=== 学生 student_key=(.+?) ===")
+
+
+def _students(count):
+    students = []
+    for i in range(count):
+        details = [
+            {
+                "question_id": str(q),
+                "score": (i + q) % 4,
+                "max_score": 4,
+                "confidence": 0.6,
+                "student_answer": f"学生{i} 第{q}题作答",
+                "feedback": "部分正确",
+                "scoring_point_results": [
+                    {
+                        "point_id": f"{q}.1",
+                        "awarded": (i + q) % 4,
+                        "max_points": 4,
+                        "evidence": "见作答第二行",
+                        "decision": "得分",
+                    },
+                ],
+            }
+            for q in (1, 2)
+        ]
+        students.append(
+            {
+                "student_key": f"S{i:02d}",
+                "question_details": details,
+                "total_score": sum(d["score"] for d in details),
+                "max_total_score": 8,
+            }
+        )
+    return students
+
+
+def test_pack_respects_token_budget_and_student_cap():
+    payloads = [
+        ReviewPayload(student_key=f"s{i}", section="x", tokens=t)
+        for i, t in enumerate([300, 300, 300, 900, 2000, 100, 100])
+    ]
+    batches = pack_review_payloads(payloads, header_tokens=200, token_budget=1200, max_students=3)
+    assert [[p.student_key for p in b] for b in batches] == [
+        ["s0", "s1", "s2"],
+        ["s3"],
+        ["s4"],
+        ["s5", "s6"],
+    ]
+
+
+def test_demux_drops_unknown_and_duplicated_students():
+    data = {
+        "students": [
+            {"student_key": "a", "v": 1},
+            {"student_key": "b", "v": 2},
+            {"student_key": "b", "v": 3},
+            {"student_key": "zzz", "v": 4},
+            "noise",
+        ]
+    }
+    assert demux_batched_output(data, ["a", "b", "c"]) == {"a": {"student_key": "a", "v": 1}}
+    assert demux_batched_output("not json", ["a"]) == {}
+
+
+@pytest.mark.asyncio
+async def test_batcher_falls_back_when_batch_call_fails():
+    async def invoke(_prompt):
+        raise RuntimeError("upstream 500")
+
+    batcher = ReviewMicroBatcher(
+        invoke, header="H", entry_schema="{}", validate=lambda k, e: True, max_students=4
+    )
+    payloads = [ReviewPayload(student_key=k, section=k) for k in ("a", "b", "a", "c")]
+    assert await batcher.run(payloads) == {}
+    # 同名学生不参与合批，只有 b、c 打包成一次调用
+    assert batcher.calls == 1
+
+
+# ---------------------------------------------------------------------------
+# 自白报告
+# ---------------------------------------------------------------------------
+
+
+def _confession_for(key):
+    return {
+        "overall_confidence": 0.8,
+        "risk_score": 0.2,
+        "objectives": [],
+        "items": [
+            {
+                "issue_type": "low_confidence",
+                "severity": "warning",
+                "question_id": "1",
+                "point_id": "1.1",
+                "refs": {"evidence_excerpt": f"{key} 证据"},
+                "impact": {"max_delta_points": 1, "impact_area": "evidence"},
+                "action": f"复核 {key} 第 1 题",
+            }
+        ],
+    }
+
+
+class _Response:
+    def __init__(self, content):
+        self.content = content
+
+
+class _ConfessionLLM:
+    """按提示词中的学生标识返回确定的报告；合批时故意漏掉 dropped 中的学生"""
+
+    def __init__(self, dropped=()):
+        self.dropped = set(dropped)
+        self.prompts = []
+
+    async def ainvoke(self, messages):
+        prompt = messages[-1].content
+        self.prompts.append(prompt)
+        keys = _SECTION_RE.findall(prompt)
+        if not keys:
+            key = re.search(r"^subject_id=(.+)$", prompt, re.M).group(1)
+            return _Response(json.dumps(_confession_for(key), ensure_ascii=False))
+        students = [
+            {"student_key": key, **_confession_for(key)} for key in keys if key not in self.dropped
+        ]
+        return _Response(json.dumps({"students": students}, ensure_ascii=False))
+
+
+def _strip_times(value):
+    if isinstance(value, dict):
+        return {
+            k: _strip_times(v)
+            for k, v in value.items()
+            if k
+            not in ("generated_at", "confession_reported_at", "logic_reviewed_at", "reviewed_at")
+        }
+    if isinstance(value, list):
+        return [_strip_times(v) for v in value]
+    return value
+
+
+@pytest.fixture
+def _quiet_node(monkeypatch):
+    async def _noop(*_args, **_kwargs):
+        return None
+
+    monkeypatch.setattr(batch_grading_module, "_broadcast_progress", _noop)
+    monkeypatch.setattr("src.services.grading_checkpoint.save_student_checkpoint", _noop)
+    monkeypatch.setattr(review_batching, "REVIEW_BATCH_MAX_STUDENTS", 3)
+
+
+async def _run_confession(monkeypatch, students, enabled, dropped=()):
+    llm = _ConfessionLLM(dropped)
+    monkeypatch.setattr(confession_auditor, "get_chat_model", lambda **kwargs: llm)
+    monkeypatch.setattr(review_batching, "REVIEW_BATCH_ENABLED", enabled)
+    state = {
+        "batch_id": "batch-confession",
+        "student_results": copy.deepcopy(students),
+        "api_key": "fake-key",
+        "timestamps": {},
+    }
+    result = await batch_grading_module.grading_confession_report_node(state)
+    return llm, result["confessed_results"]
+
+
+@pytest.mark.asyncio
+async def test_confession_reports_are_batched_with_identical_output(monkeypatch, _quiet_node):
+    students = _students(6)
+    single_llm, expected = await _run_confession(monkeypatch, students, enabled=False)
+    batched_llm, actual = await _run_confession(
+        monkeypatch, students, enabled=True, dropped={"S04"}
+    )
+
+    assert len(single_llm.prompts) == 6
+    # 6 名学生每批 3 人：2 次合批调用 + S04 分节缺失后的 1 次单独调用
+    assert len(batched_llm.prompts) == 3
+    assert sum("subject_id=S04" in p for p in batched_llm.prompts) == 2
+    # 共享指令与输出模板在合批提示词中只出现一次
+    assert batched_llm.prompts[0].count("## 允许的 issue_type 列表") == 1
+    assert _strip_times(actual) == _strip_times(expected)
+
+
+# ---------------------------------------------------------------------------
+# 逻辑复核
+# ---------------------------------------------------------------------------
+
+
+def _reviews_for(key, qids):
+    return [
+        {
+            "question_id": qid,
+            "confidence": 0.9,
+            "confidence_reason": f"{key} 证据充分",
+            "review_summary": f"{key} Q{qid} 维持原判",
+            "review_corrections": [],
+            "honesty_note": "",
+        }
+        for qid in qids
+    ]
+
+
+class _ReviewStream:
+    """逻辑复核桩：单独调用按“学生标识”作答；合批时 partial 中的学生只复核第 1 题"""
+
+    prompts = []
+    partial = set()
+
+    def __init__(self, *_args, **_kwargs):
+        pass
+
+    async def _call_text_api_stream(self, prompt):
+        type(self).prompts.append(prompt)
+        keys = _SECTION_RE.findall(prompt)
+        if not keys:
+            key = re.search(r"^## 学生标识: (.+)$", prompt, re.M).group(1)
+            payload = {"student_key": key, "question_reviews": _reviews_for(key, ["1", "2"])}
+        else:
+            payload = {
+                "students": [
+                    {
+                        "student_key": key,
+                        "question_reviews": _reviews_for(
+                            key, ["1"] if key in self.partial else ["1", "2"]
+                        ),
+                    }
+                    for key in keys
+                ]
+            }
+        text = json.dumps(payload, ensure_ascii=False)
+        yield text[: len(text) // 2]
+        yield text[len(text) // 2 :]
+
+    def _extract_json_from_text(self, text):
+        return text
+
+
+async def _run_logic_review(monkeypatch, students, enabled, partial=()):
+    _ReviewStream.prompts = []
+    _ReviewStream.partial = set(partial)
+    monkeypatch.setattr("src.services.llm_reasoning.LLMReasoningClient", _ReviewStream)
+    monkeypatch.setattr(batch_grading_module, "split_thinking_content", lambda chunk: (chunk, ""))
+    monkeypatch.setattr(review_batching, "REVIEW_BATCH_ENABLED", enabled)
+    state = {
+        "batch_id": "batch-logic",
+        "student_results": copy.deepcopy(students),
+        "parsed_rubric": {
+            "questions": [
+                {"question_id": "1", "max_score": 4},
+                {"question_id": "2", "max_score": 4},
+            ]
+        },
+        "api_key": "fake-key",
+        "inputs": {},
+        "timestamps": {},
+    }
+    result = await batch_grading_module.logic_review_node(state)
+    return list(_ReviewStream.prompts), result
+
+
+@pytest.mark.asyncio
+async def test_logic_reviews_are_batched_and_invalid_sections_fall_back(monkeypatch, _quiet_node):
+    students = _students(7)
+    single_prompts, expected = await _run_logic_review(monkeypatch, students, enabled=False)
+    batched_prompts, actual = await _run_logic_review(
+        monkeypatch, students, enabled=True, partial={"S01"}
+    )
+
+    assert len(single_prompts) == 7
+    # 7 名学生每批 3 人：[S00-S02] [S03-S05] 两次合批；S06 独占一批、S01 覆盖不全，各单独一次
+    assert len(batched_prompts) == 4
+    assert sum("## 学生标识: S01" in p for p in batched_prompts) == 2
+    assert batched_prompts[0].count("# 角色：逻辑复核审计员") == 1
+    for student in actual["student_results"]:
+        assert student["logic_review"]["coverage"]["valid"] is True
+    assert _strip_times(actual["student_results"]) == _strip_times(expected["student_results"])
+    assert _strip_times(actual["logic_review_results"]) == _strip_times(
+        expected["logic_review_results"]
+    )
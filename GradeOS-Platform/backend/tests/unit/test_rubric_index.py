@@ -0,0 +1,136 @@
+"""单元测试：评分标准编译索引（题号规范化、子题映射、共享快照）"""
+
+import copy
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.services import rubric_registry
+from src.services.rubric_registry import (
+    CompiledRubricIndex,
+    RubricRegistry,
+    canonical_question_id,
+    compile_rubric_index,
+    format_rubric_for_prompt,
+    question_rubric_from_dict,
+)
+
+
+def _parsed_rubric():
+    return {
+        "total_score": 30,
+        "questions": [
+            {
+                "question_id": "1",
+                "max_score": 5,
+                "question_text": "求速度",
+                "standard_answer": "10 m/s",
+                "scoring_points": [
+                    {"description": "列式", "score": 2},
+                    {"description": "结果", "score": 3, "point_id": "1.r"},
+                ],
+            },
+            {"question_id": "7", "max_score": 10, "question_text": "综合题"},
+            {"question_id": "8a", "max_score": 6},
+            {"question_id": "8b", "max_score": 4},
+            {"question_id": "12", "max_score": 5},
+        ],
+    }
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("7a", "7a"),
+        ("７ａ", "7a"),
+        ("第七题", "7"),
+        ("第十二题", "12"),
+        ("二十一", "21"),
+        ("Q7(a)", "7a"),
+        ("7（a）", "7a"),
+        ("7-a", "7a"),
+        ("7(1)", "7.1"),
+        ("7.1", "7.1"),
+        ("题目 3", "3"),
+        (" 12. ", "12"),
+    ],
+)
+def test_canonical_question_id(raw, expected):
+    assert canonical_question_id(raw) == expected
+
+
+def test_lookups_match_registry_semantics():
+    parsed = _parsed_rubric()
+    index = CompiledRubricIndex.from_parsed_rubric(parsed)
+    registry = RubricRegistry(total_score=30)
+    registry.register_rubrics([question_rubric_from_dict(q) for q in parsed["questions"]])
+
+    for qid in ["1", "第7题", "7a", "8a", "8b", "12"]:
+        expected = registry.get_rubric_for_question(qid)
+        actual = index.get_rubric_for_question(qid)
+        assert actual.rubric.question_id == expected.rubric.question_id
+        assert (actual.confidence, actual.is_default) == (expected.confidence, expected.is_default)
+
+    # 注册中心不识别的写法也能命中
+    assert index.get_rubric_for_question("第十二题").rubric.question_id == "12"
+    assert index.get_rubric_for_question("８Ａ").rubric.question_id == "8a"
+    assert index.get_rubric_for_question("7(b)").confidence == 0.8
+    assert index.get_sub_question_ids("第8题") == ("8a", "8b")
+    assert index.total_score == 30
+
+
+def test_default_rubric_is_built_once_per_id():
+    index = CompiledRubricIndex.from_parsed_rubric(_parsed_rubric())
+
+    first = index.get_rubric_for_question("99")
+    assert first.is_default and first.confidence == 0.3
+    assert first.rubric.question_id == "99"
+    assert index.get_rubric_for_question("99") is first
+    assert not index.has_rubric("99")
+
+
+def test_prompt_fragments_and_max_score_sums():
+    parsed = _parsed_rubric()
+    index = CompiledRubricIndex.from_parsed_rubric(parsed)
+
+    assert index.get_prompt_fragment("Q1") == format_rubric_for_prompt(
+        question_rubric_from_dict(parsed["questions"][0])
+    )
+    assert "满分6分" in index.get_prompt_fragment("8a")
+    assert index.calculate_total_max_score() == 30
+    # 子题回退到父题时同一道题只计一次
+    assert index.max_score_for(["7", "7a", "7b", "8a"]) == 16
+    assert index.max_score_for(["404"]) == 5.0
+
+
+def test_compiled_index_is_shared_until_content_changes():
+    parsed = _parsed_rubric()
+    index = compile_rubric_index(parsed)
+
+    assert compile_rubric_index(parsed) is index
+    cache_size = len(rubric_registry._index_cache)
+    # 每个学生一份深拷贝：命中同一快照，缓存不随副本增长
+    for _ in range(50):
+        assert compile_rubric_index(copy.deepcopy(parsed)) is index
+    assert len(rubric_registry._index_cache) == cache_size
+
+    patched = copy.deepcopy(parsed)
+    patched["questions"][1]["grading_notes"] = "## 规则补丁 v2"
+    patched_index = compile_rubric_index(patched)
+    assert patched_index is not index
+    assert patched_index.get_rubric_for_question("7").rubric.grading_notes == "## 规则补丁 v2"
+    assert index.get_rubric_for_question("7").rubric.grading_notes == ""
+
+
+def test_concurrent_lookups_are_consistent():
+    index = CompiledRubricIndex.from_parsed_rubric(_parsed_rubric())
+    ids = ["1", "第7题", "7c", "８ａ", "8b", "十二", "99"] * 200
+
+    def run(_):
+        return [index.get_rubric_for_question(qid).rubric.question_id for qid in ids]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(run, range(16)))
+
+    assert all(result == results[0] for result in results)
+    assert results[0][:7] == ["1", "7", "7", "8a", "8b", "12", "99"]
@@ -1,5 +1,21 @@
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+import uuid
+
+import pytest
+
 from src.models.run_lifecycle import FailureClass, RunState
-from src.services.run_state_machine import RunStateMachine, classify_failure, map_legacy_status
+from src.services import run_state_machine
+from src.services.run_state_machine import (
+    InMemoryRunStateStore,
+    RedisRunStateStore,
+    RunStateMachine,
+    classify_failure,
+    map_legacy_status,
+)
 
 
 def test_map_legacy_status() -> None:
@@ -11,28 +27,372 @@ def test_map_legacy_status() -> None:
     assert map_legacy_status("cancelled") == RunState.CANCELLED
 
 
-def test_state_machine_transitions() -> None:
-    sm = RunStateMachine()
-    sm.set_initial("run-1")
-    ok = sm.transition("run-1", RunState.RUNNING)
+async def test_state_machine_transitions() -> None:
+    sm = RunStateMachine(InMemoryRunStateStore())
+    await sm.set_initial("run-1")
+    ok = await sm.transition("run-1", RunState.RUNNING)
     assert ok.valid is True
     assert ok.current == RunState.RUNNING
 
-    ok = sm.transition("run-1", RunState.RETRYING)
+    ok = await sm.transition("run-1", RunState.RETRYING)
     assert ok.valid is True
     assert ok.current == RunState.RETRYING
 
-    ok = sm.transition("run-1", RunState.COMPLETED)
+    ok = await sm.transition("run-1", RunState.COMPLETED)
     assert ok.valid is True
     assert ok.current == RunState.COMPLETED
 
-    invalid = sm.transition("run-1", RunState.RUNNING)
+    invalid = await sm.transition("run-1", RunState.RUNNING)
     assert invalid.valid is False
     assert invalid.current == RunState.COMPLETED
 
 
 def test_classify_failure() -> None:
     assert classify_failure("rate limit exceeded") == FailureClass.RETRYABLE
-    assert classify_failure("human review required for this page") == FailureClass.HUMAN_REVIEW_REQUIRED
+    assert (
+        classify_failure("human review required for this page")
+        == FailureClass.HUMAN_REVIEW_REQUIRED
+    )
     assert classify_failure("permission denied") == FailureClass.NON_RETRYABLE
     assert classify_failure("user cancelled run") == FailureClass.USER_CANCELLED
+
+
+async def test_history_versions_and_compare_and_set() -> None:
+    sm = RunStateMachine(InMemoryRunStateStore())
+    await sm.set_initial("r", reason="pending")
+    await sm.transition("r", RunState.RUNNING, reason="running")
+    # Repeating the current state is valid but not recorded.
+    repeat = await sm.transition("r", RunState.RUNNING)
+    assert repeat.valid and not repeat.changed and repeat.version == 2
+
+    conflict = await sm.transition("r", RunState.COMPLETED, expected=RunState.CREATED)
+    assert (conflict.valid, conflict.conflict, conflict.current) == (False, True, RunState.RUNNING)
+    won = await sm.transition(
+        "r", RunState.COMPLETED, expected=RunState.RUNNING, reason="completed"
+    )
+    assert won.changed and won.version == 3
+
+    history = await sm.history("r")
+    assert [(h.previous, h.current, h.version, h.reason) for h in history] == [
+        (None, RunState.CREATED, 1, "pending"),
+        (RunState.CREATED, RunState.RUNNING, 2, "running"),
+        (RunState.RUNNING, RunState.COMPLETED, 3, "completed"),
+    ]
+    assert [h.at_ms for h in history] == sorted(h.at_ms for h in history)
+
+
+async def test_terminal_runs_are_evicted_after_ttl() -> None:
+    now = [1000.0]
+    store = InMemoryRunStateStore(
+        terminal_ttl_seconds=60, active_ttl_seconds=3600, clock=lambda: now[0]
+    )
+    sm = RunStateMachine(store)
+    await sm.transition("done", RunState.RUNNING)
+    await sm.transition("done", RunState.FAILED)
+    await sm.transition("active", RunState.RUNNING)
+
+    now[0] += 59
+    assert await sm.get("done") == RunState.FAILED
+    now[0] += 2
+    assert await sm.get("done") is None and await sm.history("done") == []
+    assert await sm.get("active") == RunState.RUNNING
+    # Active runs are refreshed on every transition.
+    now[0] += 3000
+    await sm.transition("active", RunState.RETRYING)
+    now[0] += 3000
+    assert len(store) == 1 and await sm.get("active") == RunState.RETRYING
+
+
+async def test_watch_delivers_transitions_without_polling() -> None:
+    sm = RunStateMachine(InMemoryRunStateStore())
+    async with sm.watch("a") as only_a, sm.watch() as everything:
+        await sm.transition("a", RunState.RUNNING)
+        await sm.transition("b", RunState.RUNNING)
+        await sm.transition("a", RunState.COMPLETED)
+        assert [(r.run_id, r.current) for r in [await only_a.next(1), await only_a.next(1)]] == [
+            ("a", RunState.RUNNING),
+            ("a", RunState.COMPLETED),
+        ]
+        assert [(await everything.next(1)).run_id for _ in range(3)] == ["a", "b", "a"]
+        with pytest.raises(asyncio.TimeoutError):
+            await only_a.next(0.01)
+
+
+def _random_ops(seed, count=300):
+    rng = random.Random(seed)
+    states = list(RunState)
+    for _ in range(count):
+        yield (
+            rng.choice(["r1", "r2", "r3"]),
+            rng.choice(states),
+            rng.choice([None, None, rng.choice(states)]),
+            rng.random() < 0.05,
+        )
+
+
+async def test_redis_store_matches_in_memory_semantics() -> None:
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    memory = InMemoryRunStateStore(history_limit=5)
+    redis_store = RedisRunStateStore(fakeredis.FakeAsyncRedis(), key_prefix="t", history_limit=5)
+    await redis_store.load_scripts()
+
+    for run_id, target, expected, force in _random_ops(11):
+        results = [
+            await store.apply(run_id, target, expected=expected, force=force, reason="x")
+            for store in (memory, redis_store)
+        ]
+        assert results[0] == results[1]
+
+    def strip(records):
+        return [(r.run_id, r.previous, r.current, r.version, r.reason) for r in records]
+
+    for run_id in ("r1", "r2", "r3"):
+        assert await redis_store.get(run_id) == await memory.get(run_id)
+        assert strip(await redis_store.history(run_id)) == strip(await memory.history(run_id))
+        assert len(await redis_store.history(run_id)) <= 5
+
+
+async def test_redis_store_ttl_and_watch() -> None:
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    client = fakeredis.FakeAsyncRedis()
+    store = RedisRunStateStore(
+        client, key_prefix="t", terminal_ttl_seconds=60, active_ttl_seconds=3600
+    )
+    sm = RunStateMachine(store)
+
+    async with sm.watch("r") as updates:
+        await sm.transition("r", RunState.RUNNING)
+        assert await client.ttl("t:{r}") == 3600
+        await sm.transition("r", RunState.CANCELLED, expected=RunState.RUNNING)
+        assert await client.ttl("t:{r}") == 60 and await client.ttl("t:{r}:history") == 60
+        received = [await updates.next(5), await updates.next(5)]
+    assert [(r.previous, r.current, r.version) for r in received] == [
+        (None, RunState.RUNNING, 1),
+        (RunState.RUNNING, RunState.CANCELLED, 2),
+    ]
+
+    await sm.clear_all()
+    assert await sm.get("r") is None and await client.keys("t:*") == []
+
+
+async def test_fallback_store_retries_redis_after_backoff(monkeypatch) -> None:
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    monkeypatch.delenv("RUN_STATE_STORE", raising=False)
+    monkeypatch.delenv("OFFLINE_MODE", raising=False)
+    redis_store = RedisRunStateStore(fakeredis.FakeAsyncRedis(), key_prefix="t")
+    await redis_store.apply("known", RunState.COMPLETED, force=True)
+    available = {"redis": False}
+    attempts = []
+
+    async def connect():
+        attempts.append(available["redis"])
+        return redis_store if available["redis"] else None
+
+    monkeypatch.setattr(run_state_machine, "_connect_redis_run_state_store", connect)
+    now = [0.0]
+    sm = RunStateMachine(redis_retry_seconds=30, clock=lambda: now[0])
+
+    await sm.transition("r1", RunState.RUNNING)
+    await sm.transition("known", RunState.RUNNING)
+    now[0] = 10.0
+    available["redis"] = True
+    # Still inside the backoff window: stays on the fallback without reconnecting.
+    assert await sm.get("r1") == RunState.RUNNING
+    assert attempts == [False]
+
+    now[0] = 31.0
+    assert await sm.get("r1") == RunState.RUNNING
+    assert attempts == [False, True]
+    assert await redis_store.get("r1") == RunState.RUNNING
+    # Runs Redis already tracked keep their shared state.
+    assert await redis_store.get("known") == RunState.COMPLETED
+    result = await sm.transition("r1", RunState.COMPLETED, expected=RunState.RUNNING)
+    assert result.valid and await redis_store.get("r1") == RunState.COMPLETED
+    assert attempts == [False, True]
+
+
+async def test_unreachable_redis_client_is_closed(monkeypatch) -> None:
+    import redis.asyncio as redis
+
+    from src.utils.pool_manager import UnifiedPoolManager
+
+    class UninitializedPool:
+        is_initialized = False
+
+    class UnreachableClient:
+        closed = False
+
+        async def ping(self):
+            raise ConnectionError("connection refused")
+
+        async def aclose(self):
+            self.closed = True
+
+    async def get_instance():
+        return UninitializedPool()
+
+    client = UnreachableClient()
+    monkeypatch.setattr(UnifiedPoolManager, "get_instance", get_instance)
+    monkeypatch.setattr(redis, "from_url", lambda url: client)
+    monkeypatch.setenv("REDIS_URL", "redis://unreachable:6379")
+
+    assert await run_state_machine._connect_redis_run_state_store() is None
+    assert client.closed
+
+
+def test_watch_requires_receive() -> None:
+    with pytest.raises(TypeError):
+        run_state_machine.RunStateWatch()
+
+
+# ---------------------------------------------------------------------------
+# Linearizability: concurrent transitions from several processes against a
+# real Redis (RUN_STATE_TEST_REDIS_URL, e.g. redis://localhost:6379/15)
+# ---------------------------------------------------------------------------
+
+_RACE_RUNS = [f"run-{i}" for i in range(8)]
+_RACE_PROCESSES = 6
+_RACE_OPS = 300
+_NON_TERMINAL = [RunState.RUNNING, RunState.RETRYING, RunState.PARTIAL_FAILED, RunState.CREATED]
+
+
+async def _timed(call, phase, run_id, target, expected):
+    start = time.monotonic()
+    result = await call
+    return {
+        "phase": phase,
+        "run_id": run_id,
+        "target": target.value,
+        "expected": expected.value if expected is not None else None,
+        "start": start,
+        "end": time.monotonic(),
+        "previous": result.previous.value,
+        "current": result.current.value,
+        "valid": result.valid,
+        "changed": result.changed,
+        "conflict": result.conflict,
+        "version": result.version,
+    }
+
+
+async def _race(redis_url, prefix, seed, barrier):
+    import redis.asyncio as redis
+
+    client = redis.from_url(redis_url)
+    store = RedisRunStateStore(client, key_prefix=prefix, history_limit=10_000)
+    await store.load_scripts()
+    sm = RunStateMachine(store)
+    rng = random.Random(seed)
+    log = []
+    barrier.wait()
+    # Phase 1: every process tries to start every run with a compare-and-set.
+    for run_id in _RACE_RUNS:
+        call = sm.transition(run_id, RunState.RUNNING, expected=RunState.CREATED)
+        log.append(await _timed(call, 1, run_id, RunState.RUNNING, RunState.CREATED))
+    barrier.wait()
+    # Phase 2: random transitions, half of them conditional on a fresh read.
+    for _ in range(_RACE_OPS):
+        run_id = rng.choice(_RACE_RUNS)
+        target = rng.choice(list(RunState)) if rng.random() < 0.03 else rng.choice(_NON_TERMINAL)
+        expected = None
+        if rng.random() < 0.5:
+            expected = await sm.get(run_id) or RunState.CREATED
+        call = sm.transition(run_id, target, expected=expected)
+        log.append(await _timed(call, 2, run_id, target, expected))
+    await client.aclose()
+    return log
+
+
+def _race_worker(redis_url, prefix, seed, barrier, results):
+    results.put(asyncio.run(_race(redis_url, prefix, seed, barrier)))
+
+
+async def _check_sequential_spec(ops, history):
+    """Replay ops in linearization order against the in-memory store and compare results."""
+    applied = sorted((op for op in ops if op["changed"]), key=lambda op: op["version"])
+    assert [op["version"] for op in applied] == list(range(1, len(applied) + 1))
+    assert [(h.version, h.current.value) for h in history] == [
+        (op["version"], op["target"]) for op in applied
+    ]
+
+    # State after each version; version 0 is the implicit CREATED.
+    states = {0: RunState.CREATED.value}
+    for op in applied:
+        states[op["version"]] = op["target"]
+
+    for op in ops:
+        reference = InMemoryRunStateStore()
+        before = op["version"] - 1 if op["changed"] else op["version"]
+        if before:
+            await reference.apply("r", RunState(states[before]), force=True)
+        expected = RunState(op["expected"]) if op["expected"] else None
+        spec = await reference.apply("r", RunState(op["target"]), expected=expected)
+        observed = (op["previous"], op["current"], op["valid"], op["changed"], op["conflict"])
+        assert observed == (
+            spec.previous.value, spec.current.value, spec.valid, spec.changed, spec.conflict
+        ), op
+
+    # Real-time order: an op that finished before another started linearizes first.
+    def point(op):
+        return (op["version"], 0 if op["changed"] else 1)
+
+    by_end = sorted(ops, key=lambda op: op["end"])
+    latest = (-1, 0)
+    index = 0
+    for op in sorted(ops, key=lambda op: op["start"]):
+        while index < len(by_end) and by_end[index]["end"] < op["start"]:
+            latest = max(latest, point(by_end[index]))
+            index += 1
+        assert latest <= point(op), op
+
+
+@pytest.mark.skipif(
+    not os.getenv("RUN_STATE_TEST_REDIS_URL"), reason="RUN_STATE_TEST_REDIS_URL not set"
+)
+async def test_concurrent_transitions_across_processes_are_linearizable() -> None:
+    import redis.asyncio as redis
+
+    redis_url = os.environ["RUN_STATE_TEST_REDIS_URL"]
+    prefix = f"run_state_test_{uuid.uuid4().hex[:8]}"
+    client = redis.from_url(redis_url)
+    store = RedisRunStateStore(client, key_prefix=prefix)
+
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(_RACE_PROCESSES)
+    results = ctx.Queue()
+    async with RunStateMachine(store).watch() as updates:
+        processes = [
+            ctx.Process(target=_race_worker, args=(redis_url, prefix, seed, barrier, results))
+            for seed in range(_RACE_PROCESSES)
+        ]
+        for process in processes:
+            process.start()
+        logs = [
+            await asyncio.to_thread(results.get, True, 120) for _ in range(_RACE_PROCESSES)
+        ]
+        for process in processes:
+            await asyncio.to_thread(process.join, 30)
+            assert process.exitcode == 0
+
+        ops = [op for log in logs for op in log]
+        applied = sum(op["changed"] for op in ops)
+        events = [await updates.next(10) for _ in range(applied)]
+
+    try:
+        for run_id in _RACE_RUNS:
+            run_ops = [op for op in ops if op["run_id"] == run_id]
+            # Exactly one process wins the start race for each run.
+            starts = [op for op in run_ops if op["phase"] == 1]
+            assert len(starts) == _RACE_PROCESSES
+            assert sum(op["changed"] for op in starts) == 1
+            await _check_sequential_spec(run_ops, await store.history(run_id))
+            # Watchers see each run's transitions exactly once, in version order.
+            assert [e.version for e in events if e.run_id == run_id] == list(
+                range(1, sum(op["changed"] for op in run_ops) + 1)
+            )
+    finally:
+        await store.delete_all()
+        await client.aclose()
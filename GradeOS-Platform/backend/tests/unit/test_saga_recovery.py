@@ -0,0 +1,349 @@
+"""单元测试：Saga 持久化日志、并发步骤与崩溃恢复"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+import pytest
+
+from src.services.distributed_transaction import (
+    DistributedTransactionCoordinator,
+    InMemorySagaLogStore,
+    ReviewOverrideSagaBuilder,
+    SagaRecoveryWorker,
+    SagaStep,
+    SagaStepStatus,
+    SagaTransactionStatus,
+)
+
+
+class SimulatedCrash(BaseException):
+    """模拟进程被杀死：不是 Exception，协调器不会捕获并补偿"""
+
+
+def crash_at(point: str, step_name: str):
+    async def injector(current_point, step):
+        if current_point == point and step.name == step_name:
+            raise SimulatedCrash(f"{point}:{step_name}")
+
+    return injector
+
+
+class Ledger:
+    """记录动作 / 补偿调用，并据此维护一个“外部系统”状态"""
+
+    def __init__(self):
+        self.calls = []
+        self.state = {}
+
+    def steps(self, names, idempotent=None, depends_on=None):
+        idempotent = idempotent or {}
+        depends_on = depends_on or {}
+        steps = []
+        for name in names:
+
+            async def action(name=name):
+                self.calls.append(("action", name))
+                self.state[name] = "applied"
+                return {"step": name}
+
+            async def compensation(name=name):
+                self.calls.append(("compensate", name))
+                self.state.pop(name, None)
+
+            steps.append(
+                SagaStep(
+                    name=name,
+                    action=action,
+                    compensation=compensation,
+                    idempotent=idempotent.get(name, True),
+                    depends_on=depends_on.get(name),
+                )
+            )
+        return steps
+
+
+def _coordinator(store, injector=None):
+    return DistributedTransactionCoordinator(
+        pool_manager=None,
+        log_store=store,
+        fault_injector=injector,
+        max_compensation_retries=1,
+    )
+
+
+async def _crash_run(store, ledger, injector, names=("a", "b", "c"), **step_options):
+    coordinator = _coordinator(store, injector)
+    coordinator.register_saga_type("demo", lambda ctx: ledger.steps(names, **step_options))
+    saga_id = coordinator.generate_saga_id()
+    with pytest.raises(SimulatedCrash):
+        await coordinator.execute_saga(
+            saga_id, ledger.steps(names, **step_options), saga_type="demo", context={"k": 1}
+        )
+    assert store.sagas[saga_id]["final_status"] == SagaTransactionStatus.STARTED
+    _expire_heartbeats(store)
+    return saga_id
+
+
+def _expire_heartbeats(store):
+    """把心跳拨回一小时前，模拟崩溃后经过了足够长的时间"""
+    for saga in store.sagas.values():
+        saga["updated_at"] -= timedelta(hours=1)
+
+
+async def _recover(store, ledger, names=("a", "b", "c"), **step_options):
+    # 新的协调器实例模拟重启后的进程
+    coordinator = _coordinator(store)
+    coordinator.register_saga_type("demo", lambda ctx: ledger.steps(names, **step_options))
+    return await SagaRecoveryWorker(coordinator, stale_after_seconds=60).run_once()
+
+
+@pytest.mark.asyncio
+async def test_independent_steps_run_concurrently_and_log_each_transition():
+    store = InMemorySagaLogStore()
+    coordinator = _coordinator(store)
+    running = set()
+    overlap = []
+
+    def make(name):
+        async def action():
+            running.add(name)
+            await asyncio.sleep(0.01)
+            overlap.append(set(running))
+            running.discard(name)
+
+        async def compensation():
+            pass
+
+        return action, compensation
+
+    steps = [
+        SagaStep("db", *make("db")),
+        SagaStep("cache", *make("cache"), depends_on=["db"]),
+        SagaStep("notify", *make("notify"), depends_on=["db"]),
+    ]
+    assert await coordinator.execute_saga("s1", steps)
+
+    assert any({"cache", "notify"} <= seen for seen in overlap)
+    assert "db" not in set().union(*overlap[1:])
+    transitions = [(row["step_name"], row["status"]) for row in store.step_log]
+    assert len(transitions) == 6
+    assert transitions[:2] == [("db", SagaStepStatus.RUNNING), ("db", SagaStepStatus.COMPLETED)]
+    assert store.sagas["s1"]["final_status"] == SagaTransactionStatus.COMPLETED
+
+
+def test_dependencies_must_reference_earlier_steps():
+    ledger = Ledger()
+    steps = ledger.steps(["a", "b"], depends_on={"a": ["b"]})
+    with pytest.raises(ValueError):
+        DistributedTransactionCoordinator.resolve_dependencies(steps)
+    with pytest.raises(ValueError):
+        DistributedTransactionCoordinator.resolve_dependencies(ledger.steps(["a", "a"]))
+
+
+@pytest.mark.asyncio
+async def test_crash_mid_step_resumes_idempotent_saga():
+    store, ledger = InMemorySagaLogStore(), Ledger()
+    saga_id = await _crash_run(store, ledger, crash_at("after_action", "b"))
+    assert ledger.calls == [("action", "a"), ("action", "b")]
+
+    assert await _recover(store, ledger) == 1
+
+    # a 已完成不重跑；b 处于执行中且幂等，重跑；c 首次执行
+    assert ledger.calls[2:] == [("action", "b"), ("action", "c")]
+    assert store.sagas[saga_id]["final_status"] == SagaTransactionStatus.COMPLETED
+    assert await _recover(store, ledger) == 0
+
+
+@pytest.mark.asyncio
+async def test_crash_in_non_idempotent_step_compensates():
+    store, ledger = InMemorySagaLogStore(), Ledger()
+    saga_id = await _crash_run(
+        store, ledger, crash_at("before_action", "b"), idempotent={"b": False}
+    )
+
+    await _recover(store, ledger, idempotent={"b": False})
+
+    assert ledger.calls[1:] == [("compensate", "b"), ("compensate", "a")]
+    assert ledger.state == {}
+    assert store.sagas[saga_id]["final_status"] == SagaTransactionStatus.COMPENSATED
+
+
+@pytest.mark.asyncio
+async def test_crash_during_compensation_converges_without_repeating():
+    store, ledger = InMemorySagaLogStore(), Ledger()
+    coordinator = _coordinator(store, crash_at("before_compensation", "a"))
+    coordinator.register_saga_type("demo", lambda ctx: ledger.steps(["a", "b", "c"]))
+    steps = ledger.steps(["a", "b", "c"])
+
+    async def failing():
+        raise RuntimeError("c failed")
+
+    steps[2].action = failing
+    with pytest.raises(SimulatedCrash):
+        await coordinator.execute_saga("s1", steps, saga_type="demo", context={})
+    _expire_heartbeats(store)
+
+    await _recover(store, ledger)
+
+    # b 已补偿过，恢复时只补偿 a
+    assert [c for c in ledger.calls if c[0] == "compensate"] == [
+        ("compensate", "b"),
+        ("compensate", "a"),
+    ]
+    assert ledger.state == {}
+    assert store.sagas["s1"]["final_status"] == SagaTransactionStatus.COMPENSATED
+
+
+@pytest.mark.asyncio
+async def test_concurrent_workers_claim_each_saga_once():
+    store, ledger = InMemorySagaLogStore(), Ledger()
+    await _crash_run(store, ledger, crash_at("after_action", "a"))
+
+    coordinator = _coordinator(store)
+    coordinator.register_saga_type("demo", lambda ctx: ledger.steps(["a", "b", "c"]))
+    workers = [SagaRecoveryWorker(coordinator, stale_after_seconds=60) for _ in range(3)]
+    results = await asyncio.gather(*[worker.run_once() for worker in workers])
+
+    assert sum(results) == 1
+    assert ledger.calls.count(("action", "c")) == 1
+
+
+@pytest.mark.asyncio
+async def test_unknown_saga_type_requires_intervention():
+    store, ledger = InMemorySagaLogStore(), Ledger()
+    saga_id = await _crash_run(store, ledger, crash_at("after_action", "a"))
+
+    worker = SagaRecoveryWorker(_coordinator(store), stale_after_seconds=60)
+    assert await worker.run_once() == 1
+    assert store.sagas[saga_id]["final_status"] == SagaTransactionStatus.REQUIRES_INTERVENTION
+
+
+class FakeGradingDb:
+    """只支持审核覆盖所需 SQL 的 grading_results 替身"""
+
+    def __init__(self, row):
+        self.row = dict(row)
+
+    @asynccontextmanager
+    async def pg_connection(self):
+        yield self
+
+    pg_transaction = pg_connection
+
+    async def execute(self, query, params):
+        if query.strip().startswith("SELECT"):
+            row = dict(self.row)
+
+            class Result:
+                async def fetchone(self):
+                    return row
+
+            return Result()
+        if "reviewed = TRUE" in query:
+            self.row.update(
+                score=params[0], reviewed=True, reviewer_id=params[1], review_reason=params[2]
+            )
+        else:
+            self.row.update(
+                score=params[0], reviewed=params[1], reviewer_id=params[2], review_reason=params[3]
+            )
+
+
+ORIGINAL_ROW = {"score": 3.0, "reviewed": False, "reviewer_id": None, "review_reason": None}
+
+
+class FakeCache:
+    def __init__(self):
+        self.invalidated = []
+
+    async def invalidate_with_notification(self, key):
+        self.invalidated.append(key)
+
+
+@pytest.mark.asyncio
+async def test_review_override_recovers_after_crash_following_db_update():
+    db = FakeGradingDb(ORIGINAL_ROW)
+    store = InMemorySagaLogStore()
+    coordinator = _coordinator(store, crash_at("after_action", "数据库更新"))
+    builder = ReviewOverrideSagaBuilder(coordinator, db, cache_service=FakeCache())
+
+    with pytest.raises(SimulatedCrash):
+        await builder.execute_review_override("sub-1", "q1", 5.0, "t1", "复核")
+    assert db.row["score"] == 5.0
+    _expire_heartbeats(store)
+
+    # 重启：新的协调器与构建器，通知由 notifier 发送
+    notified = []
+
+    async def notifier(context):
+        notified.append(context["submission_id"])
+
+    cache = FakeCache()
+    recovered = _coordinator(store)
+    ReviewOverrideSagaBuilder(recovered, db, cache_service=cache, notifier=notifier)
+    assert await SagaRecoveryWorker(recovered, stale_after_seconds=60).run_once() == 1
+
+    assert db.row["score"] == 5.0 and db.row["reviewed"] is True
+    assert cache.invalidated == ["grading_result:sub-1:q1"]
+    assert notified == ["sub-1"]
+
+
+@pytest.mark.asyncio
+async def test_review_override_compensation_uses_logged_snapshot():
+    db = FakeGradingDb(ORIGINAL_ROW)
+    store = InMemorySagaLogStore()
+    coordinator = _coordinator(store, crash_at("after_action", "数据库更新"))
+    builder = ReviewOverrideSagaBuilder(coordinator, db)
+    with pytest.raises(SimulatedCrash):
+        await builder.execute_review_override("sub-1", "q1", 5.0, "t1", "复核")
+    _expire_heartbeats(store)
+
+    async def broken_notifier(context):
+        raise RuntimeError("notification service down")
+
+    recovered = _coordinator(store)
+    ReviewOverrideSagaBuilder(recovered, db, notifier=broken_notifier)
+    await SagaRecoveryWorker(recovered, stale_after_seconds=60).run_once()
+
+    # 进程内已无原始数据，补偿依赖日志中的快照结果
+    assert db.row == ORIGINAL_ROW
+    (saga,) = store.sagas.values()
+    assert saga["final_status"] == SagaTransactionStatus.COMPENSATED
+
+
+def test_steps_are_not_idempotent_unless_declared():
+    async def noop():
+        return None
+
+    assert SagaStep(name="a", action=noop, compensation=noop).idempotent is False
+    builder = ReviewOverrideSagaBuilder(_coordinator(InMemorySagaLogStore()), FakeGradingDb({}))
+    flags = {
+        step.name: step.idempotent
+        for step in builder.build_steps({"submission_id": "s", "question_id": "q"})
+    }
+    assert flags == {"读取原始数据": True, "数据库更新": True, "缓存失效": True, "通知发送": False}
+
+
+@pytest.mark.asyncio
+async def test_review_override_crash_during_notify_compensates():
+    db = FakeGradingDb(ORIGINAL_ROW)
+    store = InMemorySagaLogStore()
+    coordinator = _coordinator(store, crash_at("after_action", "通知发送"))
+    builder = ReviewOverrideSagaBuilder(coordinator, db)
+    with pytest.raises(SimulatedCrash):
+        await builder.execute_review_override("sub-1", "q1", 5.0, "t1", "复核")
+    _expire_heartbeats(store)
+
+    notified = []
+
+    async def notifier(context):
+        notified.append(context["submission_id"])
+
+    recovered = _coordinator(store)
+    ReviewOverrideSagaBuilder(recovered, db, notifier=notifier)
+    await SagaRecoveryWorker(recovered, stale_after_seconds=60).run_once()
+
+    # 通知可能已发出，不重发：整体补偿
+    assert notified == []
+    assert db.row == ORIGINAL_ROW
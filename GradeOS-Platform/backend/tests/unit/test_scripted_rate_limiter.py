@@ -0,0 +1,247 @@
+"""单元测试：Lua 滑动窗口 / GCRA 限流、进程内预租与限流中间件"""
+
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from src.api.middleware.rate_limit import RateLimitMiddleware  # noqa: E402
+from src.services.rate_limiter import (  # noqa: E402
+    LocalLeaseLimiter,
+    RateLimitPolicy,
+    RateLimitPolicySet,
+    ScriptedRateLimiter,
+    load_policy_set_from_env,
+)
+
+
+class CountingRedis(fakeredis.FakeAsyncRedis):
+    """统计发往 Redis 的命令数"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.commands = []
+
+    async def execute_command(self, *args, **options):
+        self.commands.append(args[0])
+        return await super().execute_command(*args, **options)
+
+
+@pytest.fixture
+def redis_client():
+    return CountingRedis()
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_single_round_trip(redis_client):
+    limiter = ScriptedRateLimiter(redis_client, key_prefix="t")
+    await limiter.load_scripts()
+    redis_client.commands.clear()
+    policy = RateLimitPolicy(name="api", limit=5, window_seconds=60)
+
+    decisions = [await limiter.check("user:1", policy) for _ in range(7)]
+
+    assert [d.allowed for d in decisions] == [True] * 5 + [False] * 2
+    assert [d.remaining for d in decisions[:5]] == [4, 3, 2, 1, 0]
+    assert decisions[-1].retry_after_ms > 0
+    assert 0 < decisions[0].reset_after_ms <= 60_000
+    # 每次判定只有一条 EVALSHA
+    assert redis_client.commands == ["EVALSHA"] * 7
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_carries_previous_window_weight(redis_client):
+    limiter = ScriptedRateLimiter(redis_client, key_prefix="t")
+    policy = RateLimitPolicy(name="api", limit=10, window_seconds=1)
+    key = limiter._key("user:1", policy)
+
+    # 模拟上一窗口已用满：窗口刚切换时不能立刻再用满（固定窗口会允许 2 倍突发）
+    time_s, time_us = await redis_client.time()
+    now_ms = time_s * 1000 + time_us // 1000
+    start = now_ms - now_ms % 1000
+    await redis_client.hset(key, mapping={"w": start - 1000, "c": 10, "p": 0})
+
+    allowed = 0
+    for _ in range(10):
+        if (await limiter.check("user:1", policy)).allowed:
+            allowed += 1
+    assert allowed < 10
+
+
+@pytest.mark.asyncio
+async def test_gcra_burst_and_refill(redis_client):
+    limiter = ScriptedRateLimiter(redis_client, key_prefix="t")
+    policy = RateLimitPolicy(name="gcra", limit=20, window_seconds=1, algorithm="gcra", burst=5)
+
+    decisions = [await limiter.check("user:1", policy) for _ in range(6)]
+    assert [d.allowed for d in decisions] == [True] * 5 + [False]
+    assert decisions[-1].retry_after_ms <= 50 + 1
+
+    await asyncio.sleep(0.06)
+    assert (await limiter.check("user:1", policy)).allowed
+
+
+@pytest.mark.asyncio
+async def test_local_lease_avoids_network_and_respects_limit(redis_client):
+    limiter = ScriptedRateLimiter(redis_client, key_prefix="t")
+    policy = RateLimitPolicy(
+        name="leased", limit=100, window_seconds=60, algorithm="gcra", local_lease=10
+    )
+    local = LocalLeaseLimiter(limiter)
+    await limiter.load_scripts()
+    redis_client.commands.clear()
+
+    results = [await local.check("user:1", policy) for _ in range(120)]
+
+    assert sum(1 for d in results if d.allowed) == 100
+    # 10 次租约 + 1 次被拒；之后的拒绝在 retry_after 内本地完成
+    assert redis_client.commands == ["EVALSHA"] * 11
+    assert local.local_hits == 109
+    assert results[-1].retry_after_seconds >= 1
+
+
+@pytest.mark.asyncio
+async def test_local_lease_concurrent_refill_is_single_flight(redis_client):
+    limiter = ScriptedRateLimiter(redis_client, key_prefix="t")
+    policy = RateLimitPolicy(
+        name="leased", limit=1000, window_seconds=60, algorithm="gcra", local_lease=50
+    )
+    local = LocalLeaseLimiter(limiter)
+    await limiter.load_scripts()
+    redis_client.commands.clear()
+
+    results = await asyncio.gather(*(local.check("user:1", policy) for _ in range(50)))
+
+    assert all(d.allowed for d in results)
+    assert redis_client.commands == ["EVALSHA"]
+
+
+def test_policy_resolution_prefers_longest_route():
+    default = RateLimitPolicy(name="default", limit=100, window_seconds=60)
+    grading = RateLimitPolicy(name="grading", limit=10, window_seconds=60)
+    export = RateLimitPolicy(name="export", limit=2, window_seconds=60)
+    policies = RateLimitPolicySet(
+        default=default,
+        routes=[("/api/batch", grading), ("/api/batch/export", export)],
+    )
+
+    assert policies.resolve("/api/batch/export/zip") is export
+    assert policies.resolve("/api/batch/submit") is grading
+    assert policies.resolve("/api/other") is default
+
+
+def test_policy_set_from_env():
+    policies = load_policy_set_from_env(
+        {
+            "RATE_LIMIT_MAX_REQUESTS": "50",
+            "RATE_LIMIT_ALGORITHM": "gcra",
+            "RATE_LIMIT_LOCAL_LEASE": "5",
+            "RATE_LIMIT_ROUTES": json.dumps(
+                {
+                    "/api/batch": {"limit": 20, "algorithm": "gcra", "burst": 40},
+                    "/api/export": {"limit": 2, "window_seconds": 10, "name": "export"},
+                    "/api/bad": {"limit": 5, "local_lease": 3},
+                    "no-slash": {"limit": 1},
+                }
+            ),
+        }
+    )
+
+    assert (policies.default.limit, policies.default.window_seconds) == (50, 60)
+    assert policies.default.local_lease == 5
+    batch = policies.resolve("/api/batch/submit")
+    assert (batch.name, batch.limit, batch.burst_size) == ("route:/api/batch", 20, 40)
+    assert batch.window_seconds == 60 and batch.algorithm == "gcra"
+    assert policies.resolve("/api/export/zip").name == "export"
+    # 无效策略（非 gcra 的预租、前缀不以 / 开头）被忽略
+    assert [prefix for prefix, _ in policies.routes] == ["/api/export", "/api/batch"]
+
+    assert load_policy_set_from_env({"RATE_LIMIT_ROUTES": "not json"}).routes == []
+    fallback = load_policy_set_from_env({"RATE_LIMIT_LOCAL_LEASE": "5"})
+    assert fallback.default.limit == 100 and fallback.default.local_lease == 0
+
+
+def test_local_lease_requires_gcra():
+    with pytest.raises(ValueError):
+        RateLimitPolicy(name="x", limit=10, window_seconds=1, local_lease=5)
+
+
+@pytest.mark.asyncio
+async def test_middleware_headers_and_429(redis_client):
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(
+        RateLimitMiddleware, redis_client=redis_client, max_requests=2, window_seconds=60
+    )
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        first = await client.get("/api/ping")
+        second = await client.get("/api/ping")
+        third = await client.get("/api/ping")
+
+    assert first.status_code == 200
+    assert first.headers["X-RateLimit-Remaining"] == "1"
+    assert second.headers["X-RateLimit-Remaining"] == "0"
+    assert third.status_code == 429
+    assert int(third.headers["Retry-After"]) >= 1
+    assert third.json()["detail"]["error"] == "rate_limit_exceeded"
+    # 每个请求一次 EVALSHA（首个请求额外一次 SCRIPT LOAD 重试）
+    assert redis_client.commands.count("EVALSHA") == 4
+    assert redis_client.commands.count("SCRIPT LOAD") == 1
+
+
+@pytest.mark.asyncio
+async def test_middleware_fails_open_when_redis_down():
+    class BrokenRedis(fakeredis.FakeAsyncRedis):
+        async def execute_command(self, *args, **options):
+            from redis.exceptions import ConnectionError
+
+            raise ConnectionError("down")
+
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(RateLimitMiddleware, redis_client=BrokenRedis(), max_requests=1)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        responses = [await client.get("/api/ping") for _ in range(3)]
+
+    assert [r.status_code for r in responses] == [200, 200, 200]
+
+
+@pytest.mark.asyncio
+async def test_middleware_applies_route_policy(redis_client):
+    app = FastAPI()
+
+    @app.get("/api/export/zip")
+    async def export():
+        return {"ok": True}
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(
+        RateLimitMiddleware,
+        redis_client=redis_client,
+        policies=load_policy_set_from_env({"RATE_LIMIT_ROUTES": '{"/api/export": {"limit": 1}}'}),
+    )
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        exports = [await client.get("/api/export/zip") for _ in range(2)]
+        ping = await client.get("/api/ping")
+
+    assert [r.status_code for r in exports] == [200, 429]
+    assert ping.status_code == 200 and ping.headers["X-RateLimit-Limit"] == "100"
@@ -0,0 +1,257 @@
+"""单元测试：流式保存、S3 分片上传与区间读取
+
+S3 使用基于文件系统的替身客户端，行为与 aioboto3 客户端的相关接口一致
+（分片最小 5MB、Range GET、中止上传）。内存峰值以 tracemalloc 衡量。
+"""
+
+import asyncio
+import hashlib
+import os
+import shutil
+import tracemalloc
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+
+from src.api.routes import batch_langgraph
+from src.services.file_storage import (
+    S3_MIN_PART_SIZE,
+    FileStorageService,
+    LocalFileStorage,
+    S3FileStorage,
+)
+
+MB = 1024 * 1024
+
+
+class FakeBody:
+    def __init__(self, path, start, end):
+        self._file = open(path, "rb")
+        self._file.seek(start)
+        self._remaining = end - start + 1
+
+    async def read(self, amt=None):
+        size = self._remaining if amt is None else min(amt, self._remaining)
+        chunk = await asyncio.to_thread(self._file.read, size)
+        self._remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        self._file.close()
+
+
+class FilesystemS3Client:
+    """以目录模拟 S3 桶"""
+
+    def __init__(self, root):
+        self.root = root
+        self.uploads = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.put_calls = 0
+        self.aborted = []
+        self.fail_part = None
+
+    def _path(self, key):
+        path = os.path.join(self.root, "objects", key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    async def put_object(self, Bucket, Key, Body, ContentType=None, Metadata=None):
+        self.put_calls += 1
+        await asyncio.to_thread(_write, self._path(Key), Body)
+        return {"ETag": hashlib.md5(Body).hexdigest()}
+
+    async def create_multipart_upload(self, Bucket, Key, ContentType=None, Metadata=None):
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = {"key": Key, "parts": {}}
+        return {"UploadId": upload_id}
+
+    async def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if PartNumber == self.fail_part:
+                raise RuntimeError("part upload failed")
+            path = os.path.join(self.root, "parts", f"{UploadId}-{PartNumber}")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            await asyncio.to_thread(_write, path, Body)
+            self.uploads[UploadId]["parts"][PartNumber] = (path, len(Body))
+            return {"ETag": f"etag-{PartNumber}"}
+        finally:
+            self.in_flight -= 1
+
+    async def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        upload = self.uploads.pop(UploadId)
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(upload["parts"])
+        for number in numbers[:-1]:
+            assert upload["parts"][number][1] >= S3_MIN_PART_SIZE
+        with open(self._path(Key), "wb") as out:
+            for number in numbers:
+                path = upload["parts"][number][0]
+                with open(path, "rb") as part:
+                    shutil.copyfileobj(part, out, MB)
+                os.remove(path)
+
+    async def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(UploadId)
+        self.uploads.pop(UploadId, None)
+
+    async def get_object(self, Bucket, Key, Range=None):
+        path = self._path(Key)
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        if Range:
+            first, _, last = Range.split("=", 1)[1].partition("-")
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        return {"Body": FakeBody(path, start, end)}
+
+
+def _write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def _stream(total: int, chunk_size: int = 256 * 1024):
+    """生成确定性内容，复用同一块避免生成端自身占用内存"""
+    block = bytes(range(256)) * (chunk_size // 256)
+    sent = 0
+    while sent < total:
+        size = min(chunk_size, total - sent)
+        yield block if size == chunk_size else block[:size]
+        sent += size
+
+
+def _expected_sha256(total: int, chunk_size: int = 256 * 1024) -> str:
+    block = bytes(range(256)) * (chunk_size // 256)
+    hasher = hashlib.sha256()
+    sent = 0
+    while sent < total:
+        size = min(chunk_size, total - sent)
+        hasher.update(block[:size])
+        sent += size
+    return hasher.hexdigest()
+
+
+def _s3_storage(tmp_path, part_size=S3_MIN_PART_SIZE, concurrency=3):
+    storage = S3FileStorage("bucket", part_size=part_size, max_concurrency=concurrency)
+    storage._client = FilesystemS3Client(str(tmp_path))
+    return storage
+
+
+@pytest.mark.asyncio
+async def test_s3_multipart_upload_of_1gb_keeps_memory_bounded(tmp_path):
+    total = 1024 * MB
+    storage = _s3_storage(tmp_path, concurrency=3)
+
+    tracemalloc.start()
+    try:
+        stored = await storage.save_stream(_stream(total), "scan.pdf", "batch-1", "application/pdf")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    client = storage._client
+    assert stored.size == total
+    assert stored.content_hash == _expected_sha256(total)
+    assert os.path.getsize(client._path(stored.storage_path.split("bucket/", 1)[1])) == total
+    assert client.put_calls == 0
+    assert 1 < client.max_in_flight <= 3
+    # 上限约为 (并发数 + 2) 个分片，与文件大小无关
+    assert peak < (3 + 3) * S3_MIN_PART_SIZE
+
+
+@pytest.mark.asyncio
+async def test_s3_small_stream_uses_single_put_and_range_reads(tmp_path):
+    storage = _s3_storage(tmp_path)
+    data = bytes(range(256)) * 4000
+    stored = await storage.save_stream(_stream(len(data), 4096), "p.png", "b", "image/png")
+
+    assert storage._client.put_calls == 1
+    assert b"".join([c async for c in storage.open_range(stored.file_id)]) == data
+    assert b"".join([c async for c in storage.open_range(stored.file_id, 100, 1099)]) == data[
+        100:1100
+    ]
+    with pytest.raises(FileNotFoundError):
+        [c async for c in storage.open_range("missing")]
+
+
+@pytest.mark.asyncio
+async def test_s3_failed_part_aborts_upload(tmp_path):
+    storage = _s3_storage(tmp_path)
+    storage._client.fail_part = 2
+
+    with pytest.raises(RuntimeError):
+        await storage.save_stream(_stream(4 * S3_MIN_PART_SIZE), "x.pdf", "b")
+
+    assert len(storage._client.aborted) == 1
+    assert storage._client.uploads == {}
+    assert await storage.list_by_batch("b") == []
+
+
+@pytest.mark.asyncio
+async def test_local_save_stream_dedupes_and_bounds_memory(tmp_path):
+    storage = LocalFileStorage(str(tmp_path / "local"))
+    total = 64 * MB
+
+    tracemalloc.start()
+    try:
+        first = await storage.save_stream(_stream(total), "a.pdf", "batch")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    second = await storage.save_stream(_stream(total), "b.pdf", "batch")
+
+    assert first.content_hash == second.content_hash == _expected_sha256(total)
+    assert first.storage_path == second.storage_path
+    assert peak < 8 * MB
+    assert not list((tmp_path / "local" / "objects" / ".incoming").iterdir())
+
+    tail = b"".join([c async for c in storage.open_range(first.file_id, total - 10)])
+    assert tail == (bytes(range(256)) * 1024)[-10:]
+
+
+@pytest.mark.asyncio
+async def test_upload_and_ranged_download_routes(tmp_path, monkeypatch):
+    service = FileStorageService(LocalFileStorage(str(tmp_path)))
+    monkeypatch.setattr(batch_langgraph, "get_file_storage_service", lambda: service)
+    app = FastAPI()
+    app.include_router(batch_langgraph.router)
+    data = os.urandom(3 * MB + 17)
+
+    async def body():
+        for offset in range(0, len(data), 64 * 1024):
+            yield data[offset : offset + 64 * 1024]
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.post(
+            "/batch/b1/files/upload",
+            params={"filename": "scan.pdf", "page_index": 0},
+            content=body(),
+            headers={"content-type": "application/pdf"},
+        )
+        assert response.status_code == 200
+        info = response.json()
+        assert info["size"] == len(data)
+        assert info["metadata"] == {"type": "answer", "page_index": 0}
+
+        url = f"/batch/files/{info['file_id']}/download"
+        full = await client.get(url)
+        assert full.status_code == 200
+        assert full.content == data
+        assert full.headers["accept-ranges"] == "bytes"
+
+        partial = await client.get(url, headers={"Range": "bytes=1000-1999"})
+        assert partial.status_code == 206
+        assert partial.headers["content-range"] == f"bytes 1000-1999/{len(data)}"
+        assert partial.content == data[1000:2000]
+
+        suffix = await client.get(url, headers={"Range": "bytes=-5"})
+        assert suffix.content == data[-5:]
+
+        invalid = await client.get(url, headers={"Range": f"bytes={len(data)}-"})
+        assert invalid.status_code == 416
@@ -0,0 +1,256 @@
+"""单元测试：question_details 增量解析（随机分片、截断、格式损坏）与批改截断恢复"""
+
+import asyncio
+import io
+import json
+import random
+import re
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from src.services import llm_reasoning
+from src.services.llm_reasoning import LLMReasoningClient
+from src.utils.streaming_json import QuestionDetailsStreamParser
+
+_TRICKY = ["x = {a, b}", "f(x) = [1, 2]", '引号 "q" 与 \\ 反斜杠', "}]{[", "换行\n制表\t", "😀 Ω"]
+
+
+def _detail(rng, qid):
+    return {
+        "question_id": str(qid),
+        "score": rng.randint(0, 5),
+        "max_score": 5,
+        "student_answer": rng.choice(_TRICKY) * rng.randint(1, 3),
+        "feedback": rng.choice(_TRICKY),
+        "confidence": round(rng.random(), 2),
+        "source_pages": [rng.randint(0, 3) for _ in range(rng.randint(0, 2))],
+        "scoring_point_results": [
+            {
+                "point_id": f"{qid}.{j}",
+                "awarded": 1,
+                "evidence": rng.choice(_TRICKY),
+                "step_region": {"x_min": 0.1, "page_index": 0},
+            }
+            for j in range(rng.randint(0, 3))
+        ],
+    }
+
+
+def _document(rng, details):
+    body = json.dumps(
+        {
+            "score": 1,
+            "student_info": {"name": "{张三}"},
+            "question_details": details,
+            "overall_feedback": "good ]",
+        },
+        ensure_ascii=rng.random() < 0.5,
+        indent=rng.choice([None, 2]),
+    )
+    prefix = rng.choice(
+        [
+            "",
+            "```json\n",
+            "Reasoning first. "
+            '<thinking>maybe "question_details": [{"question_id": "fake"}]</thinking>\n',
+        ]
+    )
+    suffix = "\n```" if prefix.startswith("```") else ""
+    return prefix + body + suffix
+
+
+def _chunks(rng, text):
+    pos = 0
+    while pos < len(text):
+        size = rng.choice([1, 2, 3, 7, 16, 64, 300])
+        yield text[pos : pos + size]
+        pos += size
+
+
+def test_random_chunking_yields_every_item_once_in_order():
+    rng = random.Random(20261018)
+    for _ in range(200):
+        details = [_detail(rng, q + 1) for q in range(rng.randint(0, 6))]
+        text = _document(rng, details)
+        parser = QuestionDetailsStreamParser()
+        streamed = []
+        for chunk in _chunks(rng, text):
+            streamed.extend(parser.feed(chunk))
+        assert streamed == details
+        assert parser.items == details
+        assert parser.arrays_closed == 1 and not parser.in_item
+
+
+def test_items_are_emitted_as_soon_as_they_close():
+    rng = random.Random(7)
+    details = [_detail(rng, q + 1) for q in range(4)]
+    text = json.dumps({"question_details": details}, ensure_ascii=False)
+    parser = QuestionDetailsStreamParser()
+    emitted_at = []
+    for i, ch in enumerate(text):
+        if parser.feed(ch):
+            emitted_at.append(i)
+    closing = [
+        text.index(json.dumps(d, ensure_ascii=False)) + len(json.dumps(d, ensure_ascii=False)) - 1
+        for d in details
+    ]
+    assert emitted_at == closing
+
+
+def test_truncated_stream_keeps_only_closed_items():
+    rng = random.Random(99)
+    for _ in range(200):
+        details = [_detail(rng, q + 1) for q in range(rng.randint(1, 5))]
+        text = json.dumps({"question_details": details}, ensure_ascii=False)
+        cut = rng.randint(0, len(text))
+        parser = QuestionDetailsStreamParser()
+        for chunk in _chunks(rng, text[:cut]):
+            parser.feed(chunk)
+        closed = [
+            d
+            for d in details
+            if text.index(json.dumps(d, ensure_ascii=False))
+            + len(json.dumps(d, ensure_ascii=False))
+            <= cut
+        ]
+        assert parser.items == closed
+
+
+def test_malformed_items_are_skipped_and_noise_never_raises():
+    text = (
+        '{"question_details": [{"question_id": "1", "score": 2}, '
+        '{"question_id": "2", "score": }, 7, "x", [1, 2], '
+        '{"question_id": "3", "score": 1}]}\n---PAGE_BREAK---\n'
+        '{"questionDetails": [{"question_id": "4"}]}'
+    )
+    parser = QuestionDetailsStreamParser()
+    for ch in text:
+        parser.feed(ch)
+    assert [d["question_id"] for d in parser.items] == ["1", "3", "4"]
+    assert parser.malformed == 1 and parser.arrays_closed == 2
+
+    rng = random.Random(3)
+    alphabet = '{}[]":,\\ question_details<thinking>ab01'
+    for _ in range(300):
+        noise = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 200)))
+        parser = QuestionDetailsStreamParser()
+        for chunk in _chunks(rng, '"question_details": [' + noise):
+            assert isinstance(parser.feed(chunk), list)
+        assert all(isinstance(d, dict) for d in parser.items)
+
+
+# ---------------------------------------------------------------------------
+# grade_student：输出截断后保留已完成题目，只补批未完成的题目
+# ---------------------------------------------------------------------------
+
+RUBRIC = {
+    "total_score": 9,
+    "questions": [
+        {
+            "question_id": str(q),
+            "max_score": 3,
+            "scoring_points": [{"point_id": f"{q}.1", "description": "要点", "score": 3}],
+        }
+        for q in (1, 2, 3)
+    ],
+}
+
+
+def _graded(qid, score):
+    return {
+        "question_id": qid,
+        "score": score,
+        "max_score": 3,
+        "confidence": 0.9,
+        "source_pages": [0],
+        "scoring_point_results": [
+            {"point_id": f"{qid}.1", "awarded": score, "max_points": 3, "evidence": "作答原文"}
+        ],
+    }
+
+
+class _Chunk:
+    def __init__(self, content):
+        self.content = content
+
+
+class _TruncatingLLM:
+    """整卷批改输出在第 3 题中途断开；补批请求返回被要求的题目"""
+
+    def __init__(self):
+        self.prompts = []
+
+    async def astream(self, messages):
+        prompt = messages[0].content[0]["text"]
+        self.prompts.append(prompt)
+        if "Grade ONLY the following questions" in prompt:
+            asked = re.search(r"questions for [^:]+: ([^\n]+)\.", prompt).group(1).split(", ")
+            yield _Chunk(json.dumps({"question_details": [_graded(q, 1) for q in asked]}))
+            return
+        text = json.dumps({"question_details": [_graded("1", 3), _graded("2", 2), _graded("3", 0)]})
+        text = text[: text.index('{"question_id": "3"') + 30]
+        for i in range(0, len(text), 40):
+            await asyncio.sleep(0)
+            yield _Chunk(text[i : i + 40])
+
+
+def _answered_page():
+    rng = np.random.default_rng(0)
+    page = Image.new("L", (2480, 3508), 244)
+    draw = ImageDraw.Draw(page)
+    for _ in range(30):
+        points = [(int(rng.integers(300, 2100)), int(rng.integers(600, 1800)))]
+        for _ in range(6):
+            x, y = points[-1]
+            points.append((x + int(rng.integers(-60, 60)), y + int(rng.integers(-60, 60))))
+        draw.line(points, fill=40, width=8)
+    buffer = io.BytesIO()
+    page.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_grade_student_recovers_truncated_output(monkeypatch):
+    llm = _TruncatingLLM()
+    monkeypatch.setattr(llm_reasoning, "get_chat_model", lambda **kwargs: llm)
+    events = []
+
+    async def stream_callback(stream_type, chunk):
+        if stream_type == "question":
+            events.append(json.loads(chunk)["question_id"])
+
+    client = LLMReasoningClient(api_key="k", model_name="stub/model")
+    result = await client.grade_student(
+        [_answered_page()], "s1", RUBRIC, stream_callback=stream_callback
+    )
+
+    assert result["status"] == "completed" and result["stream_truncated"]
+    # 只补批截断的第 3 题
+    assert len(llm.prompts) == 2
+    assert "Grade ONLY the following questions for s1: 3." in llm.prompts[1]
+    scores = {d["question_id"]: d["score"] for d in result["question_details"]}
+    assert scores == {"1": 3, "2": 2, "3": 1}
+    assert events == ["1", "2", "3"]
+    # 截断输出不能沿用默认置信度，必须进入人工复核
+    assert result["confidence"] < 0.8 and result["needs_review"]
+    assert "stream_truncated" in result["review_reasons"]
+
+
+@pytest.mark.asyncio
+async def test_resume_student_from_partial_regrades_only_missing(monkeypatch):
+    llm = _TruncatingLLM()
+    monkeypatch.setattr(llm_reasoning, "get_chat_model", lambda **kwargs: llm)
+
+    client = LLMReasoningClient(api_key="k", model_name="stub/model")
+    result = await client.resume_student_from_partial(
+        [_answered_page()], "s1", RUBRIC, [_graded("1", 3), _graded("2", 2)]
+    )
+
+    assert len(llm.prompts) == 1
+    assert "Grade ONLY the following questions for s1: 3." in llm.prompts[0]
+    assert result["reused_question_ids"] == ["1", "2"]
+    assert result["regraded_question_ids"] == ["3"]
+    scores = {d["question_id"]: d["score"] for d in result["question_details"]}
+    assert scores == {"1": 3, "2": 2, "3": 1}
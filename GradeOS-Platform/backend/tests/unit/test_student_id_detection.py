@@ -0,0 +1,244 @@
+"""单元测试：学生身份分层识别（本地条码 / 填涂学号、名单匹配、页眉裁剪与缓存）"""
+
+import asyncio
+import base64
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw, ImageFont
+
+from src.db.postgres_store import UserRecord
+from src.services import student_id_detection, student_identification
+from src.services.student_id_detection import (
+    ID_SOURCE_BARCODE,
+    ID_SOURCE_BUBBLE,
+    ClassRoster,
+    detect_header_id,
+    get_page_identification_cache,
+    read_bubble_grid,
+)
+from src.services.student_identification import StudentIdentificationService
+
+SIZE = (2480, 3508)
+
+ROSTER = [
+    UserRecord(id="u-1", username="6901234567892", name="Zhang Wei"),
+    UserRecord(id="u-2", username="20240017", name="Wang Fang"),
+    UserRecord(id="u-3", username="20240018", name="Li Lei"),
+    UserRecord(id="u-4", username="S2024001", name="Chen Jing"),
+]
+
+# EAN-13 编码表（L / G / R 码与首位数字决定的奇偶模式）
+_EAN_L = ["0001101", "0011001", "0010011", "0111101", "0100011",
+          "0110001", "0101111", "0111011", "0110111", "0001011"]
+_EAN_R = ["".join("1" if bit == "0" else "0" for bit in code) for code in _EAN_L]
+_EAN_G = [code[::-1] for code in _EAN_R]
+_EAN_PARITY = ["LLLLLL", "LLGLGG", "LLGGLG", "LLGGGL", "LGLLGG",
+               "LGGLLG", "LGGGLL", "LGLGLG", "LGLGGL", "LGGLGL"]
+
+
+def _ean13(digits12):
+    digits = [int(c) for c in digits12]
+    checksum = sum(d * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    digits.append((10 - checksum % 10) % 10)
+    bits = "101"
+    for i, d in enumerate(digits[1:7]):
+        bits += (_EAN_L if _EAN_PARITY[digits[0]][i] == "L" else _EAN_G)[d]
+    bits += "01010" + "".join(_EAN_R[d] for d in digits[7:]) + "101"
+    return "".join(map(str, digits)), bits
+
+
+def _page(answer=True):
+    """300dpi 答题纸：页眉留白，下方横线与手写作答"""
+    page = Image.new("L", SIZE, 244)
+    draw = ImageDraw.Draw(page)
+    for y in range(1200, 3300, 120):
+        draw.line([(160, y), (SIZE[0] - 160, y)], fill=120, width=4)
+    if answer:
+        draw.line([(400, 1500), (700, 1400), (900, 1650), (1300, 1450)], fill=40, width=8)
+    return page
+
+
+def _with_barcode(page, digits12, module=4):
+    code, bits = _ean13(digits12)
+    draw = ImageDraw.Draw(page)
+    for i, bit in enumerate(bits):
+        if bit == "1":
+            x = 1500 + i * module
+            draw.rectangle([x, 200, x + module - 1, 200 + 60 * module], fill=20)
+    return code
+
+
+def _with_qr(page, text):
+    cv2 = pytest.importorskip("cv2")
+    code = cv2.QRCodeEncoder.create().encode(text)
+    code = cv2.resize(code, None, fx=8, fy=8, interpolation=cv2.INTER_NEAREST)
+    page.paste(Image.fromarray(code), (1900, 150))
+
+
+def _with_bubbles(page, digits, skip_column=None):
+    draw = ImageDraw.Draw(page)
+    for col, digit in enumerate(digits):
+        for row in range(10):
+            x, y = 300 + col * 60, 150 + row * 50
+            filled = row == int(digit) and col != skip_column
+            draw.ellipse(
+                [x - 18, y - 18, x + 18, y + 18], outline=60, width=3, fill=40 if filled else None
+            )
+
+
+def _with_name(page, name):
+    font = ImageFont.load_default(size=72)
+    ImageDraw.Draw(page).text((1000, 250), f"Name: {name}", fill=30, font=font)
+
+
+def _encode(page, fmt="PNG"):
+    buffer = io.BytesIO()
+    page.convert("RGB").save(buffer, format=fmt, compress_level=1)
+    return buffer.getvalue()
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache():
+    get_page_identification_cache().clear()
+    yield
+    get_page_identification_cache().clear()
+
+
+def test_bubble_grid_reads_one_mark_per_column():
+    page = _page()
+    _with_bubbles(page, "20240017")
+    header = np.asarray(page.crop((0, 0, SIZE[0], 1000)), dtype=np.uint8)
+    assert read_bubble_grid(header) == "20240017"
+
+    # 有一列未填涂：不猜测
+    page = _page()
+    _with_bubbles(page, "20240017", skip_column=3)
+    header = np.asarray(page.crop((0, 0, SIZE[0], 1000)), dtype=np.uint8)
+    assert read_bubble_grid(header) is None
+
+    assert read_bubble_grid(np.asarray(_page().crop((0, 0, SIZE[0], 1000)))) is None
+
+
+@pytest.mark.parametrize("fmt", ["PNG", "JPEG"])
+def test_header_barcodes_are_decoded_locally(fmt):
+    pytest.importorskip("cv2")
+    page = _page()
+    code = _with_barcode(page, "690123456789")
+    assert detect_header_id(_encode(page, fmt)).value == code
+
+    page = _page()
+    _with_qr(page, "S2024001")
+    header_id = detect_header_id(_encode(page, fmt))
+    assert header_id.value == "S2024001"
+    assert header_id.source == ID_SOURCE_BARCODE
+
+    page = _page()
+    _with_bubbles(page, "20240018")
+    header_id = detect_header_id(_encode(page, fmt))
+    assert (header_id.value, header_id.source) == ("20240018", ID_SOURCE_BUBBLE)
+
+    assert detect_header_id(_encode(_page(), fmt)) is None
+    assert detect_header_id(b"not an image") is None
+
+
+def test_roster_matching_tolerates_small_recognition_errors():
+    roster = ClassRoster(ROSTER)
+    assert roster.match_id("2024-0017").student_id == "u-2"
+    assert roster.match_id("u-3").student_id == "u-3"
+    # 一位之差且唯一：校正
+    assert roster.match_id("6901234567899").student_id == "u-1"
+    # 与两个学号都只差一位：不猜测
+    assert roster.match_id("20240019") is None
+    assert roster.match_id("999") is None
+
+    assert roster.match_name("Li Lie").student_id == "u-3"
+    assert roster.match_name("wang  fang").student_id == "u-2"
+    assert roster.match_name("Someone Else") is None
+    assert roster.match(name="Zhang Wei", student_id="unknown").student_id == "u-1"
+
+
+class _Response:
+    def __init__(self, content):
+        self.content = content
+
+
+class _HeaderLLM:
+    """只“读”页眉：页眉中有印刷姓名时返回（带识别错误的）姓名，否则 found=false"""
+
+    def __init__(self, name="Li Lie"):
+        self.name = name
+        self.sizes = []
+
+    async def ainvoke(self, messages):
+        parts = messages[0].content
+        url = next(p["image_url"] for p in parts if p.get("type") == "image_url")
+        image = Image.open(io.BytesIO(base64.b64decode(url.split(",", 1)[1]))).convert("L")
+        self.sizes.append(image.size)
+        await asyncio.sleep(0)
+        has_text = bool((np.asarray(image) < 100).mean() > 0.002)
+        info = {"found": has_text, "name": self.name if has_text else None, "confidence": 0.7}
+        return _Response(json.dumps({"student_info": info}))
+
+
+@pytest.mark.asyncio
+async def test_segmentation_uses_local_ids_and_header_crops_only_for_ambiguous_pages(
+    monkeypatch,
+):
+    llm = _HeaderLLM()
+    monkeypatch.setattr(student_identification, "get_chat_model", lambda **kwargs: llm)
+    monkeypatch.setattr(
+        student_id_detection, "_roster_cache", student_id_detection._RosterCache()
+    )
+    monkeypatch.setattr(
+        "src.db.postgres_store.list_class_students", lambda class_id: list(ROSTER)
+    )
+    service = StudentIdentificationService(model_name="stub-vision")
+
+    first = _page()
+    _with_bubbles(first, "20240017")
+    named = _page()
+    _with_name(named, "Li Lie")
+    continuation = _page()
+    ImageDraw.Draw(continuation).line([(500, 2000), (900, 2200)], fill=40, width=8)
+    pages = [_encode(p) for p in (first, _page(), named, continuation)]
+
+    result = await service.segment_batch_document(pages, class_id="class-1")
+
+    # 填涂学号页本地识别；其余三页只发送页眉（横向的窄条），不做整页分析
+    assert len(llm.sizes) == 3
+    assert all(width > height for width, height in llm.sizes)
+    assert result.student_count == 2
+    groups = service.group_pages_by_student(result)
+    assert groups == {"u-2": [0, 1], "u-3": [2, 3]}
+    names = {m.page_index: m.student_info.name for m in result.page_mappings}
+    assert names[2] == "Li Lei"
+
+    # 重复提交：全部命中页面哈希缓存
+    again = await service.segment_batch_document(pages, class_id="class-1")
+    assert len(llm.sizes) == 3
+    assert service.group_pages_by_student(again) == groups
+
+
+@pytest.mark.asyncio
+async def test_local_id_not_on_roster_is_confirmed_by_header_call(monkeypatch):
+    llm = _HeaderLLM(name="Chen Jing")
+    monkeypatch.setattr(student_identification, "get_chat_model", lambda **kwargs: llm)
+    service = StudentIdentificationService(model_name="stub-vision")
+
+    page = _page()
+    _with_bubbles(page, "55550000")
+    _with_name(page, "Chen Jing")
+    pages = [_encode(page)]
+
+    # 无名单：直接采用本地学号
+    result = await service.segment_batch_document(pages)
+    assert llm.sizes == []
+    assert result.page_mappings[0].student_info.student_id == "55550000"
+
+    # 有名单但学号不在名单中：交给模型读页眉，再按姓名匹配
+    result = await service.segment_batch_document(pages, roster=ClassRoster(ROSTER))
+    assert len(llm.sizes) == 1
+    assert result.page_mappings[0].student_info.student_id == "u-4"
@@ -0,0 +1,183 @@
+"""单元测试：追踪服务的采样、有界缓冲、批量写入与 OTLP 导出"""
+
+import asyncio
+import json
+import tracemalloc
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.services.tracing import (
+    SpanKind,
+    SpanStatus,
+    TraceSpan,
+    TracingConfig,
+    TracingService,
+)
+
+
+class RecordingCursor:
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def executemany(self, query, params_seq):
+        self.calls.append(list(params_seq))
+
+
+class RecordingConn:
+    def __init__(self):
+        self.executemany_calls = []
+        self.execute_calls = 0
+
+    def cursor(self):
+        return RecordingCursor(self.executemany_calls)
+
+    async def execute(self, *args, **kwargs):
+        self.execute_calls += 1
+
+
+class FakePoolManager:
+    def __init__(self):
+        self.conn = RecordingConn()
+
+    @asynccontextmanager
+    async def pg_connection(self):
+        yield self.conn
+
+
+def _span(i: int, duration_ms: int = 5, status: SpanStatus = SpanStatus.OK, trace_id=None):
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return TraceSpan(
+        trace_id=trace_id or f"trace-{i}",
+        span_id=f"span-{i}",
+        kind=SpanKind.INTERNAL,
+        name="op",
+        start_time=start,
+        end_time=start + timedelta(milliseconds=duration_ms),
+        duration_ms=duration_ms,
+        status=status,
+    )
+
+
+def test_sampling_keeps_errors_and_slow_spans():
+    service = TracingService(
+        FakePoolManager(), TracingConfig(sample_rate=0.0, alert_threshold_ms=100)
+    )
+
+    assert not service.record_span(_span(1))
+    assert service.record_span(_span(2, status=SpanStatus.ERROR))
+    assert service.record_span(_span(3, duration_ms=150))
+    # 出错 trace 中后续结束的跨度（如父跨度）同样保留
+    assert service.record_span(_span(4, trace_id="trace-2"))
+
+    stats = service.stats
+    assert stats["spans_sampled_out"] == 1
+    assert stats["spans_recorded"] == 3
+
+
+def test_head_sampling_is_consistent_per_trace_and_close_to_rate():
+    service = TracingService(FakePoolManager(), TracingConfig(sample_rate=0.25))
+    decisions = [service.is_trace_sampled(f"trace-{i}") for i in range(20000)]
+    assert 0.23 < sum(decisions) / len(decisions) < 0.27
+    assert all(
+        service.is_trace_sampled(f"trace-{i}") == decisions[i] for i in range(0, 20000, 97)
+    )
+
+
+def test_buffer_bounded_under_one_million_span_burst():
+    config = TracingConfig(max_buffer_spans=1000, batch_size=10**9)
+    service = TracingService(FakePoolManager(), config)
+    span = _span(0)
+
+    tracemalloc.start()
+    try:
+        for _ in range(1_000_000):
+            service.record_span(span)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    stats = service.stats
+    assert stats["buffered_spans"] == 1000
+    assert stats["spans_dropped"] == 1_000_000 - 1000
+    # 缓冲只持有引用，峰值远小于 1M 个元素的列表（约 8MB）
+    assert peak < 2 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_spans_in_bulk():
+    pool = FakePoolManager()
+    service = TracingService(pool, TracingConfig(max_flush_spans=400))
+    for i in range(1000):
+        service.record_span(_span(i))
+
+    await service._flush_buffer()
+
+    assert pool.conn.execute_calls == 0
+    assert [len(call) for call in pool.conn.executemany_calls] == [400, 400, 200]
+    assert service.stats["spans_persisted"] == 1000
+    assert service.stats["buffered_spans"] == 0
+
+
+@pytest.mark.asyncio
+async def test_background_flusher_wakes_on_batch_size():
+    pool = FakePoolManager()
+    service = TracingService(
+        pool, TracingConfig(batch_size=50, flush_interval_seconds=3600, enable_alerts=False)
+    )
+    await service.start()
+    try:
+        for i in range(50):
+            span = service.start_span(f"t{i}", SpanKind.INTERNAL, "op")
+            await service.end_span(span)
+        for _ in range(50):
+            if service.stats["spans_persisted"] == 50:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await service.stop()
+
+    assert service.stats["spans_persisted"] == 50
+
+
+@pytest.mark.asyncio
+async def test_otlp_json_file_export(tmp_path):
+    path = tmp_path / "otlp" / "spans.jsonl"
+    service = TracingService(
+        FakePoolManager(),
+        TracingConfig(enable_persistence=False, otlp_export_path=str(path)),
+    )
+    trace_id = "0af7651916cd43dd8448eb211c80319c"
+    parent = _span(1, trace_id=trace_id)
+    parent.span_id = "b7ad6b7169203331b7ad6b7169203331"
+    child = _span(2, status=SpanStatus.ERROR, trace_id=trace_id)
+    child.parent_span_id = parent.span_id
+    child.error_message = "boom"
+    child.attributes = {"student": "s1", "pages": 3, "ok": False}
+    service.record_span(child)
+    service.record_span(parent)
+
+    await service._flush_buffer()
+
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1
+    request = json.loads(lines[0])
+    resource = request["resourceSpans"][0]
+    assert resource["resource"]["attributes"][0]["value"]["stringValue"] == "gradeos-backend"
+    spans = resource["scopeSpans"][0]["spans"]
+    assert [len(s["traceId"]) for s in spans] == [32, 32]
+    assert all(len(s["spanId"]) == 16 for s in spans)
+    assert spans[0]["parentSpanId"] == spans[1]["spanId"]
+    assert spans[0]["status"] == {"code": 2, "message": "boom"}
+    attrs = {a["key"]: a["value"] for a in spans[0]["attributes"]}
+    assert attrs["pages"] == {"intValue": "3"}
+    assert attrs["ok"] == {"boolValue": False}
+    assert int(spans[0]["endTimeUnixNano"]) > int(spans[0]["startTimeUnixNano"])
+    assert service.stats["spans_exported"] == 2